@@ -16,9 +16,41 @@ import tempfile
 import time
 from typing import Dict, Any, Optional, List, Tuple
 
+# Shared helpers live in the top-level ``plugins`` package; make it importable
+# when this file is executed directly as a script (python plugins/gh/cli.py).
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PACKAGE_ROOT not in sys.path:  # pragma: no cover - only when run as a script
+    sys.path.insert(0, _PACKAGE_ROOT)
 
-def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = False, cwd: Optional[str] = None) -> Dict[str, Any]:
-    """Execute the gh command."""
+from plugins import metrics, mirrors, process, telemetry, tracing
+
+
+def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = False, cwd: Optional[str] = None,
+        enqueued_ns: Optional[int] = None) -> Dict[str, Any]:
+    """Execute the gh command.
+
+    ``enqueued_ns`` is the ``time.perf_counter_ns()`` timestamp at which a
+    batching caller queued this call; when given, the queue wait is reported
+    in the response timings.
+
+    When tracing is enabled (``SMCP_TRACE_FILE``), ``args["traceparent"]``
+    may carry the W3C trace context of the calling operation.
+
+    With ``args["mirror"]`` set, a clone borrows objects from a local
+    mirror of its remote (see ``plugins.mirrors``), reported in ``mirror``.
+    """
+    span = None if dry_run else tracing.start_span("gh", args)
+    response = _run_command(args, dry_run, non_interactive, cwd, enqueued_ns)
+    if not response.get("dry_run"):
+        metrics.record_response("gh", response)
+    tracing.finish_span(span, response, cwd)
+    return response
+
+
+def _run_command(args: Dict[str, Any], dry_run: bool, non_interactive: bool, cwd: Optional[str],
+                 enqueued_ns: Optional[int]) -> Dict[str, Any]:
+    """Build, execute and classify a single gh invocation."""
+    timer = telemetry.PhaseTimer(enqueued_ns)
     temp_files = []  # Track temp files for cleanup (fixes issue #12)
     try:
         # Validate working directory if specified (fixes issue #3, #9)
@@ -27,7 +59,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 return {
                     "success": False,
                     "error": f"Working directory does not exist: {cwd}",
-                    "error_code": "INVALID_CWD"
+                    "error_code": "INVALID_CWD",
+                    "timings": timer.as_dict()
                 }
             cwd = os.path.abspath(cwd)
         
@@ -66,7 +99,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 "command": " ".join(cmd_args),
                 "cmd_args": cmd_args,
                 "args_received": args,
-                "cwd": cwd
+                "cwd": cwd,
+                "timings": timer.as_dict()
             }
             # Include temp file info in dry run if any were created
             # Note: In dry_run mode, temp files are NOT cleaned up so tests can verify them
@@ -77,16 +111,17 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
             temp_files = []
             return result
         
+        # Borrow objects from a local mirror of the remote being cloned
+        mirror = None
+        if args.get("mirror"):
+            cmd_args, mirror = mirrors.rewrite_clone(cmd_args)
+            timer.mark("mirror")
+        
         # Execute command
-        start_time = time.time()
-        result = subprocess.run(
-            cmd_args,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=cwd
-        )
-        elapsed = time.time() - start_time
+        timer.mark("setup")
+        start_time = time.perf_counter()
+        result = process.run_process(cmd_args, timeout=30, cwd=cwd, timer=timer)
+        elapsed = time.perf_counter() - start_time
         
         # Return result in SMCP-compatible format
         # Always pass through output (stdout and/or stderr) regardless of return code
@@ -112,8 +147,12 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
         
         if result.stdout:
             response["stdout"] = result.stdout
+        if mirror is not None:
+            response["mirror"] = mirror  # The mirror used and whether it was created or refreshed
         if result.stderr:
             response["stderr"] = result.stderr
+        if result.resources is not None:
+            response["resources"] = result.resources  # Child rusage (CPU, max RSS, I/O, context switches)
         
         # Check for idempotent scenarios (fixes issue #10)
         idempotent_info = _check_idempotency(result, command_str)
@@ -128,6 +167,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 response["result"] = idempotent_info.get("message", output) if output else "Operation already in desired state"
             else:
                 response["result"] = output if output else "Command completed successfully"
+            timer.mark("classify")
+            response["timings"] = timer.as_dict()
             return response
         else:
             # Non-zero return code: enhance error messages with context (fixes issue #6, #9)
@@ -138,6 +179,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 error_hints = _analyze_error(result.stderr, command_str, cwd)
                 if error_hints:
                     response["error_hints"] = error_hints
+                timer.mark("classify")
+                response["timings"] = timer.as_dict()
                 return response
             else:
                 # No output but command failed - provide context
@@ -151,18 +194,25 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                     "cwd": cwd,
                     "args_received": args
                 }
+                timer.mark("classify")
+                response["timings"] = timer.as_dict()
                 return response
         
-    except subprocess.TimeoutExpired:
+    except subprocess.TimeoutExpired as e:
         command_str = " ".join(cmd_args) if 'cmd_args' in locals() else "gh [command]"
-        return {
+        response = {
             "success": False,
             "error": f"Command timed out after 30 seconds",
             "error_code": "TIMEOUT",
             "command": command_str,
             "error_type": "timeout",
-            "suggestion": "The command may be waiting for input or taking too long. Try using --non-interactive flag or check network connectivity."
+            "suggestion": "The command may be waiting for input or taking too long. Try using --non-interactive flag or check network connectivity.",
+            "timings": timer.as_dict()
         }
+        resources = getattr(e, "resources", None)
+        if resources is not None:
+            response["resources"] = resources  # Usage of the killed child
+        return response
     except Exception as e:
         command_str = " ".join(cmd_args) if 'cmd_args' in locals() else "gh [command]"
         return {
@@ -174,7 +224,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
             "command_context": {
                 "args_received": args,
                 "cwd": cwd
-            }
+            },
+            "timings": timer.as_dict()
         }
     finally:
         # Clean up temp files (fixes issue #12)
@@ -398,6 +449,33 @@ def describe() -> Dict[str, Any]:
                         "description": "SUBCOMMAND argument",
                         "required": False,
                         "default": None
+                    },
+                    {
+                        "name": "mirror",
+                        "type": "boolean",
+                        "description": "Clones: borrow objects from a local mirror of the remote (--reference-if-able with --dissociate), creating or refreshing it as needed",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "traceparent",
+                        "type": "string",
+                        "description": "W3C traceparent of the calling operation (used when SMCP_TRACE_FILE is set)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "metrics",
+                "description": "Render plugin execution metrics in Prometheus text format",
+                "parameters": [
+                    {
+                        "name": "output",
+                        "type": "string",
+                        "description": "File to write the metrics to (for a textfile collector)",
+                        "required": False,
+                        "default": None
                     }
                 ]
             }
@@ -412,7 +490,8 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Available commands:
-  run    Execute the gh command
+  run      Execute the gh command
+  metrics  Render execution metrics in Prometheus text format
 
 Examples:
   python cli.py run --command <value> --subcommand <value>
@@ -432,6 +511,12 @@ Examples:
     pass
     run_parser.add_argument("--command", dest="arg_command", help="COMMAND argument")
     run_parser.add_argument("--subcommand", dest="arg_subcommand", help="SUBCOMMAND argument")
+    run_parser.add_argument("--mirror", action="store_true", dest="mirror", help="Clones: borrow objects from a local mirror of the remote")
+    run_parser.add_argument("--traceparent", dest="traceparent", help="W3C traceparent of the calling operation (used when SMCP_TRACE_FILE is set)")
+    
+    # Metrics command
+    metrics_parser = subparsers.add_parser("metrics", help="Render execution metrics in Prometheus text format")
+    metrics_parser.add_argument("--output", dest="output", help="Write the metrics to this file")
     
     args = parser.parse_args()
     
@@ -457,13 +542,23 @@ Examples:
                 run_args["command"] = args.arg_command
             if hasattr(args, "arg_subcommand") and args.arg_subcommand is not None:
                 run_args["subcommand"] = args.arg_subcommand
+            if getattr(args, "mirror", False) is True:
+                run_args["mirror"] = True
+            traceparent = getattr(args, "traceparent", None)
+            if isinstance(traceparent, str):
+                run_args["traceparent"] = traceparent
             # Always call run, even with no args (to show gh help)
             result = run(run_args, dry_run=dry_run, non_interactive=non_interactive, cwd=cwd)
+        elif args.command == "metrics":
+            result = metrics.export(output=getattr(args, "output", None))
         else:
             result = {"error": f"Unknown command: {args.command}"}
         
         # Output JSON (no indentation for SMCP compatibility)
-        print(json.dumps(result))
+        print(telemetry.dumps(result))
+        sys.stdout.flush()
+        # Persist this process's metrics when SMCP_METRICS_FILE is set
+        metrics.flush()
         sys.exit(0 if "error" not in result else 1)
         
     except Exception as e:
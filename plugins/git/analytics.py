@@ -0,0 +1,351 @@
+"""
+Columnar commit history for churn, hotness and cadence reports.
+
+``History.load`` streams ``git log -z --numstat`` through a single-pass
+parser (``structured.split_fields``) into ``array`` columns: one row per
+commit (author id, author time) and one row per file a commit changed
+(commit row, path id, lines added and deleted). Author identities and paths
+are interned, so each is stored once however many rows mention it, and the
+text output is never held in memory.
+
+Aggregations run over whole columns. Counting uses ``collections.Counter``
+(whose update loop is in C) and sums accumulate into a preallocated
+``array``; nothing builds a Python object per row. ``group_by`` totals a
+metric per author, path or time bucket and ``top`` ranks the groups.
+
+``History.save`` writes the columns to a file that ``History.open`` maps
+back with ``mmap``. The columns are then ``memoryview`` casts over the map,
+so reopening a million-commit history costs only the decoding of the
+author and path tables. The file is in native byte order.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from plugins import process
+from plugins.git.structured import split_fields
+
+KEYS = ("author", "path", "time")
+
+METRICS = ("commits", "added", "deleted", "churn")
+
+# Named time buckets; any positive number of seconds works as well
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400, "month": None, "year": None}
+
+# Marks the first header field of each commit so numstat entries cannot be mistaken for one
+LOG_FORMAT = "--format=%x01%H%x00%an <%ae>%x00%at"
+
+FILE_MAGIC = b"SMCPHIST"
+FILE_VERSION = 1
+
+# magic, version, byte order, oid size, commits, changes, author table bytes, path table bytes
+_FILE_HEADER = struct.Struct("<8sIIQQQQQ")
+
+# Column name -> array typecode, in file order
+COMMIT_COLUMNS = (("commit_author", "I"), ("commit_time", "q"))
+CHANGE_COLUMNS = (("change_commit", "I"), ("change_path", "I"), ("change_added", "i"), ("change_deleted", "i"))
+
+# Epoch day 0 was a Thursday; weeks start on Monday
+_WEEK_OFFSET = 3 * 86400
+
+
+class History:
+    """Commits and the files they changed, as columns.
+
+    ``oids`` holds the raw object ids back to back, ``authors`` and
+    ``paths`` are the intern tables the ``*_author`` and ``*_path`` columns
+    index into. ``change_added`` and ``change_deleted`` are ``-1`` for
+    binary files. Renames are recorded under the new path.
+    """
+
+    def __init__(self, oid_size: int = 20):
+        self.oid_size = oid_size
+        self.oids = bytearray()
+        self.authors: List[str] = []
+        self.paths: List[str] = []
+        self.commit_author: Sequence[int] = array("I")
+        self.commit_time: Sequence[int] = array("q")
+        self.change_commit: Sequence[int] = array("I")
+        self.change_path: Sequence[int] = array("I")
+        self.change_added: Sequence[int] = array("i")
+        self.change_deleted: Sequence[int] = array("i")
+        self._map: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.commit_time)
+
+    @property
+    def change_count(self) -> int:
+        return len(self.change_path)
+
+    def oid(self, row: int) -> str:
+        """Hex object id of the commit in ``row``."""
+        return bytes(self.oids[row * self.oid_size:(row + 1) * self.oid_size]).hex()
+
+    @classmethod
+    def parse(cls, chunks: Iterable[bytes]) -> "History":
+        """Build a history from ``git log -z --numstat`` output in ``LOG_FORMAT``.
+
+        Raises ``ValueError`` on output that does not follow that format.
+        """
+        history = cls()
+        author_ids: Dict[bytes, int] = {}
+        path_ids: Dict[bytes, int] = {}
+        authors, paths = [], []
+        oids = history.oids
+        commit_author, commit_time = history.commit_author, history.commit_time
+        change_commit, change_path = history.change_commit, history.change_path
+        change_added, change_deleted = history.change_added, history.change_deleted
+        fields = split_fields(chunks)
+        row = -1
+        for field in fields:
+            if field[:1] == b"\x01":
+                header = list(islice(fields, 2))
+                if len(header) < 2:
+                    raise ValueError(f"truncated log entry: {field[:40]!r}")
+                raw = bytes.fromhex(field[1:].decode())
+                if row < 0:
+                    history.oid_size = len(raw)
+                oids += raw
+                author = author_ids.get(header[0])
+                if author is None:
+                    author = author_ids[header[0]] = len(authors)
+                    authors.append(header[0])
+                commit_author.append(author)
+                commit_time.append(int(header[1]))
+                row += 1
+                continue
+            if row < 0:
+                raise ValueError(f"numstat entry before any commit: {field[:40]!r}")
+            added, tab, rest = field.lstrip(b"\n").partition(b"\t")
+            deleted, tab2, path = rest.partition(b"\t")
+            if not tab or not tab2:
+                raise ValueError(f"unrecognized numstat entry: {field[:40]!r}")
+            if not path:
+                # A rename: the old and new paths follow as fields of their own
+                moved = list(islice(fields, 2))
+                if len(moved) < 2:
+                    raise ValueError("rename entry without its paths")
+                path = moved[1]
+            path_id = path_ids.get(path)
+            if path_id is None:
+                path_id = path_ids[path] = len(paths)
+                paths.append(path)
+            change_commit.append(row)
+            change_path.append(path_id)
+            change_added.append(-1 if added == b"-" else int(added))
+            change_deleted.append(-1 if deleted == b"-" else int(deleted))
+        history.authors = [author.decode("utf-8", "replace") for author in authors]
+        history.paths = [path.decode("utf-8", "surrogateescape") for path in paths]
+        return history
+
+    @classmethod
+    def load(cls, cwd: Optional[str] = None, args: Sequence[str] = (), timeout: float = 600) -> "History":
+        """Stream ``git log`` (with extra ``args`` such as a range or ``--since``) into a history.
+
+        Raises ``subprocess.CalledProcessError`` when git fails and
+        ``subprocess.TimeoutExpired`` when it runs past ``timeout``.
+        """
+        cmd_args = ["git", "log", "-z", "--numstat", "-M", LOG_FORMAT] + list(args)
+        with process.StreamingProcess(cmd_args, timeout=timeout, cwd=cwd) as child:
+            history = cls.parse(child)
+            result = child.wait()
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd_args, None, result.stderr)
+        return history
+
+    def save(self, path: str) -> None:
+        """Write the columns to ``path`` (atomically) for ``open`` to map back."""
+        authors = "\0".join(self.authors).encode("utf-8", "surrogateescape")
+        paths = "\0".join(self.paths).encode("utf-8", "surrogateescape")
+        header = _FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, sys.byteorder == "little", self.oid_size,
+                                   len(self), self.change_count, len(authors), len(paths))
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".history_", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                offset = 0
+                for section in [header, self.oids] + [getattr(self, name) for name, _ in
+                                                      COMMIT_COLUMNS + CHANGE_COLUMNS] + [authors, paths]:
+                    data = memoryview(section).cast("B")
+                    # Keep every column 8-byte aligned so it can be cast in place
+                    handle.write(data)
+                    offset += len(data)
+                    handle.write(b"\0" * (-offset % 8))
+                    offset += -offset % 8
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @classmethod
+    def open(cls, path: str) -> "History":
+        """Map a file written by ``save``; raises ``ValueError`` if it is not one this build can read."""
+        with open(path, "rb") as handle:
+            header = handle.read(_FILE_HEADER.size)
+            if len(header) < _FILE_HEADER.size:
+                raise ValueError(f"{path} is not a commit history file")
+            magic, version, little, oid_size, commits, changes, author_bytes, path_bytes = _FILE_HEADER.unpack(header)
+            if magic != FILE_MAGIC or version != FILE_VERSION:
+                raise ValueError(f"{path} is not a commit history file")
+            if bool(little) != (sys.byteorder == "little"):
+                raise ValueError(f"{path} was written on a machine with the other byte order")
+            sizes = [commits * oid_size]
+            sizes += [rows * array(typecode).itemsize for rows, columns in
+                      ((commits, COMMIT_COLUMNS), (changes, CHANGE_COLUMNS)) for _, typecode in columns]
+            sizes += [author_bytes, path_bytes]
+            if sum(size + (-size % 8) for size in [_FILE_HEADER.size] + sizes) > os.fstat(handle.fileno()).st_size:
+                raise ValueError(f"{path} is truncated")
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        history = cls(oid_size)
+        view = memoryview(mapped)
+        sections = []
+        offset = _FILE_HEADER.size + (-_FILE_HEADER.size % 8)
+        for size in sizes:
+            sections.append(view[offset:offset + size])
+            offset += size + (-size % 8)
+        history.oids = sections[0]
+        for section, (name, typecode) in zip(sections[1:], COMMIT_COLUMNS + CHANGE_COLUMNS):
+            setattr(history, name, section.cast(typecode))
+        history.authors = bytes(sections[-2]).decode("utf-8", "replace").split("\0") if author_bytes else []
+        history.paths = bytes(sections[-1]).decode("utf-8", "surrogateescape").split("\0") if path_bytes else []
+        history._map = mapped
+        return history
+
+    def close(self) -> None:
+        """Release the file mapping of a history returned by ``open``."""
+        if self._map is not None:
+            for name, _ in COMMIT_COLUMNS + CHANGE_COLUMNS:
+                getattr(self, name).release()
+            self.oids.release()
+            self._map.close()
+            self._map = None
+
+    def __enter__(self) -> "History":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _bucket_labels(self, bucket: Union[str, int]) -> Tuple[Sequence[int], List[str]]:
+        """Bucket id per commit and the label of each id."""
+        if isinstance(bucket, str) and BUCKETS.get(bucket, 0) is None:
+            # Calendar buckets: convert each distinct day once
+            fmt = "%Y-%m" if bucket == "month" else "%Y"
+            ids: Dict[int, int] = {}
+            labels: Dict[str, int] = {}
+            for day in set(when // 86400 for when in self.commit_time):
+                label = time.strftime(fmt, time.gmtime(day * 86400))
+                ids[day] = labels.setdefault(label, len(labels))
+            return array("I", [ids[when // 86400] for when in self.commit_time]), list(labels)
+        seconds = BUCKETS[bucket] if isinstance(bucket, str) else bucket
+        shift = _WEEK_OFFSET if seconds == BUCKETS["week"] else 0
+        starts = sorted(set((when + shift) // seconds for when in self.commit_time))
+        index = {start: number for number, start in enumerate(starts)}
+        fmt = "%Y-%m-%d" if seconds % 86400 == 0 else "%Y-%m-%dT%H:%M:%SZ"
+        labels = [time.strftime(fmt, time.gmtime(start * seconds - shift)) for start in starts]
+        return array("I", [index[(when + shift) // seconds] for when in self.commit_time]), labels
+
+    def group_by(self, key: str, metric: str = "commits", bucket: Union[str, int] = "week") -> Dict[str, int]:
+        """Total ``metric`` per author, path or time bucket.
+
+        ``commits`` counts commits (for paths, commits that changed the
+        path); ``added``, ``deleted`` and ``churn`` (both) sum changed
+        lines, counting binary files as zero. Time buckets are UTC and
+        labelled by their start (``week`` starts on Monday). Raises
+        ``ValueError`` for an unknown key, metric or bucket.
+        """
+        if key not in KEYS:
+            raise ValueError(f"unknown key {key!r}; choose from {', '.join(KEYS)}")
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r}; choose from {', '.join(METRICS)}")
+        if isinstance(bucket, bool) or not (bucket in BUCKETS or isinstance(bucket, int) and bucket > 0):
+            raise ValueError(f"unknown bucket {bucket!r}; choose from {', '.join(BUCKETS)} or a number of seconds")
+        if key == "path":
+            keys, labels = self.change_path, self.paths
+        elif key == "author":
+            keys, labels = self.commit_author, self.authors
+        else:
+            keys, labels = self._bucket_labels(bucket)
+        if metric == "commits":
+            counts = Counter(keys)
+            return {labels[group]: count for group, count in counts.items()}
+        if key != "path":
+            # Line counts live on change rows: look up each change's commit group once
+            keys = array("I", map(keys.__getitem__, self.change_commit))
+        totals = array("q", bytes(8 * len(labels)))
+        columns = [self.change_added, self.change_deleted] if metric == "churn" else [
+            self.change_added if metric == "added" else self.change_deleted]
+        for column in columns:
+            for group, lines in zip(keys, column):
+                if lines > 0:
+                    totals[group] += lines
+        touched = set(keys)
+        return {labels[group]: totals[group] for group in touched}
+
+    def top(self, k: int, key: str, metric: str = "commits", bucket: Union[str, int] = "week") -> List[Tuple[str, int]]:
+        """The ``k`` largest groups of ``group_by``, largest first (ties by label)."""
+        totals = self.group_by(key, metric, bucket)
+        return heapq.nsmallest(k, totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+def report(args: Dict[str, Any], cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Run an analytics request for the plugin CLI.
+
+    ``args`` carries ``group_by`` (``author``, ``path`` or ``time``),
+    ``metric``, ``bucket``, ``top`` and either ``load`` (a file written by
+    ``save``) or ``args`` for ``git log``; ``save`` stores the columns
+    after a git run.
+    """
+    start = time.perf_counter()
+    bucket = args.get("bucket") or "week"
+    if isinstance(bucket, str) and bucket.isdigit():
+        bucket = int(bucket)
+    log_args = args.get("args") or []
+    if isinstance(log_args, str):
+        log_args = log_args.split()
+    try:
+        if args.get("load"):
+            history = History.open(args["load"])
+        else:
+            history = History.load(cwd, log_args)
+            if args.get("save"):
+                history.save(args["save"])
+    except subprocess.CalledProcessError as e:
+        return {"success": False, "error": (e.stderr or "").strip() or f"git log exited with {e.returncode}",
+                "error_code": f"COMMAND_FAILED_{e.returncode}"}
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        return {"success": False, "error": str(e), "error_code": "ANALYTICS_FAILED"}
+    with history:
+        try:
+            top = args.get("top")
+            if top is not None:
+                if isinstance(top, bool) or not isinstance(top, int) or top < 1:
+                    raise ValueError("top must be a positive integer")
+                rows = history.top(top, args.get("group_by") or "author", args.get("metric") or "commits", bucket)
+            else:
+                rows = sorted(history.group_by(args.get("group_by") or "author", args.get("metric") or "commits",
+                                               bucket).items())
+        except ValueError as e:
+            return {"success": False, "error": f"Invalid analytics option: {e}",
+                    "error_code": "INVALID_ANALYTICS_OPTION"}
+        response = {
+            "success": True,
+            "commits": len(history),
+            "changes": history.change_count,
+            "result": [{"key": label, "value": value} for label, value in rows],
+            "elapsed": time.perf_counter() - start,
+        }
+    if args.get("save") and not args.get("load"):
+        response["saved"] = args["save"]
+    return response
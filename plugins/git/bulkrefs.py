@@ -0,0 +1,341 @@
+"""
+Create, update and delete many refs in one transaction.
+
+Creating or deleting hundreds of branches and tags one ``git branch`` or
+``git tag`` at a time costs a process, a lock and a ref rewrite each.
+``apply()`` takes a list of operations instead::
+
+    {"action": "create", "ref": "refs/heads/release/1.2", "new": "main"}
+    {"action": "update", "ref": "refs/heads/topic", "new": "abc123...", "old": "def456..."}
+    {"action": "delete", "ref": "refs/heads/stale", "old": "0123ab..."}
+    {"action": "verify", "ref": "refs/tags/v1.1", "old": "4567cd..."}
+
+``new`` and ``old`` are revisions; an empty ``old`` means the ref must not
+exist, and a missing one skips the check (``create`` always expects the ref
+to be absent). One ``git cat-file --batch-check`` resolves every value and
+reads the refs' current ones, and one ``git update-ref --stdin -z`` applies
+the operations as a single transaction, under the repository's write lock.
+
+In ``atomic`` mode either every operation is applied or none is: a ref
+whose current value does not match its ``old`` is ``rejected`` and the
+rest are ``aborted`` without writing anything. In ``best-effort`` mode the
+mismatched refs are rejected and the others applied; when git refuses one
+of them (a name conflict, say), that one is ``failed`` and the transaction
+is retried without it. Every operation gets a result with its ``status``:
+``applied``, ``rejected``, ``failed`` or ``aborted``.
+
+``push()`` sends the same operations to a remote with ``git push
+--porcelain`` and ``old`` values as ``--force-with-lease`` expectations:
+all of them in one ``--atomic`` push in atomic mode, many refspecs per
+push in best-effort mode.
+"""
+
+import collections
+import json
+import re
+import subprocess
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from plugins import process
+from plugins.git import locking
+
+ATOMIC = "atomic"
+BEST_EFFORT = "best-effort"
+MODES = (ATOMIC, BEST_EFFORT)
+
+ACTIONS = ("create", "update", "delete", "verify")
+
+# Refspecs per best-effort git push; keeps the command line well under the system's limit
+PUSH_BATCH = 500
+# Bytes of refspecs and leases one atomic git push may carry, well under Linux's 2 MiB ARG_MAX
+ATOMIC_PUSH_MAX_BYTES = 1 << 20
+
+REFS_TIMEOUT = 120
+PUSH_TIMEOUT = 600
+
+_OID_RE = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+_ZERO_RE = re.compile(r"^0+$")
+# Ref names in git's error messages, quoted or not
+_ERROR_REF_RE = re.compile(r"refs/[^\s':]+")
+
+# git push --porcelain flags of refs that now hold the pushed value
+_PUSHED_FLAGS = " +-*="
+
+
+class RefsError(Exception):
+    """Raised when the operations are malformed or git fails outside any single ref."""
+
+
+def _git(cwd: Optional[str], *args: str, input: Optional[str] = None,
+         timeout: float = REFS_TIMEOUT) -> subprocess.CompletedProcess:
+    return process.run_process(["git"] + list(args), timeout=timeout, cwd=cwd, input=input)
+
+
+def parse_ops(ops: Any) -> List[Dict[str, Optional[str]]]:
+    """Check and normalise a list of operations (or its JSON text).
+
+    The result has ``action``, ``ref``, ``new`` (``None`` for delete and
+    verify) and ``old``: ``None`` to skip the check, ``""`` when the ref
+    must not exist.
+    """
+    if isinstance(ops, str):
+        ops = json.loads(ops)
+    if not isinstance(ops, list):
+        raise RefsError("operations must be a list")
+    parsed = []
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise RefsError(f"operation {n} is not an object")
+        action, ref = op.get("action"), op.get("ref")
+        if action not in ACTIONS:
+            raise RefsError(f"operation {n} has unknown action {action!r}")
+        if not isinstance(ref, str) or not ref.startswith("refs/"):
+            raise RefsError(f"operation {n} needs a full ref name under refs/, not {ref!r}")
+        new, old = op.get("new"), op.get("old")
+        if not all(value is None or isinstance(value, str) for value in (new, old)):
+            raise RefsError(f"operation {n}: new and old must be strings")
+        if (new is not None) != (action in ("create", "update")):
+            raise RefsError(f"operation {n}: {action} {'needs' if new is None else 'takes no'} new value")
+        if old is not None and _ZERO_RE.match(old):
+            old = ""
+        if action == "create":
+            if old:
+                raise RefsError(f"operation {n}: create expects {ref} to be absent; it takes no old value")
+            old = ""
+        elif action == "update" and old == "":
+            action = "create"
+        elif action == "delete" and old == "":
+            raise RefsError(f"operation {n}: delete expects {ref} to exist; give its old value or none")
+        elif action == "verify" and old is None:
+            raise RefsError(f"operation {n}: verify needs an old value")
+        for value in (ref, new, old):
+            if value is not None and ("\n" in value or "\0" in value):
+                raise RefsError(f"operation {n} has a line break or NUL in a value")
+        parsed.append({"action": action, "ref": ref, "new": new, "old": old})
+    return parsed
+
+
+def resolve(names: List[str], cwd: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Object ids of revisions and ref names in one ``git cat-file --batch-check``; ``None`` when missing."""
+    names = [name for name in dict.fromkeys(names) if not _OID_RE.match(name)]
+    resolved: Dict[str, Optional[str]] = {}
+    if names:
+        result = _git(cwd, "cat-file", "--batch-check=%(objectname)", input="".join(name + "\n" for name in names))
+        if result.returncode != 0:
+            raise RefsError((result.stderr or "").strip() or f"git cat-file exited with {result.returncode}")
+        lines = result.stdout.splitlines()
+        if len(lines) != len(names):
+            raise RefsError(f"git cat-file answered {len(lines)} of {len(names)} names")
+        for name, line in zip(names, lines):
+            resolved[name] = line if _OID_RE.match(line) else None
+    return resolved
+
+
+def _value(resolved: Dict[str, Optional[str]], name: Optional[str]) -> Optional[str]:
+    if not name:
+        return name
+    return name if _OID_RE.match(name) else resolved.get(name)
+
+
+def _result(op: Dict[str, Optional[str]], status: str, error: Optional[str] = None, **values: Any) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"ref": op["ref"], "action": op["action"], "status": status}
+    result.update(values)
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def _check(ops: List[Dict[str, Optional[str]]], resolved: Dict[str, Optional[str]],
+           current: bool) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+    """A rejection reason (or ``None``) per operation, and the resolved new values."""
+    reasons: List[Optional[str]] = []
+    news: List[Optional[str]] = []
+    seen = set()
+    for op in ops:
+        new, old = _value(resolved, op["new"]), _value(resolved, op["old"])
+        news.append(new)
+        if op["ref"] in seen:
+            reasons.append(f"{op['ref']} appears more than once")
+        elif op["new"] is not None and new is None:
+            reasons.append(f"cannot resolve new value {op['new']}")
+        elif op["old"] and old is None:
+            reasons.append(f"cannot resolve old value {op['old']}")
+        elif not current:
+            reasons.append(None)
+        elif op["old"] == "" and resolved.get(op["ref"]) is not None:
+            reasons.append(f"{op['ref']} already exists")
+        elif old and resolved.get(op["ref"]) != old:
+            reasons.append(f"{op['ref']} is at {resolved.get(op['ref']) or 'nothing'} but expected {old}")
+        else:
+            reasons.append(None)
+        seen.add(op["ref"])
+    return reasons, news
+
+
+def _instruction(op: Dict[str, Optional[str]], new: Optional[str], old: Optional[str]) -> str:
+    if op["action"] == "create":
+        return f"create {op['ref']}\0{new}\0"
+    if op["action"] == "update":
+        return f"update {op['ref']}\0{new}\0{old or ''}\0"
+    return f"{op['action']} {op['ref']}\0{old or ''}\0"
+
+
+def _culprit(stderr: str, refs: List[str]) -> Optional[str]:
+    """The first of ``refs`` named in git's error message."""
+    pending = set(refs)
+    for name in _ERROR_REF_RE.findall(stderr):
+        if name in pending:
+            return name
+    return None
+
+
+def _aborted(results: List[Optional[Dict[str, Any]]], ops: List[Dict[str, Optional[str]]], error: str,
+             **values: List[Any]) -> None:
+    for n, op in enumerate(ops):
+        if results[n] is None:
+            results[n] = _result(op, "aborted", error, **{key: column[n] for key, column in values.items()})
+
+
+def apply(ops: Any, cwd: Optional[str] = None, mode: str = ATOMIC, message: Optional[str] = None,
+          timeout: float = REFS_TIMEOUT) -> List[Dict[str, Any]]:
+    """Apply the operations to the repository at ``cwd``; returns one result per operation, in order.
+
+    Each result has ``ref``, ``action``, ``status``, ``old`` (the ref's
+    value before, ``None`` when absent), ``new`` and, unless applied,
+    ``error``. ``message`` goes to the reflog.
+    """
+    if mode not in MODES:
+        raise RefsError(f"unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+    ops = parse_ops(ops)
+    command = ["update-ref", "--stdin", "-z"] + (["-m", message] if message else [])
+    with locking.hold(locking.WRITE, cwd):
+        names = [op["ref"] for op in ops] + [value for op in ops for value in (op["new"], op["old"]) if value]
+        resolved = resolve(names, cwd)
+        reasons, news = _check(ops, resolved, current=True)
+        befores = [resolved.get(op["ref"]) for op in ops]
+        results: List[Optional[Dict[str, Any]]] = [
+            None if reason is None else _result(op, "rejected", reason, old=befores[n], new=news[n])
+            for n, (op, reason) in enumerate(zip(ops, reasons))]
+        if mode == ATOMIC and any(results):
+            _aborted(results, ops, "another operation was rejected", old=befores, new=news)
+            return results  # type: ignore[return-value]
+        pending = [n for n, result in enumerate(results) if result is None]
+        while pending:
+            stdin = "".join(_instruction(ops[n], news[n], _value(resolved, ops[n]["old"])) for n in pending)
+            completed = _git(cwd, *command, input=stdin, timeout=timeout)
+            if completed.returncode == 0:
+                for n in pending:
+                    results[n] = _result(ops[n], "applied", old=befores[n], new=news[n])
+                break
+            error = (completed.stderr or "").strip() or f"git update-ref exited with {completed.returncode}"
+            culprit = _culprit(error, [ops[n]["ref"] for n in pending])
+            failed = [n for n in pending if culprit is None or ops[n]["ref"] == culprit]
+            for n in failed:
+                results[n] = _result(ops[n], "failed", error, old=befores[n], new=news[n])
+            if mode == ATOMIC:
+                _aborted(results, ops, "another operation failed", old=befores, new=news)
+                break
+            pending = [n for n in pending if n not in failed]
+    return results  # type: ignore[return-value]
+
+
+def _push_status(flag: str, summary: str) -> str:
+    if flag in _PUSHED_FLAGS:
+        return "applied"
+    return "aborted" if "atomic push failed" in summary else "rejected"
+
+
+def push(ops: Any, remote: str, cwd: Optional[str] = None, mode: str = ATOMIC, batch: int = PUSH_BATCH,
+         timeout: float = PUSH_TIMEOUT) -> List[Dict[str, Any]]:
+    """Apply the operations to ``remote`` with ``git push``; returns one result per operation, in order.
+
+    In atomic mode every refspec goes out in one ``--atomic`` push; a list
+    too long for one command line raises ``RefsError`` rather than being
+    split into pushes that could fail apart. In best-effort mode refspecs
+    go out ``batch`` at a time. ``old`` values become ``--force-with-lease``
+    expectations; ``verify`` has no push equivalent and is rejected.
+    Results have ``ref``, ``action``, ``status``, ``new``, ``summary``
+    (git's, when pushed) and ``error``.
+    """
+    if mode not in MODES:
+        raise RefsError(f"unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+    if batch < 1:
+        raise RefsError("batch must be at least 1")
+    ops = parse_ops(ops)
+    with locking.hold(locking.WRITE, cwd):
+        resolved = resolve([value for op in ops for value in (op["new"], op["old"]) if value], cwd)
+        reasons, news = _check(ops, resolved, current=False)
+        reasons = [reason or ("verify has no push equivalent" if op["action"] == "verify" else None)
+                   for op, reason in zip(ops, reasons)]
+        results: List[Optional[Dict[str, Any]]] = [
+            None if reason is None else _result(op, "rejected", reason, new=news[n])
+            for n, (op, reason) in enumerate(zip(ops, reasons))]
+        if mode == ATOMIC and any(results):
+            _aborted(results, ops, "another operation was rejected", new=news)
+            return results  # type: ignore[return-value]
+        pending = [n for n, result in enumerate(results) if result is None]
+        if mode == ATOMIC:
+            chunks = [pending] if pending else []
+        else:
+            chunks = [pending[start:start + batch] for start in range(0, len(pending), batch)]
+        for chunk in chunks:
+            leases = [f"--force-with-lease={ops[n]['ref']}:{_value(resolved, ops[n]['old'])}" for n in chunk
+                      if ops[n]["old"] is not None]
+            refspecs = [f"{news[n] or ''}:{ops[n]['ref']}" for n in chunk]
+            if mode == ATOMIC and sum(len(arg) + 1 for arg in leases + refspecs) > ATOMIC_PUSH_MAX_BYTES:
+                raise RefsError(f"{len(chunk)} refs do not fit in one atomic git push; "
+                                "split the operations or use best-effort mode")
+            command = ["push", "--porcelain"] + (["--atomic"] if mode == ATOMIC else []) + leases + [remote]
+            completed = _git(cwd, *(command + refspecs), timeout=timeout)
+            by_ref = {}
+            for line in completed.stdout.splitlines():
+                fields = line.split("\t")
+                if len(fields) == 3 and ":" in fields[1]:
+                    by_ref[fields[1].split(":", 1)[1]] = (line[0], fields[2])
+            error = (completed.stderr or "").strip() or f"git push exited with {completed.returncode}"
+            for n in chunk:
+                if ops[n]["ref"] not in by_ref:
+                    results[n] = _result(ops[n], "failed", error, new=news[n])
+                    continue
+                flag, summary = by_ref[ops[n]["ref"]]
+                status = _push_status(flag, summary)
+                results[n] = _result(ops[n], status, None if status == "applied" else summary, new=news[n],
+                                     summary=summary)
+    return results  # type: ignore[return-value]
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """How many operations ended in each status."""
+    return dict(sorted(collections.Counter(result["status"] for result in results).items()))
+
+
+def manage(args: Dict[str, Any], cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Apply ``args["ops"]`` (a list or its JSON text) or the JSON in ``args["file"]`` for the plugin CLI.
+
+    ``args["mode"]`` is ``atomic`` (default) or ``best-effort``;
+    ``args["remote"]`` pushes to that remote instead of updating the local
+    refs (``args["batch"]`` refspecs at a time in best-effort mode), and
+    ``args["message"]`` is the reflog message of a local update. ``result``
+    has one result per operation and ``summary`` counts them by status.
+    ``success`` means the operations ran; refs that were not applied are
+    counted in the summary.
+    """
+    start = time.perf_counter()
+    try:
+        ops = args.get("ops")
+        if ops is None and args.get("file"):
+            with open(args["file"], encoding="utf-8") as f:
+                ops = f.read()
+        if ops is None:
+            raise RefsError("ops or file is required")
+        mode = args.get("mode") or ATOMIC
+        if args.get("remote"):
+            batch = int(args["batch"]) if args.get("batch") is not None else PUSH_BATCH
+            results = push(ops, args["remote"], cwd, mode, batch)
+        else:
+            results = apply(ops, cwd, mode, args.get("message"))
+    except (RefsError, OSError, ValueError, subprocess.TimeoutExpired, locking.LockTimeout) as e:
+        return {"success": False, "error": str(e), "error_code": "REFS_FAILED"}
+    return {"success": True, "result": results, "summary": summarize(results), "mode": mode,
+            "elapsed": time.perf_counter() - start}
@@ -13,11 +13,82 @@ import shlex
 import subprocess
 import sys
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
+# Shared helpers live in the top-level ``plugins`` package; make it importable
+# when this file is executed directly as a script (python plugins/git/cli.py).
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PACKAGE_ROOT not in sys.path:  # pragma: no cover - only when run as a script
+    sys.path.insert(0, _PACKAGE_ROOT)
 
-def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = False, cwd: Optional[str] = None) -> Dict[str, Any]:
-    """Execute the git command."""
+from plugins import metrics, mirrors, process, telemetry, tracing
+from plugins.git import (analytics, bulkrefs, fastpath, fleet, locking, parallelism, prefetch, presets, search,
+                         structured, tuning, worktrees)
+
+
+def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = False, cwd: Optional[str] = None,
+        enqueued_ns: Optional[int] = None) -> Dict[str, Any]:
+    """Execute the git command.
+
+    ``enqueued_ns`` is the ``time.perf_counter_ns()`` timestamp at which a
+    batching caller queued this call; when given, the queue wait is reported
+    in the response timings.
+
+    When tracing is enabled (``SMCP_TRACE_FILE``), ``args["traceparent"]``
+    may carry the W3C trace context of the calling operation.
+
+    ``args["preset"]`` (``blobless``, ``treeless``, ``shallow`` or
+    ``sparse``) adds partial, shallow or sparse clone options to ``clone``
+    and ``fetch``; ``args["sparse"]`` lists the directories a sparse clone
+    checks out (see ``plugins.git.presets``).
+
+    With ``args["mirror"]`` set, a clone borrows objects from a local
+    mirror of its remote (see ``plugins.mirrors``), reported in ``mirror``.
+
+    With ``args["structured"]`` set, supported subcommands (see
+    ``plugins.git.structured``) run in git's machine-readable format and
+    ``result`` holds a JSON array of parsed records instead of text.
+    ``args["limit"]``, ``args["cursor"]`` and ``args["output"]`` (an NDJSON
+    file to stream the records to) page through large outputs (``log`` and
+    ``diff`` included); listings also take ``columns``, ``prefix`` and
+    ``glob``, and ``blame`` takes ``lines`` (stop once that range is
+    attributed). A structured ``diff`` with ``summary`` returns per-file
+    line counts, modes, oids and sizes with binaries flagged; with
+    ``paths`` it returns the patches of just those files, each capped at
+    ``max_bytes``. A structured ``grep`` returns one record per matching
+    line and stops git once ``limit`` matches are in.
+
+    Commands run under their repository's reader-writer lock (see
+    ``plugins.git.locking``): reads in parallel, writes one at a time.
+    ``lock`` in the response names the lock held and ``timings`` includes
+    the wait for it. With ``args["worktree"]`` (a revision, or ``True`` for
+    ``HEAD``), the command runs in a worktree leased from the repository's
+    pool (see ``plugins.git.worktrees``) and reported in ``worktree``.
+
+    Fetches, clones, checkouts, index readers and pack writers get
+    ``fetch.parallel``, ``submodule.fetchJobs``, ``checkout.workers``,
+    ``index.threads`` and ``pack.threads`` as ``-c`` options, sized to
+    their share of a job budget shared by all calls in flight (see
+    ``plugins.git.parallelism``) and reported in ``parallelism``;
+    ``command`` shows the command line as given.
+
+    With ``SMCP_PREFETCH_FILE`` set, fetches, pulls and ``remote update``
+    are counted per repository and remote, so the ``prefetch`` command can
+    fetch the busiest remotes ahead of time (see ``plugins.git.prefetch``).
+    """
+    span = None if dry_run else tracing.start_span("git", args)
+    response = _run_command(args, dry_run, non_interactive, cwd, enqueued_ns)
+    if not response.get("dry_run"):
+        metrics.record_response("git", response)
+    tracing.finish_span(span, response, cwd)
+    return response
+
+
+def _run_command(args: Dict[str, Any], dry_run: bool, non_interactive: bool, cwd: Optional[str],
+                 enqueued_ns: Optional[int]) -> Dict[str, Any]:
+    """Build, execute and classify a single git invocation."""
+    timer = telemetry.PhaseTimer(enqueued_ns)
+    lease = None
     try:
         # Validate working directory if specified (fixes issue #3, #9)
         if cwd is not None:
@@ -25,7 +96,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 return {
                     "success": False,
                     "error": f"Working directory does not exist: {cwd}",
-                    "error_code": "INVALID_CWD"
+                    "error_code": "INVALID_CWD",
+                    "timings": timer.as_dict()
                 }
             cwd = os.path.abspath(cwd)
         
@@ -55,6 +127,49 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
         if non_interactive and "--yes" not in cmd_args and "-y" not in cmd_args:
             cmd_args.append("--yes")
         
+        # Partial, shallow and sparse clone presets add their options to clone and fetch
+        sparse_directories: List[str] = []
+        if args.get("preset") or args.get("sparse"):
+            try:
+                cmd_args, sparse_directories = presets.apply(cmd_args, args.get("preset"), args.get("sparse"))
+            except ValueError as e:
+                return {
+                    "success": False,
+                    "error": f"Invalid preset: {e}",
+                    "error_code": "INVALID_PRESET",
+                    "timings": timer.as_dict()
+                }
+        
+        # Reads share the repository's lock, writes wait for it alone; classify before structured rewrites
+        lock_kind = locking.classify(cmd_args, private_worktree=bool(args.get("worktree")))
+        
+        # Run in a pooled worktree of the repository, checked out at the requested revision
+        if args.get("worktree") and not dry_run:
+            lease = worktrees.acquire(args["worktree"], cwd)
+            cwd = lease.path
+            timer.mark("lease")
+        
+        # Structured mode: switch to git's machine-readable format and parse it as it streams
+        mode = None
+        if args.get("structured"):
+            try:
+                mode = structured.prepare(cmd_args, args, cwd)
+            except ValueError as e:
+                return {
+                    "success": False,
+                    "error": f"Invalid structured option: {e}",
+                    "error_code": "INVALID_STRUCTURED_OPTION",
+                    "timings": timer.as_dict()
+                }
+            if mode is None:
+                return {
+                    "success": False,
+                    "error": f"Structured output is not supported for: {' '.join(cmd_args)}",
+                    "error_code": "STRUCTURED_UNSUPPORTED",
+                    "timings": timer.as_dict()
+                }
+            cmd_args = mode.cmd_args
+        
         # Dry run mode: return what would be executed without running
         if dry_run:
             return {
@@ -62,19 +177,41 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 "command": " ".join(cmd_args),
                 "cmd_args": cmd_args,
                 "args_received": args,
-                "cwd": cwd
+                "cwd": cwd,
+                "timings": timer.as_dict()
             }
         
+        # Borrow objects from a local mirror of the remote being cloned
+        mirror = None
+        parallel = None
+        if args.get("mirror"):
+            cmd_args, mirror = mirrors.rewrite_clone(cmd_args)
+            timer.mark("mirror")
+        
         # Execute command
-        start_time = time.time()
-        result = subprocess.run(
-            cmd_args,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=cwd
-        )
-        elapsed = time.time() - start_time
+        timer.mark("setup")
+        start_time = time.perf_counter()
+        with locking.hold(lock_kind, cwd) as held:
+            timer.mark("lock_wait")
+            if mode is not None:
+                result = structured.run(mode, cwd=cwd, timer=timer, timeout=30, output=args.get("output"))
+            else:
+                # Trivial ref, object and index reads are answered from .git without spawning git
+                result = fastpath.fast_read(cmd_args, cwd)
+                if result is not None:
+                    timer.mark("in_process")
+                else:
+                    # Fetch, checkout, pack and index settings sized to this call's share of the job budget
+                    with parallelism.lease(cmd_args, cwd) as (run_args, parallel):
+                        result = process.run_process(run_args, timeout=30, cwd=cwd, timer=timer)
+        # Count the remotes fetches and pulls use, for the background prefetch (SMCP_PREFETCH_FILE)
+        prefetch.record(cmd_args, cwd)
+        # A sparse clone checks out only the top-level files; now add the requested directories
+        sparse = None
+        if sparse_directories and result.returncode == 0:
+            sparse = presets.sparse_checkout(cmd_args, sparse_directories, cwd)
+            timer.mark("sparse_checkout")
+        elapsed = time.perf_counter() - start_time
         
         # Return result in SMCP-compatible format
         # Always pass through output (stdout and/or stderr) regardless of return code
@@ -101,20 +238,49 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
             response["stdout"] = result.stdout
         if result.stderr:
             response["stderr"] = result.stderr
+        if result.resources is not None:
+            response["resources"] = result.resources  # Child rusage (CPU, max RSS, I/O, context switches)
+        if held is not None:
+            response["lock"] = held  # "read" or "write": the repository lock the command ran under
+        if mirror is not None:
+            response["mirror"] = mirror  # The mirror used and whether it was created or refreshed
+        if parallel is not None:
+            response["parallelism"] = parallel  # The jobs granted and the -c settings added for them
+        if sparse is not None:
+            response["sparse"] = sparse  # The clone's path and the directories checked out in it
+        if lease is not None:
+            response["worktree"] = lease.as_dict()  # Reset and handed back to the pool once this returns
+        if mode is not None:
+            response["stdout_bytes"] = result.stdout_bytes  # Parsed on the fly, never kept as text
+            response["record_count"] = result.record_count
+            if result.truncated:
+                response["truncated"] = True  # The limit stopped git early
+            if result.next_cursor is not None:
+                response["next_cursor"] = result.next_cursor
         
         # Check for idempotent scenarios (fixes issue #10)
         idempotent_info = _check_idempotency(result, command_str)
         
         # Standardize response format (fixes issue #9)
-        response["success"] = result.returncode == 0 or idempotent_info["is_idempotent"]
+        # A structured call that stopped git at its limit succeeded even though git was killed
+        completed = result.returncode == 0 or (mode is not None and (
+            result.stopped or result.returncode in mode.exit_codes))
+        response["success"] = completed or idempotent_info["is_idempotent"]
         
-        if result.returncode == 0 or idempotent_info["is_idempotent"]:
+        if completed or idempotent_info["is_idempotent"]:
             # Success or idempotent (already in desired state)
-            if idempotent_info["is_idempotent"]:
+            if mode is not None and completed:
+                if result.records is not None:
+                    response["result"] = result.records
+                else:
+                    response["result"] = f"Wrote {result.record_count} records to {args['output']}"
+            elif idempotent_info["is_idempotent"]:
                 response["idempotent"] = True  # Mark as idempotent operation (fixes issue #10)
                 response["result"] = idempotent_info.get("message", output) if output else "Operation already in desired state"
             else:
                 response["result"] = output if output else "Command completed successfully"
+            timer.mark("classify")
+            response["timings"] = timer.as_dict()
             return response
         else:
             # Non-zero return code: enhance error messages with context (fixes issue #6, #9)
@@ -125,6 +291,8 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                 error_hints = _analyze_error(result.stderr, command_str, cwd)
                 if error_hints:
                     response["error_hints"] = error_hints
+                timer.mark("classify")
+                response["timings"] = timer.as_dict()
                 return response
             else:
                 # No output but command failed - provide context
@@ -138,18 +306,61 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
                     "cwd": cwd,
                     "args_received": args
                 }
+                timer.mark("classify")
+                response["timings"] = timer.as_dict()
                 return response
         
-    except subprocess.TimeoutExpired:
-        command_str = " ".join(cmd_args) if 'cmd_args' in locals() else "git [command]"
+    except presets.PresetError as e:
+        return {
+            "success": False,
+            "error": f"Sparse checkout: {e}",
+            "error_code": "SPARSE_CHECKOUT_FAILED",
+            "command": " ".join(cmd_args),
+            "timings": timer.as_dict()
+        }
+    except worktrees.LeaseTimeout as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_code": "LEASE_TIMEOUT",
+            "command": " ".join(cmd_args),
+            "error_type": "lease_timeout",
+            "suggestion": f"Every pooled worktree is in use. Retry later or raise {worktrees.POOL_SIZE_ENV}.",
+            "timings": timer.as_dict()
+        }
+    except worktrees.WorktreeError as e:
         return {
+            "success": False,
+            "error": f"Worktree pool: {e}",
+            "error_code": "WORKTREE_FAILED",
+            "command": " ".join(cmd_args),
+            "timings": timer.as_dict()
+        }
+    except locking.LockTimeout as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_code": "LOCK_TIMEOUT",
+            "command": " ".join(cmd_args),
+            "error_type": "lock_timeout",
+            "suggestion": f"Another command is still using the repository. Retry later or raise {locking.LOCK_TIMEOUT_ENV}.",
+            "timings": timer.as_dict()
+        }
+    except subprocess.TimeoutExpired as e:
+        command_str = " ".join(cmd_args) if 'cmd_args' in locals() else "git [command]"
+        response = {
             "success": False,
             "error": f"Command timed out after 30 seconds",
             "error_code": "TIMEOUT",
             "command": command_str,
             "error_type": "timeout",
-            "suggestion": "The command may be waiting for input or taking too long. Try using --non-interactive flag or check network connectivity."
+            "suggestion": "The command may be waiting for input or taking too long. Try using --non-interactive flag or check network connectivity.",
+            "timings": timer.as_dict()
         }
+        resources = getattr(e, "resources", None)
+        if resources is not None:
+            response["resources"] = resources  # Usage of the killed child
+        return response
     except Exception as e:
         command_str = " ".join(cmd_args) if 'cmd_args' in locals() else "git [command]"
         return {
@@ -161,8 +372,12 @@ def run(args: Dict[str, Any], dry_run: bool = False, non_interactive: bool = Fal
             "command_context": {
                 "args_received": args,
                 "cwd": cwd
-            }
+            },
+            "timings": timer.as_dict()
         }
+    finally:
+        if lease is not None:
+            lease.release()  # Never raises: a worktree it fails to reset is reset by its next lease
 
 
 def _check_idempotency(result: subprocess.CompletedProcess, command: str) -> Dict[str, Any]:
@@ -279,6 +494,452 @@ def describe() -> Dict[str, Any]:
                         "description": "ARGS argument",
                         "required": False,
                         "default": None
+                    },
+                    {
+                        "name": "structured",
+                        "type": "boolean",
+                        "description": "Return parsed records instead of text (supported: status, ls-files, ls-tree, log, diff, blame, grep)",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "limit",
+                        "type": "integer",
+                        "description": "Structured mode: maximum records to return (listings default to 10000, log to 100, diff and grep to 1000)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "cursor",
+                        "type": "string",
+                        "description": "Structured mode: next_cursor of the previous page",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "output",
+                        "type": "string",
+                        "description": "Structured mode: write the records to this file as NDJSON instead of returning them",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "columns",
+                        "type": "string",
+                        "description": "Listings: comma-separated extra columns (mode, oid, size)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "prefix",
+                        "type": "string",
+                        "description": "Listings: only paths starting with this prefix",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "glob",
+                        "type": "string",
+                        "description": "Listings: only paths matching this fnmatch pattern",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "lines",
+                        "type": "string",
+                        "description": "Structured blame: 'start,end' line range; git stops once it is attributed",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "summary",
+                        "type": "boolean",
+                        "description": "Structured diff: per-file line counts, modes, oids, sizes and a binary flag instead of patches",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "paths",
+                        "type": "array",
+                        "description": "Structured diff: return the patches of only these files",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "max_bytes",
+                        "type": "integer",
+                        "description": "Structured diff with paths: bytes kept of each file's patch (default 65536); the rest is counted and marked truncated",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "worktree",
+                        "type": "string",
+                        "description": "Run in a pooled worktree checked out (detached) at this revision (true: HEAD), so calls on one repository run in parallel",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "preset",
+                        "type": "string",
+                        "description": "Clone and fetch: blobless (--filter=blob:none), treeless (--filter=tree:0), shallow (--depth=1, single branch) or sparse (blobless cone-mode sparse checkout)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "sparse",
+                        "type": "array",
+                        "description": "Sparse clone: directories to check out besides the top-level files (implies preset=sparse)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "mirror",
+                        "type": "boolean",
+                        "description": "Clones: borrow objects from a local mirror of the remote (--reference-if-able with --dissociate), creating or refreshing it as needed",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "traceparent",
+                        "type": "string",
+                        "description": "W3C traceparent of the calling operation (used when SMCP_TRACE_FILE is set)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "metrics",
+                "description": "Render plugin execution metrics in Prometheus text format",
+                "parameters": [
+                    {
+                        "name": "output",
+                        "type": "string",
+                        "description": "File to write the metrics to (for a textfile collector)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "analytics",
+                "description": "Aggregate commit history (churn, file hotness, cadence) from columnar git log --numstat data",
+                "parameters": [
+                    {
+                        "name": "args",
+                        "type": "string",
+                        "description": "Extra git log arguments (range, --since, pathspecs)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "group_by",
+                        "type": "string",
+                        "description": "author, path or time",
+                        "required": False,
+                        "default": "author"
+                    },
+                    {
+                        "name": "metric",
+                        "type": "string",
+                        "description": "commits, added, deleted or churn",
+                        "required": False,
+                        "default": "commits"
+                    },
+                    {
+                        "name": "bucket",
+                        "type": "string",
+                        "description": "Time bucket for group_by=time: hour, day, week, month, year or seconds",
+                        "required": False,
+                        "default": "week"
+                    },
+                    {
+                        "name": "top",
+                        "type": "integer",
+                        "description": "Return only the largest groups, largest first",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "save",
+                        "type": "string",
+                        "description": "Write the columns to this file for later loads",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "load",
+                        "type": "string",
+                        "description": "Memory-map columns saved earlier instead of running git log",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "search",
+                "description": "Search commit messages and authors through an incremental SQLite FTS5 index of the history",
+                "parameters": [
+                    {
+                        "name": "query",
+                        "type": "string",
+                        "description": "Words that must all appear in the commit subject, body or author",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "match",
+                        "type": "string",
+                        "description": "Raw SQLite FTS5 expression (AND, OR, NOT, prefix*, column filters)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "author",
+                        "type": "string",
+                        "description": "Phrase to find in the author name or email",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "since",
+                        "type": "string",
+                        "description": "Earliest committer time (epoch seconds or ISO 8601)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "until",
+                        "type": "string",
+                        "description": "Latest committer time (epoch seconds or ISO 8601)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "order",
+                        "type": "string",
+                        "description": "rank (best match first) or date (newest first)",
+                        "required": False,
+                        "default": "rank"
+                    },
+                    {
+                        "name": "limit",
+                        "type": "integer",
+                        "description": "Maximum commits to return",
+                        "required": False,
+                        "default": 50
+                    },
+                    {
+                        "name": "sync",
+                        "type": "boolean",
+                        "description": "Bring a stale index up to date before searching",
+                        "required": False,
+                        "default": True
+                    },
+                    {
+                        "name": "index",
+                        "type": "string",
+                        "description": "Index database path (default: smcp-commit-index.sqlite in the common git directory)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "mirrors",
+                "description": "List the local clone mirror cache, refreshing stale mirrors first if asked",
+                "parameters": [
+                    {
+                        "name": "refresh",
+                        "type": "boolean",
+                        "description": "Fetch every mirror older than max_age",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "max_age",
+                        "type": "number",
+                        "description": "Seconds after which a mirror is stale (default: SMCP_MIRROR_REFRESH_SECONDS or 300)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "worktrees",
+                "description": "List, pre-create or prune the pooled worktrees that the worktree option of run leases",
+                "parameters": [
+                    {
+                        "name": "warm",
+                        "type": "integer",
+                        "description": "Create worktrees until this many exist (true: the pool size)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "prune",
+                        "type": "number",
+                        "description": "Remove worktrees not leased for this many seconds (true: SMCP_WORKTREE_IDLE_SECONDS)",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "size",
+                        "type": "integer",
+                        "description": "Pool size (default: SMCP_WORKTREE_POOL_SIZE or 4)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "tune",
+                "description": "Inspect a repository and apply commit-graph, multi-pack-index, repack and index settings, timing common commands before and after",
+                "parameters": [
+                    {
+                        "name": "dry_run",
+                        "type": "boolean",
+                        "description": "Only report the inspection and the planned steps",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "runs",
+                        "type": "integer",
+                        "description": "Timed runs of status, log -- <path> and rev-list --count before and after (0: skip)",
+                        "required": False,
+                        "default": 3
+                    },
+                    {
+                        "name": "path",
+                        "type": "string",
+                        "description": "File that the timed log -- <path> follows (default: a tracked file)",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "prefetch",
+                "description": "Fetch the most used remotes into refs/prefetch/ ahead of time, at low priority, and list the tracked remotes (needs SMCP_PREFETCH_FILE)",
+                "parameters": [
+                    {
+                        "name": "list",
+                        "type": "boolean",
+                        "description": "Only list the tracked remotes with their interval and seconds until due",
+                        "required": False,
+                        "default": False
+                    },
+                    {
+                        "name": "limit",
+                        "type": "integer",
+                        "description": "Maximum remotes to prefetch, highest score first",
+                        "required": False,
+                        "default": 10
+                    }
+                ]
+            },
+            {
+                "name": "fleet",
+                "description": "Run one git command across many repositories in parallel, returning each repository's response as it finishes and a summary with counts and the slowest repositories",
+                "parameters": [
+                    {
+                        "name": "command",
+                        "type": "string",
+                        "description": "The git subcommand to run in every repository",
+                        "required": True,
+                        "default": None
+                    },
+                    {
+                        "name": "args",
+                        "type": "array",
+                        "description": "Arguments of the command",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "paths",
+                        "type": "array",
+                        "description": "Repository paths to run in",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "root",
+                        "type": "string",
+                        "description": "Directory to find the repositories under, when paths is not given",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "depth",
+                        "type": "integer",
+                        "description": "Directories below root to look for repositories in",
+                        "required": False,
+                        "default": 3
+                    },
+                    {
+                        "name": "jobs",
+                        "type": "integer",
+                        "description": "Repositories to run in at once",
+                        "required": False,
+                        "default": 8
+                    },
+                    {
+                        "name": "slowest",
+                        "type": "integer",
+                        "description": "Slowest repositories to list in the summary",
+                        "required": False,
+                        "default": 5
+                    },
+                    {
+                        "name": "output",
+                        "type": "string",
+                        "description": "Write each repository's response to this file as NDJSON as it finishes, instead of returning them",
+                        "required": False,
+                        "default": None
+                    }
+                ]
+            },
+            {
+                "name": "refs",
+                "description": "Create, update, delete or verify many refs in one update-ref transaction, or push them to a remote in one git push --atomic, with a result per ref",
+                "parameters": [
+                    {
+                        "name": "ops",
+                        "type": "array",
+                        "description": "Operations: objects with action (create, update, delete or verify), ref (a full ref name), new and old (an empty old means the ref must not exist)",
+                        "required": True,
+                        "default": None
+                    },
+                    {
+                        "name": "mode",
+                        "type": "string",
+                        "description": "atomic applies every operation or none; best-effort applies those that can be",
+                        "required": False,
+                        "default": "atomic"
+                    },
+                    {
+                        "name": "message",
+                        "type": "string",
+                        "description": "Reflog message of a local update",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "remote",
+                        "type": "string",
+                        "description": "Push the operations to this remote instead of updating the local refs",
+                        "required": False,
+                        "default": None
+                    },
+                    {
+                        "name": "batch",
+                        "type": "integer",
+                        "description": "Refspecs per git push in best-effort mode",
+                        "required": False,
+                        "default": 500
                     }
                 ]
             }
@@ -293,7 +954,16 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Available commands:
-  run    Execute the git command
+  run        Execute the git command
+  metrics    Render execution metrics in Prometheus text format
+  analytics  Aggregate commit history by author, path or time
+  search     Search commit messages through an incremental index
+  mirrors    List or refresh the local clone mirror cache
+  worktrees  List, pre-create or prune the pooled worktrees
+  tune       Inspect a repository and apply maintenance that speeds git up
+  prefetch   Fetch the most used remotes ahead of time, in the background
+  fleet      Run one git command across many repositories in parallel
+  refs       Create, update or delete many refs in one transaction
 
 Examples:
   python cli.py run --command <value> --args <value>
@@ -313,6 +983,97 @@ Examples:
     pass
     run_parser.add_argument("--command", dest="arg_command", help="COMMAND argument")
     run_parser.add_argument("--args", nargs="*", dest="arg_args", help="ARGS argument (optional)")
+    run_parser.add_argument("--structured", action="store_true", dest="structured", help="Return parsed records instead of text (supported: status, ls-files, ls-tree, log, diff, blame, grep)")
+    run_parser.add_argument("--limit", type=int, dest="limit", help="Structured mode: maximum records to return")
+    run_parser.add_argument("--cursor", dest="cursor", help="Structured mode: next_cursor of the previous page")
+    run_parser.add_argument("--output", dest="output", help="Structured mode: write the records to this file as NDJSON")
+    run_parser.add_argument("--columns", dest="columns", help="Listings: comma-separated extra columns (mode, oid, size)")
+    run_parser.add_argument("--prefix", dest="prefix", help="Listings: only paths starting with this prefix")
+    run_parser.add_argument("--glob", dest="glob", help="Listings: only paths matching this fnmatch pattern")
+    run_parser.add_argument("--lines", dest="lines", help="Structured blame: 'start,end' line range to attribute")
+    run_parser.add_argument("--summary", action="store_true", dest="summary", help="Structured diff: per-file counts, modes, oids and sizes")
+    run_parser.add_argument("--paths", nargs="+", dest="paths", help="Structured diff: return the patches of only these files")
+    run_parser.add_argument("--max-bytes", type=int, dest="max_bytes", help="Structured diff with --paths: bytes kept of each file's patch")
+    run_parser.add_argument("--worktree", dest="worktree", help="Run in a pooled worktree checked out at this revision")
+    run_parser.add_argument("--preset", choices=sorted(presets.PRESETS), dest="preset", help="Clone and fetch: partial, shallow or sparse preset")
+    run_parser.add_argument("--sparse", nargs="+", dest="sparse", help="Sparse clone: directories to check out (implies --preset sparse)")
+    run_parser.add_argument("--mirror", action="store_true", dest="mirror", help="Clones: borrow objects from a local mirror of the remote")
+    run_parser.add_argument("--traceparent", dest="traceparent", help="W3C traceparent of the calling operation (used when SMCP_TRACE_FILE is set)")
+    
+    # Metrics command
+    metrics_parser = subparsers.add_parser("metrics", help="Render execution metrics in Prometheus text format")
+    metrics_parser.add_argument("--output", dest="output", help="Write the metrics to this file")
+    
+    # Analytics command
+    analytics_parser = subparsers.add_parser("analytics", help="Aggregate commit history by author, path or time")
+    analytics_parser.add_argument("--cwd", dest="cwd", help="Repository to read the history of")
+    analytics_parser.add_argument("--args", nargs="*", dest="arg_args", help="Extra git log arguments")
+    analytics_parser.add_argument("--group-by", dest="group_by", help="author, path or time")
+    analytics_parser.add_argument("--metric", dest="metric", help="commits, added, deleted or churn")
+    analytics_parser.add_argument("--bucket", dest="bucket", help="hour, day, week, month, year or seconds")
+    analytics_parser.add_argument("--top", type=int, dest="top", help="Return only the largest groups")
+    analytics_parser.add_argument("--save", dest="save", help="Write the columns to this file")
+    analytics_parser.add_argument("--load", dest="load", help="Memory-map columns saved earlier")
+    
+    # Search command
+    search_parser = subparsers.add_parser("search", help="Search commit messages through an incremental index")
+    search_parser.add_argument("--cwd", dest="cwd", help="Repository to search")
+    search_parser.add_argument("--query", dest="query", help="Words that must all appear in the message or author")
+    search_parser.add_argument("--match", dest="match", help="Raw SQLite FTS5 expression")
+    search_parser.add_argument("--author", dest="author", help="Phrase to find in the author name or email")
+    search_parser.add_argument("--since", dest="since", help="Earliest committer time (epoch seconds or ISO 8601)")
+    search_parser.add_argument("--until", dest="until", help="Latest committer time (epoch seconds or ISO 8601)")
+    search_parser.add_argument("--order", dest="order", help="rank or date")
+    search_parser.add_argument("--limit", type=int, dest="limit", help="Maximum commits to return")
+    search_parser.add_argument("--no-sync", action="store_false", dest="sync", help="Search a stale index as it is")
+    search_parser.add_argument("--index", dest="index", help="Index database path")
+    
+    # Mirrors command
+    mirrors_parser = subparsers.add_parser("mirrors", help="List or refresh the local clone mirror cache")
+    mirrors_parser.add_argument("--refresh", action="store_true", dest="refresh", help="Fetch every stale mirror")
+    mirrors_parser.add_argument("--max-age", type=float, dest="max_age", help="Seconds after which a mirror is stale")
+    
+    # Worktrees command
+    worktrees_parser = subparsers.add_parser("worktrees", help="List, pre-create or prune the pooled worktrees")
+    worktrees_parser.add_argument("--cwd", dest="cwd", help="Repository of the pool")
+    worktrees_parser.add_argument("--warm", type=int, nargs="?", const=True, dest="warm", help="Create worktrees until this many exist (default: the pool size)")
+    worktrees_parser.add_argument("--prune", type=float, nargs="?", const=True, dest="prune", help="Remove worktrees idle for this many seconds (default: SMCP_WORKTREE_IDLE_SECONDS)")
+    worktrees_parser.add_argument("--size", type=int, dest="size", help="Pool size")
+    
+    # Tune command
+    tune_parser = subparsers.add_parser("tune", help="Inspect a repository and apply maintenance that speeds git up")
+    tune_parser.add_argument("--cwd", dest="cwd", help="Repository to tune")
+    tune_parser.add_argument("--dry-run", action="store_true", dest="dry_run", help="Only report the inspection and the planned steps")
+    tune_parser.add_argument("--runs", type=int, dest="runs", help="Timed runs of each measured command (0: skip; default: 3)")
+    tune_parser.add_argument("--path", dest="path", help="File that the timed log -- <path> follows")
+    
+    # Prefetch command
+    prefetch_parser = subparsers.add_parser("prefetch", help="Fetch the most used remotes ahead of time, in the background")
+    prefetch_parser.add_argument("--list", action="store_true", dest="list", help="Only list the tracked remotes")
+    prefetch_parser.add_argument("--limit", type=int, dest="limit", help="Maximum remotes to prefetch (default: 10)")
+    prefetch_parser.add_argument("--loop", action="store_true", dest="loop", help="Keep prefetching remotes as they fall due until interrupted")
+    
+    # Fleet command
+    fleet_parser = subparsers.add_parser("fleet", help="Run one git command across many repositories in parallel")
+    fleet_parser.add_argument("--cwd", dest="cwd", help="Directory that relative paths and root are resolved against")
+    fleet_parser.add_argument("--command", dest="arg_command", help="The git subcommand to run in every repository")
+    fleet_parser.add_argument("--args", nargs="*", dest="arg_args", help="Arguments of the command")
+    fleet_parser.add_argument("--paths", nargs="+", dest="paths", help="Repository paths to run in")
+    fleet_parser.add_argument("--root", dest="root", help="Directory to find the repositories under")
+    fleet_parser.add_argument("--depth", type=int, dest="depth", help="Directories below root to look in (default: 3)")
+    fleet_parser.add_argument("--jobs", type=int, dest="jobs", help="Repositories to run in at once (default: 8)")
+    fleet_parser.add_argument("--slowest", type=int, dest="slowest", help="Slowest repositories to list in the summary (default: 5)")
+    fleet_parser.add_argument("--output", dest="output", help="Write the responses to this file as NDJSON as they finish")
+    
+    # Refs command
+    refs_parser = subparsers.add_parser("refs", help="Create, update or delete many refs in one transaction")
+    refs_parser.add_argument("--cwd", dest="cwd", help="Repository to update or push from")
+    refs_parser.add_argument("--ops", dest="ops", help="The operations as a JSON list")
+    refs_parser.add_argument("--file", dest="file", help="Read the operations from this JSON file")
+    refs_parser.add_argument("--mode", choices=("atomic", "best-effort"), dest="mode", help="atomic (default) or best-effort")
+    refs_parser.add_argument("--message", dest="message", help="Reflog message of a local update")
+    refs_parser.add_argument("--remote", dest="remote", help="Push the operations to this remote")
+    refs_parser.add_argument("--batch", type=int, dest="batch", help="Refspecs per best-effort git push (default: 500)")
     
     args = parser.parse_args()
     
@@ -338,13 +1099,93 @@ Examples:
                 run_args["command"] = args.arg_command
             if hasattr(args, "arg_args") and args.arg_args is not None:
                 run_args["args"] = args.arg_args
+            if getattr(args, "structured", False) is True:
+                run_args["structured"] = True
+            for name in ("limit", "cursor", "output", "columns", "prefix", "glob", "lines", "max_bytes", "worktree"):
+                value = getattr(args, name, None)
+                if isinstance(value, (int, str)):
+                    run_args[name] = value
+            if getattr(args, "summary", False) is True:
+                run_args["summary"] = True
+            if isinstance(getattr(args, "paths", None), list):
+                run_args["paths"] = args.paths
+            if isinstance(getattr(args, "preset", None), str):
+                run_args["preset"] = args.preset
+            if isinstance(getattr(args, "sparse", None), list):
+                run_args["sparse"] = args.sparse
+            if getattr(args, "mirror", False) is True:
+                run_args["mirror"] = True
+            traceparent = getattr(args, "traceparent", None)
+            if isinstance(traceparent, str):
+                run_args["traceparent"] = traceparent
             # Always call run, even with no args (to show gh help)
             result = run(run_args, dry_run=dry_run, non_interactive=non_interactive, cwd=cwd)
+        elif args.command == "metrics":
+            result = metrics.export(output=getattr(args, "output", None))
+        elif args.command == "analytics":
+            analytics_args = {"args": getattr(args, "arg_args", None)}
+            for name in ("group_by", "metric", "bucket", "top", "save", "load"):
+                value = getattr(args, name, None)
+                if isinstance(value, (int, str)):
+                    analytics_args[name] = value
+            result = analytics.report(analytics_args, cwd=getattr(args, "cwd", None))
+        elif args.command == "search":
+            search_args = {"sync": getattr(args, "sync", True) is not False}
+            for name in ("query", "match", "author", "since", "until", "order", "limit", "index"):
+                value = getattr(args, name, None)
+                if isinstance(value, (int, str)):
+                    search_args[name] = value
+            result = search.search(search_args, cwd=getattr(args, "cwd", None))
+        elif args.command == "mirrors":
+            mirrors_args = {"refresh": getattr(args, "refresh", False) is True}
+            if getattr(args, "max_age", None) is not None:
+                mirrors_args["max_age"] = args.max_age
+            result = mirrors.manage(mirrors_args)
+        elif args.command == "worktrees":
+            worktrees_args = {}
+            for name in ("warm", "prune", "size"):
+                value = getattr(args, name, None)
+                if value is not None:
+                    worktrees_args[name] = value
+            result = worktrees.manage(worktrees_args, cwd=getattr(args, "cwd", None))
+        elif args.command == "tune":
+            tune_args = {"dry_run": getattr(args, "dry_run", False) is True}
+            for name in ("runs", "path"):
+                value = getattr(args, name, None)
+                if isinstance(value, (int, str)):
+                    tune_args[name] = value
+            result = tuning.manage(tune_args, cwd=getattr(args, "cwd", None))
+        elif args.command == "prefetch":
+            prefetch_args = {name: getattr(args, name, False) is True for name in ("list", "loop")}
+            if isinstance(getattr(args, "limit", None), int):
+                prefetch_args["limit"] = args.limit
+            result = prefetch.manage(prefetch_args)
+        elif args.command == "fleet":
+            fleet_args = {}
+            if getattr(args, "arg_command", None) is not None:
+                fleet_args["command"] = args.arg_command
+            if getattr(args, "arg_args", None) is not None:
+                fleet_args["args"] = args.arg_args
+            for name in ("paths", "root", "depth", "jobs", "slowest", "output"):
+                value = getattr(args, name, None)
+                if isinstance(value, (int, str, list)):
+                    fleet_args[name] = value
+            result = fleet.manage(fleet_args, run, cwd=getattr(args, "cwd", None))
+        elif args.command == "refs":
+            refs_args = {}
+            for name in ("ops", "file", "mode", "message", "remote", "batch"):
+                value = getattr(args, name, None)
+                if isinstance(value, (int, str)):
+                    refs_args[name] = value
+            result = bulkrefs.manage(refs_args, cwd=getattr(args, "cwd", None))
         else:
             result = {"error": f"Unknown command: {args.command}"}
         
         # Output JSON (no indentation for SMCP compatibility)
-        print(json.dumps(result))
+        print(telemetry.dumps(result))
+        sys.stdout.flush()
+        # Persist this process's metrics when SMCP_METRICS_FILE is set
+        metrics.flush()
         sys.exit(0 if "error" not in result else 1)
         
     except Exception as e:
@@ -0,0 +1,569 @@
+"""
+In-process ancestry queries backed by git's commit-graph file.
+
+``CommitGraph`` memory-maps ``objects/info/commit-graph`` or, when that
+file is absent, the layers listed in
+``objects/info/commit-graphs/commit-graph-chain``. Commits are addressed
+by their global graph position; looking one up is a fanout-bounded binary
+search and reading its parents, commit time and generation number is a
+couple of ``struct`` unpacks from the map.
+
+Generation numbers are what make the walks cheap: a commit's generation
+is strictly greater than that of each of its parents, so a walk looking
+for commit ``A`` can prune everything below ``A``'s generation, and a walk
+popping commits in decreasing generation order knows a commit's flags are
+final once it is popped. The corrected commit dates of the ``GDA2`` chunk
+are used when every layer has them, topological levels otherwise.
+
+Commits written after the graph (not in it yet) are parsed from the
+object store and given a generation computed the same way, up to
+``MAX_UNGRAPHED_COMMITS``. Repositories without a graph, or whose graph
+git itself would ignore (grafts, shallow clones, replace refs,
+``core.commitGraph=false``), raise ``Unsupported``.
+"""
+
+import bisect
+import heapq
+import mmap
+import os
+import re
+import struct
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from plugins.git import objects, refs
+from plugins.git import repo as repo_module
+from plugins.git.refs import Unsupported
+
+RAW_OID_LENGTH = 20
+
+# Parent fields of a CDAT record
+GRAPH_PARENT_NONE = 0x70000000
+GRAPH_EXTRA_EDGES_NEEDED = 0x80000000
+GRAPH_LAST_EDGE = 0x80000000
+GENERATION_NUMBER_V1_MAX = 0x3FFFFFFF
+CORRECTED_DATE_OFFSET_OVERFLOW = 0x80000000
+
+# Commits missing from the graph are parsed from objects; past this many
+# spawning git is cheaper (its object parser is an order of magnitude faster)
+MAX_UNGRAPHED_COMMITS = 1000
+# Commits a single walk may visit before handing the query to git. A visit
+# costs ~2.5 us against git's ~0.6 us plus a ~2 ms spawn, so past about a
+# thousand commits git is faster (tests/benchmarks/bench_commitgraph.py)
+MAX_WALK = 1000
+# Nested annotated tags followed when peeling a revision to a commit
+MAX_TAG_DEPTH = 5
+
+# A revision name followed by ~<n> / ^<n> parent steps
+_REVISION_RE = re.compile(r"^([^~^]+)((?:[~^][0-9]*)*)$")
+_STEP_RE = re.compile(r"([~^])([0-9]*)")
+
+_HEADER = struct.Struct(">4sBBBB")
+_CHUNK = struct.Struct(">4sQ")
+_CDAT = struct.Struct(">20sIIII")
+_CDAT_SIZE = _CDAT.size
+
+# Flags used by the walks
+_PARENT1 = 1
+_PARENT2 = 2
+_STALE = 4
+
+
+class GraphLayer:
+    """One memory-mapped commit-graph file."""
+
+    def __init__(self, path: str, base_count: int = 0, base_position: int = 0):
+        self.path = path
+        self.base_position = base_position
+        with open(path, "rb") as handle:
+            try:
+                self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise Unsupported("empty commit-graph")
+        try:
+            self._parse(base_count)
+        except struct.error:
+            raise Unsupported("truncated commit-graph")
+
+    def _parse(self, base_count: int) -> None:
+        buf = self._map
+        signature, version, hash_version, chunk_count, bases = _HEADER.unpack_from(buf, 0)
+        if signature != b"CGPH" or version != 1 or hash_version != 1:
+            raise Unsupported("unsupported commit-graph format")
+        if bases != base_count:
+            raise Unsupported("commit-graph chain does not match its layers")
+        chunks: Dict[bytes, Tuple[int, int]] = {}
+        table = [_CHUNK.unpack_from(buf, _HEADER.size + i * _CHUNK.size) for i in range(chunk_count + 1)]
+        end = len(buf) - RAW_OID_LENGTH
+        for (chunk_id, offset), (_, next_offset) in zip(table, table[1:]):
+            if not offset <= next_offset <= end:
+                raise Unsupported("corrupt commit-graph chunk table")
+            chunks[chunk_id] = (offset, next_offset - offset)
+        for required in (b"OIDF", b"OIDL", b"CDAT"):
+            if required not in chunks:
+                raise Unsupported(f"commit-graph without {required.decode()} chunk")
+        fanout_offset, fanout_size = chunks[b"OIDF"]
+        if fanout_size != 256 * 4:
+            raise Unsupported("corrupt commit-graph fanout")
+        self._fanout = struct.unpack_from(">256I", buf, fanout_offset)
+        self.count = self._fanout[255]
+        self._oids, oids_size = chunks[b"OIDL"]
+        self._data, data_size = chunks[b"CDAT"]
+        if oids_size != self.count * RAW_OID_LENGTH or data_size != self.count * _CDAT_SIZE:
+            raise Unsupported("commit-graph chunk sizes do not match the fanout")
+        self._edges = chunks.get(b"EDGE", (None, 0))[0]
+        self.has_bloom_filters = b"BIDX" in chunks and b"BDAT" in chunks  # Changed-path Bloom filters
+        generation = chunks.get(b"GDA2")
+        overflow = chunks.get(b"GDO2")
+        self.has_corrected_dates = generation is not None and generation[1] == self.count * 4
+        self._generation_data = generation[0] if self.has_corrected_dates else None
+        self._generation_overflow = overflow[0] if overflow is not None else None
+
+    def close(self) -> None:
+        self._map.close()
+
+    def find(self, raw_oid: bytes) -> Optional[int]:
+        """Position of ``raw_oid`` within this layer, or None."""
+        first = raw_oid[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        buf = self._map
+        base = self._oids
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * RAW_OID_LENGTH
+            candidate = buf[start:start + RAW_OID_LENGTH]
+            if candidate < raw_oid:
+                lo = mid + 1
+            elif candidate > raw_oid:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def oid(self, local: int) -> str:
+        start = self._oids + local * RAW_OID_LENGTH
+        return self._map[start:start + RAW_OID_LENGTH].hex()
+
+    def record(self, local: int) -> Tuple[List[int], int, int]:
+        """``(parent positions, commit time, topological level)`` of an entry."""
+        _, parent1, parent2, high, low = _CDAT.unpack_from(self._map, self._data + local * _CDAT_SIZE)
+        parents = []
+        if parent1 != GRAPH_PARENT_NONE:
+            parents.append(parent1)
+            if parent2 & GRAPH_EXTRA_EDGES_NEEDED:
+                if self._edges is None:
+                    raise Unsupported("octopus merge without EDGE chunk")
+                offset = self._edges + (parent2 & ~GRAPH_EXTRA_EDGES_NEEDED) * 4
+                while True:
+                    edge = struct.unpack_from(">I", self._map, offset)[0]
+                    parents.append(edge & ~GRAPH_LAST_EDGE)
+                    if edge & GRAPH_LAST_EDGE:
+                        break
+                    offset += 4
+            elif parent2 != GRAPH_PARENT_NONE:
+                parents.append(parent2)
+        return parents, ((high & 0x3) << 32) | low, high >> 2
+
+    def corrected_date(self, local: int, commit_time: int) -> int:
+        offset = struct.unpack_from(">I", self._map, self._generation_data + local * 4)[0]
+        if offset & CORRECTED_DATE_OFFSET_OVERFLOW:
+            if self._generation_overflow is None:
+                raise Unsupported("commit-graph without GDO2 chunk")
+            position = self._generation_overflow + (offset & ~CORRECTED_DATE_OFFSET_OVERFLOW) * 8
+            offset = struct.unpack_from(">Q", self._map, position)[0]
+        return commit_time + offset
+
+
+class CommitGraph:
+    """A commit-graph file or chain of layers, addressed by global position."""
+
+    def __init__(self, layers: Sequence[GraphLayer]):
+        self.layers = list(layers)
+        self._starts = [layer.base_position for layer in self.layers]
+        self.count = sum(layer.count for layer in self.layers)
+        self.corrected_dates = all(layer.has_corrected_dates for layer in self.layers)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        for layer in self.layers:
+            layer.close()
+
+    def _layer(self, position: int) -> Tuple[GraphLayer, int]:
+        if not 0 <= position < self.count:
+            raise Unsupported("commit-graph position out of range")
+        layer = self.layers[bisect.bisect_right(self._starts, position) - 1]
+        return layer, position - layer.base_position
+
+    def find(self, oid: str) -> Optional[int]:
+        """Global position of a commit, or None if it is not in the graph."""
+        raw = bytes.fromhex(oid)
+        for layer in reversed(self.layers):
+            local = layer.find(raw)
+            if local is not None:
+                return layer.base_position + local
+        return None
+
+    def oid(self, position: int) -> str:
+        layer, local = self._layer(position)
+        return layer.oid(local)
+
+    def commit(self, position: int) -> Tuple[List[int], int]:
+        """``(parent positions, generation)`` of the commit at ``position``."""
+        layer, local = self._layer(position)
+        try:
+            parents, commit_time, level = layer.record(local)
+            if self.corrected_dates:
+                return parents, layer.corrected_date(local, commit_time)
+        except struct.error:
+            raise Unsupported("truncated commit-graph")
+        if level == 0 or level >= GENERATION_NUMBER_V1_MAX:
+            raise Unsupported("commit-graph without usable generation numbers")
+        return parents, level
+
+
+def _graph_files(objects_dir: str) -> Tuple[List[str], Optional[str]]:
+    info = os.path.join(objects_dir, "info")
+    single = os.path.join(info, "commit-graph")
+    if os.path.isfile(single):
+        return [single], single
+    chain_file = os.path.join(info, "commit-graphs", "commit-graph-chain")
+    try:
+        with open(chain_file, "r", encoding="ascii") as handle:
+            hashes = handle.read().split()
+    except FileNotFoundError:
+        return [], None
+    except (OSError, UnicodeDecodeError):
+        raise Unsupported("unreadable commit-graph chain")
+    if not hashes or not all(objects.is_full_oid(value) for value in hashes):
+        raise Unsupported("corrupt commit-graph chain")
+    return [os.path.join(info, "commit-graphs", f"graph-{value}.graph") for value in hashes], chain_file
+
+
+def load(repository: repo_module.Repository) -> CommitGraph:
+    """Return the repository's (cached) commit graph; raises ``Unsupported`` if git would not use one."""
+    if not repository.config_bool("core.commitgraph", True):
+        raise Unsupported("core.commitGraph is disabled")
+    if os.path.exists(os.path.join(repository.common_dir, "shallow")):
+        raise Unsupported("shallow repository")
+    if os.path.exists(os.path.join(repository.objects_dir, "info", "grafts")):
+        raise Unsupported("grafts file")
+    if os.environ.get("GIT_NO_REPLACE_OBJECTS") is None and refs.has_replace_refs(repository):
+        raise Unsupported("replace refs")
+    paths, stamp_path = _graph_files(repository.objects_dir)
+    if stamp_path is None:
+        raise Unsupported("no commit-graph")
+    st = os.stat(stamp_path)
+    key = (stamp_path, st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = repository._cache.get("commit-graph")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    layers: List[GraphLayer] = []
+    position = 0
+    try:
+        for base_count, path in enumerate(paths):
+            layer = GraphLayer(path, base_count, position)
+            layers.append(layer)
+            position += layer.count
+    except FileNotFoundError:
+        raise Unsupported("commit-graph chain names a missing layer")
+    graph = CommitGraph(layers)
+    repository._cache["commit-graph"] = (key, graph)
+    return graph
+
+
+def _parse_commit(data: bytes) -> Tuple[List[str], int]:
+    parents = []
+    commit_time = None
+    for line in data.split(b"\n\n", 1)[0].split(b"\n"):
+        if line.startswith(b"parent "):
+            parents.append(line[7:].decode("ascii"))
+        elif line.startswith(b"committer "):
+            try:
+                commit_time = int(line.rsplit(b" ", 2)[1])
+            except (IndexError, ValueError):
+                raise Unsupported("unparsable committer line")
+    if commit_time is None:
+        raise Unsupported("commit without committer")
+    return parents, commit_time
+
+
+class Commits:
+    """Commit ids, parents and generations for one query.
+
+    Graph commits use their graph position as id; commits missing from the
+    graph are parsed from the object store and numbered after it.
+    """
+
+    def __init__(self, repository: repo_module.Repository, graph: CommitGraph):
+        self.repository = repository
+        self.graph = graph
+        self._data: Dict[int, Tuple[List[int], int]] = {}
+        self._ungraphed: Dict[str, int] = {}
+        self._ungraphed_oids: List[str] = []
+
+    def node(self, oid: str) -> int:
+        """Id of a commit (peeling tags); raises ``Unsupported`` for non-commits."""
+        for _ in range(MAX_TAG_DEPTH):
+            position = self.graph.find(oid)
+            if position is not None:
+                return position
+            if oid in self._ungraphed:
+                return self._ungraphed[oid]
+            type_name, data = objects.read_object(self.repository, oid)
+            if type_name == "commit":
+                return self._add_ungraphed(oid, data)
+            if type_name != "tag" or not data.startswith(b"object "):
+                raise Unsupported(f"{oid} is not a commit")
+            oid = data[7:47].decode("ascii")
+        raise Unsupported("tag chain too deep")
+
+    def revision(self, name: str) -> int:
+        """Id of a revision such as ``main``, ``HEAD~2`` or ``v1.0^2``."""
+        match = _REVISION_RE.match(name)
+        if not match:
+            raise Unsupported(f"revision {name!r} needs git's revision parser")
+        node = self.node(refs.resolve_revision(self.repository, match.group(1)))
+        steps = 0
+        for operator, digits in _STEP_RE.findall(match.group(2)):
+            number = int(digits) if digits else 1
+            steps += number
+            _check_walk(steps)
+            if operator == "~":
+                for _ in range(number):
+                    node = self._parent(node, 1)
+            elif number:
+                node = self._parent(node, number)
+        return node
+
+    def _parent(self, node: int, number: int) -> int:
+        parents = self.parents(node)
+        if number > len(parents):
+            raise Unsupported("no such parent")
+        return parents[number - 1]
+
+    def _add_ungraphed(self, oid: str, data: bytes) -> int:
+        # Parents must get their generation first; walk them iteratively
+        pending = [(oid, data)]
+        while pending:
+            current, current_data = pending[-1]
+            parent_oids, commit_time = _parse_commit(current_data)
+            missing = []
+            for parent in parent_oids:
+                if self.graph.find(parent) is None and parent not in self._ungraphed:
+                    type_name, parent_data = objects.read_object(self.repository, parent)
+                    if type_name != "commit":
+                        raise Unsupported(f"parent {parent} is not a commit")
+                    missing.append((parent, parent_data))
+            if missing:
+                pending.extend(missing)
+                if len(pending) + len(self._ungraphed) > MAX_UNGRAPHED_COMMITS:
+                    raise Unsupported("too many commits missing from the commit-graph")
+                continue
+            pending.pop()
+            if current in self._ungraphed:
+                continue  # Reached twice through a merge
+            parents = [self.node(parent) for parent in parent_oids]
+            parent_generation = max((self.generation(parent) for parent in parents), default=0)
+            if self.graph.corrected_dates:
+                generation = max(commit_time, parent_generation + 1)
+            else:
+                generation = parent_generation + 1
+            node = self.graph.count + len(self._ungraphed_oids)
+            self._ungraphed[current] = node
+            self._ungraphed_oids.append(current)
+            self._data[node] = (parents, generation)
+        return self._ungraphed[oid]
+
+    def _commit(self, node: int) -> Tuple[List[int], int]:
+        data = self._data.get(node)
+        if data is None:
+            data = self._data[node] = self.graph.commit(node)
+        return data
+
+    def parents(self, node: int) -> List[int]:
+        return self._commit(node)[0]
+
+    def generation(self, node: int) -> int:
+        return self._commit(node)[1]
+
+    def oid(self, node: int) -> str:
+        if node >= self.graph.count:
+            return self._ungraphed_oids[node - self.graph.count]
+        return self.graph.oid(node)
+
+
+def _check_walk(visited: int) -> None:
+    if visited > MAX_WALK:
+        raise Unsupported("walk too long to answer in-process")
+
+
+def is_ancestor_of(commits: Commits, ancestor: int, descendant: int) -> bool:
+    """True if ``ancestor`` is reachable from ``descendant`` (or equal to it)."""
+    if ancestor == descendant:
+        return True
+    floor = commits.generation(ancestor)
+    if floor >= commits.generation(descendant):
+        return False
+    stack = [descendant]
+    seen = {descendant}
+    while stack:
+        _check_walk(len(seen))
+        for parent in commits.parents(stack.pop()):
+            if parent == ancestor:
+                return True
+            if parent not in seen and commits.generation(parent) > floor:
+                seen.add(parent)
+                stack.append(parent)
+    return False
+
+
+def _push(queue: list, commits: Commits, node: int) -> None:
+    heapq.heappush(queue, (-commits.generation(node), node))
+
+
+def merge_bases_of(commits: Commits, one: int, two: int) -> List[int]:
+    """Best common ancestors of two commits (git's paint_down_to_common)."""
+    if one == two:
+        return [one]
+    flags = {one: _PARENT1, two: _PARENT2}
+    queue: list = []
+    _push(queue, commits, one)
+    _push(queue, commits, two)
+    results = []
+    while any(not flags[node] & _STALE for _, node in queue):
+        _check_walk(len(flags))
+        _, node = heapq.heappop(queue)
+        node_flags = flags[node] & (_PARENT1 | _PARENT2 | _STALE)
+        if node_flags == _PARENT1 | _PARENT2:
+            # Each commit is queued once, so it cannot be found twice
+            results.append(node)
+            node_flags |= _STALE
+        for parent in commits.parents(node):
+            parent_flags = flags.get(parent, 0)
+            if parent_flags & node_flags == node_flags:
+                continue
+            if not parent_flags & (_PARENT1 | _PARENT2 | _STALE):
+                _push(queue, commits, parent)
+            flags[parent] = parent_flags | node_flags
+    results = [node for node in results if not flags[node] & _STALE]
+    # Drop results that are ancestors of other results (remove_redundant)
+    return [node for node in results
+            if not any(other != node and is_ancestor_of(commits, node, other) for other in results)]
+
+
+def count_commits(commits: Commits, include: Iterable[int], exclude: Iterable[int] = (),
+                  first_parent: bool = False) -> int:
+    """Number of commits reachable from ``include`` but not from ``exclude``."""
+    uninteresting: Dict[int, bool] = {}
+    queue: list = []
+    for node in exclude:
+        if node not in uninteresting:
+            _push(queue, commits, node)
+        uninteresting[node] = True
+    for node in include:
+        if node not in uninteresting:
+            uninteresting[node] = False
+            _push(queue, commits, node)
+    interesting_queued = sum(1 for _, node in queue if not uninteresting[node])
+    count = 0
+    while interesting_queued:
+        _check_walk(len(uninteresting))
+        _, node = heapq.heappop(queue)
+        if uninteresting[node]:
+            for parent in commits.parents(node):
+                state = uninteresting.get(parent)
+                if state is None:
+                    _push(queue, commits, parent)
+                elif not state:
+                    interesting_queued -= 1  # Queued as interesting; no longer is
+                uninteresting[parent] = True
+            continue
+        interesting_queued -= 1
+        count += 1
+        parents = commits.parents(node)
+        for parent in parents[:1] if first_parent else parents:
+            if parent not in uninteresting:
+                uninteresting[parent] = False
+                interesting_queued += 1
+                _push(queue, commits, parent)
+    return count
+
+
+def _commits(repository: repo_module.Repository) -> Commits:
+    return Commits(repository, load(repository))
+
+
+def is_ancestor(repository: repo_module.Repository, ancestor: str, descendant: str) -> bool:
+    """``git merge-base --is-ancestor`` for two revisions."""
+    commits = _commits(repository)
+    return is_ancestor_of(commits, commits.revision(ancestor), commits.revision(descendant))
+
+
+def merge_bases(repository: repo_module.Repository, one: str, two: str) -> List[str]:
+    """``git merge-base --all`` for two revisions, as object ids."""
+    commits = _commits(repository)
+    nodes = merge_bases_of(commits, commits.revision(one), commits.revision(two))
+    return [commits.oid(node) for node in nodes]
+
+
+def generation(repository: repo_module.Repository, revision: str) -> int:
+    """Generation number of a revision (corrected commit date or topological level)."""
+    commits = _commits(repository)
+    return commits.generation(commits.revision(revision))
+
+
+def count(repository: repo_module.Repository, include: Iterable[str], exclude: Iterable[str] = (),
+          first_parent: bool = False) -> int:
+    """``git rev-list --count`` of ``include`` minus everything reachable from ``exclude``."""
+    commits = _commits(repository)
+    return count_commits(commits, [commits.revision(name) for name in include],
+                         [commits.revision(name) for name in exclude], first_parent)
+
+
+def _cmd_merge_base(repository: repo_module.Repository, argv: List[str], cwd: Optional[str]) -> Tuple[int, str]:
+    if len(argv) == 3 and argv[0] == "--is-ancestor":
+        return (0 if is_ancestor(repository, argv[1], argv[2]) else 1), ""
+    show_all = argv[:1] == ["--all"]
+    names = argv[1:] if show_all else argv
+    if len(names) != 2 or any(name.startswith("-") for name in names):
+        raise Unsupported("merge-base arguments")
+    bases = merge_bases(repository, *names)
+    if not bases:
+        return 1, ""
+    if len(bases) > 1:
+        raise Unsupported("several merge bases; git picks and orders them by its own walk")
+    return 0, bases[0] + "\n"
+
+
+def _cmd_rev_list(repository: repo_module.Repository, argv: List[str], cwd: Optional[str]) -> Tuple[int, str]:
+    include: List[str] = []
+    exclude: List[str] = []
+    first_parent = False
+    counting = False
+    for arg in argv:
+        if arg == "--count":
+            counting = True
+        elif arg == "--first-parent":
+            first_parent = True
+        elif arg.startswith("-") or "..." in arg:
+            raise Unsupported(f"rev-list argument {arg}")
+        elif ".." in arg:
+            left, right = arg.split("..", 1)
+            exclude.append(left or "HEAD")
+            include.append(right or "HEAD")
+        elif arg.startswith("^"):
+            exclude.append(arg[1:])
+        else:
+            include.append(arg)
+    if not counting or not include:
+        raise Unsupported("rev-list without --count or revisions")
+    return 0, f"{count(repository, include, exclude, first_parent)}\n"
+
+
+# Command handlers for plugins.git.fastpath: (repository, argv, cwd) -> (returncode, stdout)
+COMMANDS = {
+    "merge-base": _cmd_merge_base,
+    "rev-list": _cmd_rev_list,
+}
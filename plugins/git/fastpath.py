@@ -0,0 +1,41 @@
+"""
+In-process answers for read-only git commands.
+
+``fast_read`` looks the git subcommand up in the handlers registered by
+``plugins.git.refs`` (HEAD, refs, objects), ``plugins.git.index``
+(tracked files, dirty checks) and ``plugins.git.commitgraph`` (ancestry
+and commit counts). A handler returns ``(returncode, stdout)``
+or raises ``Unsupported`` when only git itself can answer exactly; in that
+case, or whenever the repository is not one the readers understand,
+``fast_read`` returns ``None`` and the caller spawns git as usual.
+"""
+
+import subprocess
+from typing import List, Optional
+
+from plugins.git import commitgraph, index, objects, refs
+from plugins.git import repo as repo_module
+
+COMMANDS = dict(refs.COMMANDS, **index.COMMANDS, **commitgraph.COMMANDS)
+
+
+def fast_read(cmd_args: List[str], cwd: Optional[str] = None) -> Optional[subprocess.CompletedProcess]:
+    """Answer a supported read-only command in-process.
+
+    ``cmd_args`` is the full argv (starting with ``git``). Returns a
+    ``CompletedProcess`` shaped like the one spawning git would produce, or
+    ``None`` when the command is not supported or the repository needs
+    git's own logic.
+    """
+    if len(cmd_args) < 2 or cmd_args[0] != "git" or cmd_args[1] not in COMMANDS:
+        return None
+    try:
+        repository = repo_module.discover(cwd)
+        if repository is None:
+            return None
+        returncode, stdout = COMMANDS[cmd_args[1]](repository, cmd_args[2:], cwd)
+    except (refs.Unsupported, objects.MissingObject, OSError, ValueError):
+        return None
+    completed = subprocess.CompletedProcess(list(cmd_args), returncode, stdout, "")
+    completed.resources = None
+    return completed
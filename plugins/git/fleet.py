@@ -0,0 +1,225 @@
+"""
+Run one git command across a fleet of repositories.
+
+``stream()`` runs a ``run()``-style call in every repository of a list,
+``jobs`` at a time, and yields each repository's response as soon as it
+finishes; ``summarize()`` reduces the responses to counts and the slowest
+repositories. ``discover()`` finds the repositories under a root directory:
+working trees (a ``.git`` directory or file) and bare repositories, without
+descending into either, so submodules and nested checkouts are not run
+twice.
+
+Scheduling is work-stealing. Repositories are ordered heaviest first, by
+the size of their index and packs, and dealt round-robin into one deque
+per worker. A worker takes from the front of its own deque and, once that
+is empty, steals from the back of the fullest other one, so a worker stuck
+on a huge repository never holds up the work queued behind it and the
+large repositories start early rather than last.
+
+Each call goes through the git plugin's ``run()``, with its repository
+lock, parallelism settings and error classification; the plugin CLI's
+``fleet`` command passes it in.
+"""
+
+import collections
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from plugins.git import repo as repo_module
+
+DEFAULT_JOBS = 8
+DEFAULT_DEPTH = 3
+DEFAULT_SLOWEST = 5
+
+# A run()-style function: call arguments and a working directory in, response out
+Runner = Callable[..., Dict[str, Any]]
+
+# Arguments of the fleet itself; the rest are passed to every run() call
+_FLEET_ARGS = ("paths", "root", "depth", "jobs", "slowest", "output")
+
+
+def _is_bare(path: str) -> bool:
+    return all(os.path.exists(os.path.join(path, name)) for name in ("HEAD", "objects", "refs"))
+
+
+def discover(root: str, depth: int = DEFAULT_DEPTH) -> List[str]:
+    """Repositories at or below ``root``, at most ``depth`` directories down, sorted by path.
+
+    Hidden directories are skipped, and so is everything inside a
+    repository.
+    """
+    found: List[str] = []
+    pending = [(os.path.abspath(root), 0)]
+    while pending:
+        path, level = pending.pop()
+        if os.path.exists(os.path.join(path, ".git")) or _is_bare(path):
+            found.append(path)
+            continue
+        if level >= depth:
+            continue
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue  # Unreadable directories hold no repositories we could run in
+        pending.extend((entry.path, level + 1) for entry in entries
+                       if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False))
+    return sorted(found)
+
+
+def weight(path: str) -> int:
+    """Bytes of a repository's index and packs: a cheap stand-in for how long a command takes in it."""
+    repository = repo_module.discover(path)
+    if repository is None:
+        return 0
+    total = 0
+    try:
+        total += os.stat(os.path.join(repository.git_dir, "index")).st_size
+    except OSError:
+        pass
+    try:
+        with os.scandir(os.path.join(repository.objects_dir, "pack")) as entries:
+            total += sum(entry.stat().st_size for entry in entries if entry.name.endswith(".pack"))
+    except OSError:
+        pass
+    return total
+
+
+class _Deques:
+    """One deque of repositories per worker, with stealing from the back of the fullest other deque."""
+
+    def __init__(self, paths: List[str], workers: int):
+        self._lock = threading.Lock()
+        self._deques: List[Deque[str]] = [collections.deque() for _ in range(workers)]
+        for n, path in enumerate(paths):
+            self._deques[n % workers].append(path)
+
+    def take(self, worker: int) -> Optional[Tuple[str, bool]]:
+        """The next repository for ``worker`` and whether it was stolen; ``None`` once every deque is empty."""
+        with self._lock:
+            own = self._deques[worker]
+            if own:
+                return own.popleft(), False
+            victim = max(self._deques, key=len)
+            if victim:
+                return victim.pop(), True
+            return None
+
+
+def _run_one(run: Runner, args: Dict[str, Any], path: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        response = run(dict(args), cwd=path)
+    except Exception as e:  # One repository's failure must not end the fleet's run
+        response = {"success": False, "error": str(e), "error_code": "FLEET_FAILED"}
+    record = {"path": path}
+    record.update(response)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def stream(paths: List[str], args: Dict[str, Any], run: Runner, jobs: int = DEFAULT_JOBS) -> Iterator[Dict[str, Any]]:
+    """Run ``run(args, cwd=path)`` for every path, ``jobs`` at a time; yield responses as they finish.
+
+    Each response gains ``path``, ``seconds`` (including any wait for the
+    repository lock), ``worker`` and ``stolen``. Closing the iterator early
+    stops the workers from starting more repositories.
+    """
+    paths = sorted(paths, key=weight, reverse=True)
+    workers = max(min(jobs, len(paths)), 1)
+    deques = _Deques(paths, workers)
+    results: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+    stop = threading.Event()
+
+    def work(worker: int) -> None:
+        try:
+            while not stop.is_set():
+                taken = deques.take(worker)
+                if taken is None:
+                    break
+                record = _run_one(run, args, taken[0])
+                record["worker"], record["stolen"] = worker, taken[1]
+                results.put(record)
+        finally:
+            results.put(None)  # This worker is done
+
+    threads = [threading.Thread(target=work, args=(n,), name=f"smcp-git-fleet-{n}", daemon=True)
+               for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        running = workers
+        while running:
+            record = results.get()
+            if record is None:
+                running -= 1
+            else:
+                yield record
+    finally:
+        stop.set()
+
+
+def summarize(records: List[Dict[str, Any]], slowest: int = DEFAULT_SLOWEST) -> Dict[str, Any]:
+    """Counts of the responses, their error codes and the ``slowest`` repositories."""
+    failed = [record for record in records if not record.get("success")]
+    error_codes = collections.Counter(record.get("error_code", "UNKNOWN") for record in failed)
+    ranked = sorted(records, key=lambda record: record["seconds"], reverse=True)[:max(slowest, 0)]
+    return {
+        "repositories": len(records),
+        "succeeded": len(records) - len(failed),
+        "failed": len(failed),
+        "stolen": sum(1 for record in records if record.get("stolen")),
+        "error_codes": dict(sorted(error_codes.items())),
+        "slowest": [{"path": record["path"], "seconds": record["seconds"], "success": bool(record.get("success"))}
+                    for record in ranked],
+    }
+
+
+def manage(args: Dict[str, Any], run: Runner, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Run a command across ``args["paths"]`` or the repositories under ``args["root"]`` for the plugin CLI.
+
+    The other arguments (``command``, ``args`` and any ``run()`` option)
+    go to every call. ``result`` lists the responses in the order they
+    finished, or with ``args["output"]`` they are written to that file as
+    NDJSON as they finish; ``summary`` holds the counts and the slowest
+    repositories. ``success`` means the fleet ran; failed repositories are
+    counted in the summary.
+    """
+    start = time.perf_counter()
+    try:
+        if args.get("paths"):
+            paths = [os.path.abspath(os.path.join(cwd or os.getcwd(), path)) for path in args["paths"]]
+        elif args.get("root"):
+            root = os.path.join(cwd or os.getcwd(), args["root"])
+            paths = discover(root, int(args["depth"]) if args.get("depth") is not None else DEFAULT_DEPTH)
+        else:
+            raise ValueError("paths or root is required")
+        if not args.get("command"):
+            raise ValueError("command is required")
+        jobs = int(args["jobs"]) if args.get("jobs") is not None else DEFAULT_JOBS
+        slowest = int(args["slowest"]) if args.get("slowest") is not None else DEFAULT_SLOWEST
+        missing = [path for path in paths if not os.path.isdir(path)]
+        if missing:
+            raise ValueError(f"not a directory: {', '.join(missing)}")
+        call_args = {key: value for key, value in args.items() if key not in _FLEET_ARGS}
+        records = []
+        response: Dict[str, Any] = {"success": True}
+        if args.get("output"):
+            with open(args["output"], "w", encoding="utf-8") as handle:
+                for record in stream(paths, call_args, run, jobs):
+                    records.append(record)
+                    # Flush each record so a reader tailing the file sees it at once
+                    handle.write(json.dumps(record) + "\n")
+                    handle.flush()
+            response["result"] = f"Wrote {len(records)} records to {args['output']}"
+        else:
+            records = list(stream(paths, call_args, run, jobs))
+            response["result"] = records
+    except (OSError, ValueError) as e:
+        return {"success": False, "error": str(e), "error_code": "FLEET_FAILED"}
+    response["summary"] = summarize(records, slowest)
+    response["elapsed"] = time.perf_counter() - start
+    return response
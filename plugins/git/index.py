@@ -0,0 +1,539 @@
+"""
+In-process reads of the git index (``.git/index``).
+
+``Index`` memory-maps an index file of version 2, 3 or 4 and records, for
+every entry, its offset in the map and the location of its path in
+``array`` columns, so a million entries cost a few dozen megabytes rather
+than a million Python objects. Version 2/3 paths are served straight from
+the map; version 4 prefix-compressed paths are expanded once into a single
+byte buffer. Optional extensions are skipped; required ones this reader
+does not understand (split index, sparse index, ...) raise ``Unsupported``.
+
+On top of it, ``ls_files`` lists tracked paths under pathspec prefixes
+and ``stat_check`` compares the stat data git recorded for each entry with
+``lstat`` of the worktree file, without hashing any content, to tell
+whether anything tracked may have been modified.
+"""
+
+import mmap
+import os
+import stat
+import struct
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from plugins.git import objects, refs
+from plugins.git import repo as repo_module
+from plugins.git.refs import Unsupported
+
+RAW_OID_LENGTH = 20
+
+# Index entry flag bits
+FLAG_ASSUME_VALID = 0x8000
+FLAG_EXTENDED = 0x4000
+FLAG_NAME_MASK = 0x0FFF
+# Extended flag bits (version 3+)
+FLAG_SKIP_WORKTREE = 0x4000
+FLAG_INTENT_TO_ADD = 0x2000
+
+MODE_GITLINK = 0o160000
+MODE_SYMLINK = 0o120000
+MODE_DIRECTORY = 0o040000
+
+# ctime(8) mtime(8) dev ino mode uid gid size(4 each) oid(20) flags(2)
+_STAT = struct.Struct(">10I")
+_FLAGS_OFFSET = 40 + RAW_OID_LENGTH
+_PATH_OFFSET = _FLAGS_OFFSET + 2
+_HEADER = struct.Struct(">4sII")
+
+# Past these sizes git's C code wins even counting the ~2 ms spawn
+# (tests/benchmarks/bench_index.py): parsing a large index from scratch,
+# listing a large selection, or lstat()ing many files at ~7 us each.
+COLD_PARSE_MAX_BYTES = 256 * 1024
+LIST_MAX_ENTRIES = 5000
+STAT_CHECK_MAX_ENTRIES = 400
+
+
+class IndexEntry:
+    """Decoded view of one index entry."""
+
+    __slots__ = ("path", "oid", "mode", "stage", "flags", "extended_flags", "ctime_s", "ctime_ns",
+                 "mtime_s", "mtime_ns", "dev", "ino", "uid", "gid", "size")
+
+    def __init__(self, path: bytes, oid: str, flags: int, extended_flags: int, stat_fields: Tuple[int, ...]):
+        self.path = path
+        self.oid = oid
+        self.flags = flags
+        self.extended_flags = extended_flags
+        self.stage = (flags >> 12) & 3
+        (self.ctime_s, self.ctime_ns, self.mtime_s, self.mtime_ns, self.dev, self.ino,
+         self.mode, self.uid, self.gid, self.size) = stat_fields
+
+    @property
+    def skip_worktree(self) -> bool:
+        return bool(self.extended_flags & FLAG_SKIP_WORKTREE)
+
+    @property
+    def intent_to_add(self) -> bool:
+        return bool(self.extended_flags & FLAG_INTENT_TO_ADD)
+
+    def __repr__(self):
+        return f"IndexEntry({self.path!r}, {self.mode:o}, {self.oid}, stage={self.stage})"
+
+
+def _offset_varint(buf, pos: int) -> Tuple[int, int]:
+    # Same encoding as OFS_DELTA offsets in packs
+    byte = buf[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = buf[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+class Index:
+    """Memory-mapped, array-backed view of an index file."""
+
+    def __init__(self, path: str):
+        self.file_path = path
+        with open(path, "rb") as handle:
+            st = os.fstat(handle.fileno())
+            if st.st_size < _HEADER.size + RAW_OID_LENGTH:
+                raise Unsupported("truncated index")
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mtime_s = int(st.st_mtime)
+        self.mtime_ns = st.st_mtime_ns % 1_000_000_000
+        signature, self.version, count = _HEADER.unpack_from(self._map, 0)
+        if signature != b"DIRC" or self.version not in (2, 3, 4):
+            raise Unsupported("unsupported index format")
+        self.entry_offsets = array("Q")
+        self.path_starts = array("Q")
+        self.path_ends = array("Q")
+        self.has_conflicts = False
+        self.extensions: Dict[bytes, Tuple[int, int]] = {}
+        try:
+            end = self._parse_entries(count)
+            self._parse_extensions(end)
+        except (IndexError, struct.error):
+            raise Unsupported("truncated index")
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _parse_entries(self, count: int) -> int:
+        buf = self._map
+        version = self.version
+        entry_offsets = self.entry_offsets
+        path_starts = self.path_starts
+        path_ends = self.path_ends
+        if version == 4:
+            paths = bytearray()
+            previous = b""
+        else:
+            paths = None
+        pos = _HEADER.size
+        conflicts = False
+        for _ in range(count):
+            entry_offsets.append(pos)
+            flags = (buf[pos + _FLAGS_OFFSET] << 8) | buf[pos + _FLAGS_OFFSET + 1]
+            if flags & 0x3000:
+                conflicts = True
+            path_pos = pos + _PATH_OFFSET
+            if flags & FLAG_EXTENDED:
+                if version < 3:
+                    raise Unsupported("extended flags in a version 2 index")
+                path_pos += 2
+            if paths is not None:
+                strip, path_pos = _offset_varint(buf, path_pos)
+                nul = buf.find(b"\0", path_pos)
+                if nul < 0 or strip > len(previous):
+                    raise Unsupported("corrupt index entry")
+                previous = previous[:len(previous) - strip] + buf[path_pos:nul]
+                path_starts.append(len(paths))
+                paths += previous
+                path_ends.append(len(paths))
+                pos = nul + 1
+            else:
+                length = flags & FLAG_NAME_MASK
+                if length == FLAG_NAME_MASK:
+                    nul = buf.find(b"\0", path_pos + length)
+                    if nul < 0:
+                        raise Unsupported("corrupt index entry")
+                    length = nul - path_pos
+                path_starts.append(path_pos)
+                path_ends.append(path_pos + length)
+                # Entries are NUL-padded to a multiple of eight bytes
+                pos += ((path_pos - pos) + length + 8) & ~7
+        self._paths = paths if paths is not None else buf
+        self.has_conflicts = conflicts
+        return pos
+
+    def _parse_extensions(self, pos: int) -> None:
+        buf = self._map
+        end = len(buf) - RAW_OID_LENGTH
+        while pos + 8 <= end:
+            signature = bytes(buf[pos:pos + 4])
+            size = struct.unpack_from(">I", buf, pos + 4)[0]
+            if pos + 8 + size > end:
+                raise Unsupported("truncated index extension")
+            # Extensions whose signature starts with an uppercase letter are optional
+            if not b"A" <= signature[:1] <= b"Z":
+                raise Unsupported(f"required index extension {signature!r}")
+            self.extensions[signature] = (pos + 8, size)
+            pos += 8 + size
+        if pos != end:
+            raise Unsupported("trailing data after index extensions")
+
+    def __len__(self) -> int:
+        return len(self.entry_offsets)
+
+    def path(self, i: int) -> bytes:
+        return bytes(self._paths[self.path_starts[i]:self.path_ends[i]])
+
+    def flags(self, i: int) -> int:
+        pos = self.entry_offsets[i] + _FLAGS_OFFSET
+        return (self._map[pos] << 8) | self._map[pos + 1]
+
+    def mode(self, i: int) -> int:
+        return struct.unpack_from(">I", self._map, self.entry_offsets[i] + 24)[0]
+
+    def entry(self, i: int) -> IndexEntry:
+        pos = self.entry_offsets[i]
+        flags = self.flags(i)
+        extended = 0
+        if flags & FLAG_EXTENDED:
+            extended = (self._map[pos + _PATH_OFFSET] << 8) | self._map[pos + _PATH_OFFSET + 1]
+        oid = self._map[pos + 40:pos + 40 + RAW_OID_LENGTH].hex()
+        return IndexEntry(self.path(i), oid, flags, extended, _STAT.unpack_from(self._map, pos))
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    def lower_bound(self, prefix: bytes) -> int:
+        """Index of the first entry whose path is >= ``prefix``."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.path(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range_under(self, directory: bytes) -> Tuple[int, int]:
+        """Entries whose path equals ``directory`` or lies below it.
+
+        ``directory`` is a path without a trailing slash; ``b""`` selects
+        every entry.
+        """
+        if not directory:
+            return 0, len(self)
+        start = self.lower_bound(directory)
+        if start < len(self) and self.path(start) == directory:
+            stop = start + 1
+            while stop < len(self) and self.path(stop) == directory:
+                stop += 1  # Conflicted entries repeat the path once per stage
+            return start, stop
+        # Everything below "dir/" sorts before "dir0" ("0" follows "/")
+        return self.lower_bound(directory + b"/"), self.lower_bound(directory + b"0")
+
+    def tree_oid(self) -> Optional[str]:
+        """Root tree id from the cache-tree extension, or None if invalidated."""
+        location = self.extensions.get(b"TREE")
+        if location is None:
+            return None
+        start, size = location
+        data = self._map[start:start + size]
+        nul = data.find(b"\0")
+        newline = data.find(b"\n", nul)
+        if nul != 0 or newline < 0:
+            return None  # The first cache-tree node is always the root
+        entry_count = data[nul + 1:newline].split(b" ")[0]
+        if entry_count.startswith(b"-"):
+            return None
+        return data[newline + 1:newline + 1 + RAW_OID_LENGTH].hex()
+
+
+def read_index(repository: repo_module.Repository, max_bytes: Optional[int] = None) -> Index:
+    """Return the (cached) index of a repository; raises ``Unsupported`` if absent.
+
+    An index that is not cached yet and is larger than ``max_bytes`` also
+    raises ``Unsupported``.
+    """
+    path = os.path.join(repository.git_dir, "index")
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise Unsupported("no index")
+    key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = repository._cache.get("index")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if max_bytes is not None and st.st_size > max_bytes:
+        raise Unsupported("index too large to parse in-process")
+    index = Index(path)
+    repository._cache["index"] = (key, index)
+    return index
+
+
+def normalize_pathspecs(repository: repo_module.Repository, cwd: Optional[str],
+                        pathspecs: Sequence[str]) -> List[bytes]:
+    """Turn literal pathspecs relative to ``cwd`` into worktree-relative directories.
+
+    An empty result selects everything. Pathspecs with magic or glob
+    characters, or that leave the worktree, raise ``Unsupported``.
+    """
+    if repository.worktree is None:
+        raise Unsupported("bare repository")
+    base = os.path.relpath(os.path.abspath(cwd or os.getcwd()), repository.worktree)
+    if base == ".":
+        base = ""
+    elif base.startswith(".."):
+        raise Unsupported("cwd outside the worktree")
+    specs = list(pathspecs) or ["."]
+    result = []
+    for spec in specs:
+        if not spec or spec.startswith(":") or any(ch in spec for ch in "*?[\\"):
+            raise Unsupported("pathspec magic")
+        joined = os.path.normpath(os.path.join(base, spec)).replace(os.sep, "/")
+        if joined == ".":
+            return []
+        if joined.startswith("../") or joined == "..":
+            raise Unsupported("pathspec outside the worktree")
+        result.append(joined.encode("utf-8", "surrogateescape"))
+    return result
+
+
+def _selected(index: Index, directories: Iterable[bytes]) -> List[int]:
+    directories = list(directories)
+    if not directories:
+        return list(range(len(index)))
+    ranges = sorted(index.range_under(directory) for directory in directories)
+    selected: List[int] = []
+    for start, end in ranges:
+        # Ranges may overlap ("a" and "a/b"); keep index order without repeats
+        if selected and start <= selected[-1]:
+            start = selected[-1] + 1
+        selected.extend(range(start, end))
+    return selected
+
+
+def ls_files(repository: repo_module.Repository, directories: Iterable[bytes] = ()) -> Iterator[bytes]:
+    """Yield tracked paths (worktree-relative bytes) under ``directories`` in index order."""
+    index = read_index(repository)
+    for i in _selected(index, directories):
+        yield index.path(i)
+
+
+def _stat_key(st: os.stat_result, check_ctime: bool, minimal: bool) -> Tuple[int, ...]:
+    """Stat fields git compares, laid out like ``_entry_key``."""
+    mtime_ns = st.st_mtime_ns
+    if minimal:
+        return (mtime_ns // 1_000_000_000 & 0xFFFFFFFF, st.st_size & 0xFFFFFFFF)
+    key = (mtime_ns // 1_000_000_000 & 0xFFFFFFFF, mtime_ns % 1_000_000_000,
+           st.st_ino & 0xFFFFFFFF, st.st_uid, st.st_gid, st.st_size & 0xFFFFFFFF)
+    if check_ctime:
+        ctime_ns = st.st_ctime_ns
+        key += (ctime_ns // 1_000_000_000 & 0xFFFFFFFF, ctime_ns % 1_000_000_000)
+    return key
+
+
+def _entry_key(fields: Tuple[int, ...], check_ctime: bool, minimal: bool) -> Tuple[int, ...]:
+    ctime_s, ctime_ns, mtime_s, mtime_ns, _, ino, _, uid, gid, size = fields
+    if minimal:
+        return (mtime_s, size)
+    if check_ctime:
+        return (mtime_s, mtime_ns, ino, uid, gid, size, ctime_s, ctime_ns)
+    return (mtime_s, mtime_ns, ino, uid, gid, size)
+
+
+def _mode_matches(mode: int, st_mode: int, trust_filemode: bool) -> bool:
+    if mode & 0o170000 == MODE_SYMLINK:
+        return stat.S_ISLNK(st_mode)
+    if not stat.S_ISREG(st_mode):
+        return False
+    return not trust_filemode or bool(mode & 0o100) == bool(st_mode & 0o100)
+
+
+def stat_check(repository: repo_module.Repository, directories: Iterable[bytes] = (),
+               limit: Optional[int] = None) -> Dict[str, Any]:
+    """Compare index stat data with the worktree without hashing content.
+
+    Returns ``{"clean", "checked", "modified", "deleted", "racy", "skipped"}``.
+    ``modified`` lists entries whose stat data changed (git may still find
+    the content identical), ``deleted`` entries missing from the worktree
+    and ``racy`` entries written in the same instant as the index, whose
+    content git would have to hash. ``clean`` is True only when all three
+    are empty, i.e. git would not see any tracked change. Skip-worktree
+    and assume-valid entries are counted in ``skipped``. Submodule entries
+    raise ``Unsupported``: whether their HEAD moved is not in stat data.
+    ``limit`` stops the scan after that many findings. Untracked files are
+    not considered.
+    """
+    if repository.worktree is None:
+        raise Unsupported("bare repository")
+    if not repository.config_bool("core.symlinks", True):
+        raise Unsupported("core.symlinks=false")
+    index = read_index(repository)
+    if index.has_conflicts:
+        raise Unsupported("unmerged entries")
+    check_ctime = repository.config_bool("core.trustctime", True)
+    minimal = repository.config.get("core.checkstat", "default").lower() == "minimal"
+    trust_filemode = repository.config_bool("core.filemode", True)
+    index_mtime = (index.mtime_s, index.mtime_ns)
+    root = os.fsencode(repository.worktree) + b"/"
+    result: Dict[str, Any] = {"clean": True, "checked": 0, "modified": [], "deleted": [], "racy": [], "skipped": 0}
+    buf = index._map
+    offsets = index.entry_offsets
+    lstat = os.lstat
+    unpack_stat = _STAT.unpack_from
+    findings = 0
+    # The loop avoids per-entry objects: on large worktrees lstat() dominates
+    for i in _selected(index, directories):
+        offset = offsets[i]
+        flags = (buf[offset + _FLAGS_OFFSET] << 8) | buf[offset + _FLAGS_OFFSET + 1]
+        extended = 0
+        if flags & FLAG_EXTENDED:
+            extended = (buf[offset + _PATH_OFFSET] << 8) | buf[offset + _PATH_OFFSET + 1]
+        fields = unpack_stat(buf, offset)
+        mode = fields[6]
+        if flags & FLAG_ASSUME_VALID or extended & FLAG_SKIP_WORKTREE:
+            result["skipped"] += 1
+            continue
+        if mode & 0o170000 == MODE_GITLINK:
+            raise Unsupported("submodule entry")
+        result["checked"] += 1
+        path = index.path(i)
+        if extended & FLAG_INTENT_TO_ADD:
+            finding = "modified"
+        else:
+            try:
+                st = lstat(root + path)
+            except (FileNotFoundError, NotADirectoryError):
+                finding = "deleted"
+            else:
+                if (_stat_key(st, check_ctime, minimal) != _entry_key(fields, check_ctime, minimal)
+                        or not _mode_matches(mode, st.st_mode, trust_filemode)):
+                    finding = "modified"
+                elif (fields[2], fields[3]) >= index_mtime:
+                    finding = "racy"
+                else:
+                    continue
+        result[finding].append(path.decode("utf-8", "surrogateescape"))
+        findings += 1
+        if limit is not None and findings >= limit:
+            break
+    result["clean"] = findings == 0
+    return result
+
+
+def _head_tree(repository: repo_module.Repository) -> str:
+    oid, _ = refs.resolve(repository, "HEAD")
+    if oid is None:
+        raise Unsupported("unborn HEAD")
+    if refs.has_replace_refs(repository):
+        raise Unsupported("replace refs")
+    type_name, data = objects.read_object(repository, oid)
+    if type_name != "commit" or not data.startswith(b"tree "):
+        raise Unsupported("HEAD is not a commit")
+    return data[5:45].decode("ascii")
+
+
+def _needs_quoting(path: bytes, quote_high: bool) -> bool:
+    # Paths git's quote_c_style() would quote in non -z output
+    return any(byte < 0x20 or byte in (0x22, 0x5C, 0x7F) or (quote_high and byte >= 0x80) for byte in path)
+
+
+def _cmd_ls_files(repository: repo_module.Repository, argv: List[str], cwd: Optional[str]) -> Tuple[int, str]:
+    nul_terminated = full_name = False
+    pathspecs: List[str] = []
+    args = iter(argv)
+    for arg in args:
+        if arg == "-z":
+            nul_terminated = True
+        elif arg in ("-c", "--cached"):
+            continue
+        elif arg == "--full-name":
+            full_name = True
+        elif arg == "--":
+            pathspecs.extend(args)
+        elif arg.startswith("-"):
+            raise Unsupported(f"ls-files option {arg}")
+        else:
+            pathspecs.append(arg)
+    directories = normalize_pathspecs(repository, cwd, pathspecs)
+    index = read_index(repository, COLD_PARSE_MAX_BYTES)
+    if index.has_conflicts:
+        raise Unsupported("unmerged entries")  # ls-files prints them once per stage
+    selected = _selected(index, directories)
+    if len(selected) > LIST_MAX_ENTRIES:
+        raise Unsupported("selection too large")
+    base = os.path.relpath(os.path.abspath(cwd or os.getcwd()), repository.worktree)
+    base_bytes = b"" if base == "." or full_name else base.replace(os.sep, "/").encode("utf-8", "surrogateescape")
+    quote_high = repository.config_bool("core.quotepath", True)
+    terminator = b"\0" if nul_terminated else b"\n"
+    out = bytearray()
+    for i in selected:
+        path = index.path(i)
+        if index.mode(i) & 0o170000 == MODE_DIRECTORY:
+            raise Unsupported("sparse directory entry")
+        if base_bytes:
+            path = os.path.relpath(path, base_bytes)
+        if not nul_terminated and _needs_quoting(path, quote_high):
+            raise Unsupported("path needs quoting")
+        out += path + terminator
+    try:
+        return 0, out.decode("utf-8")
+    except UnicodeDecodeError:
+        raise Unsupported("path is not UTF-8")
+
+
+def _worktree_clean(repository: repo_module.Repository) -> bool:
+    if len(read_index(repository, COLD_PARSE_MAX_BYTES)) > STAT_CHECK_MAX_ENTRIES:
+        raise Unsupported("too many files to lstat")
+    return stat_check(repository, limit=1)["clean"]
+
+
+def _cmd_diff(repository: repo_module.Repository, argv: List[str], cwd: Optional[str]) -> Tuple[int, str]:
+    options = set(argv)
+    if len(options) != len(argv) or "--quiet" not in options:
+        raise Unsupported("diff arguments")
+    options -= {"--quiet", "--exit-code"}
+    if not options:
+        if _worktree_clean(repository):
+            return 0, ""
+        raise Unsupported("stat data changed; git has to compare content")
+    if options in ({"--cached"}, {"--staged"}):
+        index = read_index(repository, COLD_PARSE_MAX_BYTES)
+        tree = index.tree_oid()
+        if tree is None or index.has_conflicts:
+            raise Unsupported("cache-tree invalidated")
+        return (0 if tree == _head_tree(repository) else 1), ""
+    raise Unsupported("diff arguments")
+
+
+def _cmd_diff_index(repository: repo_module.Repository, argv: List[str], cwd: Optional[str]) -> Tuple[int, str]:
+    options = set(argv)
+    if (len(options) != len(argv) or not {"--quiet", "HEAD"} <= options
+            or not options <= {"--quiet", "--cached", "HEAD"}):
+        raise Unsupported("diff-index arguments")
+    index = read_index(repository, COLD_PARSE_MAX_BYTES)
+    tree = index.tree_oid()
+    if tree is None or index.has_conflicts:
+        raise Unsupported("cache-tree invalidated")
+    if tree != _head_tree(repository):
+        return 1, ""
+    if "--cached" in options or _worktree_clean(repository):
+        return 0, ""
+    raise Unsupported("stat data changed; git has to compare content")
+
+
+# Command handlers for plugins.git.fastpath: (repository, argv, cwd) -> (returncode, stdout)
+COMMANDS = {
+    "ls-files": _cmd_ls_files,
+    "diff": _cmd_diff,
+    "diff-index": _cmd_diff_index,
+}
@@ -0,0 +1,277 @@
+"""
+Per-repository reader-writer locks for git commands.
+
+Concurrent writers race on git's own lock files: two ``commit``, ``checkout``
+or ``fetch`` calls against one repository fail on ``index.lock``,
+``shallow.lock`` or a ref lock, and the caller has to retry. ``classify()``
+sorts each subcommand into a read (``log``, ``show``, ``diff``, listings,
+...) or a write (anything else that touches the repository), and ``hold()``
+takes the repository's lock for it: reads share it, writes are exclusive.
+
+The lock works at two levels. Threads of one process queue on an in-process
+lock that grants waiters in arrival order, so consecutive reads go together
+while a waiting write holds back the reads that come after it. Processes
+coordinate through ``flock()`` on two files in the repository's common git
+directory: every acquirer passes through an exclusive turnstile file before
+it locks the lock file itself, and a writer keeps the turnstile until it has
+the lock, so new readers cannot starve it. Worktrees share one lock, since
+they share refs and objects.
+
+Waits are bounded by ``SMCP_GIT_LOCK_TIMEOUT`` seconds (default 30, the
+command timeout). Repositories that ``plugins.git.repo.discover`` does not
+handle (environment overrides, unusual layouts) run unlocked, as do
+commands that need no repository (``clone``, ``init``, ``--version``).
+"""
+
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional
+
+from plugins.git import repo as repo_module
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: in-process locking only
+    fcntl = None
+
+LOCK_TIMEOUT_ENV = "SMCP_GIT_LOCK_TIMEOUT"
+DEFAULT_LOCK_TIMEOUT = 30.0
+
+READ = "read"
+WRITE = "write"
+
+# Names of the lock files in the common git directory
+LOCK_NAME = "smcp-rw.lock"
+TURNSTILE_NAME = "smcp-rw.turnstile"
+
+# Subcommands that only read the repository
+READ_COMMANDS = frozenset((
+    "annotate", "archive", "blame", "cat-file", "check-attr", "check-ignore", "check-mailmap", "cherry",
+    "count-objects", "describe", "diff", "diff-files", "diff-index", "diff-tree", "for-each-ref",
+    "format-patch", "fsck", "grep", "log", "ls-files", "ls-remote", "ls-tree", "merge-base", "name-rev",
+    "range-diff", "rev-list", "rev-parse", "shortlog", "show", "show-branch", "show-ref", "status", "var",
+    "verify-commit", "verify-pack", "verify-tag", "whatchanged",
+))
+
+# Subcommands that need no repository, or create one
+UNLOCKED_COMMANDS = frozenset(("clone", "init", "help", "version", "--version", "--help", "-h", "--exec-path",
+                               "--html-path", "--man-path", "--info-path"))
+
+# Options that keep ``branch`` and ``tag`` listing instead of changing refs
+_LISTING_OPTIONS = frozenset((
+    "-l", "--list", "-a", "--all", "-r", "--remotes", "-v", "-vv", "--verbose", "-n", "--show-current",
+    "--format", "--sort", "--column", "--no-column", "--color", "--no-color", "--abbrev", "--no-abbrev", "-i",
+    "--ignore-case", "--omit-empty",
+))
+
+# Subcommands that read when their first argument is one of these (or, for None, when they have none)
+_READ_ACTIONS: Dict[str, tuple] = {
+    "remote": (None, "-v", "--verbose", "show", "get-url"),
+    "stash": ("list", "show"),
+    "worktree": ("list",),
+    "notes": (None, "list", "show"),
+    "submodule": (None, "status", "summary"),
+    "reflog": (None, "show", "exists"),
+}
+
+# Subcommands that only change the index, HEAD and files of their own worktree
+WORKTREE_COMMANDS = frozenset(("checkout", "switch", "restore", "reset", "clean", "add", "rm", "mv", "apply",
+                               "read-tree", "checkout-index", "update-index"))
+
+# Options that make checkout and switch create a branch, which every worktree shares
+_BRANCH_CREATION = frozenset(("-b", "-B", "-c", "-C", "--create", "--force-create", "--orphan"))
+
+_CONFIG_READS = frozenset(("--get", "--get-all", "--get-regexp", "--get-urlmatch", "--get-color",
+                           "--get-colorbool", "-l", "--list"))
+
+
+class LockTimeout(Exception):
+    """Raised when a repository lock is not granted within the timeout."""
+
+
+def classify(cmd_args: List[str], private_worktree: bool = False) -> Optional[str]:
+    """Return ``READ`` or ``WRITE`` for a git command line, or ``None`` if it needs no lock.
+
+    Unknown subcommands and global options before the subcommand count as
+    writes, which is always safe: they are only serialized. With
+    ``private_worktree`` (the command runs in a worktree leased to the
+    caller alone), commands that only change that worktree share the
+    repository's lock like reads.
+    """
+    if len(cmd_args) < 2:
+        return None
+    command, args = cmd_args[1], cmd_args[2:]
+    if command in UNLOCKED_COMMANDS:
+        return None
+    if private_worktree and command in WORKTREE_COMMANDS and not any(
+            arg.partition("=")[0] in _BRANCH_CREATION for arg in args):
+        return READ
+    if command in READ_COMMANDS:
+        return READ
+    if command in ("branch", "tag"):
+        listing = all(arg.partition("=")[0] in _LISTING_OPTIONS for arg in args)
+        return READ if listing or "-l" in args or "--list" in args else WRITE
+    if command == "config":
+        return READ if any(arg in _CONFIG_READS for arg in args) else WRITE
+    if command in _READ_ACTIONS:
+        return READ if (args[0] if args else None) in _READ_ACTIONS[command] else WRITE
+    return WRITE
+
+
+def lock_timeout() -> float:
+    """Seconds to wait for a lock, from ``SMCP_GIT_LOCK_TIMEOUT``."""
+    try:
+        return max(float(os.environ.get(LOCK_TIMEOUT_ENV, DEFAULT_LOCK_TIMEOUT)), 0.0)
+    except ValueError:
+        return DEFAULT_LOCK_TIMEOUT
+
+
+class FairLock:
+    """In-process reader-writer lock that grants waiters in arrival order."""
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting: Deque[object] = deque()
+
+    def acquire(self, shared: bool, deadline: float) -> bool:
+        """Wait until ``time.monotonic()`` reaches ``deadline``; returns whether the lock was granted."""
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            while not (self._waiting[0] is ticket and not self._writer and (shared or self._readers == 0)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._condition.notify_all()
+                    return False
+                self._condition.wait(remaining)
+            self._waiting.popleft()
+            if shared:
+                self._readers += 1
+            else:
+                self._writer = True
+            # The next waiter may be a reader that can share the lock too
+            self._condition.notify_all()
+            return True
+
+    def release(self, shared: bool) -> None:
+        with self._condition:
+            if shared:
+                self._readers -= 1
+            else:
+                self._writer = False
+            self._condition.notify_all()
+
+
+def _flock(fd: int, operation: int, deadline: float) -> bool:
+    # flock() has no timeout, so poll without blocking, backing off from 0.5 ms to 50 ms
+    delay = 0.0005
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+class RepositoryLock:
+    """The reader-writer lock of one repository, across threads and processes."""
+
+    def __init__(self, common_dir: str):
+        self.common_dir = common_dir
+        self.local = FairLock()
+
+    def _lock_file(self, shared: bool, deadline: float) -> Optional[int]:
+        """Lock the repository's lock file; returns its descriptor, or ``None`` on timeout."""
+        turnstile = os.open(os.path.join(self.common_dir, TURNSTILE_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            lock = os.open(os.path.join(self.common_dir, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # Pass through the turnstile; a writer holds it until the lock is granted
+                if _flock(turnstile, fcntl.LOCK_EX, deadline) and _flock(
+                        lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, deadline):
+                    return lock
+            except BaseException:
+                os.close(lock)
+                raise
+            os.close(lock)
+            return None
+        finally:
+            os.close(turnstile)  # Closing the descriptor releases the turnstile
+
+    def acquire(self, shared: bool, timeout: float) -> Optional[int]:
+        """Take the lock; returns the lock file descriptor to pass to ``release()``.
+
+        Raises ``LockTimeout`` when it is not granted within ``timeout``
+        seconds. The descriptor is ``None`` when the lock files cannot be
+        created (a read-only repository); only threads are serialized then.
+        """
+        deadline = time.monotonic() + timeout
+        if not self.local.acquire(shared, deadline):
+            raise LockTimeout(f"{WRITE if not shared else READ} lock on {self.common_dir} not granted "
+                              f"within {timeout:g} seconds")
+        if fcntl is None:  # pragma: no cover - Windows
+            return None
+        try:
+            descriptor = self._lock_file(shared, deadline)
+        except OSError:
+            return None
+        except BaseException:
+            self.local.release(shared)
+            raise
+        if descriptor is None:
+            self.local.release(shared)
+            raise LockTimeout(f"{WRITE if not shared else READ} lock on {self.common_dir} held by another "
+                              f"process for over {timeout:g} seconds")
+        return descriptor
+
+    def release(self, shared: bool, descriptor: Optional[int]) -> None:
+        if descriptor is not None:
+            os.close(descriptor)
+        self.local.release(shared)
+
+
+_locks: Dict[str, RepositoryLock] = {}
+_locks_guard = threading.Lock()
+
+
+def repository_lock(common_dir: str) -> RepositoryLock:
+    """The process-wide lock of the repository whose common git directory is ``common_dir``."""
+    key = os.path.realpath(common_dir)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = RepositoryLock(key)
+        return lock
+
+
+@contextlib.contextmanager
+def hold(kind: Optional[str], cwd: Optional[str], timeout: Optional[float] = None) -> Iterator[Optional[str]]:
+    """Hold the lock of the repository at ``cwd`` for a ``READ`` or ``WRITE`` command.
+
+    Yields the kind of lock held, or ``None`` when the command runs
+    unlocked (``kind`` is ``None`` or the repository is not discovered).
+    Raises ``LockTimeout`` after ``timeout`` seconds (default
+    ``lock_timeout()``).
+    """
+    repository = repo_module.discover(cwd) if kind is not None else None
+    if repository is None:
+        yield None
+        return
+    lock = repository_lock(repository.common_dir)
+    shared = kind == READ
+    descriptor = lock.acquire(shared, lock_timeout() if timeout is None else timeout)
+    try:
+        yield kind
+    finally:
+        lock.release(shared, descriptor)
@@ -0,0 +1,606 @@
+"""
+In-process reads of git objects.
+
+Looks objects up in loose object files and in packfiles, binary-searching
+the memory-mapped ``.idx`` (version 2) of each pack, inflating with
+``zlib`` and resolving ``OFS_DELTA``/``REF_DELTA`` chains. Reconstructed
+delta bases are kept in a bounded LRU cache, like git's
+``core.deltaBaseCacheLimit``, so walking many objects that share bases
+stays cheap.
+
+Use ``has_object``, ``object_type``, ``object_size``, ``read_object`` and
+``cat_file`` with a repository from ``repo.discover()``. Readers raise
+``MissingObject`` when an object is not stored locally (it may still be
+fetchable in a partial clone) and ``CorruptObject`` when data cannot be
+decoded; callers fall back to git in both cases.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from plugins.git import repo as repo_module
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {OBJ_COMMIT: "commit", OBJ_TREE: "tree", OBJ_BLOB: "blob", OBJ_TAG: "tag"}
+
+RAW_OID_LENGTH = 20
+
+# Total bytes of reconstructed delta bases kept per repository
+DELTA_BASE_CACHE_LIMIT = 16 * 1024 * 1024
+
+# Compressed bytes fed to zlib per step when inflating from a mapped pack
+_INFLATE_CHUNK = 64 * 1024
+
+_IDX_MAGIC = b"\377tOc"
+_FANOUT_OFFSET = 8
+_SHA_TABLE_OFFSET = _FANOUT_OFFSET + 256 * 4
+
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+class MissingObject(LookupError):
+    """Raised when an object is not available locally."""
+
+
+class CorruptObject(ValueError):
+    """Raised when object data cannot be decoded."""
+
+
+def is_full_oid(value: str) -> bool:
+    """Return True for a full, lowercase SHA-1 hex object id."""
+    return len(value) == 2 * RAW_OID_LENGTH and set(value) <= _HEX_DIGITS
+
+
+def _map_file(path: str) -> mmap.mmap:
+    with open(path, "rb") as handle:
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PackIndex:
+    """Memory-mapped ``.idx`` version 2 file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map = _map_file(path)
+        buf = self._map
+        if len(buf) < _SHA_TABLE_OFFSET or buf[:4] != _IDX_MAGIC:
+            raise CorruptObject(f"unsupported pack index {path}")
+        if struct.unpack(">I", buf[4:8])[0] != 2:
+            raise CorruptObject(f"unsupported pack index version in {path}")
+        self.fanout = struct.unpack(">256I", buf[_FANOUT_OFFSET:_SHA_TABLE_OFFSET])
+        self.count = self.fanout[255]
+        self._crc_offset = _SHA_TABLE_OFFSET + self.count * RAW_OID_LENGTH
+        self._offset_offset = self._crc_offset + self.count * 4
+        self._large_offset = self._offset_offset + self.count * 4
+        if len(buf) < self._large_offset + 2 * RAW_OID_LENGTH:
+            raise CorruptObject(f"truncated pack index {path}")
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _oid_at(self, index: int) -> bytes:
+        start = _SHA_TABLE_OFFSET + index * RAW_OID_LENGTH
+        return self._map[start:start + RAW_OID_LENGTH]
+
+    def find(self, raw_oid: bytes) -> Optional[int]:
+        """Return the pack offset of ``raw_oid``, or None if absent."""
+        first = raw_oid[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._oid_at(mid)
+            if current < raw_oid:
+                lo = mid + 1
+            elif current > raw_oid:
+                hi = mid
+            else:
+                return self._offset_of(mid)
+        return None
+
+    def _offset_of(self, index: int) -> int:
+        start = self._offset_offset + index * 4
+        offset = struct.unpack(">I", self._map[start:start + 4])[0]
+        if offset & 0x80000000:
+            start = self._large_offset + (offset & 0x7FFFFFFF) * 8
+            offset = struct.unpack(">Q", self._map[start:start + 8])[0]
+        return offset
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self._oid_at(index)
+
+
+class Pack:
+    """A packfile and its index."""
+
+    def __init__(self, pack_path: str, idx_path: str):
+        self.path = pack_path
+        self.index = PackIndex(idx_path)
+        self._map = _map_file(pack_path)
+        if self._map[:4] != b"PACK" or struct.unpack(">I", self._map[4:8])[0] not in (2, 3):
+            self.close()
+            raise CorruptObject(f"unsupported pack {pack_path}")
+
+    def close(self) -> None:
+        self.index.close()
+        self._map.close()
+
+    def entry_header(self, offset: int) -> Tuple[int, int, int, Optional[object]]:
+        """Parse the entry at ``offset``.
+
+        Returns ``(type, size, data offset, base)`` where ``base`` is the
+        base entry offset for ``OFS_DELTA``, the raw base oid for
+        ``REF_DELTA`` and None otherwise.
+        """
+        buf = self._map
+        start = offset
+        try:
+            byte = buf[offset]
+            obj_type = (byte >> 4) & 7
+            size = byte & 15
+            shift = 4
+            offset += 1
+            while byte & 0x80:
+                byte = buf[offset]
+                size |= (byte & 0x7F) << shift
+                shift += 7
+                offset += 1
+            base = None
+            if obj_type == OBJ_OFS_DELTA:
+                byte = buf[offset]
+                distance = byte & 0x7F
+                offset += 1
+                while byte & 0x80:
+                    byte = buf[offset]
+                    distance = ((distance + 1) << 7) | (byte & 0x7F)
+                    offset += 1
+                base = start - distance
+                if base < 12 or base >= start:
+                    raise CorruptObject(f"bad delta base offset in {self.path}")
+            elif obj_type == OBJ_REF_DELTA:
+                base = bytes(buf[offset:offset + RAW_OID_LENGTH])
+                offset += RAW_OID_LENGTH
+        except IndexError:
+            raise CorruptObject(f"truncated pack entry in {self.path}")
+        if obj_type not in TYPE_NAMES and obj_type not in (OBJ_OFS_DELTA, OBJ_REF_DELTA):
+            raise CorruptObject(f"bad object type {obj_type} in {self.path}")
+        return obj_type, size, offset, base
+
+    def inflate(self, offset: int, size: int, limit: Optional[int] = None) -> bytes:
+        """Inflate the zlib stream at ``offset``.
+
+        With ``limit`` only the first ``limit`` bytes are produced, which is
+        enough to read delta headers without inflating whole objects.
+        """
+        decompressor = zlib.decompressobj()
+        wanted = size if limit is None else min(size, limit)
+        chunks: List[bytes] = []
+        produced = 0
+        buf = self._map
+        end = len(buf)
+        try:
+            while produced < wanted or (limit is None and not decompressor.eof):
+                # Asking for one byte more than expected exposes oversized streams
+                room = max(wanted - produced + 1, 1)
+                if decompressor.unconsumed_tail:
+                    data = decompressor.decompress(decompressor.unconsumed_tail, room)
+                else:
+                    if offset >= end:
+                        break
+                    data = decompressor.decompress(buf[offset:offset + _INFLATE_CHUNK], room)
+                    offset += _INFLATE_CHUNK
+                chunks.append(data)
+                produced += len(data)
+                if decompressor.eof:
+                    break
+        except zlib.error as exc:
+            raise CorruptObject(f"bad zlib data in {self.path}: {exc}")
+        data = b"".join(chunks)
+        if limit is None and (len(data) != size or not decompressor.eof):
+            raise CorruptObject(f"size mismatch inflating {self.path}")
+        return data[:wanted]
+
+
+def _delta_varint(delta: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = delta[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def delta_result_size(delta: bytes) -> int:
+    """Return the size of the object a delta produces, from its header."""
+    try:
+        _, pos = _delta_varint(delta, 0)
+        return _delta_varint(delta, pos)[0]
+    except IndexError:
+        raise CorruptObject("truncated delta header")
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Apply a git binary delta to ``base``."""
+    try:
+        source_size, pos = _delta_varint(delta, 0)
+        target_size, pos = _delta_varint(delta, pos)
+        if source_size != len(base):
+            raise CorruptObject("delta base size mismatch")
+        out = bytearray()
+        length = len(delta)
+        while pos < length:
+            op = delta[pos]
+            pos += 1
+            if op & 0x80:
+                copy_offset = 0
+                for i in range(4):
+                    if op & (1 << i):
+                        copy_offset |= delta[pos] << (8 * i)
+                        pos += 1
+                copy_size = 0
+                for i in range(3):
+                    if op & (0x10 << i):
+                        copy_size |= delta[pos] << (8 * i)
+                        pos += 1
+                if copy_size == 0:
+                    copy_size = 0x10000
+                if copy_offset + copy_size > source_size:
+                    raise CorruptObject("delta copy out of range")
+                out += base[copy_offset:copy_offset + copy_size]
+            elif op:
+                out += delta[pos:pos + op]
+                pos += op
+            else:
+                raise CorruptObject("reserved delta opcode")
+    except IndexError:
+        raise CorruptObject("truncated delta")
+    if len(out) != target_size:
+        raise CorruptObject("delta result size mismatch")
+    return bytes(out)
+
+
+class ObjectStore:
+    """Objects of one repository: loose objects, packs and alternates."""
+
+    def __init__(self, objects_dir: str, cache_limit: int = DELTA_BASE_CACHE_LIMIT):
+        self.objects_dirs = _with_alternates(objects_dir)
+        self.cache_limit = cache_limit
+        self._packs: List[Pack] = []
+        self._pack_dirs_state: Optional[Tuple] = None
+        self._base_cache: "OrderedDict[Tuple[str, int], Tuple[int, bytes]]" = OrderedDict()
+        self._base_cache_bytes = 0
+        # A store is shared by every thread reading the cached repository
+        self._packs_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._packs_lock:
+            for pack in self._packs:
+                pack.close()
+            self._packs = []
+            self._pack_dirs_state = None
+        with self._cache_lock:
+            self._base_cache.clear()
+            self._base_cache_bytes = 0
+
+    # Pack discovery
+
+    def _pack_dirs(self) -> List[str]:
+        return [os.path.join(directory, "pack") for directory in self.objects_dirs]
+
+    def _scan_state(self) -> Tuple:
+        state = []
+        for directory in self._pack_dirs():
+            try:
+                state.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+    def _refresh_packs(self) -> bool:
+        """Re-read the pack directories if they changed; returns True if they did."""
+        with self._packs_lock:
+            return self._rescan_packs()
+
+    def _rescan_packs(self) -> bool:
+        state = self._scan_state()
+        if state == self._pack_dirs_state:
+            return False
+        known = {pack.path: pack for pack in self._packs}
+        packs = []
+        for directory in self._pack_dirs():
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                if not (name.startswith("pack-") and name.endswith(".idx")):
+                    continue
+                pack_path = os.path.join(directory, name[:-4] + ".pack")
+                pack = known.pop(pack_path, None)
+                if pack is None:
+                    if not os.path.isfile(pack_path):
+                        continue
+                    try:
+                        pack = Pack(pack_path, os.path.join(directory, name))
+                    except (OSError, ValueError):
+                        continue  # Being written or removed by a concurrent repack
+                packs.append((os.stat(pack_path).st_mtime_ns if os.path.exists(pack_path) else 0, pack))
+        for stale in known.values():
+            stale.close()
+        # Newest packs first: recently written objects are looked up most
+        packs.sort(key=lambda item: item[0], reverse=True)
+        self._packs = [pack for _, pack in packs]
+        self._pack_dirs_state = state
+        return True
+
+    def _find_packed(self, raw_oid: bytes) -> Optional[Tuple[Pack, int]]:
+        if self._pack_dirs_state is None:
+            self._refresh_packs()
+        found = self._search_packs(raw_oid)
+        if found is None and self._refresh_packs():
+            found = self._search_packs(raw_oid)  # A repack may have moved it
+        return found
+
+    def _search_packs(self, raw_oid: bytes) -> Optional[Tuple[Pack, int]]:
+        for pack in self._packs:
+            offset = pack.index.find(raw_oid)
+            if offset is not None:
+                return pack, offset
+        return None
+
+    def _loose_path(self, oid: str) -> Optional[str]:
+        for directory in self.objects_dirs:
+            path = os.path.join(directory, oid[:2], oid[2:])
+            if os.path.isfile(path):
+                return path
+        return None
+
+    # Delta base cache
+
+    def _cache_get(self, key: Tuple[str, int]) -> Optional[Tuple[int, bytes]]:
+        with self._cache_lock:
+            entry = self._base_cache.get(key)
+            if entry is not None:
+                self._base_cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key: Tuple[str, int], obj_type: int, data: bytes) -> None:
+        if len(data) > self.cache_limit:
+            return
+        with self._cache_lock:
+            if key in self._base_cache:
+                return
+            self._base_cache[key] = (obj_type, data)
+            self._base_cache_bytes += len(data)
+            while self._base_cache_bytes > self.cache_limit:
+                _, (_, evicted) = self._base_cache.popitem(last=False)
+                self._base_cache_bytes -= len(evicted)
+
+    # Reading
+
+    def _read_packed(self, pack: Pack, offset: int, depth: int = 0) -> Tuple[int, bytes]:
+        # Walk down the delta chain to a base we already have, then apply
+        # the deltas back up, caching every intermediate base
+        chain: List[Tuple[int, int, int]] = []
+        current = offset
+        while True:
+            cached = self._cache_get((pack.path, current))
+            if cached is not None:
+                obj_type, data = cached
+                break
+            entry_type, size, data_offset, base = pack.entry_header(current)
+            if entry_type == OBJ_OFS_DELTA:
+                # Terminates: entry_header() only returns bases before the entry
+                chain.append((current, data_offset, size))
+                current = base
+            elif entry_type == OBJ_REF_DELTA:
+                chain.append((current, data_offset, size))
+                if depth > 64:
+                    raise CorruptObject("delta chain too deep")
+                obj_type, data = self._read_raw(base.hex(), depth + 1)
+                break
+            else:
+                obj_type, data = entry_type, pack.inflate(data_offset, size)
+                if chain:
+                    self._cache_put((pack.path, current), obj_type, data)
+                break
+        for index, (entry_offset, data_offset, size) in enumerate(reversed(chain)):
+            data = apply_delta(data, pack.inflate(data_offset, size))
+            if index < len(chain) - 1:
+                self._cache_put((pack.path, entry_offset), obj_type, data)
+        return obj_type, data
+
+    def _packed_info(self, pack: Pack, offset: int, depth: int = 0) -> Tuple[int, int]:
+        entry_type, size, data_offset, base = pack.entry_header(offset)
+        if entry_type not in (OBJ_OFS_DELTA, OBJ_REF_DELTA):
+            return entry_type, size
+        # The delta header holds the result size; the type is the base's
+        result_size = delta_result_size(pack.inflate(data_offset, size, limit=20))
+        while True:
+            if entry_type == OBJ_OFS_DELTA:
+                entry_type, size, data_offset, base = pack.entry_header(base)
+            elif entry_type == OBJ_REF_DELTA:
+                if depth > 64:
+                    raise CorruptObject("delta chain too deep")
+                return self._info(base.hex(), depth + 1)[0], result_size
+            else:
+                return entry_type, result_size
+
+    def _read_loose(self, path: str, header_only: bool = False) -> Tuple[int, int, bytes]:
+        with open(path, "rb") as handle:
+            compressed = handle.read()
+        decompressor = zlib.decompressobj()
+        try:
+            if header_only:
+                data = decompressor.decompress(compressed, 64)
+            else:
+                data = decompressor.decompress(compressed) + decompressor.flush()
+        except zlib.error as exc:
+            raise CorruptObject(f"bad loose object {path}: {exc}")
+        header, sep, body = data.partition(b"\0")
+        type_name, _, size_text = header.partition(b" ")
+        type_code = {name.encode("ascii"): code for code, name in TYPE_NAMES.items()}.get(type_name)
+        if not sep or type_code is None or not size_text.isdigit():
+            raise CorruptObject(f"bad loose object header in {path}")
+        size = int(size_text)
+        if not header_only and len(body) != size:
+            raise CorruptObject(f"loose object size mismatch in {path}")
+        return type_code, size, body
+
+    def _read_raw(self, oid: str, depth: int = 0) -> Tuple[int, bytes]:
+        found = self._find_packed(bytes.fromhex(oid))
+        if found is not None:
+            return self._read_packed(found[0], found[1], depth)
+        path = self._loose_path(oid)
+        if path is None:
+            raise MissingObject(oid)
+        type_code, _, body = self._read_loose(path)
+        return type_code, body
+
+    def _info(self, oid: str, depth: int = 0) -> Tuple[int, int]:
+        found = self._find_packed(bytes.fromhex(oid))
+        if found is not None:
+            return self._packed_info(found[0], found[1], depth)
+        path = self._loose_path(oid)
+        if path is None:
+            raise MissingObject(oid)
+        type_code, size, _ = self._read_loose(path, header_only=True)
+        return type_code, size
+
+    def has(self, oid: str) -> bool:
+        _check_oid(oid)
+        return self._find_packed(bytes.fromhex(oid)) is not None or self._loose_path(oid) is not None
+
+    def info(self, oid: str) -> Tuple[str, int]:
+        _check_oid(oid)
+        type_code, size = self._info(oid)
+        return TYPE_NAMES[type_code], size
+
+    def read(self, oid: str) -> Tuple[str, bytes]:
+        _check_oid(oid)
+        type_code, data = self._read_raw(oid)
+        return TYPE_NAMES[type_code], data
+
+
+def _check_oid(oid: str) -> None:
+    if not is_full_oid(oid):
+        raise ValueError(f"not a full object id: {oid!r}")
+
+
+def _with_alternates(objects_dir: str, depth: int = 0) -> List[str]:
+    directories = [objects_dir]
+    if depth > 5:
+        return directories
+    try:
+        with open(os.path.join(objects_dir, "info", "alternates"), "r", encoding="utf-8") as handle:
+            lines = handle.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return directories
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith('"'):
+            continue
+        alternate = os.path.normpath(os.path.join(objects_dir, line))
+        if os.path.isdir(alternate) and alternate not in directories:
+            directories.extend(d for d in _with_alternates(alternate, depth + 1) if d not in directories)
+    return directories
+
+
+def store(repository: repo_module.Repository) -> ObjectStore:
+    """Return the (cached) object store of a repository."""
+    cached = repository._cache.get("objects")
+    if cached is None:
+        cached = repository._cache["objects"] = ObjectStore(repository.objects_dir)
+    return cached
+
+
+def has_object(repository: repo_module.Repository, oid: str) -> bool:
+    """Return True if ``oid`` is stored locally (loose, packed or in an alternate)."""
+    return store(repository).has(oid)
+
+
+def object_type(repository: repo_module.Repository, oid: str) -> str:
+    """Return ``"commit"``, ``"tree"``, ``"blob"`` or ``"tag"``; raises ``MissingObject``."""
+    return store(repository).info(oid)[0]
+
+
+def object_size(repository: repo_module.Repository, oid: str) -> int:
+    """Return the object's size in bytes without inflating more than needed."""
+    return store(repository).info(oid)[1]
+
+
+def read_object(repository: repo_module.Repository, oid: str) -> Tuple[str, bytes]:
+    """Return ``(type, content)`` of an object; raises ``MissingObject``."""
+    return store(repository).read(oid)
+
+
+def parse_tree(data: bytes) -> List[Tuple[str, bytes, str]]:
+    """Split raw tree content into ``(mode, name, oid)`` entries."""
+    entries = []
+    pos = 0
+    length = len(data)
+    while pos < length:
+        space = data.find(b" ", pos)
+        nul = data.find(b"\0", space)
+        if space < 0 or nul < 0 or nul + 1 + RAW_OID_LENGTH > length:
+            raise CorruptObject("malformed tree")
+        mode = data[pos:space].decode("ascii")
+        name = data[space + 1:nul]
+        entries.append((mode, name, data[nul + 1:nul + 1 + RAW_OID_LENGTH].hex()))
+        pos = nul + 1 + RAW_OID_LENGTH
+    return entries
+
+
+def tree_entry_type(mode: str) -> str:
+    """Object type implied by a tree entry mode, as ls-tree reports it."""
+    if mode == "40000":
+        return "tree"
+    if mode == "160000":
+        return "commit"
+    return "blob"
+
+
+def cat_file(repository: repo_module.Repository, option: str, oid: str) -> bytes:
+    """Behave like ``git cat-file <option> <oid>`` for a full object id.
+
+    ``option`` is ``-e`` (empty output; raises ``MissingObject`` if absent),
+    ``-t``, ``-s``, ``-p`` or an object type name (raw content, which must
+    match the object's type). Tree entries printed by ``-p`` keep their raw
+    names; callers must quote them if they need ls-tree's quoting.
+    """
+    objects = store(repository)
+    if option == "-e":
+        if not objects.has(oid):
+            raise MissingObject(oid)
+        return b""
+    if option in ("-t", "-s"):
+        type_name, size = objects.info(oid)
+        return (type_name if option == "-t" else str(size)).encode("ascii") + b"\n"
+    type_name, data = objects.read(oid)
+    if option == "-p":
+        if type_name != "tree":
+            return data
+        return b"".join(
+            b"%06d %s %s\t%s\n" % (int(mode), tree_entry_type(mode).encode("ascii"), entry_oid.encode("ascii"), name)
+            for mode, name, entry_oid in parse_tree(data))
+    if option in TYPE_NAMES.values():
+        if option != type_name:
+            raise CorruptObject(f"object {oid} is a {type_name}, not a {option}")
+        return data
+    raise ValueError(f"unsupported cat-file option {option}")
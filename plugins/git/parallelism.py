@@ -0,0 +1,201 @@
+"""
+Core-aware parallelism settings for git commands, under a machine-wide budget.
+
+Git can fetch remotes and submodules, check files out, pack objects and
+read the index in parallel, but its defaults either run one job at a time
+(``fetch.parallel``, ``submodule.fetchJobs``, ``checkout.workers``) or start
+one thread per online CPU (``pack.threads``, ``index.threads``), which
+ignores the affinity mask of a container or taskset and oversubscribes the
+machine when several commands run at once.
+
+``lease()`` gives a command a share of a budget of ``SMCP_GIT_JOBS`` jobs
+(default: the CPUs this process may run on) and adds the settings that
+command uses, with that many jobs, as ``-c`` options:
+
+- ``clone``: ``submodule.fetchJobs``, ``checkout.workers`` and ``pack.threads``
+- ``fetch``, ``pull``, ``submodule`` and ``remote update``: ``fetch.parallel``
+  and ``submodule.fetchJobs`` (and for ``pull`` and ``submodule``, the
+  checkout settings), with ``pack.threads`` for the packs they receive
+- ``checkout``, ``switch``, ``restore``, ``reset``, ``merge`` and similar:
+  ``checkout.workers`` and ``index.threads``
+- ``status``, ``diff``, ``add``, ``commit`` and other index readers: ``index.threads``
+- ``repack``, ``gc`` and other pack writers: ``pack.threads``
+
+The budget is shared with every other call in flight, in this process or
+any other: each job is a ``flock()`` on a slot file in ``SMCP_GIT_JOBS_DIR``
+(default ``smcp-git-jobs-<uid>`` in the temporary directory), and each call
+in flight holds a lease file there too. A command takes free slots up to
+its fair share, the budget divided by the calls in flight, and index-only
+commands no more than ``INDEX_THREADS_MAX``. It always gets at least one
+job, so it never waits; with one job, ``pack.threads`` is left to git's
+default. A crashed process releases its slots with its file descriptors.
+Settings in the repository's own config win, and ``SMCP_GIT_JOBS=0`` turns
+the options off.
+"""
+
+import contextlib
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from plugins.git import repo as repo_module
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no budget shared between processes
+    fcntl = None
+
+JOBS_ENV = "SMCP_GIT_JOBS"
+JOBS_DIR_ENV = "SMCP_GIT_JOBS_DIR"
+
+_FETCH = ("fetch.parallel", "submodule.fetchjobs", "pack.threads")
+_CHECKOUT = ("checkout.workers", "index.threads")
+
+# Subcommand -> the settings that control its parallelism
+SETTINGS: Dict[str, Tuple[str, ...]] = {
+    "clone": ("submodule.fetchjobs", "checkout.workers", "pack.threads"),
+    "fetch": _FETCH,
+    "pull": _FETCH + _CHECKOUT,
+    "submodule": _FETCH + _CHECKOUT,
+    "remote": _FETCH,
+    "checkout": _CHECKOUT,
+    "switch": _CHECKOUT,
+    "restore": _CHECKOUT,
+    "reset": _CHECKOUT,
+    "merge": _CHECKOUT,
+    "rebase": _CHECKOUT,
+    "cherry-pick": _CHECKOUT,
+    "revert": _CHECKOUT,
+    "stash": _CHECKOUT,
+    "sparse-checkout": _CHECKOUT,
+    "read-tree": _CHECKOUT,
+    "status": ("index.threads",),
+    "diff": ("index.threads",),
+    "add": ("index.threads",),
+    "commit": ("index.threads",),
+    "rm": ("index.threads",),
+    "mv": ("index.threads",),
+    "ls-files": ("index.threads",),
+    "update-index": ("index.threads",),
+    "repack": ("pack.threads",),
+    "gc": ("pack.threads",),
+    "pack-objects": ("pack.threads",),
+    "index-pack": ("pack.threads",),
+    "multi-pack-index": ("pack.threads",),
+    "push": ("pack.threads",),
+    "bundle": ("pack.threads",),
+}
+
+# git gives each index thread at least 10,000 entries, so status and the like gain little past a few
+INDEX_THREADS_MAX = 4
+
+# The spelling git documents, for the -c options and the response
+_NAMES = {"submodule.fetchjobs": "submodule.fetchJobs"}
+
+
+def cpu_count() -> int:
+    """CPUs this process may run on, which a container or taskset can hold below the machine's count."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1  # pragma: no cover - platforms without affinity masks
+
+
+def budget() -> int:
+    """Jobs all git calls may use at once, from ``SMCP_GIT_JOBS`` (default ``cpu_count()``; 0: no options)."""
+    try:
+        return max(int(os.environ.get(JOBS_ENV, "")), 0)
+    except ValueError:
+        return cpu_count()
+
+
+def jobs_dir() -> str:
+    return os.environ.get(JOBS_DIR_ENV) or os.path.join(tempfile.gettempdir(), f"smcp-git-jobs-{os.getuid()}")
+
+
+def settings_for(cmd_args: List[str], cwd: Optional[str] = None) -> List[str]:
+    """The parallelism settings to add to a git command line; those the repository configures are left out."""
+    if len(cmd_args) < 2 or cmd_args[1] not in SETTINGS:
+        return []
+    if cmd_args[1] == "remote" and cmd_args[2:3] != ["update"]:
+        return []
+    repository = repo_module.discover(cwd)
+    configured = repository.config if repository is not None else {}
+    return [key for key in SETTINGS[cmd_args[1]] if key not in configured]
+
+
+def _try_lock(name: str) -> Optional[int]:
+    # Lock files are never deleted: a process could hold a lock on the old inode of a deleted one
+    fd = os.open(os.path.join(jobs_dir(), name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _register(total: int) -> Tuple[Optional[int], int]:
+    """Hold a lease file for this call; returns its descriptor and the calls in flight, this one included."""
+    mine: Optional[int] = None
+    others = 0
+    for n in range(total):
+        fd = _try_lock(f"lease{n}.lock")
+        if fd is None:
+            others += 1
+        elif mine is None:
+            mine = fd
+        else:
+            os.close(fd)
+    return mine, others + 1
+
+
+def _take_slots(count: int, total: int) -> List[int]:
+    """Lock up to ``count`` of the ``total`` slot files; returns the descriptors, which hold the slots until closed."""
+    held: List[int] = []
+    for slot in range(total):
+        if len(held) == count:
+            break
+        fd = _try_lock(f"slot{slot}.lock")
+        if fd is not None:
+            held.append(fd)
+    return held
+
+
+@contextlib.contextmanager
+def lease(cmd_args: List[str], cwd: Optional[str] = None) -> Iterator[Tuple[List[str], Optional[Dict[str, Any]]]]:
+    """Take a share of the job budget for a git command line while it runs.
+
+    Yields the command line with the ``-c`` options added and a report for
+    the response (``jobs``, ``budget`` and ``config``), or the command line
+    unchanged and ``None`` when the command has no parallelism settings to
+    add or the budget is 0. ``config`` is empty when one job leaves a pack
+    writer's ``pack.threads`` to git. The jobs go back to the budget on exit.
+    """
+    total = budget()
+    keys = settings_for(cmd_args, cwd) if total else []
+    if not keys:
+        yield cmd_args, None
+        return
+    held: List[int] = []
+    if fcntl is None:  # pragma: no cover - Windows
+        marker, in_flight = None, 1
+    else:
+        os.makedirs(jobs_dir(), exist_ok=True)
+        marker, in_flight = _register(total)
+    try:
+        share = max(total // in_flight, 1)
+        if keys == ["index.threads"]:
+            share = min(share, INDEX_THREADS_MAX)
+        if fcntl is None:  # pragma: no cover - Windows
+            jobs = share
+        else:
+            held = _take_slots(share, total)
+            jobs = max(len(held), 1)
+        if jobs == 1:
+            keys = [key for key in keys if key != "pack.threads"]
+        config = {_NAMES.get(key, key): jobs for key in keys}
+        options = [part for name in config for part in ("-c", f"{name}={jobs}")]
+        yield cmd_args[:1] + options + cmd_args[1:], {"jobs": jobs, "budget": total, "config": config}
+    finally:
+        for fd in held + ([marker] if marker is not None else []):
+            os.close(fd)
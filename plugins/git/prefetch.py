@@ -0,0 +1,331 @@
+"""
+Background prefetch of the remotes that fetches and pulls use most.
+
+A ``git fetch`` or ``git pull`` pays for ref negotiation and the pack
+transfer when the caller is waiting for it. Like ``git maintenance run
+--task=prefetch``, this module fetches those remotes ahead of time into
+``refs/prefetch/remotes/<remote>/``, where no branch, ``FETCH_HEAD`` or tag
+moves, so a later foreground fetch finds the objects already present and
+only updates its refs (or transfers what changed since).
+
+With ``SMCP_PREFETCH_FILE`` set, ``run()`` notes every fetch, pull and
+``remote update`` in that JSON state file (under a ``flock()``): per
+repository and remote, the number of uses, a score that halves every
+``HALF_LIFE`` seconds, and a smoothed gap between uses (uses closer
+together than ``MIN_INTERVAL`` count as one session). The interval between
+prefetches is half the typical gap, or half the time since the last use
+when that is longer, so busy remotes are kept close to current and idle
+ones back off, within ``MIN_INTERVAL`` and ``MAX_INTERVAL``. Remotes unused
+for ``EXPIRE_SECONDS`` are dropped.
+
+``run_due()`` prefetches the due remotes, highest score first and at most
+``limit`` of them; ``serve()`` repeats it until stopped, in this thread or
+one ``start()`` makes (the git plugin's ``prefetch`` command runs either).
+Prefetches run under ``nice`` and the idle I/O class of ``ionice`` where
+those exist. They take no repository lock: they only add objects and refs
+under ``refs/prefetch/``, and a foreground command must never wait for
+one. A prefetch that fails, for example on a ref lock held by a foreground
+fetch, is retried after the next interval.
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from plugins import process
+from plugins.git import refs
+from plugins.git import repo as repo_module
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no cross-process locking
+    fcntl = None
+
+PREFETCH_FILE_ENV = "SMCP_PREFETCH_FILE"
+
+MIN_INTERVAL = 300.0
+MAX_INTERVAL = 86400.0
+EXPIRE_SECONDS = 14 * 86400.0
+HALF_LIFE = 86400.0
+# Weight of the newest gap in the smoothed gap between uses
+SMOOTHING = 0.3
+# Remotes prefetched per run_due(), and the longest serve() sleeps before looking for new ones
+MAX_REMOTES = 10
+POLL_SECONDS = 60.0
+PREFETCH_TIMEOUT = 600
+NICENESS = 19
+
+# fetch and pull options that take the next argument as their value
+_VALUE_OPTIONS = frozenset((
+    "--depth", "--deepen", "--shallow-since", "--shallow-exclude", "-j", "--jobs", "--upload-pack",
+    "--negotiation-tip", "-o", "--server-option", "--filter", "--refmap", "--recurse-submodules-default",
+    "-s", "--strategy", "-X", "--strategy-option", "--cleanup",
+))
+
+
+def state_path() -> Optional[str]:
+    return os.environ.get(PREFETCH_FILE_ENV) or None
+
+
+@contextlib.contextmanager
+def _state(path: str) -> Iterator[Dict[str, Dict[str, Dict[str, Any]]]]:
+    """Read the state file under an exclusive lock and write it back on exit."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a+", encoding="utf-8") as handle:
+        if fcntl is not None:  # pragma: no branch - Windows: schedulers may prefetch a remote twice
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        handle.seek(0)
+        try:
+            state = json.loads(handle.read() or "{}")
+        except ValueError:
+            state = {}  # A corrupt state file starts over rather than failing the call
+        yield state
+        handle.seek(0)
+        handle.truncate()
+        json.dump(state, handle)
+
+
+def _default_remote(repository: repo_module.Repository) -> str:
+    """The remote a bare ``git fetch`` talks to: the current branch's, or ``origin``."""
+    try:
+        head = refs.head_target(repository)
+    except refs.Unsupported:
+        head = None
+    if head is None or not head.startswith("refs/heads/"):
+        return "origin"
+    return repository.config.get(f"branch.{head[len('refs/heads/'):]}.remote", "origin")
+
+
+def remotes_used(cmd_args: List[str], repository: repo_module.Repository) -> List[str]:
+    """The configured remotes a fetch, pull or ``remote update`` talks to; empty for other commands.
+
+    URLs and paths given in place of a remote name are not tracked.
+    """
+    configured = sorted(key[len("remote."):-len(".url")] for key in repository.config
+                        if key.startswith("remote.") and key.endswith(".url"))
+    subcommand, rest = (cmd_args[1], cmd_args[2:]) if len(cmd_args) > 1 else (None, [])
+    if subcommand == "remote":
+        if rest[:1] != ["update"]:
+            return []
+        names = [arg for arg in rest[1:] if not arg.startswith("-")]
+        return [name for name in names if name in configured] if names else configured
+    if subcommand not in ("fetch", "pull"):
+        return []
+    positional: List[str] = []
+    skip = False
+    for arg in rest:
+        if skip:
+            skip = False
+        elif arg == "--all":
+            return configured
+        elif arg in _VALUE_OPTIONS:
+            skip = True
+        elif not arg.startswith("-"):
+            positional.append(arg)
+    # Only --multiple makes every positional argument a remote; otherwise the rest are refspecs
+    names = positional if "--multiple" in rest else positional[:1]
+    names = names or [_default_remote(repository)]
+    return [name for name in names if name in configured]
+
+
+def _note_use(entry: Dict[str, Any], now: float) -> None:
+    last_used = entry.get("last_used")
+    if last_used is not None:
+        gap = now - last_used
+        if gap >= MIN_INTERVAL:
+            previous = entry.get("gap")
+            entry["gap"] = gap if previous is None else previous + SMOOTHING * (gap - previous)
+    entry["score"] = score(entry, now) + 1
+    entry["uses"] = entry.get("uses", 0) + 1
+    entry["last_used"] = now
+
+
+def record(cmd_args: List[str], cwd: Optional[str] = None, now: Optional[float] = None) -> List[str]:
+    """Note a git command line's use of its remotes; returns the remotes noted.
+
+    Does nothing without ``SMCP_PREFETCH_FILE`` or for commands that talk to
+    no configured remote, and never raises for an unwritable state file.
+    """
+    path = state_path()
+    if not path or len(cmd_args) < 2 or cmd_args[1] not in ("fetch", "pull", "remote"):
+        return []
+    repository = repo_module.discover(cwd)
+    remotes = remotes_used(cmd_args, repository) if repository is not None else []
+    if not remotes:
+        return []
+    now = time.time() if now is None else now
+    try:
+        with _state(path) as state:
+            tracked = state.setdefault(repository.common_dir, {})
+            for name in remotes:
+                _note_use(tracked.setdefault(name, {}), now)
+    except OSError:
+        return []
+    return remotes
+
+
+def score(entry: Dict[str, Any], now: float) -> float:
+    """Uses of a remote, each weighing half as much every ``HALF_LIFE`` seconds."""
+    if entry.get("last_used") is None:
+        return 0.0
+    return entry.get("score", 0.0) * 0.5 ** (max(now - entry["last_used"], 0.0) / HALF_LIFE)
+
+
+def interval(entry: Dict[str, Any], now: float) -> float:
+    """Seconds between prefetches of a remote: half its typical gap between uses, or of its idle time."""
+    idle = now - entry["last_used"]
+    return min(max(max(entry.get("gap") or MAX_INTERVAL, idle) / 2, MIN_INTERVAL), MAX_INTERVAL)
+
+
+def _next_due(entry: Dict[str, Any], now: float) -> float:
+    """Seconds until a remote is due; 0 when it is."""
+    if entry.get("last_prefetch") is None:
+        return 0.0
+    return max(entry["last_prefetch"] + interval(entry, now) - now, 0.0)
+
+
+def prefetch_refspecs(remote: str, fetch_refspecs: List[str]) -> List[str]:
+    """Rewrite a remote's fetch refspecs to store under ``refs/prefetch/``, as ``git maintenance`` does."""
+    rewritten = []
+    for refspec in fetch_refspecs:
+        if refspec.startswith("^") or ":" not in refspec:
+            continue  # Negative refspecs and those without a destination store nothing
+        source, destination = refspec.lstrip("+").split(":", 1)
+        if destination.startswith("refs/"):
+            rewritten.append(f"+{source}:refs/prefetch/{destination[len('refs/'):]}")
+    return rewritten or [f"+refs/heads/*:refs/prefetch/remotes/{remote}/*"]
+
+
+def _low_priority(cmd_args: List[str]) -> List[str]:
+    if shutil.which("ionice"):
+        cmd_args = ["ionice", "-c", "3"] + cmd_args
+    if shutil.which("nice"):
+        cmd_args = ["nice", "-n", str(NICENESS)] + cmd_args
+    return cmd_args
+
+
+def prefetch(common_dir: str, remote: str, timeout: float = PREFETCH_TIMEOUT) -> Dict[str, Any]:
+    """Fetch ``remote`` into ``refs/prefetch/`` of the repository at ``common_dir``, at low priority.
+
+    The report has ``path``, ``remote``, ``action`` (``fetched`` or
+    ``failed``, with ``error``) and ``seconds``.
+    """
+    start = time.perf_counter()
+    git = ["git", f"--git-dir={common_dir}"]
+    report: Dict[str, Any] = {"path": common_dir, "remote": remote}
+    try:
+        configured = process.run_process(git + ["config", "--get-all", f"remote.{remote}.fetch"], timeout=30)
+        cmd_args = git + ["fetch", remote, "--prune", "--no-tags", "--no-write-fetch-head",
+                          "--recurse-submodules=no", "--quiet", "--refmap="]
+        result = process.run_process(_low_priority(cmd_args + prefetch_refspecs(remote, configured.stdout.split())),
+                                     timeout=timeout)
+        if result.returncode != 0:
+            report["error"] = (result.stderr or "").strip() or f"git fetch exited with {result.returncode}"
+    except (OSError, subprocess.TimeoutExpired) as e:
+        report["error"] = str(e)
+    report["action"] = "failed" if "error" in report else "fetched"
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def run_due(now: Optional[float] = None, limit: int = MAX_REMOTES, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Prefetch the remotes that are due, highest score first; returns one report per remote.
+
+    Remotes are claimed in the state file before they are fetched, so
+    schedulers in other processes skip them, and the file is not locked
+    while git runs.
+    """
+    path = path or state_path()
+    if not path:
+        return []
+    now = time.time() if now is None else now
+    candidates = []
+    with _state(path) as state:
+        for common_dir, tracked in list(state.items()):
+            for name, entry in list(tracked.items()):
+                if now - entry["last_used"] > EXPIRE_SECONDS:
+                    del tracked[name]
+                elif _next_due(entry, now) == 0:
+                    candidates.append((score(entry, now), common_dir, name))
+            if not tracked or not os.path.isdir(common_dir):
+                del state[common_dir]
+                candidates = [candidate for candidate in candidates if candidate[1] != common_dir]
+        candidates = sorted(candidates, reverse=True)[:max(limit, 0)]
+        for _, common_dir, name in candidates:
+            state[common_dir][name]["last_prefetch"] = now
+    reports = [prefetch(common_dir, name) for _, common_dir, name in candidates]
+    with _state(path) as state:
+        for report in reports:
+            entry = state.get(report["path"], {}).get(report["remote"])
+            if entry is not None:
+                entry["seconds"] = report["seconds"]
+                entry["error"] = report.get("error")
+    return reports
+
+
+def scheduled(now: Optional[float] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """The tracked remotes, highest score first, with their interval and seconds until due."""
+    path = path or state_path()
+    if not path or not os.path.exists(path):
+        return []
+    now = time.time() if now is None else now
+    with _state(path) as state:
+        entries = [{"path": common_dir, "remote": name, "uses": entry.get("uses", 0),
+                    "score": score(entry, now), "interval": interval(entry, now),
+                    "next_due": _next_due(entry, now), "last_prefetch": entry.get("last_prefetch"),
+                    "seconds": entry.get("seconds"), "error": entry.get("error")}
+                   for common_dir, tracked in state.items() for name, entry in tracked.items()]
+    return sorted(entries, key=lambda entry: -entry["score"])
+
+
+def serve(stop: Optional[threading.Event] = None, limit: int = MAX_REMOTES, path: Optional[str] = None) -> None:
+    """Prefetch due remotes until ``stop`` is set, sleeping until the next one is due.
+
+    Sleeps at most ``POLL_SECONDS``, to pick up remotes that other
+    processes start using.
+    """
+    stop = threading.Event() if stop is None else stop
+    while not stop.is_set():
+        run_due(limit=limit, path=path)
+        waits = [entry["next_due"] for entry in scheduled(path=path)]
+        stop.wait(min(max(min(waits, default=POLL_SECONDS), 1.0), POLL_SECONDS))
+
+
+def start(limit: int = MAX_REMOTES, path: Optional[str] = None) -> threading.Event:
+    """Run ``serve()`` in a daemon thread; set the returned event to stop it."""
+    stop = threading.Event()
+    threading.Thread(target=serve, args=(stop, limit, path), name="smcp-git-prefetch", daemon=True).start()
+    return stop
+
+
+def manage(args: Dict[str, Any]) -> Dict[str, Any]:
+    """List the tracked remotes for the plugin CLI, prefetching the due ones first unless ``args["list"]``.
+
+    ``args["limit"]`` caps the remotes prefetched; with ``args["loop"]``
+    it keeps prefetching until interrupted, then reports.
+    """
+    start_time = time.perf_counter()
+    path = state_path()
+    if not path:
+        return {"success": False, "error": f"{PREFETCH_FILE_ENV} is not set", "error_code": "PREFETCH_FAILED"}
+    response: Dict[str, Any] = {"success": True}
+    try:
+        limit = int(args["limit"]) if args.get("limit") is not None else MAX_REMOTES
+        if args.get("loop"):
+            try:
+                serve(limit=limit, path=path)
+            except KeyboardInterrupt:
+                pass
+        elif not args.get("list"):
+            response["prefetched"] = run_due(limit=limit, path=path)
+        response["result"] = scheduled(path=path)
+    except (OSError, ValueError) as e:
+        return {"success": False, "error": str(e), "error_code": "PREFETCH_FAILED"}
+    response["file"] = path
+    response["elapsed"] = time.perf_counter() - start_time
+    return response
@@ -0,0 +1,115 @@
+"""
+Partial and sparse clone presets for ``git clone`` and ``git fetch``.
+
+A full clone of a large monorepo downloads every version of every file and
+checks all of them out, even when the caller only reads a few directories.
+The ``preset`` option of the git plugin's ``run()`` adds the options of a
+named preset to a ``clone`` or ``fetch``:
+
+- ``blobless`` (``--filter=blob:none``): all commits and trees, and only
+  the file contents the checkout needs.
+- ``treeless`` (``--filter=tree:0``): all commits, and only the trees and
+  file contents the checkout needs.
+- ``shallow`` (``--depth=1``, plus ``--single-branch`` for clones): the
+  latest commit of one branch.
+- ``sparse`` (blobless plus ``--sparse``): only the top-level files are
+  checked out. Given ``sparse`` directories, the clone is followed by
+  ``git sparse-checkout set --cone``, which checks those out as well.
+
+Blobless and treeless clones record the remote as a promisor. Later
+commands that need a missing object, such as ``show``, ``diff``, ``blame``
+or ``checkout`` of another branch, fetch it from the remote on demand. The
+remote must allow filters (``uploadpack.allowFilter``), or git falls back
+to a full clone with a warning. The in-process readers of
+``plugins.git.fastpath`` leave missing objects and shallow histories to git.
+"""
+
+import os
+import posixpath
+import shlex
+from typing import Any, Dict, List, Optional, Tuple
+
+from plugins import mirrors, process
+
+PRESETS: Dict[str, Dict[str, List[str]]] = {
+    "blobless": {"clone": ["--filter=blob:none"], "fetch": ["--filter=blob:none"]},
+    "treeless": {"clone": ["--filter=tree:0"], "fetch": ["--filter=tree:0"]},
+    "shallow": {"clone": ["--depth=1", "--single-branch"], "fetch": ["--depth=1"]},
+    "sparse": {"clone": ["--filter=blob:none", "--sparse"], "fetch": ["--filter=blob:none"]},
+}
+
+# Clone options that leave no worktree to make sparse
+_NO_WORKTREE = frozenset(("--bare", "--mirror"))
+
+
+class PresetError(Exception):
+    """Raised when the sparse checkout of a clone fails."""
+
+
+def _directories(sparse: Any) -> List[str]:
+    values = shlex.split(sparse) if isinstance(sparse, str) else [str(value) for value in sparse or ()]
+    directories = [posixpath.normpath(value) for value in values]
+    if any(directory.startswith(("/", "../")) or directory in (".", "..") for directory in directories):
+        raise ValueError(f"sparse directories must be relative paths inside the repository: {values}")
+    return directories
+
+
+def apply(cmd_args: List[str], preset: Optional[str], sparse: Any = None) -> Tuple[List[str], List[str]]:
+    """Add the options of ``preset`` to a ``git clone`` or ``git fetch`` command line.
+
+    ``sparse`` lists the directories of a sparse clone (a list or a
+    space-separated string) and implies the ``sparse`` preset. Returns the
+    new command line and the directories ``sparse_checkout()`` must set
+    once the clone succeeds (empty for fetches). Options the caller gave
+    already, such as a different ``--filter``, win over the preset's.
+    Raises ``ValueError`` for unknown presets and other commands.
+    """
+    directories = _directories(sparse)
+    preset = preset or "sparse"
+    if preset not in PRESETS:
+        raise ValueError(f"unknown preset {preset!r}; expected one of {', '.join(PRESETS)}")
+    if directories and preset != "sparse":
+        raise ValueError(f"sparse directories need the sparse preset, not {preset!r}")
+    command = cmd_args[1] if len(cmd_args) > 1 else None
+    if command not in ("clone", "fetch"):
+        raise ValueError(f"presets apply to clone and fetch, not {command or 'no command'}")
+    given = {arg.partition("=")[0] for arg in cmd_args[2:]}
+    if command == "clone" and preset == "sparse" and given & _NO_WORKTREE:
+        raise ValueError("a sparse clone needs a worktree; it cannot be --bare or --mirror")
+    options = [option for option in PRESETS[preset][command] if option.partition("=")[0] not in given]
+    return cmd_args[:2] + options + cmd_args[2:], directories if command == "clone" else []
+
+
+def clone_directory(cmd_args: List[str]) -> Optional[str]:
+    """The directory a ``git clone`` command line clones into, as git derives it, or ``None``."""
+    operands = mirrors.clone_operands(cmd_args[2:])
+    if len(operands) > 1:
+        return operands[1]
+    if not operands:
+        return None
+    # git's "humanish" name: the last path component, without /.git or .git
+    name = operands[0].rstrip("/")
+    if name.endswith("/.git"):
+        name = name[:-5]
+    name = name.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+    if name.endswith(".git"):
+        name = name[:-4]
+    return name or None
+
+
+def sparse_checkout(cmd_args: List[str], directories: List[str], cwd: Optional[str] = None,
+                    timeout: float = 30) -> Dict[str, Any]:
+    """Check ``directories`` out in the repository a sparse clone created; returns the report for the response.
+
+    Raises ``PresetError`` when git fails; the clone itself is kept.
+    """
+    directory = clone_directory(cmd_args)
+    if directory is None:
+        raise PresetError("cannot tell which directory the clone created")
+    path = os.path.join(cwd or os.getcwd(), directory)
+    result = process.run_process(["git", "sparse-checkout", "set", "--cone", "--"] + directories,
+                                 timeout=timeout, cwd=path)
+    if result.returncode != 0:
+        raise PresetError(f"git sparse-checkout set failed in {path}: "
+                          f"{(result.stderr or '').strip() or f'exit code {result.returncode}'}")
+    return {"path": path, "directories": directories}
@@ -0,0 +1,504 @@
+"""
+In-process reads of HEAD, branches and refs.
+
+Answers trivial metadata commands (``rev-parse HEAD``, ``branch
+--show-current``, ``show-ref``, ``for-each-ref`` with simple formats,
+``cat-file`` of a full object id, ...) by reading ``HEAD``, loose refs,
+``packed-refs`` and the object store directly instead of spawning git.
+``packed-refs`` is mmap-backed and binary-searched when git recorded it as
+sorted; objects are read through ``plugins.git.objects``.
+
+Every reader raises ``Unsupported`` when it meets something it cannot
+answer exactly like git would; ``plugins.git.fastpath`` turns that into
+``None`` so the caller spawns git instead.
+"""
+
+import mmap
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from plugins.git import objects
+from plugins.git import repo as repo_module
+
+# Maximum symbolic ref nesting, as in git (SYMREF_MAXDEPTH)
+MAX_SYMREF_DEPTH = 5
+
+HEX_LENGTH = 40
+
+# Refs that live in each worktree's own git dir rather than the common dir
+_PER_WORKTREE_PREFIXES = ("refs/bisect/", "refs/worktree/", "refs/rewritten/")
+
+_OID_RE = re.compile(rb"^[0-9a-f]{40}$")
+# Tree entry names ls-tree prints without quoting
+_PLAIN_NAME_RE = re.compile(rb"^[\x21-\x7e ]+$")
+_BAD_REFNAME_RE = re.compile(r"[\x00-\x20\x7f~^:?*\[\\]|\.\.|@\{|//|/\.|\.lock(/|$)|^\.|/$|\.$")
+
+# How git's revision parser expands a short ref name (ref_rev_parse_rules)
+_REV_PARSE_RULES = ("refs/{}", "refs/tags/{}", "refs/heads/{}", "refs/remotes/{}", "refs/remotes/{}/HEAD")
+
+# Formats understood by the for-each-ref fast path; others fall back
+_FORMAT_ATOM_RE = re.compile(r"%\(([^)]*)\)|%([0-9a-fA-F]{2})|%%|[^%]+|%")
+
+
+class Unsupported(Exception):
+    """Raised when a read needs git's own logic to be answered correctly."""
+
+
+def _check_refname(refname: str) -> None:
+    if _BAD_REFNAME_RE.search(refname):
+        raise Unsupported(f"unusual ref name: {refname!r}")
+
+
+class PackedRefs:
+    """Read-only view of a ``packed-refs`` file.
+
+    The file is memory-mapped; lookups binary-search it when the header
+    declares the ``sorted`` trait and scan it otherwise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._buf = b""
+        self._map = None
+        self.sorted = False
+        self.peeled = False
+        self._start = 0
+        with open(path, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size:
+                self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                self._buf = self._map
+        if self._buf[:1] == b"#":
+            eol = self._buf.find(b"\n")
+            header = bytes(self._buf[:eol if eol >= 0 else len(self._buf)])
+            if not header.startswith(b"# pack-refs with:"):
+                raise Unsupported("unknown packed-refs header")
+            traits = header[len(b"# pack-refs with:"):].split()
+            self.sorted = b"sorted" in traits
+            self.peeled = b"peeled" in traits
+            self._start = eol + 1 if eol >= 0 else len(self._buf)
+        if not self.sorted:
+            self._records = sorted(self._scan())
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _parse_at(self, offset: int) -> Tuple[bytes, bytes, int]:
+        """Parse the record at ``offset``; returns (name, oid, next record offset)."""
+        buf = self._buf
+        eol = buf.find(b"\n", offset)
+        if eol < 0:
+            eol = len(buf)
+        line = bytes(buf[offset:eol])
+        oid, _, name = line.partition(b" ")
+        if not _OID_RE.match(oid) or not name:
+            raise Unsupported("malformed packed-refs record")
+        nxt = eol + 1
+        # Skip the peeled value of an annotated tag
+        while buf[nxt:nxt + 1] == b"^":
+            peeled_eol = buf.find(b"\n", nxt)
+            nxt = len(buf) + 1 if peeled_eol < 0 else peeled_eol + 1
+        return name, oid, nxt
+
+    def _scan(self) -> Iterator[Tuple[bytes, bytes]]:
+        offset = self._start
+        while offset < len(self._buf):
+            if self._buf[offset:offset + 1] == b"^":
+                raise Unsupported("peeled line without a ref")
+            name, oid, offset = self._parse_at(offset)
+            yield name, oid
+
+    def _lower_bound(self, refname: bytes) -> int:
+        """Offset of the first record whose name is >= ``refname``."""
+        buf = self._buf
+        lo, hi = self._start, len(buf)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            newline = buf.rfind(b"\n", lo, mid)
+            record = lo if newline < 0 else newline + 1
+            while buf[record:record + 1] == b"^":
+                if record <= lo:
+                    raise Unsupported("peeled line without a ref")
+                newline = buf.rfind(b"\n", lo, record - 1)
+                record = lo if newline < 0 else newline + 1
+            name, _, nxt = self._parse_at(record)
+            if name < refname:
+                lo = nxt
+            else:
+                hi = record
+        return lo
+
+    def get(self, refname: str) -> Optional[str]:
+        """Return the oid stored for ``refname``, or None."""
+        key = refname.encode("utf-8", "surrogateescape")
+        if not self.sorted:
+            for name, oid in self._records:
+                if name == key:
+                    return oid.decode("ascii")
+            return None
+        offset = self._lower_bound(key)
+        if offset >= len(self._buf):
+            return None
+        name, oid, _ = self._parse_at(offset)
+        return oid.decode("ascii") if name == key else None
+
+    def items(self, prefix: str = "") -> Iterator[Tuple[str, str]]:
+        """Yield ``(refname, oid)`` pairs under ``prefix`` in refname order."""
+        key = prefix.encode("utf-8", "surrogateescape")
+        if not self.sorted:
+            records = iter(self._records)
+        else:
+            offset = self._lower_bound(key)
+            records = self._iter_from(offset)
+        for name, oid in records:
+            if not name.startswith(key):
+                if self.sorted and name > key:
+                    return
+                continue
+            yield name.decode("utf-8", "surrogateescape"), oid.decode("ascii")
+
+    def _iter_from(self, offset: int) -> Iterator[Tuple[bytes, bytes]]:
+        while offset < len(self._buf):
+            name, oid, offset = self._parse_at(offset)
+            yield name, oid
+
+
+def _packed_refs(repo: repo_module.Repository) -> Optional[PackedRefs]:
+    path = os.path.join(repo.common_dir, "packed-refs")
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    cached = repo._cache.get("packed-refs")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    packed = PackedRefs(path)
+    repo._cache["packed-refs"] = (key, packed)
+    return packed
+
+
+def _ref_dir(repo: repo_module.Repository, refname: str) -> str:
+    if refname.startswith("refs/") and not refname.startswith(_PER_WORKTREE_PREFIXES):
+        return repo.common_dir
+    return repo.git_dir
+
+
+def _read_loose(repo: repo_module.Repository, refname: str) -> Optional[str]:
+    path = os.path.join(_ref_dir(repo, refname), *refname.split("/"))
+    if os.path.islink(path):
+        raise Unsupported(f"symlinked ref {refname}")
+    try:
+        with open(path, "rb") as handle:
+            content = handle.read()
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        return None
+    text = content.decode("utf-8", "surrogateescape").strip()
+    if text.startswith("ref:"):
+        return text
+    if len(text) < HEX_LENGTH or not _OID_RE.match(text[:HEX_LENGTH].encode("ascii", "replace")):
+        raise Unsupported(f"unreadable loose ref {refname}")
+    return text[:HEX_LENGTH]
+
+
+def read_raw(repo: repo_module.Repository, refname: str) -> Optional[str]:
+    """Return a ref's raw value: an oid, ``"ref: <target>"``, or None if absent."""
+    loose = _read_loose(repo, refname)
+    if loose is not None:
+        return loose
+    if not refname.startswith("refs/"):
+        return None
+    packed = _packed_refs(repo)
+    return packed.get(refname) if packed is not None else None
+
+
+def resolve(repo: repo_module.Repository, refname: str) -> Tuple[Optional[str], List[str]]:
+    """Follow symbolic refs; returns ``(oid or None, chain of ref names)``."""
+    chain = [refname]
+    for _ in range(MAX_SYMREF_DEPTH + 1):
+        value = read_raw(repo, chain[-1])
+        if value is None:
+            return None, chain
+        if not value.startswith("ref:"):
+            return value, chain
+        target = value[len("ref:"):].strip()
+        _check_refname(target)
+        chain.append(target)
+    raise Unsupported("symbolic ref loop")
+
+
+def head_target(repo: repo_module.Repository) -> Optional[str]:
+    """Return the ref HEAD points to, or None when HEAD is detached."""
+    value = read_raw(repo, "HEAD")
+    if value is None:
+        raise Unsupported("missing HEAD")
+    if value.startswith("ref:"):
+        return value[len("ref:"):].strip()
+    return None
+
+
+def resolve_revision(repo: repo_module.Repository, name: str) -> str:
+    """Resolve a full object id, ``HEAD`` or a (short) ref name to an object id.
+
+    Short names are expanded like git's revision parser does. Revision
+    suffixes, abbreviated ids, other pseudorefs, dangling symrefs and names
+    matching more than one ref raise ``Unsupported``.
+    """
+    if objects.is_full_oid(name):
+        return name
+    if name in ("HEAD", "@"):
+        oid, _ = resolve(repo, "HEAD")
+        if oid is None:
+            raise Unsupported("unborn HEAD")
+        return oid
+    if not name or _BAD_REFNAME_RE.search(name) or name.replace("_", "").isupper():
+        raise Unsupported(f"revision {name!r} needs git's revision parser")
+    candidates = [name] if name.startswith("refs/") else []
+    matches = []
+    for candidate in candidates + [rule.format(name) for rule in _REV_PARSE_RULES]:
+        oid, chain = resolve(repo, candidate)
+        if oid is not None:
+            matches.append(oid)
+        elif len(chain) > 1:
+            raise Unsupported(f"dangling symbolic ref {candidate}")
+    if len(matches) != 1:
+        raise Unsupported(f"revision {name!r} is unknown or ambiguous")
+    return matches[0]
+
+
+def _walk_loose(base: str, prefix: str, include: Callable[[str], bool]) -> Iterator[str]:
+    root = os.path.join(base, *prefix.rstrip("/").split("/"))
+    for dirpath, dirnames, filenames in os.walk(root):
+        relative = os.path.relpath(dirpath, base).replace(os.sep, "/")
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in filenames:
+            if filename.startswith(".") or filename.endswith(".lock"):
+                continue
+            refname = f"{relative}/{filename}"
+            if include(refname):
+                yield refname
+
+
+def iter_refs(repo: repo_module.Repository, prefix: str = "refs/") -> Iterator[Tuple[str, str]]:
+    """Yield ``(refname, oid)`` for every ref under ``prefix`` in refname order.
+
+    Symbolic refs are reported with the oid they resolve to, like
+    ``for-each-ref``. Raises ``Unsupported`` for dangling symrefs or
+    unusual ref names.
+    """
+    if not prefix.startswith("refs/"):
+        raise Unsupported("refs outside refs/")
+    if repo.git_dir == repo.common_dir:
+        names = set(_walk_loose(repo.common_dir, "refs", lambda name: True))
+    else:
+        names = set(_walk_loose(repo.common_dir, "refs", lambda name: not name.startswith(_PER_WORKTREE_PREFIXES)))
+        for per_worktree in _PER_WORKTREE_PREFIXES:
+            names.update(_walk_loose(repo.git_dir, per_worktree, lambda name: True))
+    packed = _packed_refs(repo)
+    packed_values: Dict[str, str] = dict(packed.items(prefix)) if packed is not None else {}
+    names = {name for name in names if name.startswith(prefix)}
+    for refname in sorted(names | set(packed_values),
+                          key=lambda name: name.encode("utf-8", "surrogateescape")):
+        _check_refname(refname)
+        oid, _ = resolve(repo, refname)
+        if oid is None:
+            raise Unsupported(f"dangling ref {refname}")
+        yield refname, oid
+
+
+def _ambiguous_short_name(repo: repo_module.Repository, short: str) -> bool:
+    # Names git would also accept for the short form (shorten_unambiguous_ref)
+    for candidate in (short, f"refs/{short}", f"refs/tags/{short}", f"refs/remotes/{short}",
+                      f"refs/remotes/{short}/HEAD"):
+        if read_raw(repo, candidate) is not None:
+            return True
+    return False
+
+
+def _cmd_rev_parse(repo: repo_module.Repository, argv: List[str], cwd: Optional[str] = None) -> Tuple[int, str]:
+    if argv in (["HEAD"], ["--verify", "HEAD"]):
+        oid, _ = resolve(repo, "HEAD")
+        if oid is None:
+            raise Unsupported("unborn HEAD")
+        return 0, oid + "\n"
+    if argv == ["--abbrev-ref", "HEAD"]:
+        oid, chain = resolve(repo, "HEAD")
+        if oid is None:
+            raise Unsupported("unborn HEAD")
+        if len(chain) == 1:
+            return 0, "HEAD\n"
+        target = chain[-1]
+        if not target.startswith("refs/heads/"):
+            raise Unsupported("HEAD outside refs/heads")
+        short = target[len("refs/heads/"):]
+        if _ambiguous_short_name(repo, short):
+            raise Unsupported("ambiguous short name")
+        return 0, short + "\n"
+    if argv == ["--symbolic-full-name", "HEAD"]:
+        oid, chain = resolve(repo, "HEAD")
+        if oid is None:
+            raise Unsupported("unborn HEAD")
+        return 0, ("HEAD" if len(chain) == 1 else chain[-1]) + "\n"
+    raise Unsupported("rev-parse arguments")
+
+
+def _cmd_branch(repo: repo_module.Repository, argv: List[str], cwd: Optional[str] = None) -> Tuple[int, str]:
+    if argv != ["--show-current"]:
+        raise Unsupported("branch arguments")
+    target = head_target(repo)
+    if target is None:
+        return 0, ""
+    if not target.startswith("refs/heads/"):
+        raise Unsupported("HEAD outside refs/heads")
+    return 0, target[len("refs/heads/"):] + "\n"
+
+
+def _cmd_symbolic_ref(repo: repo_module.Repository, argv: List[str], cwd: Optional[str] = None) -> Tuple[int, str]:
+    if argv not in (["HEAD"], ["--short", "HEAD"]):
+        raise Unsupported("symbolic-ref arguments")
+    target = head_target(repo)
+    if target is None:
+        raise Unsupported("detached HEAD")
+    if argv[0] == "--short":
+        if not target.startswith("refs/heads/"):
+            raise Unsupported("HEAD outside refs/heads")
+        short = target[len("refs/heads/"):]
+        if _ambiguous_short_name(repo, short):
+            raise Unsupported("ambiguous short name")
+        return 0, short + "\n"
+    return 0, target + "\n"
+
+
+def _cmd_show_ref(repo: repo_module.Repository, argv: List[str], cwd: Optional[str] = None) -> Tuple[int, str]:
+    options = set(argv)
+    if len(options) != len(argv) or not options <= {"--heads", "--tags"}:
+        raise Unsupported("show-ref arguments")
+    prefixes = [p for flag, p in (("--heads", "refs/heads/"), ("--tags", "refs/tags/")) if flag in options]
+    lines = []
+    for refname, oid in iter_refs(repo, "refs/"):
+        if prefixes and not refname.startswith(tuple(prefixes)):
+            continue
+        lines.append(f"{oid} {refname}\n")
+    return (0 if lines else 1), "".join(lines)
+
+
+def compile_format(fmt: str, atoms: Dict[str, Callable[[str, str], str]]) -> Callable[[str, str], str]:
+    """Compile a ``for-each-ref --format`` string into a function of (refname, oid).
+
+    ``atoms`` maps supported atom names to renderers; any other atom raises
+    ``Unsupported``.
+    """
+    parts: List[Callable[[str, str], str]] = []
+    for match in _FORMAT_ATOM_RE.finditer(fmt):
+        atom, hex_escape = match.group(1), match.group(2)
+        text = match.group(0)
+        if atom is not None:
+            if atom not in atoms:
+                raise Unsupported(f"format atom {atom}")
+            parts.append(atoms[atom])
+        elif hex_escape is not None:
+            literal = chr(int(hex_escape, 16))
+            parts.append(lambda refname, oid, literal=literal: literal)
+        elif text == "%%":
+            parts.append(lambda refname, oid: "%")
+        else:
+            parts.append(lambda refname, oid, text=text: text)
+    return lambda refname, oid: "".join(part(refname, oid) for part in parts)
+
+
+# Atom renderers available without reading objects
+FORMAT_ATOMS: Dict[str, Callable[[str, str], str]] = {
+    "refname": lambda refname, oid: refname,
+    "objectname": lambda refname, oid: oid,
+}
+
+
+def object_atoms(repo: repo_module.Repository) -> Dict[str, Callable[[str, str], str]]:
+    """Return ``FORMAT_ATOMS`` plus the atoms that need the object store."""
+    atoms = dict(FORMAT_ATOMS)
+    atoms["objecttype"] = lambda refname, oid: objects.object_type(repo, oid)
+    atoms["objectsize"] = lambda refname, oid: str(objects.object_size(repo, oid))
+    return atoms
+
+
+def _match_pattern(refname: str, pattern: str) -> bool:
+    # Literal for-each-ref patterns match completely or up to a slash
+    if refname == pattern:
+        return True
+    return refname.startswith(pattern if pattern.endswith("/") else pattern + "/")
+
+
+def _cmd_for_each_ref(repo: repo_module.Repository, argv: List[str], cwd: Optional[str] = None,
+                      atoms: Optional[Dict[str, Callable[[str, str], str]]] = None) -> Tuple[int, str]:
+    fmt = None
+    patterns = []
+    args = iter(argv)
+    for arg in args:
+        if arg.startswith("--format="):
+            fmt = arg[len("--format="):]
+        elif arg == "--format":
+            fmt = next(args, None)
+            if fmt is None:
+                raise Unsupported("missing format")
+        elif arg == "--":
+            patterns.extend(args)
+        elif arg.startswith("-"):
+            raise Unsupported(f"for-each-ref option {arg}")
+        else:
+            patterns.append(arg)
+    if fmt is None:
+        fmt = "%(objectname) %(objecttype)\t%(refname)"
+    for pattern in patterns:
+        if any(ch in pattern for ch in "*?[\\") or not pattern:
+            raise Unsupported("glob pattern")
+    render = compile_format(fmt, atoms if atoms is not None else object_atoms(repo))
+    lines = []
+    for refname, oid in iter_refs(repo, "refs/"):
+        if patterns and not any(_match_pattern(refname, p) for p in patterns):
+            continue
+        lines.append(render(refname, oid) + "\n")
+    return 0, "".join(lines)
+
+
+def has_replace_refs(repo: repo_module.Repository) -> bool:
+    """Return True if any ``refs/replace/`` ref exists (objects may be substituted)."""
+    return next(iter_refs(repo, "refs/replace/"), None) is not None
+
+
+def _cmd_cat_file(repo: repo_module.Repository, argv: List[str], cwd: Optional[str] = None) -> Tuple[int, str]:
+    if len(argv) != 2 or argv[0] not in ("-e", "-t", "-s", "-p", "commit", "tree", "blob", "tag"):
+        raise Unsupported("cat-file arguments")
+    option, name = argv
+    if name == "HEAD":
+        oid, _ = resolve(repo, "HEAD")
+        if oid is None:
+            raise Unsupported("unborn HEAD")
+    elif objects.is_full_oid(name):
+        oid = name
+    else:
+        raise Unsupported("object name needs git's revision parser")
+    if os.environ.get("GIT_NO_REPLACE_OBJECTS") is None and has_replace_refs(repo):
+        raise Unsupported("replace refs")
+    if option == "-p" and objects.object_type(repo, oid) == "tree":
+        _, data = objects.read_object(repo, oid)
+        if not all(_PLAIN_NAME_RE.match(name) for _, name, _ in objects.parse_tree(data)):
+            raise Unsupported("tree entry names need quoting")
+    output = objects.cat_file(repo, option, oid)
+    try:
+        return 0, output.decode("utf-8")
+    except UnicodeDecodeError:
+        raise Unsupported("binary object content")
+
+
+# Command handlers for plugins.git.fastpath: (repository, argv, cwd) -> (returncode, stdout)
+COMMANDS = {
+    "rev-parse": _cmd_rev_parse,
+    "branch": _cmd_branch,
+    "symbolic-ref": _cmd_symbolic_ref,
+    "show-ref": _cmd_show_ref,
+    "for-each-ref": _cmd_for_each_ref,
+    "cat-file": _cmd_cat_file,
+}
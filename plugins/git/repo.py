@@ -0,0 +1,258 @@
+"""
+Repository discovery for the git plugin's in-process readers.
+
+``discover()`` locates the git directory for a working directory the same
+way git does for the common cases (``.git`` directories, ``.git`` files of
+linked worktrees and submodules, bare repositories and ``commondir``
+indirection). Whenever it meets something it does not fully understand it
+returns ``None`` so that callers fall back to spawning git.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Environment variables that change how git locates or reads a repository
+_DISCOVERY_ENV = (
+    "GIT_DIR", "GIT_WORK_TREE", "GIT_COMMON_DIR", "GIT_CEILING_DIRECTORIES",
+    "GIT_DISCOVERY_ACROSS_FILESYSTEM", "GIT_NAMESPACE", "GIT_OBJECT_DIRECTORY",
+    "GIT_ALTERNATE_OBJECT_DIRECTORIES", "GIT_INDEX_FILE", "GIT_REPLACE_REF_BASE",
+    "GIT_CONFIG_PARAMETERS", "GIT_CONFIG_COUNT"
+)
+
+# Repository extensions that do not change how refs, objects or the index are stored
+_HARMLESS_EXTENSIONS = {"noop", "preciousobjects", "partialclone", "worktreeconfig"}
+
+# Repositories kept across calls so their index/pack caches stay warm in a
+# long-lived server; entries are revalidated against the config file's stat
+_REPOSITORY_CACHE_SIZE = 16
+_repositories: "OrderedDict[Tuple[str, Optional[str]], Tuple[tuple, Repository]]" = OrderedDict()
+_repositories_lock = threading.Lock()
+
+_SECTION_RE = re.compile(r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*(.*)$')
+_KEY_RE = re.compile(r"^([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$")
+
+
+class Repository:
+    """Locations of a discovered repository."""
+
+    __slots__ = ("git_dir", "common_dir", "worktree", "config", "_cache")
+
+    def __init__(self, git_dir: str, common_dir: str, worktree: Optional[str], config: Dict[str, str]):
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.worktree = worktree
+        self.config = config
+        self._cache: Dict[str, object] = {}
+
+    @property
+    def objects_dir(self) -> str:
+        return os.path.join(self.common_dir, "objects")
+
+    def config_bool(self, key: str, default: bool = False) -> bool:
+        value = self.config.get(key)
+        if value is None:
+            return default
+        return value.lower() in ("true", "yes", "on", "1", "")
+
+    def __repr__(self):
+        return f"Repository(git_dir={self.git_dir!r}, worktree={self.worktree!r})"
+
+
+def _parse_value(raw: str) -> str:
+    # Strip trailing comments outside quotes and unquote the value
+    out = []
+    quoted = False
+    i = 0
+    while i < len(raw):
+        ch = raw[i]
+        if ch == "\\" and i + 1 < len(raw):
+            nxt = raw[i + 1]
+            out.append({"n": "\n", "t": "\t", "b": "\b"}.get(nxt, nxt))
+            i += 2
+            continue
+        if ch == '"':
+            quoted = not quoted
+        elif ch in "#;" and not quoted:
+            break
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out).strip()
+
+
+def read_config(path: str) -> Optional[Dict[str, str]]:
+    """Parse a git config file into ``{"section[.subsection].key": value}``.
+
+    Section and key names are lowercased; subsections keep their case. The
+    last value of a multi-valued key wins. Returns ``None`` for files this
+    parser cannot handle faithfully (includes, continuation lines).
+    """
+    config: Dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as handle:
+            lines = handle.read().splitlines()
+    except FileNotFoundError:
+        return config
+    except OSError:
+        return None
+    section = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped[0] in "#;":
+            continue
+        if stripped.endswith("\\"):
+            return None
+        if stripped.startswith("["):
+            match = _SECTION_RE.match(stripped)
+            if not match:
+                return None
+            name, subsection, rest = match.groups()
+            name = name.lower()
+            if name in ("include", "includeif"):
+                return None
+            section = name if subsection is None else f"{name}.{subsection}"
+            stripped = rest.strip()
+            if not stripped or stripped[0] in "#;":
+                continue
+        if section is None:
+            return None
+        match = _KEY_RE.match(stripped)
+        if not match:
+            return None
+        key, raw = match.groups()
+        config[f"{section}.{key.lower()}"] = "true" if raw is None else _parse_value(raw)
+    return config
+
+
+def _read_gitfile(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            content = handle.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not content.startswith("gitdir:"):
+        return None
+    target = content[len("gitdir:"):].strip()
+    return os.path.normpath(os.path.join(os.path.dirname(path), target))
+
+
+def _is_git_dir(path: str) -> bool:
+    return (os.path.isfile(os.path.join(path, "HEAD"))
+            and (os.path.isdir(os.path.join(path, "objects")) or os.path.isfile(os.path.join(path, "commondir")))
+            and (os.path.isdir(os.path.join(path, "refs")) or os.path.isfile(os.path.join(path, "commondir"))))
+
+
+def _owned_by_us(path: str) -> bool:
+    geteuid = getattr(os, "geteuid", None)
+    if geteuid is None:
+        return False  # Cannot replicate safe.directory checks; let git decide
+    try:
+        return os.stat(path).st_uid == geteuid()
+    except OSError:
+        return False
+
+
+def _build(git_dir: str, worktree: Optional[str]) -> Optional[Repository]:
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        try:
+            with open(commondir_file, "r", encoding="utf-8") as handle:
+                target = handle.read().strip()
+        except (OSError, UnicodeDecodeError):
+            return None
+        common_dir = os.path.normpath(os.path.join(git_dir, target))
+        if not os.path.isdir(common_dir):
+            return None
+    config_path = os.path.join(common_dir, "config")
+    try:
+        st = os.stat(config_path)
+        stamp = (common_dir, st.st_ino, st.st_size, st.st_mtime_ns,
+                 os.path.exists(os.path.join(git_dir, "config.worktree")))
+    except OSError:
+        stamp = None
+    cache_key = (git_dir, worktree)
+    with _repositories_lock:
+        cached = _repositories.get(cache_key)
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            _repositories.move_to_end(cache_key)
+            repository = cached[1]
+        else:
+            repository = None
+    if repository is not None:
+        return repository if _owned_by_us(worktree or git_dir) else None
+    config = read_config(config_path)
+    if config is None:
+        return None
+    try:
+        version = int(config.get("core.repositoryformatversion", "0"))
+    except ValueError:
+        return None
+    if version > 1:
+        return None
+    for key, value in config.items():
+        if not key.startswith("extensions."):
+            continue
+        name = key[len("extensions."):]
+        if name == "objectformat" and value.lower() == "sha1":
+            continue
+        if name not in _HARMLESS_EXTENSIONS:
+            return None  # reftable, sha256, or anything newer
+    if "core.worktree" in config or os.path.isdir(os.path.join(common_dir, "reftable")):
+        return None
+    if config.get("extensions.worktreeconfig") is not None and os.path.exists(os.path.join(git_dir, "config.worktree")):
+        return None
+    if not _owned_by_us(worktree or git_dir):
+        return None
+    repository = Repository(git_dir, common_dir, worktree, config)
+    if stamp is not None:
+        with _repositories_lock:
+            _repositories[cache_key] = (stamp, repository)
+            _repositories.move_to_end(cache_key)
+            while len(_repositories) > _REPOSITORY_CACHE_SIZE:
+                _repositories.popitem(last=False)
+    return repository
+
+
+def discover(cwd: Optional[str] = None) -> Optional[Repository]:
+    """Find the repository containing ``cwd`` (default: the current directory).
+
+    Returns ``None`` when there is no repository or the layout needs git's
+    own logic (environment overrides, filesystem boundaries, reftable,
+    unknown extensions, foreign ownership, ...).
+    """
+    if any(name in os.environ for name in _DISCOVERY_ENV):
+        return None
+    current = os.path.abspath(cwd or os.getcwd())
+    try:
+        device = os.stat(current).st_dev
+    except OSError:
+        return None
+    while True:
+        dotgit = os.path.join(current, ".git")
+        if os.path.isdir(dotgit):
+            if not _is_git_dir(dotgit):
+                return None
+            return _build(dotgit, current)
+        if os.path.isfile(dotgit):
+            git_dir = _read_gitfile(dotgit)
+            if git_dir is None or not _is_git_dir(git_dir):
+                return None
+            return _build(git_dir, current)
+        if _is_git_dir(current):
+            config = read_config(os.path.join(current, "config")) or {}
+            if config.get("core.bare", "").lower() not in ("true", "yes", "on", "1"):
+                return None
+            return _build(current, None)
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        try:
+            if os.stat(parent).st_dev != device:
+                return None  # git stops discovery at filesystem boundaries
+        except OSError:
+            return None
+        current = parent
@@ -0,0 +1,354 @@
+"""
+Incremental full-text index of commit messages.
+
+``CommitIndex`` keeps commits (oid, parents, author and committer, dates,
+subject and body) in an SQLite database with an FTS5 table over the
+messages and author identities, so searches are answered from the index
+instead of a ``git log --grep`` walk over the whole history.
+
+``sync`` remembers the ref values it indexed. The next sync walks only the
+commits reachable from the current tips but not from the tips it saw last
+time (``git log <new tips> --not <old tips>``), so keeping the index current
+costs time proportional to the new history. Branches, tags, remote-tracking
+branches and ``HEAD`` are indexed; notes, stashes and other refs are not.
+Commits that become unreachable (rewritten branches, deleted refs) stay
+searchable until the database is deleted and rebuilt.
+
+``stale_refs`` compares the stored ref values with the live ones (read
+in-process when the repository layout allows it), which is how each search
+reports whether its answer reflects the current refs.
+"""
+
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from plugins import process
+from plugins.git import refs as refs_module
+from plugins.git import repo as repo_module
+from plugins.git.structured import split_fields
+
+SCHEMA_VERSION = 1
+
+# Database name inside the repository's common git directory
+INDEX_NAME = "smcp-commit-index.sqlite"
+
+INDEXED_REFS = ("refs/heads/", "refs/tags/", "refs/remotes/")
+
+FIELDS = ("oid", "parents", "author_name", "author_email", "author_time", "committer_name", "committer_email",
+          "committer_time", "subject", "body")
+LOG_FORMAT = "--format=%H%x00%P%x00%an%x00%ae%x00%at%x00%cn%x00%ce%x00%ct%x00%s%x00%b"
+
+ORDERS = ("rank", "date")
+
+DEFAULT_SEARCH_LIMIT = 50
+
+_REF_FORMAT = "--format=%(objectname) %(objecttype) %(*objectname) %(*objecttype) %(refname)"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    oid TEXT NOT NULL UNIQUE,
+    parents TEXT NOT NULL,
+    author_name TEXT NOT NULL,
+    author_email TEXT NOT NULL,
+    author_time INTEGER NOT NULL,
+    committer_name TEXT NOT NULL,
+    committer_email TEXT NOT NULL,
+    committer_time INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS commits_committer_time ON commits (committer_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS commits_fts USING fts5 (
+    subject, body, author_name, author_email, content='commits', content_rowid='id'
+);
+CREATE TABLE IF NOT EXISTS refs (name TEXT PRIMARY KEY, oid TEXT NOT NULL, tip TEXT);
+"""
+
+_BATCH = 1000
+
+
+def _phrase(text: str) -> str:
+    """Quote ``text`` as an FTS5 phrase, so none of it is read as query syntax."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def parse_time(value: Any) -> int:
+    """Seconds since the epoch from an integer or an ISO 8601 date or time (UTC unless it has an offset)."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        if value.lstrip("-").isdigit():
+            return int(value)
+        try:
+            when = datetime.fromisoformat(value)
+        except ValueError:
+            pass
+        else:
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            return int(when.timestamp())
+    raise ValueError(f"not a time: {value!r}")
+
+
+def current_refs(cwd: Optional[str] = None, timeout: float = 30) -> Tuple[Dict[str, str], Optional[str]]:
+    """The indexed refs (name -> object id, unpeeled) and the commit ``HEAD`` points at.
+
+    Read in-process when possible; otherwise through ``git for-each-ref``
+    and ``git rev-parse``. Raises ``subprocess.CalledProcessError`` when
+    git fails.
+    """
+    repo = repo_module.discover(cwd)
+    if repo is not None:
+        try:
+            values = {}
+            for prefix in INDEXED_REFS:
+                values.update(refs_module.iter_refs(repo, prefix))
+            head, _ = refs_module.resolve(repo, "HEAD")
+            return values, head
+        except refs_module.Unsupported:
+            pass
+    cmd_args = ["git", "for-each-ref", "--format=%(objectname) %(refname)"] + [p.rstrip("/") for p in INDEXED_REFS]
+    listing = process.run_process(cmd_args, timeout=timeout, cwd=cwd)
+    if listing.returncode != 0:
+        raise subprocess.CalledProcessError(listing.returncode, cmd_args, listing.stdout, listing.stderr)
+    values = {name: oid for oid, name in (line.split(" ", 1) for line in listing.stdout.splitlines())}
+    head = process.run_process(["git", "rev-parse", "-q", "--verify", "HEAD"], timeout=timeout, cwd=cwd)
+    return values, head.stdout.strip() or None
+
+
+def default_path(cwd: Optional[str] = None, timeout: float = 30) -> str:
+    """Where the index of the repository containing ``cwd`` lives: its common git directory."""
+    repo = repo_module.discover(cwd)
+    if repo is not None:
+        return os.path.join(repo.common_dir, INDEX_NAME)
+    cmd_args = ["git", "rev-parse", "--git-common-dir"]
+    result = process.run_process(cmd_args, timeout=timeout, cwd=cwd)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd_args, result.stdout, result.stderr)
+    return os.path.join(os.path.abspath(os.path.join(cwd or os.getcwd(), result.stdout.strip())), INDEX_NAME)
+
+
+class CommitIndex:
+    """An SQLite commit index; use as a context manager or call ``close``.
+
+    Raises ``ValueError`` when ``path`` holds an index of another schema
+    version (delete the file to rebuild it).
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        try:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, SCHEMA_VERSION):
+                raise ValueError(f"{path} holds a commit index of schema {version}; delete it to rebuild")
+            # Readers keep searching while a sync writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            if version == 0:
+                self._db.executescript(_SCHEMA + f"PRAGMA user_version={SCHEMA_VERSION};")
+        except BaseException:
+            self._db.close()
+            raise
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "CommitIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+    def contains(self, oid: str) -> bool:
+        return self._db.execute("SELECT 1 FROM commits WHERE oid = ?", (oid,)).fetchone() is not None
+
+    def stale_refs(self, cwd: Optional[str] = None) -> List[str]:
+        """Refs that moved, appeared or disappeared since the last sync; empty when the index is fresh.
+
+        ``HEAD`` is listed when it points at a commit the index lacks
+        (a detached ``HEAD`` that moved).
+        """
+        values, head = current_refs(cwd)
+        stored = dict(self._db.execute("SELECT name, oid FROM refs"))
+        stale = sorted(name for name in values.keys() | stored.keys() if values.get(name) != stored.get(name))
+        if head is not None and not self.contains(head):
+            stale.append("HEAD")
+        return stale
+
+    def sync(self, cwd: Optional[str] = None, timeout: float = 600) -> int:
+        """Index the commits that are new since the last sync; returns how many were added.
+
+        The walk and the new ref values are committed in one transaction,
+        so an interrupted sync leaves the previous state intact. Raises
+        ``subprocess.CalledProcessError`` when git fails.
+        """
+        cmd_args = ["git", "for-each-ref", _REF_FORMAT] + [prefix.rstrip("/") for prefix in INDEXED_REFS]
+        listing = process.run_process(cmd_args, timeout=timeout, cwd=cwd)
+        if listing.returncode != 0:
+            raise subprocess.CalledProcessError(listing.returncode, cmd_args, listing.stdout, listing.stderr)
+        values = []
+        for line in listing.stdout.splitlines():
+            oid, kind, peeled, peeled_kind, name = line.split(" ", 4)
+            # Tags are walked from the commit they point at; tags of trees and blobs add nothing
+            tip = oid if kind == "commit" else peeled if peeled_kind == "commit" else None
+            values.append((name, oid, tip))
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            old_tips = {tip for (tip,) in self._db.execute("SELECT DISTINCT tip FROM refs WHERE tip IS NOT NULL")}
+            new_tips = {tip for _, _, tip in values if tip is not None} - old_tips
+            last = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM commits").fetchone()[0]
+            self._walk(sorted(new_tips), sorted(old_tips), cwd, timeout)
+            added = self._db.execute("INSERT INTO commits_fts (rowid, subject, body, author_name, author_email) "
+                                     "SELECT id, subject, body, author_name, author_email FROM commits "
+                                     "WHERE id > ?", (last,)).rowcount
+            self._db.execute("DELETE FROM refs")
+            self._db.executemany("INSERT INTO refs (name, oid, tip) VALUES (?, ?, ?)", values)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return added
+
+    def _walk(self, tips: Sequence[str], exclude: Sequence[str], cwd: Optional[str], timeout: float) -> None:
+        """Insert the commits reachable from ``tips`` or ``HEAD`` but not from ``exclude``."""
+        # Revisions go through stdin: a repository can have more refs than fit on a command line
+        with tempfile.TemporaryFile() as revisions:
+            revisions.write("".join(line + "\n" for line in list(tips) + ["HEAD"] + ["^" + oid for oid in exclude])
+                            .encode())
+            revisions.seek(0)
+            cmd_args = ["git", "log", "-z", LOG_FORMAT, "--ignore-missing", "--stdin"]
+            with process.StreamingProcess(cmd_args, timeout=timeout, cwd=cwd, stdin=revisions) as child:
+                fields = split_fields(child)
+                while True:
+                    rows = []
+                    for _ in range(_BATCH):
+                        record = [field.decode("utf-8", "replace") for field in islice(fields, len(FIELDS))]
+                        if len(record) < len(FIELDS):
+                            if record:
+                                raise ValueError(f"truncated log entry: {record[0][:40]!r}")
+                            break
+                        record[4], record[7] = int(record[4]), int(record[7])
+                        record[9] = record[9].rstrip("\n")
+                        rows.append(record)
+                    self._db.executemany(
+                        f"INSERT OR IGNORE INTO commits ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                        rows)
+                    if len(rows) < _BATCH:
+                        break
+                result = child.wait()
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd_args, None, result.stderr)
+
+    def search(self, query: Optional[str] = None, match: Optional[str] = None, author: Optional[str] = None,
+               since: Optional[int] = None, until: Optional[int] = None, limit: int = DEFAULT_SEARCH_LIMIT,
+               order: str = "rank") -> List[Dict[str, Any]]:
+        """Commits matching every given filter, as records with the ``FIELDS`` keys.
+
+        ``query`` holds plain words that must all appear in the subject,
+        body or author; ``match`` is a raw FTS5 expression; ``author``
+        matches a phrase in the author name or email. ``since`` and
+        ``until`` bound the committer time (seconds since the epoch, both
+        inclusive). ``order`` is ``rank`` (best match first, BM25) or
+        ``date`` (newest first). Raises ``ValueError`` for an invalid option
+        or FTS5 expression.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"unknown order {order!r}; choose from {', '.join(ORDERS)}")
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+            raise ValueError("limit must be a positive integer")
+        terms = [_phrase(word) for word in (query or "").split()]
+        if match:
+            terms.append(f"({match})")
+        if author:
+            terms.append("{author_name author_email} : " + _phrase(author))
+        where, params = [], []
+        if terms:
+            where.append("commits_fts MATCH ?")
+            params.append(" AND ".join(terms))
+        if since is not None:
+            where.append("c.committer_time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("c.committer_time <= ?")
+            params.append(until)
+        columns = ", ".join("c." + name for name in FIELDS)
+        source = "commits_fts JOIN commits AS c ON c.id = commits_fts.rowid" if terms else "commits AS c"
+        ranking = "commits_fts.rank" if terms and order == "rank" else "c.committer_time DESC, c.id"
+        sql = f"SELECT {columns} FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {ranking} LIMIT ?"
+        try:
+            rows = self._db.execute(sql, params + [limit]).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"invalid search expression: {e}") from None
+        records = []
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            record["parents"] = record["parents"].split()
+            records.append(record)
+        return records
+
+
+def search(args: Dict[str, Any], cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Run a search request for the plugin CLI.
+
+    ``args`` carries the ``CommitIndex.search`` filters (``since`` and
+    ``until`` also take ISO 8601 dates), ``index`` (database path; default
+    in the repository's common git directory) and ``sync`` (default true:
+    bring a stale index up to date first). The response reports ``fresh``
+    and, when the index lags the refs, the ``stale_refs``.
+    """
+    start = time.perf_counter()
+    try:
+        limit = args.get("limit") or DEFAULT_SEARCH_LIMIT
+        if isinstance(limit, str) and limit.isdigit():
+            limit = int(limit)
+        since = parse_time(args["since"]) if args.get("since") is not None else None
+        until = parse_time(args["until"]) if args.get("until") is not None else None
+    except ValueError as e:
+        return {"success": False, "error": f"Invalid search option: {e}", "error_code": "INVALID_SEARCH_OPTION"}
+    synced = None
+    try:
+        with CommitIndex(args.get("index") or default_path(cwd)) as index:
+            stale = index.stale_refs(cwd)
+            if stale and args.get("sync", True):
+                sync_start = time.perf_counter()
+                synced = {"added": index.sync(cwd), "seconds": time.perf_counter() - sync_start}
+                stale = index.stale_refs(cwd)
+            try:
+                records = index.search(args.get("query"), args.get("match"), args.get("author"), since, until,
+                                       limit, args.get("order") or "rank")
+            except ValueError as e:
+                return {"success": False, "error": f"Invalid search option: {e}",
+                        "error_code": "INVALID_SEARCH_OPTION"}
+            indexed = len(index)
+    except subprocess.CalledProcessError as e:
+        command = " ".join(e.cmd[:2])
+        return {"success": False, "error": (e.stderr or "").strip() or f"{command} exited with {e.returncode}",
+                "error_code": f"COMMAND_FAILED_{e.returncode}"}
+    except (OSError, ValueError, sqlite3.Error, subprocess.TimeoutExpired) as e:
+        return {"success": False, "error": str(e), "error_code": "SEARCH_FAILED"}
+    response = {
+        "success": True,
+        "result": records,
+        "record_count": len(records),
+        "indexed_commits": indexed,
+        "fresh": not stale,
+    }
+    if stale:
+        response["stale_refs"] = stale
+    if synced is not None:
+        response["synced"] = synced
+    response["elapsed"] = time.perf_counter() - start
+    return response
@@ -0,0 +1,1137 @@
+"""
+Structured output modes for the git plugin.
+
+When a caller sets ``structured``, ``run()`` rewrites a supported subcommand
+to git's machine-readable format and parses the child's stdout while it is
+still streaming in (see ``plugins.process.StreamingProcess``), so the
+response carries a JSON array of typed records instead of text the client
+would have to re-parse. Output is split on NUL in a single pass over
+fixed-size chunks: no field is ever rescanned and only a field straddling
+two chunks is joined, so parsing stays linear in the size of the output and
+the raw text is never held in memory as a whole.
+
+Every mode accepts a ``limit``: the child is killed as soon as one record
+past the limit has been parsed, and modes whose output has a stable order
+hand out an opaque ``next_cursor`` (base64url-encoded JSON) to resume from.
+With ``output``, records are written to that file as NDJSON as they are
+parsed instead of being collected, so memory use does not grow with the
+size of the output.
+
+Paths are decoded as UTF-8 with ``surrogateescape``, like the in-process
+readers, so undecodable bytes survive as lone surrogates.
+"""
+
+import base64
+import fnmatch
+import json
+import os
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from plugins import process
+from plugins.git import objects
+from plugins.git import repo as repo_module
+from plugins.git.parallelism import cpu_count as _cpu_count
+
+Record = Dict[str, Any]
+Parser = Callable[[Iterable[bytes]], Iterator[Record]]
+
+# Records returned by a listing call that neither sets ``limit`` nor writes to ``output``
+DEFAULT_LIST_LIMIT = 10000
+
+# Commits returned by a log call that neither sets ``limit`` nor writes to ``output``
+DEFAULT_LOG_LIMIT = 100
+
+# Files returned by a diff call that neither sets ``limit`` nor writes to ``output``
+DEFAULT_DIFF_LIMIT = 1000
+
+# Bytes of one file's patch kept by a diff call that selects ``paths``; the rest is only counted
+DEFAULT_PATCH_BYTES = 65536
+
+# Line ranges returned by a blame call that neither sets ``limit`` nor writes to ``output``
+DEFAULT_BLAME_LIMIT = 10000
+
+# Matches returned by a grep call that neither sets ``limit`` nor writes to ``output``
+DEFAULT_GREP_LIMIT = 1000
+
+LIST_COLUMNS = ("mode", "oid", "size")
+
+GITLINK_MODE = "160000"
+
+# Mode git reports for the missing side of an added or deleted file
+ABSENT_MODE = "000000"
+
+
+class Mode:
+    """A prepared structured call: the command to run and how to read its output."""
+
+    __slots__ = ("cmd_args", "parse", "limit", "cursor", "finished", "flush", "exit_codes")
+
+    def __init__(self, cmd_args: List[str], parse: Parser, limit: Optional[int] = None,
+                 cursor: Optional[Callable[[], str]] = None, finished: Optional[Callable[[], bool]] = None,
+                 flush: bool = False, exit_codes: Tuple[int, ...] = (0,)):
+        self.cmd_args = cmd_args
+        self.parse = parse
+        self.limit = limit
+        # Returns the cursor resuming after the last record parsed so far
+        self.cursor = cursor
+        # Returns whether the parser stopped because it has everything asked for, so git can be killed
+        self.finished = finished
+        # Flush each NDJSON record so a reader tailing ``output`` sees it at once
+        self.flush = flush
+        # Exit statuses meaning git succeeded (grep exits 1 when nothing matched)
+        self.exit_codes = exit_codes
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Encode a resume state as an opaque URL-safe token."""
+    data = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: Any, kind: str) -> Dict[str, Any]:
+    """Decode a token from ``encode_cursor``; raises ``ValueError`` if it is not one for ``kind``."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(str(token) + "=" * (-len(str(token)) % 4)))
+    except ValueError:
+        raise ValueError("invalid cursor") from None
+    if not isinstance(state, dict) or state.get("kind") != kind:
+        raise ValueError(f"cursor does not belong to a {kind} listing")
+    return state
+
+
+def split_fields(chunks: Iterable[bytes], separator: bytes = b"\0") -> Iterator[bytes]:
+    """Yield the ``separator``-terminated fields of a chunked byte stream.
+
+    A trailing field without a terminator is yielded as well.
+    """
+    pending: List[bytes] = []
+    for chunk in chunks:
+        start = 0
+        find = chunk.find
+        end = find(separator)
+        while end >= 0:
+            if pending:
+                pending.append(chunk[start:end])
+                yield b"".join(pending)
+                pending = []
+            else:
+                yield chunk[start:end]
+            start = end + 1
+            end = find(separator, start)
+        if start < len(chunk):
+            pending.append(chunk[start:])
+    if pending:
+        yield b"".join(pending)
+
+
+def _path(field: bytes) -> str:
+    return field.decode("utf-8", "surrogateescape")
+
+
+# C escapes git uses when it quotes a path (``quote_c_style``)
+_C_ESCAPES = {ord("a"): 7, ord("b"): 8, ord("t"): 9, ord("n"): 10, ord("v"): 11, ord("f"): 12, ord("r"): 13}
+
+
+def _unquote(field: bytes) -> str:
+    """Decode a path git may have C-quoted in line-oriented output."""
+    if not field.startswith(b'"') or not field.endswith(b'"') or len(field) < 2:
+        return _path(field)
+    out = bytearray()
+    position, end = 1, len(field) - 1
+    while position < end:
+        byte = field[position]
+        if byte == 0x5C and position + 1 < end:
+            escaped = field[position + 1]
+            if 0x30 <= escaped <= 0x37:
+                out.append(int(field[position + 1:position + 4], 8) & 0xFF)
+                position += 4
+                continue
+            out.append(_C_ESCAPES.get(escaped, escaped))
+            position += 2
+            continue
+        out.append(byte)
+        position += 1
+    return _path(bytes(out))
+
+
+def _branch_header(record: Record, key: str, value: str) -> None:
+    if key == "branch.oid":
+        record["oid"] = None if value == "(initial)" else value
+    elif key == "branch.head":
+        record["head"] = None if value == "(detached)" else value
+    elif key == "branch.upstream":
+        record["upstream"] = value
+    elif key == "branch.ab":
+        ahead, behind = value.split(" ")
+        record["ahead"] = int(ahead)
+        record["behind"] = -int(behind)
+
+
+def parse_status(chunks: Iterable[bytes]) -> Iterator[Record]:
+    """Parse ``git status --porcelain=v2 -z --branch`` output into records.
+
+    Emits one ``branch`` record (from the ``# branch.*`` headers), an
+    optional ``stash`` record, then ``changed``, ``renamed``/``copied``,
+    ``unmerged``, ``untracked`` and ``ignored`` entries in git's order.
+    Unknown headers are skipped, as git asks of porcelain parsers; an
+    unknown entry type raises ``ValueError``.
+    """
+    fields = split_fields(chunks)
+    branch: Optional[Record] = None
+    for field in fields:
+        kind = field[:2]
+        if kind == b"# ":
+            key, _, value = field[2:].decode("utf-8", "surrogateescape").partition(" ")
+            if key.startswith("branch."):
+                if branch is None:
+                    branch = {"type": "branch"}
+                _branch_header(branch, key, value)
+            elif key == "stash":
+                if branch is not None:
+                    yield branch
+                    branch = None
+                yield {"type": "stash", "count": int(value)}
+            continue
+        if branch is not None:
+            yield branch
+            branch = None
+        if kind == b"1 ":
+            parts = field.split(b" ", 8)
+            yield {
+                "type": "changed", "xy": parts[1].decode(), "submodule": parts[2].decode(),
+                "mode_head": parts[3].decode(), "mode_index": parts[4].decode(), "mode_worktree": parts[5].decode(),
+                "oid_head": parts[6].decode(), "oid_index": parts[7].decode(), "path": _path(parts[8]),
+            }
+        elif kind == b"2 ":
+            parts = field.split(b" ", 9)
+            score = parts[8].decode()
+            orig_path = next(fields, None)
+            if orig_path is None:
+                raise ValueError("rename entry without its original path")
+            yield {
+                "type": "renamed" if score[0] == "R" else "copied", "xy": parts[1].decode(),
+                "submodule": parts[2].decode(), "mode_head": parts[3].decode(), "mode_index": parts[4].decode(),
+                "mode_worktree": parts[5].decode(), "oid_head": parts[6].decode(), "oid_index": parts[7].decode(),
+                "similarity": int(score[1:]), "path": _path(parts[9]), "orig_path": _path(orig_path),
+            }
+        elif kind == b"u ":
+            parts = field.split(b" ", 10)
+            yield {
+                "type": "unmerged", "xy": parts[1].decode(), "submodule": parts[2].decode(),
+                "mode_stage1": parts[3].decode(), "mode_stage2": parts[4].decode(), "mode_stage3": parts[5].decode(),
+                "mode_worktree": parts[6].decode(), "oid_stage1": parts[7].decode(), "oid_stage2": parts[8].decode(),
+                "oid_stage3": parts[9].decode(), "path": _path(parts[10]),
+            }
+        elif kind == b"? ":
+            yield {"type": "untracked", "path": _path(field[2:])}
+        elif kind == b"! ":
+            yield {"type": "ignored", "path": _path(field[2:])}
+        else:
+            raise ValueError(f"unrecognized status entry: {field[:40]!r}")
+    if branch is not None:
+        yield branch
+
+
+def _with_options(cmd_args: List[str], options: List[str]) -> List[str]:
+    """Append ``options`` after the caller's own options, before any ``--``.
+
+    Placing them last lets them override conflicting format options the
+    caller passed (git honours the last one given).
+    """
+    if "--" in cmd_args:
+        split = cmd_args.index("--")
+        return cmd_args[:split] + options + cmd_args[split:]
+    return cmd_args + options
+
+
+class _Listing:
+    """Parser for ``ls-files -z`` / ``ls-tree -r -z`` output with filters and a resume position.
+
+    Both commands print paths in byte order, so the position is the last
+    path emitted plus how many records carried it (``ls-files`` repeats
+    unmerged paths once per stage).
+    """
+
+    def __init__(self, kind: str, columns: Tuple[str, ...], prefix: Optional[str], glob: Optional[str],
+                 after: Optional[Dict[str, Any]], repository: Optional[repo_module.Repository]):
+        self.kind = kind
+        self.columns = columns
+        self.prefix = prefix.encode("utf-8", "surrogateescape") if prefix else b""
+        self.glob = glob
+        self.repository = repository
+        self.last_path = b""
+        self.repeat = 0
+        if after is not None:
+            self.last_path = after["path"].encode("utf-8", "surrogateescape")
+            self.repeat = after["repeat"]
+
+    def _size(self, mode: str, oid: str, listed: bytes) -> Optional[int]:
+        if listed != b"":
+            return None if listed == b"-" else int(listed)
+        if mode == GITLINK_MODE or self.repository is None:
+            return None
+        try:
+            return objects.object_size(self.repository, oid)
+        except (objects.MissingObject, OSError, ValueError):
+            return None  # Not stored locally, e.g. in a partial clone
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[Record]:
+        columns = self.columns
+        prefix = self.prefix
+        skip_path, skip = self.last_path, self.repeat
+        for field in split_fields(chunks):
+            mode = oid = None
+            size = b""
+            path = field
+            if columns:
+                head, tab, path = field.partition(b"\t")
+                parts = head.split()
+                if not tab or len(parts) < (4 if self.kind == "ls-tree" else 3):
+                    raise ValueError(f"unrecognized {self.kind} entry: {field[:40]!r}")
+                if self.kind == "ls-tree":
+                    mode, oid, size = parts[0].decode(), parts[2].decode(), parts[3]
+                else:
+                    mode, oid = parts[0].decode(), parts[1].decode()
+            if prefix and not path.startswith(prefix):
+                continue
+            if skip_path:
+                # Resuming: drop what earlier pages returned
+                if path < skip_path:
+                    continue
+                if path == skip_path and skip > 0:
+                    skip -= 1
+                    continue
+                skip_path = b""
+            text = path.decode("utf-8", "surrogateescape")
+            if self.glob is not None and not fnmatch.fnmatchcase(text, self.glob):
+                continue
+            if path == self.last_path:
+                self.repeat += 1
+            else:
+                self.last_path, self.repeat = path, 1
+            record: Record = {"path": text}
+            if "mode" in columns:
+                record["mode"] = mode
+            if "oid" in columns:
+                record["oid"] = oid
+            if "size" in columns:
+                record["size"] = self._size(mode, oid, size)
+            yield record
+
+    def cursor(self) -> str:
+        return encode_cursor({"kind": self.kind, "path": self.last_path.decode("utf-8", "surrogateescape"),
+                              "repeat": self.repeat})
+
+
+def _status(cmd_args: List[str], options: Dict[str, Any], cwd: Optional[str]) -> Mode:
+    return Mode(_with_options(cmd_args, ["--porcelain=v2", "-z", "--branch"]), parse_status, _limit(options))
+
+
+def _limit(options: Dict[str, Any], default: Optional[int] = None) -> Optional[int]:
+    limit = options.get("limit")
+    if limit is None:
+        return None if options.get("output") else default
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return limit
+
+
+def _columns(options: Dict[str, Any]) -> Tuple[str, ...]:
+    columns = options.get("columns") or ()
+    if isinstance(columns, str):
+        columns = [column.strip() for column in columns.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in LIST_COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown columns {', '.join(map(str, unknown))}; choose from {', '.join(LIST_COLUMNS)}")
+    return tuple(column for column in LIST_COLUMNS if column in columns)
+
+
+def _listing(cmd_args: List[str], options: Dict[str, Any], cwd: Optional[str]) -> Mode:
+    kind = cmd_args[1]
+    columns = _columns(options)
+    prefix = options.get("prefix") or None
+    cursor = options.get("cursor")
+    after = decode_cursor(cursor, kind) if cursor else None
+    if after is not None and not (isinstance(after.get("path"), str) and isinstance(after.get("repeat"), int)):
+        raise ValueError("invalid cursor")
+    if kind == "ls-tree":
+        formatting = ["-r", "-z", "-l" if columns else "--name-only"]
+        positional = [arg for arg in cmd_args[2:] if not arg.startswith("-")]
+        # Extra paths would narrow an ls-tree that already names some, so only prune a bare tree listing
+        prunable = len(positional) == 1 and "--" not in cmd_args
+    else:
+        formatting = ["-z", "-s"] if columns else ["-z"]
+        prunable = all(arg.startswith("-") for arg in cmd_args[2:]) and "--" not in cmd_args
+    cmd_args = cmd_args + formatting
+    if prefix and "/" in prefix and prunable:
+        # Let git skip everything outside the prefix's directory; the exact prefix is matched below
+        cmd_args += ["--", prefix[:prefix.rindex("/") + 1]]
+    repository = repo_module.discover(cwd) if "size" in columns and kind == "ls-files" else None
+    listing = _Listing(kind, columns, prefix, options.get("glob") or None, after, repository)
+    return Mode(cmd_args, listing, _limit(options, DEFAULT_LIST_LIMIT), listing.cursor)
+
+
+# Fields of one commit in a structured log, each terminated by NUL under ``-z``
+LOG_FIELDS = ("oid", "parents", "author_name", "author_email", "author_time",
+              "committer_name", "committer_email", "committer_time", "subject")
+
+LOG_FORMAT = "--format=%H%x00%P%x00%an%x00%ae%x00%at%x00%cn%x00%ce%x00%ct%x00%s"
+
+# log options that pick the starting points of the walk; a graph cursor replaces them
+_LOG_SELECTORS = ("--all", "--branches", "--tags", "--remotes", "--glob", "--exclude", "--not")
+
+# log options that neither hide commits nor rewrite parents; a graph cursor keeps them
+_LOG_WALK_OPTIONS = ("--first-parent", "--date-order", "--topo-order", "--author-date-order",
+                     "--since", "--after", "--max-age")
+
+_LOG_ORDERS = ("--date-order", "--topo-order", "--author-date-order")
+
+
+def _option_in(arg: str, names: Tuple[str, ...]) -> bool:
+    return arg.partition("=")[0] in names
+
+
+def _is_offset(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_oid_list(value: Any) -> bool:
+    # Cursor oids end up on git's command line, so nothing else may pass
+    return isinstance(value, list) and all(
+        isinstance(oid, str) and len(oid) in (40, 64) and not oid.strip("0123456789abcdef") for oid in value)
+
+
+def parse_log(chunks: Iterable[bytes]) -> Iterator[Record]:
+    """Parse ``git log -z`` output in ``LOG_FORMAT`` into commit records.
+
+    Times are Unix timestamps and ``parents`` is a list of oids. Raises
+    ``ValueError`` when the output ends inside a commit.
+    """
+    fields = split_fields(chunks)
+    for oid in fields:
+        values = list(islice(fields, len(LOG_FIELDS) - 1))
+        if len(values) < len(LOG_FIELDS) - 1:
+            raise ValueError(f"truncated log entry: {oid[:40]!r}")
+        record: Record = {"oid": oid.decode()}
+        parents = values[0].decode()
+        record["parents"] = parents.split(" ") if parents else []
+        for key, value in zip(LOG_FIELDS[2:], values[1:]):
+            record[key] = int(value) if key.endswith("_time") else value.decode("utf-8", "replace")
+        yield record
+
+
+class _Log:
+    """Parser for a structured log page that knows where the walk stands.
+
+    A graph cursor records the frontier of the walk: the parents of the
+    commits on the page that the page did not show, plus starting points it
+    never reached, with the original exclusions. Date and topological order
+    never show a commit before its children, so the commits still to come
+    are exactly those reachable from the frontier and the next page is a
+    fresh walk from it, with no ``--skip`` over what earlier pages returned.
+    Options that hide commits or rewrite parents (paths, ``--author``,
+    ``--grep``, ``--no-merges``, ...) break that argument, so those logs
+    resume from an offset instead.
+    """
+
+    def __init__(self, cmd_args: List[str], graph: bool, first_parent: bool = False,
+                 tips: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                 offset: int = 0, cwd: Optional[str] = None):
+        self.cmd_args = cmd_args
+        self.graph = graph
+        self.first_parent = first_parent
+        self.tips = tips
+        self.exclude = exclude or []
+        self.offset = offset
+        self.cwd = cwd
+        self.count = 0
+        self.shown: set = set()
+        self.parents: List[str] = []
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[Record]:
+        for record in parse_log(chunks):
+            self.count += 1
+            if self.graph:
+                self.shown.add(record["oid"])
+                self.parents.extend(record["parents"][:1] if self.first_parent else record["parents"])
+            yield record
+
+    def _starting_points(self) -> bool:
+        """Resolve the first page's revisions into commits to start from and to exclude."""
+        result = process.run_process(
+            [self.cmd_args[0], "rev-parse", "--no-flags", "--default", "HEAD"] + self.cmd_args[2:], cwd=self.cwd)
+        if result.returncode != 0:
+            return False
+        tips, exclude = [], []
+        for line in result.stdout.splitlines():
+            if line.startswith("^"):
+                exclude.append(line[1:])
+            else:
+                tips.append(line)
+        if tips:
+            # Refs such as --tags name annotated tags; the walk shows the commits they point to
+            result = process.run_process([self.cmd_args[0], "rev-parse"] + [tip + "^{commit}" for tip in tips],
+                                         cwd=self.cwd)
+            if result.returncode != 0:
+                return False
+            tips = result.stdout.split()
+        self.tips, self.exclude = tips, exclude
+        return True
+
+    def cursor(self) -> str:
+        if self.graph and (self.tips is not None or self._starting_points()):
+            shown = self.shown
+            frontier = [oid for oid in dict.fromkeys(self.parents + self.tips) if oid not in shown]
+            return encode_cursor({"kind": "log", "tips": frontier, "exclude": self.exclude})
+        return encode_cursor({"kind": "log", "skip": self.offset + self.count})
+
+
+def _log(cmd_args: List[str], options: Dict[str, Any], cwd: Optional[str]) -> Mode:
+    cursor = options.get("cursor")
+    after = decode_cursor(cursor, "log") if cursor else None
+    if after is not None and not (_is_offset(after.get("skip")) or (
+            _is_oid_list(after.get("tips")) and _is_oid_list(after.get("exclude")))):
+        raise ValueError("invalid cursor")
+    given = [arg for arg in cmd_args[2:] if arg.startswith("-")]
+    walkable = "--" not in cmd_args and all(_option_in(arg, _LOG_SELECTORS + _LOG_WALK_OPTIONS) for arg in given)
+    formatting = ["-z", LOG_FORMAT, "--no-patch"]
+    if not any(_option_in(arg, _LOG_ORDERS) for arg in given):
+        formatting.append("--date-order")
+    first_parent = "--first-parent" in given
+    if after is None:
+        log = _Log(cmd_args, walkable, first_parent, cwd=cwd)
+    elif "tips" in after:
+        if not walkable:
+            raise ValueError("cursor does not match these log arguments")
+        # Walk on from the frontier, keeping only the options that shape the walk
+        kept = [arg for arg in given if _option_in(arg, _LOG_WALK_OPTIONS)]
+        log = _Log(cmd_args, True, first_parent, after["tips"], after["exclude"])
+        cmd_args = cmd_args[:2] + kept + after["tips"] + ["^" + oid for oid in after["exclude"]]
+    else:
+        log = _Log(cmd_args, False, offset=after["skip"])
+        formatting.append(f"--skip={after['skip']}")
+    return Mode(_with_options(cmd_args, formatting), log, _limit(options, DEFAULT_LOG_LIMIT), log.cursor)
+
+
+def parse_diff(chunks: Iterable[bytes], skip: int = 0) -> Iterator[Record]:
+    """Parse ``git diff --name-status -z`` output into one record per file.
+
+    Renames and copies carry ``orig_path`` and ``similarity``; the first
+    ``skip`` files are dropped. Raises ``ValueError`` when the output ends
+    inside an entry.
+    """
+    fields = split_fields(chunks)
+    for status in fields:
+        letter = status[:1].decode()
+        path = next(fields, None)
+        if path is None:
+            raise ValueError(f"diff entry without a path: {status[:40]!r}")
+        record: Record = {"status": letter}
+        if letter in ("R", "C"):
+            new_path = next(fields, None)
+            if new_path is None:
+                raise ValueError("rename entry without its new path")
+            record["path"] = _path(new_path)
+            record["orig_path"] = _path(path)
+            record["similarity"] = int(status[1:] or 0)
+        else:
+            record["path"] = _path(path)
+        if skip:
+            skip -= 1
+            continue
+        yield record
+
+
+class _Diff:
+    """Parser for a page of ``diff --name-status`` output that counts its offset."""
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        self.count = 0
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[Record]:
+        for record in parse_diff(chunks, self.offset):
+            self.count += 1
+            yield record
+
+    def cursor(self) -> str:
+        return encode_cursor({"kind": "diff", "offset": self.offset + self.count})
+
+
+def _raw_record(raw: bytes, path: bytes, orig_path: Optional[bytes]) -> Record:
+    parts = raw[1:].split(b" ")
+    if len(parts) != 5:
+        raise ValueError(f"unrecognized raw diff entry: {raw[:40]!r}")
+    old_mode, new_mode, old_oid, new_oid, status = (part.decode("ascii", "replace") for part in parts)
+    record: Record = {"status": status[:1], "path": _path(path)}
+    if orig_path is not None:
+        record["orig_path"] = _path(orig_path)
+        record["similarity"] = int(status[1:] or 0)
+    # An absent side has mode 000000; a zero oid on a present side is worktree content git did not hash
+    record["old_mode"] = None if old_mode == ABSENT_MODE else old_mode
+    record["new_mode"] = None if new_mode == ABSENT_MODE else new_mode
+    record["old_oid"] = None if old_mode == ABSENT_MODE or not old_oid.strip("0") else old_oid
+    record["new_oid"] = None if new_mode == ABSENT_MODE or not new_oid.strip("0") else new_oid
+    return record
+
+
+def parse_diff_summary(chunks: Iterable[bytes], skip: int = 0) -> Iterator[Record]:
+    """Parse ``git diff --raw --numstat -z`` output into one record per file.
+
+    Git prints every raw entry before the first numstat entry, so the raw
+    entries wait (as bytes) until their counts arrive and each record is
+    yielded as soon as it is complete. Records carry ``status``, ``path``
+    (plus ``orig_path`` and ``similarity`` for renames and copies), the
+    ``old_``/``new_`` ``mode`` and ``oid`` (``None`` for a side that does
+    not exist, and ``new_oid`` also for worktree content git did not hash),
+    ``added`` and ``deleted`` line counts (``None`` for binary files, or
+    when git printed no counts) and ``binary``. The first ``skip`` files
+    are dropped. Raises ``ValueError`` on output that does not follow that
+    format.
+    """
+    pending: Deque[Tuple[bytes, bytes, Optional[bytes]]] = deque()
+    fields = split_fields(chunks)
+    for field in fields:
+        if field.startswith(b":"):
+            path = next(fields, None)
+            orig_path = None
+            if field.rpartition(b" ")[2][:1] in (b"R", b"C"):
+                orig_path, path = path, next(fields, None)
+            if path is None:
+                raise ValueError(f"raw diff entry without a path: {field[:40]!r}")
+            pending.append((field, path, orig_path))
+            continue
+        counts = field.split(b"\t", 2)
+        if len(counts) != 3:
+            raise ValueError(f"unrecognized numstat entry: {field[:40]!r}")
+        added, deleted, path = counts
+        if not path:
+            next(fields, None)
+            path = next(fields, None)
+            if path is None:
+                raise ValueError("numstat rename entry without its new path")
+        # Entries come in the same order; git leaves out counts for some (e.g. -w hiding every change)
+        while pending:
+            raw, raw_path, orig_path = pending.popleft()
+            record = _raw_record(raw, raw_path, orig_path)
+            binary = added == b"-"
+            if raw_path == path:
+                record["added"] = None if binary else int(added)
+                record["deleted"] = None if binary else int(deleted)
+                record["binary"] = binary
+            else:
+                record.update(added=None, deleted=None, binary=False)
+            if skip:
+                skip -= 1
+            else:
+                yield record
+            if raw_path == path:
+                break
+        else:
+            raise ValueError(f"numstat entry without a raw entry: {path[:40]!r}")
+    for raw, raw_path, orig_path in pending:
+        record = _raw_record(raw, raw_path, orig_path)
+        record.update(added=None, deleted=None, binary=False)
+        if skip:
+            skip -= 1
+        else:
+            yield record
+
+
+class _Summary:
+    """Parser for a page of diff summary records that adds sizes and counts its offset."""
+
+    def __init__(self, offset: int, repository: Optional[repo_module.Repository]):
+        self.offset = offset
+        self.repository = repository
+        self.count = 0
+
+    def _size(self, mode: Optional[str], oid: Optional[str], path: str) -> Optional[int]:
+        repository = self.repository
+        if mode is None or mode == GITLINK_MODE or repository is None:
+            return None
+        try:
+            if oid is None:
+                if repository.worktree is None:
+                    return None
+                return os.lstat(os.path.join(repository.worktree, path)).st_size
+            return objects.object_size(repository, oid)
+        except (objects.MissingObject, OSError, ValueError):
+            return None  # Not stored locally, e.g. in a partial clone
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[Record]:
+        for record in parse_diff_summary(chunks, self.offset):
+            self.count += 1
+            old_path = record.get("orig_path", record["path"])
+            record["old_size"] = self._size(record["old_mode"], record["old_oid"], old_path)
+            record["new_size"] = self._size(record["new_mode"], record["new_oid"], record["path"])
+            yield record
+
+    def cursor(self) -> str:
+        return encode_cursor({"kind": "diff", "offset": self.offset + self.count})
+
+# Caller options choosing diff output formats; the summary and patch modes replace them with their own
+_DIFF_FORMATS = ("-p", "-u", "--patch", "-s", "--no-patch", "--raw", "--stat", "--numstat", "--shortstat",
+                 "--dirstat", "--cumulative", "--dirstat-by-file", "--summary", "--compact-summary", "--name-only",
+                 "--name-status", "--patch-with-raw", "--patch-with-stat", "--check", "-z", "--output")
+
+# Lines starting a file's section of a patch
+_PATCH_HEADERS = (b"diff --git ", b"diff --cc ", b"diff --combined ")
+
+
+def _capped_lines(chunks: Iterable[bytes], cap: int) -> Iterator[Tuple[bytes, int]]:
+    """Split on newlines, yielding the first ``cap`` bytes of each line and its full length.
+
+    A line longer than ``cap`` (minified code, a huge binary patch line) is
+    counted but never joined in memory.
+    """
+    head = b""
+    length = 0
+    for chunk in chunks:
+        start = 0
+        end = chunk.find(b"\n")
+        while end >= 0:
+            piece = chunk[start:end + 1]
+            if length:
+                yield head + piece[:cap - len(head)], length + len(piece)
+                head, length = b"", 0
+            else:
+                yield piece[:cap], len(piece)
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        if start < len(chunk):
+            if len(head) < cap:
+                head += chunk[start:start + cap - len(head)]
+            length += len(chunk) - start
+    if length:
+        yield head, length
+
+
+def _header_paths(names: bytes) -> Tuple[str, str]:
+    """Old and new path of a ``diff --git a/<old> b/<new>`` header, either of which git may quote."""
+    if names.startswith(b'"'):
+        end = 1
+        while end < len(names) and names[end] != 0x22:
+            end += 2 if names[end] == 0x5C else 1
+        old, new = names[:end + 1], names[end + 2:]
+    elif names.endswith(b'"') and b' "b/' in names:
+        split = names.rindex(b' "b/')
+        old, new = names[:split], names[split + 1:]
+    else:
+        # Unquoted names are equal unless rename or copy headers follow to say otherwise
+        half = (len(names) - 1) // 2
+        old, new = names[:half], names[half + 1:]
+    return _unquote(old)[2:], _unquote(new)[2:]
+
+
+def parse_patch(chunks: Iterable[bytes], max_bytes: int = DEFAULT_PATCH_BYTES, skip: int = 0) -> Iterator[Record]:
+    """Parse ``git diff -p`` output into one record per file, keeping at most ``max_bytes`` of each.
+
+    Records carry ``path`` (plus ``orig_path`` for renames and copies),
+    ``status`` (``A``, ``D``, ``R``, ``C`` or ``M``, from the extended
+    headers), ``binary``, ``bytes`` (the size of the file's whole section
+    of the patch, headers included), ``truncated`` and ``patch``: the
+    section decoded as UTF-8, cut after the last whole line that fits in
+    ``max_bytes`` when it is larger. Nothing past the cap is kept. The
+    first ``skip`` files are dropped.
+    """
+    record: Optional[Record] = None
+    kept: List[bytes] = []
+    size = 0
+    header = False
+    cap = max(max_bytes, 65536)
+    for line, length in _capped_lines(chunks, cap):
+        if line.startswith(_PATCH_HEADERS) or line.startswith(b"* Unmerged path "):
+            if record is not None:
+                if skip:
+                    skip -= 1
+                else:
+                    record["patch"] = b"".join(kept).decode("utf-8", "replace")
+                    yield record
+            record = None
+            if line.startswith(b"* "):
+                # Git announces a conflicted path before its combined diff; the announcement is not part of it
+                continue
+            command, _, names = line.rstrip(b"\n").partition(b" ")[2].partition(b" ")
+            if command == b"--git":
+                _, path = _header_paths(names)
+            else:
+                path = _unquote(names)
+            record = {"path": path, "status": "M", "binary": False, "bytes": 0, "truncated": False}
+            kept, size, header = [], 0, True
+        elif record is None:
+            continue
+        elif header:
+            if line.startswith((b"@@", b"Binary files ", b"GIT binary patch")):
+                header = False
+                record["binary"] = not line.startswith(b"@@")
+            else:
+                key, _, value = line.rstrip(b"\n").partition(b" ")
+                if key in (b"new", b"deleted") and value.startswith(b"file mode "):
+                    record["status"] = "A" if key == b"new" else "D"
+                elif key in (b"rename", b"copy") and value.startswith(b"from "):
+                    record["orig_path"] = _unquote(value[5:])
+                    record["status"] = "R" if key == b"rename" else "C"
+                elif key in (b"rename", b"copy") and value.startswith(b"to "):
+                    record["path"] = _unquote(value[3:])
+        record["bytes"] += length
+        if not record["truncated"] and size + length <= max_bytes:
+            kept.append(line)
+            size += length
+        else:
+            record["truncated"] = True
+    if record is not None and not skip:
+        record["patch"] = b"".join(kept).decode("utf-8", "replace")
+        yield record
+
+
+class _Patch:
+    """Parser for a page of ``diff -p`` output that counts its offset."""
+
+    def __init__(self, offset: int, max_bytes: int):
+        self.offset = offset
+        self.max_bytes = max_bytes
+        self.count = 0
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[Record]:
+        for record in parse_patch(chunks, self.max_bytes, self.offset):
+            self.count += 1
+            yield record
+
+    def cursor(self) -> str:
+        return encode_cursor({"kind": "diff", "offset": self.offset + self.count})
+
+
+def _paths(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    paths = [value] if isinstance(value, str) else value
+    if not isinstance(paths, list) or not paths or not all(isinstance(path, str) and path for path in paths):
+        raise ValueError("paths must be a non-empty list of paths")
+    return paths
+
+
+def _diff(cmd_args: List[str], options: Dict[str, Any], cwd: Optional[str]) -> Mode:
+    cursor = options.get("cursor")
+    after = decode_cursor(cursor, "diff") if cursor else {"offset": 0}
+    offset = after.get("offset")
+    if not _is_offset(offset):
+        raise ValueError("invalid cursor")
+    paths = _paths(options.get("paths"))
+    max_bytes = options.get("max_bytes")
+    if max_bytes is not None and (isinstance(max_bytes, bool) or not isinstance(max_bytes, int) or max_bytes < 1):
+        raise ValueError("max_bytes must be a positive integer")
+    if max_bytes is not None and paths is None:
+        raise ValueError("max_bytes caps the patches of the selected paths; set paths too")
+    limit = _limit(options, DEFAULT_DIFF_LIMIT)
+    if paths is not None:
+        if options.get("summary"):
+            raise ValueError("summary and paths are exclusive; summarize first, then select paths")
+        if "--" in cmd_args:
+            raise ValueError("paths replaces the pathspec after '--'")
+        patch = _Patch(offset, DEFAULT_PATCH_BYTES if max_bytes is None else max_bytes)
+        # Fixed prefixes keep the headers parseable whatever diff.noprefix or diff.mnemonicPrefix say
+        formatting = ["-p", "--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/"]
+        kept = [arg for arg in cmd_args if not _option_in(arg, _DIFF_FORMATS)]
+        return Mode(kept + formatting + ["--"] + paths, patch, limit, patch.cursor)
+    if options.get("summary"):
+        summary = _Summary(offset, repo_module.discover(cwd))
+        # --raw and --numstat add to the caller's formats instead of overriding them, so drop those
+        kept = [arg for arg in cmd_args if not _option_in(arg, _DIFF_FORMATS)]
+        return Mode(_with_options(kept, ["--raw", "--numstat", "-z", "--no-abbrev"]), summary, limit, summary.cursor)
+    diff = _Diff(offset)
+    # --name-status overrides -p, --stat and the other output formats wherever it appears
+    return Mode(_with_options(cmd_args, ["--name-status", "-z"]), diff, limit, diff.cursor)
+
+
+# ``blame --incremental`` commit headers -> commit metadata keys
+_BLAME_HEADERS = {
+    b"author": "author_name", b"author-mail": "author_email", b"author-time": "author_time",
+    b"author-tz": "author_tz", b"committer": "committer_name", b"committer-mail": "committer_email",
+    b"committer-time": "committer_time", b"committer-tz": "committer_tz", b"summary": "summary",
+}
+
+
+def parse_blame(chunks: Iterable[bytes]) -> Iterator[Record]:
+    """Parse ``git blame --incremental`` output into one record per attributed line range.
+
+    Records carry ``oid``, ``line`` (first line in the blamed file),
+    ``count``, ``orig_line`` (first line in the commit's version) and
+    ``path`` (the file's name in that commit), plus ``previous``
+    (``oid`` and ``path`` of the parent version) when git reports one.
+    Git describes each commit once, so the first range of a commit also
+    carries its ``commit`` metadata (author, committer, times, time zones,
+    ``summary`` and ``boundary``) and later ranges refer to it by oid.
+    Ranges arrive in the order git attributes them, not in line order.
+    Raises ``ValueError`` on output that does not follow that format.
+    """
+    record: Optional[Record] = None
+    for line in split_fields(chunks, b"\n"):
+        if record is None:
+            parts = line.split(b" ")
+            if len(parts) != 4 or not objects.is_full_oid(parts[0].decode("ascii", "replace")):
+                raise ValueError(f"unrecognized blame entry: {line[:40]!r}")
+            record = {"oid": parts[0].decode(), "line": int(parts[2]), "count": int(parts[3]),
+                      "orig_line": int(parts[1])}
+            continue
+        key, _, value = line.partition(b" ")
+        if key == b"filename":
+            record["path"] = _unquote(value)
+            yield record
+            record = None
+        elif key == b"previous":
+            oid, _, path = value.partition(b" ")
+            record["previous"] = {"oid": oid.decode(), "path": _unquote(path)}
+        elif key == b"boundary":
+            record.setdefault("commit", {})["boundary"] = True
+        elif key in _BLAME_HEADERS:
+            name = _BLAME_HEADERS[key]
+            if name.endswith("_time"):
+                field: Any = int(value)
+            else:
+                field = value.decode("utf-8", "replace")
+                if name.endswith("_email") and field.startswith("<") and field.endswith(">"):
+                    field = field[1:-1]
+            record.setdefault("commit", {})[name] = field
+        # Other headers are skipped, as git asks of porcelain parsers
+    if record is not None:
+        raise ValueError(f"blame entry without a filename: {record['oid']}")
+
+
+def _line_range(value: Any) -> Optional[Tuple[int, int]]:
+    if value is None:
+        return None
+    parts = value.split(",") if isinstance(value, str) else value
+    try:
+        start, end = (int(part) for part in parts)
+    except (TypeError, ValueError):
+        raise ValueError("lines must be a 'start,end' range") from None
+    if not 1 <= start <= end:
+        raise ValueError("lines must be a 'start,end' range with 1 <= start <= end")
+    return start, end
+
+
+class _Blame:
+    """Parser for ``blame --incremental`` output that stops once a line range is attributed."""
+
+    def __init__(self, lines: Optional[Tuple[int, int]]):
+        self.lines = lines
+        self.remaining = None if lines is None else lines[1] - lines[0] + 1
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[Record]:
+        for record in parse_blame(chunks):
+            yield record
+            if self.lines is not None:
+                # Count only the wanted lines, in case the caller passed other -L ranges too
+                start, end = self.lines
+                first, last = record["line"], record["line"] + record["count"] - 1
+                self.remaining -= max(0, min(last, end) - max(first, start) + 1)
+                if self.remaining <= 0:
+                    return
+
+    def finished(self) -> bool:
+        return self.remaining is not None and self.remaining <= 0
+
+
+def _blame(cmd_args: List[str], options: Dict[str, Any], cwd: Optional[str]) -> Mode:
+    lines = _line_range(options.get("lines"))
+    formatting = ["--incremental"]
+    if lines is not None:
+        # Git then only does the work for these lines
+        formatting += ["-L", f"{lines[0]},{lines[1]}"]
+    blame = _Blame(lines)
+    return Mode(_with_options(cmd_args, formatting), blame, _limit(options, DEFAULT_BLAME_LIMIT),
+                finished=blame.finished, flush=True)
+
+
+# grep options whose value is the next argument
+_GREP_VALUE_OPTIONS = ("-e", "-f", "-A", "-B", "-C", "--after-context", "--before-context", "--context",
+                       "--max-depth", "--threads", "-m", "--max-count")
+
+# grep options that change the output away from one line per match; structured grep drops them
+_GREP_FORMATS = ("-l", "--files-with-matches", "--name-only", "-L", "--files-without-match", "-c", "--count",
+                 "-h", "--heading", "--break", "-q", "--quiet", "-p", "--show-function", "-W", "--function-context",
+                 "-A", "-B", "-C", "--after-context", "--before-context", "--context", "-O", "--open-files-in-pager",
+                 "--color", "--no-column", "--no-line-number", "--null", "-z")
+
+_BINARY_NOTICE = (b"Binary file ", b" matches")
+
+
+def _grep_revisions(args: List[str]) -> List[str]:
+    """The revisions a ``git grep`` command line searches, from the arguments after ``grep``."""
+    positional = []
+    patterns = False
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == "--":
+            break
+        elif arg in ("--no-index", "--untracked"):
+            return []
+        elif arg in _GREP_VALUE_OPTIONS:
+            skip = True
+            patterns = patterns or arg in ("-e", "-f")
+        elif arg.startswith(("-e", "-f", "--patterns")):
+            patterns = True
+        elif not arg.startswith("-") and arg not in ("(", ")"):
+            positional.append(arg)
+    # Without -e or -f the first operand is the pattern
+    return positional if patterns else positional[1:]
+
+
+def _grep_arguments(args: List[str]) -> List[str]:
+    """Drop output-format options, with their values, from the arguments after ``grep``."""
+    kept: List[str] = []
+    value = None  # What to do with the next argument: the value of the option before it
+    for position, arg in enumerate(args):
+        if value is not None:
+            if value:
+                kept.append(arg)
+            value = None
+        elif arg == "--":
+            return kept + args[position:]
+        elif _option_in(arg, _GREP_FORMATS) or arg.startswith(("-A", "-B", "-C")) or (
+                arg[:1] == "-" and arg[1:].isdigit()):
+            # -A 3 and --context 3 take the next argument; -A3, --context=3 and -3 do not
+            value = False if arg in _GREP_VALUE_OPTIONS else None
+        else:
+            kept.append(arg)
+            value = True if arg in _GREP_VALUE_OPTIONS else None
+    return kept
+
+
+def parse_grep(chunks: Iterable[bytes], revisions: Tuple[str, ...] = ()) -> Iterator[Record]:
+    """Parse ``git grep -z -n --column`` output into one record per matching line.
+
+    Records carry ``path``, ``line``, ``column`` (1-based byte offset of the
+    first match, or of each match under ``-o``) and ``text``, plus
+    ``revision`` when a revision was searched: git then prints the path as
+    ``<revision>:<path>``, which is split against ``revisions``. Binary
+    files git only reports as matching yield ``path`` and ``binary: true``.
+    Raises ``ValueError`` on output that does not follow that format.
+    """
+    prefixes = sorted((revision.encode("utf-8", "surrogateescape") + b":" for revision in revisions),
+                      key=len, reverse=True)
+
+    def located(name: bytes) -> Record:
+        for prefix in prefixes:
+            if name.startswith(prefix):
+                return {"revision": prefix[:-1].decode("utf-8", "surrogateescape"), "path": _path(name[len(prefix):])}
+        return {"path": _path(name)}
+
+    pending = b""
+    for line in split_fields(chunks, b"\n"):
+        if pending:
+            # The path had a newline in it (-z leaves paths unquoted)
+            line, pending = pending + b"\n" + line, b""
+        parts = line.split(b"\0", 3)
+        if len(parts) < 4:
+            if len(parts) == 1 and line.startswith(_BINARY_NOTICE[0]) and line.endswith(_BINARY_NOTICE[1]):
+                record = located(line[len(_BINARY_NOTICE[0]):-len(_BINARY_NOTICE[1])])
+                record["binary"] = True
+                yield record
+            else:
+                pending = line
+            continue
+        path, number, column, text = parts
+        if not number.isdigit() or not column.isdigit():
+            raise ValueError(f"unrecognized grep match: {line[:40]!r}")
+        record = located(path)
+        record["line"] = int(number)
+        record["column"] = int(column)
+        record["text"] = text.decode("utf-8", "replace")
+        yield record
+    if pending:
+        raise ValueError(f"truncated grep match: {pending[:40]!r}")
+
+
+def _grep(cmd_args: List[str], options: Dict[str, Any], cwd: Optional[str]) -> Mode:
+    revisions = tuple(_grep_revisions(cmd_args[2:]))
+    # Git picks one thread per online CPU, which ignores the affinity mask a container or taskset sets
+    # Grep takes no options after its pattern, so these go first; the caller's format options are dropped
+    command = [cmd_args[0], "-c", f"grep.threads={_cpu_count()}", "grep", "-z", "-n", "--column", "--no-color"]
+    return Mode(command + _grep_arguments(cmd_args[2:]), lambda chunks: parse_grep(chunks, revisions),
+                _limit(options, DEFAULT_GREP_LIMIT), exit_codes=(0, 1))
+
+
+# Structured modes: subcommand -> (cmd_args, options, cwd) -> Mode
+COMMANDS: Dict[str, Callable[[List[str], Dict[str, Any], Optional[str]], Mode]] = {
+    "status": _status,
+    "ls-files": _listing,
+    "ls-tree": _listing,
+    "log": _log,
+    "diff": _diff,
+    "blame": _blame,
+    "grep": _grep,
+}
+
+
+def prepare(cmd_args: List[str], options: Optional[Dict[str, Any]] = None, cwd: Optional[str] = None) -> Optional[Mode]:
+    """Rewrite ``cmd_args`` for structured output, or ``None`` if unsupported.
+
+    ``options`` are the ``run()`` arguments (``limit``, ``cursor``,
+    ``output``, the listing filters, blame's ``lines`` and diff's
+    ``summary``, ``paths`` and ``max_bytes``). The subcommand must directly
+    follow ``git``; global options are not interpreted.
+    Raises ``ValueError`` for invalid options.
+    """
+    handler = COMMANDS.get(cmd_args[1]) if len(cmd_args) > 1 else None
+    return None if handler is None else handler(cmd_args, options or {}, cwd)
+
+
+def _mark_first(records: Iterator[Record], timer) -> Iterator[Record]:
+    """Charge the time until the first record is parsed to ``first_record``."""
+    for record in records:
+        timer.mark("first_record")
+        yield record
+        break
+    yield from records
+
+
+def run(mode: Mode, cwd: Optional[str] = None, timer=None, timeout: float = 30, output: Optional[str] = None):
+    """Run a prepared command, parsing its stdout as it streams in.
+
+    Returns the child's ``CompletedProcess`` with ``records`` (``None`` when
+    git failed, since its output is then not trustworthy, or when they were
+    written to ``output`` as NDJSON), ``record_count``, ``truncated`` (the
+    limit cut the output short) and ``next_cursor``. Git is also stopped
+    once a mode's parser has ``finished`` early.
+    """
+    record_count = 0
+    truncated = False
+    next_cursor = None
+    with process.StreamingProcess(mode.cmd_args, timeout=timeout, cwd=cwd, timer=timer) as child:
+        records = mode.parse(child)
+        page = records if mode.limit is None else islice(records, mode.limit)
+        if timer is not None:
+            page = _mark_first(page, timer)
+        if output is None:
+            collected = list(page)
+            record_count = len(collected)
+        else:
+            collected = None
+            encode = json.JSONEncoder().encode
+            with open(output, "w", encoding="utf-8") as handle:
+                for record in page:
+                    handle.write(encode(record) + "\n")
+                    if mode.flush:
+                        handle.flush()
+                    record_count += 1
+        if mode.limit is not None and record_count == mode.limit:
+            cursor = mode.cursor() if mode.cursor is not None else None
+            if next(records, None) is not None:
+                truncated = True
+                next_cursor = cursor
+                child.stop()
+        if mode.finished is not None and mode.finished():
+            child.stop()
+        result = child.wait()
+    succeeded = result.returncode in mode.exit_codes or result.stopped
+    result.records = collected if succeeded else None
+    result.record_count = record_count
+    result.truncated = truncated
+    result.next_cursor = next_cursor
+    return result
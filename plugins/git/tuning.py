@@ -0,0 +1,246 @@
+"""
+Inspect a repository's on-disk layout and tune it for faster git commands.
+
+Long-lived repositories slow down as they age: loose objects and small
+packs pile up between ``gc`` runs, history walks parse every commit when
+there is no commit-graph, and ``status`` reads every untracked directory.
+``inspect()`` reports what is there: ``git count-objects -v``, the
+commit-graph and its changed-path Bloom filters, the multi-pack-index, the
+index format and extensions, and the settings that matter. ``plan()``
+turns that into steps, and ``tune()`` applies them under the repository's
+write lock:
+
+- Settings: ``core.commitGraph``, and ``fetch.writeCommitGraph`` so
+  fetches keep the commit-graph current. With a worktree,
+  ``core.untrackedCache``, plus ``feature.manyFiles`` and ``index.version
+  4`` once the index has ``MANY_FILES`` entries. The index is rewritten
+  and the untracked cache enabled right away.
+- Loose objects, once there are ``LOOSE_OBJECTS_LIMIT`` of them, are
+  packed with ``git repack -d -l`` (an incremental repack: existing packs
+  are left alone).
+- Several packs get a multi-pack-index. Past ``PACK_LIMIT`` packs, they are
+  combined with ``git multi-pack-index repack`` and ``expire``.
+- The commit-graph is written incrementally with ``--split --reachable
+  --changed-paths``, which adds Bloom filters for ``log -- <path>``.
+
+Each step is idempotent, so running ``tune()`` again (from cron, say)
+maintains the repository. The thresholds are those of ``git maintenance``.
+``tune()`` also times ``git status``, ``git log -- <path>`` and
+``git rev-list --count HEAD`` before and after, so the effect is measured
+rather than assumed.
+"""
+
+import os
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from plugins import process
+from plugins.git import commitgraph, index, locking
+from plugins.git import repo as repo_module
+from plugins.git.refs import Unsupported
+
+# git maintenance's defaults for its loose-objects and incremental-repack tasks
+LOOSE_OBJECTS_LIMIT = 100
+PACK_LIMIT = 10
+
+# Index entries from which feature.manyFiles and index version 4 pay off
+MANY_FILES = 10000
+
+# Tuning rewrites packs and the commit-graph, which takes longer than a command
+TUNE_TIMEOUT = 600
+
+# Settings for every repository, for those with a worktree, and for those with many files
+_SETTINGS = {"core.commitgraph": "true", "fetch.writecommitgraph": "true"}
+_WORKTREE_SETTINGS = {"core.untrackedcache": "true"}
+_MANY_FILES_SETTINGS = {"feature.manyfiles": "true", "index.version": "4"}
+
+
+class TuneError(Exception):
+    """Raised when git fails while a repository is inspected or tuned."""
+
+
+def _git(cwd: Optional[str], *args: str, timeout: float = TUNE_TIMEOUT) -> str:
+    result = process.run_process(["git"] + list(args), timeout=timeout, cwd=cwd)
+    if result.returncode != 0:
+        raise TuneError((result.stderr or "").strip() or f"git {args[0]} exited with {result.returncode}")
+    return result.stdout
+
+
+def _discover(cwd: Optional[str]) -> repo_module.Repository:
+    repository = repo_module.discover(cwd)
+    if repository is None:
+        raise TuneError(f"not a repository that can be tuned: {cwd or os.getcwd()}")
+    return repository
+
+
+def count_objects(cwd: Optional[str]) -> Dict[str, int]:
+    """``git count-objects -v`` as a dict (``count``, ``in_pack``, ``packs``, ``size_pack``, ...; sizes in KiB)."""
+    counts = {}
+    for line in _git(cwd, "count-objects", "-v").splitlines():
+        key, _, value = line.partition(":")
+        counts[key.strip().replace("-", "_")] = int(value.strip() or 0)
+    return counts
+
+
+def _config(cwd: Optional[str]) -> Dict[str, str]:
+    # Global and system settings count too, so ask git rather than reading .git/config
+    result = process.run_process(["git", "config", "--list"], timeout=30, cwd=cwd)
+    settings = {}
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("=")
+        settings[key.lower()] = value
+    return settings
+
+
+def _commit_graph(repository: repo_module.Repository) -> Dict[str, Any]:
+    try:
+        graph = commitgraph.load(repository)
+    except (Unsupported, OSError) as e:
+        return {"present": False, "reason": str(e)}
+    return {"present": True, "layers": len(graph.layers), "commits": len(graph),
+            "bloom_filters": all(layer.has_bloom_filters for layer in graph.layers)}
+
+
+def _index(repository: repo_module.Repository) -> Optional[Dict[str, Any]]:
+    if repository.worktree is None:
+        return None
+    try:
+        current = index.read_index(repository)
+    except Unsupported as e:
+        return {"present": False, "reason": str(e)}
+    return {"present": True, "version": current.version, "entries": len(current),
+            "untracked_cache": b"UNTR" in current.extensions}
+
+
+def inspect(cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Report the repository's objects, commit-graph, multi-pack-index, index and relevant settings."""
+    repository = _discover(cwd)
+    settings = _config(cwd)
+    return {
+        "objects": count_objects(cwd),
+        "commit_graph": _commit_graph(repository),
+        "multi_pack_index": os.path.exists(os.path.join(repository.objects_dir, "pack", "multi-pack-index")),
+        "index": _index(repository),
+        "shallow": os.path.exists(os.path.join(repository.common_dir, "shallow")),
+        "config": {key: settings.get(key) for key in sorted(dict(_SETTINGS, **_WORKTREE_SETTINGS, **_MANY_FILES_SETTINGS))},
+    }
+
+
+def plan(inspection: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The steps that tune a repository as ``inspect()`` found it; each has ``step``, ``commands`` and ``reason``."""
+    steps: List[Dict[str, Any]] = []
+    current = inspection["index"]
+    wanted = dict(_SETTINGS)
+    if current is not None:
+        wanted.update(_WORKTREE_SETTINGS)
+        if current.get("entries", 0) >= MANY_FILES:
+            wanted.update(_MANY_FILES_SETTINGS)
+    for key, value in sorted(wanted.items()):
+        if (inspection["config"].get(key) or "").lower() != value:
+            steps.append({"step": "config", "commands": [["config", key, value]],
+                          "reason": f"{key} is {inspection['config'].get(key) or 'unset'}"})
+    if current is not None and current.get("present"):
+        if wanted.get("index.version") == "4" and current["version"] != 4:
+            steps.append({"step": "index_version", "commands": [["update-index", "--index-version", "4"]],
+                          "reason": f"{current['entries']} entries in a version {current['version']} index"})
+        if not current["untracked_cache"]:
+            steps.append({"step": "untracked_cache", "commands": [["update-index", "--untracked-cache"]],
+                          "reason": "status reads every untracked directory"})
+    objects = inspection["objects"]
+    packs = objects["packs"]
+    if objects["count"] >= LOOSE_OBJECTS_LIMIT:
+        steps.append({"step": "loose_objects", "commands": [["repack", "-d", "-l", "-q"]],
+                      "reason": f"{objects['count']} loose objects"})
+        packs += 1
+    if packs > PACK_LIMIT:
+        steps.append({"step": "incremental_repack",
+                      "commands": [["multi-pack-index", "write", "--no-progress"],
+                                   ["multi-pack-index", "repack", "--no-progress", "--batch-size=0"],
+                                   ["multi-pack-index", "expire", "--no-progress"]],
+                      "reason": f"{packs} packs"})
+    elif packs > 1 or inspection["multi_pack_index"]:
+        steps.append({"step": "multi_pack_index", "commands": [["multi-pack-index", "write", "--no-progress"]],
+                      "reason": f"{packs} packs" if not inspection["multi_pack_index"] else "keep it current"})
+    graph = inspection["commit_graph"]
+    if not inspection["shallow"]:
+        reason = ("keep it current" if graph["present"] and graph["bloom_filters"] else
+                  "no changed-path Bloom filters" if graph["present"] else "no commit-graph")
+        steps.append({"step": "commit_graph",
+                      "commands": [["commit-graph", "write", "--no-progress", "--split", "--reachable",
+                                    "--changed-paths"]],
+                      "reason": reason})
+    return steps
+
+
+def _median_seconds(func: Callable[[], Any], runs: int) -> float:
+    func()  # Warm up the page cache, and the untracked cache once it is enabled
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _sample_path(cwd: Optional[str]) -> Optional[str]:
+    # A tracked file from the middle of the index, so log -- <path> is neither trivial nor worst-case
+    paths = _git(cwd, "ls-files").splitlines()
+    return paths[len(paths) // 2] if paths else None
+
+
+def measure(cwd: Optional[str], path: Optional[str] = None, runs: int = 3) -> Dict[str, float]:
+    """Median seconds of ``status``, ``log -- <path>`` and ``rev-list --count HEAD`` over ``runs`` runs."""
+    repository = _discover(cwd)
+    commands: Dict[str, List[str]] = {"rev_list_count": ["rev-list", "--count", "HEAD"]}
+    if repository.worktree is not None:
+        commands["status"] = ["status", "--porcelain"]
+        path = path or _sample_path(cwd)
+    if path:
+        commands["log_path"] = ["log", "--format=%H", "--", path]
+    with locking.hold(locking.READ, cwd):
+        return {name: _median_seconds(lambda: _git(cwd, *args), runs) for name, args in commands.items()}
+
+
+def tune(cwd: Optional[str] = None, dry_run: bool = False, runs: int = 3,
+         path: Optional[str] = None) -> Dict[str, Any]:
+    """Inspect the repository at ``cwd``, apply the planned steps and report what changed.
+
+    With ``dry_run`` only the inspection and the plan are returned. ``runs``
+    (0 to skip) is the number of timed runs of each measured command, and
+    ``path`` the file ``log -- <path>`` follows (default: a tracked file).
+    Raises ``TuneError`` when git fails, and ``locking.LockTimeout``.
+    """
+    before = inspect(cwd)
+    steps = plan(before)
+    report: Dict[str, Any] = {"before": before, "steps": steps}
+    if dry_run:
+        return report
+    timings = {name: {"before": seconds} for name, seconds in measure(cwd, path, runs).items()} if runs else {}
+    with locking.hold(locking.WRITE, cwd):
+        for step in steps:
+            start = time.perf_counter()
+            for args in step["commands"]:
+                _git(cwd, *args)
+            step["seconds"] = time.perf_counter() - start
+    if any(step["step"] == "untracked_cache" for step in steps):
+        _git(cwd, "status", "--porcelain")  # Fills the untracked cache
+    report["after"] = inspect(cwd)
+    if runs:
+        for name, seconds in measure(cwd, path, runs).items():
+            timings[name]["after"] = seconds
+        report["measurements"] = timings
+    return report
+
+
+def manage(args: Dict[str, Any], cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Tune the repository for the plugin CLI; ``args`` may hold ``dry_run``, ``runs`` and ``path``."""
+    start = time.perf_counter()
+    try:
+        response: Dict[str, Any] = dict({"success": True}, **tune(
+            cwd, dry_run=bool(args.get("dry_run")), runs=int(args.get("runs", 3)), path=args.get("path")))
+    except (TuneError, OSError, ValueError, subprocess.TimeoutExpired, locking.LockTimeout) as e:
+        return {"success": False, "error": str(e), "error_code": "TUNE_FAILED"}
+    response["elapsed"] = time.perf_counter() - start
+    return response
@@ -0,0 +1,297 @@
+"""
+Pool of detached worktrees for running git commands in parallel on one repository.
+
+A repository has one main working tree, so checkouts, builds and diffs of
+different branches have to take turns in it. ``WorktreePool`` keeps up to
+``size`` extra worktrees (``git worktree add --detach``) in
+``smcp-worktrees/`` under the repository's common git directory. They share
+the object store and refs, so a new one costs a checkout, not a clone.
+
+``lease()`` hands one worktree to a caller at a time, checked out at the
+requested revision, and ``release()`` puts it back detached, with
+``git reset --hard`` and ``git clean -fd``. Ignored files such as build
+output are kept, so the next build in that worktree stays incremental.
+Leases are ``flock()`` locks on one file per worktree. A lease therefore
+ends when its process dies, and the lease file records the holder, so the
+next caller knows to clean up after a crashed one. ``prune()`` removes
+worktrees that have not been leased for a while.
+
+``acquire()`` and ``Lease.release()`` are behind the ``worktree`` option of
+the git plugin's ``run()``.
+"""
+
+import json
+import os
+import subprocess
+import time
+from typing import Any, Dict, List, Optional
+
+from plugins import process
+from plugins.git import locking
+from plugins.git import repo as repo_module
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+POOL_SIZE_ENV = "SMCP_WORKTREE_POOL_SIZE"
+IDLE_SECONDS_ENV = "SMCP_WORKTREE_IDLE_SECONDS"
+LEASE_TIMEOUT_ENV = "SMCP_WORKTREE_LEASE_TIMEOUT"
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_SECONDS = 3600.0
+DEFAULT_LEASE_TIMEOUT = 30.0
+
+# Directory of the pool inside the common git directory
+POOL_NAME = "smcp-worktrees"
+
+
+class WorktreeError(Exception):
+    """Raised when a pooled worktree cannot be created, checked out or reset."""
+
+
+class LeaseTimeout(WorktreeError):
+    """Raised when every worktree of the pool stays leased for the whole timeout."""
+
+
+def _setting(name: str, default: float) -> float:
+    try:
+        return max(float(os.environ.get(name, default)), 0.0)
+    except ValueError:
+        return default
+
+
+class Lease:
+    """A worktree of the pool held by one caller until ``release()``."""
+
+    def __init__(self, pool: "WorktreePool", slot: int, path: str, fd: int, revision: str, recovered: bool):
+        self.pool = pool
+        self.slot = slot
+        self.path = path
+        self.fd = fd
+        self.revision = revision
+        self.recovered = recovered  # The previous holder died without resetting the worktree
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"path": self.path, "slot": self.slot, "revision": self.revision, "recovered": self.recovered}
+
+    def release(self) -> bool:
+        """Reset the worktree, hand it back and prune idle ones; returns whether the reset succeeded."""
+        reset = self.pool.release(self)
+        try:
+            self.pool.prune()
+        except OSError:
+            pass  # The next release prunes again
+        return reset
+
+
+class WorktreePool:
+    """Leases the pooled worktrees of the repository at ``cwd``."""
+
+    def __init__(self, cwd: Optional[str] = None, size: Optional[int] = None, timeout: float = 30):
+        repository = repo_module.discover(cwd)
+        if repository is None:
+            raise WorktreeError(f"not a repository the worktree pool can manage: {cwd or os.getcwd()}")
+        self.cwd = cwd
+        self.root = os.path.join(repository.common_dir, POOL_NAME)
+        self.size = int(_setting(POOL_SIZE_ENV, DEFAULT_POOL_SIZE)) if size is None else size
+        self.timeout = timeout
+
+    def path(self, slot: int) -> str:
+        return os.path.join(self.root, f"wt{slot}")
+
+    def _lease_file(self, slot: int) -> str:
+        return os.path.join(self.root, f"wt{slot}.lease")
+
+    def _git(self, *args: str, cwd: Optional[str] = None) -> str:
+        cmd_args = ["git"] + list(args)
+        result = process.run_process(cmd_args, timeout=self.timeout, cwd=cwd or self.cwd)
+        if result.returncode != 0:
+            raise WorktreeError((result.stderr or "").strip() or f"{' '.join(cmd_args[:3])} exited with "
+                                f"{result.returncode}")
+        return result.stdout
+
+    def _try_lock(self, slot: int) -> Optional[int]:
+        # Lease files are never deleted: a process could be waiting on the old inode of a deleted one
+        fd = os.open(self._lease_file(slot), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _add(self, slot: int, revision: str) -> None:
+        # Adding a worktree writes the shared worktree metadata and takes the repository's write lock
+        with locking.hold(locking.WRITE, self.cwd):
+            self._git("worktree", "prune")
+            self._git("worktree", "add", "-q", "--detach", "--force", self.path(slot), revision)
+
+    def _reset(self, path: str) -> None:
+        with locking.hold(locking.READ, path):
+            # Leave any branch the holder checked out, so the main tree can check it out or delete it again
+            self._git("checkout", "-q", "--detach", "--force", cwd=path)
+            self._git("reset", "-q", "--hard", cwd=path)
+            self._git("clean", "-q", "-f", "-d", cwd=path)
+
+    def warm(self, count: Optional[int] = None) -> List[str]:
+        """Create missing worktrees until the first ``count`` (default ``size``) exist; returns the new paths."""
+        os.makedirs(self.root, exist_ok=True)
+        created = []
+        for slot in range(self.size if count is None else min(count, self.size)):
+            fd = self._try_lock(slot)
+            if fd is None:
+                continue  # Another caller holds it and creates it if needed
+            try:
+                if not os.path.isdir(self.path(slot)):
+                    self._add(slot, "HEAD")
+                    created.append(self.path(slot))
+            finally:
+                os.close(fd)
+        return created
+
+    def lease(self, revision: str = "HEAD", timeout: Optional[float] = None) -> Lease:
+        """Lease a worktree checked out (detached) at ``revision``, as resolved in ``cwd``.
+
+        Waits up to ``timeout`` seconds (default: the pool's git timeout) for a
+        worktree to be released, then raises ``LeaseTimeout``.
+        """
+        if fcntl is None:  # pragma: no cover - Windows
+            raise WorktreeError("worktree leases need fcntl.flock")
+        oid = self._git("rev-parse", "--verify", f"{revision}^{{commit}}").strip()
+        os.makedirs(self.root, exist_ok=True)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        delay = 0.001
+        while True:
+            # Prefer worktrees that exist, so a new one is only added when all of them are leased
+            slots = sorted(range(self.size), key=lambda slot: not os.path.isdir(self.path(slot)))
+            for slot in slots:
+                fd = self._try_lock(slot)
+                if fd is not None:
+                    try:
+                        return self._prepare(slot, fd, oid)
+                    except BaseException:
+                        os.close(fd)
+                        raise
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LeaseTimeout(f"all {self.size} pooled worktrees of {os.path.dirname(self.root)} stayed "
+                                   f"leased for {timeout if timeout is not None else self.timeout:g} seconds")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+    def _prepare(self, slot: int, fd: int, oid: str) -> Lease:
+        path = self.path(slot)
+        recovered = False
+        if not os.path.isdir(path):
+            self._add(slot, oid)
+        else:
+            # A lease record left behind means its holder died before release() reset the worktree
+            recovered = os.fstat(fd).st_size > 0
+            if recovered:
+                self._reset(path)
+            with locking.hold(locking.READ, path):
+                self._git("checkout", "-q", "--detach", "--force", oid, cwd=path)
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, json.dumps({"pid": os.getpid(), "since": time.time(), "revision": oid}).encode(), 0)
+        return Lease(self, slot, path, fd, oid, recovered)
+
+    def release(self, lease: Lease) -> bool:
+        """Reset the leased worktree and hand it back to the pool.
+
+        Returns ``False`` when the reset failed. The lease record is kept
+        then, so the next lease of the worktree resets it again.
+        """
+        try:
+            try:
+                self._reset(lease.path)
+            except (WorktreeError, OSError, subprocess.TimeoutExpired, locking.LockTimeout):
+                return False
+            os.ftruncate(lease.fd, 0)  # Also marks the time it went idle, for prune()
+            return True
+        finally:
+            os.close(lease.fd)
+
+    def prune(self, idle_seconds: Optional[float] = None) -> List[str]:
+        """Remove pooled worktrees not leased for ``idle_seconds`` (default ``SMCP_WORKTREE_IDLE_SECONDS``).
+
+        Worktrees beyond ``size`` are removed too. Returns the removed paths;
+        a worktree git fails to remove is skipped.
+        """
+        if idle_seconds is None:
+            idle_seconds = _setting(IDLE_SECONDS_ENV, DEFAULT_IDLE_SECONDS)
+        removed = []
+        for name in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else ():
+            if not (name.startswith("wt") and name.endswith(".lease") and name[2:-6].isdigit()):
+                continue
+            slot = int(name[2:-6])
+            path = self.path(slot)
+            fd = self._try_lock(slot)
+            if fd is None:
+                continue
+            try:
+                idle = time.time() - os.fstat(fd).st_mtime
+                if os.path.isdir(path) and (slot >= self.size or idle >= idle_seconds):
+                    with locking.hold(locking.WRITE, self.cwd):
+                        self._git("worktree", "remove", "--force", path)
+                    removed.append(path)
+            except (WorktreeError, subprocess.TimeoutExpired, locking.LockTimeout):
+                pass
+            finally:
+                os.close(fd)
+        return removed
+
+    def status(self) -> List[Dict[str, Any]]:
+        """The pooled worktrees that exist, with their lease record when leased."""
+        entries = []
+        for slot in range(self.size):
+            if not os.path.isdir(self.path(slot)):
+                continue
+            entry: Dict[str, Any] = {"slot": slot, "path": self.path(slot), "leased": False}
+            fd = self._try_lock(slot)
+            if fd is None:
+                entry["leased"] = True
+                with open(self._lease_file(slot)) as f:
+                    text = f.read()
+                if text:
+                    entry["lease"] = json.loads(text)
+            else:
+                os.close(fd)
+            entries.append(entry)
+        return entries
+
+
+def acquire(revision: Any, cwd: Optional[str], timeout: Optional[float] = None) -> Lease:
+    """Lease a pooled worktree of the repository at ``cwd`` at ``revision`` (``True`` means ``HEAD``).
+
+    Waits ``timeout`` seconds (default ``SMCP_WORKTREE_LEASE_TIMEOUT``) for a free one.
+    """
+    if timeout is None:
+        timeout = _setting(LEASE_TIMEOUT_ENV, DEFAULT_LEASE_TIMEOUT)
+    return WorktreePool(cwd).lease("HEAD" if revision is True else str(revision), timeout)
+
+
+def manage(args: Dict[str, Any], cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Inspect or maintain the worktree pool for the plugin CLI.
+
+    ``args["warm"]`` creates worktrees up to that many (``True`` means the
+    pool size), ``args["prune"]`` removes those idle for that many seconds
+    (``True`` means ``SMCP_WORKTREE_IDLE_SECONDS``), and ``args["size"]``
+    overrides ``SMCP_WORKTREE_POOL_SIZE``. The response lists the pool.
+    """
+    start = time.perf_counter()
+    response: Dict[str, Any] = {"success": True}
+    try:
+        pool = WorktreePool(cwd, size=args.get("size"))
+        warm = args.get("warm")
+        if warm:
+            response["created"] = pool.warm(None if warm is True else int(warm))
+        idle = args.get("prune")
+        if idle is not None and idle is not False:
+            response["removed"] = pool.prune(None if idle is True else float(idle))
+        response["result"] = pool.status()
+    except (WorktreeError, OSError, ValueError, subprocess.TimeoutExpired, locking.LockTimeout) as e:
+        return {"success": False, "error": str(e), "error_code": "WORKTREE_FAILED"}
+    response["size"] = pool.size
+    response["elapsed"] = time.perf_counter() - start
+    return response
@@ -0,0 +1,303 @@
+"""
+Metrics registry shared by the gh and git plugins.
+
+Every ``run()`` call is recorded into an in-process registry (call counts,
+latency histograms, bytes in/out, timeouts and aggregated child resource
+usage) labeled by tool, subcommand, ``error_code`` and idempotent/cached
+status (cached meaning answered without spawning a child). Recording is a
+handful of dict updates, so it is always on.
+
+Because each SMCP invocation is usually a short-lived process, the CLI
+merges the registry into a JSON state file named by ``SMCP_METRICS_FILE``
+when the variable is set. The ``metrics`` CLI subcommand renders the merged
+totals in the Prometheus text exposition format, optionally writing them to
+a file for a node_exporter textfile collector.
+"""
+
+import bisect
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+METRICS_FILE_ENV = "SMCP_METRICS_FILE"
+
+# Upper bounds (seconds) of the call latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CALL_LABELS = ("tool", "subcommand", "error_code", "idempotent", "cached")
+COMMAND_LABELS = ("tool", "subcommand")
+
+# name -> (type, help, label names)
+METRICS = {
+    "smcp_plugin_calls_total": (
+        "counter", "Plugin run() calls.", CALL_LABELS),
+    "smcp_plugin_call_duration_seconds": (
+        "histogram", "Plugin run() latency in seconds.", CALL_LABELS),
+    "smcp_plugin_timeouts_total": (
+        "counter", "Plugin calls that hit the command timeout.", COMMAND_LABELS),
+    "smcp_plugin_bytes_in_total": (
+        "counter", "Bytes of command line passed to the child.", COMMAND_LABELS),
+    "smcp_plugin_bytes_out_total": (
+        "counter", "Bytes of stdout and stderr returned by the child.", COMMAND_LABELS),
+    "smcp_plugin_child_cpu_seconds_total": (
+        "counter", "CPU time consumed by child processes.", COMMAND_LABELS + ("mode",)),
+    "smcp_plugin_child_block_ops_total": (
+        "counter", "Block I/O operations performed by child processes.", COMMAND_LABELS + ("direction",)),
+    "smcp_plugin_child_context_switches_total": (
+        "counter", "Context switches of child processes.", COMMAND_LABELS + ("kind",)),
+    "smcp_plugin_child_max_rss_bytes": (
+        "gauge", "Largest maximum resident set size seen for a child process.", COMMAND_LABELS),
+}
+
+# How many leading non-option words identify the subcommand of each tool
+_SUBCOMMAND_WORDS = {"gh": 2, "git": 1}
+
+
+def _byte_length(text: Any) -> int:
+    if not text:
+        return 0
+    # isascii() is O(1) on str, so the common case avoids an encode
+    return len(text) if text.isascii() else len(text.encode("utf-8", "surrogateescape"))
+
+
+def bytes_out(response: Dict[str, Any]) -> int:
+    """Bytes of output a response reports: its stdout and stderr, plus output parsed without being kept."""
+    return (_byte_length(response.get("stdout")) + response.get("stdout_bytes", 0)
+            + _byte_length(response.get("stderr")))
+
+
+def subcommand_of(tool: str, command: str) -> str:
+    """Return the subcommand label for a command string such as ``git log -5``."""
+    words = []
+    for word in command.split()[1:]:
+        if word.startswith("-"):
+            continue
+        words.append(word)
+        if len(words) == _SUBCOMMAND_WORDS.get(tool, 1):
+            break
+    return " ".join(words) if words else "none"
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, max-gauges and histograms.
+
+    Series are keyed by ``(metric name, label values tuple)``. Histograms
+    hold per-bucket counts (non-cumulative) followed by the sum and count.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+
+    def inc(self, name: str, labels: Tuple[str, ...], value: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_max(self, name: str, labels: Tuple[str, ...], value: float) -> None:
+        key = (name, labels)
+        with self._lock:
+            if value > self.gauges.get(key, float("-inf")):
+                self.gauges[key] = value
+
+    def observe(self, name: str, labels: Tuple[str, ...], value: float) -> None:
+        key = (name, labels)
+        index = bisect.bisect_left(LATENCY_BUCKETS, value)
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                # One slot per bucket plus +Inf, then sum and count
+                series = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> Dict[str, List[Any]]:
+        """Return the registry contents in a JSON-serializable form."""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "gauges": [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+                "histograms": [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()]
+            }
+
+    def merge(self, snapshot: Dict[str, List[Any]]) -> None:
+        """Add the contents of a ``snapshot()`` into this registry."""
+        for name, labels, value in snapshot.get("counters", []):
+            self.inc(name, tuple(labels), value)
+        for name, labels, value in snapshot.get("gauges", []):
+            self.set_max(name, tuple(labels), value)
+        for name, labels, values in snapshot.get("histograms", []):
+            key = (name, tuple(labels))
+            with self._lock:
+                series = self.histograms.get(key)
+                if series is None or len(series) != len(values):
+                    self.histograms[key] = list(values)
+                else:
+                    self.histograms[key] = [a + b for a, b in zip(series, values)]
+
+    def render(self) -> str:
+        """Render all series in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: list(series) for key, series in self.histograms.items()}
+        lines = []
+        for name, (metric_type, help_text, label_names) in METRICS.items():
+            if metric_type == "histogram":
+                series = sorted((labels, values) for (n, labels), values in histograms.items() if n == name)
+            else:
+                source = gauges if metric_type == "gauge" else counters
+                series = sorted((labels, value) for (n, labels), value in source.items() if n == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in series:
+                label_text = _format_labels(label_names, labels)
+                if metric_type != "histogram":
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), value):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {_format_value(cumulative)}')
+                lines.append(f"{name}_sum{{{label_text}}} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{{{label_text}}} {_format_value(value[-1])}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+
+def record_response(tool: str, response: Dict[str, Any], registry: Optional[MetricsRegistry] = None) -> None:
+    """Record one ``run()`` response into the registry."""
+    registry = REGISTRY if registry is None else registry
+    subcommand = subcommand_of(tool, response.get("command") or tool)
+    error_code = response.get("error_code") or "none"
+    idempotent = "true" if response.get("idempotent") else "false"
+    timings = response.get("timings")
+    # Calls answered without a child (in-process fast paths) count as cached
+    cached = "true" if response.get("cached") or (timings and "in_process_ns" in timings) else "false"
+    command_labels = (tool, subcommand)
+    call_labels = command_labels + (error_code, idempotent, cached)
+
+    registry.inc("smcp_plugin_calls_total", call_labels)
+    if timings:
+        registry.observe("smcp_plugin_call_duration_seconds", call_labels, timings["total_ns"] / 1e9)
+    if error_code == "TIMEOUT":
+        registry.inc("smcp_plugin_timeouts_total", command_labels)
+    registry.inc("smcp_plugin_bytes_in_total", command_labels, _byte_length(response.get("command")))
+    registry.inc("smcp_plugin_bytes_out_total", command_labels, bytes_out(response))
+
+    resources = response.get("resources")
+    if resources:
+        registry.inc("smcp_plugin_child_cpu_seconds_total", command_labels + ("user",), resources.get("user_cpu_s", 0))
+        registry.inc("smcp_plugin_child_cpu_seconds_total", command_labels + ("system",), resources.get("system_cpu_s", 0))
+        registry.inc("smcp_plugin_child_block_ops_total", command_labels + ("in",), resources.get("block_input_ops", 0))
+        registry.inc("smcp_plugin_child_block_ops_total", command_labels + ("out",), resources.get("block_output_ops", 0))
+        registry.inc("smcp_plugin_child_context_switches_total", command_labels + ("voluntary",),
+                     resources.get("voluntary_ctx_switches", 0))
+        registry.inc("smcp_plugin_child_context_switches_total", command_labels + ("involuntary",),
+                     resources.get("involuntary_ctx_switches", 0))
+        registry.set_max("smcp_plugin_child_max_rss_bytes", command_labels, resources.get("max_rss_bytes", 0))
+
+
+def _state_path(path: Optional[str]) -> Optional[str]:
+    return path if path is not None else os.environ.get(METRICS_FILE_ENV) or None
+
+
+def _read_state(handle) -> Dict[str, List[Any]]:
+    handle.seek(0)
+    data = handle.read()
+    if not data:
+        return {}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {}  # A corrupt state file starts over rather than failing the call
+
+
+def flush(path: Optional[str] = None, registry: Optional[MetricsRegistry] = None) -> bool:
+    """Merge the registry into the shared state file and reset it.
+
+    Returns False (and keeps the in-process data) when no state file is
+    configured.
+    """
+    registry = REGISTRY if registry is None else registry
+    path = _state_path(path)
+    if not path:
+        return False
+    merged = MetricsRegistry()
+    with open(path, "a+", encoding="utf-8") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        merged.merge(_read_state(handle))
+        merged.merge(registry.snapshot())
+        handle.seek(0)
+        handle.truncate()
+        json.dump(merged.snapshot(), handle)
+    registry.clear()
+    return True
+
+
+def load(path: Optional[str] = None, registry: Optional[MetricsRegistry] = None) -> MetricsRegistry:
+    """Return a registry combining the state file with in-process data."""
+    registry = REGISTRY if registry is None else registry
+    combined = MetricsRegistry()
+    path = _state_path(path)
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_SH)
+            combined.merge(_read_state(handle))
+    combined.merge(registry.snapshot())
+    return combined
+
+
+def export(output: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+    """Render metrics as Prometheus text, optionally writing them atomically to ``output``."""
+    text = load(path).render()
+    response = {
+        "success": True,
+        "format": "prometheus",
+        "result": text
+    }
+    if output:
+        directory = os.path.dirname(os.path.abspath(output))
+        fd, temp_path = tempfile.mkstemp(prefix=".metrics_", suffix=".prom", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(temp_path, output)
+        response["output"] = output
+    return response
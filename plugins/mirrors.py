@@ -0,0 +1,289 @@
+"""
+Local cache of bare mirrors that ``git clone`` and ``gh repo clone`` borrow objects from.
+
+Cloning the same repositories over and over transfers their whole history
+each time. With ``args["mirror"]`` set, the gh and git plugins first make
+sure a bare mirror of the remote exists in ``SMCP_MIRROR_DIR`` (default
+``~/.cache/smcp-mirrors``), then clone with
+``--reference-if-able <mirror> --dissociate``. The remote only sends what the
+mirror lacks, and ``--dissociate`` copies the borrowed objects into the new
+repository, so it works on its own after that.
+
+A mirror older than ``SMCP_MIRROR_REFRESH_SECONDS`` (default 300) is
+fetched again before it is used. Each mirror has a ``flock()`` lock file
+next to it, so concurrent clones do not stampede the remote:
+
+- Only one process creates a missing mirror. The others wait for it.
+- Only one refreshes a stale mirror. The others clone against the mirror as
+  it is, since a reference only needs to be close to current.
+
+``refresh_all()`` (the git plugin's ``mirrors`` command) refreshes every
+stale mirror, for a cron job or timer.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from plugins import process
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no cross-process locking
+    fcntl = None
+
+MIRROR_DIR_ENV = "SMCP_MIRROR_DIR"
+REFRESH_SECONDS_ENV = "SMCP_MIRROR_REFRESH_SECONDS"
+DEFAULT_REFRESH_SECONDS = 300.0
+
+# Cloning a mirror copies a whole history, so it gets longer than a command
+MIRROR_TIMEOUT = 600
+
+# Written into a mirror after each successful fetch; its mtime is the mirror's age
+STAMP_NAME = "smcp-fetched"
+
+# git clone options that take a separate value
+_CLONE_VALUE_OPTIONS = frozenset((
+    "-o", "--origin", "-b", "--branch", "-u", "--upload-pack", "--reference", "--reference-if-able",
+    "--separate-git-dir", "-c", "--config", "--depth", "--shallow-since", "--shallow-exclude", "-j", "--jobs",
+    "--filter", "--template", "--server-option", "--bundle-uri",
+))
+
+# user@host:path, the scp-like syntax git accepts for ssh remotes
+_SCP_LIKE = re.compile(r"^[^/:]+@[^/:]+:")
+
+
+class MirrorError(Exception):
+    """Raised when a mirror cannot be created or refreshed."""
+
+
+def mirror_root() -> str:
+    return os.environ.get(MIRROR_DIR_ENV) or os.path.join(os.path.expanduser("~"), ".cache", "smcp-mirrors")
+
+
+def refresh_seconds() -> float:
+    try:
+        return max(float(os.environ.get(REFRESH_SECONDS_ENV, DEFAULT_REFRESH_SECONDS)), 0.0)
+    except ValueError:
+        return DEFAULT_REFRESH_SECONDS
+
+
+def is_remote(url: str) -> bool:
+    """Whether ``url`` names a remote worth mirroring; local paths are hardlinked by git already."""
+    return "://" in url or bool(_SCP_LIKE.match(url))
+
+
+def mirror_path(url: str, root: Optional[str] = None) -> str:
+    """Where the mirror of ``url`` lives; URLs that differ only by a trailing ``/`` or ``.git`` share one."""
+    normalized = url.rstrip("/")
+    if normalized.endswith(".git"):
+        normalized = normalized[:-4]
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", normalized.rsplit("/", 1)[-1].rsplit(":", 1)[-1]) or "repo"
+    digest = hashlib.sha1(normalized.encode()).hexdigest()[:16]
+    return os.path.join(root or mirror_root(), f"{name}-{digest}.git")
+
+
+def _age(path: str) -> Optional[float]:
+    try:
+        return time.time() - os.stat(os.path.join(path, STAMP_NAME)).st_mtime
+    except OSError:
+        return None
+
+
+def _git(cmd_args: List[str], timeout: float) -> None:
+    result = process.run_process(["git"] + cmd_args, timeout=timeout)
+    if result.returncode != 0:
+        raise MirrorError((result.stderr or "").strip() or f"git {cmd_args[0]} exited with {result.returncode}")
+
+
+def _stamp(path: str) -> None:
+    with open(os.path.join(path, STAMP_NAME), "w"):
+        pass
+
+
+def _create(url: str, path: str, timeout: float) -> None:
+    # Clone next to the final path and rename, so a half-written mirror is never used
+    partial = path + ".partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        _git(["clone", "--mirror", "--quiet", url, partial], timeout)
+        _stamp(partial)
+        os.rename(partial, path)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+
+def _refresh(path: str, timeout: float) -> None:
+    _git(["-C", path, "fetch", "--quiet", "--prune", "origin"], timeout)
+    _stamp(path)
+
+
+def ensure(url: str, root: Optional[str] = None, max_age: Optional[float] = None,
+           timeout: float = MIRROR_TIMEOUT) -> Dict[str, Any]:
+    """Create or refresh the mirror of ``url`` as needed; returns what was done.
+
+    The result has ``path``, ``url``, ``action`` (``created``, ``refreshed``,
+    ``fresh`` or ``stale``, when another process was refreshing it) and
+    ``seconds``. Raises ``MirrorError`` when git fails and
+    ``subprocess.TimeoutExpired`` when it takes longer than ``timeout``.
+    """
+    start = time.perf_counter()
+    path = mirror_path(url, root)
+    max_age = refresh_seconds() if max_age is None else max_age
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    action = "fresh"
+    age = _age(path)
+    if age is None or age >= max_age:
+        fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:  # pragma: no branch - Windows clones may stampede
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if age is not None:
+                        action = "stale"  # Someone is refreshing it; borrow from it as it is
+                    else:
+                        fcntl.flock(fd, fcntl.LOCK_EX)  # Someone is creating it; wait for them
+            if action != "stale":
+                # Check again under the lock: whoever held it may have just done the work
+                age = _age(path)
+                if age is None:
+                    shutil.rmtree(path, ignore_errors=True)  # Left by a clone that died before stamping it
+                    _create(url, path, timeout)
+                    action = "created"
+                elif age >= max_age:
+                    _refresh(path, timeout)
+                    action = "refreshed"
+        finally:
+            os.close(fd)
+    return {"path": path, "url": url, "action": action, "seconds": time.perf_counter() - start}
+
+
+def _insert_reference(args: List[str], at: int, path: str) -> List[str]:
+    return args[:at] + ["--reference-if-able", path, "--dissociate"] + args[at:]
+
+
+def clone_operands(args: List[str]) -> List[str]:
+    """The repository and directory arguments of ``git clone`` arguments (after ``clone``)."""
+    operands = []
+    skip = False
+    for index, arg in enumerate(args):
+        if skip:
+            skip = False
+        elif arg == "--":
+            return operands + args[index + 1:]
+        elif arg in _CLONE_VALUE_OPTIONS:
+            skip = True
+        elif not arg.startswith("-"):
+            operands.append(arg)
+    return operands
+
+
+def clone_source(args: List[str]) -> Optional[str]:
+    """The repository argument of ``git clone`` arguments (after ``clone``), or ``None``."""
+    operands = clone_operands(args)
+    return operands[0] if operands else None
+
+
+def gh_clone_url(repository: str) -> Optional[str]:
+    """The git URL ``gh repo clone`` clones for ``repository`` (``OWNER/REPO``, ``HOST/OWNER/REPO`` or a URL)."""
+    if is_remote(repository):
+        return repository
+    parts = repository.split("/")
+    if len(parts) == 2 and all(parts):
+        return f"https://{os.environ.get('GH_HOST') or 'github.com'}/{repository}.git"
+    if len(parts) == 3 and all(parts):
+        return f"https://{repository}.git"
+    return None  # A bare REPO name means the authenticated user's; only gh knows who that is
+
+
+def _references(args: List[str]) -> bool:
+    return any(arg.partition("=")[0] in ("--reference", "--reference-if-able", "--shared", "-s") for arg in args)
+
+
+def rewrite_clone(cmd_args: List[str], root: Optional[str] = None,
+                  max_age: Optional[float] = None) -> Tuple[List[str], Dict[str, Any]]:
+    """Point a ``git clone`` or ``gh repo clone`` command line at the mirror of its remote.
+
+    Returns the new command line and a report for the response. The report
+    has ``skipped`` (and the unchanged command line) when the command is not
+    a clone of a remote or already names a reference, and ``error`` when
+    the mirror could not be updated. The clone then runs against the
+    remote alone, or against the mirror as it was.
+    """
+    if cmd_args[1:2] == ["clone"]:
+        url = clone_source(cmd_args[2:])
+        at = 2
+    elif cmd_args[1:3] == ["repo", "clone"] and len(cmd_args) > 3:
+        url = gh_clone_url(cmd_args[3])
+        # gh passes the arguments after "--" on to git clone
+        at = cmd_args.index("--") + 1 if "--" in cmd_args else len(cmd_args)
+    else:
+        return cmd_args, {"skipped": "not a clone"}
+    if url is None or not is_remote(url):
+        return cmd_args, {"skipped": "not a remote repository"}
+    if _references(cmd_args[at:]):
+        return cmd_args, {"skipped": "the clone already names a reference"}
+    try:
+        report = ensure(url, root, max_age)
+    except (MirrorError, OSError, subprocess.TimeoutExpired) as e:
+        path = mirror_path(url, root)
+        report = {"path": path, "url": url, "error": str(e)}
+        if not os.path.isdir(path):
+            return cmd_args, report
+    args = list(cmd_args)
+    if cmd_args[0] == "gh" and "--" not in cmd_args:
+        args.append("--")
+        at += 1
+    return _insert_reference(args, at, report["path"]), report
+
+
+def list_mirrors(root: Optional[str] = None) -> List[Dict[str, Any]]:
+    """The mirrors in the cache, with their URL and age in seconds."""
+    root = root or mirror_root()
+    entries = []
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else ():
+        path = os.path.join(root, name)
+        if not name.endswith(".git") or not os.path.isdir(path):
+            continue
+        result = process.run_process(["git", "-C", path, "config", "--get", "remote.origin.url"], timeout=30)
+        entries.append({"path": path, "url": result.stdout.strip() or None, "age_seconds": _age(path)})
+    return entries
+
+
+def refresh_all(root: Optional[str] = None, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Refresh every stale mirror in the cache; returns one report per mirror."""
+    reports = []
+    for entry in list_mirrors(root):
+        if entry["url"] is None:
+            continue
+        try:
+            reports.append(ensure(entry["url"], root, max_age))
+        except (MirrorError, OSError, subprocess.TimeoutExpired) as e:
+            reports.append({"path": entry["path"], "url": entry["url"], "error": str(e)})
+    return reports
+
+
+def manage(args: Dict[str, Any]) -> Dict[str, Any]:
+    """List the mirror cache for the plugin CLI, refreshing stale mirrors first with ``args["refresh"]``.
+
+    ``args["max_age"]`` overrides ``SMCP_MIRROR_REFRESH_SECONDS``; 0
+    refreshes every mirror.
+    """
+    start = time.perf_counter()
+    response: Dict[str, Any] = {"success": True}
+    try:
+        max_age = float(args["max_age"]) if args.get("max_age") is not None else None
+        if args.get("refresh"):
+            response["refreshed"] = refresh_all(max_age=max_age)
+        response["result"] = list_mirrors()
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        return {"success": False, "error": str(e), "error_code": "MIRROR_FAILED"}
+    response["root"] = mirror_root()
+    response["elapsed"] = time.perf_counter() - start
+    return response
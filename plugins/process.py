@@ -0,0 +1,201 @@
+"""
+Child process execution shared by the gh and git plugins.
+
+``run_process`` is a drop-in replacement for
+``subprocess.run(capture_output=True, text=True)`` that reports the spawn and
+wait phases of the child separately to a ``PhaseTimer`` and, on platforms
+with ``os.wait4``, records the resources the child consumed.
+
+``StreamingProcess`` runs a command whose output is consumed as it is
+produced (structured parsers that must not buffer a whole ``git status`` or
+``ls-files`` of a large tree): stdout is read in binary chunks, stderr is
+drained on a background thread so the child can never block on a full pipe,
+and a watchdog kills the child when the timeout expires.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+from typing import Dict, Any, Iterator, List, Optional
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+_MAXRSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+class _AccountingPopen(subprocess.Popen):
+    """Popen that reaps its child with ``os.wait4`` to keep its rusage.
+
+    ``Popen.wait()`` funnels every blocking and polling wait through
+    ``_try_wait``, so overriding it is enough to capture the rusage of the
+    child (including any grandchildren it waited for) at reap time.
+    """
+
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        try:
+            (pid, sts, rusage) = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # Same fallback as Popen: the child was reaped elsewhere
+            return (self.pid, 0)
+        if pid == self.pid:
+            self.rusage = rusage
+        return (pid, sts)
+
+
+_Popen = _AccountingPopen if hasattr(os, "wait4") else subprocess.Popen
+
+
+def rusage_to_dict(rusage) -> Dict[str, Any]:
+    """Convert a ``resource.struct_rusage`` into the response ``resources`` object."""
+    return {
+        "user_cpu_s": rusage.ru_utime,
+        "system_cpu_s": rusage.ru_stime,
+        "max_rss_bytes": rusage.ru_maxrss * _MAXRSS_SCALE,
+        "block_input_ops": rusage.ru_inblock,
+        "block_output_ops": rusage.ru_oublock,
+        "voluntary_ctx_switches": rusage.ru_nvcsw,
+        "involuntary_ctx_switches": rusage.ru_nivcsw
+    }
+
+
+def _resources(proc: subprocess.Popen) -> Optional[Dict[str, Any]]:
+    rusage = getattr(proc, "rusage", None)
+    return rusage_to_dict(rusage) if rusage is not None else None
+
+
+def run_process(cmd_args: List[str], timeout: float = 30, cwd: Optional[str] = None,
+                timer=None, env: Optional[Dict[str, str]] = None,
+                input: Optional[str] = None) -> subprocess.CompletedProcess:
+    """Run a command to completion, capturing its text output.
+
+    ``input``, when given, is written to the child's stdin, which is then
+    closed; otherwise the child inherits stdin.
+
+    The returned ``CompletedProcess`` carries a ``resources`` attribute with
+    the child's rusage (``None`` where ``os.wait4`` is unavailable).
+
+    Raises ``subprocess.TimeoutExpired`` (after killing the child) when the
+    command does not finish within ``timeout`` seconds, like ``subprocess.run``.
+    The exception carries the same ``resources`` attribute.
+    """
+    with _Popen(
+        cmd_args,
+        stdin=subprocess.PIPE if input is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        cwd=cwd,
+        env=env
+    ) as proc:
+        if timer is not None:
+            timer.mark("spawn")
+        try:
+            stdout, stderr = proc.communicate(input=input, timeout=timeout)
+        except subprocess.TimeoutExpired as exc:
+            proc.kill()
+            exc.output, exc.stderr = proc.communicate()
+            exc.resources = _resources(proc)
+            if timer is not None:
+                timer.mark("wait")
+            raise
+        except BaseException:
+            proc.kill()
+            raise
+        if timer is not None:
+            timer.mark("wait")
+    completed = subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+    completed.resources = _resources(proc)
+    return completed
+
+
+class StreamingProcess:
+    """A child process whose stdout is iterated in binary chunks.
+
+    Use as a context manager: iterate the object for stdout chunks, call
+    ``stop()`` to kill the child once enough output has been read, then
+    ``wait()`` for the ``CompletedProcess`` (``stdout`` is ``None``; the
+    number of bytes read is in ``stdout_bytes`` and the early stop in
+    ``stopped``). Leaving the block without ``wait()`` kills and reaps the
+    child. ``wait()`` raises ``subprocess.TimeoutExpired``, with the same
+    ``resources`` attribute as ``run_process``, when the watchdog fired.
+    ``stdin`` is an open file the child reads its input from.
+    """
+
+    def __init__(self, cmd_args: List[str], timeout: float = 30, cwd: Optional[str] = None,
+                 timer=None, env: Optional[Dict[str, str]] = None, chunk_size: int = 65536, stdin=None):
+        self.args = cmd_args
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.stdout_bytes = 0
+        self.stopped = False
+        self.timed_out = False
+        self._timer = timer
+        self._stderr = b""
+        self._proc = _Popen(cmd_args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
+        if timer is not None:
+            timer.mark("spawn")
+        self._drain = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._drain.start()
+        self._watchdog = threading.Timer(timeout, self._expire)
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def _drain_stderr(self) -> None:
+        self._stderr = self._proc.stderr.read()
+
+    def _expire(self) -> None:
+        if self._proc.poll() is None:
+            self.timed_out = True
+            self._proc.kill()
+
+    def __iter__(self) -> Iterator[bytes]:
+        read = self._proc.stdout.read1
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                return
+            self.stdout_bytes += len(chunk)
+            yield chunk
+
+    def stop(self) -> None:
+        """Kill the child because the caller has read all it needs."""
+        if self._proc.poll() is None:
+            self.stopped = True
+            self._proc.kill()
+
+    def _reap(self) -> None:
+        self._proc.wait()
+        self._watchdog.cancel()
+        self._drain.join()
+        self._proc.stdout.close()
+        self._proc.stderr.close()
+
+    def wait(self) -> subprocess.CompletedProcess:
+        """Reap the child and return its exit status and stderr."""
+        if not self.stopped and not self.timed_out:
+            # Let the child finish writing output the caller did not read
+            for _ in self:
+                pass
+        self._reap()
+        if self._timer is not None:
+            self._timer.mark("wait")
+        stderr = self._stderr.decode("utf-8", "replace")
+        if self.timed_out:
+            exc = subprocess.TimeoutExpired(self.args, self.timeout, stderr=stderr)
+            exc.resources = _resources(self._proc)
+            raise exc
+        completed = subprocess.CompletedProcess(self.args, self._proc.returncode, None, stderr)
+        completed.resources = _resources(self._proc)
+        completed.stdout_bytes = self.stdout_bytes
+        completed.stopped = self.stopped
+        return completed
+
+    def __enter__(self) -> "StreamingProcess":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._proc.returncode is None:
+            self._proc.kill()
+            self._reap()
@@ -0,0 +1,69 @@
+"""
+Telemetry helpers shared by the gh and git plugins.
+
+Provides a cheap per-phase timer built on ``time.perf_counter_ns`` so every
+response can report where its latency went (setup, spawn, wait, classify,
+serialize and, for batched calls, queue wait).
+"""
+
+import json
+import time
+from typing import Dict, Any, Optional
+
+_perf_counter_ns = time.perf_counter_ns
+
+
+class PhaseTimer:
+    """Accumulate monotonic per-phase durations for a single plugin call.
+
+    Each call to ``mark(phase)`` charges the time elapsed since the previous
+    mark to ``phase``. Recording a phase costs two dict operations and one
+    ``perf_counter_ns`` call, so the timer is always on.
+    """
+
+    __slots__ = ("start_ns", "last_ns", "phases")
+
+    def __init__(self, enqueued_ns: Optional[int] = None):
+        now = _perf_counter_ns()
+        self.last_ns = now
+        self.phases: Dict[str, int] = {}
+        if enqueued_ns is not None and enqueued_ns <= now:
+            # Time spent waiting in a batching caller's queue before run() started
+            self.start_ns = enqueued_ns
+            self.phases["queue_wait"] = now - enqueued_ns
+        else:
+            self.start_ns = now
+
+    def mark(self, phase: str) -> int:
+        """Close the current phase and charge its duration to ``phase``."""
+        now = _perf_counter_ns()
+        self.phases[phase] = self.phases.get(phase, 0) + (now - self.last_ns)
+        self.last_ns = now
+        return now
+
+    def add(self, phase: str, duration_ns: int) -> None:
+        """Charge an externally measured duration to ``phase``."""
+        self.phases[phase] = self.phases.get(phase, 0) + duration_ns
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return phase durations in nanoseconds, plus the total so far."""
+        timings = {f"{phase}_ns": duration for phase, duration in self.phases.items()}
+        timings["total_ns"] = self.last_ns - self.start_ns
+        return timings
+
+
+def dumps(response: Any) -> str:
+    """Serialize a plugin response, recording the serialization cost in its timings.
+
+    The response body is encoded without ``timings`` first so that the
+    ``serialize_ns`` figure can be spliced in afterwards without encoding the
+    payload twice.
+    """
+    timings = response.get("timings") if isinstance(response, dict) else None
+    if not isinstance(timings, dict):
+        return json.dumps(response)
+    start = _perf_counter_ns()
+    body = json.dumps({key: value for key, value in response.items() if key != "timings"})
+    timings["serialize_ns"] = _perf_counter_ns() - start
+    separator = ", " if len(body) > 2 else ""
+    return body[:-1] + separator + '"timings": ' + json.dumps(timings) + "}"
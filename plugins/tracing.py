@@ -0,0 +1,191 @@
+"""
+Optional span tracing for gh and git plugin calls.
+
+When ``SMCP_TRACE_FILE`` is set, every ``run()`` call produces one span that
+is appended to that file as a JSON line in the OTLP/JSON
+``ExportTraceServiceRequest`` shape, so it can be loaded by any OTLP-aware
+tool without a network collector.
+
+Parent context is propagated through the request dict: pass a W3C
+``traceparent`` string in ``args["traceparent"]`` and the span becomes its
+child. Every traced response returns ``trace`` with the new span's context so
+callers can pass it on to the calls they make next.
+
+Sampling follows the parent's sampled flag; root spans are sampled by trace
+id with probability ``SMCP_TRACE_SAMPLE_RATIO`` (default 1.0). When tracing
+is disabled the cost per call is a single environment lookup.
+"""
+
+import json
+import os
+import re
+import time
+from typing import Dict, Any, Optional
+
+from plugins import metrics
+
+TRACE_FILE_ENV = "SMCP_TRACE_FILE"
+SAMPLE_RATIO_ENV = "SMCP_TRACE_SAMPLE_RATIO"
+SERVICE_NAME_ENV = "OTEL_SERVICE_NAME"
+DEFAULT_SERVICE_NAME = "smcp-plugin-github"
+
+# Longest command line recorded as a span attribute
+MAX_COMMAND_LENGTH = 256
+
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_UNSET = 0
+STATUS_CODE_ERROR = 2
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """An in-flight span for one plugin call."""
+
+    __slots__ = ("tool", "trace_id", "span_id", "parent_span_id", "sampled", "start_unix_ns", "path")
+
+    def __init__(self, tool: str, trace_id: str, span_id: str, parent_span_id: Optional[str],
+                 sampled: bool, path: str):
+        self.tool = tool
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.start_unix_ns = time.time_ns()
+        self.path = path
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def context(self) -> Dict[str, Any]:
+        """Return the context to hand to child calls."""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "sampled": self.sampled,
+            "traceparent": self.traceparent
+        }
+
+
+def parse_traceparent(value: Any) -> Optional[Dict[str, Any]]:
+    """Parse a W3C ``traceparent`` header value; returns None if malformed."""
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return {"trace_id": trace_id, "span_id": span_id, "sampled": bool(int(flags, 16) & 1)}
+
+
+def _sample_ratio() -> float:
+    try:
+        return min(max(float(os.environ.get(SAMPLE_RATIO_ENV, "1")), 0.0), 1.0)
+    except ValueError:
+        return 1.0
+
+
+def _should_sample(trace_id: str, ratio: float) -> bool:
+    # Same rule as OpenTelemetry's TraceIdRatioBased sampler: compare the
+    # low 64 bits of the trace id against the ratio
+    return int(trace_id[16:], 16) < int(ratio * (1 << 64))
+
+
+def start_span(tool: str, args: Optional[Dict[str, Any]]) -> Optional[Span]:
+    """Start a span for a call, or return None when tracing is disabled."""
+    path = os.environ.get(TRACE_FILE_ENV)
+    if not path:
+        return None
+    parent = parse_traceparent(args.get("traceparent")) if isinstance(args, dict) else None
+    span_id = os.urandom(8).hex()
+    if parent is not None:
+        return Span(tool, parent["trace_id"], span_id, parent["span_id"], parent["sampled"], path)
+    trace_id = os.urandom(16).hex()
+    return Span(tool, trace_id, span_id, None, _should_sample(trace_id, _sample_ratio()), path)
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def build_span(span: Span, response: Dict[str, Any], cwd: Optional[str], end_unix_ns: int) -> Dict[str, Any]:
+    """Build the OTLP/JSON representation of a finished span."""
+    command = response.get("command") or span.tool
+    subcommand = metrics.subcommand_of(span.tool, command)
+    attributes = [
+        _attribute("smcp.tool", span.tool),
+        _attribute("smcp.subcommand", subcommand),
+        _attribute("process.command_line", command[:MAX_COMMAND_LENGTH]),
+        _attribute("process.command_args.count", len(command.split())),
+        _attribute("smcp.success", bool(response.get("success"))),
+        _attribute("smcp.bytes_out", metrics.bytes_out(response))
+    ]
+    if cwd:
+        attributes.append(_attribute("process.working_directory", cwd))
+    if "return_code" in response:
+        attributes.append(_attribute("process.exit_code", response["return_code"]))
+    for flag in ("idempotent", "cached"):
+        if response.get(flag):
+            attributes.append(_attribute(f"smcp.{flag}", True))
+    for phase, duration in (response.get("timings") or {}).items():
+        attributes.append(_attribute(f"smcp.timing.{phase}", duration))
+    error_code = response.get("error_code")
+    if error_code:
+        attributes.append(_attribute("smcp.error_code", error_code))
+        status = {"code": STATUS_CODE_ERROR, "message": error_code}
+    else:
+        status = {"code": STATUS_CODE_UNSET}
+
+    record = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": f"{span.tool} {subcommand}",
+        "kind": SPAN_KIND_CLIENT,
+        "startTimeUnixNano": str(span.start_unix_ns),
+        "endTimeUnixNano": str(end_unix_ns),
+        "attributes": attributes,
+        "status": status
+    }
+    if span.parent_span_id:
+        record["parentSpanId"] = span.parent_span_id
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                _attribute("service.name", os.environ.get(SERVICE_NAME_ENV) or DEFAULT_SERVICE_NAME),
+                _attribute("process.pid", os.getpid())
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "smcp.plugins", "version": "1.0.0"},
+                "spans": [record]
+            }]
+        }]
+    }
+
+
+def finish_span(span: Optional[Span], response: Dict[str, Any], cwd: Optional[str] = None) -> None:
+    """End a span: attach its context to the response and export it if sampled."""
+    if span is None:
+        return
+    response["trace"] = span.context()
+    if not span.sampled:
+        return
+    line = json.dumps(build_span(span, response, cwd, time.time_ns())) + "\n"
+    try:
+        # One O_APPEND write per span keeps lines from concurrent processes intact
+        fd = os.open(span.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+    except OSError:
+        pass  # Tracing must never fail the call it observes
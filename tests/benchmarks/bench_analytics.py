@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark columnar commit analytics against parsing ``git log --numstat`` text.
+
+Builds a throwaway repository with ``--commits`` commits by ``--authors``
+authors, each changing ``--files-per-commit`` of ``--paths`` files (written
+with ``git fast-import``). Then computes per-author churn and the ten hottest
+paths two ways: by capturing ``git log --numstat`` text and folding it into
+dicts, and with ``plugins.git.analytics.History``. Also times saving the
+columns and mapping them back. Reports wall time and peak Python heap
+(``tracemalloc``, measured in a second run) of each step, and how long
+``git log`` itself takes to produce the output.
+
+Usage: python tests/benchmarks/bench_analytics.py [--commits N] [--paths N] [--authors N] [--files-per-commit N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git.analytics import History  # noqa: E402
+from bench_commitgraph import git  # noqa: E402
+
+
+def build_history(path, commits, paths, authors, files_per_commit):
+    git(path, "init", "-q", "-b", "main")
+    stream = []
+    for i in range(commits):
+        author = f"dev{i * 7919 % authors:04d} <dev{i * 7919 % authors:04d}@example.com>"
+        stream.append(f"commit refs/heads/main\nauthor {author} {1_600_000_000 + i * 600} +0000\n"
+                      f"committer {author} {1_600_000_000 + i * 600} +0000\ndata 4\nc{i % 10}{i % 7}\n")
+        for j in range(files_per_commit):
+            number = (i * 31 + j * 17) * (j + 1) % paths
+            body = f"{i}\n" * (1 + (i + j) % 5)
+            stream.append(f"M 644 inline src/m{number // 100:03d}/f{number:05d}.py\ndata {len(body)}\n{body}")
+    git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+
+
+def measure(func):
+    # Timed untraced: tracemalloc slows per-object Python code several times over
+    start = time.perf_counter()
+    value = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return value, {"seconds": round(elapsed, 4), "peak_heap_bytes": peak}
+
+
+def text_report(path):
+    text = subprocess.run(["git", "log", "--numstat", "-M", "--format=@%H %an <%ae> %at"], cwd=path,
+                          capture_output=True, text=True, check=True).stdout
+    churn, hot = defaultdict(int), defaultdict(int)
+    author = None
+    for line in text.splitlines():
+        if line.startswith("@"):
+            author = line.split(" ", 1)[1].rsplit(" ", 1)[0]
+        elif line:
+            added, deleted, name = line.split("\t", 2)
+            if added != "-":
+                churn[author] += int(added) + int(deleted)
+            hot[name] += 1
+    return dict(churn), sorted(hot.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=100000)
+    parser.add_argument("--paths", type=int, default=20000)
+    parser.add_argument("--authors", type=int, default=500)
+    parser.add_argument("--files-per-commit", type=int, default=3)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_history(path, options.commits, options.paths, options.authors, options.files_per_commit)
+        start = time.perf_counter()
+        git(path, "log", "-z", "--numstat", "-M", "--format=%x01%H%x00%an <%ae>%x00%at")
+        git_seconds = round(time.perf_counter() - start, 4)
+        expected, text = measure(lambda: text_report(path))
+        history, load = measure(lambda: History.load(path))
+        churn, group = measure(lambda: history.group_by("author", "churn"))
+        hot, top = measure(lambda: history.top(10, "path"))
+        assert (churn, hot) == expected
+        target = os.path.join(path, "history.cols")
+        _, save = measure(lambda: history.save(target))
+        reopened, reopen = measure(lambda: History.open(target))
+        with reopened:
+            assert reopened.top(10, "path") == hot
+        report = {
+            "commits": len(history),
+            "changes": history.change_count,
+            "file_bytes": os.path.getsize(target),
+            "git_log_seconds": git_seconds,
+            "text_and_dicts": text,
+            "columnar_load": load,
+            "group_by_author_churn": group,
+            "top_10_paths": top,
+            "save": save,
+            "open": reopen,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark streamed structured blame against a plain blame run.
+
+Builds a throwaway repository with one ``--lines``-line file edited by
+``--commits`` commits, each rewriting ``--lines-per-commit`` scattered lines
+(written with ``git fast-import``). Then times ``git blame --porcelain``
+through the plugin (text handed back when git exits), the structured
+``--incremental`` mode (time to the first record and to the last) and a
+structured blame of a 20-line ``lines`` range near the end of the file,
+which stops git once those lines are attributed.
+
+Usage: python tests/benchmarks/bench_blame.py [--lines N] [--commits N] [--lines-per-commit N] [--runs N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli  # noqa: E402
+from bench_commitgraph import git, timed  # noqa: E402
+
+
+def build_history(path, lines, commits, lines_per_commit):
+    git(path, "init", "-q", "-b", "main")
+    content = [f"line {number}\n" for number in range(lines)]
+    stream = []
+    for i in range(commits):
+        for j in range(lines_per_commit):
+            line = (i * 7919 + j * 104729) % lines
+            content[line] = f"commit {i} line {line}\n"
+        body = "".join(content).encode()
+        stream.append(f"commit refs/heads/main\ncommitter bench <bench@example.com> {1_600_000_000 + i * 60} +0000\n"
+                      f"data 8\nc{i:06d}\nM 644 inline big.txt\ndata {len(body)}\n".encode() + body + b"\n")
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+
+
+def ms(nanoseconds):
+    return round(nanoseconds / 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--commits", type=int, default=2000)
+    parser.add_argument("--lines-per-commit", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_history(path, options.lines, options.commits, options.lines_per_commit)
+        text = {"command": "blame", "args": ["--porcelain", "HEAD", "--", "big.txt"]}
+        streamed = {"command": "blame", "args": ["HEAD", "--", "big.txt"], "structured": True, "limit": 10 ** 9}
+        start = options.lines - 100
+        ranged = dict(streamed, lines=f"{start},{start + 19}")
+        text_seconds = timed(lambda: cli.run(text, cwd=path), options.runs)
+        response = cli.run(streamed, cwd=path)
+        timings = response["timings"]
+        report = {
+            "lines": options.lines,
+            "commits": options.commits,
+            "ranges": response["record_count"],
+            "commits_described": sum(1 for record in response["result"] if "commit" in record),
+            "text_blame_ms": round(text_seconds * 1000, 2),
+            "structured_first_record_ms": ms(timings["setup_ns"] + timings["spawn_ns"] + timings["first_record_ns"]),
+            "structured_total_ms": round(timed(lambda: cli.run(streamed, cwd=path), options.runs) * 1000, 2),
+            "range_of_20_lines_ms": round(timed(lambda: cli.run(ranged, cwd=path), options.runs) * 1000, 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark the in-process commit-graph queries against the git CLI.
+
+Builds a throwaway repository with ``--commits`` commits on a main line
+plus a side branch merged back every ``--merge-every`` commits (written
+with ``git fast-import``), writes a commit-graph, and times
+``merge-base --is-ancestor``, ``merge-base`` and ``rev-list --count`` as
+git subprocesses against ``plugins.git.fastpath`` (warm: graph already
+mapped). Queries the fast path declines are reported as ``null``.
+
+Usage: python tests/benchmarks/bench_commitgraph.py [--commits N] [--merge-every N] [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import fastpath  # noqa: E402
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@example.com",
+               GIT_COMMITTER_NAME="bench", GIT_COMMITTER_EMAIL="bench@example.com")
+
+
+def git(cwd, *args, stdin=None):
+    return subprocess.run(["git"] + list(args), cwd=cwd, input=stdin, capture_output=True, check=True,
+                          env=GIT_ENV).stdout
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def build_history(path, commits, merge_every):
+    git(path, "init", "-q", "-b", "main")
+    stream = []
+    mark = 0
+    side = None
+    for i in range(commits):
+        mark += 1
+        stream.append(f"commit refs/heads/main\nmark :{mark}\n"
+                      f"committer bench <bench@example.com> {1_600_000_000 + i * 60} +0000\n"
+                      f"data 8\nc{i:06d}\n")
+        if mark > 1:
+            stream.append(f"from :{mark - 1 if side is None or i % merge_every else side}\n")
+            if side is not None and i % merge_every == 0:
+                stream.append(f"merge :{mark - 1}\n")
+        if i % merge_every == merge_every // 2:
+            mark += 1
+            stream.append(f"commit refs/heads/side\nmark :{mark}\n"
+                          f"committer bench <bench@example.com> {1_600_000_000 + i * 60 + 30} +0000\n"
+                          f"data 5\nside\nfrom :{mark - 1}\n")
+            side = mark
+    git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+    git(path, "commit-graph", "write", "--reachable")
+
+
+def compare(path, argv, runs):
+    fast = fastpath.fast_read(["git"] + argv, path)
+    expected = subprocess.run(["git"] + argv, cwd=path, capture_output=True, text=True)
+    if fast is not None:
+        assert (fast.returncode, fast.stdout) == (expected.returncode, expected.stdout), argv
+    return {
+        "command": " ".join(["git"] + argv),
+        "git_s": timed(lambda: subprocess.run(["git"] + argv, cwd=path, capture_output=True), runs),
+        "in_process_s": None if fast is None else timed(lambda: fastpath.fast_read(["git"] + argv, path), runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=50000)
+    parser.add_argument("--merge-every", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_history(path, options.commits, options.merge_every)
+        queries = [
+            ["merge-base", "--is-ancestor", "main~10", "main"],
+            ["merge-base", "--is-ancestor", "side", "main"],
+            ["merge-base", "--is-ancestor", "main", "main~10"],
+            ["merge-base", "--is-ancestor", f"main~{options.commits // 2}", "main"],
+            ["merge-base", "main", "side"],
+            ["rev-list", "--count", "main~100..main"],
+            ["rev-list", "--count", "side..main"],
+            ["rev-list", "--count", "main"],
+        ]
+        report = {"commits": options.commits, "queries": [compare(path, argv, options.runs) for argv in queries]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark diff summaries and selected patches against the plain text diff.
+
+Builds a throwaway repository with two commits (written with
+``git fast-import``): ``--files`` text files of ``--lines`` lines, each
+rewritten in full by the second commit, plus ``--binaries`` binary files of
+``--binary-bytes`` bytes that change too. Then diffs the two commits
+through the git plugin three ways: as plain text, as a structured
+``summary`` of every file, and as the capped patches of ``--select``
+chosen files. Reports wall time, the peak Python heap (``tracemalloc``) of
+each ``run()`` plus the JSON serialization of its response, and the
+response size.
+
+Usage: python tests/benchmarks/bench_diff.py [--files N] [--lines N] [--binaries N] [--binary-bytes N] [--select N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from bench_listing import git, measure  # noqa: E402
+
+
+def blob(path, data):
+    return f"M 644 inline {path}\ndata {len(data)}\n".encode() + data + b"\n"
+
+
+def build_refactor(path, files, lines, binaries, binary_bytes):
+    git(path, "init", "-q", "-b", "main")
+    stream = []
+    for version in range(2):
+        stream.append(f"commit refs/heads/main\ncommitter bench <bench@example.com> {1600000000 + version} +0000\n"
+                      f"data 2\nv{version}\n".encode())
+        for i in range(files):
+            text = "".join(f"value_{version}_{i}_{n} = compute({n}, {version})\n" for n in range(lines))
+            stream.append(blob(f"src/pkg{i // 100:03d}/module{i:05d}.py", text.encode()))
+        for i in range(binaries):
+            stream.append(blob(f"assets/blob{i:03d}.bin", bytes((n * (version + 3) + i) % 256
+                                                               for n in range(binary_bytes))))
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--binaries", type=int, default=20)
+    parser.add_argument("--binary-bytes", type=int, default=1 << 20)
+    parser.add_argument("--select", type=int, default=5)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_refactor(path, options.files, options.lines, options.binaries, options.binary_bytes)
+        revisions = ["main~1", "main"]
+        selected = [f"src/pkg{i // 100:03d}/module{i:05d}.py" for i in range(options.select)]
+        report = {
+            "files": options.files + options.binaries,
+            "patch_bytes": len(git(path, "diff", *revisions)),
+            "plain": measure(path, {"command": "diff", "args": revisions}),
+            "summary": measure(path, {"command": "diff", "args": revisions, "structured": True, "summary": True,
+                                      "limit": 10 ** 9}),
+            "selected_patches": measure(path, {"command": "diff", "args": revisions, "structured": True,
+                                               "paths": selected, "max_bytes": 65536}),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark one git command across many repositories.
+
+Builds ``--repos`` throwaway repositories of ``--files`` files each with
+``git fast-import``, plus one of ``--huge-files`` files in the middle of
+the list, all checked out under one root. For ``status --porcelain`` and
+``log --since``, it times:
+
+- one plugin CLI process per repository, one after another (what callers do
+  without a fleet mode);
+- the ``fleet`` command's ``stream()`` with one job;
+- ``--jobs`` threads that each take a fixed, contiguous share of the
+  repositories (a static split, so the share holding the huge repository
+  finishes last);
+- ``stream()`` with ``--jobs`` jobs (work-stealing, heaviest first).
+
+Usage: python tests/benchmarks/bench_fleet.py [--repos N] [--files N] [--huge-files N] [--jobs N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli, fleet  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "plugins", "git", "cli.py")
+COMMANDS = {"status": {"command": "status", "args": ["--porcelain"]},
+            "log_since": {"command": "log", "args": ["--oneline", "--since=2020-09-01"]}}
+
+
+def build_repository(path, files):
+    os.makedirs(path)
+    git(path, "init", "-q", "-b", "main")
+    stream = ["commit refs/heads/main\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 5\nbase\n"]
+    for n in range(files):
+        data = f"file {n}\n"
+        stream.append(f"M 100644 inline src/pkg{n // 500:03d}/file{n:06d}.txt\ndata {len(data)}\n{data}\n")
+    git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+    git(path, "reset", "-q", "--hard", "main")
+
+
+def separate_processes(paths, args):
+    for path in paths:
+        command = " ".join([args["command"]] + args["args"])
+        subprocess.run([sys.executable, CLI, "run", "--cwd", path, "--command", command], capture_output=True,
+                       check=True)
+
+
+def static_split(paths, args, jobs):
+    size = -(-len(paths) // jobs)
+
+    def work(share):
+        for path in share:
+            assert cli.run(dict(args), cwd=path)["success"]
+    threads = [threading.Thread(target=work, args=(paths[n:n + size],)) for n in range(0, len(paths), size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return round(time.perf_counter() - start, 4), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repos", type=int, default=100)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--huge-files", type=int, default=100000, dest="huge_files")
+    parser.add_argument("--jobs", type=int, default=8)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        for n in range(options.repos):
+            build_repository(os.path.join(root, f"repo{n:04d}"), options.files)
+        build_repository(os.path.join(root, f"repo{options.repos // 2:04d}-huge"), options.huge_files)
+        paths = fleet.discover(root)
+        report = {"repositories": len(paths), "jobs": options.jobs, "commands": {}}
+        for name, args in COMMANDS.items():
+            timings = report["commands"][name] = {}
+            timings["separate_processes"], _ = timed(lambda: separate_processes(paths, args))
+            timings["fleet_1_job"], _ = timed(lambda: list(fleet.stream(paths, args, cli.run, jobs=1)))
+            timings["static_split"], _ = timed(lambda: static_split(paths, args, options.jobs))
+            timings["fleet"], records = timed(lambda: list(fleet.stream(paths, args, cli.run, jobs=options.jobs)))
+            summary = fleet.summarize(records, slowest=3)
+            assert summary["failed"] == 0, summary
+            timings["stolen"] = summary["stolen"]
+            timings["slowest"] = [{"path": os.path.basename(entry["path"]), "seconds": round(entry["seconds"], 4)}
+                                  for entry in summary["slowest"]]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark structured git grep against the plain text search.
+
+Builds a throwaway repository whose index holds ``--files`` generated source
+files (written with ``git fast-import`` and ``git read-tree``, no
+worktree), with a word on every ``--every``-th line of each file. Then
+greps the index for that word through the git plugin as plain text and as
+structured records of every match, and times how long a structured call
+with a ``--limit`` of matches takes to return, since git is killed as soon
+as the page is full.
+
+Usage: python tests/benchmarks/bench_grep.py [--files N] [--lines N] [--every N] [--limit N] [--runs N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli  # noqa: E402
+from bench_listing import git  # noqa: E402
+from bench_commitgraph import timed  # noqa: E402
+
+
+def build_sources(path, files, lines, every):
+    git(path, "init", "-q", "-b", "main")
+    stream = [b"commit refs/heads/main\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 5\nbulk\n"]
+    for i in range(files):
+        body = "".join(f"    total += needle_{n}\n" if n % every == 0 else f"    total += value_{i}_{n}\n"
+                       for n in range(lines)).encode()
+        stream.append(f"M 644 inline pkg{i // 1000:04d}/module{i:07d}.py\ndata {len(body)}\n".encode() + body + b"\n")
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+    git(path, "read-tree", "main")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--every", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_sources(path, options.files, options.lines, options.every)
+        args = ["--cached", "needle"]
+        everything = cli.run({"command": "grep", "args": args, "structured": True, "limit": 10 ** 9}, cwd=path)
+        page = {"command": "grep", "args": args, "structured": True, "limit": options.limit}
+        report = {
+            "files": options.files,
+            "matches": everything["record_count"],
+            "plain_seconds": round(timed(lambda: cli.run({"command": "grep", "args": args}, cwd=path),
+                                         options.runs), 4),
+            "structured_all_seconds": round(timed(lambda: cli.run(dict(page, limit=10 ** 9), cwd=path),
+                                                  options.runs), 4),
+            "structured_limit_seconds": round(timed(lambda: cli.run(page, cwd=path), options.runs), 4),
+            "threads": cli.structured._cpu_count(),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the in-process index reader against the git CLI.
+
+Builds a throwaway repository whose index holds ``--entries`` paths (no
+worktree files are needed for listings) and times ``git ls-files`` as a
+subprocess against ``plugins.git.index`` for each index version, cold
+(fresh parse) and warm (cached ``Index``). A second, smaller repository
+with ``--worktree-files`` real files times ``git diff --quiet`` against
+``stat_check``.
+
+Usage: python tests/benchmarks/bench_index.py [--entries N] [--worktree-files N] [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import index, repo  # noqa: E402
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@example.com",
+               GIT_COMMITTER_NAME="bench", GIT_COMMITTER_EMAIL="bench@example.com")
+
+
+def git(cwd, *args, stdin=None):
+    return subprocess.run(["git"] + list(args), cwd=cwd, input=stdin, capture_output=True, check=True,
+                          env=GIT_ENV).stdout
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def bench_listing(path, entries, runs):
+    git(path, "init", "-q")
+    blob = git(path, "hash-object", "-w", "--stdin", stdin=b"x\n").decode().strip()
+    lines = "".join(f"100644 {blob}\tdir{i % 1000:03d}/sub{i % 7}/file{i:07d}.txt\n" for i in range(entries))
+    git(path, "update-index", "--index-info", stdin=lines.encode())
+    results = []
+    for version in ("2", "3", "4"):
+        git(path, "update-index", "--index-version", version)
+        expected = git(path, "ls-files").splitlines()
+
+        def cold():
+            repository = repo.discover(path)
+            repository._cache.pop("index", None)
+            return list(index.ls_files(repository))
+        warm_repo = repo.discover(path)
+        assert list(index.ls_files(warm_repo)) == expected
+        results.append({
+            "index_version": int(version),
+            "entries": entries,
+            "index_bytes": os.path.getsize(os.path.join(path, ".git", "index")),
+            "git_ls_files_s": timed(lambda: git(path, "ls-files"), runs),
+            "in_process_cold_s": timed(cold, runs),
+            "in_process_warm_s": timed(lambda: list(index.ls_files(warm_repo)), runs),
+            "prefix_lookup_warm_s": timed(lambda: list(index.ls_files(warm_repo, [b"dir042/sub0"])), runs),
+        })
+    return results
+
+
+def bench_dirty_check(path, files, runs):
+    git(path, "init", "-q")
+    for i in range(files):
+        directory = os.path.join(path, f"dir{i % 100:02d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{i:06d}.txt"), "w") as handle:
+            handle.write(f"{i}\n")
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", "bench")
+    time.sleep(1.1)  # Let entries stop being racily clean
+    git(path, "update-index", "--refresh")
+    repository = repo.discover(path)
+    assert index.stat_check(repository)["clean"]
+    return {
+        "worktree_files": files,
+        "git_diff_quiet_s": timed(lambda: subprocess.run(["git", "diff", "--quiet"], cwd=path, check=True), runs),
+        "stat_check_s": timed(lambda: index.stat_check(repository), runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--worktree-files", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as listing_dir, tempfile.TemporaryDirectory() as dirty_dir:
+        report = {
+            "listing": bench_listing(listing_dir, options.entries, options.runs),
+            "dirty_check": bench_dirty_check(dirty_dir, options.worktree_files, options.runs),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
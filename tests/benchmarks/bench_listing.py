@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark structured ls-files listings against the plain text response.
+
+Builds a throwaway repository whose index holds ``--entries`` paths (written
+with ``git fast-import`` and ``git read-tree``, no worktree), then runs
+``ls-files`` through the git plugin three ways: as plain text, streamed to an
+NDJSON file, and as one ``limit``-sized page. Reports wall time and the
+peak Python heap (``tracemalloc``) of each ``run()`` plus the JSON
+serialization of its response.
+
+Usage: python tests/benchmarks/bench_listing.py [--entries N] [--limit N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins import telemetry  # noqa: E402
+from plugins.git import cli  # noqa: E402
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@example.com",
+               GIT_COMMITTER_NAME="bench", GIT_COMMITTER_EMAIL="bench@example.com")
+
+
+def git(cwd, *args, stdin=None):
+    return subprocess.run(["git"] + list(args), cwd=cwd, input=stdin, capture_output=True, check=True,
+                          env=GIT_ENV).stdout
+
+
+def build_index(path, entries):
+    git(path, "init", "-q", "-b", "main")
+    stream = ["blob\nmark :1\ndata 6\nhello\n",
+              "commit refs/heads/main\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 5\nbulk\n"]
+    for i in range(entries):
+        stream.append(f"M 100644 :1 services/svc{i // 1000:04d}/module{i // 50 % 20:02d}/file{i:07d}.py\n")
+    git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+    git(path, "read-tree", "main")
+
+
+def measure(path, args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = cli.run(args, cwd=path)
+    body = telemetry.dumps(response)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"records": response.get("record_count"), "response_bytes": len(body), "seconds": elapsed,
+            "peak_heap_bytes": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=1000)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_index(path, options.entries)
+        output = os.path.join(path, "listing.ndjson")
+        report = {
+            "entries": options.entries,
+            "plain": measure(path, {"command": "ls-files"}),
+            "ndjson_output": measure(path, {"command": "ls-files", "structured": True, "output": output}),
+            "page": measure(path, {"command": "ls-files", "structured": True, "limit": options.limit}),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent writes with and without the repository lock.
+
+Starts ``--writers`` threads that each make ``--commits`` empty commits in
+one throwaway repository, first by running ``git commit`` directly (as the
+plugin did before it took a lock), then through the git plugin, which
+serializes them under the repository's write lock. Reports how many
+commits failed (git refuses to run while another commit holds
+``index.lock``), the wall time of each run, and the lock waits the plugin
+reported, plus the uncontended cost of taking the read lock for ``log``.
+
+Usage: python tests/benchmarks/bench_locking.py [--writers N] [--commits N] [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+
+def hammer(writers, commit):
+    """Run ``commit(writer)`` from every writer thread at once; returns (failures, seconds)"""
+    failures = []
+    threads = [threading.Thread(target=lambda writer=writer: failures.extend(commit(writer)))
+               for writer in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(failures), round(time.perf_counter() - start, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--commits", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=50)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        git(path, "init", "-q", "-b", "main")
+        git(path, "config", "user.name", "bench")
+        git(path, "config", "user.email", "bench@example.com")
+        git(path, "commit", "-q", "--allow-empty", "-m", "root")
+        message = ["commit", "-q", "--allow-empty", "-m", "bench"]
+
+        def direct(writer):
+            return [1 for _ in range(options.commits)
+                    if subprocess.run(["git"] + message, cwd=path, capture_output=True).returncode != 0]
+
+        waits = []
+
+        def locked(writer):
+            responses = [cli.run({"command": "commit", "args": message[1:]}, cwd=path)
+                         for _ in range(options.commits)]
+            waits.extend(response["timings"]["lock_wait_ns"] for response in responses)
+            return [1 for response in responses if not response["success"]]
+
+        direct_failures, direct_seconds = hammer(options.writers, direct)
+        locked_failures, locked_seconds = hammer(options.writers, locked)
+        reads = [cli.run({"command": "log", "args": ["-1"]}, cwd=path)["timings"]["lock_wait_ns"]
+                 for _ in range(options.runs)]
+        report = {
+            "writers": options.writers,
+            "commits": options.writers * options.commits,
+            "unlocked_failed_commits": direct_failures,
+            "unlocked_seconds": direct_seconds,
+            "locked_failed_commits": locked_failures,
+            "locked_seconds": locked_seconds,
+            "locked_median_wait_ms": round(statistics.median(waits) / 1e6, 2),
+            "locked_max_wait_ms": round(max(waits) / 1e6, 2),
+            "uncontended_read_lock_us": round(statistics.median(reads) / 1e3, 1),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
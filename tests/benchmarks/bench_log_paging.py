@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark structured log pages deep into a history, by cursor kind.
+
+Builds a throwaway repository with ``--commits`` commits on a main line plus
+a side branch merged back every ``--merge-every`` commits (written with
+``git fast-import``), then fetches one ``--limit``-commit page of
+``git log`` through the git plugin at increasing depths. Each depth is read
+twice: with the graph cursor the plugin hands out (the walk frontier) and
+with an offset cursor (what ``--skip`` paging costs). Both cursors are
+computed from ``git rev-list --date-order --parents``.
+
+Usage: python tests/benchmarks/bench_log_paging.py [--commits N] [--merge-every N] [--limit N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli, structured  # noqa: E402
+from bench_commitgraph import build_history, git  # noqa: E402
+
+
+def graph_cursor(order, parents, depth):
+    shown = set(order[:depth])
+    frontier = [oid for oid in dict.fromkeys(p for oid in order[:depth] for p in parents[oid]) if oid not in shown]
+    return structured.encode_cursor({"kind": "log", "tips": frontier, "exclude": []})
+
+
+def page(path, cursor, limit):
+    start = time.perf_counter()
+    response = cli.run({"command": "log", "structured": True, "limit": limit, "cursor": cursor}, cwd=path)
+    elapsed = time.perf_counter() - start
+    assert response["success"] and response["record_count"] == limit, response.get("result")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=100000)
+    parser.add_argument("--merge-every", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=100)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_history(path, options.commits, options.merge_every)
+        order, parents = [], {}
+        for line in git(path, "rev-list", "--date-order", "--parents", "main").decode().splitlines():
+            oid, *rest = line.split()
+            order.append(oid)
+            parents[oid] = rest
+        results = []
+        for depth in (0, 1000, 10000, len(order) // 2, len(order) - 2 * options.limit):
+            results.append({
+                "depth": depth,
+                "graph_cursor_s": page(path, graph_cursor(order, parents, depth) if depth else None, options.limit),
+                "offset_cursor_s": page(path, structured.encode_cursor({"kind": "log", "skip": depth}),
+                                        options.limit),
+            })
+    print(json.dumps({"commits": len(order), "limit": options.limit, "pages": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark cloning through a local mirror against cloning from the remote alone.
+
+Builds a throwaway bare repository (written with ``git fast-import``) with
+``--commits`` commits that each rewrite ``--files`` files, served as a
+``file://`` URL, and mirrors it. Then adds ``--new`` commits to the remote,
+so the mirror is behind, as it would be between refreshes. Reports the
+bytes of pack data the remote sends (from ``GIT_TRACE_PACKFILE``) and the
+wall time for a plain clone, for refreshing the stale mirror, and for a
+clone through the git plugin's ``mirror`` option, stale and fresh.
+
+Usage: python tests/benchmarks/bench_mirrors.py [--commits N] [--files N] [--new N] [--runs N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins import mirrors  # noqa: E402
+from plugins.git import cli  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+
+def add_commits(path, start, count, files):
+    """Append ``count`` commits to main, each rewriting every file with incompressible text"""
+    parent = git(path, "rev-parse", "main").strip() if start else b""
+    stream = []
+    for i in range(start, start + count):
+        stream.append(f"commit refs/heads/main\ncommitter bench <bench@example.com> {1_600_000_000 + i * 60} "
+                      f"+0000\ndata 8\nc{i:06d}\n".encode())
+        if i == start and parent:
+            stream.append(f"from {parent.decode()}\n".encode())
+        for f in range(files):
+            data = "".join(hashlib.sha1(f"{i}/{f}/{n}".encode()).hexdigest() + "\n" for n in range(50)).encode()
+            stream.append(f"M 644 inline file{f:03d}.txt\ndata {len(data)}\n".encode() + data + b"\n")
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+
+
+def traced(trace, func):
+    """Run ``func`` with git tracing received packs to ``trace``; returns (seconds, pack bytes)"""
+    if os.path.exists(trace):
+        os.remove(trace)
+    os.environ["GIT_TRACE_PACKFILE"] = trace
+    try:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    finally:
+        del os.environ["GIT_TRACE_PACKFILE"]
+    return elapsed, os.path.getsize(trace) if os.path.exists(trace) else 0
+
+
+def median_clone(root, trace, runs, func):
+    samples = []
+    for run in range(runs):
+        dest = os.path.join(root, "dest")
+        shutil.rmtree(dest, ignore_errors=True)
+        samples.append(traced(trace, lambda: func(dest)))
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--new", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        remote = os.path.join(root, "remote.git")
+        git(root, "init", "-q", "--bare", "-b", "main", remote)
+        add_commits(remote, 0, options.commits, options.files)
+        git(remote, "gc", "-q")
+        url = "file://" + remote
+        mirror_root = os.path.join(root, "mirrors")
+        trace = os.path.join(root, "pack.trace")
+        created, created_bytes = traced(trace, lambda: mirrors.ensure(url, mirror_root))
+        add_commits(remote, options.commits, options.new, options.files)
+        os.environ[mirrors.MIRROR_DIR_ENV] = mirror_root
+
+        def plain(dest):
+            # Not the bench git() helper: its environment is fixed at import, without the pack trace
+            subprocess.run(["git", "clone", "-q", url, dest], cwd=root, check=True)
+
+        def through_mirror(dest):
+            result = cli.run({"command": "clone", "args": ["-q", url, dest], "mirror": True}, cwd=root)
+            assert result["success"] and "error" not in result["mirror"], result
+
+        plain_seconds, plain_bytes = median_clone(root, trace, options.runs, plain)
+        # The mirror is --new commits behind: this clone refreshes it first, and both fetches are traced
+        os.environ[mirrors.REFRESH_SECONDS_ENV] = "0"
+        stale_seconds, stale_bytes = traced(trace, lambda: through_mirror(os.path.join(root, "stale")))
+        refresh_seconds, refresh_bytes = traced(trace, lambda: mirrors.ensure(url, mirror_root, max_age=0))
+        os.environ[mirrors.REFRESH_SECONDS_ENV] = "3600"
+        fresh_seconds, fresh_bytes = median_clone(root, trace, options.runs, through_mirror)
+        report = {
+            "commits": options.commits + options.new,
+            "files": options.files,
+            "mirror_create_seconds": round(created, 4),
+            "mirror_create_bytes": created_bytes,
+            "plain_clone_seconds": round(plain_seconds, 4),
+            "plain_clone_bytes": plain_bytes,
+            "stale_mirror_clone_seconds": round(stale_seconds, 4),
+            "stale_mirror_clone_bytes": stale_bytes,
+            "mirror_refresh_noop_seconds": round(refresh_seconds, 4),
+            "mirror_refresh_noop_bytes": refresh_bytes,
+            "fresh_mirror_clone_seconds": round(fresh_seconds, 4),
+            "fresh_mirror_clone_bytes": fresh_bytes,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
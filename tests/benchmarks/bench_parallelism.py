@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark the parallelism settings on a repository with many submodules and files.
+
+Builds throwaway bare repositories with ``git fast-import``: ``--submodules``
+submodules of ``--sub-files`` files each, and a superproject of ``--files``
+files that links all of them. For each job budget in ``--budgets``
+(``SMCP_GIT_JOBS``; 0 adds no settings, which is git's default behaviour)
+it times, through the git plugin, a ``clone --recurse-submodules`` over
+``file://``, a ``fetch --recurse-submodules=yes`` of every submodule, and
+``checkout`` and ``status`` in the superproject (medians of ``--runs``). Finally ``--concurrent``
+threads clone at once under the largest budget, and the jobs each clone was
+granted are reported, to show the budget being shared.
+
+Usage: python tests/benchmarks/bench_parallelism.py [--submodules N] [--sub-files N] [--files N] [--budgets N,N] [--runs N]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli, parallelism  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+
+def import_files(path, ref, paths, extra=b"", parent=None):
+    stream = [f"commit {ref}\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 4\nbulk\n".encode()]
+    if parent:
+        stream.append(f"from {parent}\n".encode())
+    for i, name in enumerate(paths):
+        data = f"{name} {i}\n".encode()
+        stream.append(f"M 644 inline {name}\ndata {len(data)}\n".encode() + data + b"\n")
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream) + extra)
+
+
+def build_superproject(root, submodules, sub_files, files):
+    links = []
+    for n in range(submodules):
+        sub = os.path.join(root, f"sub{n:03d}.git")
+        os.makedirs(sub)
+        git(sub, "init", "-q", "--bare", "-b", "main")
+        import_files(sub, "refs/heads/main", [f"src/file{i:05d}.txt" for i in range(sub_files)])
+        links.append((f"libs/sub{n:03d}", "file://" + sub, git(sub, "rev-parse", "main").decode().strip()))
+    superproject = os.path.join(root, "super.git")
+    os.makedirs(superproject)
+    git(superproject, "init", "-q", "--bare", "-b", "main")
+    gitmodules = "".join(f'[submodule "{name}"]\n\tpath = {name}\n\turl = {url}\n' for name, url, _ in links).encode()
+    extra = f"M 644 inline .gitmodules\ndata {len(gitmodules)}\n".encode() + gitmodules + b"\n"
+    extra += b"".join(f"M 160000 {oid} {name}\n".encode() for name, _, oid in links)
+    import_files(superproject, "refs/heads/main", [f"app/pkg{i // 500:03d}/file{i:06d}.txt" for i in range(files)],
+                 extra)
+    # A branch that rewrites a tenth of the files, for the checkout
+    import_files(superproject, "refs/heads/topic", [f"app/pkg{i // 500:03d}/file{i:06d}.txt"
+                                                    for i in range(0, files, 10)][::-1], parent="refs/heads/main")
+    return superproject
+
+
+def timed_run(args, cwd):
+    start = time.perf_counter()
+    result = cli.run(args, cwd=cwd)
+    assert result["success"], result
+    return time.perf_counter() - start, result.get("parallelism")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--submodules", type=int, default=40)
+    parser.add_argument("--sub-files", type=int, default=200, dest="sub_files")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--budgets", default=f"0,{parallelism.cpu_count()},8")
+    parser.add_argument("--concurrent", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+    budgets = [int(value) for value in options.budgets.split(",")]
+    with tempfile.TemporaryDirectory() as root:
+        # Submodules cloned from file:// URLs need the file protocol, which git restricts by default
+        config = os.path.join(root, "gitconfig")
+        with open(config, "w") as f:
+            f.write('[protocol "file"]\n\tallow = always\n')
+        os.environ["GIT_CONFIG_GLOBAL"] = config
+        os.environ[parallelism.JOBS_DIR_ENV] = os.path.join(root, "jobs")
+        superproject = build_superproject(root, options.submodules, options.sub_files, options.files)
+        report = {"submodules": options.submodules, "files": options.files + options.submodules * options.sub_files,
+                  "cpus": parallelism.cpu_count(), "budgets": {}}
+        samples = {budget: {} for budget in budgets}
+        # Budgets take turns in every round, so a cold cache or a busy moment does not favour one of them
+        for run in range(options.runs):
+            for budget in budgets:
+                os.environ[parallelism.JOBS_ENV] = str(budget)
+                dest = os.path.join(root, f"clone{budget}")
+                timings = samples[budget]
+                timings.setdefault("clone_recurse_submodules", []).append(timed_run({"command": "clone", "args": [
+                    "-q", "--recurse-submodules", "file://" + superproject, dest]}, root))
+                timings.setdefault("fetch_recurse_submodules", []).append(timed_run(
+                    {"command": "fetch", "args": ["-q", "--recurse-submodules=yes", "origin"]}, dest))
+                timings.setdefault("checkout", []).append(timed_run({"command": "checkout", "args": ["-q", "topic"]},
+                                                                    dest))
+                timings.setdefault("status", []).append(timed_run({"command": "status", "args": ["--porcelain"]},
+                                                                  dest))
+                shutil.rmtree(dest)
+        for budget, timings in samples.items():
+            report["budgets"][budget] = {name: round(statistics.median(seconds for seconds, _ in runs), 4)
+                                         for name, runs in timings.items()}
+            report["budgets"][budget]["clone_settings"] = timings["clone_recurse_submodules"][0][1]
+        os.environ[parallelism.JOBS_ENV] = str(max(budgets))
+        granted = []
+
+        def clone(n):
+            granted.append(timed_run({"command": "clone", "args": [
+                "-q", "--recurse-submodules", "file://" + superproject, os.path.join(root, f"concurrent{n}")]},
+                root)[1]["jobs"])
+        threads = [threading.Thread(target=clone, args=(n,)) for n in range(options.concurrent)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report["concurrent_clone_jobs"] = sorted(granted, reverse=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
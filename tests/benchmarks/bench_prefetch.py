@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark foreground fetches with and without a background prefetch.
+
+Builds a throwaway bare remote with ``git fast-import`` (``--files`` files)
+and, in each of ``--runs`` rounds, clones it twice over ``file://``, then
+advances the remote by ``--commits`` commits that each rewrite ``--changed``
+files with ``--size`` bytes of fresh data. One clone fetches through the git
+plugin straight away; the other has its remote prefetched by
+``prefetch.run_due()`` first, as the scheduler would between two uses, and
+then fetches. Reports the medians of the foreground fetch time and of the
+pack bytes it received (``GIT_TRACE_PACKFILE``), and of the prefetch itself.
+
+Usage: python tests/benchmarks/bench_prefetch.py [--files N] [--commits N] [--changed N] [--size N] [--runs N]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli, prefetch  # noqa: E402
+from bench_listing import git  # noqa: E402
+from bench_mirrors import traced  # noqa: E402
+
+
+def file_path(n):
+    return f"src/pkg{n // 500:03d}/file{n:06d}.txt"
+
+
+def build_remote(path, files):
+    git(path, "init", "-q", "--bare", "-b", "main")
+    stream = ["commit refs/heads/main\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 5\nbase\n"]
+    for n in range(files):
+        data = f"file {n}\n"
+        stream.append(f"M 100644 inline {file_path(n)}\ndata {len(data)}\n{data}\n")
+    git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+
+
+def advance(path, files, commits, changed, size, round_):
+    stream = []
+    for i in range(commits):
+        stream.append(f"commit refs/heads/main\ncommitter bench <bench@example.com> {1600000060 + i} +0000\n"
+                      f"data 9\nr{round_:02d}c{i:04d}\n")
+        if i == 0:
+            stream.append("from refs/heads/main^0\n")
+        for k in range(changed):
+            # Fresh random bytes: the pack cannot delta them against what the clone already has
+            data = os.urandom(size // 2).hex()
+            stream.append(f"M 100644 inline {file_path((i * changed + k) * 7919 % files)}\ndata {len(data)}\n{data}\n")
+    git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+
+
+def fetch(clone):
+    result = cli.run({"command": "fetch", "args": ["-q", "origin"]}, cwd=clone)
+    assert result["success"], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--commits", type=int, default=50)
+    parser.add_argument("--changed", type=int, default=20)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        os.environ[prefetch.PREFETCH_FILE_ENV] = os.path.join(root, "prefetch.json")
+        remote = os.path.join(root, "remote.git")
+        os.makedirs(remote)
+        build_remote(remote, options.files)
+        trace = os.path.join(root, "trace")
+        samples = {"prefetch": [], "warm_fetch": [], "cold_fetch": []}
+        for round_ in range(options.runs):
+            cold, warm = os.path.join(root, "cold"), os.path.join(root, "warm")
+            for clone in (cold, warm):
+                git(root, "clone", "-q", "file://" + remote, clone)
+            prefetch.record(["git", "fetch", "origin"], warm)
+            advance(remote, options.files, options.commits, options.changed, options.size, round_)
+            reports = []
+            samples["prefetch"].append(traced(trace, lambda: reports.extend(prefetch.run_due())))
+            assert [report["action"] for report in reports] == ["fetched"], reports
+            samples["warm_fetch"].append(traced(trace, lambda: fetch(warm)))
+            samples["cold_fetch"].append(traced(trace, lambda: fetch(cold)))
+            shutil.rmtree(cold)
+            shutil.rmtree(warm)
+            os.remove(os.environ[prefetch.PREFETCH_FILE_ENV])
+        report = {"files": options.files, "commits": options.commits,
+                  "changed_bytes": options.commits * options.changed * options.size}
+        for name, runs in samples.items():
+            report[name] = {"seconds": round(statistics.median(seconds for seconds, _ in runs), 4),
+                            "pack_bytes": int(statistics.median(size for _, size in runs))}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark partial, shallow and sparse clone presets against a full clone.
+
+Builds a throwaway bare repository (written with ``git fast-import``) that
+allows filters, with ``--dirs`` top-level directories of ``--files`` files
+each and ``--commits`` commits that each rewrite one directory. Clones it
+over ``file://`` through the git plugin, in full and with every preset (the
+sparse clone checks out one directory), and reports the pack data sent
+(from ``GIT_TRACE_PACKFILE``), the wall time, the size of ``.git`` and the
+number of files checked out. Then times ``git show`` of an old version of a
+file in the blobless clone, which fetches that blob on demand.
+
+Usage: python tests/benchmarks/bench_presets.py [--dirs N] [--files N] [--commits N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli  # noqa: E402
+from bench_listing import git  # noqa: E402
+from bench_mirrors import traced  # noqa: E402
+
+
+def build_monorepo(path, dirs, files, commits):
+    git(path, "init", "-q", "--bare", "-b", "main")
+    git(path, "config", "uploadpack.allowFilter", "true")
+    stream = []
+    for i in range(commits):
+        stream.append(f"commit refs/heads/main\nmark :{i + 1}\ncommitter bench <bench@example.com> "
+                      f"{1_600_000_000 + i * 60} +0000\ndata 8\nc{i:06d}\n".encode())
+        if i:
+            stream.append(f"from :{i}\n".encode())
+        # The first commit writes every directory, later ones rewrite one directory each
+        for d in range(dirs) if i == 0 else (i % dirs,):
+            for f in range(files):
+                data = "".join(hashlib.sha1(f"{i}/{d}/{f}/{n}".encode()).hexdigest() + "\n"
+                               for n in range(20)).encode()
+                stream.append(f"M 644 inline dir{d:03d}/file{f:04d}.txt\ndata {len(data)}\n".encode() + data + b"\n")
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+
+
+def disk_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def checked_out(path):
+    return sum(len(names) for root, _, names in os.walk(path) if ".git" not in root.split(os.sep))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dirs", type=int, default=50)
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--commits", type=int, default=200)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        remote = os.path.join(root, "remote.git")
+        os.makedirs(remote)
+        build_monorepo(remote, options.dirs, options.files, options.commits)
+        url = "file://" + remote
+        trace = os.path.join(root, "pack.trace")
+        report = {"dirs": options.dirs, "files": options.dirs * options.files, "commits": options.commits}
+        variants = [("full", {}), ("blobless", {"preset": "blobless"}), ("treeless", {"preset": "treeless"}),
+                    ("shallow", {"preset": "shallow"}), ("sparse", {"sparse": ["dir000"]})]
+        for name, preset in variants:
+            dest = os.path.join(root, name)
+            run_args = dict({"command": "clone", "args": ["-q", url, dest]}, **preset)
+            seconds, pack_bytes = traced(trace, lambda: cli.run(run_args, cwd=root))
+            report[name] = {"seconds": round(seconds, 4), "pack_bytes": pack_bytes,
+                            "git_dir_bytes": disk_bytes(os.path.join(dest, ".git")), "files": checked_out(dest)}
+        # An old version of a file the blobless clone does not have yet
+        start = time.perf_counter()
+        shown = cli.run({"command": "show", "args": [f"HEAD~{options.commits - 1}:dir001/file0000.txt"]},
+                        cwd=os.path.join(root, "blobless"))
+        assert shown["success"], shown
+        report["blobless_show_old_blob_seconds"] = round(time.perf_counter() - start, 4)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
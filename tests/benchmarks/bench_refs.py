@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark creating and deleting many refs one command at a time and in bulk.
+
+Builds a throwaway repository with ``git fast-import`` and, for ``--refs``
+branches, times:
+
+- one ``git branch`` per branch to create them, and one ``git branch -D``
+  per branch to delete them (what callers do without a bulk API);
+- ``bulkrefs.apply()`` creating them, then deleting them with their
+  expected old values, in one ``git update-ref --stdin -z`` transaction
+  each.
+
+Then, against a bare ``file://`` remote, it times one ``git push`` per
+branch and ``bulkrefs.push()`` (one ``--atomic`` push), for creating and
+for deleting the branches.
+
+Usage: python tests/benchmarks/bench_refs.py [--refs N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import bulkrefs  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return round(time.perf_counter() - start, 4), result
+
+
+def applied(results):
+    assert all(result["status"] == "applied" for result in results), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--refs", type=int, default=500)
+    options = parser.parse_args()
+    names = [f"release/{n:05d}" for n in range(options.refs)]
+    with tempfile.TemporaryDirectory() as root:
+        repo, remote = os.path.join(root, "repo"), os.path.join(root, "remote.git")
+        git(root, "init", "-q", "-b", "main", repo)
+        git(repo, "fast-import", "--quiet",
+            stdin=b"commit refs/heads/main\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 5\nbase\n")
+        git(root, "init", "-q", "--bare", remote)
+        git(repo, "remote", "add", "origin", "file://" + remote)
+        git(repo, "push", "-q", "origin", "main")
+        oid = git(repo, "rev-parse", "main").decode().strip()
+        creates = [{"action": "create", "ref": f"refs/heads/{name}", "new": oid} for name in names]
+        deletes = [{"action": "delete", "ref": f"refs/heads/{name}", "old": oid} for name in names]
+        report = {"refs": options.refs, "local": {}, "push": {}}
+        local, push = report["local"], report["push"]
+        local["create_one_by_one"], _ = timed(lambda: [git(repo, "branch", name, oid) for name in names])
+        local["delete_one_by_one"], _ = timed(lambda: [git(repo, "branch", "-D", name) for name in names])
+        local["create_bulk"], results = timed(lambda: bulkrefs.apply(creates, repo))
+        applied(results)
+        local["delete_bulk"], results = timed(lambda: bulkrefs.apply(deletes, repo))
+        applied(results)
+        push["create_one_by_one"], _ = timed(lambda: [git(repo, "push", "-q", "origin", f"{oid}:refs/heads/{name}")
+                                                      for name in names])
+        push["delete_one_by_one"], _ = timed(lambda: [git(repo, "push", "-q", "origin", f":refs/heads/{name}")
+                                                      for name in names])
+        push["create_bulk"], results = timed(lambda: bulkrefs.push(creates, "origin", repo))
+        applied(results)
+        push["delete_bulk"], results = timed(lambda: bulkrefs.push(deletes, "origin", repo))
+        applied(results)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
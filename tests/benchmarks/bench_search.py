@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark the incremental commit search index against ``git log --grep``.
+
+Builds a throwaway repository with ``--commits`` commits whose messages are
+drawn from a small vocabulary plus one rare word per commit (written with
+``git fast-import``), then times building the index from scratch, a search
+of a fresh index (freshness check included), an incremental sync after
+``--new-commits`` more commits, and the same queries answered by
+``git log --all -i --grep`` over the whole history.
+
+Usage: python tests/benchmarks/bench_search.py [--commits N] [--new-commits N] [--runs N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import search  # noqa: E402
+from bench_commitgraph import git, timed  # noqa: E402
+
+WORDS = ["fix", "crash", "parser", "update", "docs", "refactor", "cache", "network", "timeout", "test", "release",
+         "config", "build", "memory", "leak", "index", "merge", "render", "query", "schema"]
+
+
+def append_commits(path, start, count, first):
+    stream = []
+    for i in range(start, start + count):
+        subject = " ".join(WORDS[(i * k) % len(WORDS)] for k in (1, 7, 13))
+        message = f"{subject}\n\nTouches token{i:07d} in module m{i % 97}.\n".encode()
+        stream.append(f"commit refs/heads/main\ncommitter dev{i % 50} <dev{i % 50}@example.com> "
+                      f"{1_600_000_000 + i * 60} +0000\ndata {len(message)}\n".encode() + message + b"\n")
+        if i == start and not first:
+            stream.append(b"from refs/heads/main^0\n")
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=100000)
+    parser.add_argument("--new-commits", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+    queries = {
+        "rare_word": {"query": f"token{options.commits // 2:07d}"},
+        "common_words_ranked": {"query": "crash memory", "limit": 20},
+        "author_and_since": {"author": "dev7@example.com", "since": 1_600_000_000 + options.commits * 30,
+                             "order": "date", "limit": 20},
+    }
+    greps = {
+        "rare_word": ["--grep", f"token{options.commits // 2:07d}"],
+        "common_words_ranked": ["--grep", "crash", "--grep", "memory", "--all-match", "-n", "20"],
+        "author_and_since": ["--author", "dev7@example.com", "--since", str(1_600_000_000 + options.commits * 30),
+                             "-n", "20"],
+    }
+    with tempfile.TemporaryDirectory() as path:
+        git(path, "init", "-q", "-b", "main")
+        append_commits(path, 0, options.commits, True)
+        index_path = os.path.join(path, "index.sqlite")
+        start = time.perf_counter()
+        first = search.search({"index": index_path}, cwd=path)
+        build_seconds = time.perf_counter() - start
+        report = {"commits": first["indexed_commits"], "build_seconds": round(build_seconds, 4),
+                  "index_bytes": os.path.getsize(index_path), "queries": {}}
+        for name, args in queries.items():
+            response = search.search(dict(args, index=index_path), cwd=path)
+            assert response["fresh"] and "synced" not in response
+            report["queries"][name] = {
+                "matches": response["record_count"],
+                "index_seconds": round(timed(lambda: search.search(dict(args, index=index_path), cwd=path),
+                                             options.runs), 5),
+                "git_log_grep_seconds": round(timed(lambda: git(path, "log", "--all", "-i", "--format=%H",
+                                                                *greps[name]), options.runs), 5),
+            }
+        append_commits(path, options.commits, options.new_commits, False)
+        start = time.perf_counter()
+        response = search.search({"index": index_path, "query": "leak"}, cwd=path)
+        report["incremental_sync"] = {"added": response["synced"]["added"],
+                                      "search_with_sync_seconds": round(time.perf_counter() - start, 4)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark common git commands before and after tuning an aged repository.
+
+Builds a throwaway repository with ``git fast-import``: ``--files`` files
+spread over directories and ``--commits`` commits that each rewrite a few
+of them, imported in ``--packs`` batches so the history sits in that many
+packs, followed by ``--loose`` commits made with ``git commit`` (loose
+objects) and an untracked file in every directory. Then runs the git
+plugin's ``tune`` command and reports the steps it took, how long each took,
+and the median time of ``git status``, ``git log -- <path>`` and
+``git rev-list --count HEAD`` before and after.
+
+Usage: python tests/benchmarks/bench_tuning.py [--files N] [--commits N] [--packs N] [--loose N] [--runs N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import tuning  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+
+def file_path(n):
+    return f"src/mod{n // 1000:03d}/pkg{n // 100 % 10}/file{n:06d}.txt"
+
+
+def build_aged_repository(path, files, commits, packs, loose):
+    git(path, "init", "-q", "-b", "main")
+    git(path, "config", "gc.auto", "0")
+    first = ["blob\nmark :1\ndata 5\nbase\n",
+             "commit refs/heads/main\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 5\nbase\n"]
+    first.extend(f"M 100644 :1 {file_path(n)}\n" for n in range(files))
+    git(path, "fast-import", "--quiet", stdin="".join(first).encode())
+    batch = -(-commits // packs)
+    for start in range(0, commits, batch):
+        # One fast-import run, and so one pack, per batch; each commit rewrites three files
+        stream = []
+        for i in range(start, min(start + batch, commits)):
+            stream.append(f"commit refs/heads/main\ncommitter bench <bench@example.com> {1600000060 + i * 60} "
+                          f"+0000\ndata 8\nc{i:06d}\n")
+            if i == start:
+                # Continue from the previous batch; later commits continue the branch in memory
+                stream.append("from refs/heads/main^0\n")
+            for n in (i * 7919 % files, i * 104729 % files, i % files):
+                data = f"file {n} at {i}\n"
+                stream.append(f"M 100644 inline {file_path(n)}\ndata {len(data)}\n{data}\n")
+        git(path, "fast-import", "--quiet", stdin="".join(stream).encode())
+    git(path, "reset", "-q", "--hard", "main")
+    for i in range(loose):
+        target = os.path.join(path, file_path(i * 31 % files))
+        with open(target, "a") as f:
+            f.write(f"loose {i}\n")
+        git(path, "commit", "-q", "-am", f"loose {i}")
+    for directory in sorted({os.path.dirname(file_path(n)) for n in range(files)}):
+        with open(os.path.join(path, directory, "untracked.tmp"), "w") as f:
+            f.write("untracked\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--commits", type=int, default=20000)
+    parser.add_argument("--packs", type=int, default=20)
+    parser.add_argument("--loose", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        build_aged_repository(path, options.files, options.commits, options.packs, options.loose)
+        result = tuning.manage({"runs": options.runs, "path": file_path(options.files // 2)}, cwd=path)
+        assert result["success"], result
+        report = {
+            "files": options.files, "commits": options.commits + options.loose + 1,
+            "before": {"loose_objects": result["before"]["objects"]["count"],
+                       "packs": result["before"]["objects"]["packs"]},
+            "after": {"loose_objects": result["after"]["objects"]["count"],
+                      "packs": result["after"]["objects"]["packs"],
+                      "commit_graph": result["after"]["commit_graph"], "index": result["after"]["index"]},
+            "steps": [{"step": step["step"], "reason": step["reason"], "seconds": round(step["seconds"], 4)}
+                      for step in result["steps"]],
+            "measurements": {name: {when: round(seconds, 4) for when, seconds in timing.items()}
+                             for name, timing in result["measurements"].items()},
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark leasing pooled worktrees against cloning and switching branches in place.
+
+Builds a throwaway repository (written with ``git fast-import``) with
+``--files`` files on ``main`` and ``--branches`` branches that each change
+``--changed`` of them. Then reports the time to add a worktree on the first
+lease, to lease and release a warm one at another branch, and to make a
+full ``file://`` clone instead. It also times running ``git diff --stat
+main`` for every branch, one after another in the main worktree (checking
+each branch out first) and from ``--branches`` threads at once through the
+git plugin's ``worktree`` option.
+
+Usage: python tests/benchmarks/bench_worktrees.py [--files N] [--branches N] [--changed N] [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from plugins.git import cli, worktrees  # noqa: E402
+from bench_listing import git  # noqa: E402
+
+
+def blob(path, text):
+    data = text.encode()
+    return f"M 644 inline {path}\ndata {len(data)}\n".encode() + data + b"\n"
+
+
+def build_branches(path, files, branches, changed):
+    git(path, "init", "-q", "-b", "main")
+    stream = [b"commit refs/heads/main\nmark :1\ncommitter bench <bench@example.com> 1600000000 +0000\ndata 4\nbase\n"]
+    stream += [blob(f"src/pkg{i // 100:03d}/module{i:05d}.py", f"value = {i}\n" * 20) for i in range(files)]
+    for branch in range(branches):
+        stream.append(f"commit refs/heads/b{branch}\ncommitter bench <bench@example.com> 1600000001 +0000\n"
+                      f"data 3\nb{branch}\nfrom :1\n".encode())
+        stream += [blob(f"src/pkg{i // 100:03d}/module{i:05d}.py", f"value = {branch}\n" * 20)
+                   for i in range(branch, files, max(files // changed, 1))]
+    git(path, "fast-import", "--quiet", stdin=b"".join(stream))
+    git(path, "checkout", "-q", "main")
+
+
+def seconds(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--branches", type=int, default=4)
+    parser.add_argument("--changed", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "repo")
+        os.makedirs(path)
+        build_branches(path, options.files, options.branches, options.changed)
+        pool = worktrees.WorktreePool(path, size=options.branches)
+        first = time.perf_counter()
+        lease = pool.lease("b0")
+        first = time.perf_counter() - first
+        pool.release(lease)
+        warm = []
+        for run in range(options.runs):
+            start = time.perf_counter()
+            pool.release(pool.lease(f"b{(run + 1) % options.branches}"))
+            warm.append(time.perf_counter() - start)
+        clone = seconds(lambda: git(root, "clone", "-q", f"file://{path}", "clone"))
+        diff = ["diff", "--stat", "main"]
+
+        def in_place():
+            for branch in range(options.branches):
+                git(path, "checkout", "-q", f"b{branch}")
+                git(path, *diff)
+            git(path, "checkout", "-q", "main")
+
+        def pooled():
+            threads = [threading.Thread(target=cli.run, args=({"command": "diff", "args": diff[1:],
+                                                                "worktree": f"b{branch}"},), kwargs={"cwd": path})
+                       for branch in range(options.branches)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        pool.warm()
+        report = {
+            "files": options.files,
+            "branches": options.branches,
+            "cpus": os.cpu_count(),
+            "first_lease_seconds": round(first, 4),
+            "warm_lease_and_release_seconds": round(statistics.median(warm), 4),
+            "full_clone_seconds": round(clone, 4),
+            "in_place_serial_seconds": round(seconds(in_place), 4),
+            "pooled_parallel_seconds": round(seconds(pooled), 4),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,38 +6,68 @@ import subprocess
 from unittest.mock import MagicMock, Mock
 import pytest
 
+from plugins import process
+
+
+def make_repository(path, config="", head="ref: refs/heads/main\n", bare=False):
+    """Create the minimal git directory layout discovery recognises"""
+    git_dir = path if bare else path / ".git"
+    (git_dir / "objects" / "pack").mkdir(parents=True)
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text(head)
+    core = "[core]\n\trepositoryformatversion = 0\n" + ("\tbare = true\n" if bare else "")
+    (git_dir / "config").write_text(core + config)
+    return str(path)
+
+
+def completed(cmd_args, returncode, stdout, stderr):
+    """A finished process as process.run_process returns it"""
+    result = subprocess.CompletedProcess(cmd_args, returncode, stdout, stderr)
+    result.resources = None
+    return result
+
+
+def git(cwd, *args, **kwargs):
+    """Run git for a test and return its output, decoded unless ``text=False``"""
+    kwargs.setdefault("text", True)
+    return subprocess.run(["git"] + list(args), cwd=cwd, capture_output=True, check=True, **kwargs).stdout
+
 
 @pytest.fixture
 def mock_subprocess_run(monkeypatch):
-    """Mock subprocess.run for unit tests"""
+    """Mock subprocess.run (and the plugins' process.run_process) for unit tests"""
     mock_result = Mock()
     mock_result.returncode = 0
     mock_result.stdout = "test output"
     mock_result.stderr = ""
+    mock_result.resources = None
     
     def mock_run(*args, **kwargs):
         return mock_result
     
     monkeypatch.setattr(subprocess, "run", mock_run)
+    monkeypatch.setattr(process, "run_process", mock_run)
     return mock_result
 
 
 @pytest.fixture
 def mock_subprocess_timeout(monkeypatch):
-    """Mock subprocess.run to raise TimeoutExpired"""
+    """Mock subprocess.run (and process.run_process) to raise TimeoutExpired"""
     def mock_run(*args, **kwargs):
         raise subprocess.TimeoutExpired(cmd=args[0], timeout=30)
     
     monkeypatch.setattr(subprocess, "run", mock_run)
+    monkeypatch.setattr(process, "run_process", mock_run)
 
 
 @pytest.fixture
 def mock_subprocess_exception(monkeypatch):
-    """Mock subprocess.run to raise a generic exception"""
+    """Mock subprocess.run (and process.run_process) to raise a generic exception"""
     def mock_run(*args, **kwargs):
         raise Exception("Command execution failed")
     
     monkeypatch.setattr(subprocess, "run", mock_run)
+    monkeypatch.setattr(process, "run_process", mock_run)
 
 
 @pytest.fixture
@@ -0,0 +1,85 @@
+"""
+Integration tests for the git plugin's commit analytics against real git
+"""
+import os
+from collections import Counter
+import pytest
+
+from plugins.git import analytics
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestAnalytics:
+    """Aggregations over the columns must match git's own numstat output"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def history_repo(self, tmp_path):
+        """Commits by two authors over two months with a rename, a binary file and a merge"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        for number in range(12):
+            name = f"src/m{number % 3}.py"
+            os.makedirs(os.path.join(repo, "src"), exist_ok=True)
+            with open(os.path.join(repo, name), "a") as f:
+                f.write("line\n" * (number + 1))
+            if number == 4:
+                with open(os.path.join(repo, "logo.png"), "wb") as f:
+                    f.write(b"\x89PNG\0\1\2")
+            if number == 6:
+                git(repo, "add", "-A")
+                git(repo, "mv", "src/m1.py", "src/renamed.py")
+            git(repo, "add", "-A")
+            env = dict(os.environ, GIT_AUTHOR_DATE=f"2024-0{1 + number // 6}-{10 + number}T12:00:00Z",
+                       GIT_AUTHOR_NAME="Ann" if number % 2 else "Bob")
+            git(repo, "commit", "-q", "-m", f"c{number}", env=env)
+        git(repo, "checkout", "-q", "-b", "side", "HEAD~2")
+        git(repo, "commit", "-q", "--allow-empty", "-m", "side")
+        git(repo, "checkout", "-q", "main")
+        git(repo, "merge", "-q", "--no-edit", "side")
+        return repo
+    
+    def test_matches_numstat(self, history_repo):
+        history = analytics.History.load(history_repo)
+        churn, author = Counter(), None
+        for line in git(history_repo, "log", "--numstat", "-M", "--format=@%an <%ae>").splitlines():
+            if line.startswith("@"):
+                author = line[1:]
+            elif line and not line.startswith("-"):
+                added, deleted, _ = line.split("\t")
+                churn[author] += int(added) + int(deleted)
+        hot = Counter(git(history_repo, "log", "-M", "--name-only", "--format=").split())
+        assert len(history) == 14
+        assert history.group_by("author", "churn") == dict(churn)
+        assert history.group_by("path") == dict(hot)
+        assert history.group_by("time", bucket="month") == {"2024-01": 6, "2024-02": 6, **{
+            git(history_repo, "log", "-1", "--format=%ad", "--date=format-local:%Y-%m", "main").strip(): 2}}
+        assert "src/renamed.py" in history.paths
+    
+    def test_report_round_trip(self, history_repo, tmp_path):
+        target = str(tmp_path / "history.cols")
+        built = analytics.report({"group_by": "path", "metric": "churn", "top": 2, "save": target,
+                                  "args": ["main~6..main"]}, cwd=history_repo)
+        loaded = analytics.report({"group_by": "path", "metric": "churn", "top": 2, "load": target})
+        assert built["success"] is True
+        assert built["result"] == loaded["result"]
+        assert loaded["commits"] == int(git(history_repo, "rev-list", "--count", "main~6..main"))
+    
+    def test_bad_revision(self, history_repo):
+        response = analytics.report({"args": "nope"}, cwd=history_repo)
+        assert response["success"] is False
+        assert response["error_code"] == "COMMAND_FAILED_128"
@@ -0,0 +1,89 @@
+"""
+Integration tests for bulk ref updates against real repositories
+"""
+import json
+import pytest
+
+from plugins.git import bulkrefs
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestBulkRefs:
+    """Many ref changes through one update-ref transaction or one atomic push"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def repo(self, tmp_path):
+        """A repository with two commits, twenty stale branches and a bare remote that has all of them"""
+        path = str(tmp_path / "repo")
+        git(str(tmp_path), "init", "-q", "-b", "main", path)
+        for n in range(2):
+            git(path, "commit", "-q", "--allow-empty", "-m", f"commit {n}")
+        for n in range(20):
+            git(path, "branch", f"stale/{n:02d}", "HEAD~1")
+        git(str(tmp_path), "init", "-q", "--bare", str(tmp_path / "remote.git"))
+        git(path, "remote", "add", "origin", str(tmp_path / "remote.git"))
+        git(path, "push", "-q", "origin", "refs/heads/*:refs/heads/*")
+        return path
+    
+    def branches(self, path):
+        return git(path, "for-each-ref", "--format=%(refname:short)", "refs/heads/").split()
+    
+    @pytest.mark.integration
+    def test_cleanup_and_fan_out(self, repo):
+        stale = git(repo, "rev-parse", "HEAD~1").strip()
+        ops = [{"action": "delete", "ref": f"refs/heads/stale/{n:02d}", "old": stale} for n in range(20)]
+        ops += [{"action": "create", "ref": f"refs/heads/release/{n}", "new": "main"} for n in range(5)]
+        result = bulkrefs.manage({"ops": json.dumps(ops), "message": "release fan-out"}, cwd=repo)
+        assert result["success"] is True and result["summary"] == {"applied": 25}
+        assert self.branches(repo) == ["main"] + [f"release/{n}" for n in range(5)]
+        assert "release fan-out" in git(repo, "reflog", "-1", "release/0")
+    
+    @pytest.mark.integration
+    def test_atomic_and_best_effort(self, repo):
+        ops = [{"action": "create", "ref": "refs/heads/release/1", "new": "main"},
+               {"action": "delete", "ref": "refs/heads/stale/00", "old": "main"},
+               {"action": "create", "ref": "refs/heads/stale/01/x", "new": "main"}]
+        results = bulkrefs.apply(ops, repo)
+        assert [result["status"] for result in results] == ["aborted", "rejected", "aborted"]
+        assert "release/1" not in self.branches(repo)
+        results = bulkrefs.apply(ops, repo, mode=bulkrefs.BEST_EFFORT)
+        assert [result["status"] for result in results] == ["applied", "rejected", "failed"]
+        assert "refs/heads/stale/01" in results[2]["error"]
+        assert "release/1" in self.branches(repo) and "stale/00" in self.branches(repo)
+    
+    @pytest.mark.integration
+    def test_push(self, repo, tmp_path):
+        remote = str(tmp_path / "remote.git")
+        stale = git(repo, "rev-parse", "HEAD~1").strip()
+        ops = [{"action": "delete", "ref": f"refs/heads/stale/{n:02d}", "old": stale} for n in range(20)]
+        ops.append({"action": "create", "ref": "refs/tags/v1", "new": "main"})
+        results = bulkrefs.push(ops, "origin", repo, batch=8)
+        assert [result["status"] for result in results] == ["applied"] * 21
+        assert self.branches(remote) == ["main"]
+        assert git(remote, "tag") == "v1\n"
+        # A rejected ref past the first batch still keeps every ref in the push off the remote
+        ops = [{"action": "create", "ref": f"refs/heads/new/{n:02d}", "new": "main"} for n in range(10)]
+        ops.append({"action": "delete", "ref": "refs/tags/v1", "old": "main~1"})
+        results = bulkrefs.push(ops, "origin", repo, batch=4)
+        assert [result["status"] for result in results] == ["aborted"] * 10 + ["rejected"]
+        assert self.branches(remote) == ["main"]
+        # The lease fails for the remote's main, so nothing in the push is applied
+        ops = [{"action": "create", "ref": "refs/heads/release/1", "new": "main"},
+               {"action": "update", "ref": "refs/heads/main", "new": "main~1", "old": "main~1"}]
+        results = bulkrefs.push(ops, "origin", repo)
+        assert [result["status"] for result in results] == ["aborted", "rejected"]
+        assert self.branches(remote) == ["main"]
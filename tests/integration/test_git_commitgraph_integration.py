@@ -0,0 +1,102 @@
+"""
+Integration tests comparing the in-process commit-graph queries with real git
+"""
+import os
+import subprocess
+import pytest
+
+from plugins.git import fastpath
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestCommitGraphMatchesGit:
+    """The fast path must print and exit exactly like git"""
+    
+    QUERIES = [
+        ["merge-base", "--is-ancestor", "main~5", "main"],
+        ["merge-base", "--is-ancestor", "topic", "main"],
+        ["merge-base", "--is-ancestor", "main", "topic"],
+        ["merge-base", "--is-ancestor", "v1", "topic"],
+        ["merge-base", "main", "topic"],
+        ["merge-base", "--all", "main~2", "topic"],
+        ["merge-base", "main~1^2", "main~6"],
+        ["rev-list", "--count", "main"],
+        ["rev-list", "--count", "topic..main"],
+        ["rev-list", "--count", "main..topic"],
+        ["rev-list", "--count", "^v1", "main"],
+        ["rev-list", "--count", "--first-parent", "main"],
+        ["rev-list", "--count", "v1"],
+    ]
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def history_repo(self, tmp_path):
+        """A main line with a merged topic branch, an unmerged one and an annotated tag"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        for i in range(12):
+            git(repo, "commit", "-q", "--allow-empty", "-m", f"main {i}")
+        git(repo, "checkout", "-q", "-b", "feature", "HEAD~6")
+        for i in range(3):
+            git(repo, "commit", "-q", "--allow-empty", "-m", f"feature {i}")
+        git(repo, "checkout", "-q", "main")
+        git(repo, "merge", "-q", "--no-ff", "--no-edit", "feature")
+        git(repo, "commit", "-q", "--allow-empty", "-m", "after merge")
+        git(repo, "tag", "-a", "-m", "release", "v1", "HEAD~3")
+        git(repo, "checkout", "-q", "-b", "topic", "HEAD~2")
+        for i in range(2):
+            git(repo, "commit", "-q", "--allow-empty", "-m", f"topic {i}")
+        git(repo, "checkout", "-q", "main")
+        return repo
+    
+    def assert_matches(self, cwd, argv):
+        fast = fastpath.fast_read(["git"] + argv, cwd)
+        expected = subprocess.run(["git"] + argv, cwd=cwd, capture_output=True, text=True)
+        assert fast is not None, argv
+        assert (fast.returncode, fast.stdout) == (expected.returncode, expected.stdout), argv
+    
+    @pytest.mark.parametrize("write_args", [
+        ["--reachable"],
+        ["--reachable", "--changed-paths"],
+    ])
+    def test_single_graph_matches_git(self, history_repo, write_args):
+        git(history_repo, "commit-graph", "write", *write_args)
+        for argv in self.QUERIES:
+            self.assert_matches(history_repo, argv)
+    
+    def test_split_graph_matches_git(self, history_repo):
+        git(history_repo, "checkout", "-q", "topic")
+        git(history_repo, "commit-graph", "write", "--reachable", "--split")
+        git(history_repo, "checkout", "-q", "-b", "later", "main")
+        git(history_repo, "commit", "-q", "--allow-empty", "-m", "second layer")
+        git(history_repo, "commit-graph", "write", "--reachable", "--split=no-merge")
+        git(history_repo, "checkout", "-q", "main")
+        assert os.path.exists(os.path.join(history_repo, ".git", "objects", "info", "commit-graphs",
+                                           "commit-graph-chain"))
+        for argv in self.QUERIES:
+            self.assert_matches(history_repo, argv)
+    
+    def test_commits_newer_than_the_graph_match_git(self, history_repo):
+        git(history_repo, "commit-graph", "write", "--reachable")
+        git(history_repo, "merge", "-q", "--no-ff", "--no-edit", "topic")
+        git(history_repo, "commit", "-q", "--allow-empty", "-m", "not in the graph")
+        for argv in self.QUERIES:
+            self.assert_matches(history_repo, argv)
+    
+    def test_without_graph_falls_back(self, history_repo):
+        git(history_repo, "config", "gc.writeCommitGraph", "false")
+        assert fastpath.fast_read(["git", "rev-list", "--count", "main"], history_repo) is None
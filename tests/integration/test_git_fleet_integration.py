@@ -0,0 +1,72 @@
+"""
+Integration tests for running git commands across real repositories
+"""
+import json
+import os
+import pytest
+
+from plugins.git import cli, fleet
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestFleet:
+    """One command across a directory of repositories, through the git plugin's run()"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def root(self, tmp_path):
+        """Four repositories under one directory; two have a branch named stale, and one is bare"""
+        for n in range(3):
+            path = str(tmp_path / "team" / f"repo{n}")
+            os.makedirs(path)
+            git(path, "init", "-q", "-b", "main")
+            with open(os.path.join(path, "file.txt"), "w") as f:
+                f.write(f"repo {n}\n")
+            git(path, "add", ".")
+            git(path, "commit", "-q", "-m", f"repo {n}")
+            if n < 2:
+                git(path, "branch", "stale")
+        git(str(tmp_path), "clone", "-q", "--bare", str(tmp_path / "team" / "repo0"), str(tmp_path / "mirror.git"))
+        return str(tmp_path)
+    
+    @pytest.mark.integration
+    def test_status_across_a_root(self, root):
+        with open(os.path.join(root, "team", "repo1", "file.txt"), "a") as f:
+            f.write("changed\n")
+        result = fleet.manage({"command": "status", "args": ["--porcelain"], "root": root, "jobs": 3}, cli.run)
+        assert result["success"] is True, result
+        records = {os.path.relpath(record["path"], root): record for record in result["result"]}
+        assert sorted(records) == ["mirror.git", "team/repo0", "team/repo1", "team/repo2"]
+        assert records["team/repo1"]["result"].strip() == "M file.txt"
+        assert records["team/repo0"]["lock"] == "read"
+        # status needs a work tree
+        assert records["mirror.git"]["success"] is False
+        assert result["summary"]["repositories"] == 4 and result["summary"]["failed"] == 1
+        assert result["summary"]["slowest"][0]["seconds"] >= result["summary"]["slowest"][-1]["seconds"]
+    
+    @pytest.mark.integration
+    def test_branch_cleanup(self, root, tmp_path):
+        paths = [os.path.join(root, "team", f"repo{n}") for n in range(3)]
+        output = str(tmp_path / "cleanup.ndjson")
+        result = fleet.manage({"command": "branch", "args": ["-D", "stale"], "paths": paths, "output": output},
+                              cli.run)
+        assert result["result"] == f"Wrote 3 records to {output}"
+        with open(output) as f:
+            records = {os.path.basename(record["path"]): record for record in map(json.loads, f)}
+        assert [records[f"repo{n}"]["success"] for n in range(3)] == [True, True, False]
+        assert result["summary"]["error_codes"] == {"COMMAND_FAILED_1": 1}
+        for path in paths:
+            assert git(path, "branch", "--list", "stale") == ""
@@ -0,0 +1,111 @@
+"""
+Integration tests comparing the in-process index reader with real git
+"""
+import os
+import subprocess
+import time
+import pytest
+
+from plugins.git import fastpath, index
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestIndexMatchesGit:
+    """The fast path must print and exit exactly like git"""
+    
+    FILES = ["README", "a/b.txt", "a/c/d.txt", "a/e", "a0", "dir-x/f", "dir/g", "space name.txt"]
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def work_repo(self, tmp_path):
+        """A committed worktree whose index is refreshed past the racy window"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        for name in self.FILES:
+            path = os.path.join(repo, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"{name}\n")
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "initial")
+        time.sleep(1.1)
+        git(repo, "update-index", "--refresh")
+        return repo
+    
+    def assert_matches(self, cwd, argv):
+        fast = fastpath.fast_read(["git"] + argv, cwd)
+        expected = subprocess.run(["git"] + argv, cwd=cwd, capture_output=True, text=True)
+        if fast is None:
+            return False
+        assert (fast.returncode, fast.stdout) == (expected.returncode, expected.stdout), argv
+        return True
+    
+    @pytest.mark.parametrize("version", ["2", "3", "4"])
+    def test_ls_files_matches_git(self, work_repo, version):
+        git(work_repo, "update-index", "--index-version", version)
+        for argv in (["ls-files"], ["ls-files", "-z"], ["ls-files", "a"], ["ls-files", "--", "dir", "a/c"],
+                     ["ls-files", "a/e", "README"], ["ls-files", "missing"]):
+            assert self.assert_matches(work_repo, argv)
+        sub = os.path.join(work_repo, "a")
+        for argv in (["ls-files"], ["ls-files", "../dir"], ["ls-files", "--full-name"], ["ls-files", "c"]):
+            assert self.assert_matches(sub, argv)
+    
+    @pytest.mark.parametrize("version", ["2", "4"])
+    def test_clean_checks_match_git(self, work_repo, version):
+        git(work_repo, "update-index", "--index-version", version)
+        time.sleep(1.1)
+        git(work_repo, "update-index", "--refresh")
+        for argv in (["diff", "--quiet"], ["diff", "--cached", "--quiet"],
+                     ["diff-index", "--quiet", "HEAD"], ["diff-index", "--quiet", "--cached", "HEAD"]):
+            assert self.assert_matches(work_repo, argv)
+    
+    def test_modified_worktree_falls_back(self, work_repo):
+        with open(os.path.join(work_repo, "a", "e"), "w") as f:
+            f.write("changed\n")
+        assert fastpath.fast_read(["git", "diff", "--quiet"], work_repo) is None
+        assert not index.stat_check(repo_module.discover(work_repo))["clean"]
+        assert self.assert_matches(work_repo, ["diff", "--cached", "--quiet"])
+    
+    def test_staged_change_invalidates_cache_tree(self, work_repo):
+        with open(os.path.join(work_repo, "a", "e"), "w") as f:
+            f.write("staged\n")
+        git(work_repo, "add", "a/e")
+        assert fastpath.fast_read(["git", "diff", "--cached", "--quiet"], work_repo) is None
+        git(work_repo, "write-tree")
+        assert self.assert_matches(work_repo, ["diff", "--cached", "--quiet"])
+        assert self.assert_matches(work_repo, ["diff-index", "--quiet", "--cached", "HEAD"])
+    
+    def test_stat_check_agrees_with_git(self, work_repo):
+        os.remove(os.path.join(work_repo, "a0"))
+        result = index.stat_check(repo_module.discover(work_repo))
+        assert result["deleted"] == ["a0"]
+        assert git(work_repo, "diff", "--name-only").splitlines() == ["a0"]
+    
+    def test_moved_submodule_falls_back(self, work_repo, tmp_path):
+        library = str(tmp_path / "library")
+        git(str(tmp_path), "init", "-q", "-b", "main", library)
+        git(library, "commit", "-q", "--allow-empty", "-m", "first")
+        git(work_repo, "-c", "protocol.file.allow=always", "submodule", "add", "-q", library, "lib")
+        git(work_repo, "commit", "-q", "-m", "add submodule")
+        time.sleep(1.1)
+        git(work_repo, "update-index", "--refresh")
+        # Moving the submodule's HEAD leaves the gitlink's stat data untouched
+        git(os.path.join(work_repo, "lib"), "commit", "-q", "--allow-empty", "-m", "second")
+        for argv in (["diff", "--quiet"], ["diff-index", "--quiet", "HEAD"]):
+            assert subprocess.run(["git"] + argv, cwd=work_repo).returncode == 1
+            assert fastpath.fast_read(["git"] + argv, work_repo) is None
+        assert self.assert_matches(work_repo, ["diff", "--cached", "--quiet"])
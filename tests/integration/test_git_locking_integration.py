@@ -0,0 +1,95 @@
+"""
+Integration tests for the git plugin's repository lock against real git
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import pytest
+
+from plugins.git import cli, locking
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Commits through the plugin from a separate process, printing each response's success
+COMMITTER = """
+import json, sys
+from plugins.git import cli
+for number in range(int(sys.argv[2])):
+    response = cli.run({"command": "commit", "args": ["-q", "--allow-empty", "-m", f"{sys.argv[3]} {number}"]},
+                       cwd=sys.argv[1])
+    print(json.dumps(response["success"]))
+"""
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestRepositoryLock:
+    """Concurrent writes through the plugin must not collide on git's lock files"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def repo(self, tmp_path):
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        git(repo, "commit", "-q", "--allow-empty", "-m", "root")
+        return repo
+    
+    @pytest.mark.integration
+    def test_concurrent_commits_from_threads(self, repo):
+        responses = []
+        
+        def commit(number):
+            responses.append(cli.run({"command": "commit", "args": ["-q", "--allow-empty", "-m", f"t{number}"]},
+                                     cwd=repo))
+        
+        threads = [threading.Thread(target=commit, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [r["success"] for r in responses] == [True] * 8
+        assert {r["lock"] for r in responses} == {"write"}
+        assert all(r["timings"]["lock_wait_ns"] >= 0 for r in responses)
+        assert git(repo, "rev-list", "--count", "HEAD").strip() == "9"
+    
+    @pytest.mark.integration
+    def test_concurrent_commits_from_processes(self, repo):
+        env = dict(os.environ, PYTHONPATH=PACKAGE_ROOT)
+        workers = [subprocess.Popen([sys.executable, "-c", COMMITTER, repo, "5", f"p{number}"], env=env,
+                                    stdout=subprocess.PIPE, text=True) for number in range(4)]
+        outputs = [worker.communicate(timeout=120)[0] for worker in workers]
+        assert [json.loads(line) for output in outputs for line in output.split()] == [True] * 20
+        assert git(repo, "rev-list", "--count", "HEAD").strip() == "21"
+        assert os.path.isfile(os.path.join(repo, ".git", locking.LOCK_NAME))
+    
+    @pytest.mark.integration
+    def test_reads_share_the_lock(self, repo):
+        with locking.hold(locking.READ, repo):
+            response = cli.run({"command": "log", "args": ["--oneline"]}, cwd=repo)
+        assert response["success"] is True
+        assert response["lock"] == "read"
+        assert "root" in response["result"]
+    
+    @pytest.mark.integration
+    def test_worktrees_share_one_lock(self, repo, tmp_path, monkeypatch):
+        git(repo, "worktree", "add", "-q", str(tmp_path / "wt"), "-b", "wt")
+        monkeypatch.setenv(locking.LOCK_TIMEOUT_ENV, "0.05")
+        with locking.hold(locking.WRITE, repo):
+            response = cli.run({"command": "commit", "args": ["--allow-empty", "-m", "wt"]}, cwd=str(tmp_path / "wt"))
+        assert response["error_code"] == "LOCK_TIMEOUT"
+        assert git(repo, "rev-list", "--count", "wt").strip() == "1"
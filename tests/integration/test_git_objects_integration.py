@@ -0,0 +1,95 @@
+"""
+Integration tests comparing the in-process object reader with git cat-file
+"""
+import os
+import subprocess
+import pytest
+
+from plugins.git import objects
+from plugins.git import fastpath
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+def all_objects(cwd):
+    """(oid, type, size) of every object, as git cat-file reports them"""
+    lines = git(cwd, "cat-file", "--batch-all-objects", "--batch-check").splitlines()
+    return [(oid, type_name, int(size)) for oid, type_name, size in (line.split() for line in lines)]
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestObjectsMatchGit:
+    """The object reader must agree with git cat-file on every object"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def corpus(self, tmp_path):
+        """A history with growing files (deltas), binaries, subdirectories and tags"""
+        path = str(tmp_path / "corpus")
+        os.makedirs(path)
+        git(path, "init", "-q", "-b", "main")
+        for i in range(1, 31):
+            with open(os.path.join(path, "big.txt"), "w") as f:
+                f.write("".join(f"line {n}\n" for n in range(i * 40)))
+            os.makedirs(os.path.join(path, f"dir{i % 3}"), exist_ok=True)
+            with open(os.path.join(path, f"dir{i % 3}", f"file{i}.txt"), "w") as f:
+                f.write(f"{i}\n")
+            with open(os.path.join(path, "data.bin"), "wb") as f:
+                f.write(bytes([0, 1, 2, i]) * 100)
+            git(path, "add", "-A")
+            git(path, "commit", "-q", "-m", f"commit {i}")
+        git(path, "tag", "-a", "-m", "release", "v1", "HEAD~5")
+        return path
+    
+    def assert_store_matches(self, path):
+        repository = repo_module.discover(path)
+        listing = all_objects(path)
+        assert listing
+        for oid, type_name, size in listing:
+            assert objects.object_type(repository, oid) == type_name
+            assert objects.object_size(repository, oid) == size
+            assert objects.read_object(repository, oid)[1] == git(path, "cat-file", type_name, oid, text=False)
+            assert objects.cat_file(repository, "-p", oid) == git(path, "cat-file", "-p", oid, text=False)
+        return repository
+    
+    def test_loose_objects(self, corpus):
+        self.assert_store_matches(corpus)
+    
+    def test_ofs_delta_pack(self, corpus):
+        git(corpus, "gc", "-q", "--aggressive")
+        repository = self.assert_store_matches(corpus)
+        assert objects.store(repository)._base_cache_bytes > 0
+    
+    def test_ref_delta_pack_plus_loose(self, corpus):
+        git(corpus, "-c", "repack.useDeltaBaseOffset=false", "repack", "-q", "-a", "-d", "-f")
+        with open(os.path.join(corpus, "late.txt"), "w") as f:
+            f.write("written after the repack\n")
+        git(corpus, "add", "late.txt")
+        git(corpus, "commit", "-q", "-m", "late")
+        self.assert_store_matches(corpus)
+    
+    def test_fast_read_matches_git(self, corpus):
+        git(corpus, "gc", "-q")
+        head = git(corpus, "rev-parse", "HEAD").strip()
+        tree = git(corpus, "rev-parse", "HEAD^{tree}").strip()
+        for argv in (["-t", head], ["-s", tree], ["-p", head], ["-p", tree], ["commit", head],
+                     ["-e", head], ["-t", "HEAD"], ["-p", "HEAD"]):
+            fast = fastpath.fast_read(["git", "cat-file"] + argv, corpus)
+            expected = subprocess.run(["git", "cat-file"] + argv, cwd=corpus, capture_output=True, text=True)
+            assert (fast.returncode, fast.stdout) == (expected.returncode, expected.stdout), argv
+    
+    def test_default_for_each_ref_matches_git(self, corpus):
+        for argv in (["for-each-ref"], ["for-each-ref", "--format=%(objecttype) %(objectsize) %(refname)"]):
+            fast = fastpath.fast_read(["git"] + argv, corpus)
+            assert fast.stdout == git(corpus, *argv)
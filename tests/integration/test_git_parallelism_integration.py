@@ -0,0 +1,96 @@
+"""
+Integration tests for parallelism settings on real fetches, clones and checkouts with submodules
+"""
+import os
+import pytest
+
+from plugins.git import cli, parallelism
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+SUBMODULES = 4
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestParallelism:
+    """Commands run with the added settings must behave as they do without them"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch, tmp_path):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+        # Submodules cloned from local paths need the file protocol, which git restricts by default
+        config = tmp_path / "gitconfig"
+        config.write_text("[protocol \"file\"]\n\tallow = always\n")
+        monkeypatch.setenv("GIT_CONFIG_GLOBAL", str(config))
+        monkeypatch.setenv(parallelism.JOBS_DIR_ENV, str(tmp_path / "jobs"))
+        monkeypatch.setenv(parallelism.JOBS_ENV, "3")
+    
+    @pytest.fixture
+    def superproject(self, tmp_path):
+        """A bare superproject with four submodules, each a repository with one commit"""
+        work = str(tmp_path / "work")
+        os.makedirs(work)
+        git(work, "init", "-q", "-b", "main")
+        for n in range(SUBMODULES):
+            sub = str(tmp_path / f"sub{n}")
+            os.makedirs(sub)
+            git(sub, "init", "-q", "-b", "main")
+            with open(os.path.join(sub, "file.txt"), "w") as f:
+                f.write(f"submodule {n}\n")
+            git(sub, "add", ".")
+            git(sub, "commit", "-q", "-m", f"submodule {n}")
+            git(work, "submodule", "add", "-q", sub, f"libs/sub{n}")
+        git(work, "commit", "-q", "-m", "add submodules")
+        bare = str(tmp_path / "super.git")
+        git(str(tmp_path), "clone", "-q", "--bare", work, bare)
+        return bare
+    
+    @pytest.mark.integration
+    def test_clone_with_submodules(self, superproject, tmp_path):
+        result = cli.run({"command": "clone", "args": ["-q", "--recurse-submodules", superproject, "clone"]},
+                         cwd=str(tmp_path))
+        assert result["success"] is True, result
+        assert result["command"] == f"git clone -q --recurse-submodules {superproject} clone"
+        assert result["parallelism"] == {"jobs": 3, "budget": 3, "config": {
+            "submodule.fetchJobs": 3, "checkout.workers": 3, "pack.threads": 3}}
+        for n in range(SUBMODULES):
+            with open(tmp_path / "clone" / "libs" / f"sub{n}" / "file.txt") as f:
+                assert f.read() == f"submodule {n}\n"
+    
+    @pytest.mark.integration
+    def test_submodule_update_and_fetch(self, superproject, tmp_path):
+        git(str(tmp_path), "clone", "-q", superproject, "clone")
+        path = str(tmp_path / "clone")
+        result = cli.run({"command": "submodule", "args": ["update", "-q", "--init"]}, cwd=path)
+        assert result["success"] is True, result
+        assert result["parallelism"]["config"]["submodule.fetchJobs"] == 3
+        assert git(path, "submodule", "status").count(" libs/sub") == SUBMODULES
+        result = cli.run({"command": "fetch", "args": ["-q", "--recurse-submodules", "origin"]}, cwd=path)
+        assert result["success"] is True, result
+        assert result["parallelism"]["config"] == {"fetch.parallel": 3, "submodule.fetchJobs": 3, "pack.threads": 3}
+        # The repository's own settings win
+        git(path, "config", "fetch.parallel", "1")
+        result = cli.run({"command": "fetch", "args": ["-q", "origin"]}, cwd=path)
+        assert "fetch.parallel" not in result["parallelism"]["config"]
+    
+    @pytest.mark.integration
+    def test_status_and_checkout(self, superproject, tmp_path):
+        git(str(tmp_path), "clone", "-q", superproject, "clone")
+        path = str(tmp_path / "clone")
+        result = cli.run({"command": "checkout", "args": ["-q", "-b", "topic"]}, cwd=path)
+        assert result["success"] is True, result
+        assert result["parallelism"]["config"] == {"checkout.workers": 3, "index.threads": 3}
+        result = cli.run({"command": "status", "args": ["--porcelain"]}, cwd=path)
+        assert result["success"] is True and "stdout" not in result
+        assert result["parallelism"]["config"] == {"index.threads": 3}
+        # Every job is back in the budget
+        with parallelism.lease(["git", "status"], path) as (_, report):
+            assert report["jobs"] == 3
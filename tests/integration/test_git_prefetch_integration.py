@@ -0,0 +1,103 @@
+"""
+Integration tests for background prefetches from local bare remotes
+"""
+import os
+import pytest
+
+from plugins.git import cli, prefetch
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+def commit(cwd, name, content):
+    with open(os.path.join(cwd, name), "w") as f:
+        f.write(content)
+    git(cwd, "add", name)
+    git(cwd, "commit", "-q", "-m", f"update {name}")
+
+
+def object_ids(cwd):
+    """Every object in the repository, loose or packed"""
+    return set(git(cwd, "cat-file", "--batch-all-objects", "--batch-check=%(objectname)").split())
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestPrefetch:
+    """Prefetches must fill refs/prefetch/ so that the foreground fetch has nothing left to transfer"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch, tmp_path):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv(prefetch.PREFETCH_FILE_ENV, str(tmp_path / "prefetch.json"))
+    
+    @pytest.fixture
+    def remote(self, tmp_path):
+        """A bare remote, a clone that the tests fetch into and a second clone that pushes to the remote"""
+        bare = str(tmp_path / "remote.git")
+        git(str(tmp_path), "init", "-q", "--bare", "-b", "main", bare)
+        pusher = str(tmp_path / "pusher")
+        git(str(tmp_path), "clone", "-q", bare, pusher)
+        commit(pusher, "file.txt", "first\n")
+        git(pusher, "push", "-q", "origin", "HEAD:main", "HEAD:topic")
+        git(str(tmp_path), "clone", "-q", bare, str(tmp_path / "clone"))
+        return bare, pusher, str(tmp_path / "clone")
+    
+    @pytest.mark.integration
+    def test_prefetch_then_fetch(self, remote):
+        bare, pusher, clone = remote
+        result = cli.run({"command": "fetch", "args": ["-q"]}, cwd=clone)
+        assert result["success"] is True, result
+        [entry] = prefetch.scheduled()
+        assert (entry["remote"], entry["uses"], entry["next_due"]) == ("origin", 1, 0)
+        for n in range(5):
+            commit(pusher, f"file{n}.txt", f"change {n}\n" * 100)
+        git(pusher, "push", "-q", "origin", "HEAD:main", ":topic")
+        tip = git(bare, "rev-parse", "main").strip()
+        before = git(clone, "rev-parse", "origin/main").strip()
+        with open(os.path.join(clone, ".git", "FETCH_HEAD")) as f:
+            fetch_head = f.read()
+        [report] = prefetch.run_due()
+        assert report["action"] == "fetched", report
+        # The remote's branches are in refs/prefetch/, and nothing the user sees has moved
+        assert git(clone, "for-each-ref", "--format=%(refname) %(objectname)", "refs/prefetch/") == (
+            f"refs/prefetch/remotes/origin/main {tip}\n")
+        assert git(clone, "rev-parse", "origin/main").strip() == before
+        with open(os.path.join(clone, ".git", "FETCH_HEAD")) as f:
+            assert f.read() == fetch_head
+        # The foreground fetch only moves refs: every object it needs is already here
+        objects = object_ids(clone)
+        result = cli.run({"command": "fetch", "args": ["-q", "--prune"]}, cwd=clone)
+        assert result["success"] is True, result
+        assert git(clone, "rev-parse", "origin/main").strip() == tip
+        assert object_ids(clone) == objects
+        assert prefetch.scheduled()[0]["uses"] == 2
+    
+    @pytest.mark.integration
+    def test_prefetch_command(self, remote, tmp_path):
+        _, _, clone = remote
+        assert prefetch.record(["git", "pull"], clone) == ["origin"]
+        assert prefetch.manage({"list": True})["result"][0]["last_prefetch"] is None
+        result = prefetch.manage({})
+        assert result["success"] is True, result
+        assert [report["action"] for report in result["prefetched"]] == ["fetched"]
+        assert git(clone, "for-each-ref", "--format=%(refname)", "refs/prefetch/") == (
+            "refs/prefetch/remotes/origin/main\nrefs/prefetch/remotes/origin/topic\n")
+        # Not due again until its interval has passed
+        assert prefetch.manage({})["prefetched"] == []
+    
+    @pytest.mark.integration
+    def test_unreachable_remote(self, remote, tmp_path):
+        bare, _, clone = remote
+        prefetch.record(["git", "fetch"], clone)
+        os.rename(bare, str(tmp_path / "moved.git"))
+        [report] = prefetch.run_due()
+        assert report["action"] == "failed" and report["error"]
+        assert prefetch.scheduled()[0]["error"] == report["error"]
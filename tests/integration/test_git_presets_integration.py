@@ -0,0 +1,126 @@
+"""
+Integration tests for partial, shallow and sparse clone presets against a file:// remote
+"""
+import os
+import pytest
+
+from plugins.git import cli
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+FILES = ("README.md", "services/api/main.py", "services/web/app.js", "docs/guide.md")
+
+
+def missing_objects(path):
+    listing = git(path, "rev-list", "--objects", "--all", "--missing=print")
+    return [line[1:] for line in listing.splitlines() if line.startswith("?")]
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestClonePresets:
+    """Preset clones must leave out what they promise and fetch it on demand later"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def remote(self, tmp_path):
+        """Three commits of a small monorepo in a bare repository that serves filtered fetches"""
+        work = str(tmp_path / "work")
+        os.makedirs(work)
+        git(work, "init", "-q", "-b", "main")
+        for n in range(3):
+            for name in FILES:
+                os.makedirs(os.path.dirname(os.path.join(work, name)) or work, exist_ok=True)
+                with open(os.path.join(work, name), "w") as f:
+                    f.write(f"{name} version {n}\n")
+            git(work, "add", ".")
+            git(work, "commit", "-q", "-m", f"version {n}")
+        bare = str(tmp_path / "remote.git")
+        git(str(tmp_path), "clone", "-q", "--bare", work, bare)
+        git(bare, "config", "uploadpack.allowFilter", "true")
+        git(work, "remote", "add", "origin", bare)
+        return work, "file://" + bare
+    
+    def clone(self, tmp_path, url, **options):
+        return cli.run(dict({"command": "clone", "args": ["-q", url, "clone"]}, **options), cwd=str(tmp_path))
+    
+    @pytest.mark.integration
+    def test_blobless_fetches_blobs_on_demand(self, remote, tmp_path):
+        work, url = remote
+        result = self.clone(tmp_path, url, preset="blobless")
+        assert result["success"] is True, result
+        path = str(tmp_path / "clone")
+        assert git(path, "config", "remote.origin.promisor").strip() == "true"
+        # Only the checked-out version of each file was sent
+        missing = missing_objects(path)
+        assert len(missing) == 2 * len(FILES)
+        shown = cli.run({"command": "show", "args": ["HEAD~2:docs/guide.md"]}, cwd=path)
+        assert shown["success"] is True and shown["stdout"] == "docs/guide.md version 0\n"
+        # The in-process object reader hands missing blobs to git, which fetches them
+        oid = git(path, "rev-parse", "HEAD~1:README.md").strip()
+        assert oid in missing_objects(path)
+        assert cli.run({"command": "cat-file", "args": ["-p", oid]}, cwd=path)["stdout"] == "README.md version 1\n"
+        assert len(missing_objects(path)) == 2 * len(FILES) - 2
+    
+    @pytest.mark.integration
+    def test_treeless_log_patch(self, remote, tmp_path):
+        work, url = remote
+        assert self.clone(tmp_path, url, preset="treeless")["success"] is True
+        path = str(tmp_path / "clone")
+        assert missing_objects(path)
+        result = cli.run({"command": "log", "args": ["-p", "--format=%s", "--", "services/api"]}, cwd=path)
+        assert result["success"] is True
+        assert "-services/api/main.py version 0" in result["stdout"]
+    
+    @pytest.mark.integration
+    def test_shallow_single_branch(self, remote, tmp_path):
+        work, url = remote
+        git(work, "push", "-q", "origin", "main:other")
+        assert self.clone(tmp_path, url, preset="shallow")["success"] is True
+        path = str(tmp_path / "clone")
+        assert os.path.exists(os.path.join(path, ".git", "shallow"))
+        assert cli.run({"command": "rev-list", "args": ["--count", "HEAD"]}, cwd=path)["stdout"] == "1\n"
+        assert git(path, "for-each-ref", "--format=%(refname)", "refs/remotes").split() == [
+            "refs/remotes/origin/HEAD", "refs/remotes/origin/main"]
+    
+    @pytest.mark.integration
+    def test_sparse_cone(self, remote, tmp_path):
+        work, url = remote
+        result = self.clone(tmp_path, url, sparse=["services/api"])
+        assert result["success"] is True, result
+        path = str(tmp_path / "clone")
+        assert result["sparse"] == {"path": path, "directories": ["services/api"]}
+        assert sorted(os.listdir(path)) == [".git", "README.md", "services"]
+        assert os.listdir(os.path.join(path, "services")) == ["api"]
+        status = cli.run({"command": "status", "args": ["--porcelain"]}, cwd=path)
+        assert status["success"] is True and "stdout" not in status
+        # Widening the cone fetches the newly needed blobs
+        assert cli.run({"command": "sparse-checkout", "args": ["add", "docs"]}, cwd=path)["success"] is True
+        with open(os.path.join(path, "docs", "guide.md")) as f:
+            assert f.read() == "docs/guide.md version 2\n"
+    
+    @pytest.mark.integration
+    def test_blobless_fetch(self, remote, tmp_path):
+        work, url = remote
+        assert self.clone(tmp_path, url, preset="blobless")["success"] is True
+        path = str(tmp_path / "clone")
+        before = len(missing_objects(path))
+        with open(os.path.join(work, "docs", "guide.md"), "w") as f:
+            f.write("docs/guide.md version 3\n")
+        git(work, "commit", "-q", "-am", "version 3")
+        git(work, "push", "-q", "origin", "main")
+        result = cli.run({"command": "fetch", "args": ["-q", "origin"], "preset": "blobless"}, cwd=path)
+        assert result["success"] is True, result
+        assert result["command"] == "git fetch --filter=blob:none -q origin"
+        # The new version of the file is left on the remote until something reads it
+        assert len(missing_objects(path)) == before + 1
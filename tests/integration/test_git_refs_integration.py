@@ -0,0 +1,115 @@
+"""
+Integration tests comparing the in-process ref readers with real git
+"""
+import os
+import subprocess
+import pytest
+
+from plugins.git import fastpath
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestRefsMatchGit:
+    """The fast path must print exactly what git prints"""
+    
+    COMMANDS = [
+        ["rev-parse", "HEAD"],
+        ["rev-parse", "--verify", "HEAD"],
+        ["rev-parse", "--abbrev-ref", "HEAD"],
+        ["rev-parse", "--symbolic-full-name", "HEAD"],
+        ["branch", "--show-current"],
+        ["symbolic-ref", "HEAD"],
+        ["symbolic-ref", "--short", "HEAD"],
+        ["show-ref"],
+        ["show-ref", "--heads"],
+        ["show-ref", "--tags"],
+        ["for-each-ref", "--format=%(refname) %(objectname)"],
+        ["for-each-ref", "--format=%(objectname)%09%(refname)", "refs/heads", "refs/tags/v1"],
+        ["for-each-ref", "--format=%(refname)", "refs/remotes/"],
+    ]
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def cloned_repo(self, tmp_path):
+        """A clone with packed refs, loose refs, annotated tags and origin/HEAD"""
+        origin = str(tmp_path / "origin")
+        os.makedirs(origin)
+        git(origin, "init", "-q", "-b", "main")
+        for i in range(3):
+            with open(os.path.join(origin, "file.txt"), "w") as f:
+                f.write(f"{i}\n")
+            git(origin, "add", "file.txt")
+            git(origin, "commit", "-q", "-m", f"commit {i}")
+            git(origin, "branch", f"topic-{i}")
+        git(origin, "tag", "v1", "HEAD~1")
+        git(origin, "tag", "-a", "-m", "release", "v2")
+        clone = str(tmp_path / "clone")
+        git(str(tmp_path), "clone", "-q", origin, clone)
+        git(clone, "branch", "local-only", "HEAD~2")
+        return clone
+    
+    def assert_matches(self, cwd, argv):
+        fast = fastpath.fast_read(["git"] + argv, cwd)
+        expected = subprocess.run(["git"] + argv, cwd=cwd, capture_output=True, text=True)
+        if fast is None:
+            return False
+        assert (fast.returncode, fast.stdout) == (expected.returncode, expected.stdout), argv
+        return True
+    
+    def test_clone_matches_git(self, cloned_repo):
+        answered = [argv for argv in self.COMMANDS if self.assert_matches(cloned_repo, argv)]
+        # Everything is answerable here; nothing should have fallen back
+        assert answered == self.COMMANDS
+    
+    def test_subdirectory_matches_git(self, cloned_repo):
+        sub = os.path.join(cloned_repo, "a", "b")
+        os.makedirs(sub)
+        assert self.assert_matches(sub, ["rev-parse", "HEAD"])
+        assert self.assert_matches(sub, ["show-ref", "--heads"])
+    
+    def test_after_pack_refs_matches_git(self, cloned_repo):
+        git(cloned_repo, "pack-refs", "--all")
+        git(cloned_repo, "update-ref", "refs/heads/topic-0", "HEAD")
+        for argv in self.COMMANDS:
+            self.assert_matches(cloned_repo, argv)
+        assert fastpath.fast_read(["git", "show-ref", "--heads"], cloned_repo) is not None
+    
+    def test_detached_head_matches_git(self, cloned_repo):
+        git(cloned_repo, "checkout", "-q", "--detach", "HEAD~1")
+        for argv in (["rev-parse", "HEAD"], ["rev-parse", "--abbrev-ref", "HEAD"],
+                     ["rev-parse", "--symbolic-full-name", "HEAD"], ["branch", "--show-current"]):
+            assert self.assert_matches(cloned_repo, argv)
+    
+    def test_linked_worktree_matches_git(self, cloned_repo, tmp_path):
+        worktree = str(tmp_path / "wt")
+        git(cloned_repo, "worktree", "add", "-q", "-b", "wt-branch", worktree, "HEAD~1")
+        for argv in (["rev-parse", "HEAD"], ["branch", "--show-current"], ["symbolic-ref", "HEAD"], ["show-ref"]):
+            assert self.assert_matches(worktree, argv)
+    
+    def test_bare_repository_matches_git(self, cloned_repo, tmp_path):
+        bare = str(tmp_path / "bare.git")
+        git(str(tmp_path), "clone", "-q", "--bare", cloned_repo, bare)
+        for argv in (["rev-parse", "HEAD"], ["show-ref"], ["symbolic-ref", "HEAD"]):
+            assert self.assert_matches(bare, argv)
+    
+    def test_unborn_branch_matches_git(self, tmp_path):
+        repo = str(tmp_path / "empty")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "trunk")
+        assert self.assert_matches(repo, ["branch", "--show-current"])
+        assert self.assert_matches(repo, ["symbolic-ref", "HEAD"])
+        assert self.assert_matches(repo, ["show-ref"])
+        assert fastpath.fast_read(["git", "rev-parse", "HEAD"], repo) is None
@@ -0,0 +1,130 @@
+"""
+Integration tests for the git plugin's incremental commit search index against real git
+"""
+import os
+import pytest
+
+from plugins.git import repo as repo_module
+from plugins.git import search
+from plugins.git.search import CommitIndex
+from tests.conftest import git
+
+
+def grep_oids(repo, word):
+    """What git log --grep finds over the indexed refs"""
+    return set(git(repo, "log", "--branches", "--tags", "--remotes", "HEAD", "-i", f"--grep=\\b{word}\\b",
+                   "--format=%H").split())
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestCommitSearch:
+    """Searches must agree with git log --grep and track ref updates incrementally"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def repo(self, tmp_path):
+        """A main line, a side branch, an annotated tag and a tag of a tree"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        words = ["alpha", "beta", "gamma"]
+        for number in range(9):
+            env = dict(os.environ, GIT_AUTHOR_NAME="Ann" if number % 2 else "Bob",
+                       GIT_COMMITTER_DATE=f"2024-01-{10 + number}T12:00:00Z")
+            git(repo, "commit", "-q", "--allow-empty", "-m", f"{words[number % 3]} change {number}",
+                "-m", f"Details about {words[(number + 1) % 3]}.", env=env)
+        git(repo, "tag", "-a", "v1", "-m", "release", "HEAD~4")
+        git(repo, "tag", "tree", "HEAD^{tree}")
+        git(repo, "checkout", "-q", "-b", "side", "HEAD~3")
+        git(repo, "commit", "-q", "--allow-empty", "-m", "delta on the side")
+        git(repo, "checkout", "-q", "main")
+        return repo
+    
+    @pytest.mark.integration
+    def test_first_search_builds_index(self, repo):
+        response = search.search({"query": "alpha", "limit": 100}, cwd=repo)
+        assert response["success"] is True
+        assert response["fresh"] is True
+        assert response["synced"]["added"] == response["indexed_commits"] == 10
+        assert {r["oid"] for r in response["result"]} == grep_oids(repo, "alpha")
+        assert os.path.isfile(os.path.join(repo, ".git", search.INDEX_NAME))
+        again = search.search({"query": "alpha", "limit": 100}, cwd=repo)
+        assert "synced" not in again and again["result"] == response["result"]
+        record = search.search({"query": "delta"}, cwd=repo)["result"][0]
+        assert record["subject"] == "delta on the side"
+        assert record["parents"] == [git(repo, "rev-parse", "main~3").strip()]
+        assert record["author_name"] == "Test User"
+    
+    @pytest.mark.integration
+    def test_author_and_time_filters(self, repo):
+        response = search.search({"author": "Ann", "since": "2024-01-12", "until": "2024-01-15T12:00:00Z",
+                                  "order": "date"}, cwd=repo)
+        expected = git(repo, "log", "main", "--author=Ann", "--since=2024-01-12T00:00:00Z",
+                       "--until=2024-01-15T12:00:00Z", "--format=%s").splitlines()
+        assert [r["subject"] for r in response["result"]] == expected
+    
+    @pytest.mark.integration
+    def test_sync_walks_only_new_commits(self, repo):
+        search.search({}, cwd=repo)
+        git(repo, "checkout", "-q", "-b", "topic")
+        for number in range(3):
+            git(repo, "commit", "-q", "--allow-empty", "-m", f"epsilon {number}")
+        git(repo, "checkout", "-q", "main")
+        stale = search.search({"query": "epsilon", "sync": False}, cwd=repo)
+        assert (stale["fresh"], stale["stale_refs"], stale["record_count"]) == (False, ["refs/heads/topic"], 0)
+        response = search.search({"query": "epsilon"}, cwd=repo)
+        assert (response["fresh"], response["synced"]["added"], response["record_count"]) == (True, 3, 3)
+    
+    @pytest.mark.integration
+    def test_detached_head_and_rewritten_branch(self, repo):
+        search.search({}, cwd=repo)
+        git(repo, "checkout", "-q", "--detach")
+        git(repo, "commit", "-q", "--allow-empty", "-m", "zeta detached")
+        assert search.search({"sync": False}, cwd=repo)["stale_refs"] == ["HEAD"]
+        assert search.search({"query": "zeta"}, cwd=repo)["record_count"] == 1
+        git(repo, "checkout", "-q", "main")
+        old = git(repo, "rev-parse", "HEAD").strip()
+        git(repo, "commit", "-q", "--amend", "--allow-empty", "-m", "eta amended")
+        response = search.search({"query": "change 8"}, cwd=repo)
+        assert response["fresh"] is True and response["synced"]["added"] == 1
+        # The replaced commit stays searchable until the index is rebuilt
+        assert [r["oid"] for r in response["result"]] == [old]
+    
+    @pytest.mark.integration
+    def test_worktrees_share_the_index(self, repo, tmp_path):
+        search.search({}, cwd=repo)
+        linked = str(tmp_path / "linked")
+        git(repo, "worktree", "add", "-q", linked, "side")
+        response = search.search({"query": "delta"}, cwd=linked)
+        assert (response["fresh"], response["record_count"], "synced" in response) == (True, 1, False)
+    
+    @pytest.mark.integration
+    def test_freshness_through_git_when_layout_is_unusual(self, repo, monkeypatch):
+        search.search({}, cwd=repo)
+        with CommitIndex(os.path.join(repo, ".git", search.INDEX_NAME)) as index:
+            assert index.stale_refs(repo) == []
+            in_process = search.current_refs(repo)
+            monkeypatch.setenv("GIT_DIR", os.path.join(repo, ".git"))
+            assert repo_module.discover(repo) is None
+            assert search.current_refs(repo) == in_process
+            assert index.stale_refs(repo) == []
+            assert search.default_path(repo) == os.path.join(repo, ".git", search.INDEX_NAME)
+            git(repo, "branch", "-f", "side", "main")
+            assert index.stale_refs(repo) == ["refs/heads/side"]
+    
+    @pytest.mark.integration
+    def test_not_a_repository(self, tmp_path):
+        response = search.search({}, cwd=str(tmp_path))
+        assert response["success"] is False
+        assert response["error_code"] == "COMMAND_FAILED_128"
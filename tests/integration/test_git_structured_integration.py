@@ -0,0 +1,588 @@
+"""
+Integration tests for the git plugin's structured output modes against real git
+"""
+import json
+import os
+import subprocess
+import pytest
+
+from plugins.git import cli as git_cli
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestStructuredStatus:
+    """run(structured=True) on status must reflect what git reports"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def work_repo(self, tmp_path):
+        """A repository with an upstream, a rename, a modification, a conflict, untracked and ignored files"""
+        origin = str(tmp_path / "origin")
+        os.makedirs(origin)
+        git(origin, "init", "-q", "-b", "main")
+        write(os.path.join(origin, "old name.txt"), "rename me\n" * 20)
+        write(os.path.join(origin, "dir", "edit.txt"), "one\n")
+        write(os.path.join(origin, "conflict.txt"), "base\n")
+        write(os.path.join(origin, ".gitignore"), "*.log\n")
+        git(origin, "add", "-A")
+        git(origin, "commit", "-q", "-m", "initial")
+        repo = str(tmp_path / "repo")
+        git(str(tmp_path), "clone", "-q", origin, repo)
+        git(repo, "checkout", "-q", "-b", "other")
+        write(os.path.join(repo, "conflict.txt"), "other\n")
+        git(repo, "commit", "-q", "-am", "other side")
+        git(repo, "checkout", "-q", "main")
+        write(os.path.join(repo, "conflict.txt"), "main\n")
+        git(repo, "commit", "-q", "-am", "main side")
+        subprocess.run(["git", "merge", "-q", "other"], cwd=repo, capture_output=True)
+        git(repo, "mv", "old name.txt", "new name.txt")
+        write(os.path.join(repo, "dir", "edit.txt"), "two\n")
+        write(os.path.join(repo, "untracked file"), "new\n")
+        write(os.path.join(repo, "debug.log"), "ignored\n")
+        return repo
+    
+    def test_status_records(self, work_repo):
+        response = git_cli.run({"command": "status", "args": ["--ignored"], "structured": True}, cwd=work_repo)
+        assert response["success"] is True
+        assert response["stdout_bytes"] > 0
+        records = response["result"]
+        head = git(work_repo, "rev-parse", "HEAD").strip()
+        assert records[0] == {"type": "branch", "oid": head, "head": "main", "upstream": "origin/main",
+                              "ahead": 1, "behind": 0}
+        by_type = {}
+        for record in records[1:]:
+            by_type.setdefault(record["type"], []).append(record)
+        assert [(r["path"], r["orig_path"], r["similarity"]) for r in by_type["renamed"]] == [
+            ("new name.txt", "old name.txt", 100)]
+        assert [(r["xy"], r["path"]) for r in by_type["changed"]] == [(".M", "dir/edit.txt")]
+        assert [(r["xy"], r["path"]) for r in by_type["unmerged"]] == [("UU", "conflict.txt")]
+        assert by_type["unmerged"][0]["oid_stage1"] == git(work_repo, "rev-parse", ":1:conflict.txt").strip()
+        assert [r["path"] for r in by_type["untracked"]] == ["untracked file"]
+        assert [r["path"] for r in by_type["ignored"]] == ["debug.log"]
+    
+    def test_user_format_options_are_overridden(self, work_repo):
+        response = git_cli.run({"command": "status", "args": ["--short", "-uno", "--", "dir"], "structured": True},
+                               cwd=work_repo)
+        assert [r["type"] for r in response["result"]] == ["branch", "changed"]
+    
+    def test_many_entries(self, work_repo):
+        for i in range(3000):
+            write(os.path.join(work_repo, "bulk", f"file {i:04d} ünïcode.txt"), "x")
+        response = git_cli.run({"command": "status", "args": ["-uall"], "structured": True}, cwd=work_repo)
+        untracked = [r["path"] for r in response["result"] if r["type"] == "untracked"]
+        assert len(untracked) == 3001
+        assert "bulk/file 2999 ünïcode.txt" in untracked
+    
+    def test_outside_repository(self, tmp_path):
+        response = git_cli.run({"command": "status", "structured": True}, cwd=str(tmp_path))
+        assert response["success"] is False
+        assert "not a git repository" in response["result"]
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestStructuredListing:
+    """Paged ls-files / ls-tree listings must add up to git's own listing"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def tree_repo(self, tmp_path):
+        """A committed tree with nested directories, odd names and an executable"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        names = ["README", "a-b", "a.txt", "a/b/c.py", "a/d.py", "docs/guide.md", "space name.txt", "src/app.py",
+                 "src/application/x.py", "src/lib.txt", "ünï.txt"]
+        for number, name in enumerate(names):
+            write(os.path.join(repo, name), "x" * number)
+        os.chmod(os.path.join(repo, "src", "app.py"), 0o755)
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "initial")
+        return repo
+    
+    def pages(self, repo, options):
+        paths, cursor = [], None
+        while True:
+            args = dict(options, structured=True, limit=3)
+            if cursor:
+                args["cursor"] = cursor
+            response = git_cli.run(args, cwd=repo)
+            assert response["success"] is True
+            paths.extend(response["result"])
+            cursor = response.get("next_cursor")
+            if cursor is None:
+                return paths
+    
+    def test_ls_files_pages_match_git(self, tree_repo):
+        expected = git(tree_repo, "ls-files", "-z").split("\0")[:-1]
+        records = self.pages(tree_repo, {"command": "ls-files"})
+        assert [r["path"] for r in records] == expected
+    
+    def test_ls_files_columns_match_git(self, tree_repo):
+        response = git_cli.run({"command": "ls-files", "structured": True, "columns": "mode,oid,size"}, cwd=tree_repo)
+        for record, line in zip(response["result"], git(tree_repo, "ls-files", "-s").splitlines()):
+            mode, oid, _ = line.split("\t")[0].split()
+            assert (record["mode"], record["oid"]) == (mode, oid)
+            assert record["size"] == int(git(tree_repo, "cat-file", "-s", oid))
+        assert next(r for r in response["result"] if r["path"] == "src/app.py")["mode"] == "100755"
+    
+    def test_ls_tree_pages_match_git(self, tree_repo):
+        expected = []
+        for line in git(tree_repo, "ls-tree", "-r", "-l", "-z", "HEAD").split("\0")[:-1]:
+            head, path = line.split("\t", 1)
+            mode, _, oid, size = head.split()
+            expected.append({"path": path, "mode": mode, "oid": oid, "size": int(size)})
+        records = self.pages(tree_repo, {"command": "ls-tree", "args": "HEAD", "columns": "mode,oid,size"})
+        assert records == expected
+    
+    def test_filters(self, tree_repo):
+        response = git_cli.run({"command": "ls-tree", "args": "HEAD", "structured": True, "prefix": "src/app"},
+                               cwd=tree_repo)
+        assert [r["path"] for r in response["result"]] == ["src/app.py", "src/application/x.py"]
+        assert response["command"].endswith("-- src/")
+        response = git_cli.run({"command": "ls-files", "structured": True, "glob": "*.py", "prefix": "a"},
+                               cwd=tree_repo)
+        assert [r["path"] for r in response["result"]] == ["a/b/c.py", "a/d.py"]
+    
+    def test_subdirectory_paths_are_relative(self, tree_repo):
+        response = git_cli.run({"command": "ls-files", "structured": True, "prefix": "application/"},
+                               cwd=os.path.join(tree_repo, "src"))
+        assert [r["path"] for r in response["result"]] == ["application/x.py"]
+    
+    def test_unmerged_entries_page_one_at_a_time(self, tree_repo):
+        git(tree_repo, "checkout", "-q", "-b", "other")
+        write(os.path.join(tree_repo, "a.txt"), "other\n")
+        git(tree_repo, "commit", "-q", "-am", "other")
+        git(tree_repo, "checkout", "-q", "main")
+        write(os.path.join(tree_repo, "a.txt"), "main\n")
+        git(tree_repo, "commit", "-q", "-am", "main")
+        subprocess.run(["git", "merge", "-q", "other"], cwd=tree_repo, capture_output=True)
+        expected = git(tree_repo, "ls-files", "-s", "-z").split("\0")[:-1]
+        paths, cursor = [], None
+        while True:
+            args = {"command": "ls-files", "structured": True, "limit": 1, "columns": "oid"}
+            if cursor:
+                args["cursor"] = cursor
+            response = git_cli.run(args, cwd=tree_repo)
+            paths.extend((r["oid"], r["path"]) for r in response["result"])
+            cursor = response.get("next_cursor")
+            if cursor is None:
+                break
+        assert paths == [(line.split()[1], line.split("\t")[1]) for line in expected]
+        assert [path for _, path in paths].count("a.txt") == 3
+    
+    def test_ndjson_output(self, tree_repo, tmp_path):
+        target = str(tmp_path / "tree.ndjson")
+        response = git_cli.run({"command": "ls-tree", "args": "HEAD", "structured": True, "output": target},
+                               cwd=tree_repo)
+        assert response["record_count"] == 11
+        with open(target, encoding="utf-8") as f:
+            assert [json.loads(line)["path"] for line in f] == git(tree_repo, "ls-tree", "-r", "-z", "--name-only",
+                                                                   "HEAD").split("\0")[:-1]
+    
+    def test_bad_tree_reports_git_error(self, tree_repo):
+        response = git_cli.run({"command": "ls-tree", "args": "nope", "structured": True}, cwd=tree_repo)
+        assert response["success"] is False
+        assert "Not a valid object name" in response["result"]
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestStructuredLogAndDiff:
+    """Paged logs and diffs must add up to git's own output without repeats"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def history_repo(self, tmp_path):
+        """main with a side branch merged back every fifth commit, skewed clocks, a topic branch and an annotated tag"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        stream, mark, side = [], 0, None
+        for i in range(60):
+            mark += 1
+            when = 1600000000 + i * 60 - (3600 if i % 7 == 3 else 0)  # Some commits older than their parents
+            author = "Ann <ann@example.com>" if i % 3 else "Bob <bob@example.com>"
+            stream.append(f"commit refs/heads/main\nmark :{mark}\nauthor {author} {when} +0000\n"
+                          f"committer {author} {when} +0000\ndata 5\nc{i:03d}\n")
+            if mark > 1:
+                stream.append(f"from :{mark - 1 if side is None or i % 5 else side}\n")
+                if side is not None and i % 5 == 0:
+                    stream.append(f"merge :{mark - 1}\n")
+            stream.append(f"M 644 inline f{i % 4}.txt\ndata 4\n{i:03d}\n")
+            if i % 5 == 2:
+                mark += 1
+                stream.append(f"commit refs/heads/side\nmark :{mark}\ncommitter {author} {when + 30} +0000\n"
+                              f"data 5\nside\nfrom :{mark - 1}\nM 644 inline side.txt\ndata 4\n{i:03d}\n")
+                side = mark
+        subprocess.run(["git", "fast-import", "--quiet"], cwd=repo, input="".join(stream).encode(), check=True)
+        git(repo, "branch", "topic", "main~12")
+        git(repo, "tag", "-a", "-m", "release", "v1", "main~30")
+        git(repo, "checkout", "-q", "main")
+        return repo
+    
+    def pages(self, repo, options, limit):
+        records, cursor = [], None
+        while True:
+            args = dict(options, structured=True, limit=limit)
+            if cursor:
+                args["cursor"] = cursor
+            response = git_cli.run(args, cwd=repo)
+            assert response["success"] is True, response.get("result")
+            assert response["record_count"] <= limit
+            records.extend(response["result"])
+            cursor = response.get("next_cursor")
+            if cursor is None:
+                return records
+    
+    def assert_walk(self, repo, args, limit):
+        records = self.pages(repo, {"command": "log", "args": args}, limit)
+        oids = [r["oid"] for r in records]
+        expected = git(repo, "log", "--format=%H", *args).split()
+        assert len(oids) == len(set(oids)) == len(expected)
+        assert set(oids) == set(expected)
+        position = {oid: i for i, oid in enumerate(oids)}
+        for record in records:
+            assert all(position[record["oid"]] < position[p] for p in record["parents"] if p in position)
+    
+    @pytest.mark.parametrize("args", [[], ["--all"], ["--first-parent"], ["v1..topic"], ["--tags", "--not", "side"],
+                                      ["--branches", "--topo-order", "--since=2020-09-13"]])
+    @pytest.mark.parametrize("limit", [1, 4, 7])
+    def test_frontier_pages_cover_the_walk(self, history_repo, args, limit):
+        self.assert_walk(history_repo, args, limit)
+    
+    def test_next_page_resumes_from_frontier(self, history_repo):
+        response = git_cli.run({"command": "log", "args": ["--all"], "structured": True, "limit": 5}, cwd=history_repo)
+        assert response["truncated"] is True
+        response = git_cli.run({"command": "log", "args": ["--all"], "structured": True, "limit": 5,
+                                "cursor": response["next_cursor"]}, cwd=history_repo)
+        assert "--skip" not in response["command"]
+        assert "--all" not in response["command"]
+    
+    @pytest.mark.parametrize("args", [["--author=Bob"], ["--no-merges", "--all"], ["--", "f1.txt"]])
+    def test_filtered_logs_page_by_offset(self, history_repo, args):
+        records = self.pages(history_repo, {"command": "log", "args": args}, 4)
+        assert [r["oid"] for r in records] == git(history_repo, "log", "--format=%H", "--date-order", *args).split()
+    
+    def test_commit_fields(self, history_repo):
+        response = git_cli.run({"command": "log", "args": ["-1", "main~2", "--oneline"], "structured": True},
+                               cwd=history_repo)
+        fields = git(history_repo, "log", "-1", "--format=%H%n%P%n%an%n%ae%n%at%n%cn%n%ce%n%ct%n%s", "main~2")
+        oid, parents, an, ae, at, cn, ce, ct, subject = fields.splitlines()
+        assert response["result"] == [{
+            "oid": oid, "parents": parents.split(), "author_name": an, "author_email": ae, "author_time": int(at),
+            "committer_name": cn, "committer_email": ce, "committer_time": int(ct), "subject": subject}]
+    
+    def test_diff_pages_and_per_path_patch(self, history_repo):
+        git(history_repo, "mv", "f0.txt", "renamed.txt")
+        for number in range(12):
+            write(os.path.join(history_repo, "many", f"n{number:02d}.txt"), "new\n")
+        git(history_repo, "add", "-A")
+        git(history_repo, "rm", "-q", "--cached", "f2.txt")
+        records = self.pages(history_repo, {"command": "diff", "args": ["--cached", "-M", "--stat"]}, 5)
+        assert [r["path"] for r in records] == git(history_repo, "diff", "--cached", "-M", "--name-only",
+                                                    "-z").split("\0")[:-1]
+        assert len(records) == 14
+        assert {"status": "R", "path": "renamed.txt", "orig_path": "f0.txt", "similarity": 100} in records
+        assert {"status": "D", "path": "f2.txt"} in records
+        response = git_cli.run({"command": "diff", "args": ["--cached", "--", "many/n03.txt"]}, cwd=history_repo)
+        assert "+new" in response["result"]
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestStructuredDiffSummary:
+    """Diff summaries must agree with git's numstat and object sizes, and selected patches with git's own diff"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def refactor_repo(self, tmp_path):
+        """Staged edits, a binary rewrite, a rename, a quoted name, a mode change, an add and a delete"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        write(os.path.join(repo, "big.txt"), "".join(f"line {n}\n" for n in range(5000)))
+        write(os.path.join(repo, "old name.txt"), "".join(f"kept {n}\n" for n in range(50)))
+        write(os.path.join(repo, "caf\u00e9.txt"), "caf\u00e9\n")
+        write(os.path.join(repo, "run.sh"), "echo\n")
+        write(os.path.join(repo, "gone.txt"), "bye\n")
+        with open(os.path.join(repo, "logo.bin"), "wb") as f:
+            f.write(bytes(range(256)) * 800)
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "base")
+        write(os.path.join(repo, "big.txt"), "".join(f"line {n * 3}\n" for n in range(5000)))
+        git(repo, "mv", "old name.txt", "new name.txt")
+        with open(os.path.join(repo, "new name.txt"), "a") as f:
+            f.write("added\n")
+        write(os.path.join(repo, "caf\u00e9.txt"), "caf\u00e9 au lait\n")
+        os.chmod(os.path.join(repo, "run.sh"), 0o755)
+        os.remove(os.path.join(repo, "gone.txt"))
+        with open(os.path.join(repo, "logo.bin"), "wb") as f:
+            f.write(bytes(range(255, -1, -1)) * 900)
+        write(os.path.join(repo, "src", "new.py"), "print()\n")
+        git(repo, "add", "-A")
+        return repo
+    
+    def run(self, repo, args, **options):
+        response = git_cli.run(dict(options, command="diff", args=args, structured=True), cwd=repo)
+        assert response["success"] is True, response.get("result")
+        return response
+    
+    def test_summary_matches_numstat_and_sizes(self, refactor_repo):
+        records = self.run(refactor_repo, ["--cached", "-M"], summary=True)["result"]
+        numstat = git(refactor_repo, "diff", "--cached", "-M", "--numstat", "-z").split("\0")
+        assert len(records) == 7
+        by_path = {r["path"]: r for r in records}
+        for record in records:
+            expected = f"{record['added']}\t{record['deleted']}\t" if not record["binary"] else "-\t-\t"
+            if "orig_path" in record:
+                assert numstat[numstat.index(expected) + 1:][:2] == [record["orig_path"], record["path"]]
+            else:
+                assert expected + record["path"] in numstat
+            for side in ("old", "new"):
+                oid = record[f"{side}_oid"]
+                if oid is not None:
+                    assert record[f"{side}_size"] == int(git(refactor_repo, "cat-file", "-s", oid))
+        assert by_path["logo.bin"]["binary"] is True
+        assert (by_path["logo.bin"]["old_size"], by_path["logo.bin"]["new_size"]) == (204800, 230400)
+        assert {key: by_path["new name.txt"][key] for key in ("status", "orig_path", "added", "deleted")} == {
+            "status": "R", "orig_path": "old name.txt", "added": 1, "deleted": 0}
+        assert (by_path["run.sh"]["old_mode"], by_path["run.sh"]["new_mode"]) == ("100644", "100755")
+        assert (by_path["gone.txt"]["status"], by_path["gone.txt"]["new_size"]) == ("D", None)
+        assert (by_path["src/new.py"]["old_mode"], by_path["src/new.py"]["new_size"]) == (None, 8)
+        assert by_path["caf\u00e9.txt"]["added"] == 1
+        pages = TestStructuredLogAndDiff.pages(self, refactor_repo,
+                                               {"command": "diff", "args": ["--cached", "-M"], "summary": True}, 3)
+        assert pages == records
+    
+    def test_summary_sizes_worktree_content(self, refactor_repo):
+        with open(os.path.join(refactor_repo, "src", "new.py"), "a") as f:
+            f.write("print(1)\n")
+        [record] = self.run(refactor_repo, [], summary=True)["result"]
+        assert (record["path"], record["new_oid"], record["new_size"]) == ("src/new.py", None, 17)
+    
+    def test_selected_patches_match_git(self, refactor_repo):
+        paths = ["caf\u00e9.txt", "new name.txt", "old name.txt", "logo.bin", "run.sh"]
+        records = self.run(refactor_repo, ["--cached", "-M"], paths=paths)["result"]
+        assert "".join(r["patch"] for r in records) == git(refactor_repo, "diff", "--cached", "-M", "--", *paths)
+        assert [(r["path"], r["status"], r["binary"], r["truncated"]) for r in records] == [
+            ("caf\u00e9.txt", "M", False, False), ("logo.bin", "M", True, False),
+            ("new name.txt", "R", False, False), ("run.sh", "M", False, False)]
+        assert records[2]["orig_path"] == "old name.txt"
+    
+    def test_patch_cap_and_paging(self, refactor_repo):
+        full = git(refactor_repo, "diff", "--cached", "--", "big.txt")
+        response = self.run(refactor_repo, ["--cached"], paths=["big.txt", "src/new.py"], max_bytes=1000, limit=1)
+        [record] = response["result"]
+        assert (record["bytes"], record["truncated"]) == (len(full), True)
+        assert len(record["patch"]) <= 1000 and full.startswith(record["patch"])
+        assert record["patch"].endswith("\n")
+        response = self.run(refactor_repo, ["--cached"], paths=["big.txt", "src/new.py"],
+                            cursor=response["next_cursor"])
+        assert [(r["path"], r["status"], r["truncated"]) for r in response["result"]] == [("src/new.py", "A", False)]
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestStructuredGrep:
+    """Structured grep must report every match git grep prints, across revisions and pathspecs"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def grep_repo(self, tmp_path):
+        """Two commits of sources, a name with a colon, a binary file, and an uncommitted edit"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        for number in range(30):
+            write(os.path.join(repo, "src", f"m{number:02d}.py"),
+                  "".join(f"def f{n}():\n    return needle_{number}_{n}\n" for n in range(number % 4)))
+        write(os.path.join(repo, "docs", "a:b.md"), "a needle in docs\n")
+        with open(os.path.join(repo, "blob.bin"), "wb") as f:
+            f.write(b"\0needle\0")
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "one")
+        write(os.path.join(repo, "src", "m01.py"), "needle = 1  # needle\n")
+        git(repo, "commit", "-q", "-am", "two")
+        write(os.path.join(repo, "src", "m02.py"), "no match here\n")
+        return repo
+    
+    def grep(self, repo, args, **options):
+        response = git_cli.run(dict(options, command="grep", args=args, structured=True), cwd=repo)
+        assert response["success"] is True, response.get("result")
+        return response
+    
+    def expected(self, repo, *args):
+        matches, binaries = [], []
+        for line in git(repo, "grep", "-n", "--column", "-z", *args).splitlines():
+            if line.startswith("Binary file "):
+                binaries.append(line[len("Binary file "):-len(" matches")])
+            else:
+                name, number, column, text = line.split("\0", 3)
+                matches.append((name, int(number), int(column), text))
+        return matches, binaries
+    
+    def test_worktree_matches_git(self, grep_repo):
+        records = self.grep(grep_repo, ["needle"], limit=1000)["result"]
+        matches, binaries = self.expected(grep_repo, "needle")
+        assert [(r["path"], r["line"], r["column"], r["text"]) for r in records if "line" in r] == matches
+        assert [r["path"] for r in records if r.get("binary")] == binaries == ["blob.bin"]
+        assert {"path": "docs/a:b.md", "line": 1, "column": 3, "text": "a needle in docs"} in records
+    
+    def test_revisions_and_pathspecs(self, grep_repo):
+        args = ["-e", "needle", "HEAD", "HEAD~1", "--", "src/m0*.py", "docs"]
+        records = self.grep(grep_repo, args)["result"]
+        matches, _ = self.expected(grep_repo, *args)
+        assert [(f"{r['revision']}:{r['path']}", r["line"], r["column"], r["text"]) for r in records] == matches
+        assert {(r["revision"], r["path"]) for r in records if r["path"] == "src/m01.py"} == {
+            ("HEAD", "src/m01.py"), ("HEAD~1", "src/m01.py")}
+        assert ("HEAD~1", "docs/a:b.md") in {(r["revision"], r["path"]) for r in records}
+    
+    def test_output_options_are_dropped(self, grep_repo):
+        records = self.grep(grep_repo, ["-l", "-C", "2", "-o", "needle", "--", "src/m01.py"])["result"]
+        matches, _ = self.expected(grep_repo, "-o", "needle", "--", "src/m01.py")
+        assert [(r["path"], r["line"], r["column"], r["text"]) for r in records] == matches
+        assert [r["text"] for r in records] == ["needle", "needle"]
+    
+    def test_limit_and_no_match(self, grep_repo):
+        response = self.grep(grep_repo, ["needle"], limit=3)
+        assert (response["record_count"], response["truncated"]) == (3, True)
+        assert "next_cursor" not in response
+        response = self.grep(grep_repo, ["-e", "absent_word"])
+        assert (response["return_code"], response["result"]) == (1, [])
+        response = git_cli.run({"command": "grep", "args": ["needle", "no-such-rev"], "structured": True},
+                               cwd=grep_repo)
+        assert response["success"] is False and response["return_code"] == 128
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestStructuredBlame:
+    """Streamed blame ranges must attribute every line like git blame itself"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def blame_repo(self, tmp_path):
+        """A 300-line file edited in chunks by several commits, then renamed to a name git quotes"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        lines = [f"line {number}\n" for number in range(300)]
+        path = os.path.join(repo, "old.txt")
+        for number in range(6):
+            for line in range(number * 7, 300, 13 + number):
+                lines[line] = f"edit {number} {line}\n"
+            write(path, "".join(lines))
+            git(repo, "add", "-A")
+            git(repo, "commit", "-q", "-m", f"edit {number}")
+        git(repo, "mv", "old.txt", 'new "file".txt')
+        git(repo, "commit", "-q", "-m", "rename")
+        return repo
+    
+    def owners(self, records):
+        owner = {}
+        for record in records:
+            for line in range(record["line"], record["line"] + record["count"]):
+                assert line not in owner
+                owner[line] = record["oid"]
+        return owner
+    
+    def test_ranges_match_line_porcelain(self, blame_repo):
+        response = git_cli.run({"command": "blame", "args": ["--", 'new "file".txt'], "structured": True},
+                               cwd=blame_repo)
+        assert response["success"] is True
+        expected = {}
+        for line in git(blame_repo, "blame", "--line-porcelain", "--", 'new "file".txt').splitlines():
+            parts = line.split(" ")
+            if len(parts) >= 3 and len(parts[0]) == 40 and parts[1].isdigit():
+                expected[int(parts[2])] = parts[0]
+        assert self.owners(response["result"]) == expected
+        # Each commit is described once, on its first range
+        described = [r["oid"] for r in response["result"] if "commit" in r]
+        assert sorted(described) == sorted(set(expected.values()))
+        assert {r["path"] for r in response["result"]} == {"old.txt"}
+        assert "first_record_ns" in response["timings"]
+    
+    def test_line_range_stops_when_attributed(self, blame_repo, tmp_path):
+        output = tmp_path / "blame.ndjson"
+        response = git_cli.run({"command": "blame", "args": ["HEAD", "--", 'new "file".txt'], "structured": True,
+                                "lines": "100,140", "output": str(output)}, cwd=blame_repo)
+        assert response["success"] is True
+        assert response["command"].endswith('--incremental -L 100,140 -- new "file".txt')
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        assert sorted(self.owners(records)) == list(range(100, 141))
+    
+    def test_missing_file_reports_git_error(self, blame_repo):
+        response = git_cli.run({"command": "blame", "args": ["--", "missing.txt"], "structured": True},
+                               cwd=blame_repo)
+        assert response["success"] is False
+        assert "no such path" in response["stderr"]
@@ -0,0 +1,99 @@
+"""
+Integration tests for tuning real repositories with git
+"""
+import os
+import subprocess
+import pytest
+
+from plugins.git import cli, commitgraph, index, tuning
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestTuning:
+    """Tuning must leave git's own view of the repository unchanged and the in-process readers working"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+    
+    @pytest.fixture
+    def repo(self, tmp_path):
+        """Forty commits, each adding a file, all still loose, plus two packs from earlier repacks"""
+        path = str(tmp_path / "repo")
+        os.makedirs(os.path.join(path, "src"))
+        git(path, "init", "-q", "-b", "main")
+        git(path, "config", "gc.auto", "0")
+        for n in range(40):
+            with open(os.path.join(path, "src", f"file{n:02d}.txt"), "w") as f:
+                f.write(f"file {n}\n")
+            git(path, "add", ".")
+            git(path, "commit", "-q", "-m", f"add file {n}")
+            if n in (9, 19):
+                git(path, "repack", "-q")
+        with open(os.path.join(path, "untracked.txt"), "w") as f:
+            f.write("not added\n")
+        return path
+    
+    @pytest.mark.integration
+    def test_tune(self, repo, monkeypatch):
+        monkeypatch.setattr(tuning, "MANY_FILES", 10)
+        status = git(repo, "status", "--porcelain")
+        history = git(repo, "log", "--format=%H", "--", "src/file05.txt")
+        result = cli.run({"command": "rev-list", "args": ["--count", "HEAD"]}, cwd=repo)
+        report = tuning.tune(repo, runs=1, path="src/file05.txt")
+        before = report["before"]
+        assert before["objects"]["count"] >= tuning.LOOSE_OBJECTS_LIMIT
+        assert before["objects"]["packs"] == 2
+        assert before["commit_graph"]["present"] is False
+        assert [step["step"] for step in report["steps"]] == [
+            "config", "config", "config", "config", "config", "index_version", "untracked_cache",
+            "loose_objects", "multi_pack_index", "commit_graph"]
+        after = report["after"]
+        assert after["objects"]["count"] == 0 and after["objects"]["packs"] == 3
+        assert after["multi_pack_index"] is True
+        assert after["commit_graph"] == {"present": True, "layers": 1, "commits": 40, "bloom_filters": True}
+        assert after["index"] == {"present": True, "version": 4, "entries": 40, "untracked_cache": True}
+        assert after["config"] == {"core.commitgraph": "true", "core.untrackedcache": "true",
+                                   "feature.manyfiles": "true", "fetch.writecommitgraph": "true", "index.version": "4"}
+        assert set(report["measurements"]) == {"status", "log_path", "rev_list_count"}
+        # git and the in-process readers see the same repository as before
+        assert git(repo, "status", "--porcelain") == status
+        assert git(repo, "log", "--format=%H", "--", "src/file05.txt") == history
+        assert cli.run({"command": "rev-list", "args": ["--count", "HEAD"]}, cwd=repo)["stdout"] == result["stdout"]
+        repository = repo_module.discover(repo)
+        assert len(list(index.ls_files(repository))) == 40
+        assert commitgraph.count(repository, ["HEAD"]) == 40
+        git(repo, "fsck", "--no-progress")
+    
+    @pytest.mark.integration
+    def test_tune_again_maintains(self, repo):
+        tuning.tune(repo, runs=0)
+        with open(os.path.join(repo, "src", "new.txt"), "w") as f:
+            f.write("new\n")
+        git(repo, "add", ".")
+        git(repo, "commit", "-q", "-m", "add new")
+        report = tuning.tune(repo, runs=0)
+        assert [step["step"] for step in report["steps"]] == ["multi_pack_index", "commit_graph"]
+        assert report["steps"][-1]["reason"] == "keep it current"
+        assert report["after"]["commit_graph"]["commits"] == 41
+        assert report["after"]["commit_graph"]["bloom_filters"] is True
+    
+    @pytest.mark.integration
+    def test_cli_dry_run(self, repo):
+        head = git(repo, "rev-parse", "HEAD")
+        result = tuning.manage({"dry_run": True}, cwd=repo)
+        assert result["success"] is True
+        assert "after" not in result
+        assert not os.path.exists(os.path.join(repo, ".git", "objects", "info", "commit-graphs"))
+        assert subprocess.run(["git", "config", "--get", "core.untrackedCache"], cwd=repo).returncode == 1
+        assert git(repo, "rev-parse", "HEAD") == head
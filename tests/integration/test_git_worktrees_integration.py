@@ -0,0 +1,152 @@
+"""
+Integration tests for the git plugin's worktree pool against real git
+"""
+import os
+import subprocess
+import sys
+import threading
+import pytest
+
+from plugins.git import cli, worktrees
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Leases a worktree, dirties it and dies without releasing it
+CRASHER = """
+import os, sys
+from plugins.git import worktrees
+lease = worktrees.WorktreePool(sys.argv[1]).lease("main")
+with open(os.path.join(lease.path, "a.txt"), "w") as f:
+    f.write("half-written\\n")
+print(lease.path, flush=True)
+os._exit(1)
+"""
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestWorktreePool:
+    """Pooled worktrees must run branches in parallel and come back clean"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+        for name in (worktrees.POOL_SIZE_ENV, worktrees.IDLE_SECONDS_ENV, worktrees.LEASE_TIMEOUT_ENV):
+            monkeypatch.delenv(name, raising=False)
+    
+    @pytest.fixture
+    def repo(self, tmp_path):
+        """main and four branches, each with its own version of a.txt; build/ is ignored"""
+        repo = str(tmp_path / "repo")
+        os.makedirs(repo)
+        git(repo, "init", "-q", "-b", "main")
+        with open(os.path.join(repo, ".gitignore"), "w") as f:
+            f.write("build/\n")
+        with open(os.path.join(repo, "a.txt"), "w") as f:
+            f.write("main\n")
+        git(repo, "add", ".")
+        git(repo, "commit", "-q", "-m", "main")
+        for number in range(4):
+            git(repo, "checkout", "-q", "-b", f"b{number}", "main")
+            with open(os.path.join(repo, "a.txt"), "w") as f:
+                f.write(f"branch {number}\n")
+            git(repo, "commit", "-q", "-am", f"b{number}")
+        git(repo, "checkout", "-q", "main")
+        return repo
+    
+    @pytest.mark.integration
+    def test_branches_in_parallel(self, repo):
+        responses = {}
+        
+        def show(branch):
+            responses[branch] = cli.run({"command": "show", "args": ["HEAD:a.txt"], "worktree": branch}, cwd=repo)
+        
+        threads = [threading.Thread(target=show, args=(f"b{number}",)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for number in range(4):
+            response = responses[f"b{number}"]
+            assert response["success"] is True
+            assert response["result"].strip() == f"branch {number}"
+            assert response["worktree"]["revision"] == git(repo, "rev-parse", f"b{number}").strip()
+        assert git(repo, "status", "--porcelain") == ""
+        assert git(repo, "rev-parse", "--abbrev-ref", "HEAD").strip() == "main"
+        listed = git(repo, "worktree", "list", "--porcelain")
+        assert listed.count("detached") == len({r["worktree"]["slot"] for r in responses.values()})
+    
+    @pytest.mark.integration
+    def test_release_resets_but_keeps_ignored_files(self, repo):
+        pool = worktrees.WorktreePool(repo, size=1)
+        lease = pool.lease("b1")
+        with open(os.path.join(lease.path, "a.txt"), "w") as f:
+            f.write("edited\n")
+        with open(os.path.join(lease.path, "scratch.txt"), "w") as f:
+            f.write("untracked\n")
+        os.makedirs(os.path.join(lease.path, "build"))
+        with open(os.path.join(lease.path, "build", "out.o"), "w") as f:
+            f.write("object\n")
+        assert pool.release(lease) is True
+        lease = pool.lease("b2")
+        with open(os.path.join(lease.path, "a.txt")) as f:
+            assert f.read() == "branch 2\n"
+        assert not os.path.exists(os.path.join(lease.path, "scratch.txt"))
+        assert os.path.isfile(os.path.join(lease.path, "build", "out.o"))
+        pool.release(lease)
+    
+    @pytest.mark.integration
+    def test_release_detaches_checked_out_branch(self, repo):
+        pool = worktrees.WorktreePool(repo, size=1)
+        lease = pool.lease("main")
+        git(lease.path, "checkout", "-q", "b1")
+        assert pool.release(lease) is True
+        assert git(lease.path, "rev-parse", "--abbrev-ref", "HEAD").strip() == "HEAD"
+        git(repo, "checkout", "-q", "b1")
+        git(repo, "checkout", "-q", "main")
+        git(repo, "branch", "-q", "-D", "b1")
+        assert "b1" not in git(repo, "branch", "--format=%(refname:short)").split()
+    
+    @pytest.mark.integration
+    def test_commands_change_only_the_leased_worktree(self, repo):
+        response = cli.run({"command": "checkout", "args": ["-q", "b3"], "worktree": "main"}, cwd=repo)
+        assert response["success"] is True
+        assert response["lock"] == "read"
+        assert git(repo, "rev-parse", "--abbrev-ref", "HEAD").strip() == "main"
+        response = cli.run({"command": "commit", "args": ["-q", "--allow-empty", "-m", "detached"],
+                            "worktree": "main"}, cwd=repo)
+        assert response["success"] is True
+        assert response["lock"] == "write"
+        assert git(repo, "log", "-1", "--format=%s", "main").strip() == "main"
+    
+    @pytest.mark.integration
+    def test_recovers_from_crashed_holder(self, repo):
+        crashed = subprocess.run([sys.executable, "-c", CRASHER, repo], env=dict(os.environ, PYTHONPATH=PACKAGE_ROOT),
+                                 capture_output=True, text=True)
+        path = crashed.stdout.strip()
+        assert crashed.returncode == 1 and os.path.isdir(path)
+        pool = worktrees.WorktreePool(repo, size=1)
+        lease = pool.lease("main")
+        assert lease.path == path
+        assert lease.recovered is True
+        with open(os.path.join(path, "a.txt")) as f:
+            assert f.read() == "main\n"
+        pool.release(lease)
+    
+    @pytest.mark.integration
+    def test_warm_and_prune(self, repo):
+        response = worktrees.manage({"warm": True, "size": 2}, cwd=repo)
+        assert len(response["created"]) == 2
+        assert len(git(repo, "worktree", "list").splitlines()) == 3
+        response = worktrees.manage({"prune": 0, "size": 2}, cwd=repo)
+        assert len(response["removed"]) == 2
+        assert len(git(repo, "worktree", "list").splitlines()) == 1
@@ -0,0 +1,97 @@
+"""
+Integration tests for the clone mirror cache against real git and file:// remotes
+"""
+import os
+import shutil
+import threading
+import pytest
+
+from plugins import mirrors
+from plugins.git import cli
+from plugins.git import repo as repo_module
+from tests.conftest import git
+
+
+@pytest.mark.integration
+@pytest.mark.requires_git
+class TestMirrorClones:
+    """Clones through a mirror must get the remote's history and stand on their own"""
+    
+    @pytest.fixture(autouse=True)
+    def check_git_available(self, check_command_available, monkeypatch, tmp_path):
+        """Skip tests if git is not available and isolate git from user config"""
+        if not check_command_available("git"):
+            pytest.skip("git CLI not available")
+        for name in repo_module._DISCOVERY_ENV:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in (("GIT_AUTHOR_NAME", "Test User"), ("GIT_AUTHOR_EMAIL", "test@example.com"),
+                            ("GIT_COMMITTER_NAME", "Test User"), ("GIT_COMMITTER_EMAIL", "test@example.com")):
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv(mirrors.MIRROR_DIR_ENV, str(tmp_path / "mirrors"))
+        monkeypatch.delenv(mirrors.REFRESH_SECONDS_ENV, raising=False)
+    
+    @pytest.fixture
+    def remote(self, tmp_path):
+        """A bare repository with two commits on main, served as a file:// URL"""
+        work = str(tmp_path / "work")
+        os.makedirs(work)
+        git(work, "init", "-q", "-b", "main")
+        for n in range(2):
+            with open(os.path.join(work, "a.txt"), "w") as f:
+                f.write(f"{n}\n")
+            git(work, "add", "a.txt")
+            git(work, "commit", "-q", "-m", f"commit {n}")
+        bare = str(tmp_path / "remote.git")
+        git(str(tmp_path), "clone", "-q", "--bare", work, bare)
+        git(work, "remote", "add", "origin", bare)
+        return work, "file://" + bare
+    
+    def clone(self, url, cwd, dest):
+        return cli.run({"command": "clone", "args": ["-q", url, dest], "mirror": True}, cwd=cwd)
+    
+    @pytest.mark.integration
+    def test_clone_survives_mirror_removal(self, remote, tmp_path):
+        work, url = remote
+        result = self.clone(url, str(tmp_path), "first")
+        assert result["success"] is True, result
+        assert result["mirror"]["action"] == "created"
+        assert "--dissociate" in result["command"]
+        first = str(tmp_path / "first")
+        assert not os.path.exists(os.path.join(first, ".git", "objects", "info", "alternates"))
+        shutil.rmtree(result["mirror"]["path"])
+        assert git(first, "log", "--format=%s").split("\n")[:2] == ["commit 1", "commit 0"]
+        assert git(first, "fsck", "--connectivity-only") == ""
+    
+    @pytest.mark.integration
+    def test_stale_mirror_is_refreshed(self, remote, tmp_path, monkeypatch):
+        work, url = remote
+        assert self.clone(url, str(tmp_path), "first")["mirror"]["action"] == "created"
+        assert self.clone(url, str(tmp_path), "second")["mirror"]["action"] == "fresh"
+        with open(os.path.join(work, "a.txt"), "w") as f:
+            f.write("new\n")
+        git(work, "commit", "-q", "-am", "commit 2")
+        git(work, "push", "-q", "origin", "main")
+        monkeypatch.setenv(mirrors.REFRESH_SECONDS_ENV, "0")
+        result = self.clone(url, str(tmp_path), "third")
+        assert result["mirror"]["action"] == "refreshed"
+        assert git(result["mirror"]["path"], "log", "-1", "--format=%s", "main").strip() == "commit 2"
+        assert git(str(tmp_path / "third"), "log", "-1", "--format=%s").strip() == "commit 2"
+    
+    @pytest.mark.integration
+    def test_concurrent_clones_create_one_mirror(self, remote, tmp_path):
+        work, url = remote
+        reports = []
+        threads = [threading.Thread(target=lambda: reports.append(mirrors.ensure(url))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(report["action"] for report in reports) == ["created", "fresh", "fresh", "fresh"]
+        assert [entry["url"] for entry in mirrors.list_mirrors()] == [url]
+    
+    @pytest.mark.integration
+    def test_unreachable_remote_reports_error(self, tmp_path):
+        result = self.clone("file://" + str(tmp_path / "missing.git"), str(tmp_path), "dest")
+        assert result["success"] is False
+        assert "error" in result["mirror"]
+        assert "--reference-if-able" not in result["command"]
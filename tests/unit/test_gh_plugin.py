@@ -154,6 +154,60 @@ class TestGhRun:
         assert "error" in result
         assert "timed out" in result["error"]
     
+    @pytest.mark.unit
+    def test_run_reports_phase_timings(self, mock_subprocess_run):
+        """Test that responses carry per-phase timings"""
+        result = run({"command": "repo"}, dry_run=False)
+        assert result["timings"]["setup_ns"] >= 0
+        assert result["timings"]["classify_ns"] >= 0
+        assert result["timings"]["total_ns"] >= result["timings"]["setup_ns"]
+    
+    @pytest.mark.unit
+    def test_run_reports_queue_wait(self, mock_subprocess_run):
+        """Test that batched calls report their queue wait"""
+        import time
+        result = run({"command": "repo"}, dry_run=False, enqueued_ns=time.perf_counter_ns() - 1000)
+        assert result["timings"]["queue_wait_ns"] >= 1000
+    
+    @pytest.mark.unit
+    def test_early_returns_report_timings(self):
+        """Test that dry runs and invalid working directories still report timings"""
+        for result in (run({"command": "repo"}, dry_run=True), run({"command": "repo"}, dry_run=False, cwd="/nonexistent/directory/12345")):
+            assert result["timings"]["total_ns"] >= 0
+    
+    @pytest.mark.unit
+    def test_run_reports_child_resources(self, mock_subprocess_run):
+        """Test that child rusage is passed through as resources"""
+        mock_subprocess_run.resources = {"user_cpu_s": 0.5, "max_rss_bytes": 1024}
+        result = run({"command": "repo"}, dry_run=False)
+        assert result["resources"] == {"user_cpu_s": 0.5, "max_rss_bytes": 1024}
+    
+    @pytest.mark.unit
+    def test_run_without_child_resources(self, mock_subprocess_run):
+        """Test that resources are omitted when rusage is unavailable"""
+        result = run({"command": "repo"}, dry_run=False)
+        assert "resources" not in result
+    
+    @pytest.mark.unit
+    def test_run_timeout_reports_child_resources(self, monkeypatch):
+        """Test that a timed-out child's rusage is reported"""
+        from plugins import process
+        def timed_out(*args, **kwargs):
+            exc = subprocess.TimeoutExpired(cmd=args[0], timeout=30)
+            exc.resources = {"user_cpu_s": 1.0}
+            raise exc
+        monkeypatch.setattr(process, "run_process", timed_out)
+        result = run({"command": "repo"}, dry_run=False)
+        assert result["error_code"] == "TIMEOUT"
+        assert result["resources"] == {"user_cpu_s": 1.0}
+    
+    @pytest.mark.unit
+    def test_run_timeout_reports_timings(self, mock_subprocess_timeout):
+        """Test that timeouts still report timings"""
+        result = run({"command": "repo"}, dry_run=False)
+        assert result["error_code"] == "TIMEOUT"
+        assert "setup_ns" in result["timings"]
+    
     @pytest.mark.unit
     def test_run_exception(self, mock_subprocess_exception):
         """Test exception handling"""
@@ -680,8 +734,7 @@ class TestGhDescribe:
         assert "commands" in result
         assert result["plugin"]["name"] == "gh"
         assert result["plugin"]["version"] == "1.0.0"
-        assert len(result["commands"]) == 1
-        assert result["commands"][0]["name"] == "run"
+        assert [c["name"] for c in result["commands"]] == ["run", "metrics"]
     
     @pytest.mark.unit
     def test_describe_plugin_info(self):
@@ -700,7 +753,7 @@ class TestGhDescribe:
         assert command["name"] == "run"
         assert "description" in command
         assert "parameters" in command
-        assert len(command["parameters"]) == 2
+        assert [p["name"] for p in command["parameters"]] == ["command", "subcommand", "mirror", "traceparent"]
     
     @pytest.mark.unit
     def test_describe_parameters(self):
@@ -737,6 +790,77 @@ class TestGhMain:
         assert "plugin" in output
         assert output["plugin"]["name"] == "gh"
     
+    @pytest.mark.unit
+    def test_main_metrics_command(self, capsys, mock_subprocess_run, tmp_path, monkeypatch):
+        """Test the metrics command renders recorded calls and persists state"""
+        from plugins import metrics
+        state = tmp_path / "metrics.json"
+        monkeypatch.setenv("SMCP_METRICS_FILE", str(state))
+        metrics.REGISTRY.clear()
+        with patch("sys.argv", ["cli.py", "run", "--command", "repo"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        capsys.readouterr()
+        assert state.exists()
+        
+        output = tmp_path / "gh.prom"
+        with patch("sys.argv", ["cli.py", "metrics", "--output", str(output)]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        
+        result = json.loads(capsys.readouterr().out)
+        assert result["success"] is True
+        assert 'tool="gh"' in result["result"]
+        assert output.read_text() == result["result"]
+    
+    @pytest.mark.unit
+    def test_main_run_with_mirror(self, capsys):
+        """Test --mirror is passed through to run()"""
+        with patch("sys.argv", ["cli.py", "run", "--dry-run", "--command", "repo clone org/project", "--mirror"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        assert json.loads(capsys.readouterr().out)["args_received"]["mirror"] is True
+    
+    @pytest.mark.unit
+    def test_main_run_with_traceparent(self, capsys, mock_subprocess_run, tmp_path, monkeypatch):
+        """Test that a traceparent passed on the CLI parents the exported span"""
+        spans = tmp_path / "spans.jsonl"
+        monkeypatch.setenv("SMCP_TRACE_FILE", str(spans))
+        parent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+        with patch("sys.argv", ["cli.py", "run", "--command", "repo", "--traceparent", parent]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        
+        result = json.loads(capsys.readouterr().out)
+        assert result["trace"]["trace_id"] == "0af7651916cd43dd8448eb211c80319c"
+        record = json.loads(spans.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert record["parentSpanId"] == "b7ad6b7169203331"
+        assert record["spanId"] == result["trace"]["span_id"]
+    
+    @pytest.mark.unit
+    def test_run_dry_run_not_traced(self, tmp_path, monkeypatch):
+        """Test that dry runs do not produce spans"""
+        monkeypatch.setenv("SMCP_TRACE_FILE", str(tmp_path / "spans.jsonl"))
+        result = run({"command": "repo"}, dry_run=True)
+        assert "trace" not in result
+        assert not (tmp_path / "spans.jsonl").exists()
+    
+    @pytest.mark.unit
+    def test_run_dry_run_not_recorded(self):
+        """Test that dry runs are not recorded as executions"""
+        from plugins import metrics
+        metrics.REGISTRY.clear()
+        run({"command": "repo"}, dry_run=True)
+        assert not metrics.REGISTRY.counters
+    
     @pytest.mark.unit
     def test_main_no_command(self, capsys):
         """Test main with no command"""
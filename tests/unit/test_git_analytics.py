@@ -0,0 +1,262 @@
+"""
+Unit tests for the git plugin's columnar commit analytics
+"""
+import subprocess
+import sys
+import pytest
+
+from plugins.git import analytics
+from plugins.git.analytics import History
+
+OID_A = "a" * 40
+OID_B = "b" * 40
+OID_C = "c" * 40
+
+# 2024-01-01 (a Monday), 2024-01-03 and 2024-02-10, all 12:00 UTC
+MONDAY, WEDNESDAY, LATER = 1704110400, 1704283200, 1707566400
+
+
+def header(oid, author, when):
+    return b"\x01" + oid.encode() + b"\0" + author.encode() + b"\0" + str(when).encode() + b"\0"
+
+
+def numstat(*entries):
+    return b"\n" + b"".join(entry + b"\0" for entry in entries)
+
+
+LOG = (header(OID_C, "Ann <ann@example.com>", LATER) + numstat(b"5\t1\tsrc/a.py", b"0\t0\t", b"old.txt", b"new.txt")
+       + header(OID_B, "Bob <bob@example.com>", WEDNESDAY) + numstat(b"-\t-\tlogo.png", b"2\t2\tsrc/a.py")
+       + header(OID_A, "Ann <ann@example.com>", MONDAY) + numstat(b"10\t0\tsrc/a.py", b"3\t0\tcaf\xe9.txt")
+       + header("d" * 40, "Bob <bob@example.com>", MONDAY))
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def history():
+    return History.parse([LOG])
+
+
+class TestParse:
+    """Test building columns from git log -z --numstat output"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 7, 4096])
+    def test_columns(self, size):
+        history = History.parse(chunked(LOG, size))
+        assert len(history) == 4
+        assert history.change_count == 6
+        assert [history.oid(row) for row in range(4)] == [OID_C, OID_B, OID_A, "d" * 40]
+        assert history.authors == ["Ann <ann@example.com>", "Bob <bob@example.com>"]
+        assert history.paths == ["src/a.py", "new.txt", "logo.png", "caf\udce9.txt"]
+        assert list(history.commit_author) == [0, 1, 0, 1]
+        assert list(history.commit_time) == [LATER, WEDNESDAY, MONDAY, MONDAY]
+        assert list(history.change_commit) == [0, 0, 1, 1, 2, 2]
+        assert list(history.change_path) == [0, 1, 2, 0, 0, 3]
+        assert list(history.change_added) == [5, 0, -1, 2, 10, 3]
+        assert list(history.change_deleted) == [1, 0, -1, 2, 0, 0]
+    
+    @pytest.mark.unit
+    def test_empty(self):
+        history = History.parse([])
+        assert len(history) == 0
+        assert history.group_by("author") == {}
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("data,message", [
+        (b"\x01" + OID_A.encode() + b"\0Ann\0", "truncated log entry"),
+        (b"\n1\t1\tx\0", "before any commit"),
+        (header(OID_A, "Ann", 1) + b"\n1 1 x\0", "unrecognized numstat entry"),
+        (header(OID_A, "Ann", 1) + b"\n1\t1\t\0old\0", "rename entry without its paths"),
+    ])
+    def test_malformed_output_raises(self, data, message):
+        with pytest.raises(ValueError, match=message):
+            History.parse([data])
+
+
+class TestGroupBy:
+    """Test column aggregations"""
+    
+    @pytest.mark.unit
+    def test_by_author(self, history):
+        assert history.group_by("author") == {"Ann <ann@example.com>": 2, "Bob <bob@example.com>": 2}
+        assert history.group_by("author", "churn") == {"Ann <ann@example.com>": 19, "Bob <bob@example.com>": 4}
+        assert history.group_by("author", "added") == {"Ann <ann@example.com>": 18, "Bob <bob@example.com>": 2}
+        assert history.group_by("author", "deleted") == {"Ann <ann@example.com>": 1, "Bob <bob@example.com>": 2}
+    
+    @pytest.mark.unit
+    def test_by_path(self, history):
+        assert history.group_by("path") == {"src/a.py": 3, "new.txt": 1, "logo.png": 1, "caf\udce9.txt": 1}
+        assert history.group_by("path", "churn")["src/a.py"] == 20
+        assert history.group_by("path", "churn")["logo.png"] == 0
+    
+    @pytest.mark.unit
+    def test_by_time(self, history):
+        assert history.group_by("time", bucket="week") == {"2024-01-01": 3, "2024-02-05": 1}
+        assert history.group_by("time", "churn", "day") == {"2024-01-01": 13, "2024-01-03": 4, "2024-02-10": 6}
+        assert history.group_by("time", bucket="month") == {"2024-01": 3, "2024-02": 1}
+        assert history.group_by("time", "added", "year") == {"2024": 20}
+        assert history.group_by("time", bucket=6 * 3600) == {
+            "2024-01-01T12:00:00Z": 2, "2024-01-03T12:00:00Z": 1, "2024-02-10T12:00:00Z": 1}
+    
+    @pytest.mark.unit
+    def test_top(self, history):
+        assert history.top(2, "path") == [("src/a.py", 3), ("caf\udce9.txt", 1)]
+        assert history.top(1, "author", "churn") == [("Ann <ann@example.com>", 19)]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("key,metric,bucket,message", [
+        ("team", "commits", "week", "unknown key"),
+        ("author", "lines", "week", "unknown metric"),
+        ("time", "commits", "fortnight", "unknown bucket"),
+        ("time", "commits", 0, "unknown bucket"),
+        ("time", "commits", True, "unknown bucket"),
+    ])
+    def test_invalid_options(self, history, key, metric, bucket, message):
+        with pytest.raises(ValueError, match=message):
+            history.group_by(key, metric, bucket)
+
+
+class TestPersistence:
+    """Test saving columns and mapping them back"""
+    
+    @pytest.mark.unit
+    def test_round_trip(self, history, tmp_path):
+        target = str(tmp_path / "history.cols")
+        history.save(target)
+        with History.open(target) as reopened:
+            assert isinstance(reopened.commit_time, memoryview)
+            assert len(reopened) == 4
+            assert reopened.oid(2) == OID_A
+            assert reopened.authors == history.authors
+            assert reopened.paths == history.paths
+            for name, _ in analytics.COMMIT_COLUMNS + analytics.CHANGE_COLUMNS:
+                assert list(getattr(reopened, name)) == list(getattr(history, name))
+            assert reopened.group_by("time", "churn", "month") == history.group_by("time", "churn", "month")
+        assert reopened._map is None
+        reopened.close()
+        assert [p.name for p in tmp_path.iterdir()] == ["history.cols"]
+    
+    @pytest.mark.unit
+    def test_empty_round_trip(self, tmp_path):
+        target = str(tmp_path / "empty.cols")
+        History.parse([]).save(target)
+        with History.open(target) as reopened:
+            assert (len(reopened), reopened.authors, reopened.paths) == (0, [], [])
+    
+    @pytest.mark.unit
+    def test_failed_save_leaves_no_temporary_file(self, history, tmp_path, monkeypatch):
+        def fail(*args):
+            raise OSError("disk full")
+        monkeypatch.setattr(analytics.os, "replace", fail)
+        with pytest.raises(OSError, match="disk full"):
+            history.save(str(tmp_path / "history.cols"))
+        assert list(tmp_path.iterdir()) == []
+    
+    @pytest.mark.unit
+    def test_rejects_foreign_files(self, history, tmp_path):
+        target = tmp_path / "history.cols"
+        history.save(str(target))
+        data = target.read_bytes()
+        cases = {
+            b"": "not a commit history file",
+            b"NOTHIST!" + data[8:]: "not a commit history file",
+            data[:8] + (2).to_bytes(4, "little") + data[12:]: "not a commit history file",
+            data[:12] + bytes([data[12] ^ 1]) + data[13:]: "other byte order",
+            data[:-16]: "truncated",
+        }
+        for content, message in cases.items():
+            target.write_bytes(content)
+            with pytest.raises(ValueError, match=message):
+                History.open(str(target))
+
+
+class TestLoad:
+    """Test streaming git log into a history"""
+    
+    @pytest.mark.unit
+    def test_load_from_child(self, monkeypatch):
+        calls = []
+        code = f"import sys; sys.stdout.buffer.write({LOG!r})"
+        real = analytics.process.StreamingProcess
+    
+        def fake(cmd_args, **kwargs):
+            calls.append(cmd_args)
+            return real([sys.executable, "-c", code], **kwargs)
+        monkeypatch.setattr(analytics.process, "StreamingProcess", fake)
+        history = History.load(None, ["--since=2024-01-01"])
+        assert len(history) == 4
+        assert calls == [["git", "log", "-z", "--numstat", "-M", analytics.LOG_FORMAT, "--since=2024-01-01"]]
+    
+    @pytest.mark.unit
+    def test_git_failure_raises(self, monkeypatch):
+        real = analytics.process.StreamingProcess
+        code = "import sys; sys.stderr.write('fatal: bad revision'); sys.exit(128)"
+        monkeypatch.setattr(analytics.process, "StreamingProcess",
+                            lambda cmd_args, **kwargs: real([sys.executable, "-c", code], **kwargs))
+        with pytest.raises(subprocess.CalledProcessError) as info:
+            History.load()
+        assert info.value.returncode == 128
+        assert info.value.stderr == "fatal: bad revision"
+
+
+class TestReport:
+    """Test the analytics command of the plugin CLI"""
+    
+    @pytest.fixture
+    def loaded(self, monkeypatch):
+        calls = []
+    
+        def load(cls, cwd=None, args=()):
+            calls.append((cwd, list(args)))
+            return History.parse([LOG])
+        monkeypatch.setattr(History, "load", classmethod(load))
+        return calls
+    
+    @pytest.mark.unit
+    def test_group_by_sorted_by_key(self, loaded):
+        response = analytics.report({"group_by": "time", "bucket": "86400", "args": "main --since=2024-01-01"},
+                                    cwd="/repo")
+        assert response["success"] is True
+        assert (response["commits"], response["changes"]) == (4, 6)
+        assert response["result"] == [{"key": "2024-01-01", "value": 2}, {"key": "2024-01-03", "value": 1},
+                                      {"key": "2024-02-10", "value": 1}]
+        assert loaded == [("/repo", ["main", "--since=2024-01-01"])]
+    
+    @pytest.mark.unit
+    def test_top_with_save_and_load(self, loaded, tmp_path):
+        target = str(tmp_path / "history.cols")
+        response = analytics.report({"group_by": "path", "metric": "churn", "top": 1, "save": target})
+        assert response["result"] == [{"key": "src/a.py", "value": 20}]
+        assert response["saved"] == target
+        response = analytics.report({"group_by": "author", "top": 5, "load": target})
+        assert response["result"] == [{"key": "Ann <ann@example.com>", "value": 2},
+                                      {"key": "Bob <bob@example.com>", "value": 2}]
+        assert "saved" not in response
+        assert len(loaded) == 1
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args", [{"top": 0}, {"top": True}, {"metric": "lines"}])
+    def test_invalid_options(self, loaded, args):
+        response = analytics.report(args)
+        assert response["success"] is False
+        assert response["error_code"] == "INVALID_ANALYTICS_OPTION"
+    
+    @pytest.mark.unit
+    def test_git_failure(self, monkeypatch):
+        def fail(cls, cwd=None, args=()):
+            raise subprocess.CalledProcessError(128, ["git", "log"], None, "fatal: bad revision\n")
+        monkeypatch.setattr(History, "load", classmethod(fail))
+        response = analytics.report({})
+        assert response == {"success": False, "error": "fatal: bad revision", "error_code": "COMMAND_FAILED_128"}
+        monkeypatch.setattr(History, "load", classmethod(lambda cls, cwd=None, args=(): (_ for _ in ()).throw(
+            subprocess.CalledProcessError(1, ["git", "log"], None, ""))))
+        assert analytics.report({})["error"] == "git log exited with 1"
+    
+    @pytest.mark.unit
+    def test_unreadable_file(self, tmp_path):
+        response = analytics.report({"load": str(tmp_path / "missing.cols")})
+        assert response["success"] is False
+        assert response["error_code"] == "ANALYTICS_FAILED"
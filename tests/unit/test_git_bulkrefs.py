@@ -0,0 +1,348 @@
+"""
+Unit tests for the git plugin's bulk ref updates
+"""
+import json
+import pytest
+
+from plugins.git import bulkrefs, locking
+from plugins.git import repo as repo_module
+from tests.conftest import completed, make_repository
+
+MAIN = "a" * 40
+TOPIC = "b" * 40
+STALE = "c" * 40
+OTHER = "d" * 40
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+class FakeGit:
+    """Resolves names from a table for cat-file and answers update-ref and push from queues of responses"""
+    
+    def __init__(self, monkeypatch, objects=None, update_ref=(), push=()):
+        self.calls = []
+        self.objects = {"main": MAIN, "topic": TOPIC, "refs/heads/main": MAIN, "refs/heads/topic": TOPIC,
+                        "refs/heads/stale": STALE}
+        self.objects.update(objects or {})
+        self.update_ref = list(update_ref)
+        self.push = list(push)
+        monkeypatch.setattr(bulkrefs.process, "run_process", self.run_process)
+    
+    def run_process(self, cmd_args, timeout=30, cwd=None, timer=None, env=None, input=None):
+        self.calls.append((cmd_args[1:], input))
+        if cmd_args[1] == "cat-file":
+            answers = [self.objects.get(name, f"{name} missing") for name in input.splitlines()]
+            return completed(cmd_args, 0, "".join(answer + "\n" for answer in answers), "")
+        if cmd_args[1] == "update-ref":
+            returncode, stderr = self.update_ref.pop(0) if self.update_ref else (0, "")
+            return completed(cmd_args, returncode, "", stderr)
+        returncode, stdout, stderr = self.push.pop(0)
+        return completed(cmd_args, returncode, stdout, stderr)
+    
+    def commands(self, name):
+        return [(args, input) for args, input in self.calls if args[0] == name]
+
+
+def record_locks(monkeypatch):
+    """Record the kind of every repository lock taken"""
+    held = []
+    original = locking.hold
+
+    def hold(kind, cwd, timeout=None):
+        held.append(kind)
+        return original(kind, cwd, timeout)
+    monkeypatch.setattr(bulkrefs.locking, "hold", hold)
+    return held
+
+
+class TestParseOps:
+    """Test checking and normalising the operations"""
+    
+    @pytest.mark.unit
+    def test_normalises(self):
+        ops = bulkrefs.parse_ops(json.dumps([
+            {"action": "create", "ref": "refs/heads/new", "new": "main"},
+            {"action": "update", "ref": "refs/heads/topic", "new": "main", "old": "0" * 40},
+            {"action": "update", "ref": "refs/heads/main", "new": "topic"},
+            {"action": "delete", "ref": "refs/heads/stale", "old": STALE},
+            {"action": "verify", "ref": "refs/tags/v1", "old": ""}]))
+        assert ops == [{"action": "create", "ref": "refs/heads/new", "new": "main", "old": ""},
+                       {"action": "create", "ref": "refs/heads/topic", "new": "main", "old": ""},
+                       {"action": "update", "ref": "refs/heads/main", "new": "topic", "old": None},
+                       {"action": "delete", "ref": "refs/heads/stale", "new": None, "old": STALE},
+                       {"action": "verify", "ref": "refs/tags/v1", "new": None, "old": ""}]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("ops,error", [
+        ({"action": "create"}, "operations must be a list"),
+        (["refs/heads/x"], "operation 0 is not an object"),
+        ([{"action": "rename", "ref": "refs/heads/x"}], "operation 0 has unknown action 'rename'"),
+        ([{"action": "delete", "ref": "stale"}], "operation 0 needs a full ref name under refs/, not 'stale'"),
+        ([{"action": "create", "ref": "refs/heads/x", "new": 7}], "operation 0: new and old must be strings"),
+        ([{"action": "create", "ref": "refs/heads/x"}], "operation 0: create needs new value"),
+        ([{"action": "delete", "ref": "refs/heads/x", "new": "main"}], "operation 0: delete takes no new value"),
+        ([{"action": "create", "ref": "refs/heads/x", "new": "main", "old": MAIN}], "operation 0: create expects"),
+        ([{"action": "delete", "ref": "refs/heads/x", "old": ""}], "operation 0: delete expects refs/heads/x to"),
+        ([{"action": "verify", "ref": "refs/heads/x"}], "operation 0: verify needs an old value"),
+        ([{"action": "update", "ref": "refs/heads/x", "new": "main\nrefs/heads/y"}], "operation 0 has a line"),
+    ])
+    def test_errors(self, ops, error):
+        with pytest.raises(bulkrefs.RefsError) as excinfo:
+            bulkrefs.parse_ops(ops)
+        assert str(excinfo.value).startswith(error)
+
+
+class TestResolve:
+    """Test resolving names in one cat-file"""
+    
+    @pytest.mark.unit
+    def test_resolve(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        assert bulkrefs.resolve(["main", "refs/heads/gone", "main", OTHER]) == {"main": MAIN, "refs/heads/gone": None}
+        # Object ids are taken as they are and names are asked for once
+        assert git.calls == [(["cat-file", "--batch-check=%(objectname)"], "main\nrefs/heads/gone\n")]
+        assert bulkrefs.resolve([OTHER]) == {}
+        assert len(git.calls) == 1
+    
+    @pytest.mark.unit
+    def test_failures(self, monkeypatch):
+        answers = [completed([], 128, "", "fatal: not a git repository\n"), completed([], 0, MAIN + "\n", "")]
+        monkeypatch.setattr(bulkrefs.process, "run_process", lambda *args, **kwargs: answers.pop(0))
+        with pytest.raises(bulkrefs.RefsError, match="not a git repository"):
+            bulkrefs.resolve(["main"])
+        with pytest.raises(bulkrefs.RefsError, match="answered 1 of 2 names"):
+            bulkrefs.resolve(["main", "topic"])
+
+
+class TestApply:
+    """Test applying the operations in one update-ref transaction"""
+    
+    @pytest.mark.unit
+    def test_one_transaction(self, monkeypatch, tmp_path):
+        repo = make_repository(tmp_path / "repo")
+        git = FakeGit(monkeypatch)
+        held = record_locks(monkeypatch)
+        results = bulkrefs.apply([{"action": "create", "ref": "refs/heads/release", "new": "main"},
+                                  {"action": "update", "ref": "refs/heads/topic", "new": "main", "old": "topic"},
+                                  {"action": "update", "ref": "refs/heads/main", "new": OTHER},
+                                  {"action": "delete", "ref": "refs/heads/stale"}], repo, message="release fan-out")
+        assert [result["status"] for result in results] == ["applied"] * 4
+        assert results[0] == {"ref": "refs/heads/release", "action": "create", "status": "applied", "old": None,
+                              "new": MAIN}
+        assert (results[3]["old"], results[3]["new"]) == (STALE, None)
+        assert len(git.calls) == 2
+        args, stdin = git.commands("update-ref")[0]
+        assert args == ["update-ref", "--stdin", "-z", "-m", "release fan-out"]
+        assert stdin == (f"create refs/heads/release\0{MAIN}\0update refs/heads/topic\0{MAIN}\0{TOPIC}\0"
+                         f"update refs/heads/main\0{OTHER}\0\0delete refs/heads/stale\0\0")
+        assert held == [locking.WRITE]
+    
+    @pytest.mark.unit
+    def test_verify(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        results = bulkrefs.apply([{"action": "verify", "ref": "refs/heads/main", "old": "main"},
+                                  {"action": "verify", "ref": "refs/tags/v2", "old": ""}])
+        assert [result["status"] for result in results] == ["applied", "applied"]
+        assert git.commands("update-ref")[0][1] == f"verify refs/heads/main\0{MAIN}\0verify refs/tags/v2\0\0"
+    
+    @pytest.mark.unit
+    def test_atomic_rejection_writes_nothing(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        results = bulkrefs.apply([{"action": "create", "ref": "refs/heads/main", "new": "topic"},
+                                  {"action": "delete", "ref": "refs/heads/stale", "old": OTHER},
+                                  {"action": "delete", "ref": "refs/heads/gone", "old": "main"},
+                                  {"action": "update", "ref": "refs/heads/topic", "new": "missing"},
+                                  {"action": "delete", "ref": "refs/heads/x", "old": "missing"},
+                                  {"action": "delete", "ref": "refs/heads/main"},
+                                  {"action": "delete", "ref": "refs/heads/release"}])
+        assert [(result["status"], result["error"]) for result in results] == [
+            ("rejected", "refs/heads/main already exists"),
+            ("rejected", f"refs/heads/stale is at {STALE} but expected {OTHER}"),
+            ("rejected", f"refs/heads/gone is at nothing but expected {MAIN}"),
+            ("rejected", "cannot resolve new value missing"),
+            ("rejected", "cannot resolve old value missing"),
+            ("rejected", "refs/heads/main appears more than once"),
+            ("aborted", "another operation was rejected")]
+        assert git.commands("update-ref") == []
+    
+    @pytest.mark.unit
+    def test_atomic_failure(self, monkeypatch):
+        git = FakeGit(monkeypatch, update_ref=[(128, "fatal: cannot lock ref 'refs/heads/a/b': 'refs/heads/a' "
+                                                    "exists; cannot create 'refs/heads/a/b'\n")])
+        results = bulkrefs.apply([{"action": "create", "ref": "refs/heads/x", "new": "main"},
+                                  {"action": "create", "ref": "refs/heads/a/b", "new": "main"}])
+        assert [result["status"] for result in results] == ["aborted", "failed"]
+        assert results[1]["error"].startswith("fatal: cannot lock ref 'refs/heads/a/b'")
+        assert results[0]["error"] == "another operation failed"
+        assert len(git.commands("update-ref")) == 1
+    
+    @pytest.mark.unit
+    def test_best_effort_retries_without_the_failed_ref(self, monkeypatch):
+        git = FakeGit(monkeypatch, update_ref=[(128, "fatal: cannot lock ref 'refs/heads/y': unable to create "
+                                                    "lock file\n"), (0, "")])
+        results = bulkrefs.apply([{"action": "create", "ref": "refs/heads/x", "new": "main"},
+                                  {"action": "create", "ref": "refs/heads/y", "new": "main"},
+                                  {"action": "create", "ref": "refs/heads/main", "new": "main"},
+                                  {"action": "delete", "ref": "refs/heads/stale"}], mode="best-effort")
+        assert [result["status"] for result in results] == ["applied", "failed", "rejected", "applied"]
+        assert [stdin for _, stdin in git.commands("update-ref")] == [
+            f"create refs/heads/x\0{MAIN}\0create refs/heads/y\0{MAIN}\0delete refs/heads/stale\0\0",
+            f"create refs/heads/x\0{MAIN}\0delete refs/heads/stale\0\0"]
+    
+    @pytest.mark.unit
+    def test_unattributed_failure(self, monkeypatch):
+        # A symbolic ref is updated through its target, which is the ref git names
+        error = "fatal: cannot lock ref 'refs/heads/main': unable to create lock file"
+        git = FakeGit(monkeypatch, update_ref=[(128, error + "\n"), (1, "")])
+        ops = [{"action": "update", "ref": "refs/heads/current", "new": "topic"},
+               {"action": "create", "ref": "refs/heads/y", "new": "main"}]
+        results = bulkrefs.apply(ops, mode="best-effort")
+        assert [(result["status"], result["error"]) for result in results] == [("failed", error), ("failed", error)]
+        assert len(git.commands("update-ref")) == 1
+        results = bulkrefs.apply(ops, mode="best-effort")
+        assert results[0]["error"] == "git update-ref exited with 1"
+    
+    @pytest.mark.unit
+    def test_unknown_mode(self, monkeypatch):
+        FakeGit(monkeypatch)
+        with pytest.raises(bulkrefs.RefsError, match="unknown mode 'some'"):
+            bulkrefs.apply([], mode="some")
+        with pytest.raises(bulkrefs.RefsError, match="unknown mode 'some'"):
+            bulkrefs.push([], "origin", mode="some")
+
+
+PUSHED = ("To /srv/remote.git\n"
+          f"*\t{MAIN}:refs/heads/release\t[new branch]\n"
+          "-\t:refs/heads/stale\t[deleted]\n"
+          f"=\t{MAIN}:refs/heads/main\t[up to date]\n"
+          "Done\n")
+
+
+class TestPush:
+    """Test pushing the operations to a remote"""
+    
+    OPS = [{"action": "create", "ref": "refs/heads/release", "new": "main"},
+           {"action": "delete", "ref": "refs/heads/stale", "old": STALE},
+           {"action": "update", "ref": "refs/heads/main", "new": "main"},
+           {"action": "update", "ref": "refs/heads/topic", "new": "topic", "old": "main"}]
+    
+    @pytest.mark.unit
+    def test_atomic_sends_one_push(self, monkeypatch, tmp_path):
+        repo = make_repository(tmp_path / "repo")
+        output = PUSHED.replace("Done\n", f"+\t{TOPIC}:refs/heads/topic\t{STALE[:7]}...{TOPIC[:7]} (forced update)\n")
+        git = FakeGit(monkeypatch, push=[(0, output + "Done\n", "")])
+        held = record_locks(monkeypatch)
+        results = bulkrefs.push(self.OPS, "origin", repo, batch=3)
+        assert [result["status"] for result in results] == ["applied"] * 4
+        assert results[0] == {"ref": "refs/heads/release", "action": "create", "status": "applied", "new": MAIN,
+                              "summary": "[new branch]"}
+        assert [args for args, _ in git.commands("push")] == [
+            ["push", "--porcelain", "--atomic", "--force-with-lease=refs/heads/release:",
+             f"--force-with-lease=refs/heads/stale:{STALE}", f"--force-with-lease=refs/heads/topic:{MAIN}",
+             "origin", f"{MAIN}:refs/heads/release", ":refs/heads/stale", f"{MAIN}:refs/heads/main",
+             f"{TOPIC}:refs/heads/topic"]]
+        assert held == [locking.WRITE]
+    
+    @pytest.mark.unit
+    def test_atomic_failure(self, monkeypatch):
+        output = (f"!\t{MAIN}:refs/heads/release\t[rejected] (atomic push failed)\n"
+                  f"!\t{MAIN}:refs/heads/main\t[rejected] (stale info)\n"
+                  f"!\t{MAIN}:refs/heads/later\t[rejected] (atomic push failed)\nDone\n")
+        git = FakeGit(monkeypatch, push=[(1, output, "error: failed to push some refs\n")])
+        results = bulkrefs.push([{"action": "create", "ref": "refs/heads/release", "new": "main"},
+                                 {"action": "update", "ref": "refs/heads/main", "new": "main", "old": "topic"},
+                                 {"action": "create", "ref": "refs/heads/later", "new": "main"}], "origin", batch=2)
+        assert [(result["status"], result["error"]) for result in results] == [
+            ("aborted", "[rejected] (atomic push failed)"), ("rejected", "[rejected] (stale info)"),
+            ("aborted", "[rejected] (atomic push failed)")]
+        assert len(git.commands("push")) == 1
+    
+    @pytest.mark.unit
+    def test_atomic_push_too_long(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        monkeypatch.setattr(bulkrefs, "ATOMIC_PUSH_MAX_BYTES", 100)
+        with pytest.raises(bulkrefs.RefsError, match="4 refs do not fit in one atomic git push"):
+            bulkrefs.push(self.OPS, "origin")
+        assert git.commands("push") == []
+    
+    @pytest.mark.unit
+    def test_best_effort_batches(self, monkeypatch):
+        second = f"+\t{TOPIC}:refs/heads/topic\t{STALE[:7]}...{TOPIC[:7]} (forced update)\nDone\n"
+        git = FakeGit(monkeypatch, push=[(0, PUSHED, ""), (0, second, "")])
+        results = bulkrefs.push(self.OPS, "origin", mode="best-effort", batch=3)
+        assert [result["status"] for result in results] == ["applied"] * 4
+        assert [args for args, _ in git.commands("push")] == [
+            ["push", "--porcelain", "--force-with-lease=refs/heads/release:",
+             f"--force-with-lease=refs/heads/stale:{STALE}", "origin", f"{MAIN}:refs/heads/release",
+             ":refs/heads/stale", f"{MAIN}:refs/heads/main"],
+            ["push", "--porcelain", f"--force-with-lease=refs/heads/topic:{MAIN}", "origin",
+             f"{TOPIC}:refs/heads/topic"]]
+    
+    @pytest.mark.unit
+    def test_best_effort(self, monkeypatch):
+        output = f"!\t{MAIN}:refs/heads/main\t[rejected] (non-fast-forward)\nDone\n"
+        git = FakeGit(monkeypatch, push=[(1, output, "error: failed to push some refs\n"),
+                                         (128, "", "fatal: could not read from remote repository.\n")])
+        results = bulkrefs.push([{"action": "update", "ref": "refs/heads/main", "new": "main"},
+                                 {"action": "verify", "ref": "refs/heads/topic", "old": "topic"},
+                                 {"action": "create", "ref": "refs/heads/later", "new": "main"}], "origin",
+                                mode="best-effort", batch=1)
+        assert [(result["status"], result["error"]) for result in results] == [
+            ("rejected", "[rejected] (non-fast-forward)"), ("rejected", "verify has no push equivalent"),
+            ("failed", "fatal: could not read from remote repository.")]
+        pushes = [args for args, _ in git.commands("push")]
+        assert len(pushes) == 2 and not any("--atomic" in args for args in pushes)
+    
+    @pytest.mark.unit
+    def test_atomic_rejection_pushes_nothing(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        results = bulkrefs.push([{"action": "create", "ref": "refs/heads/release", "new": "missing"},
+                                 {"action": "delete", "ref": "refs/heads/stale"}], "origin")
+        assert [result["status"] for result in results] == ["rejected", "aborted"]
+        assert git.commands("push") == []
+    
+    @pytest.mark.unit
+    def test_bad_batch(self):
+        with pytest.raises(bulkrefs.RefsError, match="batch must be at least 1"):
+            bulkrefs.push([], "origin", batch=0)
+
+
+class TestManage:
+    """Test the refs command of the plugin CLI"""
+    
+    @pytest.mark.unit
+    def test_local(self, monkeypatch):
+        FakeGit(monkeypatch)
+        result = bulkrefs.manage({"ops": '[{"action": "delete", "ref": "refs/heads/stale"}, '
+                                         '{"action": "create", "ref": "refs/heads/main", "new": "main"}]',
+                                  "mode": "best-effort", "message": "cleanup"})
+        assert result["success"] is True and result["mode"] == "best-effort"
+        assert result["summary"] == {"applied": 1, "rejected": 1}
+        assert result["elapsed"] >= 0
+    
+    @pytest.mark.unit
+    def test_file_and_remote(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch, push=[(0, "-\t:refs/heads/stale\t[deleted]\nDone\n", ""),
+                                         (0, "-\t:refs/heads/stale\t[deleted]\nDone\n", "")])
+        path = tmp_path / "ops.json"
+        path.write_text(json.dumps([{"action": "delete", "ref": "refs/heads/stale"}]))
+        for batch in (None, 10):
+            result = bulkrefs.manage({"file": str(path), "remote": "origin", "batch": batch})
+            assert result["summary"] == {"applied": 1} and result["mode"] == "atomic"
+        assert len(git.commands("push")) == 2
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args,error", [
+        ({}, "ops or file is required"),
+        ({"ops": "not json"}, "Expecting value"),
+        ({"ops": [], "mode": "some"}, "unknown mode"),
+        ({"file": "/no/such/ops.json"}, "[Errno 2]"),
+    ])
+    def test_errors(self, args, error):
+        result = bulkrefs.manage(args)
+        assert result["success"] is False and result["error_code"] == "REFS_FAILED"
+        assert result["error"].startswith(error)
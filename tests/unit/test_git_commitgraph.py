@@ -0,0 +1,556 @@
+"""
+Unit tests for the in-process commit-graph reader of the git plugin
+"""
+import hashlib
+import os
+import struct
+import zlib
+import pytest
+
+from plugins.git import commitgraph, fastpath
+from plugins.git import repo as repo_module
+from plugins.git.refs import Unsupported
+
+TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# label -> (parents, commit time); listed parents first
+HISTORY = [
+    ("c1", [], 1000),
+    ("c2", ["c1"], 1100),
+    ("c3", ["c2"], 1200),
+    ("s1", ["c1"], 1050),
+    ("s2", ["s1"], 1060),
+    ("m", ["c3", "s2"], 1300),
+    ("c4", ["m"], 1250),  # Committed with a clock behind its parent
+    ("x1", ["c1"], 1010),
+    ("o", ["c4", "s2", "x1"], 1400),
+    ("a1", ["c1"], 1020),
+    ("b1", ["c1"], 1030),
+    ("a2", ["a1", "b1"], 1500),
+    ("b2", ["b1", "a1"], 1510),
+    ("lone", [], 900),
+]
+PARENTS = {label: parents for label, parents, _ in HISTORY}
+
+
+def oid_of(label):
+    return hashlib.sha1(label.encode()).hexdigest()
+
+
+OIDS = {label: oid_of(label) for label in PARENTS}
+LABELS = {oid: label for label, oid in OIDS.items()}
+
+
+@pytest.fixture(autouse=True)
+def clean_git_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.delenv("GIT_NO_REPLACE_OBJECTS", raising=False)
+
+
+def generations(history):
+    """Topological levels and corrected commit dates, as git computes them"""
+    levels, corrected = {}, {}
+    for label, parents, commit_time in history:
+        levels[label] = 1 + max((levels[p] for p in parents), default=0)
+        corrected[label] = max(commit_time, max((corrected[p] + 1 for p in parents), default=0))
+    return levels, corrected
+
+
+def graph_bytes(layer, positions, base_count=0, corrected=True, overflow=False, levels=None, chunks=None):
+    """Serialize one commit-graph layer; ``layer`` lists (label, parents, time) tuples"""
+    layer = sorted(layer, key=lambda item: OIDS[item[0]])
+    level_of, corrected_of = generations([item for item in HISTORY if item[0] in positions])
+    if levels is not None:
+        level_of = dict(level_of, **levels)
+    fanout = [0] * 256
+    for label, _, _ in layer:
+        fanout[int(OIDS[label][:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    cdat = bytearray()
+    edges = bytearray()
+    gda = bytearray()
+    gdo = bytearray()
+    for label, parents, commit_time in layer:
+        ids = [positions[p] for p in parents]
+        first = ids[0] if ids else commitgraph.GRAPH_PARENT_NONE
+        if len(ids) > 2:
+            second = commitgraph.GRAPH_EXTRA_EDGES_NEEDED | (len(edges) // 4)
+            for i, position in enumerate(ids[1:]):
+                edges += struct.pack(">I", position | (commitgraph.GRAPH_LAST_EDGE if i == len(ids) - 2 else 0))
+        else:
+            second = ids[1] if len(ids) > 1 else commitgraph.GRAPH_PARENT_NONE
+        cdat += bytes.fromhex(TREE) + struct.pack(">IIII", first, second,
+                                                  (level_of[label] << 2) | (commit_time >> 32),
+                                                  commit_time & 0xFFFFFFFF)
+        offset = corrected_of[label] - commit_time
+        if overflow:
+            gda += struct.pack(">I", commitgraph.CORRECTED_DATE_OFFSET_OVERFLOW | (len(gdo) // 8))
+            gdo += struct.pack(">Q", offset)
+        else:
+            gda += struct.pack(">I", offset)
+    if chunks is None:
+        chunks = [(b"OIDF", struct.pack(">256I", *fanout)),
+                  (b"OIDL", b"".join(bytes.fromhex(OIDS[label]) for label, _, _ in layer)),
+                  (b"CDAT", bytes(cdat))]
+        if edges:
+            chunks.append((b"EDGE", bytes(edges)))
+        if corrected:
+            chunks.append((b"GDA2", bytes(gda)))
+            if overflow:
+                chunks.append((b"GDO2", bytes(gdo)))
+        if base_count:
+            chunks.append((b"BASE", b"\0" * 20 * base_count))
+    out = bytearray(struct.pack(">4sBBBB", b"CGPH", 1, 1, len(chunks), base_count))
+    offset = len(out) + 12 * (len(chunks) + 1)
+    for chunk_id, data in chunks:
+        out += struct.pack(">4sQ", chunk_id, offset)
+        offset += len(data)
+    out += struct.pack(">4sQ", b"\0\0\0\0", offset)
+    for _, data in chunks:
+        out += data
+    return bytes(out + hashlib.sha1(out).digest())
+
+
+def positions_for(layers):
+    positions = {}
+    for layer in layers:
+        for label, _, _ in sorted(layer, key=lambda item: OIDS[item[0]]):
+            positions[label] = len(positions)
+    return positions
+
+
+def write_graph(repo_dir, history=HISTORY, **options):
+    data = graph_bytes(history, positions_for([history]), **options)
+    path = repo_dir / ".git" / "objects" / "info" / "commit-graph"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def write_chain(repo_dir, layers, **options):
+    directory = repo_dir / ".git" / "objects" / "info" / "commit-graphs"
+    directory.mkdir(parents=True, exist_ok=True)
+    positions = positions_for(layers)
+    hashes = []
+    for base_count, layer in enumerate(layers):
+        data = graph_bytes(layer, positions, base_count=base_count, **options)
+        hashes.append(hashlib.sha1(data).hexdigest())
+        (directory / f"graph-{hashes[-1]}.graph").write_bytes(data)
+    (directory / "commit-graph-chain").write_text("".join(h + "\n" for h in hashes))
+    return hashes
+
+
+def write_object(repo_dir, type_name, data):
+    raw = b"%s %d\0" % (type_name.encode(), len(data)) + data
+    oid = hashlib.sha1(raw).hexdigest()
+    path = repo_dir / ".git" / "objects" / oid[:2] / oid[2:]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(zlib.compress(raw))
+    return oid
+
+
+def write_commit(repo_dir, parents, commit_time=2000, message="new"):
+    lines = [f"tree {TREE}"] + [f"parent {p}" for p in parents]
+    lines.append(f"author A <a@example.com> {commit_time} +0000")
+    lines.append(f"committer A <a@example.com> {commit_time} +0000")
+    return write_object(repo_dir, "commit", ("\n".join(lines) + f"\n\n{message}\n").encode())
+
+
+def set_ref(repo_dir, name, oid):
+    path = repo_dir / ".git" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(oid + "\n")
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    git_dir = tmp_path / ".git"
+    (git_dir / "objects").mkdir(parents=True)
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    (git_dir / "config").write_text("[core]\n\trepositoryformatversion = 0\n")
+    for label in PARENTS:
+        set_ref(tmp_path, f"refs/heads/{label}", OIDS[label])
+    set_ref(tmp_path, "refs/heads/main", OIDS["o"])
+    return tmp_path
+
+
+@pytest.fixture
+def graph_repo(repo_dir):
+    write_graph(repo_dir)
+    return repo_dir
+
+
+def open_repo(repo_dir):
+    return repo_module.discover(str(repo_dir))
+
+
+def ancestors(label):
+    seen = set()
+    stack = [label]
+    while stack:
+        current = stack.pop()
+        if current not in seen:
+            seen.add(current)
+            stack.extend(PARENTS[current])
+    return seen
+
+
+def run_fast(repo_dir, *argv):
+    return fastpath.fast_read(["git"] + list(argv), str(repo_dir))
+
+
+class TestGraphFile:
+    """Test decoding of commit-graph files and chains"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("options", [{}, {"corrected": False}, {"overflow": True}],
+                             ids=["corrected", "levels", "overflow"])
+    def test_commits_and_generations(self, graph_repo, options):
+        write_graph(graph_repo, **options)
+        graph = commitgraph.load(open_repo(graph_repo))
+        levels, corrected = generations(HISTORY)
+        assert len(graph) == len(HISTORY)
+        assert graph.corrected_dates == options.get("corrected", True)
+        for label, parents, _ in HISTORY:
+            position = graph.find(OIDS[label])
+            assert graph.oid(position) == OIDS[label]
+            parent_positions, generation = graph.commit(position)
+            assert [LABELS[graph.oid(p)] for p in parent_positions] == parents
+            assert generation == (corrected if graph.corrected_dates else levels)[label]
+        assert graph.find("0" * 40) is None
+        assert graph.find(OIDS["c1"][:2] + "0" * 38) is None
+        assert graph.find(OIDS["c1"][:2] + "f" * 38) is None
+        assert graph.find("f" * 40) is None
+        graph.close()
+    
+    @pytest.mark.unit
+    def test_split_chain(self, repo_dir):
+        write_chain(repo_dir, [HISTORY[:6], HISTORY[6:10], HISTORY[10:]])
+        graph = commitgraph.load(open_repo(repo_dir))
+        assert [layer.count for layer in graph.layers] == [6, 4, 4]
+        for label, parents, _ in HISTORY:
+            parent_positions, _ = graph.commit(graph.find(OIDS[label]))
+            assert [LABELS[graph.oid(p)] for p in parent_positions] == parents
+    
+    @pytest.mark.unit
+    def test_chain_with_a_layer_missing_corrected_dates_uses_levels(self, repo_dir):
+        write_chain(repo_dir, [HISTORY[:6], HISTORY[6:]])
+        directory = repo_dir / ".git" / "objects" / "info" / "commit-graphs"
+        top = (directory / "commit-graph-chain").read_text().split()[1]
+        positions = positions_for([HISTORY[:6], HISTORY[6:]])
+        (directory / f"graph-{top}.graph").write_bytes(graph_bytes(HISTORY[6:], positions, 1, corrected=False))
+        graph = commitgraph.load(open_repo(repo_dir))
+        assert not graph.corrected_dates
+        assert graph.commit(graph.find(OIDS["m"]))[1] == generations(HISTORY)[0]["m"]
+    
+    @pytest.mark.unit
+    def test_single_file_preferred_over_chain(self, repo_dir):
+        write_chain(repo_dir, [HISTORY[:3]])
+        write_graph(repo_dir)
+        assert len(commitgraph.load(open_repo(repo_dir))) == len(HISTORY)
+    
+    @pytest.mark.unit
+    def test_graph_cached_until_rewritten(self, graph_repo):
+        repository = open_repo(graph_repo)
+        first = commitgraph.load(repository)
+        assert commitgraph.load(repository) is first
+        path = write_graph(graph_repo, history=HISTORY[:3])
+        os.utime(str(path), (1, 1))
+        assert len(commitgraph.load(repository)) == 3
+    
+    @pytest.mark.unit
+    def test_git_would_ignore_the_graph(self, graph_repo, monkeypatch):
+        git_dir = graph_repo / ".git"
+        cases = [
+            lambda: (git_dir / "config").write_text("[core]\n\tcommitGraph = false\n"),
+            lambda: (git_dir / "shallow").write_text(OIDS["c1"] + "\n"),
+            lambda: (git_dir / "objects" / "info" / "grafts").write_text(OIDS["c2"] + "\n"),
+        ]
+        for make_case in cases:
+            make_case()
+            with pytest.raises(Unsupported):
+                commitgraph.load(open_repo(graph_repo))
+            (git_dir / "config").write_text("[core]\n")
+            for name in (git_dir / "shallow", git_dir / "objects" / "info" / "grafts"):
+                if name.exists():
+                    name.unlink()
+        set_ref(graph_repo, f"refs/replace/{OIDS['c2']}", OIDS["c3"])
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(graph_repo))
+        monkeypatch.setenv("GIT_NO_REPLACE_OBJECTS", "1")
+        assert commitgraph.load(open_repo(graph_repo)) is not None
+    
+    @pytest.mark.unit
+    def test_no_graph(self, repo_dir):
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(repo_dir))
+        assert run_fast(repo_dir, "merge-base", "--is-ancestor", "c1", "c2") is None
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("content", ["", "not-a-hash\n", OIDS["c1"] + "\n"], ids=["empty", "garbage", "missing"])
+    def test_broken_chains(self, repo_dir, content):
+        directory = repo_dir / ".git" / "objects" / "info" / "commit-graphs"
+        directory.mkdir(parents=True)
+        (directory / "commit-graph-chain").write_text(content)
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(repo_dir))
+    
+    @pytest.mark.unit
+    def test_unreadable_chain(self, repo_dir):
+        (repo_dir / ".git" / "objects" / "info" / "commit-graphs" / "commit-graph-chain").mkdir(parents=True)
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(repo_dir))
+    
+    @pytest.mark.unit
+    def test_chain_layers_must_match(self, repo_dir):
+        hashes = write_chain(repo_dir, [HISTORY[:6], HISTORY[6:]])
+        directory = repo_dir / ".git" / "objects" / "info" / "commit-graphs"
+        (directory / "commit-graph-chain").write_text(hashes[1] + "\n" + hashes[0] + "\n")
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(repo_dir))
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("mutate", [
+        lambda data: b"",
+        lambda data: data[:6],
+        lambda data: b"XXXX" + data[4:],
+        lambda data: data[:4] + b"\x02" + data[5:],
+        lambda data: data[:7] + b"\x01" + data[8:],
+        lambda data: data[:12] + struct.pack(">Q", 1 << 40) + data[20:],
+    ], ids=["empty", "truncated", "signature", "version", "base-count", "chunk-offset"])
+    def test_corrupt_files(self, graph_repo, mutate):
+        path = graph_repo / ".git" / "objects" / "info" / "commit-graph"
+        path.write_bytes(mutate(path.read_bytes()))
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(graph_repo))
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("chunks", [
+        [(b"OIDF", b"\0" * 1024), (b"OIDL", b"")],
+        [(b"OIDF", b"\0" * 1020), (b"OIDL", b""), (b"CDAT", b"")],
+        [(b"OIDF", struct.pack(">256I", *([0] * 255 + [1]))), (b"OIDL", b""), (b"CDAT", b"")],
+    ], ids=["missing-cdat", "fanout-size", "count-mismatch"])
+    def test_malformed_chunks(self, repo_dir, chunks):
+        write_graph(repo_dir, chunks=chunks)
+        with pytest.raises(Unsupported):
+            commitgraph.load(open_repo(repo_dir))
+    
+    @pytest.mark.unit
+    def test_bad_records_raise_unsupported(self, repo_dir):
+        write_graph(repo_dir)
+        graph = commitgraph.load(open_repo(repo_dir))
+        with pytest.raises(Unsupported):
+            graph.commit(len(graph))
+        octopus = graph.find(OIDS["o"])
+        layer = graph.layers[0]
+        layer._edges = None
+        with pytest.raises(Unsupported):
+            graph.commit(octopus)
+        layer._edges = len(layer._map) - 2
+        with pytest.raises(Unsupported):
+            graph.commit(octopus)
+    
+    @pytest.mark.unit
+    def test_overflow_without_gdo2(self, repo_dir):
+        write_graph(repo_dir, overflow=True)
+        graph = commitgraph.load(open_repo(repo_dir))
+        graph.layers[0]._generation_overflow = None
+        with pytest.raises(Unsupported):
+            graph.commit(0)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("level", [0, commitgraph.GENERATION_NUMBER_V1_MAX])
+    def test_unusable_levels(self, repo_dir, level):
+        write_graph(repo_dir, corrected=False, levels={"c1": level})
+        graph = commitgraph.load(open_repo(repo_dir))
+        with pytest.raises(Unsupported):
+            graph.commit(graph.find(OIDS["c1"]))
+
+
+class TestQueries:
+    """Test ancestry, merge-base and counting walks"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("options", [{}, {"corrected": False}], ids=["corrected", "levels"])
+    def test_is_ancestor_matches_reachability(self, graph_repo, options):
+        write_graph(graph_repo, **options)
+        repository = open_repo(graph_repo)
+        for ancestor in PARENTS:
+            for descendant in PARENTS:
+                expected = ancestor in ancestors(descendant)
+                assert commitgraph.is_ancestor(repository, ancestor, descendant) == expected, (ancestor, descendant)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("one,two,expected", [
+        ("c4", "s2", ["s2"]),
+        ("c3", "s2", ["c1"]),
+        ("o", "o", ["o"]),
+        ("c2", "c4", ["c2"]),
+        ("a2", "b2", ["a1", "b1"]),
+        ("lone", "c2", []),
+    ])
+    def test_merge_bases(self, graph_repo, one, two, expected):
+        bases = commitgraph.merge_bases(open_repo(graph_repo), one, two)
+        assert sorted(LABELS[oid] for oid in bases) == expected
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("include,exclude", [
+        (["o"], []),
+        (["o"], ["c3"]),
+        (["o", "b2"], ["a2"]),
+        (["c4"], ["s2", "x1"]),
+        (["c2", "c2"], ["c1", "c1"]),
+        (["c1"], ["o"]),
+        (["m"], ["m"]),
+    ])
+    def test_count_matches_reachability(self, graph_repo, include, exclude):
+        expected = set().union(*(ancestors(label) for label in include))
+        expected -= set().union(*(ancestors(label) for label in exclude))
+        assert commitgraph.count(open_repo(graph_repo), include, exclude) == len(expected)
+    
+    @pytest.mark.unit
+    def test_count_first_parent(self, graph_repo):
+        repository = open_repo(graph_repo)
+        # o -> c4 -> m -> c3 -> c2 -> c1
+        assert commitgraph.count(repository, ["o"], first_parent=True) == 6
+        assert commitgraph.count(repository, ["o"], ["s2"], first_parent=True) == 5
+    
+    @pytest.mark.unit
+    def test_generation(self, graph_repo):
+        assert commitgraph.generation(open_repo(graph_repo), "m") == generations(HISTORY)[1]["m"]
+    
+    @pytest.mark.unit
+    def test_revision_suffixes(self, graph_repo):
+        repository = open_repo(graph_repo)
+        commits = commitgraph.Commits(repository, commitgraph.load(repository))
+        expected = {"o~1": "c4", "o^": "c4", "o^2": "s2", "o^3": "x1", "o~2^2~1": "s1", "o^0": "o", "main~3": "c3",
+                    "o^^": "m"}
+        for name, label in expected.items():
+            assert commits.oid(commits.revision(name)) == OIDS[label], name
+        for name in ("o^4", "c1^", "o^{tree}", "o@{1}"):
+            with pytest.raises(Unsupported):
+                commits.revision(name)
+    
+    @pytest.mark.unit
+    def test_walks_are_bounded(self, graph_repo, monkeypatch):
+        repository = open_repo(graph_repo)
+        monkeypatch.setattr(commitgraph, "MAX_WALK", 2)
+        with pytest.raises(Unsupported):
+            commitgraph.is_ancestor(repository, "c1", "o")
+        with pytest.raises(Unsupported):
+            commitgraph.merge_bases(repository, "c4", "x1")
+        with pytest.raises(Unsupported):
+            commitgraph.count(repository, ["o"])
+        with pytest.raises(Unsupported):
+            commitgraph.is_ancestor(repository, "o~3", "o")
+        assert commitgraph.is_ancestor(repository, "c4", "o")
+
+
+class TestUngraphedCommits:
+    """Test commits written after the commit-graph"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("options", [{}, {"corrected": False}], ids=["corrected", "levels"])
+    def test_new_commits_on_top_of_the_graph(self, graph_repo, options):
+        write_graph(graph_repo, **options)
+        new1 = write_commit(graph_repo, [OIDS["o"]], commit_time=100)
+        new2 = write_commit(graph_repo, [new1, OIDS["b2"]], message="merge")
+        new3 = write_commit(graph_repo, [new1, new2], message="diamond")
+        set_ref(graph_repo, "refs/heads/main", new3)
+        repository = open_repo(graph_repo)
+        assert commitgraph.is_ancestor(repository, "a1", "main")
+        assert not commitgraph.is_ancestor(repository, "main", "o")
+        assert commitgraph.count(repository, ["main"]) == len(ancestors("o") | ancestors("b2")) + 3
+        assert commitgraph.count(repository, ["main"], ["o"]) == 3 + len(ancestors("b2") - ancestors("o"))
+        assert sorted(LABELS[oid] for oid in commitgraph.merge_bases(repository, "main", "a2")) == ["a1", "b1"]
+        commits = commitgraph.Commits(repository, commitgraph.load(repository))
+        node = commits.revision("main")
+        assert commits.revision(new3) == node
+        parent_generation = commits.generation(commits.node(OIDS["o"]))
+        assert commits.generation(commits.node(new1)) > parent_generation
+        assert commits.oid(node) == new3
+    
+    @pytest.mark.unit
+    def test_annotated_tags_are_peeled(self, graph_repo):
+        tag = write_object(graph_repo, "tag", f"object {OIDS['c3']}\ntype commit\ntag v1\n\nmsg\n".encode())
+        nested = write_object(graph_repo, "tag", f"object {tag}\ntype tag\ntag v2\n\nmsg\n".encode())
+        set_ref(graph_repo, "refs/tags/v2", nested)
+        assert commitgraph.is_ancestor(open_repo(graph_repo), "v2", "o")
+    
+    @pytest.mark.unit
+    def test_non_commits_raise_unsupported(self, graph_repo, monkeypatch):
+        blob = write_object(graph_repo, "blob", b"data")
+        tag = write_object(graph_repo, "tag", f"object {blob}\ntype blob\ntag b\n\n".encode())
+        bad_parent = write_commit(graph_repo, [blob])
+        no_committer = write_object(graph_repo, "commit", f"tree {TREE}\n\nmsg\n".encode())
+        bad_committer = write_object(graph_repo, "commit", f"tree {TREE}\ncommitter x\n\nmsg\n".encode())
+        repository = open_repo(graph_repo)
+        for oid in (blob, tag, bad_parent, no_committer, bad_committer):
+            with pytest.raises(Unsupported):
+                commitgraph.Commits(repository, commitgraph.load(repository)).node(oid)
+        monkeypatch.setattr(commitgraph, "MAX_TAG_DEPTH", 1)
+        with pytest.raises(Unsupported):
+            commitgraph.Commits(repository, commitgraph.load(repository)).node(tag)
+    
+    @pytest.mark.unit
+    def test_too_many_ungraphed_commits(self, graph_repo, monkeypatch):
+        tip = OIDS["o"]
+        for i in range(4):
+            tip = write_commit(graph_repo, [tip], message=str(i))
+        repository = open_repo(graph_repo)
+        monkeypatch.setattr(commitgraph, "MAX_UNGRAPHED_COMMITS", 2)
+        with pytest.raises(Unsupported):
+            commitgraph.Commits(repository, commitgraph.load(repository)).node(tip)
+
+
+class TestCommands:
+    """Test the merge-base and rev-list handlers through fast_read"""
+    
+    @pytest.mark.unit
+    def test_is_ancestor(self, graph_repo):
+        result = run_fast(graph_repo, "merge-base", "--is-ancestor", "c1", "main")
+        assert (result.returncode, result.stdout, result.stderr) == (0, "", "")
+        assert run_fast(graph_repo, "merge-base", "--is-ancestor", "main", "c1").returncode == 1
+    
+    @pytest.mark.unit
+    def test_merge_base(self, graph_repo):
+        assert run_fast(graph_repo, "merge-base", "c3", "s2").stdout == OIDS["c1"] + "\n"
+        assert run_fast(graph_repo, "merge-base", "--all", "c3", "s2").stdout == OIDS["c1"] + "\n"
+        result = run_fast(graph_repo, "merge-base", "lone", "c1")
+        assert (result.returncode, result.stdout) == (1, "")
+        assert run_fast(graph_repo, "merge-base", "a2", "b2") is None
+        assert run_fast(graph_repo, "merge-base", "--all", "a2", "b2") is None
+    
+    @pytest.mark.unit
+    def test_rev_list_count(self, graph_repo):
+        assert run_fast(graph_repo, "rev-list", "--count", "main").stdout == f"{len(ancestors('o'))}\n"
+        expected = f"{len(ancestors('o') - ancestors('c3'))}\n"
+        assert run_fast(graph_repo, "rev-list", "--count", "c3..main").stdout == expected
+        assert run_fast(graph_repo, "rev-list", "--count", "^c3", "main").stdout == expected
+        assert run_fast(graph_repo, "rev-list", "--count", "c3..").stdout == expected
+        assert run_fast(graph_repo, "rev-list", "--count", "..c3").stdout == "0\n"
+        assert run_fast(graph_repo, "rev-list", "--first-parent", "--count", "o").stdout == "6\n"
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("argv", [
+        ["merge-base", "c1"],
+        ["merge-base", "--octopus", "c1", "c2"],
+        ["merge-base", "--fork-point", "c1"],
+        ["merge-base", "c1", "c2", "c3"],
+        ["rev-list", "main"],
+        ["rev-list", "--count"],
+        ["rev-list", "--count", "--all"],
+        ["rev-list", "--count", "c1...c2"],
+        ["rev-list", "--count", "main", "--", "file"],
+        ["rev-list", "--count", "nope"],
+    ])
+    def test_unsupported_arguments(self, graph_repo, argv):
+        assert run_fast(graph_repo, *argv) is None
+    
+    @pytest.mark.unit
+    def test_missing_objects_fall_back(self, graph_repo):
+        assert run_fast(graph_repo, "merge-base", "--is-ancestor", "c1", "f" * 40) is None
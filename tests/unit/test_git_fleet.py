@@ -0,0 +1,222 @@
+"""
+Unit tests for running git commands across a fleet of repositories
+"""
+import json
+import os
+import threading
+import pytest
+
+from plugins.git import fleet
+from plugins.git import repo as repo_module
+from tests.conftest import make_repository
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+class FakeRun:
+    """Stands in for cli.run, recording the calls and answering from a table of responses"""
+    
+    def __init__(self, responses=None):
+        self.calls = []
+        self.responses = responses or {}
+        self.lock = threading.Lock()
+    
+    def __call__(self, args, cwd=None):
+        with self.lock:
+            self.calls.append((args, cwd))
+        response = self.responses.get(os.path.basename(cwd), {"success": True, "result": "ok"})
+        if isinstance(response, Exception):
+            raise response
+        return dict(response)
+
+
+class TestDiscover:
+    """Test finding the repositories under a root directory"""
+    
+    @pytest.mark.unit
+    def test_finds_repositories(self, tmp_path):
+        make_repository(tmp_path / "a")
+        make_repository(tmp_path / "a" / "vendor" / "nested")
+        make_repository(tmp_path / "group" / "b.git", bare=True)
+        (tmp_path / "group" / "c").mkdir()
+        (tmp_path / "group" / "c" / ".git").write_text("gitdir: ../../a/.git/worktrees/c\n")
+        make_repository(tmp_path / ".hidden" / "d")
+        make_repository(tmp_path / "deep" / "x" / "y" / "e")
+        (tmp_path / "notes.txt").write_text("not a repository\n")
+        assert fleet.discover(str(tmp_path)) == [str(tmp_path / "a"), str(tmp_path / "group" / "b.git"),
+                                                 str(tmp_path / "group" / "c")]
+        assert str(tmp_path / "deep" / "x" / "y" / "e") in fleet.discover(str(tmp_path), depth=4)
+        assert fleet.discover(str(tmp_path / "a")) == [str(tmp_path / "a")]
+    
+    @pytest.mark.unit
+    def test_unreadable_directory(self, tmp_path, monkeypatch):
+        make_repository(tmp_path / "a")
+        (tmp_path / "locked").mkdir()
+        scandir = os.scandir
+    
+        def guarded(path):
+            if path.endswith("locked"):
+                raise PermissionError(path)
+            return scandir(path)
+        monkeypatch.setattr(fleet.os, "scandir", guarded)
+        assert fleet.discover(str(tmp_path)) == [str(tmp_path / "a")]
+    
+    @pytest.mark.unit
+    def test_weight(self, tmp_path):
+        repo = make_repository(tmp_path / "a")
+        assert fleet.weight(repo) == 0
+        (tmp_path / "a" / ".git" / "index").write_bytes(b"x" * 10)
+        (tmp_path / "a" / ".git" / "objects" / "pack" / "pack-1.pack").write_bytes(b"x" * 100)
+        (tmp_path / "a" / ".git" / "objects" / "pack" / "pack-1.idx").write_bytes(b"x" * 1000)
+        assert fleet.weight(repo) == 110
+        bare = make_repository(tmp_path / "b.git", bare=True)
+        # Neither an index nor a pack directory
+        (tmp_path / "b.git" / "objects" / "pack").rmdir()
+        assert fleet.weight(bare) == 0
+        assert fleet.weight(str(tmp_path)) == 0
+
+
+class TestStream:
+    """Test the work-stealing scheduler and the streamed responses"""
+    
+    @pytest.mark.unit
+    def test_deques(self):
+        deques = fleet._Deques(["a", "b", "c", "d", "e"], 2)
+        assert deques.take(1) == ("b", False)
+        assert deques.take(1) == ("d", False)
+        # Worker 1 is out of work: it steals from the back of worker 0's deque
+        assert deques.take(1) == ("e", True)
+        assert deques.take(0) == ("a", False)
+        assert deques.take(0) == ("c", False)
+        assert deques.take(0) is None and deques.take(1) is None
+    
+    @pytest.mark.unit
+    def test_a_slow_repository_does_not_stall_the_rest(self, monkeypatch):
+        paths = ["/r/huge", "/r/b", "/r/c", "/r/d", "/r/e"]
+        monkeypatch.setattr(fleet, "weight", lambda path: 100 if path == "/r/huge" else 1)
+        others_done = threading.Event()
+        finished = []
+    
+        def run(args, cwd=None):
+            if cwd == "/r/huge":
+                assert others_done.wait(5)
+            else:
+                finished.append(cwd)
+                if len(finished) == 4:
+                    others_done.set()
+            return {"success": True}
+        records = list(fleet.stream(paths, {"command": "status"}, run, jobs=2))
+        # huge went first and finished last; its queued repositories were stolen meanwhile
+        assert [record["path"] for record in records][-1] == "/r/huge"
+        assert sorted(record["path"] for record in records) == sorted(paths)
+        stolen = [record["path"] for record in records if record["stolen"]]
+        assert stolen and all(record["worker"] == 1 for record in records if record["stolen"])
+        assert all(record["seconds"] >= 0 for record in records)
+    
+    @pytest.mark.unit
+    def test_failures_are_records(self):
+        run = FakeRun({"a": {"success": False, "error": "boom", "error_code": "COMMAND_FAILED_1"},
+                       "b": RuntimeError("crashed")})
+        records = {record["path"]: record for record in fleet.stream(["/r/a", "/r/b", "/r/c"], {"command": "fetch"},
+                                                                     run)}
+        assert records["/r/a"]["error_code"] == "COMMAND_FAILED_1"
+        assert (records["/r/b"]["error"], records["/r/b"]["error_code"]) == ("crashed", "FLEET_FAILED")
+        assert records["/r/c"]["result"] == "ok"
+        assert sorted(cwd for _, cwd in run.calls) == ["/r/a", "/r/b", "/r/c"]
+        assert all(args == {"command": "fetch"} for args, _ in run.calls)
+    
+    @pytest.mark.unit
+    def test_closing_early_stops_the_workers(self):
+        release = threading.Event()
+        calls = []
+    
+        def run(args, cwd=None):
+            calls.append(cwd)
+            if len(calls) > 1:
+                assert release.wait(5)
+            return {"success": True}
+        records = fleet.stream([f"/r/{n}" for n in range(20)], {"command": "status"}, run, jobs=1)
+        next(records)
+        records.close()
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name.startswith("smcp-git-fleet-"):
+                thread.join(5)
+        # The repository in flight finishes; no other one starts
+        assert len(calls) == 2
+    
+    @pytest.mark.unit
+    def test_no_paths(self):
+        assert list(fleet.stream([], {"command": "status"}, FakeRun())) == []
+
+
+class TestSummary:
+    """Test the counts and the slowest repositories"""
+    
+    @pytest.mark.unit
+    def test_summarize(self):
+        records = [{"path": "/r/a", "success": True, "seconds": 0.5, "stolen": False},
+                   {"path": "/r/b", "success": False, "error_code": "COMMAND_FAILED_1", "seconds": 2.0,
+                    "stolen": True},
+                   {"path": "/r/c", "success": False, "error_code": "COMMAND_FAILED_1", "seconds": 0.1},
+                   {"path": "/r/d", "seconds": 1.0}]
+        assert fleet.summarize(records, slowest=2) == {
+            "repositories": 4, "succeeded": 1, "failed": 3, "stolen": 1,
+            "error_codes": {"COMMAND_FAILED_1": 2, "UNKNOWN": 1},
+            "slowest": [{"path": "/r/b", "seconds": 2.0, "success": False},
+                        {"path": "/r/d", "seconds": 1.0, "success": False}]}
+        assert fleet.summarize([])["slowest"] == []
+
+
+class TestManage:
+    """Test the fleet command of the plugin CLI"""
+    
+    @pytest.mark.unit
+    def test_paths(self, tmp_path):
+        for name in ("a", "b"):
+            make_repository(tmp_path / name)
+        run = FakeRun({"b": {"success": False, "error_code": "COMMAND_FAILED_128"}})
+        result = fleet.manage({"command": "status", "args": ["--short"], "paths": ["a", "b"], "jobs": 2,
+                               "structured": True}, run, cwd=str(tmp_path))
+        assert result["success"] is True
+        assert sorted(record["path"] for record in result["result"]) == [str(tmp_path / "a"), str(tmp_path / "b")]
+        assert result["summary"]["failed"] == 1 and result["summary"]["error_codes"] == {"COMMAND_FAILED_128": 1}
+        assert run.calls[0][0] == {"command": "status", "args": ["--short"], "structured": True}
+        assert result["elapsed"] >= 0
+    
+    @pytest.mark.unit
+    def test_root_and_output(self, tmp_path):
+        for name in ("a", "b", "c"):
+            make_repository(tmp_path / "root" / name)
+        output = str(tmp_path / "results.ndjson")
+        result = fleet.manage({"command": "fetch", "root": str(tmp_path / "root"), "depth": 1, "slowest": 1,
+                               "output": output}, FakeRun())
+        assert result["result"] == f"Wrote 3 records to {output}"
+        assert len(result["summary"]["slowest"]) == 1
+        with open(output) as f:
+            records = [json.loads(line) for line in f]
+        assert sorted(os.path.basename(record["path"]) for record in records) == ["a", "b", "c"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args,error", [
+        ({"command": "status"}, "paths or root is required"),
+        ({"paths": ["a"]}, "command is required"),
+        ({"command": "status", "paths": ["a", "missing"]}, "not a directory: "),
+        ({"command": "status", "paths": ["a"], "jobs": "many"}, "invalid literal"),
+    ])
+    def test_errors(self, args, error, tmp_path):
+        make_repository(tmp_path / "a")
+        result = fleet.manage(args, FakeRun(), cwd=str(tmp_path))
+        assert result["success"] is False and result["error_code"] == "FLEET_FAILED"
+        assert result["error"].startswith(error)
+    
+    @pytest.mark.unit
+    def test_unwritable_output(self, tmp_path):
+        make_repository(tmp_path / "a")
+        result = fleet.manage({"command": "status", "paths": ["a"], "output": str(tmp_path / "no" / "such.ndjson")},
+                              FakeRun(), cwd=str(tmp_path))
+        assert result["error_code"] == "FLEET_FAILED"
@@ -0,0 +1,547 @@
+"""
+Unit tests for the in-process index reader of the git plugin
+"""
+import hashlib
+import os
+import struct
+import zlib
+import pytest
+
+from plugins.git import fastpath, index
+from plugins.git import repo as repo_module
+from plugins.git.refs import Unsupported
+
+OID_A = "a" * 40
+OID_B = "b" * 40
+# Worktree files get an old mtime so they are never racily clean
+OLD_MTIME = 1_000_000_000
+
+
+@pytest.fixture(autouse=True)
+def clean_git_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+def offset_varint(value):
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        value -= 1
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def entry(path, oid=OID_A, mode=0o100644, stage=0, flags=0, extended=0, st=None):
+    """Describe one index entry; ``st`` is an os.stat_result to copy stat data from"""
+    fields = [0] * 10
+    if st is not None:
+        fields = [int(st.st_ctime), st.st_ctime_ns % 1_000_000_000, int(st.st_mtime), st.st_mtime_ns % 1_000_000_000,
+                  st.st_dev & 0xFFFFFFFF, st.st_ino & 0xFFFFFFFF, 0, st.st_uid, st.st_gid, st.st_size & 0xFFFFFFFF]
+    fields[6] = mode
+    return {"path": path.encode() if isinstance(path, str) else path, "oid": oid, "stage": stage,
+            "flags": flags, "extended": extended, "fields": fields}
+
+
+def build_index(entries, version=2, extensions=b"", name_length=None):
+    """Serialize entries (already in index order) into an index file"""
+    out = bytearray(struct.pack(">4sII", b"DIRC", version, len(entries)))
+    previous = b""
+    for item in entries:
+        start = len(out)
+        path = item["path"]
+        flags = item["flags"] | (item["stage"] << 12)
+        flags |= min(len(path), 0xFFF) if name_length is None else name_length
+        if item["extended"]:
+            flags |= index.FLAG_EXTENDED
+        out += struct.pack(">10I", *item["fields"]) + bytes.fromhex(item["oid"]) + struct.pack(">H", flags)
+        if item["extended"]:
+            out += struct.pack(">H", item["extended"])
+        if version == 4:
+            common = os.path.commonprefix([previous, path])
+            out += offset_varint(len(previous) - len(common)) + path[len(common):] + b"\0"
+            previous = path
+        else:
+            out += path
+            out += b"\0" * (8 - (len(out) - start) % 8)
+    out += extensions
+    return bytes(out + hashlib.sha1(out).digest())
+
+
+def extension(signature, data):
+    return signature + struct.pack(">I", len(data)) + data
+
+
+def tree_extension(oid, count=3):
+    return extension(b"TREE", b"\0%d 0\n" % count + bytes.fromhex(oid))
+
+
+def write_index(repo_dir, data, mtime=None):
+    path = str(repo_dir / ".git" / "index")
+    with open(path, "wb") as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def write_loose(repo_dir, type_name, data):
+    raw = b"%s %d\0" % (type_name.encode(), len(data)) + data
+    oid = hashlib.sha1(raw).hexdigest()
+    path = repo_dir / ".git" / "objects" / oid[:2] / oid[2:]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(zlib.compress(raw))
+    return oid
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    git_dir = tmp_path / ".git"
+    (git_dir / "objects").mkdir(parents=True)
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    (git_dir / "config").write_text("[core]\n\trepositoryformatversion = 0\n")
+    return tmp_path
+
+
+def open_repo(repo_dir):
+    return repo_module.discover(str(repo_dir))
+
+
+def make_worktree(repo_dir, files):
+    """Create files with an old mtime and return index entries matching them"""
+    entries = []
+    for name in sorted(files):
+        path = repo_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(files[name])
+        os.utime(str(path), (OLD_MTIME, OLD_MTIME))
+        entries.append(entry(name, st=os.lstat(str(path))))
+    return entries
+
+
+def run_fast(repo_dir, *argv, cwd=None):
+    return fastpath.fast_read(["git"] + list(argv), str(cwd or repo_dir))
+
+
+NAMES = ["README", "a/b.txt", "a/c/d.txt", "a/e", "a0", "dir-x/f", "dir/g"]
+
+
+class TestIndexParsing:
+    """Test decoding of index files"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("version", [2, 3, 4])
+    def test_paths_and_entries(self, repo_dir, version):
+        entries = [entry(name) for name in NAMES]
+        entries[1] = entry("a/b.txt", OID_B, mode=0o100755)
+        write_index(repo_dir, build_index(entries, version))
+        parsed = index.read_index(open_repo(repo_dir))
+        assert parsed.version == version
+        assert len(parsed) == len(NAMES)
+        assert [parsed.path(i) for i in range(len(parsed))] == [name.encode() for name in NAMES]
+        item = parsed.entry(1)
+        assert (item.path, item.oid, item.mode, item.stage) == (b"a/b.txt", OID_B, 0o100755, 0)
+        assert parsed.mode(1) == 0o100755
+        assert [e.path for e in parsed] == [name.encode() for name in NAMES]
+        assert repr(item) == f"IndexEntry(b'a/b.txt', 100755, {OID_B}, stage=0)"
+        parsed.close()
+    
+    @pytest.mark.unit
+    def test_extended_flags(self, repo_dir):
+        entries = [entry("a", extended=index.FLAG_SKIP_WORKTREE), entry("b", extended=index.FLAG_INTENT_TO_ADD)]
+        write_index(repo_dir, build_index(entries, 3))
+        parsed = index.read_index(open_repo(repo_dir))
+        assert parsed.entry(0).skip_worktree and not parsed.entry(0).intent_to_add
+        assert parsed.entry(1).intent_to_add and not parsed.entry(1).skip_worktree
+        assert parsed.path(1) == b"b"
+    
+    @pytest.mark.unit
+    def test_long_paths(self, repo_dir):
+        long_name = "d/" + "x" * 5000
+        write_index(repo_dir, build_index([entry(long_name), entry("z")]))
+        parsed = index.read_index(open_repo(repo_dir))
+        assert parsed.path(0) == long_name.encode()
+        assert parsed.path(1) == b"z"
+    
+    @pytest.mark.unit
+    def test_version_4_long_shared_prefix(self, repo_dir):
+        # Stripping more than 127 bytes needs a multi-byte offset varint
+        base = "p" * 300
+        names = [base + "/a", "q"]
+        write_index(repo_dir, build_index([entry(name) for name in names], 4))
+        parsed = index.read_index(open_repo(repo_dir))
+        assert [parsed.path(i) for i in range(2)] == [name.encode() for name in names]
+    
+    @pytest.mark.unit
+    def test_conflicts_detected(self, repo_dir):
+        write_index(repo_dir, build_index([entry("a", stage=1), entry("a", stage=2), entry("b")]))
+        parsed = index.read_index(open_repo(repo_dir))
+        assert parsed.has_conflicts
+        assert parsed.entry(1).stage == 2
+        assert parsed.range_under(b"a") == (0, 2)
+    
+    @pytest.mark.unit
+    def test_optional_extensions_recorded(self, repo_dir):
+        data = build_index([entry("a")], extensions=extension(b"UNTR", b"xyz") + tree_extension(OID_B, 1))
+        write_index(repo_dir, data)
+        parsed = index.read_index(open_repo(repo_dir))
+        assert set(parsed.extensions) == {b"UNTR", b"TREE"}
+        assert parsed.tree_oid() == OID_B
+    
+    @pytest.mark.unit
+    def test_read_index_is_cached_by_stat(self, repo_dir):
+        write_index(repo_dir, build_index([entry("a")]))
+        repository = open_repo(repo_dir)
+        first = index.read_index(repository)
+        assert index.read_index(repository) is first
+        write_index(repo_dir, build_index([entry("a"), entry("b")]), mtime=OLD_MTIME)
+        assert len(index.read_index(repository)) == 2
+    
+    @pytest.mark.unit
+    def test_missing_index(self, repo_dir):
+        with pytest.raises(Unsupported):
+            index.read_index(open_repo(repo_dir))
+    
+    @pytest.mark.unit
+    def test_large_index_not_parsed_cold(self, repo_dir):
+        data = build_index([entry("a")])
+        write_index(repo_dir, data)
+        repository = open_repo(repo_dir)
+        with pytest.raises(Unsupported):
+            index.read_index(repository, max_bytes=len(data) - 1)
+        parsed = index.read_index(repository)
+        assert index.read_index(repository, max_bytes=1) is parsed
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("data", [
+        b"DIRC",
+        b"XXXX" + struct.pack(">II", 2, 0) + b"\0" * 20,
+        b"DIRC" + struct.pack(">II", 5, 0) + b"\0" * 20,
+        build_index([entry("a")])[:30] + b"\0" * 20,
+        build_index([entry("a")], extensions=extension(b"link", b"\0" * 20)),
+        build_index([entry("a")], extensions=extension(b"sdir", b"")),
+        build_index([entry("a")], extensions=b"TREE" + struct.pack(">I", 1000)),
+        build_index([entry("a")], extensions=b"TRE"),
+        build_index([entry("a", extended=index.FLAG_SKIP_WORKTREE)], 2),
+        build_index([entry("a")], name_length=0xFFF)[:-21] + b"x" * 21,
+        build_index([entry("a")], 4)[:-24] + b"\x05a" + b"\0" * 20,
+        build_index([entry("a")], 4)[:-23] + b"a" * 23,
+    ], ids=["short", "signature", "version", "truncated-entry", "link", "sdir", "extension-size",
+            "trailing", "extended-v2", "long-name-unterminated", "v4-strip", "v4-unterminated"])
+    def test_corrupt_or_unsupported_indexes(self, repo_dir, data):
+        write_index(repo_dir, data)
+        with pytest.raises(Unsupported):
+            index.read_index(open_repo(repo_dir))
+
+
+class TestLookup:
+    """Test prefix lookups and the cache-tree root"""
+    
+    @pytest.fixture
+    def parsed(self, repo_dir):
+        write_index(repo_dir, build_index([entry(name) for name in NAMES], 4))
+        return index.read_index(open_repo(repo_dir))
+    
+    @pytest.mark.unit
+    def test_lower_bound(self, parsed):
+        assert parsed.lower_bound(b"") == 0
+        assert parsed.lower_bound(b"a/") == 1
+        assert parsed.lower_bound(b"zzz") == len(NAMES)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("directory,expected", [
+        (b"", NAMES),
+        (b"a", ["a/b.txt", "a/c/d.txt", "a/e"]),
+        (b"a/c", ["a/c/d.txt"]),
+        (b"a/e", ["a/e"]),
+        (b"dir", ["dir/g"]),
+        (b"missing", []),
+    ])
+    def test_range_under(self, parsed, directory, expected):
+        start, stop = parsed.range_under(directory)
+        assert [parsed.path(i).decode() for i in range(start, stop)] == expected
+    
+    @pytest.mark.unit
+    def test_range_under_last_entry(self, repo_dir):
+        write_index(repo_dir, build_index([entry("a"), entry("b")]))
+        assert index.read_index(open_repo(repo_dir)).range_under(b"b") == (1, 2)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("extensions", [
+        b"",
+        tree_extension(OID_B, -1),
+        extension(b"TREE", b"sub\x001 0\n" + bytes.fromhex(OID_B)),
+        extension(b"TREE", b"\x001 0"),
+    ], ids=["absent", "invalidated", "not-root", "unterminated"])
+    def test_tree_oid_unavailable(self, repo_dir, extensions):
+        write_index(repo_dir, build_index([entry("a")], extensions=extensions))
+        assert index.read_index(open_repo(repo_dir)).tree_oid() is None
+    
+    @pytest.mark.unit
+    def test_ls_files_merges_overlapping_prefixes(self, parsed, repo_dir):
+        paths = list(index.ls_files(open_repo(repo_dir), [b"a/c", b"a", b"README"]))
+        assert paths == [b"README", b"a/b.txt", b"a/c/d.txt", b"a/e"]
+        assert list(index.ls_files(open_repo(repo_dir))) == [name.encode() for name in NAMES]
+
+
+class TestPathspecs:
+    """Test normalization of literal pathspecs"""
+    
+    @pytest.mark.unit
+    def test_relative_to_cwd(self, repo_dir):
+        (repo_dir / "a" / "c").mkdir(parents=True)
+        repository = open_repo(repo_dir)
+        assert index.normalize_pathspecs(repository, str(repo_dir), []) == []
+        assert index.normalize_pathspecs(repository, str(repo_dir), ["a/", "dir"]) == [b"a", b"dir"]
+        assert index.normalize_pathspecs(repository, str(repo_dir / "a"), []) == [b"a"]
+        assert index.normalize_pathspecs(repository, str(repo_dir / "a"), ["c", "../README"]) == [b"a/c", b"README"]
+        assert index.normalize_pathspecs(repository, str(repo_dir / "a"), [".."]) == []
+    
+    @pytest.mark.unit
+    def test_default_cwd(self, repo_dir, monkeypatch):
+        monkeypatch.chdir(str(repo_dir))
+        assert index.normalize_pathspecs(open_repo(repo_dir), None, ["x"]) == [b"x"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("spec", ["", ":(glob)*", "*.py", "a?", "[ab]", "a\\b", "..", "../x"])
+    def test_unsupported_pathspecs(self, repo_dir, spec):
+        with pytest.raises(Unsupported):
+            index.normalize_pathspecs(open_repo(repo_dir), str(repo_dir), [spec])
+    
+    @pytest.mark.unit
+    def test_cwd_outside_worktree(self, repo_dir, tmp_path_factory):
+        with pytest.raises(Unsupported):
+            index.normalize_pathspecs(open_repo(repo_dir), str(tmp_path_factory.mktemp("elsewhere")), [])
+    
+    @pytest.mark.unit
+    def test_bare_repository(self, tmp_path):
+        bare = tmp_path / "bare.git"
+        (bare / "objects").mkdir(parents=True)
+        (bare / "refs").mkdir()
+        (bare / "HEAD").write_text("ref: refs/heads/main\n")
+        (bare / "config").write_text("[core]\n\tbare = true\n")
+        repository = repo_module.discover(str(bare))
+        with pytest.raises(Unsupported):
+            index.normalize_pathspecs(repository, str(bare), [])
+        with pytest.raises(Unsupported):
+            index.stat_check(repository)
+
+
+class TestStatCheck:
+    """Test the stat-only dirty check"""
+    
+    @pytest.fixture
+    def clean_repo(self, repo_dir):
+        entries = make_worktree(repo_dir, {"a/one": "1\n", "a/two": "22\n", "b": "3\n"})
+        write_index(repo_dir, build_index(entries))
+        return repo_dir
+    
+    @pytest.mark.unit
+    def test_clean(self, clean_repo):
+        result = index.stat_check(open_repo(clean_repo))
+        assert result == {"clean": True, "checked": 3, "modified": [], "deleted": [], "racy": [], "skipped": 0}
+    
+    @pytest.mark.unit
+    def test_modified_deleted_and_limit(self, clean_repo):
+        (clean_repo / "a" / "two").write_text("changed\n")
+        os.remove(str(clean_repo / "b"))
+        repository = open_repo(clean_repo)
+        result = index.stat_check(repository)
+        assert not result["clean"]
+        assert (result["modified"], result["deleted"]) == (["a/two"], ["b"])
+        assert index.stat_check(repository, [b"a/one"])["clean"]
+        limited = index.stat_check(repository, limit=1)
+        assert limited["modified"] == ["a/two"] and limited["deleted"] == []
+    
+    @pytest.mark.unit
+    def test_path_replaced_by_file_in_parent(self, repo_dir):
+        entries = make_worktree(repo_dir, {"a/one": "1\n"})
+        write_index(repo_dir, build_index(entries))
+        (repo_dir / "a" / "one").unlink()
+        (repo_dir / "a").rmdir()
+        (repo_dir / "a").write_text("now a file\n")
+        assert index.stat_check(open_repo(repo_dir))["deleted"] == ["a/one"]
+    
+    @pytest.mark.unit
+    def test_racy_entries(self, repo_dir):
+        entries = make_worktree(repo_dir, {"a": "1\n"})
+        write_index(repo_dir, build_index(entries), mtime=OLD_MTIME)
+        result = index.stat_check(open_repo(repo_dir))
+        assert result["racy"] == ["a"] and not result["clean"]
+    
+    @pytest.mark.unit
+    def test_mode_changes(self, repo_dir):
+        entries = make_worktree(repo_dir, {"exe": "1\n", "link": "x\n"})
+        entries[0]["fields"][6] = 0o100755
+        entries[1]["fields"][6] = index.MODE_SYMLINK
+        write_index(repo_dir, build_index(entries))
+        repository = open_repo(repo_dir)
+        assert index.stat_check(repository)["modified"] == ["exe", "link"]
+        (repo_dir / ".git" / "config").write_text("[core]\n\tfileMode = false\n")
+        assert index.stat_check(open_repo(repo_dir))["modified"] == ["link"]
+    
+    @pytest.mark.unit
+    def test_symlink_and_directory(self, repo_dir):
+        os.symlink("target", str(repo_dir / "link"))
+        (repo_dir / "sub").mkdir()
+        link = entry("link", mode=index.MODE_SYMLINK, st=os.lstat(str(repo_dir / "link")))
+        sub = entry("sub", st=os.lstat(str(repo_dir / "sub")))
+        write_index(repo_dir, build_index([link, sub]))
+        os.utime(str(repo_dir / ".git" / "index"), (2 ** 31, 2 ** 31))
+        result = index.stat_check(open_repo(repo_dir))
+        assert result["modified"] == ["sub"] and result["racy"] == []
+    
+    @pytest.mark.unit
+    def test_skipped_and_intent_to_add(self, repo_dir):
+        entries = [entry("assumed", flags=index.FLAG_ASSUME_VALID),
+                   entry("ita", extended=index.FLAG_INTENT_TO_ADD),
+                   entry("sparse", extended=index.FLAG_SKIP_WORKTREE)]
+        write_index(repo_dir, build_index(entries, 3))
+        result = index.stat_check(open_repo(repo_dir))
+        assert (result["skipped"], result["checked"], result["modified"]) == (2, 1, ["ita"])
+    
+    @pytest.mark.unit
+    def test_submodule_entry_unsupported(self, repo_dir):
+        entries = make_worktree(repo_dir, {"a/one": "1\n", "sub/README": "s\n"})
+        entries[1] = entry("sub", mode=index.MODE_GITLINK, st=os.lstat(str(repo_dir / "sub")))
+        write_index(repo_dir, build_index(entries))
+        repository = open_repo(repo_dir)
+        assert index.stat_check(repository, [b"a"])["clean"]
+        with pytest.raises(Unsupported):
+            index.stat_check(repository)
+    
+    @pytest.mark.unit
+    def test_ctime_and_checkstat(self, clean_repo):
+        raw = bytearray((clean_repo / ".git" / "index").read_bytes())
+        # Corrupt the recorded ctime of every entry
+        for offset in index.read_index(open_repo(clean_repo)).entry_offsets:
+            raw[offset:offset + 4] = b"\0\0\0\1"
+        write_index(clean_repo, bytes(raw))
+        assert index.stat_check(open_repo(clean_repo))["modified"] == ["a/one", "a/two", "b"]
+        (clean_repo / ".git" / "config").write_text("[core]\n\ttrustCtime = false\n")
+        assert index.stat_check(open_repo(clean_repo))["clean"]
+        (clean_repo / ".git" / "config").write_text("[core]\n\tcheckStat = minimal\n")
+        assert index.stat_check(open_repo(clean_repo))["clean"]
+    
+    @pytest.mark.unit
+    def test_unsupported_configurations(self, clean_repo):
+        (clean_repo / ".git" / "config").write_text("[core]\n\tsymlinks = false\n")
+        with pytest.raises(Unsupported):
+            index.stat_check(open_repo(clean_repo))
+        (clean_repo / ".git" / "config").write_text("[core]\n")
+        write_index(clean_repo, build_index([entry("b", stage=1), entry("b", stage=3)]))
+        with pytest.raises(Unsupported):
+            index.stat_check(open_repo(clean_repo))
+
+
+class TestFastPathCommands:
+    """Test the ls-files and diff handlers through fast_read"""
+    
+    @pytest.fixture
+    def committed_repo(self, repo_dir):
+        """A clean worktree whose index cache-tree matches HEAD"""
+        entries = make_worktree(repo_dir, {"a/one": "1\n", "b": "2\n"})
+        tree = write_loose(repo_dir, "tree", b"dummy")
+        commit = write_loose(repo_dir, "commit", b"tree %s\nauthor x\n\nmsg\n" % tree.encode())
+        (repo_dir / ".git" / "refs" / "heads" / "main").write_text(commit + "\n")
+        write_index(repo_dir, build_index(entries, extensions=tree_extension(tree, 2)))
+        return repo_dir
+    
+    @pytest.mark.unit
+    def test_ls_files(self, committed_repo):
+        result = run_fast(committed_repo, "ls-files")
+        assert (result.returncode, result.stdout, result.stderr) == (0, "a/one\nb\n", "")
+        assert result.resources is None
+        assert run_fast(committed_repo, "ls-files", "-z", "--cached").stdout == "a/one\0b\0"
+        assert run_fast(committed_repo, "ls-files", "--", "b").stdout == "b\n"
+    
+    @pytest.mark.unit
+    def test_ls_files_from_subdirectory(self, committed_repo):
+        sub = committed_repo / "a"
+        assert run_fast(committed_repo, "ls-files", cwd=sub).stdout == "one\n"
+        assert run_fast(committed_repo, "ls-files", "../b", cwd=sub).stdout == "../b\n"
+        assert run_fast(committed_repo, "ls-files", "--full-name", cwd=sub).stdout == "a/one\n"
+    
+    @pytest.mark.unit
+    def test_ls_files_falls_back(self, repo_dir, monkeypatch):
+        write_index(repo_dir, build_index([entry("a b"), entry('q"uote'), entry(b"\xc3\xa9"), entry(b"\xff")]))
+        assert run_fast(repo_dir, "ls-files", "--stage") is None
+        assert run_fast(repo_dir, "ls-files", "a b").stdout == "a b\n"
+        assert run_fast(repo_dir, "ls-files", 'q"uote') is None
+        assert run_fast(repo_dir, "ls-files", "-z", 'q"uote').stdout == 'q"uote\0'
+        assert run_fast(repo_dir, "ls-files", "é") is None
+        (repo_dir / ".git" / "config").write_text("[core]\n\tquotePath = false\n")
+        assert run_fast(repo_dir, "ls-files", "é").stdout == "é\n"
+        assert run_fast(repo_dir, "ls-files", "-z") is None
+        monkeypatch.setattr(index, "LIST_MAX_ENTRIES", 1)
+        assert run_fast(repo_dir, "ls-files", "a b") is not None
+        assert run_fast(repo_dir, "ls-files") is None
+    
+    @pytest.mark.unit
+    def test_ls_files_conflicts_and_sparse_directories(self, repo_dir):
+        write_index(repo_dir, build_index([entry("a", stage=1), entry("a", stage=2)]))
+        assert run_fast(repo_dir, "ls-files") is None
+        write_index(repo_dir, build_index([entry("dir/", mode=index.MODE_DIRECTORY)]), mtime=OLD_MTIME)
+        assert run_fast(repo_dir, "ls-files") is None
+    
+    @pytest.mark.unit
+    def test_diff_quiet(self, committed_repo, monkeypatch):
+        result = run_fast(committed_repo, "diff", "--quiet")
+        assert (result.returncode, result.stdout) == (0, "")
+        assert run_fast(committed_repo, "diff", "--exit-code", "--quiet").returncode == 0
+        monkeypatch.setattr(index, "STAT_CHECK_MAX_ENTRIES", 1)
+        assert run_fast(committed_repo, "diff", "--quiet") is None
+    
+    @pytest.mark.unit
+    def test_diff_quiet_falls_back_when_stat_differs(self, committed_repo):
+        (committed_repo / "b").write_text("changed\n")
+        assert run_fast(committed_repo, "diff", "--quiet") is None
+        assert run_fast(committed_repo, "diff-index", "--quiet", "HEAD") is None
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("argv", [
+        ["diff"], ["diff", "--quiet", "--quiet"], ["diff", "--quiet", "HEAD"],
+        ["diff-index", "--quiet"], ["diff-index", "HEAD"], ["diff-index", "--quiet", "HEAD", "-p"],
+        ["diff-index", "--quiet", "HEAD", "HEAD"],
+    ])
+    def test_unsupported_arguments(self, committed_repo, argv):
+        assert run_fast(committed_repo, *argv) is None
+    
+    @pytest.mark.unit
+    def test_cached_diff(self, committed_repo):
+        for argv in (["diff", "--cached", "--quiet"], ["diff", "--staged", "--quiet"],
+                     ["diff-index", "--quiet", "--cached", "HEAD"], ["diff-index", "--quiet", "HEAD"]):
+            assert run_fast(committed_repo, *argv).returncode == 0
+        other = write_loose(committed_repo, "commit", b"tree %s\n\nother\n" % OID_B.encode())
+        (committed_repo / ".git" / "refs" / "heads" / "main").write_text(other + "\n")
+        assert run_fast(committed_repo, "diff", "--cached", "--quiet").returncode == 1
+        assert run_fast(committed_repo, "diff-index", "--quiet", "HEAD").returncode == 1
+    
+    @pytest.mark.unit
+    def test_cached_diff_needs_cache_tree(self, committed_repo):
+        data = build_index([entry("b")], extensions=tree_extension(OID_B, -1))
+        write_index(committed_repo, data, mtime=OLD_MTIME)
+        assert run_fast(committed_repo, "diff", "--cached", "--quiet") is None
+        assert run_fast(committed_repo, "diff-index", "--quiet", "HEAD") is None
+    
+    @pytest.mark.unit
+    def test_cached_diff_head_fallbacks(self, committed_repo):
+        (committed_repo / ".git" / "refs" / "replace").mkdir()
+        (committed_repo / ".git" / "refs" / "replace" / OID_A).write_text(OID_B + "\n")
+        assert run_fast(committed_repo, "diff", "--cached", "--quiet") is None
+        os.remove(str(committed_repo / ".git" / "refs" / "replace" / OID_A))
+        blob = write_loose(committed_repo, "blob", b"not a commit")
+        (committed_repo / ".git" / "refs" / "heads" / "main").write_text(blob + "\n")
+        assert run_fast(committed_repo, "diff", "--cached", "--quiet") is None
+        os.remove(str(committed_repo / ".git" / "refs" / "heads" / "main"))
+        assert run_fast(committed_repo, "diff", "--cached", "--quiet") is None
+    
+    @pytest.mark.unit
+    def test_declined_commands(self, committed_repo, tmp_path_factory):
+        assert fastpath.fast_read(["git"]) is None
+        assert fastpath.fast_read(["gh", "ls-files"]) is None
+        assert fastpath.fast_read(["git", "status"], str(committed_repo)) is None
+        assert fastpath.fast_read(["git", "ls-files"], str(tmp_path_factory.mktemp("plain"))) is None
@@ -0,0 +1,279 @@
+"""
+Unit tests for the per-repository git read/write lock
+"""
+import fcntl
+import os
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from plugins.git import cli, locking
+from plugins.git import repo as repo_module
+from tests.conftest import make_repository
+
+
+def hold_file(path, operation):
+    """Lock ``path`` on a descriptor of its own, as another process would"""
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, operation)
+    return fd
+
+
+@pytest.fixture(autouse=True)
+def clean_git_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.delenv(locking.LOCK_TIMEOUT_ENV, raising=False)
+
+
+class TestClassify:
+    """Test sorting git command lines into reads and writes"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args", [
+        ["log", "--oneline"], ["show", "HEAD"], ["diff"], ["blame", "f"], ["grep", "x"], ["status"],
+        ["rev-parse", "HEAD"], ["cat-file", "-p", "HEAD"], ["for-each-ref"], ["ls-files"],
+        ["branch"], ["branch", "-a", "-v"], ["branch", "--format=%(refname)"], ["branch", "--list", "feat*"],
+        ["tag", "-l", "v*"], ["tag"], ["remote"], ["remote", "-v"], ["remote", "get-url", "origin"],
+        ["stash", "list"], ["config", "--get", "user.name"], ["config", "--list"], ["worktree", "list"],
+        ["reflog"], ["reflog", "show", "main"], ["notes", "list"], ["submodule", "status"],
+    ])
+    def test_reads(self, args):
+        assert locking.classify(["git"] + args) == locking.READ
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args", [
+        ["commit", "-m", "x"], ["checkout", "main"], ["fetch"], ["add", "."], ["push"], ["gc"],
+        ["branch", "new"], ["branch", "-d", "old"], ["tag", "v1"], ["remote", "add", "o", "url"],
+        ["stash"], ["stash", "pop"], ["config", "user.name", "A"], ["worktree", "add", "../w"],
+        ["reflog", "expire", "--all"], ["notes", "add"], ["submodule", "update"], ["-C", "sub", "log"],
+        ["frobnicate"],
+    ])
+    def test_writes(self, args):
+        assert locking.classify(["git"] + args) == locking.WRITE
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args", [["git"], ["git", "clone", "url"], ["git", "init"], ["git", "--version"]])
+    def test_unlocked(self, cmd_args):
+        assert locking.classify(cmd_args) is None
+
+
+class TestLockTimeout:
+    """Test the lock timeout setting"""
+    
+    @pytest.mark.unit
+    def test_default(self):
+        assert locking.lock_timeout() == locking.DEFAULT_LOCK_TIMEOUT
+    
+    @pytest.mark.unit
+    def test_from_environment(self, monkeypatch):
+        monkeypatch.setenv(locking.LOCK_TIMEOUT_ENV, "2.5")
+        assert locking.lock_timeout() == 2.5
+        monkeypatch.setenv(locking.LOCK_TIMEOUT_ENV, "-1")
+        assert locking.lock_timeout() == 0.0
+    
+    @pytest.mark.unit
+    def test_invalid_value_falls_back(self, monkeypatch):
+        monkeypatch.setenv(locking.LOCK_TIMEOUT_ENV, "soon")
+        assert locking.lock_timeout() == locking.DEFAULT_LOCK_TIMEOUT
+
+
+class TestFairLock:
+    """Test the in-process reader-writer lock"""
+    
+    @pytest.mark.unit
+    def test_readers_share(self):
+        lock = locking.FairLock()
+        assert lock.acquire(True, time.monotonic() + 1)
+        assert lock.acquire(True, time.monotonic() + 1)
+        assert not lock.acquire(False, time.monotonic() + 0.01)
+        lock.release(True)
+        lock.release(True)
+        assert lock.acquire(False, time.monotonic() + 1)
+    
+    @pytest.mark.unit
+    def test_writer_is_exclusive(self):
+        lock = locking.FairLock()
+        assert lock.acquire(False, time.monotonic() + 1)
+        assert not lock.acquire(True, time.monotonic() + 0.01)
+        assert not lock.acquire(False, time.monotonic() + 0.01)
+        lock.release(False)
+        assert lock.acquire(True, time.monotonic() + 1)
+    
+    @pytest.mark.unit
+    def test_waiting_writer_holds_back_later_readers(self):
+        lock = locking.FairLock()
+        lock.acquire(True, time.monotonic() + 1)
+        order = []
+    
+        def take(shared, name):
+            lock.acquire(shared, time.monotonic() + 5)
+            order.append(name)
+            lock.release(shared)
+    
+        writer = threading.Thread(target=take, args=(False, "writer"))
+        writer.start()
+        while not lock._waiting:
+            time.sleep(0.001)
+        reader = threading.Thread(target=take, args=(True, "reader"))
+        reader.start()
+        while len(lock._waiting) < 2:
+            time.sleep(0.001)
+        # A reader could share the lock with the current one, but the writer arrived first
+        assert not lock.acquire(True, time.monotonic() + 0.01)
+        lock.release(True)
+        writer.join()
+        reader.join()
+        assert order == ["writer", "reader"]
+    
+    @pytest.mark.unit
+    def test_timeout_leaves_the_queue(self):
+        lock = locking.FairLock()
+        lock.acquire(False, time.monotonic() + 1)
+        assert not lock.acquire(True, time.monotonic())
+        assert not lock._waiting
+        lock.release(False)
+        assert lock.acquire(True, time.monotonic() + 1)
+
+
+class TestRepositoryLock:
+    """Test the lock shared with other processes through flock()"""
+    
+    @pytest.mark.unit
+    def test_shared_and_exclusive(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path))
+        descriptor = lock.acquire(True, 1)
+        assert descriptor is not None
+        other = hold_file(tmp_path / locking.LOCK_NAME, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        os.close(other)
+        lock.release(True, descriptor)
+        descriptor = lock.acquire(False, 1)
+        with pytest.raises(BlockingIOError):
+            hold_file(tmp_path / locking.LOCK_NAME, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        lock.release(False, descriptor)
+        assert not (tmp_path / locking.TURNSTILE_NAME).read_bytes()
+    
+    @pytest.mark.unit
+    def test_other_process_writer_times_out_read(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path))
+        other = hold_file(tmp_path / locking.LOCK_NAME, fcntl.LOCK_EX)
+        try:
+            with pytest.raises(locking.LockTimeout, match="held by another process"):
+                lock.acquire(True, 0.02)
+        finally:
+            os.close(other)
+        # The in-process lock was given back
+        lock.release(False, lock.acquire(False, 1))
+    
+    @pytest.mark.unit
+    def test_other_process_reader_admits_reads_only(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path))
+        other = hold_file(tmp_path / locking.LOCK_NAME, fcntl.LOCK_SH)
+        try:
+            lock.release(True, lock.acquire(True, 1))
+            with pytest.raises(locking.LockTimeout):
+                lock.acquire(False, 0.02)
+        finally:
+            os.close(other)
+    
+    @pytest.mark.unit
+    def test_waiting_writer_in_turnstile_blocks_readers(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path))
+        other = hold_file(tmp_path / locking.TURNSTILE_NAME, fcntl.LOCK_EX)
+        try:
+            with pytest.raises(locking.LockTimeout):
+                lock.acquire(True, 0.02)
+        finally:
+            os.close(other)
+    
+    @pytest.mark.unit
+    def test_thread_timeout(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path))
+        descriptor = lock.acquire(False, 1)
+        with pytest.raises(locking.LockTimeout, match="not granted within"):
+            lock.acquire(True, 0.01)
+        lock.release(False, descriptor)
+    
+    @pytest.mark.unit
+    def test_unwritable_directory_locks_threads_only(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path / "missing"))
+        assert lock.acquire(False, 1) is None
+        assert not lock.local.acquire(True, time.monotonic())
+        lock.release(False, None)
+    
+    @pytest.mark.unit
+    def test_interrupted_wait_releases_everything(self, tmp_path):
+        lock = locking.RepositoryLock(str(tmp_path))
+        with patch.object(locking, "_flock", side_effect=KeyboardInterrupt):
+            with pytest.raises(KeyboardInterrupt):
+                lock.acquire(False, 1)
+        assert lock.local.acquire(False, time.monotonic())
+    
+    @pytest.mark.unit
+    def test_one_lock_per_repository(self, tmp_path):
+        (tmp_path / "git").mkdir()
+        os.symlink(str(tmp_path / "git"), str(tmp_path / "link"))
+        assert locking.repository_lock(str(tmp_path / "link")) is locking.repository_lock(str(tmp_path / "git"))
+
+
+class TestHold:
+    """Test holding the lock of the repository a command runs in"""
+    
+    @pytest.mark.unit
+    def test_holds_repository_lock(self, tmp_path):
+        path = make_repository(tmp_path)
+        with locking.hold(locking.WRITE, path) as held:
+            assert held == locking.WRITE
+            with pytest.raises(locking.LockTimeout):
+                with locking.hold(locking.READ, path, timeout=0.01):
+                    pass  # pragma: no cover
+        assert (tmp_path / ".git" / locking.LOCK_NAME).exists()
+        with locking.hold(locking.READ, path, timeout=0) as held:
+            assert held == locking.READ
+    
+    @pytest.mark.unit
+    def test_unlocked(self, tmp_path):
+        with locking.hold(None, make_repository(tmp_path)) as held:
+            assert held is None
+        with locking.hold(locking.WRITE, str(tmp_path / ".git" / "objects")) as held:
+            assert held is None
+    
+    @pytest.mark.unit
+    def test_released_on_error(self, tmp_path):
+        path = make_repository(tmp_path)
+        with pytest.raises(RuntimeError):
+            with locking.hold(locking.WRITE, path):
+                raise RuntimeError("boom")
+        with locking.hold(locking.WRITE, path, timeout=0) as held:
+            assert held == locking.WRITE
+
+
+class TestCliLocking:
+    """Test the lock around git calls made through the plugin"""
+    
+    @pytest.mark.unit
+    def test_response_names_lock_and_wait(self, tmp_path, mock_subprocess_run):
+        path = make_repository(tmp_path)
+        result = cli.run({"command": "commit", "args": ["-m", "x"]}, cwd=path)
+        assert result["lock"] == "write"
+        assert result["timings"]["lock_wait_ns"] >= 0
+        assert cli.run({"command": "log"}, cwd=path)["lock"] == "read"
+        assert "lock" not in cli.run({"command": "--version"}, cwd=path)
+    
+    @pytest.mark.unit
+    def test_lock_timeout(self, tmp_path, monkeypatch, mock_subprocess_run):
+        path = make_repository(tmp_path)
+        monkeypatch.setenv(locking.LOCK_TIMEOUT_ENV, "0.01")
+        other = hold_file(tmp_path / ".git" / locking.LOCK_NAME, fcntl.LOCK_EX)
+        try:
+            result = cli.run({"command": "log"}, cwd=path)
+        finally:
+            os.close(other)
+        assert result["success"] is False
+        assert result["error_code"] == "LOCK_TIMEOUT"
+        assert result["command"] == "git log"
+        assert locking.LOCK_TIMEOUT_ENV in result["suggestion"]
+        assert "setup_ns" in result["timings"]
+        assert "return_code" not in result
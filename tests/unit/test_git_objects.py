@@ -0,0 +1,609 @@
+"""
+Unit tests for the in-process object reader of the git plugin
+"""
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import pytest
+
+from plugins.git import objects
+from plugins.git import fastpath
+from plugins.git import repo as repo_module
+
+TYPE_CODES = {"commit": 1, "tree": 2, "blob": 3, "tag": 4}
+
+
+@pytest.fixture(autouse=True)
+def clean_git_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+def object_id(type_name, data):
+    return hashlib.sha1(b"%s %d\0" % (type_name.encode(), len(data)) + data).hexdigest()
+
+
+def write_loose(objects_dir, type_name, data):
+    oid = object_id(type_name, data)
+    path = os.path.join(objects_dir, oid[:2], oid[2:])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(zlib.compress(b"%s %d\0" % (type_name.encode(), len(data)) + data))
+    return oid
+
+
+def varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def entry_header(type_code, size):
+    byte = (type_code << 4) | (size & 15)
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 0x7F
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+
+def ofs_encoding(distance):
+    out = [distance & 0x7F]
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.append(0x80 | (distance & 0x7F))
+        distance >>= 7
+    return bytes(reversed(out))
+
+
+def make_delta(base, target):
+    """A delta copying the common prefix of base and inserting the rest"""
+    common = 0
+    while common < min(len(base), len(target), 0x10000) and base[common] == target[common]:
+        common += 1
+    delta = varint(len(base)) + varint(len(target))
+    if common:
+        delta += bytes([0x80 | 0x10 | 0x20, common & 0xFF, common >> 8])
+    rest = target[common:]
+    while rest:
+        delta += bytes([min(len(rest), 127)]) + rest[:127]
+        rest = rest[127:]
+    return delta
+
+
+def write_pack(pack_dir, entries, name="test", large_offsets=False):
+    """Write a version 2 pack and idx.
+
+    ``entries`` are ``(type, data)`` for whole objects, ``("ofs", index,
+    target)`` for an OFS_DELTA against an earlier entry and ``("ref", oid,
+    base, type, target)`` for a REF_DELTA against any object. With
+    ``large_offsets`` every offset goes through the 64-bit offset table.
+    """
+    os.makedirs(pack_dir, exist_ok=True)
+    body = bytearray(b"PACK" + struct.pack(">II", 2, len(entries)))
+    records = []
+    offsets = []
+    resolved = []
+    for entry in entries:
+        offset = len(body)
+        offsets.append(offset)
+        if entry[0] == "ofs":
+            _, base_index, target = entry
+            base_type, base_data = resolved[base_index]
+            delta = make_delta(base_data, target)
+            raw = entry_header(6, len(delta)) + ofs_encoding(offset - offsets[base_index]) + zlib.compress(delta)
+            type_name, data = base_type, target
+        elif entry[0] == "ref":
+            _, base_oid, base_data, type_name, target = entry
+            delta = make_delta(base_data, target)
+            raw = entry_header(7, len(delta)) + bytes.fromhex(base_oid) + zlib.compress(delta)
+            data = target
+        else:
+            type_name, data = entry
+            raw = entry_header(TYPE_CODES[type_name], len(data)) + zlib.compress(data)
+        resolved.append((type_name, data))
+        records.append((bytes.fromhex(object_id(type_name, data)), zlib.crc32(raw), offset))
+        body += raw
+    pack_checksum = hashlib.sha1(body).digest()
+    body += pack_checksum
+    records.sort()
+    idx = bytearray(b"\377tOc" + struct.pack(">I", 2))
+    fanout = [0] * 256
+    for raw_oid, _, _ in records:
+        fanout[raw_oid[0]] += 1
+    total = 0
+    for i in range(256):
+        total += fanout[i]
+        idx += struct.pack(">I", total)
+    for raw_oid, _, _ in records:
+        idx += raw_oid
+    for _, crc, _ in records:
+        idx += struct.pack(">I", crc)
+    for index, (_, _, offset) in enumerate(records):
+        idx += struct.pack(">I", 0x80000000 | index if large_offsets else offset)
+    if large_offsets:
+        for _, _, offset in records:
+            idx += struct.pack(">Q", offset)
+    idx += pack_checksum
+    idx += hashlib.sha1(idx).digest()
+    with open(os.path.join(pack_dir, f"pack-{name}.pack"), "wb") as f:
+        f.write(body)
+    with open(os.path.join(pack_dir, f"pack-{name}.idx"), "wb") as f:
+        f.write(idx)
+    return [object_id(type_name, data) for type_name, data in resolved]
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    git_dir = tmp_path / ".git"
+    (git_dir / "objects").mkdir(parents=True)
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    (git_dir / "config").write_text("[core]\n\trepositoryformatversion = 0\n")
+    return tmp_path
+
+
+def open_repo(repo_dir):
+    return repo_module.discover(str(repo_dir))
+
+
+BASE = b"".join(b"line %d\n" % i for i in range(200))
+TARGET_1 = BASE + b"one more line\n"
+TARGET_2 = TARGET_1 + b"and another\n"
+
+
+class TestDelta:
+    """Test the binary delta decoder"""
+    
+    @pytest.mark.unit
+    def test_copy_and_insert(self):
+        delta = make_delta(BASE, TARGET_1)
+        assert objects.delta_result_size(delta) == len(TARGET_1)
+        assert objects.apply_delta(BASE, delta) == TARGET_1
+    
+    @pytest.mark.unit
+    def test_copy_size_zero_means_64k(self):
+        base = bytes(range(256)) * 300
+        delta = varint(len(base)) + varint(0x10000) + bytes([0x80])
+        assert objects.apply_delta(base, delta) == base[:0x10000]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("delta", [
+        varint(3) + varint(1) + b"\x01x",
+        varint(len(BASE)) + varint(5) + b"\x01x",
+        varint(len(BASE)) + varint(1) + b"\x00",
+        varint(len(BASE)) + varint(10) + bytes([0x91, 0xff, 0xff]),
+        varint(len(BASE)) + varint(10) + b"\x05ab",
+        b"\x80",
+    ])
+    def test_corrupt_deltas(self, delta):
+        with pytest.raises(objects.CorruptObject):
+            objects.apply_delta(BASE, delta)
+
+
+class TestObjectStore:
+    """Test loose and packed object lookups"""
+    
+    @pytest.mark.unit
+    def test_loose_objects(self, repo_dir):
+        objects_dir = str(repo_dir / ".git" / "objects")
+        oid = write_loose(objects_dir, "blob", b"hello\n")
+        repository = open_repo(repo_dir)
+        assert objects.has_object(repository, oid)
+        assert objects.object_type(repository, oid) == "blob"
+        assert objects.object_size(repository, oid) == 6
+        assert objects.read_object(repository, oid) == ("blob", b"hello\n")
+    
+    @pytest.mark.unit
+    def test_missing_object(self, repo_dir):
+        repository = open_repo(repo_dir)
+        missing = "0" * 40
+        assert not objects.has_object(repository, missing)
+        with pytest.raises(objects.MissingObject):
+            objects.read_object(repository, missing)
+        with pytest.raises(objects.MissingObject):
+            objects.object_type(repository, missing)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("oid", ["abc", "A" * 40, "g" * 40, "HEAD"])
+    def test_rejects_non_oids(self, repo_dir, oid):
+        with pytest.raises(ValueError):
+            objects.has_object(open_repo(repo_dir), oid)
+    
+    @pytest.mark.unit
+    def test_packed_objects_and_deltas(self, repo_dir):
+        pack_dir = str(repo_dir / ".git" / "objects" / "pack")
+        loose_base = write_loose(str(repo_dir / ".git" / "objects"), "blob", b"loose base\n" * 20)
+        oids = write_pack(pack_dir, [
+            ("blob", BASE),
+            ("ofs", 0, TARGET_1),
+            ("ofs", 1, TARGET_2),
+            ("commit", b"tree " + b"4b825dc642cb6eb9a060e54bf8d69288fbee4904\n\nmsg\n"),
+            ("ref", loose_base, b"loose base\n" * 20, "blob", b"loose base\n" * 20 + b"tail\n"),
+        ])
+        repository = open_repo(repo_dir)
+        assert objects.read_object(repository, oids[0]) == ("blob", BASE)
+        assert objects.read_object(repository, oids[1]) == ("blob", TARGET_1)
+        assert objects.read_object(repository, oids[2]) == ("blob", TARGET_2)
+        assert objects.object_type(repository, oids[3]) == "commit"
+        assert objects.read_object(repository, oids[4]) == ("blob", b"loose base\n" * 20 + b"tail\n")
+        # Sizes of deltified objects come from the delta header
+        assert objects.object_size(repository, oids[2]) == len(TARGET_2)
+        assert objects.object_type(repository, oids[2]) == "blob"
+        assert objects.object_size(repository, oids[4]) == len(b"loose base\n" * 20 + b"tail\n")
+        assert all(objects.has_object(repository, oid) for oid in oids)
+    
+    @pytest.mark.unit
+    def test_delta_base_cache_is_bounded(self, repo_dir):
+        pack_dir = str(repo_dir / ".git" / "objects" / "pack")
+        oids = write_pack(pack_dir, [("blob", BASE), ("ofs", 0, TARGET_1), ("ofs", 1, TARGET_2)])
+        repository = open_repo(repo_dir)
+        store = objects.store(repository)
+        assert objects.store(repository) is store
+        store.read(oids[2])
+        assert store._base_cache_bytes == len(BASE) + len(TARGET_1)
+        for limit in (len(BASE) + 1, len(TARGET_1) + 1):
+            store.cache_limit = limit
+            store._base_cache.clear()
+            store._base_cache_bytes = 0
+            store.read(oids[2])
+            assert 0 < store._base_cache_bytes <= store.cache_limit
+        assert store.read(oids[2]) == ("blob", TARGET_2)
+        store.close()
+        assert store._base_cache_bytes == 0
+    
+    @pytest.mark.unit
+    def test_concurrent_reads_share_the_cache(self, repo_dir):
+        pack_dir = str(repo_dir / ".git" / "objects" / "pack")
+        entries = [("blob", BASE)]
+        contents = [BASE]
+        for n in range(1, 40):
+            contents.append(contents[-1] + b"line %d of the chain\n" % n)
+            entries.append(("ofs", n - 1, contents[-1]))
+        oids = write_pack(pack_dir, entries)
+        store = objects.store(open_repo(repo_dir))
+        # A cache that holds a few bases at most, so the threads keep evicting each other's entries
+        store.cache_limit = len(contents[-1]) * 3
+    
+        class YieldingCache(OrderedDict):
+            """Gives up the GIL inside each lookup and eviction, where an unlocked cache races"""
+            def __contains__(self, key):
+                time.sleep(0)
+                return super().__contains__(key)
+            
+            def popitem(self, last=True):
+                time.sleep(0)
+                return super().popitem(last)
+        store._base_cache = YieldingCache()
+        failures = []
+    
+        def read():
+            for n in range(100):
+                # Every thread walks the same chains, so they insert and evict the same bases
+                index = len(oids) - 1 - n % 5
+                try:
+                    result = fastpath.fast_read(["git", "cat-file", "-p", oids[index]], str(repo_dir))
+                except Exception as e:
+                    failures.append(e)
+                    continue
+                if result is None or result.stdout != contents[index].decode():
+                    failures.append(index)
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert failures == []
+        assert store._base_cache_bytes == sum(len(data) for _, data in store._base_cache.values())
+        assert 0 < store._base_cache_bytes <= store.cache_limit
+    
+    @pytest.mark.unit
+    def test_binary_search_over_many_objects(self, repo_dir):
+        pack_dir = str(repo_dir / ".git" / "objects" / "pack")
+        oids = write_pack(pack_dir, [("blob", b"%d\n" % i) for i in range(600)])
+        repository = open_repo(repo_dir)
+        for i, oid in enumerate(oids):
+            assert objects.read_object(repository, oid) == ("blob", b"%d\n" % i)
+        for oid in oids[:50]:
+            # Same fanout bucket, absent object
+            assert not objects.has_object(repository, oid[:39] + ("0" if oid[39] != "0" else "1"))
+    
+    @pytest.mark.unit
+    def test_new_pack_is_picked_up(self, repo_dir):
+        pack_dir = str(repo_dir / ".git" / "objects" / "pack")
+        write_pack(pack_dir, [("blob", b"first\n")], name="a")
+        repository = open_repo(repo_dir)
+        assert objects.has_object(repository, object_id("blob", b"first\n"))
+        [oid] = write_pack(pack_dir, [("blob", b"second\n")], name="b")
+        os.utime(pack_dir, ns=(0, os.stat(pack_dir).st_mtime_ns + 10 ** 9))
+        assert objects.read_object(repository, oid) == ("blob", b"second\n")
+    
+    @pytest.mark.unit
+    def test_alternates(self, repo_dir, tmp_path):
+        shared = tmp_path / "shared-objects"
+        shared.mkdir()
+        oid = write_loose(str(shared), "blob", b"shared\n")
+        info = repo_dir / ".git" / "objects" / "info"
+        info.mkdir()
+        (info / "alternates").write_text(f"# comment\n{shared}\n/does/not/exist\n")
+        assert objects.read_object(open_repo(repo_dir), oid) == ("blob", b"shared\n")
+    
+    @pytest.mark.unit
+    def test_corrupt_loose_object(self, repo_dir):
+        path = repo_dir / ".git" / "objects" / "ab" / ("c" * 38)
+        path.parent.mkdir()
+        path.write_bytes(b"not zlib")
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), "ab" + "c" * 38)
+    
+    @pytest.mark.unit
+    def test_bad_index_is_skipped(self, repo_dir):
+        pack_dir = repo_dir / ".git" / "objects" / "pack"
+        pack_dir.mkdir()
+        (pack_dir / "pack-bad.idx").write_bytes(b"\377tOc\0\0\0\1" + b"\0" * 2000)
+        (pack_dir / "pack-bad.pack").write_bytes(b"PACK")
+        assert not objects.has_object(open_repo(repo_dir), "1" * 40)
+
+
+class TestTreesAndCatFile:
+    """Test tree parsing and the cat-file helper"""
+    
+    @pytest.fixture
+    def tree_repo(self, repo_dir):
+        objects_dir = str(repo_dir / ".git" / "objects")
+        blob = write_loose(objects_dir, "blob", b"content\n")
+        subtree = write_loose(objects_dir, "tree", b"100644 inner.txt\0" + bytes.fromhex(blob))
+        tree = write_loose(objects_dir, "tree",
+                           b"100755 run.sh\0" + bytes.fromhex(blob)
+                           + b"40000 sub\0" + bytes.fromhex(subtree)
+                           + b"160000 vendor\0" + bytes.fromhex("1" * 40))
+        return repo_dir, blob, subtree, tree
+    
+    @pytest.mark.unit
+    def test_parse_tree(self, tree_repo):
+        repo_dir, blob, subtree, tree = tree_repo
+        _, data = objects.read_object(open_repo(repo_dir), tree)
+        assert objects.parse_tree(data) == [
+            ("100755", b"run.sh", blob), ("40000", b"sub", subtree), ("160000", b"vendor", "1" * 40)]
+        with pytest.raises(objects.CorruptObject):
+            objects.parse_tree(b"100644 truncated\0abc")
+    
+    @pytest.mark.unit
+    def test_cat_file_options(self, tree_repo):
+        repo_dir, blob, subtree, tree = tree_repo
+        repository = open_repo(repo_dir)
+        assert objects.cat_file(repository, "-e", blob) == b""
+        assert objects.cat_file(repository, "-t", tree) == b"tree\n"
+        assert objects.cat_file(repository, "-s", blob) == b"8\n"
+        assert objects.cat_file(repository, "-p", blob) == b"content\n"
+        assert objects.cat_file(repository, "blob", blob) == b"content\n"
+        assert objects.cat_file(repository, "-p", tree) == (
+            f"100755 blob {blob}\trun.sh\n"
+            f"040000 tree {subtree}\tsub\n"
+            f"160000 commit {'1' * 40}\tvendor\n").encode()
+        with pytest.raises(objects.CorruptObject):
+            objects.cat_file(repository, "commit", blob)
+        with pytest.raises(objects.MissingObject):
+            objects.cat_file(repository, "-e", "2" * 40)
+        with pytest.raises(ValueError):
+            objects.cat_file(repository, "--batch", blob)
+    
+    @pytest.mark.unit
+    def test_fast_read_cat_file(self, tree_repo):
+        repo_dir, blob, subtree, tree = tree_repo
+        run = lambda *argv: fastpath.fast_read(["git", "cat-file"] + list(argv), str(repo_dir))
+        assert run("-t", blob).stdout == "blob\n"
+        assert run("-p", tree).stdout.startswith("100755 blob")
+        assert (run("-e", blob).returncode, run("-e", blob).stdout) == (0, "")
+        assert run("-e", "2" * 40) is None
+        assert run("-p", blob[:7]) is None
+        assert run("--batch-check") is None
+    
+    @pytest.mark.unit
+    def test_fast_read_cat_file_falls_back(self, repo_dir):
+        objects_dir = str(repo_dir / ".git" / "objects")
+        binary = write_loose(objects_dir, "blob", b"\xff\xfe\x00")
+        odd = write_loose(objects_dir, "tree", b"100644 tab\tname\0" + bytes.fromhex(binary))
+        run = lambda *argv: fastpath.fast_read(["git", "cat-file"] + list(argv), str(repo_dir))
+        assert run("-p", binary) is None
+        assert run("-s", binary).stdout == "3\n"
+        assert run("-p", odd) is None
+        (repo_dir / ".git" / "refs" / "replace").mkdir(parents=True)
+        (repo_dir / ".git" / "refs" / "replace" / binary).write_text(odd + "\n")
+        assert run("-s", binary) is None
+    
+    @pytest.mark.unit
+    def test_fast_read_cat_file_head(self, repo_dir):
+        objects_dir = str(repo_dir / ".git" / "objects")
+        commit = write_loose(objects_dir, "commit", b"tree " + b"4b825dc642cb6eb9a060e54bf8d69288fbee4904\n\nmsg\n")
+        (repo_dir / ".git" / "refs" / "heads" / "main").write_text(commit + "\n")
+        result = fastpath.fast_read(["git", "cat-file", "-t", "HEAD"], str(repo_dir))
+        assert result.stdout == "commit\n"
+        result = fastpath.fast_read(["git", "for-each-ref"], str(repo_dir))
+        assert result.stdout == f"{commit} commit\trefs/heads/main\n"
+        result = fastpath.fast_read(["git", "for-each-ref", "--format=%(objectsize) %(refname)"], str(repo_dir))
+        assert result.stdout == "51 refs/heads/main\n"
+
+
+class TestCorruptData:
+    """Test that damaged packs and objects raise CorruptObject"""
+    
+    @pytest.fixture
+    def pack_dir(self, repo_dir):
+        return str(repo_dir / ".git" / "objects" / "pack")
+    
+    def patch_pack(self, pack_dir, offset, data=None, truncate=None):
+        path = os.path.join(pack_dir, "pack-test.pack")
+        with open(path, "r+b") as f:
+            if data is not None:
+                f.seek(offset)
+                f.write(data)
+            if truncate is not None:
+                f.truncate(truncate)
+    
+    @pytest.mark.unit
+    def test_large_offsets_and_iteration(self, repo_dir, pack_dir):
+        oids = write_pack(pack_dir, [("blob", BASE), ("ofs", 0, TARGET_1)], large_offsets=True)
+        repository = open_repo(repo_dir)
+        assert objects.read_object(repository, oids[1]) == ("blob", TARGET_1)
+        index = objects.store(repository)._packs[0].index
+        assert sorted(raw.hex() for raw in index) == sorted(oids)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("content", [
+        b"\377tOc",
+        b"\377tOc\0\0\0\3" + b"\0" * 1024,
+        b"\377tOc\0\0\0\2" + b"\0" * 1020 + struct.pack(">I", 5),
+    ])
+    def test_bad_index_files(self, tmp_path, content):
+        path = tmp_path / "pack-x.idx"
+        path.write_bytes(content)
+        with pytest.raises(objects.CorruptObject):
+            objects.PackIndex(str(path))
+    
+    @pytest.mark.unit
+    def test_bad_pack_header(self, tmp_path, pack_dir):
+        write_pack(pack_dir, [("blob", b"x\n")])
+        self.patch_pack(pack_dir, 0, b"JUNK")
+        with pytest.raises(objects.CorruptObject):
+            objects.Pack(os.path.join(pack_dir, "pack-test.pack"), os.path.join(pack_dir, "pack-test.idx"))
+    
+    @pytest.mark.unit
+    def test_bad_object_type(self, repo_dir, pack_dir):
+        [oid] = write_pack(pack_dir, [("blob", b"x\n")])
+        self.patch_pack(pack_dir, 12, bytes([(5 << 4) | 2]))
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), oid)
+    
+    @pytest.mark.unit
+    def test_truncated_entry_header(self, repo_dir, pack_dir):
+        [oid] = write_pack(pack_dir, [("blob", b"x" * 100)])
+        self.patch_pack(pack_dir, 12, truncate=13)
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), oid)
+    
+    @pytest.mark.unit
+    def test_truncated_zlib_stream(self, repo_dir, pack_dir):
+        [oid] = write_pack(pack_dir, [("blob", BASE)])
+        self.patch_pack(pack_dir, 12, truncate=40)
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), oid)
+    
+    @pytest.mark.unit
+    def test_inflate_rejects_oversized_stream(self, repo_dir, pack_dir):
+        [oid] = write_pack(pack_dir, [("blob", BASE)])
+        repository = open_repo(repo_dir)
+        pack, offset = objects.store(repository)._find_packed(bytes.fromhex(oid))
+        _, size, data_offset, _ = pack.entry_header(offset)
+        assert pack.inflate(data_offset, size, limit=10) == BASE[:10]
+        with pytest.raises(objects.CorruptObject):
+            pack.inflate(data_offset, 10)
+    
+    @pytest.mark.unit
+    def test_garbage_zlib_stream(self, repo_dir, pack_dir):
+        [oid] = write_pack(pack_dir, [("blob", BASE)])
+        self.patch_pack(pack_dir, 14, b"\xff" * 8)
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), oid)
+    
+    @pytest.mark.unit
+    def test_stream_longer_than_declared(self, repo_dir, pack_dir):
+        [oid] = write_pack(pack_dir, [("blob", b"ab")])
+        # Declare one byte where the stream holds two
+        self.patch_pack(pack_dir, 12, bytes([(3 << 4) | 1]))
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), oid)
+    
+    @pytest.mark.unit
+    def test_bad_ofs_delta_base(self, repo_dir, pack_dir):
+        oids = write_pack(pack_dir, [("blob", BASE), ("ofs", 0, TARGET_1)])
+        repository = open_repo(repo_dir)
+        pack = objects.store(repository)
+        found = pack._find_packed(bytes.fromhex(oids[1]))
+        _, _, data_offset, _ = found[0].entry_header(found[1])
+        objects.store(repository).close()
+        # The distance byte directly precedes the zlib data
+        self.patch_pack(pack_dir, data_offset - 1, b"\x7f")
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), oids[1])
+    
+    @pytest.mark.unit
+    def test_ref_delta_cycle(self, repo_dir, pack_dir):
+        first, second = b"first version\n" * 10, b"second version\n" * 10
+        oids = write_pack(pack_dir, [
+            ("ref", object_id("blob", second), second, "blob", first),
+            ("ref", object_id("blob", first), first, "blob", second),
+        ])
+        repository = open_repo(repo_dir)
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(repository, oids[0])
+        with pytest.raises(objects.CorruptObject):
+            objects.object_type(repository, oids[0])
+    
+    @pytest.mark.unit
+    def test_truncated_delta_header(self):
+        with pytest.raises(objects.CorruptObject):
+            objects.delta_result_size(b"\x80")
+    
+    @pytest.mark.unit
+    def test_delta_copy_out_of_range(self):
+        delta = varint(len(BASE)) + varint(10) + bytes([0x93, 0xff, 0xff, 0x0a])
+        with pytest.raises(objects.CorruptObject):
+            objects.apply_delta(BASE, delta)
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("content", [b"blob\0abc", b"bogus 3\0abc", b"blob 5\0abc"])
+    def test_bad_loose_headers(self, repo_dir, content):
+        path = repo_dir / ".git" / "objects" / "ab" / ("c" * 38)
+        path.parent.mkdir()
+        path.write_bytes(zlib.compress(content))
+        with pytest.raises(objects.CorruptObject):
+            objects.read_object(open_repo(repo_dir), "ab" + "c" * 38)
+
+
+class TestPackDiscovery:
+    """Test pack directory rescans"""
+    
+    @pytest.mark.unit
+    def test_index_without_pack_and_removed_packs(self, repo_dir):
+        pack_dir = str(repo_dir / ".git" / "objects" / "pack")
+        [kept] = write_pack(pack_dir, [("blob", b"kept\n")], name="a")
+        [gone] = write_pack(pack_dir, [("blob", b"gone\n")], name="b")
+        os.remove(os.path.join(pack_dir, "pack-a.pack"))
+        repository = open_repo(repo_dir)
+        assert not objects.has_object(repository, kept)
+        assert objects.has_object(repository, gone)
+        os.remove(os.path.join(pack_dir, "pack-b.pack"))
+        os.remove(os.path.join(pack_dir, "pack-b.idx"))
+        os.utime(pack_dir, ns=(0, os.stat(pack_dir).st_mtime_ns + 10 ** 9))
+        # A miss rescans the directory and drops the removed pack
+        assert not objects.has_object(repository, "0" * 40)
+        assert objects.store(repository)._packs == []
+        assert not objects.has_object(repository, gone)
+    
+    @pytest.mark.unit
+    def test_alternates_cycle(self, repo_dir, tmp_path):
+        first, second = tmp_path / "first", tmp_path / "second"
+        for directory, other in ((first, second), (second, first)):
+            (directory / "info").mkdir(parents=True)
+            (directory / "info" / "alternates").write_text(f"{other}\n")
+        info = repo_dir / ".git" / "objects" / "info"
+        info.mkdir()
+        (info / "alternates").write_text(f"{first}\n")
+        oid = write_loose(str(second), "blob", b"deep\n")
+        assert objects.read_object(open_repo(repo_dir), oid) == ("blob", b"deep\n")
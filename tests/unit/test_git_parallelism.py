@@ -0,0 +1,175 @@
+"""
+Unit tests for the git plugin's parallelism settings and job budget
+"""
+import fcntl
+import os
+import tempfile
+import pytest
+
+from plugins.git import cli, parallelism
+from plugins.git import repo as repo_module
+from tests.conftest import completed, make_repository
+
+
+@pytest.fixture(autouse=True)
+def jobs(tmp_path, monkeypatch):
+    """A private slot directory and a budget of four jobs"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv(parallelism.JOBS_DIR_ENV, str(tmp_path / "jobs"))
+    monkeypatch.setenv(parallelism.JOBS_ENV, "4")
+    return str(tmp_path / "jobs")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return make_repository(tmp_path / "repo")
+
+
+def hold_slot(jobs, slot):
+    """Take a slot the way another process would"""
+    os.makedirs(jobs, exist_ok=True)
+    fd = os.open(os.path.join(jobs, f"slot{slot}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+class TestSettings:
+    """Test the budget and the settings chosen for each command"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value,expected", [("4", 4), ("0", 0), ("-2", 0), ("many", None), (None, None)])
+    def test_budget(self, value, expected, monkeypatch):
+        monkeypatch.setattr(parallelism.os, "sched_getaffinity", lambda pid: {0, 1, 2}, raising=False)
+        if value is None:
+            monkeypatch.delenv(parallelism.JOBS_ENV)
+        else:
+            monkeypatch.setenv(parallelism.JOBS_ENV, value)
+        assert parallelism.budget() == (3 if expected is None else expected)
+    
+    @pytest.mark.unit
+    def test_jobs_dir(self, jobs, monkeypatch):
+        assert parallelism.jobs_dir() == jobs
+        monkeypatch.delenv(parallelism.JOBS_DIR_ENV)
+        assert parallelism.jobs_dir() == os.path.join(tempfile.gettempdir(), f"smcp-git-jobs-{os.getuid()}")
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args,keys", [
+        (["git", "fetch", "--all"], ["fetch.parallel", "submodule.fetchjobs", "pack.threads"]),
+        (["git", "clone", "url"], ["submodule.fetchjobs", "checkout.workers", "pack.threads"]),
+        (["git", "submodule", "update", "--init"], ["fetch.parallel", "submodule.fetchjobs", "pack.threads",
+                                                     "checkout.workers", "index.threads"]),
+        (["git", "remote", "update"], ["fetch.parallel", "submodule.fetchjobs", "pack.threads"]),
+        (["git", "remote", "add", "origin", "url"], []),
+        (["git", "checkout", "main"], ["checkout.workers", "index.threads"]),
+        (["git", "status"], ["index.threads"]),
+        (["git", "repack", "-d"], ["pack.threads"]),
+        (["git", "log"], []),
+        (["git", "-C", "sub", "fetch"], []),
+        (["git"], []),
+    ])
+    def test_settings_for(self, cmd_args, keys, repo):
+        assert parallelism.settings_for(cmd_args, repo) == keys
+    
+    @pytest.mark.unit
+    def test_repository_config_wins(self, tmp_path):
+        repo = make_repository(tmp_path / "configured", "[pack]\n\tthreads = 2\n[submodule]\n\tfetchJobs = 8\n")
+        assert parallelism.settings_for(["git", "fetch"], repo) == ["fetch.parallel"]
+    
+    @pytest.mark.unit
+    def test_outside_a_repository(self, tmp_path):
+        assert parallelism.settings_for(["git", "clone", "url"], str(tmp_path)) == [
+            "submodule.fetchjobs", "checkout.workers", "pack.threads"]
+
+
+class TestLease:
+    """Test sharing the job budget between calls"""
+    
+    @pytest.mark.unit
+    def test_takes_the_free_jobs(self, repo):
+        with parallelism.lease(["git", "fetch", "origin"], repo) as (cmd_args, report):
+            assert cmd_args == ["git", "-c", "fetch.parallel=4", "-c", "submodule.fetchJobs=4",
+                                "-c", "pack.threads=4", "fetch", "origin"]
+            assert report == {"jobs": 4, "budget": 4,
+                              "config": {"fetch.parallel": 4, "submodule.fetchJobs": 4, "pack.threads": 4}}
+    
+    @pytest.mark.unit
+    def test_concurrent_calls_share_the_budget(self, repo, jobs):
+        other = [hold_slot(jobs, 0), hold_slot(jobs, 2)]
+        try:
+            with parallelism.lease(["git", "status"], repo) as (cmd_args, report):
+                assert cmd_args == ["git", "-c", "index.threads=2", "status"]
+                assert report["jobs"] == 2
+                # Every slot is taken now; a call still runs, with one job and git's own pack.threads
+                with parallelism.lease(["git", "repack"], repo) as (cmd_args, report):
+                    assert cmd_args == ["git", "repack"]
+                    assert report == {"jobs": 1, "budget": 4, "config": {}}
+        finally:
+            for fd in other:
+                os.close(fd)
+        # Leaving a lease hands its jobs back
+        with parallelism.lease(["git", "status"], repo) as (cmd_args, report):
+            assert report["jobs"] == 4
+    
+    @pytest.mark.unit
+    def test_calls_in_flight_get_a_fair_share(self, repo, monkeypatch):
+        monkeypatch.setenv(parallelism.JOBS_ENV, "8")
+        with parallelism.lease(["git", "status"], repo) as (cmd_args, report):
+            # An index-only command leaves most of the budget to the calls after it
+            assert cmd_args == ["git", "-c", "index.threads=4", "status"]
+            with parallelism.lease(["git", "fetch"], repo) as (cmd_args, report):
+                assert report == {"jobs": 4, "budget": 8,
+                                  "config": {"fetch.parallel": 4, "submodule.fetchJobs": 4, "pack.threads": 4}}
+                with parallelism.lease(["git", "checkout", "main"], repo) as (cmd_args, report):
+                    assert report["jobs"] == 1
+        with parallelism.lease(["git", "fetch"], repo) as (cmd_args, report):
+            assert report["jobs"] == 8
+    
+    @pytest.mark.unit
+    def test_calls_in_other_processes_count(self, repo, jobs):
+        os.makedirs(jobs)
+        other = os.open(os.path.join(jobs, "lease1.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(other, fcntl.LOCK_EX)
+        try:
+            with parallelism.lease(["git", "clone", "url"], repo) as (cmd_args, report):
+                assert report["jobs"] == 2
+        finally:
+            os.close(other)
+    
+    @pytest.mark.unit
+    def test_released_on_error(self, repo):
+        with pytest.raises(RuntimeError):
+            with parallelism.lease(["git", "status"], repo):
+                raise RuntimeError("git failed")
+        with parallelism.lease(["git", "status"], repo) as (_, report):
+            assert report["jobs"] == 4
+    
+    @pytest.mark.unit
+    def test_unchanged(self, repo, monkeypatch):
+        with parallelism.lease(["git", "log"], repo) as (cmd_args, report):
+            assert (cmd_args, report) == (["git", "log"], None)
+        monkeypatch.setenv(parallelism.JOBS_ENV, "0")
+        with parallelism.lease(["git", "fetch"], repo) as (cmd_args, report):
+            assert (cmd_args, report) == (["git", "fetch"], None)
+
+
+class TestCliParallelism:
+    """Test the settings run() adds to the commands it executes"""
+    
+    @pytest.mark.unit
+    def test_fetch(self, repo, monkeypatch):
+        calls = []
+    
+        def run_process(cmd_args, timeout=30, cwd=None, timer=None):
+            calls.append(cmd_args)
+            return completed(cmd_args, 0, "", "")
+        monkeypatch.setattr(cli.process, "run_process", run_process)
+        result = cli.run({"command": "fetch", "args": ["origin"]}, cwd=repo)
+        assert result["success"] is True
+        assert result["command"] == "git fetch origin"
+        assert result["parallelism"]["jobs"] == 4
+        assert calls == [["git", "-c", "fetch.parallel=4", "-c", "submodule.fetchJobs=4", "-c", "pack.threads=4",
+                          "fetch", "origin"]]
+        result = cli.run({"command": "log"}, cwd=repo)
+        assert "parallelism" not in result
+        assert calls[-1] == ["git", "log"]
@@ -170,6 +170,86 @@ class TestGitRun:
         assert "error" in result
         assert "timed out" in result["error"]
     
+    @pytest.mark.unit
+    def test_run_reports_phase_timings(self, mock_subprocess_run):
+        """Test that responses carry per-phase timings"""
+        result = run({"command": "status"}, dry_run=False)
+        assert result["timings"]["setup_ns"] >= 0
+        assert result["timings"]["classify_ns"] >= 0
+        assert result["timings"]["total_ns"] >= result["timings"]["setup_ns"]
+    
+    @pytest.mark.unit
+    def test_run_reports_queue_wait(self, mock_subprocess_run):
+        """Test that batched calls report their queue wait"""
+        import time
+        result = run({"command": "status"}, dry_run=False, enqueued_ns=time.perf_counter_ns() - 1000)
+        assert result["timings"]["queue_wait_ns"] >= 1000
+    
+    @pytest.mark.unit
+    def test_early_returns_report_timings(self):
+        """Test that dry runs and invalid working directories still report timings"""
+        for result in (run({"command": "status"}, dry_run=True), run({"command": "status"}, dry_run=False, cwd="/nonexistent/directory/12345")):
+            assert result["timings"]["total_ns"] >= 0
+    
+    @pytest.mark.unit
+    def test_run_reports_child_resources(self, mock_subprocess_run):
+        """Test that child rusage is passed through as resources"""
+        mock_subprocess_run.resources = {"user_cpu_s": 0.5, "max_rss_bytes": 1024}
+        result = run({"command": "status"}, dry_run=False)
+        assert result["resources"] == {"user_cpu_s": 0.5, "max_rss_bytes": 1024}
+    
+    @pytest.mark.unit
+    def test_run_without_child_resources(self, mock_subprocess_run):
+        """Test that resources are omitted when rusage is unavailable"""
+        result = run({"command": "status"}, dry_run=False)
+        assert "resources" not in result
+    
+    @pytest.mark.unit
+    def test_run_timeout_reports_child_resources(self, monkeypatch):
+        """Test that a timed-out child's rusage is reported"""
+        from plugins import process
+        def timed_out(*args, **kwargs):
+            exc = subprocess.TimeoutExpired(cmd=args[0], timeout=30)
+            exc.resources = {"user_cpu_s": 1.0}
+            raise exc
+        monkeypatch.setattr(process, "run_process", timed_out)
+        result = run({"command": "status"}, dry_run=False)
+        assert result["error_code"] == "TIMEOUT"
+        assert result["resources"] == {"user_cpu_s": 1.0}
+    
+    @pytest.mark.unit
+    def test_run_answers_ref_reads_in_process(self, mock_subprocess_run, monkeypatch):
+        """Test that trivial ref reads skip the child process"""
+        from plugins import metrics
+        from plugins.git import fastpath
+        answered = subprocess.CompletedProcess(["git", "rev-parse", "HEAD"], 0, "a" * 40 + "\n", "")
+        answered.resources = None
+        monkeypatch.setattr(fastpath, "fast_read", lambda cmd_args, cwd: answered)
+        registry = metrics.MetricsRegistry()
+        result = run({"command": "rev-parse", "args": "HEAD"}, dry_run=False)
+        metrics.record_response("git", result, registry)
+        assert result["result"] == "a" * 40 + "\n"
+        assert "in_process_ns" in result["timings"]
+        assert "spawn_ns" not in result["timings"]
+        assert "resources" not in result
+        assert ("smcp_plugin_calls_total", ("git", "rev-parse", "none", "false", "true")) in registry.counters
+    
+    @pytest.mark.unit
+    def test_run_spawns_when_fast_read_declines(self, mock_subprocess_run, monkeypatch):
+        """Test that unsupported reads still run git"""
+        from plugins.git import fastpath
+        monkeypatch.setattr(fastpath, "fast_read", lambda cmd_args, cwd: None)
+        result = run({"command": "rev-parse", "args": "HEAD"}, dry_run=False)
+        assert result["result"] == "test output"
+        assert "in_process_ns" not in result["timings"]
+    
+    @pytest.mark.unit
+    def test_run_timeout_reports_timings(self, mock_subprocess_timeout):
+        """Test that timeouts still report timings"""
+        result = run({"command": "status"}, dry_run=False)
+        assert result["error_code"] == "TIMEOUT"
+        assert "setup_ns" in result["timings"]
+    
     @pytest.mark.unit
     def test_run_exception(self, mock_subprocess_exception):
         """Test exception handling"""
@@ -489,6 +569,125 @@ class TestGitRun:
         assert "error_hints" not in result
         assert "result" in result  # Should have result from stdout
     
+    @pytest.mark.unit
+    def test_run_structured_dry_run_shows_rewritten_command(self):
+        """Test structured mode rewrites status to porcelain v2 before any trailing pathspec"""
+        result = run({"command": "status", "args": ["-uno", "--", "src"], "structured": True}, dry_run=True)
+        assert result["cmd_args"] == ["git", "status", "-uno", "--porcelain=v2", "-z", "--branch", "--", "src"]
+    
+    @pytest.mark.unit
+    def test_run_structured_unsupported(self):
+        """Test structured mode rejects subcommands without a parser"""
+        result = run({"command": "show", "structured": True})
+        assert result["success"] is False
+        assert result["error_code"] == "STRUCTURED_UNSUPPORTED"
+        assert result["timings"]["total_ns"] >= 0
+    
+    @pytest.mark.unit
+    def test_run_structured_returns_records(self, monkeypatch):
+        """Test structured mode returns parsed records and the streamed byte count"""
+        from plugins.git import structured
+        
+        def fake_run(mode, cwd=None, timer=None, timeout=30, output=None):
+            completed = subprocess.CompletedProcess(mode.cmd_args, 0, None, "")
+            completed.resources = None
+            completed.stdout_bytes = 14
+            completed.stopped = False
+            completed.records = list(mode.parse([b"? nothing to\0"]))
+            completed.record_count = 1
+            completed.truncated = False
+            completed.next_cursor = None
+            return completed
+        monkeypatch.setattr(structured, "run", fake_run)
+        result = run({"command": "status", "structured": True})
+        assert result["success"] is True
+        assert result["result"] == [{"type": "untracked", "path": "nothing to"}]
+        assert result["stdout_bytes"] == 14
+        assert result["record_count"] == 1
+        assert "truncated" not in result
+        assert "next_cursor" not in result
+        assert "idempotent" not in result
+        assert "stdout" not in result
+    
+    @pytest.mark.unit
+    def test_run_structured_failure_reports_stderr(self, monkeypatch):
+        """Test a failing structured command reports git's error text"""
+        from plugins.git import structured
+        
+        def fake_run(mode, cwd=None, timer=None, timeout=30, output=None):
+            completed = subprocess.CompletedProcess(mode.cmd_args, 128, None, "fatal: not a git repository\n")
+            completed.resources = None
+            completed.stdout_bytes = 0
+            completed.stopped = False
+            completed.records = None
+            completed.record_count = 0
+            completed.truncated = False
+            completed.next_cursor = None
+            return completed
+        monkeypatch.setattr(structured, "run", fake_run)
+        result = run({"command": "status", "structured": True})
+        assert result["success"] is False
+        assert result["error_code"] == "COMMAND_FAILED_128"
+        assert result["result"] == "fatal: not a git repository\n"
+        assert result["error_hints"]["error_type"] == "git_repository_error"
+    
+    @pytest.mark.unit
+    def test_run_structured_page_stopped_at_limit(self, monkeypatch):
+        """Test a page cut short by its limit succeeds and hands out the next cursor"""
+        from plugins.git import structured
+        
+        def fake_run(mode, cwd=None, timer=None, timeout=30, output=None):
+            completed = subprocess.CompletedProcess(mode.cmd_args, -9, None, "")
+            completed.resources = None
+            completed.stdout_bytes = 65536
+            completed.stopped = True
+            completed.records = [{"path": "a"}, {"path": "b"}]
+            completed.record_count = 2
+            completed.truncated = True
+            completed.next_cursor = "abc"
+            return completed
+        monkeypatch.setattr(structured, "run", fake_run)
+        result = run({"command": "ls-files", "structured": True, "limit": 2})
+        assert result["success"] is True
+        assert result["command"] == "git ls-files -z"
+        assert result["result"] == [{"path": "a"}, {"path": "b"}]
+        assert result["truncated"] is True
+        assert result["next_cursor"] == "abc"
+    
+    @pytest.mark.unit
+    def test_run_structured_output_file(self, monkeypatch, tmp_path):
+        """Test records written to an NDJSON file are summarized in result"""
+        from plugins.git import structured
+        target = str(tmp_path / "files.ndjson")
+        seen = {}
+        
+        def fake_run(mode, cwd=None, timer=None, timeout=30, output=None):
+            seen["output"], seen["limit"] = output, mode.limit
+            completed = subprocess.CompletedProcess(mode.cmd_args, 0, None, "")
+            completed.resources = None
+            completed.stdout_bytes = 100
+            completed.stopped = False
+            completed.records = None
+            completed.record_count = 7
+            completed.truncated = False
+            completed.next_cursor = None
+            return completed
+        monkeypatch.setattr(structured, "run", fake_run)
+        result = run({"command": "ls-files", "structured": True, "output": target})
+        assert seen == {"output": target, "limit": None}
+        assert result["result"] == f"Wrote 7 records to {target}"
+        assert result["record_count"] == 7
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("options", [{"limit": 0}, {"limit": "10"}, {"columns": "mode,owner"},
+                                         {"cursor": "not-a-cursor"}])
+    def test_run_structured_invalid_option(self, options):
+        """Test invalid structured options are rejected before running git"""
+        result = run(dict({"command": "ls-files", "structured": True}, **options))
+        assert result["success"] is False
+        assert result["error_code"] == "INVALID_STRUCTURED_OPTION"
+        assert result["timings"]["total_ns"] >= 0
+    
     @pytest.mark.unit
     def test_analyze_error_empty_stderr(self):
         """Test _analyze_error returns None for empty stderr (fixes issue #6)"""
@@ -557,8 +756,8 @@ class TestGitDescribe:
         assert "commands" in result
         assert result["plugin"]["name"] == "git"
         assert result["plugin"]["version"] == "1.0.0"
-        assert len(result["commands"]) == 1
-        assert result["commands"][0]["name"] == "run"
+        assert [c["name"] for c in result["commands"]] == ["run", "metrics", "analytics", "search", "mirrors",
+                                                             "worktrees", "tune", "prefetch", "fleet", "refs"]
     
     @pytest.mark.unit
     def test_describe_plugin_info(self):
@@ -577,7 +776,10 @@ class TestGitDescribe:
         assert command["name"] == "run"
         assert "description" in command
         assert "parameters" in command
-        assert len(command["parameters"]) == 2
+        assert [p["name"] for p in command["parameters"]] == ["command", "args", "structured", "limit", "cursor", "output",
+                                                           "columns", "prefix", "glob", "lines", "summary", "paths", "max_bytes",
+                                                           "worktree", "preset", "sparse", "mirror",
+                                                           "traceparent"]
     
     @pytest.mark.unit
     def test_describe_parameters(self):
@@ -614,6 +816,311 @@ class TestGitMain:
         assert "plugin" in output
         assert output["plugin"]["name"] == "git"
     
+    @pytest.mark.unit
+    def test_main_metrics_command(self, capsys, mock_subprocess_run, tmp_path, monkeypatch):
+        """Test the metrics command renders recorded calls and persists state"""
+        from plugins import metrics
+        state = tmp_path / "metrics.json"
+        monkeypatch.setenv("SMCP_METRICS_FILE", str(state))
+        metrics.REGISTRY.clear()
+        with patch("sys.argv", ["cli.py", "run", "--command", "status"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        capsys.readouterr()
+        assert state.exists()
+        
+        output = tmp_path / "git.prom"
+        with patch("sys.argv", ["cli.py", "metrics", "--output", str(output)]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        
+        result = json.loads(capsys.readouterr().out)
+        assert result["success"] is True
+        assert 'tool="git"' in result["result"]
+        assert output.read_text() == result["result"]
+    
+    @pytest.mark.unit
+    def test_main_analytics_command(self, capsys, monkeypatch):
+        """Test the analytics command passes its options to analytics.report"""
+        from plugins.git import analytics
+        calls = []
+        
+        def fake_report(args, cwd=None):
+            calls.append((args, cwd))
+            return {"success": True, "result": [{"key": "src/a.py", "value": 3}]}
+        monkeypatch.setattr(analytics, "report", fake_report)
+        with patch("sys.argv", ["cli.py", "analytics", "--cwd", "/repo", "--args", "main", "--group-by", "path",
+                                "--metric", "churn", "--top", "5"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        assert json.loads(capsys.readouterr().out)["result"] == [{"key": "src/a.py", "value": 3}]
+        assert calls == [({"args": ["main"], "group_by": "path", "metric": "churn", "top": 5}, "/repo")]
+    
+    @pytest.mark.unit
+    def test_main_search_command(self, capsys, monkeypatch):
+        """Test the search command passes its options to search.search"""
+        from plugins.git import search
+        calls = []
+        
+        def fake_search(args, cwd=None):
+            calls.append((args, cwd))
+            return {"success": True, "result": [], "fresh": True}
+        monkeypatch.setattr(search, "search", fake_search)
+        with patch("sys.argv", ["cli.py", "search", "--cwd", "/repo", "--query", "fix crash", "--since", "2024-01-01",
+                                "--limit", "5", "--no-sync"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        assert json.loads(capsys.readouterr().out)["fresh"] is True
+        assert calls == [({"sync": False, "query": "fix crash", "since": "2024-01-01", "limit": 5}, "/repo")]
+    
+    @pytest.mark.unit
+    def test_main_worktrees_command(self, capsys, monkeypatch):
+        """Test the worktrees command passes its options to worktrees.manage"""
+        from plugins.git import worktrees
+        calls = []
+        
+        def fake_manage(args, cwd=None):
+            calls.append((args, cwd))
+            return {"success": True, "result": []}
+        monkeypatch.setattr(worktrees, "manage", fake_manage)
+        for argv in (["--warm", "--prune", "600"], ["--warm", "2", "--size", "3"], []):
+            with patch("sys.argv", ["cli.py", "worktrees", "--cwd", "/repo"] + argv):
+                try:
+                    main()
+                except SystemExit as e:
+                    assert e.code == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[0])["result"] == []
+        assert calls == [({"warm": True, "prune": 600.0}, "/repo"), ({"warm": 2, "size": 3}, "/repo"), ({}, "/repo")]
+    
+    @pytest.mark.unit
+    def test_main_mirrors_command(self, capsys, monkeypatch):
+        """Test the mirrors command passes its options to mirrors.manage"""
+        from plugins import mirrors
+        calls = []
+        
+        def fake_manage(args):
+            calls.append(args)
+            return {"success": True, "result": []}
+        monkeypatch.setattr(mirrors, "manage", fake_manage)
+        for argv in (["--refresh", "--max-age", "0"], []):
+            with patch("sys.argv", ["cli.py", "mirrors"] + argv):
+                try:
+                    main()
+                except SystemExit as e:
+                    assert e.code == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[0])["result"] == []
+        assert calls == [{"refresh": True, "max_age": 0.0}, {"refresh": False}]
+    
+    @pytest.mark.unit
+    def test_main_tune_command(self, capsys, monkeypatch):
+        """Test the tune command passes its options to tuning.manage"""
+        from plugins.git import tuning
+        calls = []
+        
+        def fake_manage(args, cwd=None):
+            calls.append((args, cwd))
+            return {"success": True, "steps": []}
+        monkeypatch.setattr(tuning, "manage", fake_manage)
+        for argv in (["--dry-run", "--path", "src/main.py"], ["--runs", "0"]):
+            with patch("sys.argv", ["cli.py", "tune", "--cwd", "/repo"] + argv):
+                try:
+                    main()
+                except SystemExit as e:
+                    assert e.code == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[0])["steps"] == []
+        assert calls == [({"dry_run": True, "path": "src/main.py"}, "/repo"), ({"dry_run": False, "runs": 0}, "/repo")]
+    
+    @pytest.mark.unit
+    def test_main_prefetch_command(self, capsys, monkeypatch):
+        """Test the prefetch command passes its options to prefetch.manage"""
+        from plugins.git import prefetch
+        calls = []
+        
+        def fake_manage(args):
+            calls.append(args)
+            return {"success": True, "result": []}
+        monkeypatch.setattr(prefetch, "manage", fake_manage)
+        for argv in (["--limit", "3"], ["--list"]):
+            with patch("sys.argv", ["cli.py", "prefetch"] + argv):
+                try:
+                    main()
+                except SystemExit as e:
+                    assert e.code == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[0])["result"] == []
+        assert calls == [{"list": False, "loop": False, "limit": 3}, {"list": True, "loop": False}]
+    
+    @pytest.mark.unit
+    def test_main_fleet_command(self, capsys, monkeypatch):
+        """Test the fleet command passes its options and run() to fleet.manage"""
+        from plugins.git import fleet
+        calls = []
+        
+        def fake_manage(args, run, cwd=None):
+            calls.append((args, run, cwd))
+            return {"success": True, "result": [], "summary": {}}
+        monkeypatch.setattr(fleet, "manage", fake_manage)
+        for argv in (["--cwd", "/srv", "--command", "fetch", "--args", "origin", "--root", "repos", "--jobs", "4",
+                      "--output", "out.ndjson"], ["--paths", "a", "b"]):
+            with patch("sys.argv", ["cli.py", "fleet"] + argv):
+                try:
+                    main()
+                except SystemExit as e:
+                    assert e.code == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[0])["summary"] == {}
+        assert calls == [({"command": "fetch", "args": ["origin"], "root": "repos", "jobs": 4,
+                           "output": "out.ndjson"}, git_cli.run, "/srv"), ({"paths": ["a", "b"]}, git_cli.run, None)]
+    
+    @pytest.mark.unit
+    def test_main_refs_command(self, capsys, monkeypatch):
+        """Test the refs command passes its options to bulkrefs.manage"""
+        from plugins.git import bulkrefs
+        calls = []
+        
+        def fake_manage(args, cwd=None):
+            calls.append((args, cwd))
+            return {"success": True, "result": [], "summary": {}}
+        monkeypatch.setattr(bulkrefs, "manage", fake_manage)
+        ops = '[{"action": "delete", "ref": "refs/heads/stale"}]'
+        for argv in (["--cwd", "/srv/repo", "--ops", ops, "--mode", "best-effort", "--message", "cleanup"],
+                     ["--file", "ops.json", "--remote", "origin", "--batch", "100"]):
+            with patch("sys.argv", ["cli.py", "refs"] + argv):
+                try:
+                    main()
+                except SystemExit as e:
+                    assert e.code == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[0])["summary"] == {}
+        assert calls == [({"ops": ops, "mode": "best-effort", "message": "cleanup"}, "/srv/repo"),
+                         ({"file": "ops.json", "remote": "origin", "batch": 100}, None)]
+    
+    @pytest.mark.unit
+    def test_main_run_with_preset(self, capsys):
+        """Test --preset and --sparse are passed through to run()"""
+        with patch("sys.argv", ["cli.py", "run", "--dry-run", "--command", "clone", "--args", "file:///srv/repo.git",
+                                "--preset", "sparse", "--sparse", "src", "docs"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        result = json.loads(capsys.readouterr().out)
+        assert result["args_received"]["preset"] == "sparse"
+        assert result["args_received"]["sparse"] == ["src", "docs"]
+        assert result["cmd_args"] == ["git", "clone", "--filter=blob:none", "--sparse", "file:///srv/repo.git"]
+    
+    @pytest.mark.unit
+    def test_main_run_with_mirror(self, capsys):
+        """Test --mirror is passed through to run()"""
+        with patch("sys.argv", ["cli.py", "run", "--dry-run", "--command", "clone", "--mirror"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        assert json.loads(capsys.readouterr().out)["args_received"]["mirror"] is True
+    
+    @pytest.mark.unit
+    def test_main_run_with_worktree(self, capsys):
+        """Test --worktree is passed through to run()"""
+        with patch("sys.argv", ["cli.py", "run", "--dry-run", "--command", "status", "--worktree", "main"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        assert json.loads(capsys.readouterr().out)["args_received"]["worktree"] == "main"
+    
+    @pytest.mark.unit
+    def test_main_run_with_traceparent(self, capsys, mock_subprocess_run, tmp_path, monkeypatch):
+        """Test that a traceparent passed on the CLI parents the exported span"""
+        spans = tmp_path / "spans.jsonl"
+        monkeypatch.setenv("SMCP_TRACE_FILE", str(spans))
+        parent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+        with patch("sys.argv", ["cli.py", "run", "--command", "status", "--traceparent", parent]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        
+        result = json.loads(capsys.readouterr().out)
+        assert result["trace"]["trace_id"] == "0af7651916cd43dd8448eb211c80319c"
+        record = json.loads(spans.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert record["parentSpanId"] == "b7ad6b7169203331"
+        assert record["spanId"] == result["trace"]["span_id"]
+    
+    @pytest.mark.unit
+    def test_main_run_structured(self, capsys):
+        """Test --structured is passed through to run()"""
+        with patch("sys.argv", ["cli.py", "run", "--dry-run", "--structured", "--command", "status"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        
+        result = json.loads(capsys.readouterr().out)
+        assert result["args_received"]["structured"] is True
+        assert result["command"] == "git status --porcelain=v2 -z --branch"
+    
+    @pytest.mark.unit
+    def test_main_run_structured_listing_options(self, capsys):
+        """Test listing options are passed through to run()"""
+        argv = ["cli.py", "run", "--dry-run", "--structured", "--command", "ls-tree", "--args", "HEAD",
+                "--limit", "50", "--cursor", "abc", "--columns", "mode,oid", "--prefix", "src/", "--glob", "*.py",
+                "--output", "out.ndjson"]
+        with patch("sys.argv", argv):
+            with pytest.raises(SystemExit):
+                main()
+        
+        result = json.loads(capsys.readouterr().out)
+        assert result["error_code"] == "INVALID_STRUCTURED_OPTION"  # "abc" is not a real cursor
+        with patch("sys.argv", [arg for arg in argv if arg not in ("--cursor", "abc")]):
+            with pytest.raises(SystemExit):
+                main()
+        result = json.loads(capsys.readouterr().out)
+        assert result["args_received"] == {"command": "ls-tree", "args": ["HEAD"], "structured": True, "limit": 50,
+                                           "output": "out.ndjson", "columns": "mode,oid", "prefix": "src/",
+                                           "glob": "*.py"}
+        assert result["command"] == "git ls-tree HEAD -r -z -l -- src/"
+    
+    @pytest.mark.unit
+    def test_main_run_structured_diff_options(self, capsys):
+        """Test diff summary and patch selection options are passed through to run()"""
+        argv = ["cli.py", "run", "--dry-run", "--structured", "--command", "diff", "--args", "HEAD",
+                "--paths", "a.py", "b c.py", "--max-bytes", "4096"]
+        with patch("sys.argv", argv):
+            with pytest.raises(SystemExit):
+                main()
+        result = json.loads(capsys.readouterr().out)
+        assert result["args_received"] == {"command": "diff", "args": ["HEAD"], "structured": True,
+                                           "max_bytes": 4096, "paths": ["a.py", "b c.py"]}
+        assert result["command"].endswith(" --src-prefix=a/ --dst-prefix=b/ -- a.py b c.py")
+        with patch("sys.argv", argv[:8] + ["--summary"]):
+            with pytest.raises(SystemExit):
+                main()
+        result = json.loads(capsys.readouterr().out)
+        assert result["args_received"]["summary"] is True
+        assert result["command"] == "git diff HEAD --raw --numstat -z --no-abbrev"
+    
+    @pytest.mark.unit
+    def test_run_dry_run_not_traced(self, tmp_path, monkeypatch):
+        """Test that dry runs do not produce spans"""
+        monkeypatch.setenv("SMCP_TRACE_FILE", str(tmp_path / "spans.jsonl"))
+        result = run({"command": "status"}, dry_run=True)
+        assert "trace" not in result
+        assert not (tmp_path / "spans.jsonl").exists()
+    
+    @pytest.mark.unit
+    def test_run_dry_run_not_recorded(self):
+        """Test that dry runs are not recorded as executions"""
+        from plugins import metrics
+        metrics.REGISTRY.clear()
+        run({"command": "status"}, dry_run=True)
+        assert not metrics.REGISTRY.counters
+    
     @pytest.mark.unit
     def test_main_no_command(self, capsys):
         """Test main with no command"""
@@ -662,6 +1169,19 @@ class TestGitMain:
         assert result["return_code"] == 0
         assert "git status" in result["command"]
     
+    @pytest.mark.unit
+    def test_main_run_reports_serialize_timing(self, capsys, mock_subprocess_run):
+        """Test that the CLI output includes the serialization phase"""
+        with patch("sys.argv", ["cli.py", "run", "--command", "status"]):
+            try:
+                main()
+            except SystemExit as e:
+                assert e.code == 0
+        
+        captured = capsys.readouterr()
+        result = json.loads(captured.out)
+        assert result["timings"]["serialize_ns"] >= 0
+    
     @pytest.mark.unit
     def test_main_run_with_command_and_args(self, capsys, mock_subprocess_run):
         """Test main with run, command, and args"""
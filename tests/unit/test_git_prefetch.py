@@ -0,0 +1,346 @@
+"""
+Unit tests for the git plugin's background prefetch scheduler
+"""
+import json
+import os
+import subprocess
+import threading
+import pytest
+
+from plugins.git import cli, prefetch
+from plugins.git import repo as repo_module
+from tests.conftest import completed, make_repository
+
+REMOTES = ('[remote "origin"]\n\turl = https://example.com/origin.git\n'
+           '\tfetch = +refs/heads/*:refs/remotes/origin/*\n'
+           '[remote "upstream"]\n\turl = https://example.com/upstream.git\n'
+           '[branch "topic"]\n\tremote = upstream\n')
+HOUR = 3600.0
+
+
+class FakeGit:
+    """Stands in for process.run_process, recording each command line"""
+    
+    def __init__(self, fetch_returncode=0, fetch_stderr="", refspecs="+refs/heads/*:refs/remotes/origin/*\n"):
+        self.calls = []
+        self.fetch_returncode = fetch_returncode
+        self.fetch_stderr = fetch_stderr
+        self.refspecs = refspecs
+    
+    def __call__(self, cmd_args, timeout=30, cwd=None, timer=None):
+        self.calls.append(cmd_args)
+        if "config" in cmd_args:
+            return completed(cmd_args, 0 if self.refspecs else 1, self.refspecs, "")
+        if "fetch" in cmd_args:
+            return completed(cmd_args, self.fetch_returncode, "", self.fetch_stderr)
+        return completed(cmd_args, 0, "", "")
+
+
+@pytest.fixture(autouse=True)
+def state_file(tmp_path, monkeypatch):
+    """A private state file; nice and ionice are left out of the command lines"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv(prefetch.PREFETCH_FILE_ENV, str(tmp_path / "state" / "prefetch.json"))
+    monkeypatch.setattr(prefetch.shutil, "which", lambda name: None)
+    return str(tmp_path / "state" / "prefetch.json")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return make_repository(tmp_path / "repo", REMOTES)
+
+
+@pytest.fixture
+def fake_git(monkeypatch):
+    fake = FakeGit()
+    monkeypatch.setattr(prefetch.process, "run_process", fake)
+    return fake
+
+
+def read_state(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def common_dir(repo):
+    return repo_module.discover(repo).common_dir
+
+
+class TestRemotesUsed:
+    """Test which remotes a command line counts as used"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args,expected", [
+        (["git", "fetch"], ["origin"]),
+        (["git", "fetch", "upstream", "main"], ["upstream"]),
+        (["git", "fetch", "--depth", "1", "upstream"], ["upstream"]),
+        (["git", "fetch", "--all", "--prune"], ["origin", "upstream"]),
+        (["git", "fetch", "--multiple", "upstream", "origin"], ["upstream", "origin"]),
+        (["git", "fetch", "https://example.com/other.git"], []),
+        (["git", "pull", "--rebase", "upstream"], ["upstream"]),
+        (["git", "remote", "update"], ["origin", "upstream"]),
+        (["git", "remote", "update", "--prune", "upstream", "group"], ["upstream"]),
+        (["git", "remote", "add", "other", "url"], []),
+        (["git", "status"], []),
+        (["git"], []),
+    ])
+    def test_remotes(self, cmd_args, expected, repo):
+        assert prefetch.remotes_used(cmd_args, repo_module.discover(repo)) == expected
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("head,expected", [
+        ("ref: refs/heads/topic\n", ["upstream"]),
+        ("0123456789abcdef0123456789abcdef01234567\n", ["origin"]),
+        ("ref: refs/remotes/upstream/main\n", ["origin"]),
+    ])
+    def test_current_branch_remote(self, head, expected, tmp_path):
+        repository = repo_module.discover(make_repository(tmp_path / "branch", REMOTES, head=head))
+        assert prefetch.remotes_used(["git", "pull"], repository) == expected
+    
+    @pytest.mark.unit
+    def test_unreadable_head(self, repo):
+        repository = repo_module.discover(repo)
+        os.remove(os.path.join(repository.git_dir, "HEAD"))
+        assert prefetch.remotes_used(["git", "fetch"], repository) == ["origin"]
+
+
+class TestRecord:
+    """Test noting the use of remotes in the state file"""
+    
+    @pytest.mark.unit
+    def test_records_uses(self, repo, state_file):
+        assert prefetch.record(["git", "fetch", "--all"], repo, now=1000.0) == ["origin", "upstream"]
+        assert prefetch.record(["git", "fetch"], repo, now=1000.0 + HOUR) == ["origin"]
+        state = read_state(state_file)
+        assert list(state) == [common_dir(repo)]
+        assert state[common_dir(repo)]["origin"] == {"uses": 2, "score": pytest.approx(1 + 0.5 ** (1 / 24)),
+                                                     "last_used": 1000.0 + HOUR, "gap": HOUR}
+        assert state[common_dir(repo)]["upstream"]["uses"] == 1
+        assert "gap" not in state[common_dir(repo)]["upstream"]
+    
+    @pytest.mark.unit
+    def test_nothing_to_record(self, repo, tmp_path, state_file, monkeypatch):
+        assert prefetch.record(["git", "status"], repo) == []
+        assert prefetch.record(["git", "fetch", "/srv/other.git"], repo) == []
+        assert prefetch.record(["git", "fetch"], str(tmp_path)) == []
+        assert not os.path.exists(state_file)
+        monkeypatch.delenv(prefetch.PREFETCH_FILE_ENV)
+        assert prefetch.state_path() is None
+        assert prefetch.record(["git", "fetch"], repo) == []
+    
+    @pytest.mark.unit
+    def test_unwritable_state_file(self, repo, state_file):
+        os.makedirs(state_file)
+        assert prefetch.record(["git", "fetch"], repo) == []
+    
+    @pytest.mark.unit
+    def test_corrupt_state_file(self, repo, state_file):
+        os.makedirs(os.path.dirname(state_file))
+        with open(state_file, "w") as f:
+            f.write("{not json")
+        assert prefetch.record(["git", "fetch"], repo, now=1000.0) == ["origin"]
+        assert read_state(state_file)[common_dir(repo)]["origin"]["uses"] == 1
+
+
+class TestSchedule:
+    """Test the score and the interval adapting to observed use"""
+    
+    @pytest.mark.unit
+    def test_interval_follows_the_gap_between_uses(self):
+        entry = {}
+        for n in range(20):
+            prefetch._note_use(entry, n * HOUR)
+        assert entry["gap"] == pytest.approx(HOUR)
+        assert prefetch.interval(entry, 19 * HOUR) == pytest.approx(HOUR / 2)
+        # Idle remotes back off, up to MAX_INTERVAL
+        assert prefetch.interval(entry, 19 * HOUR + 10 * HOUR) == pytest.approx(5 * HOUR)
+        assert prefetch.interval(entry, 19 * HOUR + 100 * HOUR) == prefetch.MAX_INTERVAL
+        # Uses a day apart drift the gap towards a day
+        prefetch._note_use(entry, 43 * HOUR)
+        assert entry["gap"] == pytest.approx(HOUR + prefetch.SMOOTHING * 23 * HOUR)
+    
+    @pytest.mark.unit
+    def test_bursts_are_one_session(self):
+        entry = {}
+        for n in range(10):
+            prefetch._note_use(entry, n * 10.0)
+        assert "gap" not in entry
+        assert entry["uses"] == 10
+        assert prefetch.interval(entry, 90.0) == prefetch.MAX_INTERVAL / 2
+        # Frequent sessions never go below MIN_INTERVAL
+        prefetch._note_use(entry, 90.0 + prefetch.MIN_INTERVAL)
+        assert prefetch.interval(entry, 90.0 + prefetch.MIN_INTERVAL) == prefetch.MIN_INTERVAL
+    
+    @pytest.mark.unit
+    def test_score_halves_every_half_life(self):
+        entry = {}
+        prefetch._note_use(entry, 0.0)
+        prefetch._note_use(entry, 0.0)
+        assert prefetch.score(entry, 0.0) == 2
+        assert prefetch.score(entry, prefetch.HALF_LIFE) == pytest.approx(1)
+        assert prefetch.score({}, 0.0) == 0
+
+
+class TestPrefetch:
+    """Test the low-priority fetch into refs/prefetch/"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("configured,expected", [
+        (["+refs/heads/*:refs/remotes/origin/*"], ["+refs/heads/*:refs/prefetch/remotes/origin/*"]),
+        (["refs/heads/main:refs/remotes/origin/main", "^refs/heads/tmp/*", "refs/tags/v1"],
+         ["+refs/heads/main:refs/prefetch/remotes/origin/main"]),
+        (["+refs/heads/*:other/*"], ["+refs/heads/*:refs/prefetch/remotes/origin/*"]),
+        ([], ["+refs/heads/*:refs/prefetch/remotes/origin/*"]),
+    ])
+    def test_refspecs(self, configured, expected):
+        assert prefetch.prefetch_refspecs("origin", configured) == expected
+    
+    @pytest.mark.unit
+    def test_fetch_command(self, fake_git):
+        report = prefetch.prefetch("/srv/repo/.git", "origin")
+        assert report["action"] == "fetched" and report["seconds"] >= 0
+        assert fake_git.calls == [
+            ["git", "--git-dir=/srv/repo/.git", "config", "--get-all", "remote.origin.fetch"],
+            ["git", "--git-dir=/srv/repo/.git", "fetch", "origin", "--prune", "--no-tags", "--no-write-fetch-head",
+             "--recurse-submodules=no", "--quiet", "--refmap=", "+refs/heads/*:refs/prefetch/remotes/origin/*"]]
+    
+    @pytest.mark.unit
+    def test_low_priority(self, fake_git, monkeypatch):
+        monkeypatch.setattr(prefetch.shutil, "which", lambda name: "/usr/bin/" + name)
+        prefetch.prefetch("/srv/repo/.git", "origin")
+        assert fake_git.calls[1][:8] == ["nice", "-n", "19", "ionice", "-c", "3", "git", "--git-dir=/srv/repo/.git"]
+    
+    @pytest.mark.unit
+    def test_failures(self, fake_git, monkeypatch):
+        fake_git.fetch_returncode, fake_git.fetch_stderr = 128, "fatal: could not read from remote\n"
+        report = prefetch.prefetch("/srv/repo/.git", "origin")
+        assert (report["action"], report["error"]) == ("failed", "fatal: could not read from remote")
+        fake_git.fetch_stderr = ""
+        assert prefetch.prefetch("/srv/repo/.git", "origin")["error"] == "git fetch exited with 128"
+    
+        def timeout(cmd_args, timeout=30, cwd=None, timer=None):
+            raise subprocess.TimeoutExpired(cmd_args, timeout)
+        monkeypatch.setattr(prefetch.process, "run_process", timeout)
+        assert prefetch.prefetch("/srv/repo/.git", "origin")["action"] == "failed"
+
+
+class TestRunDue:
+    """Test choosing, claiming and reporting the due remotes"""
+    
+    @pytest.mark.unit
+    def test_prefetches_the_busiest_due_remotes(self, repo, fake_git, state_file):
+        for n in range(3):
+            prefetch.record(["git", "fetch", "upstream"], repo, now=1000.0 + n)
+        prefetch.record(["git", "fetch", "origin"], repo, now=1000.0)
+        reports = prefetch.run_due(now=2000.0, limit=1)
+        assert [(report["remote"], report["action"]) for report in reports] == [("upstream", "fetched")]
+        state = read_state(state_file)[common_dir(repo)]
+        assert state["upstream"]["last_prefetch"] == 2000.0
+        assert state["upstream"]["error"] is None and state["upstream"]["seconds"] >= 0
+        # upstream waits for its interval now, so origin is next
+        assert [report["remote"] for report in prefetch.run_due(now=2001.0)] == ["origin"]
+        assert prefetch.run_due(now=2002.0) == []
+        now = 2001.0 + prefetch.MAX_INTERVAL / 2
+        assert [report["remote"] for report in prefetch.run_due(now=now)] == ["upstream", "origin"]
+    
+    @pytest.mark.unit
+    def test_failure_is_kept_for_the_listing(self, repo, fake_git, state_file):
+        fake_git.fetch_returncode = 1
+        prefetch.record(["git", "fetch"], repo, now=1000.0)
+        assert prefetch.run_due(now=1000.0)[0]["action"] == "failed"
+        [entry] = prefetch.scheduled(now=1000.0)
+        assert entry["error"] == "git fetch exited with 1"
+        assert entry["next_due"] == prefetch.MAX_INTERVAL / 2
+    
+    @pytest.mark.unit
+    def test_expired_and_removed_repositories(self, repo, tmp_path, fake_git, state_file):
+        gone = make_repository(tmp_path / "gone", REMOTES)
+        prefetch.record(["git", "fetch"], gone, now=prefetch.EXPIRE_SECONDS)
+        prefetch.record(["git", "fetch", "--all"], repo, now=0.0)
+        prefetch.record(["git", "fetch"], repo, now=prefetch.EXPIRE_SECONDS)
+        gone_dir = common_dir(gone)
+        os.rename(gone_dir, gone_dir + ".moved")
+        reports = prefetch.run_due(now=prefetch.EXPIRE_SECONDS + 1)
+        assert [(report["path"], report["remote"]) for report in reports] == [(common_dir(repo), "origin")]
+        state = read_state(state_file)
+        assert list(state) == [common_dir(repo)] and list(state[common_dir(repo)]) == ["origin"]
+    
+    @pytest.mark.unit
+    def test_dropped_while_fetching(self, repo, state_file, monkeypatch):
+        def fetch_and_drop(common_dir, remote):
+            with open(state_file, "w") as f:
+                f.write("{}")  # Another process dropped the repository meanwhile
+            return {"path": common_dir, "remote": remote, "action": "fetched", "seconds": 0.0}
+        monkeypatch.setattr(prefetch, "prefetch", fetch_and_drop)
+        prefetch.record(["git", "fetch"], repo, now=1000.0)
+        assert [report["action"] for report in prefetch.run_due(now=1000.0)] == ["fetched"]
+        assert read_state(state_file) == {}
+    
+    @pytest.mark.unit
+    def test_without_a_state_file(self, monkeypatch):
+        monkeypatch.delenv(prefetch.PREFETCH_FILE_ENV)
+        assert prefetch.run_due() == []
+        assert prefetch.scheduled() == []
+
+
+class TestServe:
+    """Test the background loop and the plugin command"""
+    
+    @pytest.mark.unit
+    def test_serve_until_stopped(self, repo, fake_git, monkeypatch):
+        prefetch.record(["git", "fetch"], repo)
+        stop = threading.Event()
+        waits = []
+    
+        def wait(seconds):
+            waits.append(seconds)
+            if len(waits) == 2:
+                stop.set()
+        monkeypatch.setattr(stop, "wait", wait)
+        prefetch.serve(stop)
+        assert waits == [prefetch.POLL_SECONDS, prefetch.POLL_SECONDS]
+        assert len([call for call in fake_git.calls if "fetch" in call]) == 1
+    
+    @pytest.mark.unit
+    def test_start(self, monkeypatch):
+        served = threading.Event()
+    
+        def serve(stop, limit, path):
+            served.set()
+            stop.wait()
+        monkeypatch.setattr(prefetch, "serve", serve)
+        stop = prefetch.start(limit=2)
+        assert served.wait(5)
+        stop.set()
+    
+    @pytest.mark.unit
+    def test_manage(self, repo, fake_git, state_file, monkeypatch):
+        prefetch.record(["git", "fetch"], repo)
+        listed = prefetch.manage({"list": True})
+        assert listed["success"] is True and "prefetched" not in listed
+        assert [entry["remote"] for entry in listed["result"]] == ["origin"]
+        assert listed["file"] == state_file
+        result = prefetch.manage({"limit": 5})
+        assert [report["remote"] for report in result["prefetched"]] == ["origin"]
+        assert result["result"][0]["last_prefetch"] is not None
+        assert prefetch.manage({"limit": "many"})["error_code"] == "PREFETCH_FAILED"
+    
+        def interrupted(stop=None, limit=10, path=None):
+            raise KeyboardInterrupt
+        monkeypatch.setattr(prefetch, "serve", interrupted)
+        assert prefetch.manage({"loop": True})["success"] is True
+        monkeypatch.delenv(prefetch.PREFETCH_FILE_ENV)
+        assert prefetch.manage({}) == {"success": False, "error": "SMCP_PREFETCH_FILE is not set",
+                                       "error_code": "PREFETCH_FAILED"}
+
+
+class TestCliRecords:
+    """Test that run() counts the fetches it executes"""
+    
+    @pytest.mark.unit
+    def test_fetch_is_recorded(self, repo, state_file, monkeypatch):
+        monkeypatch.setattr(cli.process, "run_process", FakeGit())
+        assert cli.run({"command": "fetch", "args": ["upstream"]}, cwd=repo)["success"] is True
+        assert cli.run({"command": "log"}, cwd=repo)["success"] is True
+        assert list(read_state(state_file)[common_dir(repo)]) == ["upstream"]
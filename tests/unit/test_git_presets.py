@@ -0,0 +1,183 @@
+"""
+Unit tests for the git plugin's partial, shallow and sparse clone presets
+"""
+import os
+import pytest
+
+from plugins.git import cli, parallelism, presets
+from tests.conftest import completed
+
+URL = "file:///srv/monorepo.git"
+
+
+class FakeGit:
+    """Records git calls; sparse-checkout fails when asked to"""
+    
+    def __init__(self, monkeypatch, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+        monkeypatch.setattr(presets.process, "run_process", self.run_process)
+    
+    def run_process(self, cmd_args, timeout=30, cwd=None, timer=None):
+        self.calls.append((cmd_args, cwd))
+        if cmd_args[1] in self.fail:
+            return completed(cmd_args, 128, "", f"fatal: {cmd_args[1]} failed\n")
+        return completed(cmd_args, 0, "", "")
+
+
+class TestApply:
+    """Test adding preset options to clone and fetch command lines"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("preset,command,options", [
+        ("blobless", "clone", ["--filter=blob:none"]),
+        ("blobless", "fetch", ["--filter=blob:none"]),
+        ("treeless", "clone", ["--filter=tree:0"]),
+        ("treeless", "fetch", ["--filter=tree:0"]),
+        ("shallow", "clone", ["--depth=1", "--single-branch"]),
+        ("shallow", "fetch", ["--depth=1"]),
+        ("sparse", "clone", ["--filter=blob:none", "--sparse"]),
+        ("sparse", "fetch", ["--filter=blob:none"]),
+    ])
+    def test_presets(self, preset, command, options):
+        cmd_args, directories = presets.apply(["git", command, URL], preset)
+        assert cmd_args == ["git", command] + options + [URL]
+        assert directories == []
+    
+    @pytest.mark.unit
+    def test_sparse_directories(self):
+        cmd_args, directories = presets.apply(["git", "clone", URL], None, ["services/api/", "./docs", "libs"])
+        assert cmd_args == ["git", "clone", "--filter=blob:none", "--sparse", URL]
+        assert directories == ["services/api", "docs", "libs"]
+        assert presets.apply(["git", "clone", URL], "sparse", "a 'b c'")[1] == ["a", "b c"]
+        # Fetches take the filter; the directories only apply to a new clone
+        assert presets.apply(["git", "fetch", "origin"], None, ["a"]) == (
+            ["git", "fetch", "--filter=blob:none", "origin"], [])
+    
+    @pytest.mark.unit
+    def test_given_options_win(self):
+        cmd_args, _ = presets.apply(["git", "clone", "--filter=blob:limit=1m", "--depth", "5", URL], "shallow")
+        assert cmd_args == ["git", "clone", "--single-branch", "--filter=blob:limit=1m", "--depth", "5", URL]
+        cmd_args, _ = presets.apply(["git", "clone", "--filter=blob:limit=1m", URL], "blobless")
+        assert cmd_args == ["git", "clone", "--filter=blob:limit=1m", URL]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args,preset,sparse,message", [
+        (["git", "clone", URL], "fast", None, "unknown preset 'fast'"),
+        (["git", "clone", URL], "blobless", ["src"], "need the sparse preset"),
+        (["git", "pull"], "blobless", None, "not pull"),
+        (["git"], "blobless", None, "not no command"),
+        (["git", "clone", "--bare", URL], "sparse", None, "needs a worktree"),
+        (["git", "clone", "--mirror", URL], None, ["src"], "needs a worktree"),
+        (["git", "clone", URL], None, ["/etc"], "relative paths"),
+        (["git", "clone", URL], None, ["../up"], "relative paths"),
+        (["git", "clone", URL], None, [".."], "relative paths"),
+        (["git", "clone", URL], None, ["./"], "relative paths"),
+    ])
+    def test_invalid(self, cmd_args, preset, sparse, message):
+        with pytest.raises(ValueError, match=message):
+            presets.apply(cmd_args, preset, sparse)
+
+
+class TestCloneDirectory:
+    """Test finding the directory a clone creates"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args,directory", [
+        ([URL, "dest"], "dest"),
+        (["--depth", "1", URL, "dest"], "dest"),
+        ([URL], "monorepo"),
+        (["file:///srv/monorepo/"], "monorepo"),
+        (["/srv/monorepo/.git"], "monorepo"),
+        (["git@host:org/tool.git"], "tool"),
+        (["host:tool"], "tool"),
+        (["--", URL], "monorepo"),
+        (["--quiet"], None),
+        ([".git"], None),
+    ])
+    def test_clone_directory(self, args, directory):
+        assert presets.clone_directory(["git", "clone"] + args) == directory
+
+
+class TestSparseCheckout:
+    """Test checking the requested directories out after a sparse clone"""
+    
+    @pytest.mark.unit
+    def test_sets_cone(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        report = presets.sparse_checkout(["git", "clone", URL], ["src", "docs"], str(tmp_path))
+        path = str(tmp_path / "monorepo")
+        assert report == {"path": path, "directories": ["src", "docs"]}
+        assert git.calls == [(["git", "sparse-checkout", "set", "--cone", "--", "src", "docs"], path)]
+    
+    @pytest.mark.unit
+    def test_relative_to_process_cwd(self, monkeypatch, tmp_path):
+        FakeGit(monkeypatch)
+        monkeypatch.chdir(tmp_path)
+        assert presets.sparse_checkout(["git", "clone", URL, "x"], ["src"])["path"] == os.path.join(
+            os.getcwd(), "x")
+    
+    @pytest.mark.unit
+    def test_failure(self, monkeypatch, tmp_path):
+        FakeGit(monkeypatch, fail={"sparse-checkout"})
+        with pytest.raises(presets.PresetError, match="sparse-checkout failed"):
+            presets.sparse_checkout(["git", "clone", URL], ["src"], str(tmp_path))
+    
+    @pytest.mark.unit
+    def test_unknown_directory(self):
+        with pytest.raises(presets.PresetError, match="which directory"):
+            presets.sparse_checkout(["git", "clone", "--quiet"], ["src"])
+
+
+class TestCliPresets:
+    """Test the preset and sparse options of the git plugin"""
+    
+    @pytest.fixture(autouse=True)
+    def without_parallelism(self, monkeypatch):
+        """Compare command lines as given, without the parallelism settings"""
+        monkeypatch.setenv(parallelism.JOBS_ENV, "0")
+    
+    @pytest.mark.unit
+    def test_sparse_clone(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        result = cli.run({"command": "clone", "args": [URL], "sparse": ["src"]}, cwd=str(tmp_path))
+        assert result["success"] is True
+        assert result["command"] == f"git clone --filter=blob:none --sparse {URL}"
+        assert result["sparse"] == {"path": str(tmp_path / "monorepo"), "directories": ["src"]}
+        assert "sparse_checkout_ns" in result["timings"]
+        assert [call[0][1] for call in git.calls] == ["clone", "sparse-checkout"]
+    
+    @pytest.mark.unit
+    def test_failed_clone_skips_sparse_checkout(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch, fail={"clone"})
+        result = cli.run({"command": "clone", "args": [URL], "sparse": ["src"]}, cwd=str(tmp_path))
+        assert result["success"] is False
+        assert "sparse" not in result
+        assert len(git.calls) == 1
+    
+    @pytest.mark.unit
+    def test_sparse_checkout_failure(self, monkeypatch, tmp_path):
+        FakeGit(monkeypatch, fail={"sparse-checkout"})
+        result = cli.run({"command": "clone", "args": [URL], "sparse": ["src"]}, cwd=str(tmp_path))
+        assert result["success"] is False
+        assert result["error_code"] == "SPARSE_CHECKOUT_FAILED"
+        assert "fatal: sparse-checkout failed" in result["error"]
+        assert result["command"].startswith("git clone --filter=blob:none --sparse")
+    
+    @pytest.mark.unit
+    def test_fetch_preset(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        result = cli.run({"command": "fetch", "args": ["origin"], "preset": "treeless"}, cwd=str(tmp_path))
+        assert result["success"] is True
+        assert "sparse" not in result
+        assert git.calls[0][0] == ["git", "fetch", "--filter=tree:0", "origin"]
+    
+    @pytest.mark.unit
+    def test_invalid_preset(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        result = cli.run({"command": "status", "preset": "blobless"}, cwd=str(tmp_path))
+        assert result["success"] is False
+        assert result["error_code"] == "INVALID_PRESET"
+        assert "not status" in result["error"]
+        assert result["timings"]["total_ns"] >= 0
+        assert not git.calls
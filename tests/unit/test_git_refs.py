@@ -0,0 +1,435 @@
+"""
+Unit tests for the in-process ref readers of the git plugin
+"""
+import os
+import pytest
+
+from plugins.git import fastpath, refs
+from plugins.git import repo as repo_module
+
+OID_A = "a" * 40
+OID_B = "b" * 40
+OID_C = "c" * 40
+OID_D = "d" * 40
+OID_E = "e" * 40
+
+
+@pytest.fixture(autouse=True)
+def clean_git_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    """A synthetic repository with loose refs, packed refs and a symref"""
+    git_dir = tmp_path / ".git"
+    (git_dir / "objects").mkdir(parents=True)
+    write(str(git_dir / "config"), "[core]\n\trepositoryformatversion = 0\n\tbare = false\n")
+    write(str(git_dir / "HEAD"), "ref: refs/heads/main\n")
+    write(str(git_dir / "refs" / "heads" / "main"), OID_A + "\n")
+    write(str(git_dir / "refs" / "remotes" / "origin" / "HEAD"), "ref: refs/remotes/origin/main\n")
+    write(str(git_dir / "packed-refs"),
+          "# pack-refs with: peeled fully-peeled sorted \n"
+          f"{OID_B} refs/heads/feature\n"
+          f"{OID_C} refs/heads/main\n"
+          f"{OID_B} refs/remotes/origin/main\n"
+          f"{OID_D} refs/tags/v1\n"
+          f"^{OID_B}\n"
+          f"{OID_E} refs/tags/v2\n")
+    return tmp_path
+
+
+def run_fast(repo_dir, *argv):
+    return fastpath.fast_read(["git"] + list(argv), str(repo_dir))
+
+
+class TestPackedRefs:
+    """Test the packed-refs reader"""
+    
+    @pytest.mark.unit
+    def test_sorted_lookup(self, repo_dir):
+        packed = refs.PackedRefs(str(repo_dir / ".git" / "packed-refs"))
+        assert packed.sorted and packed.peeled
+        assert packed.get("refs/heads/feature") == OID_B
+        assert packed.get("refs/tags/v1") == OID_D
+        assert packed.get("refs/tags/v2") == OID_E
+        assert packed.get("refs/tags/v0") is None
+        assert packed.get("refs/tags/v3") is None
+        assert packed.get("refs/heads") is None
+        packed.close()
+    
+    @pytest.mark.unit
+    def test_sorted_prefix_iteration(self, repo_dir):
+        packed = refs.PackedRefs(str(repo_dir / ".git" / "packed-refs"))
+        assert list(packed.items("refs/heads/")) == [
+            ("refs/heads/feature", OID_B), ("refs/heads/main", OID_C)]
+        assert [name for name, _ in packed.items("refs/tags/")] == ["refs/tags/v1", "refs/tags/v2"]
+        assert len(list(packed.items())) == 5
+        packed.close()
+    
+    @pytest.mark.unit
+    def test_binary_search_over_many_records(self, tmp_path):
+        names = sorted(f"refs/tags/t{i:05d}" for i in range(2000))
+        lines = ["# pack-refs with: peeled fully-peeled sorted \n"]
+        for i, name in enumerate(names):
+            lines.append(f"{i:040x} {name}\n")
+            if i % 3 == 0:
+                lines.append(f"^{OID_A}\n")
+        path = tmp_path / "packed-refs"
+        path.write_text("".join(lines))
+        packed = refs.PackedRefs(str(path))
+        for i in (0, 1, 2, 3, 999, 1998, 1999):
+            assert packed.get(names[i]) == f"{i:040x}"
+        assert packed.get("refs/tags/t0") is None
+        assert packed.get("refs/tags/zzz") is None
+        assert len(list(packed.items("refs/tags/t019"))) == 100
+    
+    @pytest.mark.unit
+    def test_unsorted_file(self, tmp_path):
+        path = tmp_path / "packed-refs"
+        path.write_text(f"{OID_B} refs/heads/z\n{OID_A} refs/heads/a\n")
+        packed = refs.PackedRefs(str(path))
+        assert not packed.sorted
+        assert packed.get("refs/heads/z") == OID_B
+        assert packed.get("refs/heads/missing") is None
+        assert list(packed.items("refs/heads/")) == [("refs/heads/a", OID_A), ("refs/heads/z", OID_B)]
+    
+    @pytest.mark.unit
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "packed-refs"
+        path.write_text("")
+        packed = refs.PackedRefs(str(path))
+        assert packed.get("refs/heads/main") is None
+        assert list(packed.items()) == []
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("content", [
+        "# something else\n",
+        f"^{OID_A}\n{OID_B} refs/heads/a\n",
+        "not-an-oid refs/heads/a\n",
+    ])
+    def test_malformed_files(self, tmp_path, content):
+        path = tmp_path / "packed-refs"
+        path.write_text(content)
+        with pytest.raises(refs.Unsupported):
+            refs.PackedRefs(str(path))
+    
+    @pytest.mark.unit
+    def test_cached_until_file_changes(self, repo_dir):
+        repository = repo_module.discover(str(repo_dir))
+        first = refs._packed_refs(repository)
+        assert refs._packed_refs(repository) is first
+        write(str(repo_dir / ".git" / "packed-refs"), f"# pack-refs with: sorted \n{OID_A} refs/heads/x\n")
+        assert refs._packed_refs(repository) is not first
+        assert refs.read_raw(repository, "refs/heads/x") == OID_A
+
+
+class TestResolve:
+    """Test loose ref and symref resolution"""
+    
+    @pytest.mark.unit
+    def test_loose_ref_shadows_packed(self, repo_dir):
+        repository = repo_module.discover(str(repo_dir))
+        assert refs.read_raw(repository, "refs/heads/main") == OID_A
+        assert refs.resolve(repository, "HEAD") == (OID_A, ["HEAD", "refs/heads/main"])
+    
+    @pytest.mark.unit
+    def test_symref_chain(self, repo_dir):
+        repository = repo_module.discover(str(repo_dir))
+        assert refs.resolve(repository, "refs/remotes/origin/HEAD") == (
+            OID_B, ["refs/remotes/origin/HEAD", "refs/remotes/origin/main"])
+    
+    @pytest.mark.unit
+    def test_missing_ref(self, repo_dir):
+        repository = repo_module.discover(str(repo_dir))
+        assert refs.resolve(repository, "refs/heads/nope") == (None, ["refs/heads/nope"])
+        assert refs.read_raw(repository, "ORIG_HEAD") is None
+    
+    @pytest.mark.unit
+    def test_symref_loop(self, repo_dir):
+        write(str(repo_dir / ".git" / "refs" / "heads" / "loop"), "ref: refs/heads/loop\n")
+        repository = repo_module.discover(str(repo_dir))
+        with pytest.raises(refs.Unsupported):
+            refs.resolve(repository, "refs/heads/loop")
+    
+    @pytest.mark.unit
+    def test_garbage_loose_ref(self, repo_dir):
+        write(str(repo_dir / ".git" / "refs" / "heads" / "bad"), "garbage\n")
+        repository = repo_module.discover(str(repo_dir))
+        with pytest.raises(refs.Unsupported):
+            refs.read_raw(repository, "refs/heads/bad")
+    
+    @pytest.mark.unit
+    def test_symlinked_ref(self, repo_dir):
+        os.symlink(str(repo_dir / ".git" / "refs" / "heads" / "main"),
+                   str(repo_dir / ".git" / "refs" / "heads" / "link"))
+        repository = repo_module.discover(str(repo_dir))
+        with pytest.raises(refs.Unsupported):
+            refs.read_raw(repository, "refs/heads/link")
+    
+    @pytest.mark.unit
+    def test_iter_refs_merges_loose_and_packed(self, repo_dir):
+        write(str(repo_dir / ".git" / "refs" / "heads" / "main.lock"), OID_E + "\n")
+        repository = repo_module.discover(str(repo_dir))
+        assert list(refs.iter_refs(repository)) == [
+            ("refs/heads/feature", OID_B),
+            ("refs/heads/main", OID_A),
+            ("refs/remotes/origin/HEAD", OID_B),
+            ("refs/remotes/origin/main", OID_B),
+            ("refs/tags/v1", OID_D),
+            ("refs/tags/v2", OID_E),
+        ]
+        assert [name for name, _ in refs.iter_refs(repository, "refs/tags/")] == ["refs/tags/v1", "refs/tags/v2"]
+    
+    @pytest.mark.unit
+    def test_iter_refs_dangling_symref(self, repo_dir):
+        write(str(repo_dir / ".git" / "refs" / "heads" / "dangling"), "ref: refs/heads/nowhere\n")
+        repository = repo_module.discover(str(repo_dir))
+        with pytest.raises(refs.Unsupported):
+            list(refs.iter_refs(repository))
+    
+    @pytest.mark.unit
+    def test_linked_worktree_refs(self, repo_dir, tmp_path):
+        main_git = repo_dir / ".git"
+        write(str(main_git / "refs" / "bisect" / "bad"), OID_C + "\n")
+        linked = main_git / "worktrees" / "wt"
+        write(str(linked / "HEAD"), OID_D + "\n")
+        write(str(linked / "commondir"), "../..\n")
+        write(str(linked / "refs" / "bisect" / "good"), OID_E + "\n")
+        wt = tmp_path / "wt"
+        write(str(wt / ".git"), f"gitdir: {linked}\n")
+        repository = repo_module.discover(str(wt))
+        names = [name for name, _ in refs.iter_refs(repository)]
+        assert "refs/bisect/good" in names
+        assert "refs/bisect/bad" not in names
+        assert "refs/heads/main" in names
+        assert refs.resolve(repository, "HEAD") == (OID_D, ["HEAD"])
+
+
+class TestCommands:
+    """Test the commands answered by fast_read"""
+    
+    @pytest.mark.unit
+    def test_rev_parse_head(self, repo_dir):
+        result = run_fast(repo_dir, "rev-parse", "HEAD")
+        assert result.returncode == 0
+        assert result.stdout == OID_A + "\n"
+        assert result.stderr == ""
+        assert result.resources is None
+        assert result.args == ["git", "rev-parse", "HEAD"]
+        assert run_fast(repo_dir, "rev-parse", "--verify", "HEAD").stdout == OID_A + "\n"
+    
+    @pytest.mark.unit
+    def test_rev_parse_names(self, repo_dir):
+        assert run_fast(repo_dir, "rev-parse", "--abbrev-ref", "HEAD").stdout == "main\n"
+        assert run_fast(repo_dir, "rev-parse", "--symbolic-full-name", "HEAD").stdout == "refs/heads/main\n"
+    
+    @pytest.mark.unit
+    def test_rev_parse_ambiguous_short_name_falls_back(self, repo_dir):
+        write(str(repo_dir / ".git" / "refs" / "tags" / "main"), OID_B + "\n")
+        assert run_fast(repo_dir, "rev-parse", "--abbrev-ref", "HEAD") is None
+        assert run_fast(repo_dir, "symbolic-ref", "--short", "HEAD") is None
+    
+    @pytest.mark.unit
+    def test_detached_head(self, repo_dir):
+        write(str(repo_dir / ".git" / "HEAD"), OID_B + "\n")
+        assert run_fast(repo_dir, "rev-parse", "HEAD").stdout == OID_B + "\n"
+        assert run_fast(repo_dir, "rev-parse", "--abbrev-ref", "HEAD").stdout == "HEAD\n"
+        assert run_fast(repo_dir, "rev-parse", "--symbolic-full-name", "HEAD").stdout == "HEAD\n"
+        result = run_fast(repo_dir, "branch", "--show-current")
+        assert (result.returncode, result.stdout) == (0, "")
+        assert run_fast(repo_dir, "symbolic-ref", "HEAD") is None
+    
+    @pytest.mark.unit
+    def test_unborn_branch(self, repo_dir):
+        write(str(repo_dir / ".git" / "HEAD"), "ref: refs/heads/unborn\n")
+        assert run_fast(repo_dir, "rev-parse", "HEAD") is None
+        assert run_fast(repo_dir, "rev-parse", "--abbrev-ref", "HEAD") is None
+        assert run_fast(repo_dir, "branch", "--show-current").stdout == "unborn\n"
+        assert run_fast(repo_dir, "symbolic-ref", "HEAD").stdout == "refs/heads/unborn\n"
+    
+    @pytest.mark.unit
+    def test_branch_and_symbolic_ref(self, repo_dir):
+        assert run_fast(repo_dir, "branch", "--show-current").stdout == "main\n"
+        assert run_fast(repo_dir, "symbolic-ref", "HEAD").stdout == "refs/heads/main\n"
+        assert run_fast(repo_dir, "symbolic-ref", "--short", "HEAD").stdout == "main\n"
+    
+    @pytest.mark.unit
+    def test_show_ref(self, repo_dir):
+        result = run_fast(repo_dir, "show-ref", "--heads")
+        assert result.stdout == f"{OID_B} refs/heads/feature\n{OID_A} refs/heads/main\n"
+        result = run_fast(repo_dir, "show-ref", "--tags")
+        assert result.stdout == f"{OID_D} refs/tags/v1\n{OID_E} refs/tags/v2\n"
+        assert len(run_fast(repo_dir, "show-ref").stdout.splitlines()) == 6
+        assert len(run_fast(repo_dir, "show-ref", "--heads", "--tags").stdout.splitlines()) == 4
+    
+    @pytest.mark.unit
+    def test_show_ref_empty(self, tmp_path):
+        (tmp_path / ".git" / "objects").mkdir(parents=True)
+        (tmp_path / ".git" / "refs").mkdir()
+        write(str(tmp_path / ".git" / "HEAD"), "ref: refs/heads/main\n")
+        result = run_fast(tmp_path, "show-ref")
+        assert (result.returncode, result.stdout) == (1, "")
+    
+    @pytest.mark.unit
+    def test_for_each_ref_formats(self, repo_dir):
+        result = run_fast(repo_dir, "for-each-ref", "--format=%(refname) %(objectname)", "refs/tags")
+        assert result.stdout == f"refs/tags/v1 {OID_D}\nrefs/tags/v2 {OID_E}\n"
+        result = run_fast(repo_dir, "for-each-ref", "--format", "%(refname)%09100%%", "refs/heads/", "refs/tags/v2")
+        assert result.stdout == "refs/heads/feature\t100%\nrefs/heads/main\t100%\nrefs/tags/v2\t100%\n"
+        result = run_fast(repo_dir, "for-each-ref", "--format=%(refname)", "--", "refs/remotes")
+        assert result.stdout == "refs/remotes/origin/HEAD\nrefs/remotes/origin/main\n"
+    
+    @pytest.mark.unit
+    def test_for_each_ref_pattern_matches_whole_components(self, repo_dir):
+        result = run_fast(repo_dir, "for-each-ref", "--format=%(refname)", "refs/heads/fea")
+        assert result.stdout == ""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("argv", [
+        ["for-each-ref"],
+        ["for-each-ref", "--format=%(objecttype)"],
+        ["for-each-ref", "--format=%(refname:short)"],
+        ["for-each-ref", "--format=%(refname)", "refs/heads/*"],
+        ["for-each-ref", "--sort=-committerdate"],
+        ["for-each-ref", "--format"],
+        ["rev-parse", "HEAD~1"],
+        ["rev-parse", "--show-toplevel"],
+        ["branch"],
+        ["branch", "-a"],
+        ["symbolic-ref", "refs/remotes/origin/HEAD"],
+        ["show-ref", "--verify", "refs/heads/main"],
+        ["show-ref", "--heads", "--heads"],
+        ["status"],
+        [],
+    ])
+    def test_unsupported_arguments_fall_back(self, repo_dir, argv):
+        assert run_fast(repo_dir, *argv) is None
+    
+    @pytest.mark.unit
+    def test_not_git(self, repo_dir):
+        assert fastpath.fast_read(["gh", "rev-parse", "HEAD"], str(repo_dir)) is None
+    
+    @pytest.mark.unit
+    def test_no_repository_falls_back(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(repo_module, "discover", lambda cwd=None: None)
+        assert run_fast(tmp_path, "rev-parse", "HEAD") is None
+    
+    @pytest.mark.unit
+    def test_missing_head_falls_back(self, repo_dir):
+        os.remove(str(repo_dir / ".git" / "HEAD"))
+        write(str(repo_dir / ".git" / "commondir"), ".\n")
+        assert run_fast(repo_dir, "branch", "--show-current") is None
+    
+    @pytest.mark.unit
+    def test_unusual_ref_name_falls_back(self, repo_dir):
+        write(str(repo_dir / ".git" / "HEAD"), "ref: refs/heads/a..b\n")
+        assert run_fast(repo_dir, "rev-parse", "HEAD") is None
+    
+    @pytest.mark.unit
+    def test_compile_format_custom_atoms(self):
+        render = refs.compile_format("[%(x)]", {"x": lambda refname, oid: refname.upper()})
+        assert render("refs/heads/a", OID_A) == "[REFS/HEADS/A]"
+        with pytest.raises(refs.Unsupported):
+            refs.compile_format("%(refname)", {})
+
+
+class TestEdgeCases:
+    """Test fallbacks for less common layouts"""
+    
+    @pytest.mark.unit
+    def test_packed_refs_without_trailing_newline(self, tmp_path):
+        path = tmp_path / "packed-refs"
+        path.write_text(f"# pack-refs with: sorted \n{OID_A} refs/heads/a\n{OID_B} refs/heads/b")
+        packed = refs.PackedRefs(str(path))
+        assert packed.get("refs/heads/b") == OID_B
+        packed.close()
+        packed.close()
+    
+    @pytest.mark.unit
+    def test_sorted_packed_refs_starting_with_peeled_line(self, tmp_path):
+        path = tmp_path / "packed-refs"
+        path.write_text(f"# pack-refs with: sorted \n^{OID_A}\n{OID_B} refs/heads/b\n")
+        with pytest.raises(refs.Unsupported):
+            refs.PackedRefs(str(path)).get("refs/heads/b")
+    
+    @pytest.mark.unit
+    def test_unsorted_items_filter_prefix(self, tmp_path):
+        path = tmp_path / "packed-refs"
+        path.write_text(f"{OID_B} refs/tags/z\n{OID_A} refs/heads/a\n")
+        assert list(refs.PackedRefs(str(path)).items("refs/tags/")) == [("refs/tags/z", OID_B)]
+    
+    @pytest.mark.unit
+    def test_missing_head_after_discovery(self, repo_dir):
+        repository = repo_module.discover(str(repo_dir))
+        os.remove(str(repo_dir / ".git" / "HEAD"))
+        with pytest.raises(refs.Unsupported):
+            refs.head_target(repository)
+    
+    @pytest.mark.unit
+    def test_iter_refs_outside_refs(self, repo_dir):
+        with pytest.raises(refs.Unsupported):
+            list(refs.iter_refs(repo_module.discover(str(repo_dir)), "HEAD"))
+    
+    @pytest.mark.unit
+    def test_head_outside_refs_heads_falls_back(self, repo_dir):
+        write(str(repo_dir / ".git" / "HEAD"), "ref: refs/remotes/origin/main\n")
+        assert run_fast(repo_dir, "rev-parse", "--abbrev-ref", "HEAD") is None
+        assert run_fast(repo_dir, "branch", "--show-current") is None
+        assert run_fast(repo_dir, "symbolic-ref", "--short", "HEAD") is None
+        assert run_fast(repo_dir, "symbolic-ref", "HEAD").stdout == "refs/remotes/origin/main\n"
+    
+    @pytest.mark.unit
+    def test_unborn_head_falls_back(self, repo_dir):
+        write(str(repo_dir / ".git" / "HEAD"), "ref: refs/heads/unborn\n")
+        assert run_fast(repo_dir, "rev-parse", "--symbolic-full-name", "HEAD") is None
+        assert run_fast(repo_dir, "cat-file", "-t", "HEAD") is None
+
+
+class TestResolveRevision:
+    """Test short-name resolution for revision arguments"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("name,expected", [
+        (OID_C, OID_C),
+        ("HEAD", OID_A),
+        ("@", OID_A),
+        ("main", OID_A),
+        ("refs/heads/feature", OID_B),
+        ("feature", OID_B),
+        ("v1", OID_D),
+        ("tags/v2", OID_E),
+        ("origin/main", OID_B),
+        ("origin", OID_B),
+    ])
+    def test_names(self, repo_dir, name, expected):
+        assert refs.resolve_revision(repo_module.discover(str(repo_dir)), name) == expected
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("name", ["", "nope", "main~1", "main^2", "FETCH_HEAD", "a" * 39])
+    def test_unsupported_names(self, repo_dir, name):
+        with pytest.raises(refs.Unsupported):
+            refs.resolve_revision(repo_module.discover(str(repo_dir)), name)
+    
+    @pytest.mark.unit
+    def test_ambiguous_and_dangling_names(self, repo_dir):
+        write(str(repo_dir / ".git" / "refs" / "tags" / "main"), OID_E + "\n")
+        write(str(repo_dir / ".git" / "refs" / "heads" / "dangling"), "ref: refs/heads/nowhere\n")
+        repository = repo_module.discover(str(repo_dir))
+        for name in ("main", "dangling"):
+            with pytest.raises(refs.Unsupported):
+                refs.resolve_revision(repository, name)
+    
+    @pytest.mark.unit
+    def test_unborn_head(self, repo_dir):
+        write(str(repo_dir / ".git" / "HEAD"), "ref: refs/heads/unborn\n")
+        with pytest.raises(refs.Unsupported):
+            refs.resolve_revision(repo_module.discover(str(repo_dir)), "HEAD")
@@ -0,0 +1,301 @@
+"""
+Unit tests for git repository discovery and config parsing
+"""
+import os
+import pytest
+
+from plugins.git import repo as repo_module
+
+
+def make_git_dir(path, config="[core]\n\trepositoryformatversion = 0\n"):
+    """Create the minimal layout git recognises as a git directory"""
+    os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+    os.makedirs(os.path.join(path, "refs", "heads"), exist_ok=True)
+    with open(os.path.join(path, "HEAD"), "w") as f:
+        f.write("ref: refs/heads/main\n")
+    with open(os.path.join(path, "config"), "w") as f:
+        f.write(config)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def clean_git_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+class TestReadConfig:
+    """Test the minimal git config parser"""
+    
+    @pytest.mark.unit
+    def test_sections_keys_and_values(self, tmp_path):
+        path = tmp_path / "config"
+        path.write_text(
+            "# comment\n"
+            "[core]\n"
+            "\tbare = false\n"
+            "\tfileMode\n"
+            "[remote \"Origin\"]\n"
+            "\turl = \"https://example.com/a b\" ; trailing comment\n"
+            "[Extensions] objectFormat = sha1\n"
+            "[user]\n"
+            "\tname = A\\tB\n"
+            "\n"
+            "; another comment\n"
+            "[alias] # comment after section\n"
+        )
+        config = repo_module.read_config(str(path))
+        assert config == {
+            "core.bare": "false",
+            "core.filemode": "true",
+            "remote.Origin.url": "https://example.com/a b",
+            "extensions.objectformat": "sha1",
+            "user.name": "A\tB",
+        }
+    
+    @pytest.mark.unit
+    def test_missing_file_is_empty(self, tmp_path):
+        assert repo_module.read_config(str(tmp_path / "nope")) == {}
+    
+    @pytest.mark.unit
+    def test_unreadable_file(self, tmp_path):
+        assert repo_module.read_config(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("text", [
+        "[include]\n\tpath = other\n",
+        "[includeIf \"gitdir:~/\"]\n\tpath = other\n",
+        "[core]\n\tbare = \\\n  false\n",
+        "[core\n",
+        "key = value\n",
+        "[core]\n\t!bad = 1\n",
+    ])
+    def test_unsupported_configs(self, tmp_path, text):
+        path = tmp_path / "config"
+        path.write_text(text)
+        assert repo_module.read_config(str(path)) is None
+
+
+class TestDiscover:
+    """Test repository discovery"""
+    
+    @pytest.mark.unit
+    def test_discover_from_subdirectory(self, tmp_path):
+        make_git_dir(str(tmp_path / ".git"))
+        sub = tmp_path / "a" / "b"
+        sub.mkdir(parents=True)
+        repository = repo_module.discover(str(sub))
+        assert repository.git_dir == str(tmp_path / ".git")
+        assert repository.common_dir == repository.git_dir
+        assert repository.worktree == str(tmp_path)
+        assert repository.objects_dir == str(tmp_path / ".git" / "objects")
+        assert "Repository(" in repr(repository)
+    
+    @pytest.mark.unit
+    def test_discover_uses_current_directory(self, tmp_path, monkeypatch):
+        make_git_dir(str(tmp_path / ".git"))
+        monkeypatch.chdir(tmp_path)
+        assert repo_module.discover().worktree == str(tmp_path)
+    
+    @pytest.mark.unit
+    def test_discover_gitfile_and_commondir(self, tmp_path):
+        main = make_git_dir(str(tmp_path / "main" / ".git"))
+        linked = tmp_path / "main" / ".git" / "worktrees" / "wt"
+        linked.mkdir(parents=True)
+        (linked / "HEAD").write_text("ref: refs/heads/feature\n")
+        (linked / "commondir").write_text("../..\n")
+        wt = tmp_path / "wt"
+        wt.mkdir()
+        (wt / ".git").write_text(f"gitdir: {linked}\n")
+        repository = repo_module.discover(str(wt))
+        assert repository.git_dir == str(linked)
+        assert repository.common_dir == main
+        assert repository.worktree == str(wt)
+    
+    @pytest.mark.unit
+    def test_discover_relative_gitfile(self, tmp_path):
+        make_git_dir(str(tmp_path / "modules" / "sub"))
+        wt = tmp_path / "sub"
+        wt.mkdir()
+        (wt / ".git").write_text("gitdir: ../modules/sub\n")
+        assert repo_module.discover(str(wt)).git_dir == str(tmp_path / "modules" / "sub")
+    
+    @pytest.mark.unit
+    def test_discover_bare_repository(self, tmp_path):
+        bare = make_git_dir(str(tmp_path / "bare.git"), "[core]\n\tbare = true\n")
+        repository = repo_module.discover(bare)
+        assert repository.git_dir == bare
+        assert repository.worktree is None
+        assert repository.config_bool("core.bare") is True
+        assert repository.config_bool("core.missing") is False
+        assert repository.config_bool("core.missing", True) is True
+    
+    @pytest.mark.unit
+    def test_inside_non_bare_git_dir_falls_back(self, tmp_path):
+        git_dir = make_git_dir(str(tmp_path / ".git"))
+        # The .git directory itself has no .git entry and is not marked bare
+        assert repo_module.discover(git_dir) is None
+    
+    @pytest.mark.unit
+    def test_no_repository(self, tmp_path):
+        repository = repo_module.discover(str(tmp_path))
+        # tmp_path may itself live inside some repository, but never is one
+        assert repository is None or repository.worktree != str(tmp_path)
+    
+    @pytest.mark.unit
+    def test_missing_directory(self, tmp_path):
+        assert repo_module.discover(str(tmp_path / "missing")) is None
+    
+    @pytest.mark.unit
+    def test_environment_override_falls_back(self, tmp_path, monkeypatch):
+        make_git_dir(str(tmp_path / ".git"))
+        monkeypatch.setenv("GIT_DIR", str(tmp_path / ".git"))
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("config", [
+        "[core]\n\trepositoryformatversion = 1\n[extensions]\n\trefStorage = reftable\n",
+        "[core]\n\trepositoryformatversion = 1\n[extensions]\n\tobjectFormat = sha256\n",
+        "[core]\n\trepositoryformatversion = 2\n",
+        "[core]\n\trepositoryformatversion = x\n",
+        "[core]\n\tworktree = /elsewhere\n",
+        "[include]\n\tpath = x\n",
+    ])
+    def test_unusual_repositories_fall_back(self, tmp_path, config):
+        make_git_dir(str(tmp_path / ".git"), config)
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_harmless_extensions_accepted(self, tmp_path):
+        make_git_dir(str(tmp_path / ".git"),
+                     "[core]\n\trepositoryformatversion = 1\n[extensions]\n\tobjectFormat = sha1\n\tpartialClone = origin\n")
+        assert repo_module.discover(str(tmp_path)) is not None
+    
+    @pytest.mark.unit
+    def test_worktree_config_falls_back(self, tmp_path):
+        make_git_dir(str(tmp_path / ".git"),
+                               "[core]\n\trepositoryformatversion = 1\n[extensions]\n\tworktreeConfig = true\n")
+        assert repo_module.discover(str(tmp_path)) is not None
+        (tmp_path / ".git" / "config.worktree").write_text("[core]\n\tsparseCheckout = true\n")
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_reftable_directory_falls_back(self, tmp_path):
+        make_git_dir(str(tmp_path / ".git"))
+        (tmp_path / ".git" / "reftable").mkdir()
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_foreign_owner_falls_back(self, tmp_path, monkeypatch):
+        make_git_dir(str(tmp_path / ".git"))
+        monkeypatch.setattr(os, "geteuid", lambda: 999999, raising=False)
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_no_geteuid_falls_back(self, tmp_path, monkeypatch):
+        make_git_dir(str(tmp_path / ".git"))
+        monkeypatch.delattr(os, "geteuid", raising=False)
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_invalid_gitfile_falls_back(self, tmp_path):
+        (tmp_path / ".git").write_text("not a gitfile\n")
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_broken_git_dir_falls_back(self, tmp_path):
+        (tmp_path / ".git").mkdir()
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_missing_commondir_target_falls_back(self, tmp_path):
+        git_dir = make_git_dir(str(tmp_path / ".git"))
+        with open(os.path.join(git_dir, "commondir"), "w") as f:
+            f.write("../nowhere\n")
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_filesystem_boundary_stops_discovery(self, tmp_path, monkeypatch):
+        sub = tmp_path / "mnt"
+        sub.mkdir()
+        real_stat = os.stat
+        
+        class FakeStat:
+            def __init__(self, st, dev):
+                self.st_dev = dev
+                self.st_uid = st.st_uid
+        
+        def fake_stat(path, *args, **kwargs):
+            st = real_stat(path, *args, **kwargs)
+            return FakeStat(st, 1 if str(path) == str(sub) else 2)
+        monkeypatch.setattr(os, "stat", fake_stat)
+        assert repo_module.discover(str(sub)) is None
+    
+    @pytest.mark.unit
+    def test_undecodable_gitfile_falls_back(self, tmp_path):
+        (tmp_path / ".git").write_bytes(b"gitdir: \xff\xfe\n")
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_undecodable_commondir_falls_back(self, tmp_path):
+        git_dir = make_git_dir(str(tmp_path / ".git"))
+        with open(os.path.join(git_dir, "commondir"), "wb") as f:
+            f.write(b"\xff\xfe\n")
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_ownership_of_missing_path(self, tmp_path):
+        assert repo_module._owned_by_us(str(tmp_path / "missing")) is False
+    
+    @pytest.mark.unit
+    def test_unreadable_parent_stops_discovery(self, tmp_path, monkeypatch):
+        sub = tmp_path / "sub"
+        sub.mkdir()
+        real_stat = os.stat
+        
+        def fake_stat(path, *args, **kwargs):
+            if str(path) == str(tmp_path):
+                raise PermissionError(path)
+            return real_stat(path, *args, **kwargs)
+        monkeypatch.setattr(os, "stat", fake_stat)
+        assert repo_module.discover(str(sub)) is None
+
+
+class TestRepositoryCache:
+    """Test reuse of discovered repositories across calls"""
+    
+    @pytest.mark.unit
+    def test_repository_reused_until_config_changes(self, tmp_path):
+        make_git_dir(str(tmp_path / ".git"))
+        first = repo_module.discover(str(tmp_path))
+        assert repo_module.discover(str(tmp_path)) is first
+        with open(str(tmp_path / ".git" / "config"), "a") as f:
+            f.write("[core]\n\tquotePath = false\n")
+        second = repo_module.discover(str(tmp_path))
+        assert second is not first
+        assert second.config["core.quotepath"] == "false"
+    
+    @pytest.mark.unit
+    def test_missing_config_is_not_cached(self, tmp_path):
+        make_git_dir(str(tmp_path / ".git"))
+        os.remove(str(tmp_path / ".git" / "config"))
+        first = repo_module.discover(str(tmp_path))
+        assert first is not None
+        assert repo_module.discover(str(tmp_path)) is not first
+    
+    @pytest.mark.unit
+    def test_ownership_checked_on_cache_hit(self, tmp_path, monkeypatch):
+        make_git_dir(str(tmp_path / ".git"))
+        assert repo_module.discover(str(tmp_path)) is not None
+        monkeypatch.setattr(os, "geteuid", lambda: 999999, raising=False)
+        assert repo_module.discover(str(tmp_path)) is None
+    
+    @pytest.mark.unit
+    def test_cache_is_bounded(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(repo_module, "_repositories", type(repo_module._repositories)())
+        monkeypatch.setattr(repo_module, "_REPOSITORY_CACHE_SIZE", 2)
+        for name in ("a", "b", "c"):
+            make_git_dir(str(tmp_path / name / ".git"))
+            repo_module.discover(str(tmp_path / name))
+        assert [key[1] for key in repo_module._repositories] == [str(tmp_path / "b"), str(tmp_path / "c")]
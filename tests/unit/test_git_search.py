@@ -0,0 +1,343 @@
+"""
+Unit tests for the git plugin's incremental commit search index
+"""
+import subprocess
+import sys
+import tempfile
+import pytest
+
+from plugins.git import search
+from plugins.git.search import CommitIndex
+
+OID_A = "a" * 40
+OID_B = "b" * 40
+OID_C = "c" * 40
+TAG = "d" * 40
+TREE = "e" * 40
+
+# 2024-01-01, 2024-01-03 and 2024-02-10, all 12:00 UTC
+FIRST, SECOND, THIRD = 1704110400, 1704283200, 1707566400
+
+
+def record(oid, parents, author, when, subject, body=""):
+    name, email = author
+    fields = [oid, " ".join(parents), name, email, str(when), name, email, str(when), subject, body]
+    return "".join(field + "\0" for field in fields).encode()
+
+
+STREAMING_PROCESS = search.process.StreamingProcess
+
+ANN = ("Ann", "ann@example.com")
+BOB = ("Bob Stone", "bob@example.org")
+
+LOG_AB = (record(OID_B, [OID_A], BOB, SECOND, "Fix crash in parser", "The \"tokenizer\" overran.\n")
+          + record(OID_A, [], ANN, FIRST, "Initial import"))
+LOG_C = record(OID_C, [OID_B], ANN, THIRD, "Speed up parser", "Caf\xe9 benchmark\n")
+
+
+def ref_listing(*entries):
+    return "".join(" ".join(entry) + "\n" for entry in entries)
+
+
+class FakeGit:
+    """Stands in for git for-each-ref, rev-parse and log"""
+    
+    def __init__(self, monkeypatch, refs, log, log_code=0):
+        self.refs, self.log, self.log_code = refs, log, log_code
+        self.calls, self.revisions = [], []
+        monkeypatch.setattr(search.process, "run_process", self.run_process)
+        monkeypatch.setattr(search.process, "StreamingProcess", self.streaming)
+    
+    def run_process(self, cmd_args, timeout=30, cwd=None):
+        self.calls.append(cmd_args)
+        if cmd_args[1] == "for-each-ref":
+            return subprocess.CompletedProcess(cmd_args, 0, self.refs, "")
+        return subprocess.CompletedProcess(cmd_args, 128, "", "fatal: not a git repository\n")
+    
+    def streaming(self, cmd_args, timeout=30, cwd=None, stdin=None):
+        self.calls.append(cmd_args)
+        self.revisions.append(stdin.read().decode().split())
+        with tempfile.TemporaryFile() as log:
+            log.write(self.log)
+            log.seek(0)
+            code = f"import sys; sys.stdout.buffer.write(sys.stdin.buffer.read()); sys.exit({self.log_code})"
+            return STREAMING_PROCESS([sys.executable, "-c", code], timeout=timeout, stdin=log)
+
+
+@pytest.fixture
+def index(tmp_path):
+    with CommitIndex(str(tmp_path / "index.sqlite")) as index:
+        yield index
+
+
+@pytest.fixture
+def synced(index, monkeypatch):
+    FakeGit(monkeypatch, ref_listing((OID_B, "commit", "", "", "refs/heads/main")), LOG_AB)
+    index.sync()
+    return index
+
+
+class TestParseTime:
+    """Test reading search time bounds"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value,expected", [
+        (FIRST, FIRST),
+        (str(SECOND), SECOND),
+        ("-5", -5),
+        ("2024-01-01", FIRST - 12 * 3600),
+        ("2024-01-01T12:00:00", FIRST),
+        ("2024-01-01T14:00:00+02:00", FIRST),
+    ])
+    def test_values(self, value, expected):
+        assert search.parse_time(value) == expected
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value", [True, None, "yesterday", 1.5])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError, match="not a time"):
+            search.parse_time(value)
+
+
+class TestSync:
+    """Test incremental indexing from git log"""
+    
+    @pytest.mark.unit
+    def test_first_sync_walks_all_tips(self, index, monkeypatch):
+        git = FakeGit(monkeypatch, ref_listing((OID_B, "commit", "", "", "refs/heads/main"),
+                                               (TAG, "tag", OID_A, "commit", "refs/tags/v1"),
+                                               (TREE, "tag", TREE, "tree", "refs/tags/tree")), LOG_AB)
+        assert index.sync("/repo") == 2
+        assert len(index) == 2
+        assert git.calls[0] == ["git", "for-each-ref", search._REF_FORMAT, "refs/heads", "refs/tags", "refs/remotes"]
+        assert git.calls[1] == ["git", "log", "-z", search.LOG_FORMAT, "--ignore-missing", "--stdin"]
+        assert git.revisions == [[OID_A, OID_B, "HEAD"]]
+        assert index.contains(OID_A) and not index.contains(OID_C)
+        stored = sorted(index._db.execute("SELECT name, oid, tip FROM refs"))
+        assert stored == [("refs/heads/main", OID_B, OID_B), ("refs/tags/tree", TREE, None),
+                          ("refs/tags/v1", TAG, OID_A)]
+    
+    @pytest.mark.unit
+    def test_next_sync_excludes_old_tips(self, synced, monkeypatch):
+        git = FakeGit(monkeypatch, ref_listing((OID_C, "commit", "", "", "refs/heads/main"),
+                                               (OID_B, "commit", "", "", "refs/heads/old")), LOG_C + LOG_AB)
+        # Commits indexed before are skipped even when git walks them again
+        assert synced.sync() == 1
+        assert len(synced) == 3
+        assert git.revisions == [[OID_C, "HEAD", "^" + OID_B]]
+        assert {r["oid"] for r in synced.search("parser")} == {OID_B, OID_C}
+    
+    @pytest.mark.unit
+    def test_git_failures_keep_previous_state(self, synced, monkeypatch):
+        FakeGit(monkeypatch, ref_listing((OID_C, "commit", "", "", "refs/heads/main")), LOG_C, log_code=128)
+        with pytest.raises(subprocess.CalledProcessError) as info:
+            synced.sync()
+        assert info.value.cmd[:2] == ["git", "log"]
+        git = FakeGit(monkeypatch, "", LOG_C[:-30])
+        with pytest.raises(ValueError, match="truncated log entry"):
+            synced.sync()
+        git.run_process = lambda cmd_args, timeout=30, cwd=None: subprocess.CompletedProcess(cmd_args, 129, "", "")
+        monkeypatch.setattr(search.process, "run_process", git.run_process)
+        with pytest.raises(subprocess.CalledProcessError):
+            synced.sync()
+        assert len(synced) == 2
+        assert list(synced._db.execute("SELECT name, tip FROM refs")) == [("refs/heads/main", OID_B)]
+        assert synced.search("speed") == []
+    
+    @pytest.mark.unit
+    def test_large_walk_inserts_in_batches(self, index, monkeypatch):
+        oids = [f"{number:040x}" for number in range(2500)]
+        log = b"".join(record(oid, [], ANN, FIRST + number, f"change {number}") for number, oid in enumerate(oids))
+        FakeGit(monkeypatch, ref_listing((oids[-1], "commit", "", "", "refs/heads/main")), log)
+        assert index.sync() == 2500
+        assert [r["subject"] for r in index.search("change", order="date", limit=2)] == ["change 2499", "change 2498"]
+
+
+class TestOpen:
+    """Test opening index databases"""
+    
+    @pytest.mark.unit
+    def test_reopen_keeps_commits(self, synced):
+        with CommitIndex(synced.path) as reopened:
+            assert len(reopened) == 2
+    
+    @pytest.mark.unit
+    def test_rejects_other_schema(self, tmp_path):
+        path = str(tmp_path / "index.sqlite")
+        with CommitIndex(path) as index:
+            index._db.execute("PRAGMA user_version=99")
+        with pytest.raises(ValueError, match="schema 99; delete it to rebuild"):
+            CommitIndex(path)
+
+
+class TestSearch:
+    """Test full-text and time-bounded queries"""
+    
+    @pytest.mark.unit
+    def test_query_words_match_message_and_author(self, synced):
+        results = synced.search("crash parser")
+        assert [r["oid"] for r in results] == [OID_B]
+        assert results[0] == {
+            "oid": OID_B, "parents": [OID_A], "author_name": "Bob Stone", "author_email": "bob@example.org",
+            "author_time": SECOND, "committer_name": "Bob Stone", "committer_email": "bob@example.org",
+            "committer_time": SECOND, "subject": "Fix crash in parser", "body": 'The "tokenizer" overran.'}
+        assert [r["oid"] for r in synced.search("stone")] == [OID_B]
+        assert synced.search("crash import") == []
+    
+    @pytest.mark.unit
+    def test_query_syntax_is_quoted(self, synced):
+        assert [r["oid"] for r in synced.search('"tokenizer" overran.')] == [OID_B]
+        assert synced.search("crash OR import") == []
+        assert synced.search("NOT") == []
+    
+    @pytest.mark.unit
+    def test_match_author_and_order(self, synced):
+        assert {r["oid"] for r in synced.search(match="crash OR initial")} == {OID_A, OID_B}
+        assert [r["oid"] for r in synced.search(match="subject: imp*")] == [OID_A]
+        assert [r["oid"] for r in synced.search(match="crash OR initial", author="ann@example.com")] == [OID_A]
+        assert [r["oid"] for r in synced.search(match="crash OR initial", order="date")] == [OID_B, OID_A]
+    
+    @pytest.mark.unit
+    def test_time_bounds_without_text(self, synced):
+        assert [r["oid"] for r in synced.search(since=SECOND)] == [OID_B]
+        assert [r["oid"] for r in synced.search(until=SECOND - 1)] == [OID_A]
+        assert [r["oid"] for r in synced.search(limit=1)] == [OID_B]
+        assert synced.search("crash", since=SECOND + 1) == []
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("kwargs,message", [
+        ({"order": "size"}, "unknown order"),
+        ({"limit": 0}, "limit must be a positive integer"),
+        ({"limit": True}, "limit must be a positive integer"),
+        ({"match": "crash AND"}, "invalid search expression"),
+    ])
+    def test_invalid_options(self, synced, kwargs, message):
+        with pytest.raises(ValueError, match=message):
+            synced.search(**kwargs)
+
+
+class TestFreshness:
+    """Test comparing the index with the live refs"""
+    
+    @pytest.mark.unit
+    def test_stale_refs(self, synced, monkeypatch):
+        monkeypatch.setattr(search, "current_refs", lambda cwd=None: ({"refs/heads/main": OID_B}, OID_B))
+        assert synced.stale_refs() == []
+        monkeypatch.setattr(search, "current_refs", lambda cwd=None: ({"refs/heads/main": OID_C,
+                                                                       "refs/heads/new": OID_A}, OID_C))
+        assert synced.stale_refs() == ["refs/heads/main", "refs/heads/new", "HEAD"]
+        monkeypatch.setattr(search, "current_refs", lambda cwd=None: ({}, None))
+        assert synced.stale_refs() == ["refs/heads/main"]
+    
+    @pytest.mark.unit
+    def test_current_refs_in_process(self, monkeypatch):
+        monkeypatch.setattr(search.repo_module, "discover", lambda cwd=None: "repo")
+        listed = {"refs/heads/": [("refs/heads/main", OID_B)], "refs/tags/": [("refs/tags/v1", TAG)]}
+        monkeypatch.setattr(search.refs_module, "iter_refs", lambda repo, prefix: iter(listed.get(prefix, [])))
+        monkeypatch.setattr(search.refs_module, "resolve", lambda repo, name: (OID_B, [name, "refs/heads/main"]))
+        monkeypatch.setattr(search.process, "run_process", None)
+        assert search.current_refs() == ({"refs/heads/main": OID_B, "refs/tags/v1": TAG}, OID_B)
+    
+    @pytest.mark.unit
+    def test_current_refs_from_git(self, monkeypatch):
+        monkeypatch.setattr(search.repo_module, "discover", lambda cwd=None: None)
+        calls = []
+    
+        def run_process(cmd_args, timeout=30, cwd=None):
+            calls.append(cmd_args)
+            if cmd_args[1] == "for-each-ref":
+                return subprocess.CompletedProcess(cmd_args, 0, f"{OID_B} refs/heads/main\n{TAG} refs/tags/v1\n", "")
+            return subprocess.CompletedProcess(cmd_args, 0, OID_B + "\n", "")
+        monkeypatch.setattr(search.process, "run_process", run_process)
+        assert search.current_refs("/repo") == ({"refs/heads/main": OID_B, "refs/tags/v1": TAG}, OID_B)
+        assert calls[1] == ["git", "rev-parse", "-q", "--verify", "HEAD"]
+        monkeypatch.setattr(search.process, "run_process",
+                            lambda cmd_args, timeout=30, cwd=None: subprocess.CompletedProcess(cmd_args, 128, "", ""))
+        with pytest.raises(subprocess.CalledProcessError):
+            search.current_refs("/repo")
+    
+    @pytest.mark.unit
+    def test_unsupported_layout_falls_back_to_git(self, monkeypatch):
+        monkeypatch.setattr(search.repo_module, "discover", lambda cwd=None: object())
+    
+        def unsupported(repo, prefix):
+            raise search.refs_module.Unsupported("unusual ref name")
+        monkeypatch.setattr(search.refs_module, "iter_refs", unsupported)
+        monkeypatch.setattr(search.process, "run_process",
+                            lambda cmd_args, timeout=30, cwd=None: subprocess.CompletedProcess(cmd_args, 0, "", ""))
+        assert search.current_refs() == ({}, None)
+
+
+class TestDefaultPath:
+    """Test locating the index of a repository"""
+    
+    @pytest.mark.unit
+    def test_in_common_dir(self, monkeypatch):
+        monkeypatch.setattr(search.repo_module, "discover",
+                            lambda cwd=None: search.repo_module.Repository("/repo/.git/worktrees/w", "/repo/.git",
+                                                                           "/w", {}))
+        assert search.default_path("/w") == "/repo/.git/" + search.INDEX_NAME
+    
+    @pytest.mark.unit
+    def test_from_git(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(search.repo_module, "discover", lambda cwd=None: None)
+        monkeypatch.setattr(search.process, "run_process",
+                            lambda cmd_args, timeout=30, cwd=None: subprocess.CompletedProcess(cmd_args, 0, ".git\n", ""))
+        assert search.default_path(str(tmp_path)) == str(tmp_path / ".git" / search.INDEX_NAME)
+        monkeypatch.setattr(search.process, "run_process",
+                            lambda cmd_args, timeout=30, cwd=None: subprocess.CompletedProcess(cmd_args, 128, "", ""))
+        with pytest.raises(subprocess.CalledProcessError):
+            search.default_path(str(tmp_path))
+
+
+class TestSearchCommand:
+    """Test the search command of the plugin CLI"""
+    
+    @pytest.fixture
+    def live(self, synced, monkeypatch):
+        refs = {"refs/heads/main": OID_B}
+        monkeypatch.setattr(search, "current_refs", lambda cwd=None: (dict(refs), OID_B))
+        return refs
+    
+    @pytest.mark.unit
+    def test_fresh_index(self, synced, live):
+        response = search.search({"query": "crash", "index": synced.path})
+        assert response["success"] is True
+        assert (response["record_count"], response["indexed_commits"], response["fresh"]) == (1, 2, True)
+        assert "stale_refs" not in response and "synced" not in response
+    
+    @pytest.mark.unit
+    def test_stale_index_is_synced_first(self, synced, live, monkeypatch):
+        live["refs/heads/main"] = OID_C
+        FakeGit(monkeypatch, ref_listing((OID_C, "commit", "", "", "refs/heads/main")), LOG_C)
+        response = search.search({"index": synced.path, "sync": False, "query": "speed"})
+        assert (response["fresh"], response["stale_refs"], response["record_count"]) == (False, ["refs/heads/main"], 0)
+        response = search.search({"index": synced.path, "query": "speed", "since": "2024-02-01", "limit": "10"})
+        assert (response["fresh"], response["record_count"], response["synced"]["added"]) == (True, 1, 1)
+    
+    @pytest.mark.unit
+    def test_default_index_location(self, live, monkeypatch, tmp_path):
+        monkeypatch.setattr(search, "default_path", lambda cwd=None: str(tmp_path / "index.sqlite"))
+        assert search.search({"order": "date"})["indexed_commits"] == 2
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args", [{"since": "yesterday"}, {"until": True}, {"order": "size"}, {"limit": "x"}])
+    def test_invalid_options(self, synced, live, args):
+        response = search.search(dict(args, index=synced.path))
+        assert response["success"] is False
+        assert response["error_code"] == "INVALID_SEARCH_OPTION"
+    
+    @pytest.mark.unit
+    def test_failures(self, tmp_path, monkeypatch):
+        def fail(cwd=None):
+            raise subprocess.CalledProcessError(128, ["git", "rev-parse"], "", "fatal: not a git repository\n")
+        monkeypatch.setattr(search, "default_path", fail)
+        assert search.search({}) == {"success": False, "error": "fatal: not a git repository",
+                                     "error_code": "COMMAND_FAILED_128"}
+        monkeypatch.setattr(search, "current_refs", lambda cwd=None: ({"refs/heads/main": OID_A}, None))
+        git = FakeGit(monkeypatch, "", b"", log_code=1)
+        git.refs = ""
+        response = search.search({"index": str(tmp_path / "index.sqlite")})
+        assert response["error"] == "git log exited with 1"
+        response = search.search({"index": str(tmp_path / "missing" / "index.sqlite")})
+        assert response["error_code"] == "SEARCH_FAILED"
@@ -0,0 +1,991 @@
+"""
+Unit tests for the git plugin's structured output parsers
+"""
+import json
+import subprocess
+import sys
+from itertools import islice
+import pytest
+
+from plugins.git import structured
+
+OID_A = "a" * 40
+OID_B = "b" * 40
+OID_C = "c" * 40
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def status(*entries):
+    return b"".join(entry + b"\0" for entry in entries)
+
+
+class TestSplitFields:
+    """Test NUL splitting of a chunked stream"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 2, 3, 7, 100])
+    def test_fields_straddling_chunks(self, size):
+        data = b"one\0two words\0\0last\0"
+        assert list(structured.split_fields(chunked(data, size))) == [b"one", b"two words", b"", b"last"]
+    
+    @pytest.mark.unit
+    def test_unterminated_tail(self):
+        assert list(structured.split_fields([b"a\0b", b"c"])) == [b"a", b"bc"]
+    
+    @pytest.mark.unit
+    def test_empty_stream(self):
+        assert list(structured.split_fields([])) == []
+        assert list(structured.split_fields([b""])) == []
+    
+    @pytest.mark.unit
+    def test_custom_separator(self):
+        assert list(structured.split_fields([b"a\nb\n"], b"\n")) == [b"a", b"b"]
+
+
+class TestParseStatus:
+    """Test parsing of status --porcelain=v2 -z --branch output"""
+    
+    @pytest.mark.unit
+    def test_all_entry_types(self):
+        data = status(
+            b"# branch.oid " + OID_A.encode(),
+            b"# branch.head main",
+            b"# branch.upstream origin/main",
+            b"# branch.ab +2 -3",
+            b"# stash 4",
+            b"1 .M N... 100644 100644 100644 " + OID_A.encode() + b" " + OID_A.encode() + b" dir/with space.txt",
+            b"2 R. N... 100644 100644 100644 " + OID_B.encode() + b" " + OID_B.encode() + b" R87 new name",
+            b"old name",
+            b"2 C. N... 100644 100644 100644 " + OID_B.encode() + b" " + OID_B.encode() + b" C100 copy",
+            b"orig",
+            b"u UU N... 100644 100644 100644 100644 " + b" ".join(o.encode() for o in (OID_A, OID_B, OID_C))
+            + b" conflict",
+            b"? new file",
+            b"! build/out",
+        )
+        records = list(structured.parse_status(chunked(data, 5)))
+        assert records[0] == {"type": "branch", "oid": OID_A, "head": "main", "upstream": "origin/main",
+                              "ahead": 2, "behind": 3}
+        assert records[1] == {"type": "stash", "count": 4}
+        assert records[2] == {
+            "type": "changed", "xy": ".M", "submodule": "N...", "mode_head": "100644", "mode_index": "100644",
+            "mode_worktree": "100644", "oid_head": OID_A, "oid_index": OID_A, "path": "dir/with space.txt",
+        }
+        assert records[3]["type"] == "renamed"
+        assert (records[3]["similarity"], records[3]["path"], records[3]["orig_path"]) == (87, "new name", "old name")
+        assert records[4]["type"] == "copied"
+        assert (records[4]["similarity"], records[4]["path"], records[4]["orig_path"]) == (100, "copy", "orig")
+        assert records[5] == {
+            "type": "unmerged", "xy": "UU", "submodule": "N...", "mode_stage1": "100644", "mode_stage2": "100644",
+            "mode_stage3": "100644", "mode_worktree": "100644", "oid_stage1": OID_A, "oid_stage2": OID_B,
+            "oid_stage3": OID_C, "path": "conflict",
+        }
+        assert records[6:] == [{"type": "untracked", "path": "new file"}, {"type": "ignored", "path": "build/out"}]
+    
+    @pytest.mark.unit
+    def test_initial_and_detached_branch_only(self):
+        data = status(b"# branch.oid (initial)", b"# branch.head (detached)")
+        assert list(structured.parse_status([data])) == [{"type": "branch", "oid": None, "head": None}]
+    
+    @pytest.mark.unit
+    def test_stash_without_branch_headers(self):
+        assert list(structured.parse_status([status(b"# stash 1")])) == [{"type": "stash", "count": 1}]
+    
+    @pytest.mark.unit
+    def test_without_headers(self):
+        assert list(structured.parse_status([status(b"? a")])) == [{"type": "untracked", "path": "a"}]
+        assert list(structured.parse_status([])) == []
+    
+    @pytest.mark.unit
+    def test_unknown_headers_are_skipped(self):
+        data = status(b"# future.header 1", b"# branch.head main", b"# branch.future x", b"? a")
+        assert list(structured.parse_status([data])) == [
+            {"type": "branch", "head": "main"}, {"type": "untracked", "path": "a"}]
+    
+    @pytest.mark.unit
+    def test_undecodable_path_survives(self):
+        records = list(structured.parse_status([status(b"? caf\xe9")]))
+        assert records[0]["path"] == "caf\udce9"
+        assert records[0]["path"].encode("utf-8", "surrogateescape") == b"caf\xe9"
+    
+    @pytest.mark.unit
+    def test_truncated_rename_raises(self):
+        data = b"2 R. N... 100644 100644 100644 " + OID_B.encode() + b" " + OID_B.encode() + b" R100 new\0"
+        with pytest.raises(ValueError, match="original path"):
+            list(structured.parse_status([data]))
+    
+    @pytest.mark.unit
+    def test_unknown_entry_raises(self):
+        with pytest.raises(ValueError, match="unrecognized status entry"):
+            list(structured.parse_status([status(b"# branch.head main", b"X bogus")]))
+
+
+class TestPrepare:
+    """Test rewriting commands for structured output"""
+    
+    @pytest.mark.unit
+    def test_status_options_go_last(self):
+        mode = structured.prepare(["git", "status", "--short", "src"])
+        assert mode.cmd_args == ["git", "status", "--short", "src", "--porcelain=v2", "-z", "--branch"]
+        assert mode.parse is structured.parse_status
+        assert mode.limit is None
+        assert mode.cursor is None
+    
+    @pytest.mark.unit
+    def test_status_options_before_pathspec_separator(self):
+        mode = structured.prepare(["git", "status", "--", "-odd-name"], {"limit": 5})
+        assert mode.limit == 5
+        assert mode.cmd_args == ["git", "status", "--porcelain=v2", "-z", "--branch", "--", "-odd-name"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args", [["git"], ["git", "show"], ["git", "-C", "repo", "status"]])
+    def test_unsupported(self, cmd_args):
+        assert structured.prepare(cmd_args) is None
+
+
+class TestRun:
+    """Test running a prepared command through the streaming parser"""
+    
+    @pytest.mark.unit
+    def test_records_from_child(self):
+        code = "import sys; sys.stdout.buffer.write(b'? a\\0? b\\0')"
+        result = structured.run(structured.Mode([sys.executable, "-c", code], structured.parse_status))
+        assert result.returncode == 0
+        assert result.records == [{"type": "untracked", "path": "a"}, {"type": "untracked", "path": "b"}]
+        assert result.stdout_bytes == 8
+    
+    @pytest.mark.unit
+    def test_failed_child_has_no_records(self):
+        code = "import sys; sys.stdout.buffer.write(b'? a\\0'); sys.stderr.write('fatal: boom'); sys.exit(128)"
+        result = structured.run(structured.Mode([sys.executable, "-c", code], structured.parse_status))
+        assert result.returncode == 128
+        assert result.records is None
+        assert result.stderr == "fatal: boom"
+    
+    @pytest.mark.unit
+    def test_parse_error_kills_child(self):
+        code = "import sys, time; sys.stdout.buffer.write(b'Z\\0'); sys.stdout.flush(); time.sleep(10)"
+        with pytest.raises(ValueError):
+            structured.run(structured.Mode([sys.executable, "-c", code], structured.parse_status), timeout=20)
+    
+    @pytest.mark.unit
+    def test_timeout(self):
+        code = "import time; time.sleep(10)"
+        with pytest.raises(subprocess.TimeoutExpired):
+            structured.run(structured.Mode([sys.executable, "-c", code], structured.parse_status), timeout=0.2)
+
+
+def listing(kind="ls-files", columns=(), prefix=None, glob=None, after=None, repository=None):
+    return structured._Listing(kind, tuple(columns), prefix, glob, after, repository)
+
+
+def staged(mode, oid, stage, path):
+    return f"{mode} {oid} {stage}\t".encode() + path
+
+
+def tree_entry(mode, kind, oid, size, path):
+    return f"{mode} {kind} {oid} {size:>7}\t".encode() + path
+
+
+class TestCursor:
+    """Test opaque cursor tokens"""
+    
+    @pytest.mark.unit
+    def test_round_trip(self):
+        token = structured.encode_cursor({"kind": "ls-files", "path": "caf\udce9", "repeat": 2})
+        assert "=" not in token
+        assert structured.decode_cursor(token, "ls-files") == {"kind": "ls-files", "path": "caf\udce9", "repeat": 2}
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("token", ["!!", "bm90IGpzb24", "WzFd", "é"])
+    def test_invalid_tokens(self, token):
+        with pytest.raises(ValueError, match="invalid cursor|does not belong"):
+            structured.decode_cursor(token, "ls-files")
+    
+    @pytest.mark.unit
+    def test_cursor_of_another_command(self):
+        token = structured.encode_cursor({"kind": "ls-tree", "path": "a", "repeat": 1})
+        with pytest.raises(ValueError, match="does not belong to a ls-files listing"):
+            structured.decode_cursor(token, "ls-files")
+
+
+class TestListing:
+    """Test the ls-files / ls-tree listing parser"""
+    
+    @pytest.mark.unit
+    def test_paths_only(self):
+        data = status(b"README", b"dir/with space", b"odd\nname")
+        assert list(listing()(chunked(data, 3))) == [{"path": "README"}, {"path": "dir/with space"},
+                                                       {"path": "odd\nname"}]
+    
+    @pytest.mark.unit
+    def test_ls_tree_columns(self):
+        data = status(tree_entry("100644", "blob", OID_A, 42, b"src/a.py"),
+                      tree_entry("160000", "commit", OID_B, "-", b"vendor/lib"))
+        records = list(listing("ls-tree", ("mode", "oid", "size"))([data]))
+        assert records == [{"path": "src/a.py", "mode": "100644", "oid": OID_A, "size": 42},
+                           {"path": "vendor/lib", "mode": "160000", "oid": OID_B, "size": None}]
+    
+    @pytest.mark.unit
+    def test_ls_files_columns_without_repository(self):
+        data = status(staged("100755", OID_A, 0, b"run.sh"))
+        assert list(listing("ls-files", ("mode", "size"))([data])) == [{"path": "run.sh", "mode": "100755",
+                                                                        "size": None}]
+    
+    @pytest.mark.unit
+    def test_ls_files_sizes_from_object_store(self, monkeypatch):
+        sizes = {OID_A: 10}
+        
+        def object_size(repository, oid):
+            if oid not in sizes:
+                raise structured.objects.MissingObject(oid)
+            return sizes[oid]
+        monkeypatch.setattr(structured.objects, "object_size", object_size)
+        data = status(staged("100644", OID_A, 0, b"a"), staged("100644", OID_B, 0, b"b"),
+                      staged("160000", OID_C, 0, b"sub"))
+        records = list(listing("ls-files", ("oid", "size"), repository=object())([data]))
+        assert [(r["oid"], r["size"]) for r in records] == [(OID_A, 10), (OID_B, None), (OID_C, None)]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("kind,entry", [("ls-files", b"just-a-path"), ("ls-tree", b"100644 blob x\tpath")])
+    def test_malformed_entry_raises(self, kind, entry):
+        with pytest.raises(ValueError, match=f"unrecognized {kind} entry"):
+            list(listing(kind, ("mode",))([status(entry)]))
+    
+    @pytest.mark.unit
+    def test_prefix_and_glob(self):
+        data = status(b"docs/a.md", b"src/app.py", b"src/application/x.py", b"src/b.txt", b"test/t.py")
+        assert [r["path"] for r in listing(prefix="src/app")([data])] == ["src/app.py", "src/application/x.py"]
+        assert [r["path"] for r in listing(glob="*.py")([data])] == ["src/app.py", "src/application/x.py",
+                                                                     "test/t.py"]
+        assert [r["path"] for r in listing(prefix="src/", glob="src/*.py")([data])] == ["src/app.py",
+                                                                                         "src/application/x.py"]
+    
+    @pytest.mark.unit
+    def test_resume_after_cursor(self):
+        data = status(b"a", b"b", b"c", b"d")
+        first = listing()
+        page = list(islice(first([data]), 2))
+        assert [r["path"] for r in page] == ["a", "b"]
+        after = structured.decode_cursor(first.cursor(), "ls-files")
+        assert after == {"kind": "ls-files", "path": "b", "repeat": 1}
+        assert [r["path"] for r in listing(after=after)([data])] == ["c", "d"]
+    
+    @pytest.mark.unit
+    def test_resume_inside_repeated_path(self):
+        data = status(*(staged("100644", oid, stage, b"conflict") for stage, oid in ((1, OID_A), (2, OID_B),
+                                                                                        (3, OID_C))), staged("100644", OID_A, 0, b"z"))
+        data = status(staged("100644", OID_A, 0, b"a")) + data
+        first = listing(columns=("oid",))
+        assert [r["oid"] for r in islice(first([data]), 3)] == [OID_A, OID_A, OID_B]
+        after = structured.decode_cursor(first.cursor(), "ls-files")
+        assert (after["path"], after["repeat"]) == ("conflict", 2)
+        second = listing(columns=("oid",), after=after)
+        records = list(second([data]))
+        assert [r["oid"] for r in records[:1]] == [OID_C]
+        assert records[1]["path"] == "z"
+
+
+class TestPrepareListing:
+    """Test rewriting ls-files / ls-tree for structured listings"""
+    
+    @pytest.mark.unit
+    def test_ls_files_defaults(self):
+        mode = structured.prepare(["git", "ls-files"])
+        assert mode.cmd_args == ["git", "ls-files", "-z"]
+        assert mode.limit == structured.DEFAULT_LIST_LIMIT
+        assert mode.cursor is not None
+    
+    @pytest.mark.unit
+    def test_ls_files_columns_and_prefix_pruning(self, tmp_path):
+        mode = structured.prepare(["git", "ls-files", "--cached"], {"columns": ["oid", "mode"], "prefix": "src/ap"},
+                                  str(tmp_path))
+        assert mode.cmd_args == ["git", "ls-files", "--cached", "-z", "-s", "--", "src/"]
+        assert mode.parse.columns == ("mode", "oid")
+        assert mode.parse.repository is None
+    
+    @pytest.mark.unit
+    def test_ls_files_with_own_pathspec_is_not_pruned(self):
+        mode = structured.prepare(["git", "ls-files", "docs"], {"prefix": "src/a", "columns": "size"})
+        assert mode.cmd_args == ["git", "ls-files", "docs", "-z", "-s"]
+    
+    @pytest.mark.unit
+    def test_ls_tree(self):
+        assert structured.prepare(["git", "ls-tree", "HEAD"], {"prefix": "lib/"}).cmd_args == [
+            "git", "ls-tree", "HEAD", "-r", "-z", "--name-only", "--", "lib/"]
+        assert structured.prepare(["git", "ls-tree", "HEAD", "lib"], {"prefix": "lib/x", "columns": "mode"}).cmd_args == [
+            "git", "ls-tree", "HEAD", "lib", "-r", "-z", "-l"]
+        assert structured.prepare(["git", "ls-tree", "HEAD"], {"prefix": "top"}).cmd_args == [
+            "git", "ls-tree", "HEAD", "-r", "-z", "--name-only"]
+    
+    @pytest.mark.unit
+    def test_output_lifts_default_limit(self):
+        assert structured.prepare(["git", "ls-files"], {"output": "x.ndjson"}).limit is None
+        assert structured.prepare(["git", "ls-files"], {"output": "x.ndjson", "limit": 3}).limit == 3
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("options,message", [
+        ({"limit": 0}, "positive integer"),
+        ({"limit": True}, "positive integer"),
+        ({"columns": "mode,owner"}, "unknown columns owner"),
+        ({"cursor": structured.encode_cursor({"kind": "ls-files", "path": 3})}, "invalid cursor"),
+        ({"cursor": structured.encode_cursor({"kind": "ls-tree", "path": "a", "repeat": 1})}, "does not belong"),
+    ])
+    def test_invalid_options(self, options, message):
+        with pytest.raises(ValueError, match=message):
+            structured.prepare(["git", "ls-files"], options)
+
+
+class TestRunPages:
+    """Test limits, cursors and NDJSON output of a running mode"""
+    
+    def producer(self, count):
+        code = ("import sys\n"
+                f"for i in range({count}): sys.stdout.buffer.write(b'f%06d\\0' % i); sys.stdout.flush()\n"
+                "import time; time.sleep(10)" if count > 100 else
+                f"import sys; sys.stdout.buffer.write(b''.join(b'f%06d\\0' % i for i in range({count})))")
+        return [sys.executable, "-c", code]
+    
+    @pytest.mark.unit
+    def test_limit_stops_child_and_returns_cursor(self):
+        parse = listing()
+        result = structured.run(structured.Mode(self.producer(1000), parse, 5, parse.cursor), timeout=20)
+        assert [r["path"] for r in result.records] == [f"f{i:06d}" for i in range(5)]
+        assert result.stopped is True
+        assert result.truncated is True
+        after = structured.decode_cursor(result.next_cursor, "ls-files")
+        assert after["path"] == "f000004"
+    
+    @pytest.mark.unit
+    def test_limit_equal_to_output_is_not_truncated(self):
+        parse = listing()
+        result = structured.run(structured.Mode(self.producer(5), parse, 5, parse.cursor))
+        assert result.record_count == 5
+        assert result.truncated is False
+        assert result.next_cursor is None
+    
+    @pytest.mark.unit
+    def test_limit_without_cursor_support(self):
+        code = "import sys; sys.stdout.buffer.write(b'? a\\0? b\\0? c\\0')"
+        result = structured.run(structured.Mode([sys.executable, "-c", code], structured.parse_status, 2))
+        assert result.truncated is True
+        assert result.next_cursor is None
+        assert len(result.records) == 2
+    
+    @pytest.mark.unit
+    def test_ndjson_output(self, tmp_path):
+        target = tmp_path / "out.ndjson"
+        result = structured.run(structured.Mode(self.producer(50), listing()), output=str(target))
+        assert result.records is None
+        assert result.record_count == 50
+        lines = target.read_text().splitlines()
+        assert len(lines) == 50
+        assert json.loads(lines[-1]) == {"path": "f000049"}
+
+
+def commit(oid, parents=(), subject="subject", author_time=1700000000):
+    fields = [oid, " ".join(parents), "Ann", "ann@example.com", str(author_time), "Cy", "cy@example.com",
+              str(author_time + 5), subject]
+    return b"".join(field.encode() + b"\0" for field in fields)
+
+
+class TestParseLog:
+    """Test parsing git log -z output"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 7, 4096])
+    def test_commits(self, size):
+        data = commit(OID_A, [OID_B, OID_C], "Merge: tabs\tand\nnewlines") + commit(OID_B)
+        records = list(structured.parse_log(chunked(data, size)))
+        assert records == [
+            {"oid": OID_A, "parents": [OID_B, OID_C], "author_name": "Ann", "author_email": "ann@example.com",
+             "author_time": 1700000000, "committer_name": "Cy", "committer_email": "cy@example.com",
+             "committer_time": 1700000005, "subject": "Merge: tabs\tand\nnewlines"},
+            {"oid": OID_B, "parents": [], "author_name": "Ann", "author_email": "ann@example.com",
+             "author_time": 1700000000, "committer_name": "Cy", "committer_email": "cy@example.com",
+             "committer_time": 1700000005, "subject": "subject"},
+        ]
+    
+    @pytest.mark.unit
+    def test_truncated_commit_raises(self):
+        with pytest.raises(ValueError, match="truncated log entry"):
+            list(structured.parse_log([commit(OID_A)[:-30]]))
+
+
+class FakeGit:
+    """Stand-in for process.run_process answering rev-parse calls"""
+    
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.calls = []
+    
+    def __call__(self, cmd_args, cwd=None, **kwargs):
+        self.calls.append(cmd_args)
+        returncode, stdout = self.outputs.pop(0)
+        return subprocess.CompletedProcess(cmd_args, returncode, stdout, "")
+
+
+class TestLogCursor:
+    """Test where a structured log page resumes"""
+    
+    @pytest.mark.unit
+    def test_first_page_frontier(self, monkeypatch):
+        fake = FakeGit((0, f"{OID_A}\nv1\n^{OID_C}\n"), (0, f"{OID_A}\n{'d' * 40}\n"))
+        monkeypatch.setattr(structured.process, "run_process", fake)
+        log = structured._Log(["git", "log", "main", "--tags", "--not", "old"], True, cwd="/repo")
+        page = list(islice(log([commit(OID_A, [OID_B, "e" * 40]) + commit(OID_B, ["f" * 40])]), 2))
+        assert len(page) == 2
+        after = structured.decode_cursor(log.cursor(), "log")
+        # Parents not shown, then starting points the walk did not reach (the tag, peeled to its commit)
+        assert after == {"kind": "log", "tips": ["e" * 40, "f" * 40, "d" * 40], "exclude": [OID_C]}
+        assert fake.calls == [["git", "rev-parse", "--no-flags", "--default", "HEAD", "main", "--tags", "--not", "old"],
+                              ["git", "rev-parse", OID_A + "^{commit}", "v1^{commit}"]]
+    
+    @pytest.mark.unit
+    def test_first_parent_frontier(self):
+        log = structured._Log(["git", "log"], True, True, tips=[OID_A], exclude=[])
+        list(log([commit(OID_A, [OID_B, OID_C])]))
+        assert structured.decode_cursor(log.cursor(), "log")["tips"] == [OID_B]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("outputs", [[(128, "")], [(0, "main\n"), (128, "")]])
+    def test_unresolvable_revisions_fall_back_to_offset(self, monkeypatch, outputs):
+        monkeypatch.setattr(structured.process, "run_process", FakeGit(*outputs))
+        log = structured._Log(["git", "log", "main"], True)
+        list(log([commit(OID_A)]))
+        assert structured.decode_cursor(log.cursor(), "log") == {"kind": "log", "skip": 1}
+    
+    @pytest.mark.unit
+    def test_only_exclusions(self, monkeypatch):
+        monkeypatch.setattr(structured.process, "run_process", FakeGit((0, f"^{OID_C}\n")))
+        log = structured._Log(["git", "log", "^x"], True)
+        list(log([commit(OID_A, [OID_B])]))
+        assert structured.decode_cursor(log.cursor(), "log") == {"kind": "log", "tips": [OID_B], "exclude": [OID_C]}
+    
+    @pytest.mark.unit
+    def test_offset_pages_do_not_track_parents(self):
+        log = structured._Log(["git", "log", "--author=x"], False, offset=10)
+        list(log([commit(OID_A, [OID_B]), commit(OID_B)]))
+        assert log.parents == []
+        assert structured.decode_cursor(log.cursor(), "log") == {"kind": "log", "skip": 12}
+
+
+class TestPrepareLog:
+    """Test rewriting git log for structured output"""
+    
+    @pytest.mark.unit
+    def test_first_page(self):
+        mode = structured.prepare(["git", "log", "--all", "main~5"], {}, "/repo")
+        assert mode.cmd_args == ["git", "log", "--all", "main~5", "-z", structured.LOG_FORMAT, "--no-patch",
+                                 "--date-order"]
+        assert mode.limit == structured.DEFAULT_LOG_LIMIT
+        assert mode.parse.graph is True
+        assert mode.parse.cwd == "/repo"
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args", [
+        ["git", "log", "--author=x"], ["git", "log", "--no-merges"], ["git", "log", "--", "src"],
+        ["git", "log", "--author", "x"], ["git", "log", "-p"],
+    ])
+    def test_commit_hiding_options_page_by_offset(self, cmd_args):
+        assert structured.prepare(cmd_args).parse.graph is False
+    
+    @pytest.mark.unit
+    def test_own_order_is_kept(self):
+        mode = structured.prepare(["git", "log", "--topo-order"])
+        assert "--date-order" not in mode.cmd_args
+    
+    @pytest.mark.unit
+    def test_resume_from_frontier(self):
+        cursor = structured.encode_cursor({"kind": "log", "tips": [OID_A, OID_B], "exclude": [OID_C]})
+        mode = structured.prepare(["git", "log", "--branches=feat/*", "--first-parent", "--since=2020-01-01", "main"],
+                                  {"cursor": cursor, "limit": 5})
+        assert mode.cmd_args == ["git", "log", "--first-parent", "--since=2020-01-01", OID_A, OID_B, "^" + OID_C,
+                                 "-z", structured.LOG_FORMAT, "--no-patch", "--date-order"]
+        assert mode.limit == 5
+        assert (mode.parse.tips, mode.parse.exclude, mode.parse.first_parent) == ([OID_A, OID_B], [OID_C], True)
+    
+    @pytest.mark.unit
+    def test_resume_from_offset(self):
+        cursor = structured.encode_cursor({"kind": "log", "skip": 40})
+        mode = structured.prepare(["git", "log", "--grep=fix", "--", "src"], {"cursor": cursor})
+        assert mode.cmd_args == ["git", "log", "--grep=fix", "-z", structured.LOG_FORMAT, "--no-patch",
+                                 "--date-order", "--skip=40", "--", "src"]
+        assert mode.parse.offset == 40
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("state,args,message", [
+        ({"kind": "log", "tips": ["--output=/tmp/x"], "exclude": []}, [], "invalid cursor"),
+        ({"kind": "log", "tips": [OID_A], "exclude": "x"}, [], "invalid cursor"),
+        ({"kind": "log", "skip": -1}, [], "invalid cursor"),
+        ({"kind": "log", "skip": True}, [], "invalid cursor"),
+        ({"kind": "diff", "offset": 1}, [], "does not belong"),
+        ({"kind": "log", "tips": [OID_A], "exclude": []}, ["--author=x"], "does not match"),
+    ])
+    def test_invalid_cursors(self, state, args, message):
+        with pytest.raises(ValueError, match=message):
+            structured.prepare(["git", "log"] + args, {"cursor": structured.encode_cursor(state)})
+
+
+class TestParseDiff:
+    """Test parsing git diff --name-status -z output"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 5, 4096])
+    def test_entries(self, size):
+        data = status(b"M", b"src/a.py", b"R087", b"old name", b"new\nname", b"C100", b"x", b"y", b"D", b"caf\xe9")
+        assert list(structured.parse_diff(chunked(data, size))) == [
+            {"status": "M", "path": "src/a.py"},
+            {"status": "R", "path": "new\nname", "orig_path": "old name", "similarity": 87},
+            {"status": "C", "path": "y", "orig_path": "x", "similarity": 100},
+            {"status": "D", "path": "caf\udce9"},
+        ]
+    
+    @pytest.mark.unit
+    def test_skip(self):
+        data = status(b"A", b"a", b"R100", b"b", b"c", b"M", b"d")
+        assert [r["path"] for r in structured.parse_diff([data], 2)] == ["d"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("data,message", [
+        (status(b"M"), "without a path"),
+        (status(b"R100", b"old"), "without its new path"),
+    ])
+    def test_truncated_entries_raise(self, data, message):
+        with pytest.raises(ValueError, match=message):
+            list(structured.parse_diff([data]))
+
+
+class TestPrepareDiff:
+    """Test rewriting git diff for structured output"""
+    
+    @pytest.mark.unit
+    def test_first_page(self):
+        mode = structured.prepare(["git", "diff", "-p", "main...topic", "--", "src"])
+        assert mode.cmd_args == ["git", "diff", "-p", "main...topic", "--name-status", "-z", "--", "src"]
+        assert mode.limit == structured.DEFAULT_DIFF_LIMIT
+        assert structured.decode_cursor(mode.cursor(), "diff") == {"kind": "diff", "offset": 0}
+    
+    @pytest.mark.unit
+    def test_resume(self):
+        mode = structured.prepare(["git", "diff"], {"cursor": structured.encode_cursor({"kind": "diff", "offset": 2})})
+        records = list(mode.parse([status(b"M", b"a", b"M", b"b", b"M", b"c")]))
+        assert records == [{"status": "M", "path": "c"}]
+        assert structured.decode_cursor(mode.cursor(), "diff") == {"kind": "diff", "offset": 3}
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("state", [{"kind": "diff"}, {"kind": "diff", "offset": "3"}])
+    def test_invalid_cursors(self, state):
+        with pytest.raises(ValueError, match="invalid cursor"):
+            structured.prepare(["git", "diff"], {"cursor": structured.encode_cursor(state)})
+
+
+def raw(old_mode, new_mode, old_oid, new_oid, letter):
+    return f":{old_mode} {new_mode} {old_oid} {new_oid} {letter}".encode()
+
+
+ZERO = "0" * 40
+
+SUMMARY = status(
+    raw("100644", "100644", OID_A, OID_B, "M"), b"src/a.py",
+    raw("100644", "100755", OID_A, OID_C, "R087"), b"old name", b"new\nname",
+    raw("000000", "100644", ZERO, OID_B, "A"), b"logo.png",
+    raw("100644", "000000", OID_C, ZERO, "D"), b"caf\xe9",
+    raw("100644", "100644", OID_A, ZERO, "M"), b"wt.txt",
+    b"3\t1\tsrc/a.py", b"2\t0\t", b"old name", b"new\nname", b"-\t-\tlogo.png", b"0\t4\tcaf\xe9",
+)
+
+
+class TestParseDiffSummary:
+    """Test parsing git diff --raw --numstat -z output"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 7, 4096])
+    def test_entries(self, size):
+        records = list(structured.parse_diff_summary(chunked(SUMMARY, size)))
+        assert records[0] == {"status": "M", "path": "src/a.py", "old_mode": "100644", "new_mode": "100644",
+                              "old_oid": OID_A, "new_oid": OID_B, "added": 3, "deleted": 1, "binary": False}
+        assert records[1] == {"status": "R", "path": "new\nname", "orig_path": "old name", "similarity": 87,
+                              "old_mode": "100644", "new_mode": "100755", "old_oid": OID_A, "new_oid": OID_C,
+                              "added": 2, "deleted": 0, "binary": False}
+        assert records[2]["binary"] is True and records[2]["added"] is records[2]["deleted"] is None
+        assert (records[2]["old_mode"], records[2]["old_oid"], records[2]["new_oid"]) == (None, None, OID_B)
+        assert (records[3]["path"], records[3]["new_mode"], records[3]["new_oid"]) == ("caf\udce9", None, None)
+        # Git printed no counts for the last file: it is still reported, after the others
+        assert records[4] == {"status": "M", "path": "wt.txt", "old_mode": "100644", "new_mode": "100644",
+                              "old_oid": OID_A, "new_oid": None, "added": None, "deleted": None, "binary": False}
+    
+    @pytest.mark.unit
+    def test_missing_counts_and_repeated_paths(self):
+        data = status(raw("000000", "000000", ZERO, ZERO, "U"), b"a", raw("100644", "100644", OID_A, ZERO, "M"),
+                      b"a", raw("100644", "100644", OID_A, OID_B, "M"), b"b", raw("100644", "100644", OID_A, OID_B,
+                                                                                    "M"), b"c",
+                      b"0\t0\ta", b"4\t0\ta", b"1\t1\tc")
+        records = list(structured.parse_diff_summary([data]))
+        assert [(r["status"], r["path"], r["added"]) for r in records] == [
+            ("U", "a", 0), ("M", "a", 4), ("M", "b", None), ("M", "c", 1)]
+        assert [r["path"] for r in structured.parse_diff_summary([data], 3)] == ["c"]
+        assert [r["path"] for r in structured.parse_diff_summary([data[:data.index(b"0\t0")]], 3)] == ["c"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("data,message", [
+        (status(b":100644 100644 M", b"a"), "unrecognized raw diff entry"),
+        (status(raw("100644", "100644", OID_A, OID_B, "M")), "without a path"),
+        (status(raw("100644", "100644", OID_A, OID_B, "R100"), b"old"), "without a path"),
+        (status(b"1 2 a"), "unrecognized numstat entry"),
+        (status(b"1\t2\t", b"old"), "without its new path"),
+        (status(raw("100644", "100644", OID_A, OID_B, "M"), b"a", b"1\t2\tb"), "without a raw entry"),
+    ])
+    def test_malformed_entries_raise(self, data, message):
+        with pytest.raises(ValueError, match=message):
+            list(structured.parse_diff_summary([data]))
+
+
+class FakeRepository:
+    def __init__(self, worktree):
+        self.worktree = worktree
+
+
+class TestSummarySizes:
+    """Test sizing both sides of a summary record"""
+    
+    @pytest.mark.unit
+    def test_sizes_from_object_store_and_worktree(self, tmp_path, monkeypatch):
+        (tmp_path / "wt.txt").write_bytes(b"12345")
+        sizes = {OID_A: 10, OID_B: 20}
+        
+        def object_size(repository, oid):
+            if oid not in sizes:
+                raise structured.objects.MissingObject(oid)
+            return sizes[oid]
+        
+        monkeypatch.setattr(structured.objects, "object_size", object_size)
+        summary = structured._Summary(0, FakeRepository(str(tmp_path)))
+        records = list(summary([SUMMARY]))
+        assert [(r["old_size"], r["new_size"]) for r in records] == [
+            (10, 20), (10, None), (None, 20), (None, None), (10, 5)]
+        assert structured.decode_cursor(summary.cursor(), "diff") == {"kind": "diff", "offset": 5}
+    
+    @pytest.mark.unit
+    def test_without_repository_or_worktree(self, monkeypatch):
+        monkeypatch.setattr(structured.objects, "object_size", lambda repository, oid: 10)
+        data = status(raw("160000", "160000", OID_A, OID_B, "M"), b"sub",
+                      raw("100644", "100644", OID_A, ZERO, "M"), b"wt.txt")
+        records = list(structured._Summary(0, None)([data]))
+        assert [(r["old_size"], r["new_size"]) for r in records] == [(None, None), (None, None)]
+        # A bare repository has no worktree to size unhashed content from
+        records = list(structured._Summary(0, FakeRepository(None))([data]))
+        assert [(r["old_size"], r["new_size"]) for r in records] == [(None, None), (10, None)]
+
+
+def patch_section(old, new, *lines):
+    return f"diff --git a/{old} b/{new}\n".encode() + b"".join(line + b"\n" for line in lines)
+
+
+PATCH = (patch_section("src/a.py", "src/a.py", b"index 1..2 100644", b"--- a/src/a.py", b"+++ b/src/a.py",
+                       b"@@ -1 +1 @@", b"-old", b"+new", b"--- a/src/a.py looks like a header")
+         + patch_section("a b", "c d", b"similarity index 90%", b"rename from a b", b"rename to c d",
+                         b"index 1..2 100644", b"@@ -1 +1 @@", b"-x", b"+y")
+         + b'diff --git "a/caf\\303\\251" "b/caf\\303\\251"\nnew file mode 100644\nindex 0..1\n'
+         + b"Binary files /dev/null and \"b/caf\\303\\251\" differ\n"
+         + patch_section("x", '"y\\tz"', b"copy from x", b'copy to "y\\tz"')
+         + b'diff --git a/tab "b/new\\tname"\ndeleted file mode 100644\n'
+         + b"* Unmerged path conflict.txt\n"
+         + b"diff --cc conflict.txt\nindex 1,2..0\n@@@ -1,1 -1,1 +1,5 @@@\n++<<<<<<< HEAD\n")
+
+
+class TestParsePatch:
+    """Test parsing git diff -p output into capped per-file patches"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 9, 4096])
+    def test_sections(self, size):
+        records = list(structured.parse_patch(chunked(PATCH, size)))
+        assert [(r["path"], r.get("orig_path"), r["status"], r["binary"]) for r in records] == [
+            ("src/a.py", None, "M", False), ("c d", "a b", "R", False), ("café", None, "A", True),
+            ("y\tz", "x", "C", False), ("new\tname", None, "D", False), ("conflict.txt", None, "M", False)]
+        assert records[0]["patch"].endswith("+new\n--- a/src/a.py looks like a header\n")
+        assert all(r["truncated"] is False and r["bytes"] == len(r["patch"].encode()) for r in records)
+        assert "".join(r["patch"] for r in records) == PATCH.decode().replace("* Unmerged path conflict.txt\n", "")
+    
+    @pytest.mark.unit
+    def test_cap_keeps_whole_lines(self):
+        section = patch_section("big", "big", b"@@ -1 +1,3 @@", b"+" + b"x" * 200000, b"+tail")
+        record, _ = structured.parse_patch(chunked(section + patch_section("a", "a", b"@@ -1 +1 @@"), 4096), 40)
+        assert record["patch"] == "diff --git a/big b/big\n@@ -1 +1,3 @@\n"
+        assert (record["bytes"], record["truncated"]) == (len(section), True)
+    
+    @pytest.mark.unit
+    def test_long_line_is_not_joined(self):
+        lines = list(structured._capped_lines(chunked(b"a" * 100 + b"\nbc\n" + b"d" * 50, 7), 10))
+        assert lines == [(b"a" * 10, 101), (b"bc\n", 3), (b"d" * 10, 50)]
+    
+    @pytest.mark.unit
+    def test_output_before_first_section_is_ignored(self):
+        assert list(structured.parse_patch([b"warning: stray\n"])) == []
+        assert list(structured.parse_patch([patch_section("a", "a")], skip=1)) == []
+
+
+class TestPrepareDiffSummary:
+    """Test rewriting git diff for summaries and selected patches"""
+    
+    @pytest.mark.unit
+    def test_summary_replaces_output_formats(self, monkeypatch):
+        monkeypatch.setattr(structured.repo_module, "discover", lambda cwd: None)
+        mode = structured.prepare(["git", "diff", "-p", "--stat=80", "-M", "main...topic", "--", "src"],
+                                  {"summary": True, "limit": 5})
+        assert mode.cmd_args == ["git", "diff", "-M", "main...topic", "--raw", "--numstat", "-z", "--no-abbrev",
+                                 "--", "src"]
+        assert mode.limit == 5
+        assert structured.decode_cursor(mode.cursor(), "diff") == {"kind": "diff", "offset": 0}
+    
+    @pytest.mark.unit
+    def test_selected_paths(self):
+        cursor = structured.encode_cursor({"kind": "diff", "offset": 1})
+        mode = structured.prepare(["git", "diff", "--stat", "-U1", "HEAD"],
+                                  {"paths": ["a", "b"], "max_bytes": 10, "cursor": cursor})
+        assert mode.cmd_args == ["git", "diff", "-U1", "HEAD", "-p", "--no-color", "--no-ext-diff",
+                                 "--src-prefix=a/", "--dst-prefix=b/", "--", "a", "b"]
+        records = list(mode.parse([patch_section("a", "a", b"@@ -1 +1 @@") + patch_section("b", "b")]))
+        assert records == [{"path": "b", "status": "M", "binary": False, "bytes": 19, "truncated": True,
+                            "patch": ""}]
+        assert structured.decode_cursor(mode.cursor(), "diff") == {"kind": "diff", "offset": 2}
+        mode = structured.prepare(["git", "diff"], {"paths": "only one"})
+        assert mode.cmd_args[-2:] == ["--", "only one"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args,options,message", [
+        (["HEAD"], {"paths": []}, "non-empty list"),
+        (["HEAD"], {"paths": ["a", 3]}, "non-empty list"),
+        (["HEAD"], {"paths": ["a"], "max_bytes": 0}, "max_bytes must be"),
+        (["HEAD"], {"paths": ["a"], "max_bytes": True}, "max_bytes must be"),
+        (["HEAD"], {"max_bytes": 10}, "set paths too"),
+        (["HEAD"], {"paths": ["a"], "summary": True}, "exclusive"),
+        (["HEAD", "--", "src"], {"paths": ["a"]}, "replaces the pathspec"),
+    ])
+    def test_invalid_options(self, args, options, message):
+        with pytest.raises(ValueError, match=message):
+            structured.prepare(["git", "diff"] + args, options)
+
+
+def blame_entry(oid, orig_line, line, count, path=b"src/a.py", headers=()):
+    return (f"{oid} {orig_line} {line} {count}\n".encode() + b"".join(header + b"\n" for header in headers)
+            + b"filename " + path + b"\n")
+
+
+COMMIT_HEADERS = (b"author Ann", b"author-mail <ann@example.com>", b"author-time 1700000000", b"author-tz +0100",
+                  b"committer Bob", b"committer-mail <bob@example.com>", b"committer-time 1700000100",
+                  b"committer-tz -0500", b"summary Fix caf\xc3\xa9 parser")
+
+BLAME = (blame_entry(OID_B, 3, 4, 2, headers=COMMIT_HEADERS + (b"previous " + OID_A.encode() + b" src/old.py",))
+         + blame_entry(OID_A, 1, 1, 3, headers=(b"author Cy", b"summary Initial", b"boundary", b"x-future 1"))
+         + blame_entry(OID_B, 6, 6, 1, path=b'"sp\\303\\251cial \\"q\\"\\ttab"'))
+
+
+class TestParseBlame:
+    """Test parsing git blame --incremental output"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 9, 4096])
+    def test_entries(self, size):
+        assert list(structured.parse_blame(chunked(BLAME, size))) == [
+            {"oid": OID_B, "line": 4, "count": 2, "orig_line": 3, "path": "src/a.py",
+             "commit": {"author_name": "Ann", "author_email": "ann@example.com", "author_time": 1700000000,
+                        "author_tz": "+0100", "committer_name": "Bob", "committer_email": "bob@example.com",
+                        "committer_time": 1700000100, "committer_tz": "-0500", "summary": "Fix caf\xe9 parser"},
+             "previous": {"oid": OID_A, "path": "src/old.py"}},
+            {"oid": OID_A, "line": 1, "count": 3, "orig_line": 1, "path": "src/a.py",
+             "commit": {"author_name": "Cy", "summary": "Initial", "boundary": True}},
+            {"oid": OID_B, "line": 6, "count": 1, "orig_line": 6, "path": 'sp\xe9cial "q"\ttab'},
+        ]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("field,expected", [
+        (b"plain", "plain"),
+        (b'"a\\\\b\\a\\b\\f\\n\\r\\v\\x"', "a\\b\a\b\f\n\r\vx"),
+        (b'"\\377"', "\udcff"),
+        (b'"', '"'),
+        (b'"dangling\\"', "dangling\\"),
+    ])
+    def test_unquote(self, field, expected):
+        assert structured._unquote(field) == expected
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("data,message", [
+        (b"not a header\n", "unrecognized blame entry"),
+        (b"zz" * 20 + b" 1 1 1\n", "unrecognized blame entry"),
+        (f"{OID_A} 1 1 1\nauthor Ann\n".encode(), "without a filename"),
+    ])
+    def test_malformed_output_raises(self, data, message):
+        with pytest.raises(ValueError, match=message):
+            list(structured.parse_blame([data]))
+
+
+class TestPrepareBlame:
+    """Test rewriting git blame for structured output"""
+    
+    @pytest.mark.unit
+    def test_whole_file(self):
+        mode = structured.prepare(["git", "blame", "--porcelain", "HEAD", "--", "src/a.py"])
+        assert mode.cmd_args == ["git", "blame", "--porcelain", "HEAD", "--incremental", "--", "src/a.py"]
+        assert mode.limit == structured.DEFAULT_BLAME_LIMIT
+        assert mode.cursor is None
+        assert mode.flush is True
+        assert len(list(mode.parse([BLAME]))) == 3
+        assert mode.finished() is False
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("lines", ["4,6", [4, 6]])
+    def test_line_range_stops_once_attributed(self, lines):
+        mode = structured.prepare(["git", "blame", "src/a.py"], {"lines": lines})
+        assert mode.cmd_args == ["git", "blame", "src/a.py", "--incremental", "-L", "4,6"]
+        # Only lines 4-6 count: the range of lines 1-3 (from another -L) does not
+        parsed = mode.parse([blame_entry(OID_A, 1, 1, 3) + BLAME])
+        assert [r["line"] for r in parsed] == [1, 4, 1, 6]
+        assert mode.finished() is True
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("lines", ["4", "a,b", "0,3", "5,4", 7, [1, 2, 3]])
+    def test_invalid_line_ranges(self, lines):
+        with pytest.raises(ValueError, match="lines must be"):
+            structured.prepare(["git", "blame", "a"], {"lines": lines})
+
+
+class TestRunBlame:
+    """Test early stops, flushing and first-record timing of a running blame"""
+    
+    @pytest.mark.unit
+    def test_finished_parser_stops_child(self, tmp_path):
+        from plugins import telemetry
+        entry = blame_entry(OID_A, 1, 1, 2)
+        code = ("import sys, time\n"
+                f"sys.stdout.buffer.write({entry!r}); sys.stdout.flush()\n"
+                "time.sleep(10)")
+        mode = structured.prepare(["git", "blame", "a"], {"lines": "1,2"})
+        mode.cmd_args = [sys.executable, "-c", code]
+        timer = telemetry.PhaseTimer()
+        output = tmp_path / "blame.ndjson"
+        result = structured.run(mode, timer=timer, timeout=20, output=str(output))
+        assert result.stopped is True
+        assert result.record_count == 1
+        assert json.loads(output.read_text())["count"] == 2
+        assert "first_record_ns" in timer.as_dict()
+    
+    @pytest.mark.unit
+    def test_no_records_no_first_record_timing(self):
+        from plugins import telemetry
+        timer = telemetry.PhaseTimer()
+        mode = structured.prepare(["git", "blame", "a"])
+        mode.cmd_args = [sys.executable, "-c", "pass"]
+        result = structured.run(mode, timer=timer)
+        assert (result.records, result.stopped) == ([], False)
+        assert "first_record_ns" not in timer.as_dict()
+
+
+GREP = (b"Binary file HEAD:logo.png matches\n"
+        + b"HEAD:src/a.py\x001\x005\x00def main():\n"
+        + b"HEAD~1:x:y.txt\x0012\x001\x00caf\xc3\xa9 \xff\n"
+        + b"Binary file HEAD~1:data.bin matches\nBinary file HEAD~1:more.bin matches\n"
+        + b"HEAD~1:new\nline.txt\x003\x002\x00 main\n"
+        + b"Binary file HEAD:last.bin matches\n")
+
+
+class TestParseGrep:
+    """Test parsing git grep -z -n --column output"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("size", [1, 6, 4096])
+    def test_matches_and_binary_notices(self, size):
+        records = list(structured.parse_grep(chunked(GREP, size), ("HEAD", "HEAD~1")))
+        assert records == [
+            {"revision": "HEAD", "path": "logo.png", "binary": True},
+            {"revision": "HEAD", "path": "src/a.py", "line": 1, "column": 5, "text": "def main():"},
+            {"revision": "HEAD~1", "path": "x:y.txt", "line": 12, "column": 1, "text": "café �"},
+            {"revision": "HEAD~1", "path": "data.bin", "binary": True},
+            {"revision": "HEAD~1", "path": "more.bin", "binary": True},
+            {"revision": "HEAD~1", "path": "new\nline.txt", "line": 3, "column": 2, "text": " main"},
+            {"revision": "HEAD", "path": "last.bin", "binary": True},
+        ]
+    
+    @pytest.mark.unit
+    def test_worktree_paths_keep_colons(self):
+        records = list(structured.parse_grep([b"HEAD:odd\x001\x001\x00x\n"]))
+        assert records == [{"path": "HEAD:odd", "line": 1, "column": 1, "text": "x"}]
+        assert list(structured.parse_grep([b""])) == []
+        # Under -a the text of a match may hold NULs
+        assert list(structured.parse_grep([b"a\x001\x001\x00x\x00y\n"]))[0]["text"] == "x\x00y"
+    
+    @pytest.mark.unit
+    def test_longest_revision_prefix_wins(self):
+        records = list(structured.parse_grep([b"HEAD::a\x001\x001\x00x\n"], ("HEAD", "HEAD:")))
+        assert (records[0]["revision"], records[0]["path"]) == ("HEAD:", "a")
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("data,message", [
+        (b"a.py\n", "truncated grep match"),
+        (b"a.py\x001\x00\n", "truncated grep match"),
+        (b"a.py\x00x\x001\x00text\n", "unrecognized grep match"),
+        (b"a.py\x001\x00y\x00text\n", "unrecognized grep match"),
+    ])
+    def test_malformed_output_raises(self, data, message):
+        with pytest.raises(ValueError, match=message):
+            list(structured.parse_grep([data]))
+
+
+class TestPrepareGrep:
+    """Test rewriting git grep for structured output"""
+    
+    @pytest.mark.unit
+    def test_format_options_go_first(self, monkeypatch):
+        monkeypatch.setattr(structured, "_cpu_count", lambda: 6)
+        mode = structured.prepare(["git", "grep", "-i", "-l", "--color=always", "-C", "3", "-A2", "-5",
+                                   "--heading", "-e", "-l", "main", "v1", "--", "*.py"])
+        assert mode.cmd_args == ["git", "-c", "grep.threads=6", "grep", "-z", "-n", "--column", "--no-color",
+                                 "-i", "-e", "-l", "main", "v1", "--", "*.py"]
+        assert mode.limit == structured.DEFAULT_GREP_LIMIT
+        assert (mode.cursor, mode.exit_codes) == (None, (0, 1))
+        assert list(mode.parse([b"v1:a.py\x001\x001\x00main\n"]))[0]["revision"] == "v1"
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args,revisions", [
+        (["main"], []),
+        (["main", "HEAD", "v1"], ["HEAD", "v1"]),
+        (["-i", "main", "HEAD", "--", "HEAD"], ["HEAD"]),
+        (["-e", "a", "--or", "-e", "b", "HEAD"], ["HEAD"]),
+        (["-e", "a", "--and", "(", "-e", "b", ")", "HEAD~2"], ["HEAD~2"]),
+        (["-emain", "HEAD"], ["HEAD"]),
+        (["-f", "patterns.txt", "HEAD"], ["HEAD"]),
+        (["--max-depth", "2", "main", "HEAD"], ["HEAD"]),
+        (["--no-index", "main", "dir"], []),
+    ])
+    def test_revisions(self, args, revisions):
+        assert structured._grep_revisions(args) == revisions
+    
+    @pytest.mark.unit
+    def test_cpu_count_follows_affinity(self, monkeypatch):
+        monkeypatch.setattr(structured.os, "sched_getaffinity", lambda pid: {0, 2, 5}, raising=False)
+        assert structured._cpu_count() == 3
+
+
+class TestRunGrep:
+    """Test a running grep's exit statuses and early stop"""
+    
+    @pytest.mark.unit
+    def test_no_match_is_success(self):
+        mode = structured.prepare(["git", "grep", "nothing"])
+        mode.cmd_args = [sys.executable, "-c", "import sys; sys.exit(1)"]
+        result = structured.run(mode)
+        assert (result.returncode, result.records) == (1, [])
+    
+    @pytest.mark.unit
+    def test_limit_kills_a_long_search(self):
+        code = ("import sys, time\n"
+                "sys.stdout.buffer.write(b'a.py\\x001\\x001\\x00x\\n' * 3); sys.stdout.flush()\n"
+                "time.sleep(10)")
+        mode = structured.prepare(["git", "grep", "x"], {"limit": 2})
+        mode.cmd_args = [sys.executable, "-c", code]
+        result = structured.run(mode, timeout=20)
+        assert (result.stopped, result.truncated, result.record_count) == (True, True, 2)
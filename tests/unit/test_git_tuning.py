@@ -0,0 +1,321 @@
+"""
+Unit tests for the git plugin's repository tuning
+"""
+import hashlib
+import struct
+import pytest
+
+from plugins.git import cli, locking, tuning
+from plugins.git import repo as repo_module
+from tests.conftest import completed, make_repository
+
+COUNT_OBJECTS = "count: {loose}\nsize: 8\nin-pack: 500\npacks: {packs}\nsize-pack: 96\nprune-packable: 0\ngarbage: 0\nsize-garbage: 0\n"
+
+
+def write_index(path, version=2, untracked_cache=False):
+    """An index without entries, optionally with an untracked cache extension"""
+    data = struct.pack(">4sII", b"DIRC", version, 0)
+    if untracked_cache:
+        data += b"UNTR" + struct.pack(">I", 4) + b"\0\0\0\0"
+    (path / ".git" / "index").write_bytes(data + hashlib.sha1(data).digest())
+
+
+class FakeGit:
+    """Answers count-objects, config --list and ls-files; records every other command"""
+    
+    def __init__(self, monkeypatch, loose=0, packs=1, config="", files="a.txt\nsrc/b.py\nsrc/c.py\n", fail=()):
+        self.calls = []
+        self.loose = loose
+        self.packs = packs
+        self.config = config
+        self.files = files
+        self.fail = set(fail)
+        monkeypatch.setattr(tuning.process, "run_process", self.run_process)
+    
+    def run_process(self, cmd_args, timeout=30, cwd=None, timer=None):
+        self.calls.append(cmd_args[1:])
+        if cmd_args[1] in self.fail:
+            return completed(cmd_args, 128, "", f"fatal: {cmd_args[1]} failed\n")
+        if cmd_args[1] == "count-objects":
+            return completed(cmd_args, 0, COUNT_OBJECTS.format(loose=self.loose, packs=self.packs), "")
+        if cmd_args[1:3] == ["config", "--list"]:
+            return completed(cmd_args, 0, self.config, "")
+        if cmd_args[1] == "ls-files":
+            return completed(cmd_args, 0, self.files, "")
+        return completed(cmd_args, 0, "", "")
+    
+    def commands(self):
+        return [" ".join(args) for args in self.calls
+                if args[0] not in ("count-objects", "ls-files") and args[:2] != ["config", "--list"]]
+
+
+class FakeLayer:
+    def __init__(self, has_bloom_filters):
+        self.has_bloom_filters = has_bloom_filters
+
+
+class FakeGraph:
+    def __init__(self, *blooms):
+        self.layers = [FakeLayer(bloom) for bloom in blooms]
+    
+    def __len__(self):
+        return 7
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / "repo"
+    make_repository(path)
+    write_index(path)
+    return str(path)
+
+
+def steps_of(report):
+    return [step["step"] for step in report["steps"]]
+
+
+class TestInspect:
+    """Test reading a repository's objects, commit-graph, index and settings"""
+    
+    @pytest.mark.unit
+    def test_untuned(self, repo, monkeypatch):
+        FakeGit(monkeypatch, loose=12, config="core.bare=false\nCore.UntrackedCache=false\nfetch.writeCommitGraph\n")
+        inspection = tuning.inspect(repo)
+        assert inspection["objects"] == {"count": 12, "size": 8, "in_pack": 500, "packs": 1, "size_pack": 96,
+                                         "prune_packable": 0, "garbage": 0, "size_garbage": 0}
+        assert inspection["commit_graph"] == {"present": False, "reason": "no commit-graph"}
+        assert inspection["multi_pack_index"] is False
+        assert inspection["index"] == {"present": True, "version": 2, "entries": 0, "untracked_cache": False}
+        assert inspection["shallow"] is False
+        assert inspection["config"] == {"core.commitgraph": None, "core.untrackedcache": "false",
+                                        "feature.manyfiles": None, "fetch.writecommitgraph": "", "index.version": None}
+    
+    @pytest.mark.unit
+    def test_tuned(self, tmp_path, monkeypatch):
+        path = tmp_path / "repo"
+        make_repository(path)
+        write_index(path, version=4, untracked_cache=True)
+        (path / ".git" / "objects" / "pack" / "multi-pack-index").write_bytes(b"MIDX")
+        monkeypatch.setattr(tuning.commitgraph, "load", lambda repository: FakeGraph(True, True))
+        FakeGit(monkeypatch)
+        inspection = tuning.inspect(str(path))
+        assert inspection["commit_graph"] == {"present": True, "layers": 2, "commits": 7, "bloom_filters": True}
+        assert inspection["multi_pack_index"] is True
+        assert inspection["index"] == {"present": True, "version": 4, "entries": 0, "untracked_cache": True}
+    
+    @pytest.mark.unit
+    def test_bare_and_missing_index(self, tmp_path, monkeypatch):
+        FakeGit(monkeypatch)
+        assert tuning.inspect(make_repository(tmp_path / "bare.git", bare=True))["index"] is None
+        assert tuning.inspect(make_repository(tmp_path / "empty"))["index"] == {"present": False,
+                                                                                 "reason": "no index"}
+    
+    @pytest.mark.unit
+    def test_not_a_repository(self, tmp_path):
+        with pytest.raises(tuning.TuneError, match="not a repository"):
+            tuning.inspect(str(tmp_path))
+    
+    @pytest.mark.unit
+    def test_count_objects_failure(self, repo, monkeypatch):
+        FakeGit(monkeypatch, fail={"count-objects"})
+        with pytest.raises(tuning.TuneError, match="fatal: count-objects failed"):
+            tuning.inspect(repo)
+
+
+class TestPlan:
+    """Test turning an inspection into maintenance steps"""
+    
+    def inspection(self, loose=0, packs=1, midx=False, graph=None, index=None, shallow=False, config=None):
+        return {"objects": {"count": loose, "packs": packs}, "multi_pack_index": midx,
+                "commit_graph": graph or {"present": False, "reason": "no commit-graph"},
+                "index": {"present": True, "version": 2, "entries": 10, "untracked_cache": False} if index is None
+                else index, "shallow": shallow, "config": config or {}}
+    
+    @pytest.mark.unit
+    def test_untuned_repository(self):
+        steps = tuning.plan(self.inspection())
+        assert [step["commands"] for step in steps] == [
+            [["config", "core.commitgraph", "true"]],
+            [["config", "core.untrackedcache", "true"]],
+            [["config", "fetch.writecommitgraph", "true"]],
+            [["update-index", "--untracked-cache"]],
+            [["commit-graph", "write", "--no-progress", "--split", "--reachable", "--changed-paths"]]]
+        assert steps[0]["reason"] == "core.commitgraph is unset"
+        assert steps[-1]["reason"] == "no commit-graph"
+    
+    @pytest.mark.unit
+    def test_tuned_repository_keeps_graph_current(self):
+        config = {"core.commitgraph": "TRUE", "core.untrackedcache": "true", "fetch.writecommitgraph": "true"}
+        index = {"present": True, "version": 2, "entries": 10, "untracked_cache": True}
+        graph = {"present": True, "layers": 1, "commits": 3, "bloom_filters": True}
+        steps = tuning.plan(self.inspection(graph=graph, index=index, config=config))
+        assert [(step["step"], step["reason"]) for step in steps] == [("commit_graph", "keep it current")]
+        graph["bloom_filters"] = False
+        assert tuning.plan(self.inspection(graph=graph, index=index, config=config))[0]["reason"] == (
+            "no changed-path Bloom filters")
+    
+    @pytest.mark.unit
+    def test_many_files(self):
+        index = {"present": True, "version": 3, "entries": tuning.MANY_FILES, "untracked_cache": True}
+        steps = tuning.plan(self.inspection(index=index, config={"index.version": "3"}))
+        assert [step["commands"][0][1] for step in steps if step["step"] == "config"] == [
+            "core.commitgraph", "core.untrackedcache", "feature.manyfiles", "fetch.writecommitgraph", "index.version"]
+        assert steps[1]["reason"] == "core.untrackedcache is unset"
+        assert steps[4]["reason"] == "index.version is 3"
+        assert steps[5] == {"step": "index_version", "commands": [["update-index", "--index-version", "4"]],
+                            "reason": f"{tuning.MANY_FILES} entries in a version 3 index"}
+    
+    @pytest.mark.unit
+    def test_bare_shallow_repository(self):
+        inspection = self.inspection(shallow=True)
+        inspection["index"] = None
+        steps = tuning.plan(inspection)
+        assert [step["commands"][0][1] for step in steps] == ["core.commitgraph", "fetch.writecommitgraph"]
+    
+    @pytest.mark.unit
+    def test_unreadable_index_keeps_settings(self):
+        steps = tuning.plan(self.inspection(index={"present": False, "reason": "no index"}))
+        assert "untracked_cache" not in [step["step"] for step in steps]
+        assert ["config", "core.untrackedcache", "true"] in [step["commands"][0] for step in steps]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("loose,packs,midx,expected", [
+        (tuning.LOOSE_OBJECTS_LIMIT - 1, 1, False, []),
+        (tuning.LOOSE_OBJECTS_LIMIT, 1, False, [("loose_objects", "100 loose objects"), ("multi_pack_index", "2 packs")]),
+        (0, 1, True, [("multi_pack_index", "keep it current")]),
+        (0, tuning.PACK_LIMIT, False, [("multi_pack_index", "10 packs")]),
+        (tuning.LOOSE_OBJECTS_LIMIT, tuning.PACK_LIMIT, True,
+         [("loose_objects", "100 loose objects"), ("incremental_repack", "11 packs")]),
+    ])
+    def test_objects(self, loose, packs, midx, expected):
+        steps = tuning.plan(self.inspection(loose=loose, packs=packs, midx=midx, shallow=True))
+        assert [(step["step"], step["reason"]) for step in steps if step["step"] not in (
+            "config", "untracked_cache")] == expected
+    
+    @pytest.mark.unit
+    def test_incremental_repack_commands(self):
+        steps = tuning.plan(self.inspection(packs=tuning.PACK_LIMIT + 1, shallow=True))
+        assert steps[-1]["commands"] == [["multi-pack-index", "write", "--no-progress"],
+                                         ["multi-pack-index", "repack", "--no-progress", "--batch-size=0"],
+                                         ["multi-pack-index", "expire", "--no-progress"]]
+
+
+class TestTune:
+    """Test applying the plan under the repository lock and measuring commands around it"""
+    
+    @pytest.mark.unit
+    def test_dry_run(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        report = tuning.tune(repo, dry_run=True)
+        assert set(report) == {"before", "steps"}
+        assert "seconds" not in report["steps"][0]
+        assert git.commands() == []
+    
+    @pytest.mark.unit
+    def test_applies_steps_and_measures(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch, loose=tuning.LOOSE_OBJECTS_LIMIT)
+        held = []
+        original = locking.hold
+    
+        def hold(kind, cwd, timeout=None):
+            held.append(kind)
+            return original(kind, cwd, timeout)
+        monkeypatch.setattr(tuning.locking, "hold", hold)
+        report = tuning.tune(repo, runs=2)
+        assert steps_of(report) == ["config", "config", "config", "untracked_cache", "loose_objects",
+                                    "multi_pack_index", "commit_graph"]
+        assert all(step["seconds"] >= 0 for step in report["steps"])
+        assert held == [locking.READ, locking.WRITE, locking.READ]
+        measured = ["status --porcelain", "log --format=%H -- src/b.py", "rev-list --count HEAD"]
+        commands = git.commands()
+        # A warm-up and two timed runs of each command, before and after
+        assert sorted(commands[:9]) == sorted(measured * 3)
+        assert commands[9:17] == ["config core.commitgraph true", "config core.untrackedcache true",
+                                  "config fetch.writecommitgraph true", "update-index --untracked-cache",
+                                  "repack -d -l -q", "multi-pack-index write --no-progress",
+                                  "commit-graph write --no-progress --split --reachable --changed-paths",
+                                  "status --porcelain"]
+        assert sorted(commands[17:]) == sorted(measured * 3)
+        assert set(report["measurements"]) == {"status", "log_path", "rev_list_count"}
+        assert set(report["measurements"]["status"]) == {"before", "after"}
+        assert report["after"]["objects"]["count"] == tuning.LOOSE_OBJECTS_LIMIT
+    
+    @pytest.mark.unit
+    def test_without_measurements(self, tmp_path, monkeypatch):
+        git = FakeGit(monkeypatch)
+        path = tmp_path / "repo"
+        repo = make_repository(path)
+        write_index(path, untracked_cache=True)
+        report = tuning.tune(repo, runs=0)
+        assert "measurements" not in report
+        assert "status --porcelain" not in git.commands()
+    
+    @pytest.mark.unit
+    def test_given_path_and_bare_repository(self, tmp_path, monkeypatch):
+        git = FakeGit(monkeypatch)
+        bare = make_repository(tmp_path / "bare.git", bare=True)
+        report = tuning.tune(bare, runs=1, path="docs/guide.md")
+        assert set(report["measurements"]) == {"log_path", "rev_list_count"}
+        assert "log --format=%H -- docs/guide.md" in git.commands()
+        git.calls.clear()
+        assert set(tuning.measure(bare, runs=1)) == {"rev_list_count"}
+    
+    @pytest.mark.unit
+    def test_empty_worktree_skips_log(self, repo, monkeypatch):
+        FakeGit(monkeypatch, files="")
+        assert set(tuning.measure(repo, runs=1)) == {"status", "rev_list_count"}
+    
+    @pytest.mark.unit
+    def test_failed_step(self, repo, monkeypatch):
+        FakeGit(monkeypatch, fail={"commit-graph"})
+        with pytest.raises(tuning.TuneError, match="fatal: commit-graph failed"):
+            tuning.tune(repo, runs=0)
+    
+    @pytest.mark.unit
+    def test_failure_without_stderr(self, repo, monkeypatch):
+        monkeypatch.setattr(tuning.process, "run_process",
+                            lambda cmd_args, timeout=30, cwd=None, timer=None: completed(cmd_args, 1, "", ""))
+        with pytest.raises(tuning.TuneError, match="git count-objects exited with 1"):
+            tuning.tune(repo)
+
+
+class TestManage:
+    """Test the tune command of the plugin CLI"""
+    
+    @pytest.mark.unit
+    def test_success(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        result = tuning.manage({"dry_run": True}, cwd=repo)
+        assert result["success"] is True
+        assert result["elapsed"] >= 0
+        assert "commit_graph" in steps_of(result)
+    
+    @pytest.mark.unit
+    def test_failure(self, tmp_path):
+        result = tuning.manage({"runs": "0"}, cwd=str(tmp_path))
+        assert result == {"success": False, "error": f"not a repository that can be tuned: {tmp_path}",
+                          "error_code": "TUNE_FAILED"}
+    
+    @pytest.mark.unit
+    def test_lock_timeout(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        monkeypatch.setenv(locking.LOCK_TIMEOUT_ENV, "0")
+        lock = locking.repository_lock(repo_module.discover(repo).common_dir)
+        descriptor = lock.acquire(False, 1)
+        try:
+            result = tuning.manage({"runs": 0}, cwd=repo)
+        finally:
+            lock.release(False, descriptor)
+        assert result["success"] is False and result["error_code"] == "TUNE_FAILED"
+    
+    @pytest.mark.unit
+    def test_describe(self):
+        command = [c for c in cli.describe()["commands"] if c["name"] == "tune"][0]
+        assert [p["name"] for p in command["parameters"]] == ["dry_run", "runs", "path"]
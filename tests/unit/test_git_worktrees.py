@@ -0,0 +1,331 @@
+"""
+Unit tests for the git plugin's worktree pool
+"""
+import fcntl
+import json
+import os
+import shutil
+import time
+import pytest
+
+from plugins.git import cli, locking, parallelism, worktrees
+from plugins.git import repo as repo_module
+from tests.conftest import completed, make_repository
+
+OID = "a" * 40
+
+
+class FakeGit:
+    """Stands in for the git commands the pool runs; worktree add and remove create and delete directories"""
+    
+    def __init__(self, monkeypatch, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+        monkeypatch.setattr(worktrees.process, "run_process", self.run_process)
+    
+    def run_process(self, cmd_args, timeout=30, cwd=None, timer=None):
+        self.calls.append((cmd_args[1:], cwd))
+        command = cmd_args[1] if cmd_args[1] != "worktree" else " ".join(cmd_args[1:3])
+        if command in self.fail:
+            return completed(cmd_args, 1, "", "")
+        if command == "rev-parse":
+            if cmd_args[-1].startswith("missing"):
+                return completed(cmd_args, 128, "", "fatal: Needed a single revision\n")
+            return completed(cmd_args, 0, OID + "\n", "")
+        if command == "worktree add":
+            # A linked worktree: a .git file pointing at its administrative directory
+            path = cmd_args[-2]
+            admin = os.path.join(os.path.dirname(os.path.dirname(path)), "worktrees", os.path.basename(path))
+            os.makedirs(admin)
+            os.makedirs(path)
+            with open(os.path.join(admin, "HEAD"), "w") as f:
+                f.write(OID + "\n")
+            with open(os.path.join(admin, "commondir"), "w") as f:
+                f.write("../..\n")
+            with open(os.path.join(path, ".git"), "w") as f:
+                f.write(f"gitdir: {admin}\n")
+        elif command == "worktree remove":
+            shutil.rmtree(cmd_args[-1])
+            shutil.rmtree(os.path.join(os.path.dirname(os.path.dirname(cmd_args[-1])), "worktrees",
+                                       os.path.basename(cmd_args[-1])))
+        return completed(cmd_args, 0, "ran\n", "")
+    
+    def commands(self):
+        return [args[:2] if args[0] == "worktree" else args[:1] for args, _ in self.calls]
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    """Discovery refuses to run when git environment overrides are present"""
+    for name in repo_module._DISCOVERY_ENV:
+        monkeypatch.delenv(name, raising=False)
+    for name in (worktrees.POOL_SIZE_ENV, worktrees.IDLE_SECONDS_ENV, worktrees.LEASE_TIMEOUT_ENV):
+        monkeypatch.delenv(name, raising=False)
+    # Command lines are compared as given, without the parallelism settings
+    monkeypatch.setenv(parallelism.JOBS_ENV, "0")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return make_repository(tmp_path / "repo")
+
+
+def hold_lease(pool, slot, record=""):
+    """Lease a slot the way another process would"""
+    fd = os.open(pool._lease_file(slot), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    os.write(fd, record.encode())
+    return fd
+
+
+class TestPool:
+    """Test leasing, resetting and pruning pooled worktrees"""
+    
+    @pytest.mark.unit
+    def test_settings(self, repo, monkeypatch):
+        pool = worktrees.WorktreePool(repo)
+        assert pool.size == worktrees.DEFAULT_POOL_SIZE
+        assert pool.root == os.path.join(repo, ".git", worktrees.POOL_NAME)
+        monkeypatch.setenv(worktrees.POOL_SIZE_ENV, "2")
+        assert worktrees.WorktreePool(repo).size == 2
+        monkeypatch.setenv(worktrees.POOL_SIZE_ENV, "many")
+        assert worktrees.WorktreePool(repo).size == worktrees.DEFAULT_POOL_SIZE
+        assert worktrees.WorktreePool(repo, size=7).size == 7
+    
+    @pytest.mark.unit
+    def test_not_a_repository(self, tmp_path):
+        with pytest.raises(worktrees.WorktreeError, match="not a repository"):
+            worktrees.WorktreePool(str(tmp_path))
+    
+    @pytest.mark.unit
+    def test_lease_adds_then_reuses_worktree(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo)
+        lease = pool.lease("main")
+        assert lease.as_dict() == {"path": pool.path(0), "slot": 0, "revision": OID, "recovered": False}
+        assert os.path.isdir(lease.path)
+        assert json.loads(open(pool._lease_file(0)).read())["pid"] == os.getpid()
+        assert git.calls[0] == (["rev-parse", "--verify", "main^{commit}"], repo)
+        assert git.calls[2] == (["worktree", "add", "-q", "--detach", "--force", pool.path(0), OID], repo)
+        git.calls.clear()
+        assert pool.release(lease) is True
+        assert os.path.getsize(pool._lease_file(0)) == 0
+        assert git.calls == [(["checkout", "-q", "--detach", "--force"], lease.path),
+                             (["reset", "-q", "--hard"], lease.path), (["clean", "-q", "-f", "-d"], lease.path)]
+        git.calls.clear()
+        again = pool.lease()
+        assert again.slot == 0
+        assert git.calls[1] == (["checkout", "-q", "--detach", "--force", OID], again.path)
+        pool.release(again)
+    
+    @pytest.mark.unit
+    def test_concurrent_leases_get_their_own_worktree(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=2)
+        first, second = pool.lease(), pool.lease()
+        assert (first.slot, second.slot) == (0, 1)
+        with pytest.raises(worktrees.LeaseTimeout, match="all 2 pooled worktrees"):
+            pool.lease(timeout=0.01)
+        pool.release(second)
+        # Existing worktrees are preferred over adding one for a free slot
+        pool.release(first)
+        shutil.rmtree(pool.path(0))
+        assert pool.lease().slot == 1
+    
+    @pytest.mark.unit
+    def test_lease_waits_for_release(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=1, timeout=0.01)
+        lease = pool.lease()
+        start = time.monotonic()
+        with pytest.raises(worktrees.LeaseTimeout, match="0.01 seconds"):
+            pool.lease()
+        assert time.monotonic() - start >= 0.01
+        pool.release(lease)
+    
+    @pytest.mark.unit
+    def test_recovers_after_crashed_holder(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=1)
+        pool.release(pool.lease())
+        fd = hold_lease(pool, 0, '{"pid": 1}')
+        os.close(fd)  # The holder died: its lock is gone, its record is not
+        git.calls.clear()
+        lease = pool.lease()
+        assert lease.recovered is True
+        assert git.commands()[1:5] == [["checkout"], ["reset"], ["clean"], ["checkout"]]
+        pool.release(lease)
+    
+    @pytest.mark.unit
+    def test_failed_reset_keeps_record(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=1)
+        lease = pool.lease()
+        git.fail.add("clean")
+        assert pool.release(lease) is False
+        assert os.path.getsize(pool._lease_file(0)) > 0
+        git.fail.clear()
+        assert pool.lease().recovered is True
+    
+    @pytest.mark.unit
+    def test_failed_checkout_frees_slot(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=1)
+        pool.release(pool.lease())
+        git.fail.add("checkout")
+        with pytest.raises(worktrees.WorktreeError, match="git checkout -q exited with 1"):
+            pool.lease()
+        git.fail.clear()
+        assert pool.lease().slot == 0
+    
+    @pytest.mark.unit
+    def test_unknown_revision(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        with pytest.raises(worktrees.WorktreeError, match="Needed a single revision"):
+            worktrees.WorktreePool(repo).lease("missing")
+    
+    @pytest.mark.unit
+    def test_warm(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=3)
+        assert pool.warm(1) == [pool.path(0)]
+        fd = hold_lease(pool, 1)
+        assert pool.warm() == [pool.path(2)]
+        os.close(fd)
+        assert pool.warm(10) == [pool.path(1)]
+        assert pool.warm() == []
+        assert git.commands().count(["worktree", "add"]) == 3
+    
+    @pytest.mark.unit
+    def test_prune(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=3)
+        assert pool.prune(0) == []
+        pool.warm()
+        assert pool.prune() == []  # Not idle for an hour yet
+        open(os.path.join(pool.root, "wtx.lease"), "w").close()
+        fd = hold_lease(pool, 1)
+        git.fail.add("worktree remove")
+        assert pool.prune(0) == []
+        git.fail.clear()
+        assert pool.prune(0) == [pool.path(0), pool.path(2)]
+        os.close(fd)
+        assert worktrees.WorktreePool(repo, size=2).prune(3600) == []
+        assert worktrees.WorktreePool(repo, size=0).prune(3600) == [pool.path(1)]
+    
+    @pytest.mark.unit
+    def test_prune_idle_from_environment(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=1)
+        pool.warm()
+        monkeypatch.setenv(worktrees.IDLE_SECONDS_ENV, "0")
+        assert pool.prune() == [pool.path(0)]
+    
+    @pytest.mark.unit
+    def test_status(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        pool = worktrees.WorktreePool(repo, size=3)
+        pool.warm()
+        lease = pool.lease()
+        fd = hold_lease(pool, 1)
+        assert pool.status() == [
+            {"slot": 0, "path": pool.path(0), "leased": True,
+             "lease": json.loads(open(pool._lease_file(0)).read())},
+            {"slot": 1, "path": pool.path(1), "leased": True},
+            {"slot": 2, "path": pool.path(2), "leased": False},
+        ]
+        os.close(fd)
+        pool.release(lease)
+    
+    @pytest.mark.unit
+    def test_acquire_and_release(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        lease = worktrees.acquire(True, repo)
+        assert git.calls[0][0][-1] == "HEAD^{commit}"
+        monkeypatch.setenv(worktrees.IDLE_SECONDS_ENV, "0")
+        assert lease.release() is True
+        assert not os.path.isdir(lease.path)  # Pruned once idle
+    
+    @pytest.mark.unit
+    def test_release_survives_prune_errors(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        lease = worktrees.acquire("v1", repo, timeout=1)
+    
+        def broken(idle_seconds=None):
+            raise PermissionError("read-only")
+        monkeypatch.setattr(lease.pool, "prune", broken)
+        assert lease.release() is True
+
+
+class TestManage:
+    """Test the worktrees command"""
+    
+    @pytest.mark.unit
+    def test_warm_prune_and_list(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        response = worktrees.manage({"warm": True, "size": 2}, cwd=repo)
+        assert response["success"] is True
+        assert response["size"] == 2
+        assert len(response["created"]) == 2
+        assert [entry["leased"] for entry in response["result"]] == [False, False]
+        response = worktrees.manage({"prune": 0, "warm": False}, cwd=repo)
+        assert len(response["removed"]) == 2 and response["result"] == []
+        assert worktrees.manage({"warm": 1, "prune": True}, cwd=repo)["removed"] == []
+        assert "created" not in worktrees.manage({}, cwd=repo)
+    
+    @pytest.mark.unit
+    def test_failure(self, tmp_path):
+        response = worktrees.manage({}, cwd=str(tmp_path))
+        assert response["success"] is False
+        assert response["error_code"] == "WORKTREE_FAILED"
+
+
+class TestCliWorktree:
+    """Test the worktree option of run()"""
+    
+    @pytest.mark.unit
+    def test_runs_in_leased_worktree(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        result = cli.run({"command": "checkout", "args": ["feature"], "worktree": "main"}, cwd=repo)
+        assert result["success"] is True
+        path = os.path.join(repo, ".git", worktrees.POOL_NAME, "wt0")
+        assert result["worktree"] == {"path": path, "slot": 0, "revision": OID, "recovered": False}
+        assert result["lock"] == "read"  # A checkout only changes the leased worktree
+        assert result["timings"]["lease_ns"] >= 0
+        assert (["checkout", "feature"], path) in git.calls
+        assert git.commands()[-3:] == [["checkout"], ["reset"], ["clean"]]
+        assert os.path.getsize(path + ".lease") == 0
+    
+    @pytest.mark.unit
+    def test_dry_run_does_not_lease(self, repo, monkeypatch):
+        git = FakeGit(monkeypatch)
+        result = cli.run({"command": "status", "worktree": True}, dry_run=True, cwd=repo)
+        assert result["cwd"] == repo
+        assert git.calls == []
+    
+    @pytest.mark.unit
+    def test_lease_timeout(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        monkeypatch.setenv(worktrees.POOL_SIZE_ENV, "0")
+        monkeypatch.setenv(worktrees.LEASE_TIMEOUT_ENV, "0.01")
+        result = cli.run({"command": "status", "worktree": True}, cwd=repo)
+        assert result["error_code"] == "LEASE_TIMEOUT"
+        assert worktrees.POOL_SIZE_ENV in result["suggestion"]
+    
+    @pytest.mark.unit
+    def test_worktree_failure(self, repo, monkeypatch):
+        FakeGit(monkeypatch)
+        result = cli.run({"command": "status", "worktree": "missing"}, cwd=repo)
+        assert result["success"] is False
+        assert result["error_code"] == "WORKTREE_FAILED"
+        assert "Needed a single revision" in result["error"]
+        assert result["command"] == "git status"
+    
+    @pytest.mark.unit
+    def test_private_worktree_classification(self):
+        assert locking.classify(["git", "checkout", "main"], private_worktree=True) == locking.READ
+        assert locking.classify(["git", "reset", "--hard"], private_worktree=True) == locking.READ
+        assert locking.classify(["git", "checkout", "-b", "new"], private_worktree=True) == locking.WRITE
+        assert locking.classify(["git", "switch", "--create=new"], private_worktree=True) == locking.WRITE
+        assert locking.classify(["git", "commit", "-m", "x"], private_worktree=True) == locking.WRITE
+        assert locking.classify(["git", "checkout", "main"]) == locking.WRITE
@@ -0,0 +1,215 @@
+"""
+Unit tests for the shared metrics registry and Prometheus exporter
+"""
+import json
+import os
+import pytest
+
+from plugins import metrics
+
+
+def _response(**overrides):
+    response = {
+        "command": "git log --oneline -5",
+        "return_code": 0,
+        "success": True,
+        "stdout": "abc123 commit\n",
+        "timings": {"total_ns": 20_000_000},
+    }
+    response.update(overrides)
+    return response
+
+
+class TestSubcommandOf:
+    """Test subcommand label extraction"""
+    
+    @pytest.mark.unit
+    def test_git_subcommand(self):
+        assert metrics.subcommand_of("git", "git log --oneline") == "log"
+        assert metrics.subcommand_of("git", "git --no-pager diff") == "diff"
+    
+    @pytest.mark.unit
+    def test_gh_subcommand_uses_two_words(self):
+        assert metrics.subcommand_of("gh", "gh repo list --limit 5") == "repo list"
+    
+    @pytest.mark.unit
+    def test_missing_subcommand(self):
+        assert metrics.subcommand_of("git", "git") == "none"
+        assert metrics.subcommand_of("git", "git --version") == "none"
+
+
+class TestRecordResponse:
+    """Test recording run() responses"""
+    
+    @pytest.mark.unit
+    def test_record_success(self):
+        registry = metrics.MetricsRegistry()
+        metrics.record_response("git", _response(), registry)
+        labels = ("git", "log", "none", "false", "false")
+        assert registry.counters[("smcp_plugin_calls_total", labels)] == 1
+        assert registry.counters[("smcp_plugin_bytes_in_total", ("git", "log"))] == len("git log --oneline -5")
+        assert registry.counters[("smcp_plugin_bytes_out_total", ("git", "log"))] == len("abc123 commit\n")
+        series = registry.histograms[("smcp_plugin_call_duration_seconds", labels)]
+        assert series[-1] == 1
+        assert series[-2] == pytest.approx(0.02)
+    
+    @pytest.mark.unit
+    def test_record_non_ascii_output_counts_bytes(self):
+        registry = metrics.MetricsRegistry()
+        metrics.record_response("git", _response(stdout="é", stderr="warn"), registry)
+        assert registry.counters[("smcp_plugin_bytes_out_total", ("git", "log"))] == 2 + 4
+    
+    @pytest.mark.unit
+    def test_record_streamed_output_counts_bytes(self):
+        registry = metrics.MetricsRegistry()
+        metrics.record_response("git", _response(stdout=None, stdout_bytes=4096, stderr="warn"), registry)
+        assert registry.counters[("smcp_plugin_bytes_out_total", ("git", "log"))] == 4096 + 4
+    
+    @pytest.mark.unit
+    def test_record_timeout_and_flags(self):
+        registry = metrics.MetricsRegistry()
+        metrics.record_response("git", _response(error_code="TIMEOUT", idempotent=True, cached=True, stdout=None), registry)
+        assert registry.counters[("smcp_plugin_timeouts_total", ("git", "log"))] == 1
+        assert ("smcp_plugin_calls_total", ("git", "log", "TIMEOUT", "true", "true")) in registry.counters
+    
+    @pytest.mark.unit
+    def test_record_without_timings(self):
+        registry = metrics.MetricsRegistry()
+        metrics.record_response("git", {"success": False, "error_code": "INVALID_CWD"}, registry)
+        assert ("smcp_plugin_calls_total", ("git", "none", "INVALID_CWD", "false", "false")) in registry.counters
+        assert not registry.histograms
+    
+    @pytest.mark.unit
+    def test_record_resources(self):
+        registry = metrics.MetricsRegistry()
+        resources = {
+            "user_cpu_s": 0.25, "system_cpu_s": 0.5, "max_rss_bytes": 4096,
+            "block_input_ops": 3, "block_output_ops": 4,
+            "voluntary_ctx_switches": 5, "involuntary_ctx_switches": 6
+        }
+        metrics.record_response("git", _response(resources=resources), registry)
+        metrics.record_response("git", _response(resources=dict(resources, max_rss_bytes=1024)), registry)
+        key = ("git", "log")
+        assert registry.counters[("smcp_plugin_child_cpu_seconds_total", key + ("user",))] == 0.5
+        assert registry.counters[("smcp_plugin_child_cpu_seconds_total", key + ("system",))] == 1.0
+        assert registry.counters[("smcp_plugin_child_block_ops_total", key + ("in",))] == 6
+        assert registry.counters[("smcp_plugin_child_block_ops_total", key + ("out",))] == 8
+        assert registry.counters[("smcp_plugin_child_context_switches_total", key + ("voluntary",))] == 10
+        assert registry.counters[("smcp_plugin_child_context_switches_total", key + ("involuntary",))] == 12
+        assert registry.gauges[("smcp_plugin_child_max_rss_bytes", key)] == 4096
+    
+    @pytest.mark.unit
+    def test_record_uses_global_registry(self):
+        metrics.REGISTRY.clear()
+        metrics.record_response("gh", _response(command="gh repo list"))
+        assert ("smcp_plugin_calls_total", ("gh", "repo list", "none", "false", "false")) in metrics.REGISTRY.counters
+        metrics.REGISTRY.clear()
+
+
+class TestRender:
+    """Test Prometheus text rendering"""
+    
+    @pytest.mark.unit
+    def test_render_empty(self):
+        assert metrics.MetricsRegistry().render() == ""
+    
+    @pytest.mark.unit
+    def test_render_counters_histograms_and_gauges(self):
+        registry = metrics.MetricsRegistry()
+        metrics.record_response("git", _response(resources={"max_rss_bytes": 2048}), registry)
+        text = registry.render()
+        assert "# TYPE smcp_plugin_calls_total counter" in text
+        assert 'smcp_plugin_calls_total{tool="git",subcommand="log",error_code="none",idempotent="false",cached="false"} 1' in text
+        assert "# TYPE smcp_plugin_call_duration_seconds histogram" in text
+        assert 'le="0.01"} 0' in text
+        assert 'le="0.025"} 1' in text
+        assert 'le="+Inf"} 1' in text
+        assert "smcp_plugin_call_duration_seconds_sum" in text
+        assert "smcp_plugin_call_duration_seconds_count" in text
+        assert 'smcp_plugin_child_max_rss_bytes{tool="git",subcommand="log"} 2048' in text
+        assert text.endswith("\n")
+    
+    @pytest.mark.unit
+    def test_render_escapes_label_values(self):
+        registry = metrics.MetricsRegistry()
+        registry.inc("smcp_plugin_timeouts_total", ("git", 'we"ird\\\n'))
+        assert 'subcommand="we\\"ird\\\\\\n"' in registry.render()
+
+
+class TestPersistence:
+    """Test the state file merge and export"""
+    
+    @pytest.mark.unit
+    def test_flush_without_state_file(self, monkeypatch):
+        monkeypatch.delenv(metrics.METRICS_FILE_ENV, raising=False)
+        registry = metrics.MetricsRegistry()
+        registry.inc("smcp_plugin_timeouts_total", ("git", "fetch"))
+        assert metrics.flush(registry=registry) is False
+        assert registry.counters
+    
+    @pytest.mark.unit
+    def test_flush_merges_across_processes(self, tmp_path, monkeypatch):
+        state = tmp_path / "metrics.json"
+        monkeypatch.setenv(metrics.METRICS_FILE_ENV, str(state))
+        for _ in range(2):
+            registry = metrics.MetricsRegistry()
+            metrics.record_response("git", _response(resources={"max_rss_bytes": 10}), registry)
+            assert metrics.flush(registry=registry) is True
+            assert not registry.counters
+        combined = metrics.load(registry=metrics.MetricsRegistry())
+        labels = ("git", "log", "none", "false", "false")
+        assert combined.counters[("smcp_plugin_calls_total", labels)] == 2
+        assert combined.histograms[("smcp_plugin_call_duration_seconds", labels)][-1] == 2
+        assert combined.gauges[("smcp_plugin_child_max_rss_bytes", ("git", "log"))] == 10
+    
+    @pytest.mark.unit
+    def test_flush_and_load_without_fcntl(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(metrics, "fcntl", None)
+        state = tmp_path / "metrics.json"
+        registry = metrics.MetricsRegistry()
+        registry.inc("smcp_plugin_timeouts_total", ("git", "fetch"))
+        assert metrics.flush(str(state), registry) is True
+        combined = metrics.load(str(state), metrics.MetricsRegistry())
+        assert combined.counters[("smcp_plugin_timeouts_total", ("git", "fetch"))] == 1
+    
+    @pytest.mark.unit
+    def test_corrupt_state_file_starts_over(self, tmp_path):
+        state = tmp_path / "metrics.json"
+        state.write_text("{not json")
+        registry = metrics.MetricsRegistry()
+        registry.inc("smcp_plugin_timeouts_total", ("git", "fetch"))
+        metrics.flush(str(state), registry)
+        assert json.loads(state.read_text())["counters"] == [["smcp_plugin_timeouts_total", ["git", "fetch"], 1]]
+    
+    @pytest.mark.unit
+    def test_merge_mismatched_histogram_layout(self):
+        registry = metrics.MetricsRegistry()
+        registry.observe("smcp_plugin_call_duration_seconds", ("git",), 0.5)
+        registry.merge({"histograms": [["smcp_plugin_call_duration_seconds", ["git"], [1, 2, 3]]]})
+        assert registry.histograms[("smcp_plugin_call_duration_seconds", ("git",))] == [1, 2, 3]
+    
+    @pytest.mark.unit
+    def test_load_missing_state_file(self, tmp_path):
+        combined = metrics.load(str(tmp_path / "missing.json"), metrics.MetricsRegistry())
+        assert combined.render() == ""
+    
+    @pytest.mark.unit
+    def test_export_writes_textfile(self, tmp_path, monkeypatch):
+        monkeypatch.delenv(metrics.METRICS_FILE_ENV, raising=False)
+        metrics.REGISTRY.clear()
+        metrics.record_response("git", _response())
+        output = tmp_path / "plugins.prom"
+        result = metrics.export(output=str(output))
+        metrics.REGISTRY.clear()
+        assert result["success"] is True
+        assert result["format"] == "prometheus"
+        assert result["output"] == str(output)
+        assert output.read_text() == result["result"]
+        assert "smcp_plugin_calls_total" in result["result"]
+        assert not [name for name in os.listdir(tmp_path) if name.startswith(".metrics_")]
+    
+    @pytest.mark.unit
+    def test_export_without_output(self, monkeypatch):
+        monkeypatch.delenv(metrics.METRICS_FILE_ENV, raising=False)
+        result = metrics.export()
+        assert "output" not in result
@@ -0,0 +1,330 @@
+"""
+Unit tests for the local mirror cache clones borrow objects from
+"""
+import fcntl
+import os
+import threading
+import time
+import pytest
+
+from plugins import mirrors
+from plugins.gh import cli as gh_cli
+from plugins.git import cli as git_cli
+from plugins.git import parallelism
+from tests.conftest import completed
+
+URL = "https://example.com/org/project.git"
+
+
+class FakeGit:
+    """Stands in for git and gh; clone --mirror creates the mirror directory and records its URL"""
+    
+    def __init__(self, monkeypatch, fail=(), stderr=""):
+        self.calls = []
+        self.fail = set(fail)
+        self.stderr = stderr
+        monkeypatch.setattr(mirrors.process, "run_process", self.run_process)
+    
+    def run_process(self, cmd_args, timeout=30, cwd=None, timer=None):
+        self.calls.append(cmd_args)
+        if "--mirror" in cmd_args:
+            if "clone" in self.fail:
+                return completed(cmd_args, 128, "", self.stderr)
+            os.makedirs(cmd_args[-1])
+            with open(os.path.join(cmd_args[-1], "url"), "w") as f:
+                f.write(cmd_args[-2])
+        elif "fetch" in cmd_args and "fetch" in self.fail:
+            return completed(cmd_args, 1, "", self.stderr)
+        elif "config" in cmd_args:
+            url_file = os.path.join(cmd_args[2], "url")
+            if not os.path.exists(url_file):
+                return completed(cmd_args, 1, "", "")
+            with open(url_file) as f:
+                return completed(cmd_args, 0, f.read() + "\n", "")
+        return completed(cmd_args, 0, "", "")
+
+
+@pytest.fixture(autouse=True)
+def mirror_dir(tmp_path, monkeypatch):
+    root = tmp_path / "mirrors"
+    monkeypatch.setenv(mirrors.MIRROR_DIR_ENV, str(root))
+    monkeypatch.delenv(mirrors.REFRESH_SECONDS_ENV, raising=False)
+    monkeypatch.delenv("GH_HOST", raising=False)
+    # Clone command lines are compared as given, without the parallelism settings
+    monkeypatch.setenv(parallelism.JOBS_ENV, "0")
+    return root
+
+
+def make_stale(path):
+    stamp = os.path.join(path, mirrors.STAMP_NAME)
+    os.utime(stamp, (time.time() - 3600, time.time() - 3600))
+
+
+def hold_lock(path):
+    """Lock a mirror's lock file on a descriptor of its own, as another process would"""
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+class TestSettings:
+    """Test the cache location and refresh interval settings"""
+    
+    @pytest.mark.unit
+    def test_mirror_root(self, mirror_dir, monkeypatch):
+        assert mirrors.mirror_root() == str(mirror_dir)
+        monkeypatch.delenv(mirrors.MIRROR_DIR_ENV)
+        assert mirrors.mirror_root() == os.path.join(os.path.expanduser("~"), ".cache", "smcp-mirrors")
+    
+    @pytest.mark.unit
+    def test_refresh_seconds(self, monkeypatch):
+        assert mirrors.refresh_seconds() == mirrors.DEFAULT_REFRESH_SECONDS
+        monkeypatch.setenv(mirrors.REFRESH_SECONDS_ENV, "60")
+        assert mirrors.refresh_seconds() == 60.0
+        monkeypatch.setenv(mirrors.REFRESH_SECONDS_ENV, "-5")
+        assert mirrors.refresh_seconds() == 0.0
+        monkeypatch.setenv(mirrors.REFRESH_SECONDS_ENV, "hourly")
+        assert mirrors.refresh_seconds() == mirrors.DEFAULT_REFRESH_SECONDS
+
+
+class TestUrls:
+    """Test recognising remotes and naming their mirrors"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("url,remote", [
+        (URL, True), ("file:///srv/repo.git", True), ("git@github.com:org/project.git", True),
+        ("ssh://git@host/repo", True), ("/srv/repo.git", False), ("../repo", False), ("C:/repo", False),
+    ])
+    def test_is_remote(self, url, remote):
+        assert mirrors.is_remote(url) is remote
+    
+    @pytest.mark.unit
+    def test_mirror_path(self, mirror_dir):
+        path = mirrors.mirror_path(URL)
+        assert os.path.dirname(path) == str(mirror_dir)
+        assert os.path.basename(path).startswith("project-") and path.endswith(".git")
+        assert mirrors.mirror_path("https://example.com/org/project/") == path
+        assert mirrors.mirror_path("https://example.com/other/project.git") != path
+        assert os.path.basename(mirrors.mirror_path("git@host:project.git")).startswith("project-")
+        assert os.path.basename(mirrors.mirror_path("file:///", root="/cache")).startswith("repo-")
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("args,source", [
+        ([URL], URL), (["--depth", "1", "-b", "main", URL, "dest"], URL), (["--bare", "--", URL], URL),
+        (["--"], None), (["--quiet"], None), (["--filter=blob:none", URL], URL),
+    ])
+    def test_clone_source(self, args, source):
+        assert mirrors.clone_source(args) == source
+    
+    @pytest.mark.unit
+    def test_gh_clone_url(self, monkeypatch):
+        assert mirrors.gh_clone_url("org/project") == "https://github.com/org/project.git"
+        assert mirrors.gh_clone_url("ghe.example.com/org/project") == "https://ghe.example.com/org/project.git"
+        assert mirrors.gh_clone_url(URL) == URL
+        assert mirrors.gh_clone_url("project") is None
+        assert mirrors.gh_clone_url("org/") is None
+        monkeypatch.setenv("GH_HOST", "ghe.example.com")
+        assert mirrors.gh_clone_url("org/project") == "https://ghe.example.com/org/project.git"
+
+
+class TestEnsure:
+    """Test creating and refreshing a mirror under its lock"""
+    
+    @pytest.mark.unit
+    def test_created_then_fresh_then_refreshed(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        report = mirrors.ensure(URL)
+        assert report["action"] == "created"
+        assert report["url"] == URL and report["seconds"] >= 0
+        assert os.path.exists(os.path.join(report["path"], mirrors.STAMP_NAME))
+        assert git.calls[0][:4] == ["git", "clone", "--mirror", "--quiet"]
+        assert git.calls[0][-1] == report["path"] + ".partial"
+        assert mirrors.ensure(URL)["action"] == "fresh"
+        assert len(git.calls) == 1
+        assert mirrors.ensure(URL, max_age=0)["action"] == "refreshed"
+        assert git.calls[-1] == ["git", "-C", report["path"], "fetch", "--quiet", "--prune", "origin"]
+    
+    @pytest.mark.unit
+    def test_refresh_interval_from_environment(self, monkeypatch):
+        FakeGit(monkeypatch)
+        path = mirrors.ensure(URL)["path"]
+        make_stale(path)
+        monkeypatch.setenv(mirrors.REFRESH_SECONDS_ENV, "7200")
+        assert mirrors.ensure(URL)["action"] == "fresh"
+        monkeypatch.setenv(mirrors.REFRESH_SECONDS_ENV, "60")
+        assert mirrors.ensure(URL)["action"] == "refreshed"
+    
+    @pytest.mark.unit
+    def test_unstamped_mirror_is_recreated(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        path = mirrors.mirror_path(URL)
+        os.makedirs(os.path.join(path, "objects"))
+        assert mirrors.ensure(URL)["action"] == "created"
+        assert not os.path.exists(os.path.join(path, "objects"))
+        assert len(git.calls) == 1
+    
+    @pytest.mark.unit
+    def test_failed_clone_leaves_nothing(self, monkeypatch):
+        FakeGit(monkeypatch, fail={"clone"}, stderr="fatal: repository not found\n")
+        with pytest.raises(mirrors.MirrorError, match="repository not found"):
+            mirrors.ensure(URL)
+        path = mirrors.mirror_path(URL)
+        assert not os.path.exists(path) and not os.path.exists(path + ".partial")
+    
+    @pytest.mark.unit
+    def test_failure_without_message(self, monkeypatch):
+        FakeGit(monkeypatch, fail={"fetch"})
+        mirrors.ensure(URL)
+        with pytest.raises(mirrors.MirrorError, match="git -C exited with 1"):
+            mirrors.ensure(URL, max_age=0)
+    
+    @pytest.mark.unit
+    def test_stale_mirror_is_used_while_another_refreshes(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        path = mirrors.ensure(URL)["path"]
+        make_stale(path)
+        other = hold_lock(path)
+        try:
+            assert mirrors.ensure(URL)["action"] == "stale"
+        finally:
+            os.close(other)
+        assert len(git.calls) == 1
+    
+    @pytest.mark.unit
+    def test_waits_for_another_creator(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        path = mirrors.mirror_path(URL)
+        os.makedirs(os.path.dirname(path))
+        other = hold_lock(path)
+        reports = []
+        waiter = threading.Thread(target=lambda: reports.append(mirrors.ensure(URL)))
+        waiter.start()
+        time.sleep(0.05)
+        assert not reports
+        # The other process finishes the mirror, then lets go of the lock
+        os.makedirs(path)
+        open(os.path.join(path, mirrors.STAMP_NAME), "w").close()
+        os.close(other)
+        waiter.join()
+        assert reports[0]["action"] == "fresh"
+        assert not git.calls
+
+
+class TestRewriteClone:
+    """Test pointing clone command lines at the mirror of their remote"""
+    
+    @pytest.mark.unit
+    def test_git_clone(self, monkeypatch):
+        FakeGit(monkeypatch)
+        cmd_args, report = mirrors.rewrite_clone(["git", "clone", "--depth", "1", URL, "dest"])
+        assert report["action"] == "created"
+        assert cmd_args == ["git", "clone", "--reference-if-able", report["path"], "--dissociate", "--depth", "1",
+                            URL, "dest"]
+    
+    @pytest.mark.unit
+    def test_gh_repo_clone(self, monkeypatch):
+        git = FakeGit(monkeypatch)
+        cmd_args, report = mirrors.rewrite_clone(["gh", "repo", "clone", "org/project"])
+        assert report["url"] == "https://github.com/org/project.git"
+        assert git.calls[0][-2] == report["url"]
+        assert cmd_args == ["gh", "repo", "clone", "org/project", "--", "--reference-if-able", report["path"],
+                            "--dissociate"]
+        cmd_args, report = mirrors.rewrite_clone(["gh", "repo", "clone", "org/project", "dest", "--", "--depth=1"])
+        assert report["action"] == "fresh"
+        assert cmd_args == ["gh", "repo", "clone", "org/project", "dest", "--", "--reference-if-able",
+                            report["path"], "--dissociate", "--depth=1"]
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("cmd_args,reason", [
+        (["git", "status"], "not a clone"),
+        (["gh", "repo", "clone"], "not a clone"),
+        (["gh", "repo", "view", "org/project"], "not a clone"),
+        (["git", "clone", "/srv/repo.git"], "not a remote repository"),
+        (["git", "clone", "--quiet"], "not a remote repository"),
+        (["gh", "repo", "clone", "project"], "not a remote repository"),
+        (["git", "clone", "--reference=/srv/cache", URL], "already names a reference"),
+        (["git", "clone", "-s", URL], "already names a reference"),
+        (["gh", "repo", "clone", "org/project", "--", "--reference-if-able", "/srv/cache"],
+         "already names a reference"),
+    ])
+    def test_skipped(self, monkeypatch, cmd_args, reason):
+        git = FakeGit(monkeypatch)
+        rewritten, report = mirrors.rewrite_clone(cmd_args)
+        assert rewritten == cmd_args
+        assert reason in report["skipped"]
+        assert not git.calls
+    
+    @pytest.mark.unit
+    def test_missing_mirror_error_clones_from_remote(self, monkeypatch):
+        FakeGit(monkeypatch, fail={"clone"}, stderr="fatal: unable to access\n")
+        cmd_args, report = mirrors.rewrite_clone(["git", "clone", URL])
+        assert cmd_args == ["git", "clone", URL]
+        assert report == {"path": mirrors.mirror_path(URL), "url": URL, "error": "fatal: unable to access"}
+    
+    @pytest.mark.unit
+    def test_refresh_error_still_borrows_from_mirror(self, monkeypatch):
+        FakeGit(monkeypatch, fail={"fetch"}, stderr="fatal: unable to access\n")
+        path = mirrors.ensure(URL)["path"]
+        cmd_args, report = mirrors.rewrite_clone(["git", "clone", URL], max_age=0)
+        assert report["error"] == "fatal: unable to access"
+        assert cmd_args == ["git", "clone", "--reference-if-able", path, "--dissociate", URL]
+
+
+class TestManage:
+    """Test listing and refreshing the whole cache"""
+    
+    @pytest.mark.unit
+    def test_list_and_refresh(self, monkeypatch, mirror_dir):
+        git = FakeGit(monkeypatch, fail={"fetch"})
+        assert mirrors.manage({})["result"] == []
+        path = mirrors.ensure(URL)["path"]
+        (mirror_dir / "notes.txt").write_text("")
+        (mirror_dir / "orphan.git").mkdir()
+        result = mirrors.manage({})
+        assert result["success"] is True and result["root"] == str(mirror_dir)
+        assert [entry["path"] for entry in result["result"]] == [str(mirror_dir / "orphan.git"), path]
+        assert result["result"][1]["url"] == URL and result["result"][1]["age_seconds"] >= 0
+        assert result["result"][0]["url"] is None and result["result"][0]["age_seconds"] is None
+        assert "refreshed" not in result
+        assert mirrors.manage({"refresh": True})["refreshed"][0]["action"] == "fresh"
+        git.fail = set()
+        assert mirrors.manage({"refresh": True, "max_age": 0})["refreshed"][0]["action"] == "refreshed"
+        git.fail = {"fetch"}
+        assert mirrors.manage({"refresh": True, "max_age": "0"})["refreshed"] == [
+            {"path": path, "url": URL, "error": "git -C exited with 1"}]
+    
+    @pytest.mark.unit
+    def test_invalid_max_age(self, monkeypatch):
+        FakeGit(monkeypatch)
+        result = mirrors.manage({"refresh": True, "max_age": "soon"})
+        assert result["success"] is False
+        assert result["error_code"] == "MIRROR_FAILED"
+
+
+class TestCliMirror:
+    """Test the mirror option of the git and gh plugins"""
+    
+    @pytest.mark.unit
+    def test_git_clone_through_mirror(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        result = git_cli.run({"command": "clone", "args": [URL, "dest"], "mirror": True}, cwd=str(tmp_path))
+        assert result["success"] is True
+        assert result["mirror"]["action"] == "created"
+        assert "mirror_ns" in result["timings"]
+        assert git.calls[-1] == ["git", "clone", "--reference-if-able", result["mirror"]["path"], "--dissociate",
+                                 URL, "dest"]
+    
+    @pytest.mark.unit
+    def test_gh_clone_through_mirror(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        result = gh_cli.run({"command": "repo clone org/project", "mirror": True}, cwd=str(tmp_path))
+        assert result["success"] is True
+        assert result["mirror"]["url"] == "https://github.com/org/project.git"
+        assert git.calls[-1][-3:] == ["--reference-if-able", result["mirror"]["path"], "--dissociate"]
+    
+    @pytest.mark.unit
+    def test_without_mirror_option(self, monkeypatch, tmp_path):
+        git = FakeGit(monkeypatch)
+        assert "mirror" not in git_cli.run({"command": "clone", "args": [URL]}, cwd=str(tmp_path))
+        assert "mirror" not in gh_cli.run({"command": "repo clone org/project"}, cwd=str(tmp_path))
+        assert len(git.calls) == 2
@@ -0,0 +1,288 @@
+"""
+Unit tests for the shared telemetry and process helpers
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+from plugins import process, telemetry
+
+
+class TestPhaseTimer:
+    """Test the PhaseTimer class"""
+    
+    @pytest.mark.unit
+    def test_mark_accumulates_phases(self):
+        """Test that repeated marks accumulate per phase"""
+        timer = telemetry.PhaseTimer()
+        timer.mark("setup")
+        timer.mark("wait")
+        timer.mark("setup")
+        timings = timer.as_dict()
+        assert set(timings) == {"setup_ns", "wait_ns", "total_ns"}
+        assert timings["setup_ns"] >= 0
+        assert timings["total_ns"] == timings["setup_ns"] + timings["wait_ns"]
+    
+    @pytest.mark.unit
+    def test_queue_wait_recorded(self):
+        """Test that an enqueue timestamp produces a queue_wait phase"""
+        enqueued = time.perf_counter_ns() - 5_000_000
+        timer = telemetry.PhaseTimer(enqueued)
+        timings = timer.as_dict()
+        assert timings["queue_wait_ns"] >= 5_000_000
+        assert timings["total_ns"] >= timings["queue_wait_ns"]
+    
+    @pytest.mark.unit
+    def test_future_enqueue_timestamp_ignored(self):
+        """Test that an enqueue timestamp in the future is ignored"""
+        timer = telemetry.PhaseTimer(time.perf_counter_ns() + 10**12)
+        assert "queue_wait_ns" not in timer.as_dict()
+    
+    @pytest.mark.unit
+    def test_add_external_duration(self):
+        """Test charging an externally measured duration"""
+        timer = telemetry.PhaseTimer()
+        timer.add("lock_wait", 42)
+        timer.add("lock_wait", 8)
+        assert timer.as_dict()["lock_wait_ns"] == 50
+
+
+class TestDumps:
+    """Test the dumps() serializer"""
+    
+    @pytest.mark.unit
+    def test_dumps_without_timings(self):
+        """Test responses without timings serialize unchanged"""
+        assert telemetry.dumps({"a": 1}) == json.dumps({"a": 1})
+        assert telemetry.dumps(["x"]) == json.dumps(["x"])
+    
+    @pytest.mark.unit
+    def test_dumps_records_serialize_phase(self):
+        """Test that serialization cost is spliced into timings"""
+        response = {"command": "git status", "timings": {"setup_ns": 1, "total_ns": 1}}
+        decoded = json.loads(telemetry.dumps(response))
+        assert decoded["command"] == "git status"
+        assert decoded["timings"]["setup_ns"] == 1
+        assert decoded["timings"]["serialize_ns"] >= 0
+    
+    @pytest.mark.unit
+    def test_dumps_timings_only(self):
+        """Test a response containing nothing but timings"""
+        decoded = json.loads(telemetry.dumps({"timings": {"total_ns": 0}}))
+        assert list(decoded) == ["timings"]
+
+
+class TestRunProcess:
+    """Test the run_process() helper"""
+    
+    @pytest.mark.unit
+    def test_run_process_captures_output(self):
+        """Test stdout, stderr and return code capture with phase marks"""
+        timer = telemetry.PhaseTimer()
+        code = "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"
+        result = process.run_process([sys.executable, "-c", code], timer=timer)
+        assert result.returncode == 3
+        assert result.stdout == "out\n"
+        assert result.stderr == "err\n"
+        timings = timer.as_dict()
+        assert "spawn_ns" in timings
+        assert "wait_ns" in timings
+    
+    @pytest.mark.unit
+    @pytest.mark.skipif(not hasattr(os, "wait4"), reason="os.wait4 not available")
+    def test_run_process_records_resources(self):
+        """Test that child rusage is captured through os.wait4"""
+        code = "x = sum(i * i for i in range(200000)); b = bytearray(8 * 1024 * 1024)"
+        result = process.run_process([sys.executable, "-c", code])
+        resources = result.resources
+        assert set(resources) == {
+            "user_cpu_s", "system_cpu_s", "max_rss_bytes", "block_input_ops",
+            "block_output_ops", "voluntary_ctx_switches", "involuntary_ctx_switches"
+        }
+        assert resources["user_cpu_s"] + resources["system_cpu_s"] > 0
+        assert resources["max_rss_bytes"] >= 8 * 1024 * 1024
+    
+    @pytest.mark.unit
+    @pytest.mark.skipif(not hasattr(os, "wait4"), reason="os.wait4 not available")
+    def test_run_process_timeout_records_resources(self):
+        """Test that a killed child still reports its rusage"""
+        with pytest.raises(subprocess.TimeoutExpired) as excinfo:
+            process.run_process([sys.executable, "-c", "import time; time.sleep(10)"], timeout=0.2)
+        assert "max_rss_bytes" in excinfo.value.resources
+    
+    @pytest.mark.unit
+    def test_accounting_popen_child_already_reaped(self, monkeypatch):
+        """Test the ChildProcessError fallback when the child was reaped elsewhere"""
+        def reaped(pid, flags):
+            raise ChildProcessError()
+        monkeypatch.setattr(os, "wait4", reaped, raising=False)
+        proc = process._AccountingPopen.__new__(process._AccountingPopen)
+        proc.pid = 12345
+        assert proc._try_wait(0) == (12345, 0)
+        assert proc.rusage is None
+    
+    @pytest.mark.unit
+    def test_accounting_popen_no_child_ready(self, monkeypatch):
+        """Test a WNOHANG poll that finds no exited child keeps rusage unset"""
+        monkeypatch.setattr(os, "wait4", lambda pid, flags: (0, 0, object()), raising=False)
+        proc = process._AccountingPopen.__new__(process._AccountingPopen)
+        proc.pid = 12345
+        assert proc._try_wait(os.WNOHANG) == (0, 0)
+        assert proc.rusage is None
+    
+    @pytest.mark.unit
+    def test_run_process_without_timer(self, tmp_path):
+        """Test run_process honours cwd without a timer"""
+        code = "import os; print(os.getcwd())"
+        result = process.run_process([sys.executable, "-c", code], cwd=str(tmp_path))
+        assert result.stdout.strip() == str(tmp_path)
+    
+    @pytest.mark.unit
+    def test_run_process_input(self):
+        """Test that input is written to the child's stdin"""
+        code = "import sys; print(sys.stdin.read().split('\\0'))"
+        result = process.run_process([sys.executable, "-c", code], input="a\0b\0")
+        assert result.stdout.strip() == "['a', 'b', '']"
+    
+    @pytest.mark.unit
+    def test_run_process_timeout(self):
+        """Test that a slow child is killed and TimeoutExpired raised"""
+        timer = telemetry.PhaseTimer()
+        with pytest.raises(subprocess.TimeoutExpired):
+            process.run_process([sys.executable, "-c", "import time; time.sleep(10)"],
+                                timeout=0.2, timer=timer)
+        assert "wait_ns" in timer.as_dict()
+    
+    @pytest.mark.unit
+    def test_run_process_timeout_without_timer(self):
+        """Test timeout handling without a timer"""
+        with pytest.raises(subprocess.TimeoutExpired):
+            process.run_process([sys.executable, "-c", "import time; time.sleep(10)"], timeout=0.2)
+    
+    @pytest.mark.unit
+    def test_run_process_interrupted(self, monkeypatch):
+        """Test that the child is killed when waiting is interrupted"""
+        def interrupted(self, *args, **kwargs):
+            raise KeyboardInterrupt()
+        monkeypatch.setattr(subprocess.Popen, "communicate", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            process.run_process([sys.executable, "-c", "import time; time.sleep(10)"])
+    
+    @pytest.mark.unit
+    def test_run_process_missing_executable(self):
+        """Test that a missing executable raises like subprocess.run"""
+        with pytest.raises(FileNotFoundError):
+            process.run_process(["definitely-not-a-real-command-12345"])
+
+
+class TestStreamingProcess:
+    """Test the StreamingProcess helper"""
+    
+    @pytest.mark.unit
+    def test_streams_stdout_and_drains_stderr(self):
+        """Test chunked stdout while more stderr than a pipe buffer is written"""
+        timer = telemetry.PhaseTimer()
+        code = ("import sys\n"
+                "sys.stderr.write('e' * 200000); sys.stderr.flush()\n"
+                "for i in range(100): sys.stdout.write('x' * 1000); sys.stdout.flush()\n"
+                "sys.exit(2)")
+        with process.StreamingProcess([sys.executable, "-c", code], timer=timer, chunk_size=4096) as child:
+            chunks = list(child)
+            result = child.wait()
+        assert all(len(chunk) <= 4096 for chunk in chunks)
+        assert b"".join(chunks) == b"x" * 100000
+        assert result.returncode == 2
+        assert result.stdout is None
+        assert result.stderr == "e" * 200000
+        assert result.stdout_bytes == 100000
+        assert result.stopped is False
+        timings = timer.as_dict()
+        assert "spawn_ns" in timings
+        assert "wait_ns" in timings
+    
+    @pytest.mark.unit
+    @pytest.mark.skipif(not hasattr(os, "wait4"), reason="os.wait4 not available")
+    def test_records_resources(self):
+        """Test that child rusage is captured like run_process"""
+        with process.StreamingProcess([sys.executable, "-c", "print('ok')"]) as child:
+            result = child.wait()
+        assert result.stdout_bytes == 3
+        assert "max_rss_bytes" in result.resources
+    
+    @pytest.mark.unit
+    def test_stop_kills_child_early(self):
+        """Test that a caller can stop an endless producer once it has read enough"""
+        code = "import sys\nwhile True: sys.stdout.write('y' * 1024); sys.stdout.flush()"
+        start = time.perf_counter()
+        with process.StreamingProcess([sys.executable, "-c", code], timeout=10) as child:
+            for chunk in child:
+                child.stop()
+            child.stop()
+            result = child.wait()
+        assert time.perf_counter() - start < 5
+        assert result.stopped is True
+        assert result.returncode != 0
+    
+    @pytest.mark.unit
+    def test_stop_and_watchdog_after_exit_are_noops(self):
+        """Test that stopping or expiring an already finished child changes nothing"""
+        with process.StreamingProcess([sys.executable, "-c", "pass"]) as child:
+            result = child.wait()
+            child.stop()
+            child._expire()
+        assert result.returncode == 0
+        assert child.stopped is False
+        assert child.timed_out is False
+    
+    @pytest.mark.unit
+    def test_wait_reads_unconsumed_output(self):
+        """Test that wait() lets a child finish output nobody read"""
+        code = "import sys; sys.stdout.write('z' * 500000)"
+        with process.StreamingProcess([sys.executable, "-c", code]) as child:
+            result = child.wait()
+        assert result.returncode == 0
+        assert result.stdout_bytes == 500000
+    
+    @pytest.mark.unit
+    def test_reads_stdin_from_file(self, tmp_path):
+        """Test that the child reads its input from the given file"""
+        source = tmp_path / "input.txt"
+        source.write_bytes(b"one\ntwo\n")
+        code = "import sys; sys.stdout.write(sys.stdin.read().upper())"
+        with open(source, "rb") as handle, process.StreamingProcess([sys.executable, "-c", code],
+                                                                     stdin=handle) as child:
+            output = b"".join(child)
+            child.wait()
+        assert output == b"ONE\nTWO\n"
+    
+    @pytest.mark.unit
+    def test_timeout_kills_child(self):
+        """Test that the watchdog kills a slow child and wait() raises TimeoutExpired"""
+        timer = telemetry.PhaseTimer()
+        code = "import sys, time; print('partial', flush=True); time.sleep(10)"
+        with pytest.raises(subprocess.TimeoutExpired) as excinfo:
+            with process.StreamingProcess([sys.executable, "-c", code], timeout=0.3, timer=timer) as child:
+                assert b"".join(child) == b"partial\n"
+                child.wait()
+        assert excinfo.value.timeout == 0.3
+        assert "wait_ns" in timer.as_dict()
+        if hasattr(os, "wait4"):
+            assert "max_rss_bytes" in excinfo.value.resources
+    
+    @pytest.mark.unit
+    def test_leaving_block_kills_child(self):
+        """Test that an exception inside the block kills and reaps the child"""
+        with pytest.raises(RuntimeError):
+            with process.StreamingProcess([sys.executable, "-c", "import time; time.sleep(10)"]) as child:
+                raise RuntimeError("parser failed")
+        assert child._proc.returncode is not None
+        assert child._proc.stdout.closed
+    
+    @pytest.mark.unit
+    def test_missing_executable(self):
+        """Test that a missing executable raises like subprocess.run"""
+        with pytest.raises(FileNotFoundError):
+            process.StreamingProcess(["definitely-not-a-real-command-12345"])
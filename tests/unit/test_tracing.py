@@ -0,0 +1,193 @@
+"""
+Unit tests for the shared span tracing helpers
+"""
+import json
+import pytest
+
+from plugins import tracing
+
+
+PARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def _response(**overrides):
+    response = {
+        "command": "git status --short",
+        "return_code": 0,
+        "success": True,
+        "stdout": "M file\n",
+        "timings": {"setup_ns": 10, "total_ns": 100},
+    }
+    response.update(overrides)
+    return response
+
+
+class TestParseTraceparent:
+    """Test W3C traceparent parsing"""
+    
+    @pytest.mark.unit
+    def test_valid_traceparent(self):
+        parsed = tracing.parse_traceparent(PARENT)
+        assert parsed == {
+            "trace_id": "0af7651916cd43dd8448eb211c80319c",
+            "span_id": "b7ad6b7169203331",
+            "sampled": True
+        }
+    
+    @pytest.mark.unit
+    def test_unsampled_flag(self):
+        assert tracing.parse_traceparent(PARENT[:-2] + "00")["sampled"] is False
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value", [
+        None, 42, "", "garbage",
+        "ff-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01",
+        "00-00000000000000000000000000000000-b7ad6b7169203331-01",
+        "00-0af7651916cd43dd8448eb211c80319c-0000000000000000-01",
+    ])
+    def test_invalid_traceparent(self, value):
+        assert tracing.parse_traceparent(value) is None
+
+
+class TestStartSpan:
+    """Test span creation and sampling"""
+    
+    @pytest.mark.unit
+    def test_disabled_without_trace_file(self, monkeypatch):
+        monkeypatch.delenv(tracing.TRACE_FILE_ENV, raising=False)
+        assert tracing.start_span("git", {}) is None
+    
+    @pytest.mark.unit
+    def test_root_span(self, monkeypatch, tmp_path):
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(tmp_path / "t.jsonl"))
+        monkeypatch.delenv(tracing.SAMPLE_RATIO_ENV, raising=False)
+        span = tracing.start_span("git", {"command": "status"})
+        assert len(span.trace_id) == 32
+        assert len(span.span_id) == 16
+        assert span.parent_span_id is None
+        assert span.sampled is True
+    
+    @pytest.mark.unit
+    def test_child_span_inherits_context(self, monkeypatch, tmp_path):
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(tmp_path / "t.jsonl"))
+        span = tracing.start_span("git", {"traceparent": PARENT[:-2] + "00"})
+        assert span.trace_id == "0af7651916cd43dd8448eb211c80319c"
+        assert span.parent_span_id == "b7ad6b7169203331"
+        assert span.sampled is False
+        assert span.traceparent == f"00-{span.trace_id}-{span.span_id}-00"
+    
+    @pytest.mark.unit
+    def test_non_dict_args(self, monkeypatch, tmp_path):
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(tmp_path / "t.jsonl"))
+        assert tracing.start_span("git", None).parent_span_id is None
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("ratio,expected", [("0", False), ("1", True), ("-3", False), ("7", True)])
+    def test_sample_ratio(self, monkeypatch, tmp_path, ratio, expected):
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(tmp_path / "t.jsonl"))
+        monkeypatch.setenv(tracing.SAMPLE_RATIO_ENV, ratio)
+        assert tracing.start_span("git", {}).sampled is expected
+    
+    @pytest.mark.unit
+    def test_invalid_sample_ratio_defaults_to_always(self, monkeypatch):
+        monkeypatch.setenv(tracing.SAMPLE_RATIO_ENV, "often")
+        assert tracing._sample_ratio() == 1.0
+    
+    @pytest.mark.unit
+    def test_ratio_sampling_uses_trace_id(self):
+        assert tracing._should_sample("0" * 16 + "0" * 16, 0.5) is True
+        assert tracing._should_sample("0" * 16 + "f" * 16, 0.5) is False
+
+
+class TestFinishSpan:
+    """Test span export"""
+    
+    @pytest.mark.unit
+    def test_finish_none_is_noop(self):
+        response = _response()
+        tracing.finish_span(None, response)
+        assert "trace" not in response
+    
+    @pytest.mark.unit
+    def test_exports_otlp_json_line(self, monkeypatch, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(path))
+        monkeypatch.setenv(tracing.SERVICE_NAME_ENV, "agent-fleet")
+        span = tracing.start_span("git", {"traceparent": PARENT})
+        response = _response(idempotent=True)
+        tracing.finish_span(span, response, cwd="/repo")
+        assert response["trace"]["traceparent"] == span.traceparent
+        
+        lines = path.read_text().splitlines()
+        assert len(lines) == 1
+        export = json.loads(lines[0])
+        resource_spans = export["resourceSpans"][0]
+        resource = {a["key"]: a["value"] for a in resource_spans["resource"]["attributes"]}
+        assert resource["service.name"] == {"stringValue": "agent-fleet"}
+        record = resource_spans["scopeSpans"][0]["spans"][0]
+        assert record["traceId"] == "0af7651916cd43dd8448eb211c80319c"
+        assert record["parentSpanId"] == "b7ad6b7169203331"
+        assert record["name"] == "git status"
+        assert record["kind"] == tracing.SPAN_KIND_CLIENT
+        assert int(record["endTimeUnixNano"]) >= int(record["startTimeUnixNano"])
+        assert record["status"] == {"code": tracing.STATUS_CODE_UNSET}
+        attributes = {a["key"]: a["value"] for a in record["attributes"]}
+        assert attributes["process.working_directory"] == {"stringValue": "/repo"}
+        assert attributes["process.exit_code"] == {"intValue": "0"}
+        assert attributes["smcp.success"] == {"boolValue": True}
+        assert attributes["smcp.idempotent"] == {"boolValue": True}
+        assert attributes["smcp.bytes_out"] == {"intValue": "7"}
+        assert attributes["smcp.timing.setup_ns"] == {"intValue": "10"}
+    
+    @pytest.mark.unit
+    def test_error_status_and_root_span(self, monkeypatch, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(path))
+        monkeypatch.delenv(tracing.SAMPLE_RATIO_ENV, raising=False)
+        span = tracing.start_span("gh", {})
+        response = {"success": False, "error_code": "INVALID_CWD", "elapsed_ratio": 0.5}
+        tracing.finish_span(span, response)
+        record = json.loads(path.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert "parentSpanId" not in record
+        assert record["name"] == "gh none"
+        assert record["status"] == {"code": tracing.STATUS_CODE_ERROR, "message": "INVALID_CWD"}
+    
+    @pytest.mark.unit
+    def test_unsampled_span_not_exported(self, monkeypatch, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(path))
+        span = tracing.start_span("git", {"traceparent": PARENT[:-2] + "00"})
+        response = _response()
+        tracing.finish_span(span, response)
+        assert response["trace"]["sampled"] is False
+        assert not path.exists()
+    
+    @pytest.mark.unit
+    def test_export_failure_is_ignored(self, monkeypatch, tmp_path):
+        monkeypatch.setenv(tracing.TRACE_FILE_ENV, str(tmp_path / "missing-dir" / "spans.jsonl"))
+        span = tracing.start_span("git", {"traceparent": PARENT})
+        response = _response()
+        tracing.finish_span(span, response)
+        assert "trace" in response
+    
+    @pytest.mark.unit
+    def test_attribute_encoding(self):
+        assert tracing._attribute("a", 1.5) == {"key": "a", "value": {"doubleValue": 1.5}}
+        assert tracing._attribute("b", None) == {"key": "b", "value": {"stringValue": "None"}}
+    
+    @pytest.mark.unit
+    def test_long_command_truncated(self, monkeypatch, tmp_path):
+        span = tracing.Span("git", "a" * 32, "b" * 16, None, True, str(tmp_path / "x"))
+        built = tracing.build_span(span, _response(command="git log " + "x" * 1000), None, span.start_unix_ns)
+        attributes = {a["key"]: a["value"] for a in built["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["attributes"]}
+        assert len(attributes["process.command_line"]["stringValue"]) == tracing.MAX_COMMAND_LENGTH
+    
+    @pytest.mark.unit
+    def test_bytes_out_counts_bytes_like_metrics(self, tmp_path):
+        from plugins import metrics
+        span = tracing.Span("git", "a" * 32, "b" * 16, None, True, str(tmp_path / "x"))
+        response = _response(stdout="héllo wörld\n", stderr="ß\n", stdout_bytes=100)
+        built = tracing.build_span(span, response, None, span.start_unix_ns)
+        attributes = {a["key"]: a["value"] for a in built["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["attributes"]}
+        assert attributes["smcp.bytes_out"] == {"intValue": "117"}
+        assert metrics.bytes_out(response) == 117